@@ -0,0 +1,55 @@
+#!/bin/bash
+
+# Run the resource manager load generator against a private murphyd.
+#
+# Usage: scripts/resource-load.sh [resource-api-load options]
+#
+# The daemon is started from the build tree with the sample resource
+# configuration and listens on a private address, so the script does not
+# interfere with a running murphyd. The daemon also gets a console on a
+# private address, which the generator uses to read the time the daemon
+# spends arbitrating in each phase, and it samples the memory usage of the
+# daemon. The results of each measurement phase are printed as one JSON
+# object per line on stdout.
+
+TOP=$(cd $(dirname $0)/.. && pwd)
+SRC=$TOP/src
+CFG=$SRC/daemon/sample-config
+TMP=$(mktemp -d /tmp/resource-load.XXXXXX)
+
+export MURPHY_RESOURCE_ADDRESS="unxs:@murphy-resource-load-$$"
+CONSOLE="unxs:@murphy-console-load-$$"
+
+cleanup() {
+    [ -n "$PID" ] && kill $PID 2> /dev/null && wait $PID 2> /dev/null
+    rm -fr $TMP
+}
+
+trap cleanup EXIT
+
+cat > $TMP/main.cfg <<EOT
+m = murphy.get()
+m:include_once('common.cfg')
+include('resource.cfg', MANDATORY)
+m:load_plugin('console', { address = '$CONSOLE' })
+EOT
+
+echo "load-plugin lua config=\"$TMP/main.cfg\"" > $TMP/murphy.conf
+
+$SRC/murphyd -f -c $TMP/murphy.conf -C $CFG -P $SRC/.libs \
+    > $TMP/murphyd.log 2>&1 &
+PID=$!
+
+# wait for the daemon to start listening on the private addresses
+for i in $(seq 50); do
+    grep -q "@murphy-resource-load-$$\$" /proc/net/unix &&
+        grep -q "@murphy-console-load-$$\$" /proc/net/unix && break
+    if ! kill -0 $PID 2> /dev/null; then
+        echo "murphyd failed to start:" 1>&2
+        cat $TMP/murphyd.log 1>&2
+        exit 1
+    fi
+    sleep 0.1
+done
+
+$SRC/resource-api-load -A $CONSOLE -p $PID "$@"
@@ -917,7 +917,6 @@ static mrp_dbus_msg_t *msg_encode(mrp_dbus_t *dbus, const char *destination,
                     break
 
     mrp_dbus_msg_t  *m;
-    mrp_list_hook_t *p, *n;
     mrp_msg_field_t *f;
     uint16_t         base;
     uint32_t         asize, i;
@@ -940,9 +939,7 @@ static mrp_dbus_msg_t *msg_encode(mrp_dbus_t *dbus, const char *destination,
     if (!mrp_dbus_msg_append_basic(m, MRP_DBUS_TYPE_UINT16, &msg->nfield))
         goto fail;
 
-    mrp_list_foreach(&msg->fields, p, n) {
-        f = mrp_list_entry(p, typeof(*f), hook);
-
+    for (f = msg->fields; f < msg->fields + msg->nfield; f++) {
         if (!mrp_dbus_msg_append_basic(m, MRP_DBUS_TYPE_UINT16, &f->tag) ||
             !mrp_dbus_msg_append_basic(m, MRP_DBUS_TYPE_UINT16, &f->type))
             goto fail;
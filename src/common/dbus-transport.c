@@ -905,7 +905,6 @@ static DBusMessage *msg_encode(const char *sender_id, mrp_msg_t *msg)
                     break
 
     DBusMessage     *m;
-    mrp_list_hook_t *p, *n;
     mrp_msg_field_t *f;
     uint16_t         base;
     uint32_t         asize, i;
@@ -930,9 +929,7 @@ static DBusMessage *msg_encode(const char *sender_id, mrp_msg_t *msg)
     if (!dbus_message_iter_append_basic(&im, DBUS_TYPE_UINT16, &msg->nfield))
         goto fail;
 
-    mrp_list_foreach(&msg->fields, p, n) {
-        f = mrp_list_entry(p, typeof(*f), hook);
-
+    for (f = msg->fields; f < msg->fields + msg->nfield; f++) {
         if (!dbus_message_iter_append_basic(&im, DBUS_TYPE_UINT16, &f->tag) ||
             !dbus_message_iter_append_basic(&im, DBUS_TYPE_UINT16, &f->type))
             goto fail;
@@ -34,7 +34,6 @@
 #include <fcntl.h>
 #include <sys/types.h>
 #include <sys/socket.h>
-#include <sys/uio.h>
 
 #include <murphy/common/macros.h>
 #include <murphy/common/mm.h>
@@ -55,6 +54,7 @@
 
 
 #define DEFAULT_SIZE 1024                /* default input buffer size */
+#define SCRATCH_MIN  1024                /* initial encoding buffer size */
 
 typedef struct {
     MRP_TRANSPORT_PUBLIC_FIELDS;         /* common transport fields */
@@ -64,6 +64,8 @@ typedef struct {
     void           *ibuf;                /* input buffer */
     size_t          isize;               /* input buffer size */
     size_t          idata;               /* amount of input data */
+    char           *sbuf;                /* scratch buffer for encoding */
+    size_t          ssize;               /* scratch buffer size */
 } dgrm_t;
 
 
@@ -330,6 +332,10 @@ static void dgrm_close(mrp_transport_t *mu)
     u->isize = 0;
     u->idata = 0;
 
+    mrp_free(u->sbuf);
+    u->sbuf  = NULL;
+    u->ssize = 0;
+
     if (u->sock >= 0){
         close(u->sock);
         u->sock = -1;
@@ -500,28 +506,70 @@ static int dgrm_disconnect(mrp_transport_t *mu)
 }
 
 
+/*
+ * Datagrams are sent right away, so we can always encode them into a
+ * scratch buffer we keep around and reuse. The encoders tell us the
+ * size they need if the buffer turns out to be too small.
+ */
+static char *scratch_alloc(dgrm_t *u, size_t size)
+{
+    size_t ssize;
+
+    if (size > u->ssize) {
+        ssize = MRP_MAX(u->ssize, (size_t)SCRATCH_MIN);
+
+        while (ssize < size)
+            ssize *= 2;
+
+        if (mrp_realloc(u->sbuf, ssize) == NULL)
+            return NULL;
+
+        u->ssize = ssize;
+    }
+
+    return u->sbuf;
+}
+
+
+static ssize_t encode_msg(dgrm_t *u, mrp_msg_t *msg, char **bufp)
+{
+    char     *buf;
+    ssize_t   size;
+    size_t    hdr, avail;
+    uint32_t *lenp;
+
+    hdr   = sizeof(*lenp);
+    avail = u->ssize > hdr ? u->ssize - hdr : 0;
+    size  = mrp_msg_default_encode_to(msg, avail ? u->sbuf + hdr : NULL,
+                                      avail);
+
+    if (size < 0 || (buf = scratch_alloc(u, hdr + size)) == NULL)
+        return -1;
+
+    if ((size_t)size > avail)
+        mrp_msg_default_encode_to(msg, buf + hdr, size);
+
+    lenp  = (uint32_t *)buf;
+    *lenp = htobe32(size);
+    *bufp = buf;
+
+    return hdr + size;
+}
+
+
 static int dgrm_send(mrp_transport_t *mu, mrp_msg_t *msg)
 {
-    dgrm_t       *u = (dgrm_t *)mu;
-    struct iovec  iov[2];
-    void         *buf;
-    ssize_t       size, n;
-    uint32_t      len;
+    dgrm_t  *u = (dgrm_t *)mu;
+    char    *buf;
+    ssize_t  size, n;
 
     if (u->connected) {
-        size = mrp_msg_default_encode(msg, &buf);
+        size = encode_msg(u, msg, &buf);
 
         if (size >= 0) {
-            len = htonl(size);
-            iov[0].iov_base = &len;
-            iov[0].iov_len  = sizeof(len);
-            iov[1].iov_base = buf;
-            iov[1].iov_len  = size;
-
-            n = writev(u->sock, iov, 2);
-            mrp_free(buf);
+            n = send(u->sock, buf, size, 0);
 
-            if (n == (ssize_t)(size + sizeof(len)))
+            if (n == size)
                 return TRUE;
             else {
                 if (n == -1 && errno == EAGAIN) {
@@ -540,40 +588,21 @@ static int dgrm_send(mrp_transport_t *mu, mrp_msg_t *msg)
 static int dgrm_sendto(mrp_transport_t *mu, mrp_msg_t *msg,
                        mrp_sockaddr_t *addr, socklen_t addrlen)
 {
-    dgrm_t          *u = (dgrm_t *)mu;
-    struct iovec     iov[2];
-    void            *buf;
-    ssize_t          size, n;
-    uint32_t         len;
-    struct msghdr    hdr;
+    dgrm_t  *u = (dgrm_t *)mu;
+    char    *buf;
+    ssize_t  size, n;
 
     if (MRP_UNLIKELY(u->sock == -1)) {
         if (!open_socket(u, ((struct sockaddr *)addr)->sa_family))
             return FALSE;
     }
 
-    size = mrp_msg_default_encode(msg, &buf);
+    size = encode_msg(u, msg, &buf);
 
     if (size >= 0) {
-        len = htonl(size);
-        iov[0].iov_base = &len;
-        iov[0].iov_len  = sizeof(len);
-        iov[1].iov_base = buf;
-        iov[1].iov_len  = size;
-
-        hdr.msg_name    = addr;
-        hdr.msg_namelen = addrlen;
-        hdr.msg_iov     = iov;
-        hdr.msg_iovlen  = MRP_ARRAY_SIZE(iov);
-
-        hdr.msg_control    = NULL;
-        hdr.msg_controllen = 0;
-        hdr.msg_flags      = 0;
-
-        n = sendmsg(u->sock, &hdr, 0);
-        mrp_free(buf);
+        n = sendto(u->sock, buf, size, 0, &addr->any, addrlen);
 
-        if (n == (ssize_t)(size + sizeof(len)))
+        if (n == size)
             return TRUE;
         else {
             if (n == -1 && errno == EAGAIN) {
@@ -641,9 +670,9 @@ static int senddatato(mrp_transport_t *mu, void *data, uint16_t tag,
 {
     dgrm_t           *u = (dgrm_t *)mu;
     mrp_data_descr_t *type;
-    ssize_t           n;
-    void             *buf;
-    size_t            size, reserve, len;
+    char             *buf;
+    ssize_t           size, n;
+    size_t            hdr, avail;
     uint32_t         *lenp;
     uint16_t         *tagp;
 
@@ -655,30 +684,34 @@ static int senddatato(mrp_transport_t *mu, void *data, uint16_t tag,
     type = mrp_msg_find_type(tag);
 
     if (type != NULL) {
-        reserve = sizeof(*lenp) + sizeof(*tagp);
-        size    = mrp_data_encode(&buf, data, type, reserve);
-
-        if (size > 0) {
-            lenp  = buf;
-            len   = size - sizeof(*lenp);
-            tagp  = buf + sizeof(*lenp);
-            *lenp = htobe32(len);
-            *tagp = htobe16(tag);
-
-            if (u->connected)
-                n = send(u->sock, buf, len + sizeof(*lenp), 0);
-            else
-                n = sendto(u->sock, buf, len + sizeof(*lenp), 0, &addr->any, addrlen);
+        hdr   = sizeof(*lenp) + sizeof(*tagp);
+        avail = u->ssize > hdr ? u->ssize - hdr : 0;
+        size  = mrp_data_encode_to(avail ? u->sbuf + hdr : NULL, avail,
+                                   data, type);
 
-            mrp_free(buf);
+        if (size < 0 || (buf = scratch_alloc(u, hdr + size)) == NULL)
+            return FALSE;
 
-            if (n == (ssize_t)(len + sizeof(*lenp)))
-                return TRUE;
-            else {
-                if (n == -1 && errno == EAGAIN) {
-                    mrp_log_error("%s(): XXX TODO: dgrm-transport send"
-                                  " needs queuing", __FUNCTION__);
-                }
+        if ((size_t)size > avail)
+            mrp_data_encode_to(buf + hdr, size, data, type);
+
+        lenp  = (uint32_t *)buf;
+        tagp  = (uint16_t *)(buf + sizeof(*lenp));
+        *lenp = htobe32(sizeof(*tagp) + size);
+        *tagp = htobe16(tag);
+        size += hdr;
+
+        if (u->connected)
+            n = send(u->sock, buf, size, 0);
+        else
+            n = sendto(u->sock, buf, size, 0, &addr->any, addrlen);
+
+        if (n == size)
+            return TRUE;
+        else {
+            if (n == -1 && errno == EAGAIN) {
+                mrp_log_error("%s(): XXX TODO: dgrm-transport send"
+                              " needs queuing", __FUNCTION__);
             }
         }
     }
@@ -720,7 +753,7 @@ static int sendnativeto(mrp_transport_t *mu, void *data, uint32_t type_id,
 
     reserve = sizeof(*lenp);
 
-    if (mrp_encode_native(data, type_id, reserve, &buf, &size, map) > 0) {
+    if (mrp_encode_native(data, type_id, reserve, &buf, &size, map) == 0) {
         lenp  = buf;
         *lenp = htobe32(size - sizeof(*lenp));
 
@@ -28,36 +28,73 @@
  */
 
 #include <stdint.h>
+#include <string.h>
 
+#include "murphy/common/macros.h"
 #include "murphy/common/mm.h"
-#include "murphy/common/list.h"
 #include "murphy/common/hashtbl.h"
 
-#define MIN_NBUCKET   8
-#define MAX_NBUCKET 128
+#define MIN_NSLOT          8            /* minimum number of slots */
+#define MAX_NSLOT_HINT (1 << 16)        /* max. initial number of slots */
+#define MIGRATE_STEP      32            /* slots to migrate per operation */
 
-typedef struct {                        /* a hash bucket */
-    mrp_list_hook_t entries;            /* hook to hash table entries */
-    mrp_list_hook_t used;               /* hook to list of buckets in use */
-} bucket_t;
+/*
+ * A hash table is an open addressing table with linear probing. Each
+ * slot caches the hash of its key, so probing only calls the comparison
+ * function for keys with a matching hash and resizing never rehashes
+ * keys.
+ *
+ * Tables are resized incrementally. When a table becomes too full (or
+ * too empty) a new table of the right size is allocated and all further
+ * insertions go there. Entries of the older tables are moved over to the
+ * newest one a few slots at a time by every insertion, lookup and
+ * removal, and an older table is freed once it has been drained. Lookups
+ * check all tables, oldest first. While an iterator is active, migration
+ * is suspended so that entries never move under the iterator. If the
+ * newest table fills up during iteration yet another table is appended.
+ *
+ * Of entries with equal keys, lookups find the earliest inserted one.
+ * The only exception are duplicates inserted from an iterator callback
+ * while the table is being resized.
+ */
+
+enum {
+    SLOT_FREE = 0,                      /* never used */
+    SLOT_USED,                          /* holds an entry */
+    SLOT_DELETED,                       /* held a deleted entry */
+};
 
-typedef struct {                        /* a hash table entry */
-    mrp_list_hook_t  hook;              /* hook to bucket chain */
-    void            *key;               /* key for this entry */
-    void            *obj;               /* object for this entry */
-} entry_t;
+typedef struct {                        /* a hash table slot */
+    void     *key;                      /* key for this entry */
+    void     *obj;                      /* object for this entry */
+    uint32_t  hash;                     /* cached hash of key */
+    uint32_t  state;                    /* SLOT_* */
+} slot_t;
+
+typedef struct {                        /* a table of slots */
+    slot_t *slots;                      /* the slots */
+    size_t  nslot;                      /* number of slots, a power of 2 */
+    int     shift;                      /* 32 - log2(nslot) */
+    size_t  nused;                      /* slots in use */
+    size_t  ndeleted;                   /* slots with deleted entries */
+} table_t;
 
 typedef struct {                        /* iterator state */
-    mrp_list_hook_t *bp, *bn;           /* current bucket hook pointers */
-    mrp_list_hook_t *ep, *en;           /* current entry hook pointers */
-    entry_t         *entry;             /* current entry */
-    int              verdict;           /* remove-from-cb verdict */
+    int     tidx;                       /* current table */
+    size_t  sidx;                       /* current slot */
+    void   *key;                        /* current key */
+    void   *obj;                        /* current object */
+    int     busy;                       /* current entry still hashed */
+    int     verdict;                    /* remove-from-cb verdict */
 } iter_t;
 
 struct mrp_htbl_s {
-    bucket_t           *buckets;        /* hash table buckets */
-    size_t              nbucket;        /* this many of them */
-    mrp_list_hook_t     used;           /* buckets in use */
+    table_t            *tables;         /* tables, oldest first */
+    int                 ntable;         /* number of tables */
+    size_t              mstart;         /* migration start in oldest table */
+    size_t              migrated;       /* slots migrated from there */
+    size_t              nentry;         /* number of entries */
+    size_t              minslot;        /* never shrink below this */
     mrp_htbl_comp_fn_t  comp;           /* key comparison function */
     mrp_htbl_hash_fn_t  hash;           /* key hash function */
     mrp_htbl_free_fn_t  free;           /* function to free an entry */
@@ -65,58 +102,82 @@ struct mrp_htbl_s {
 };
 
 
-static size_t calc_buckets(size_t nbucket)
+static size_t calc_slots(size_t nentry)
 {
     size_t n;
 
-    if (nbucket < MIN_NBUCKET)
-        nbucket = MIN_NBUCKET;
-    if (nbucket > MAX_NBUCKET)
-        nbucket = MAX_NBUCKET;
-
-    for (n = MIN_NBUCKET; n < nbucket; n <<= 1)
+    for (n = MIN_NSLOT; n < 2 * nentry; n <<= 1)
         ;
 
     return n;
 }
 
 
+static int table_init(table_t *t, size_t nslot)
+{
+    size_t n;
+
+    mrp_clear(t);
+
+    if ((t->slots = mrp_allocz_array(slot_t, nslot)) == NULL)
+        return FALSE;
+
+    t->nslot = nslot;
+    t->shift = 32;
+
+    for (n = nslot; n > 1; n >>= 1)
+        t->shift--;
+
+    return TRUE;
+}
+
+
+static inline size_t slot_index(table_t *t, uint32_t hash)
+{
+    /* Fibonacci hashing, so weak low bits of the hash do no harm */
+    return (uint32_t)(hash * 2654435769U) >> t->shift;
+}
+
+
+static inline table_t *newest_table(mrp_htbl_t *ht)
+{
+    return ht->tables + ht->ntable - 1;
+}
+
+
 mrp_htbl_t *mrp_htbl_create(mrp_htbl_config_t *cfg)
 {
     mrp_htbl_t *ht;
-    size_t     i, nbucket;
+    size_t      nentry, nslot;
 
     if (cfg->comp && cfg->hash) {
         if ((ht = mrp_allocz(sizeof(*ht))) != NULL) {
-            if (cfg->nbucket != 0)
-                nbucket = cfg->nbucket;
-            else {
-                if (cfg->nentry != 0)
-                    nbucket = cfg->nentry / 4;
-                else
-                    nbucket = 4 * MIN_NBUCKET;
-            }
+            if (cfg->nentry != 0)
+                nentry = cfg->nentry;
+            else
+                nentry = cfg->nbucket;
+
+            nslot = calc_slots(nentry);
 
-            ht->nbucket = calc_buckets(nbucket);
+            if (nslot > MAX_NSLOT_HINT)
+                nslot = MAX_NSLOT_HINT;
+
+            ht->minslot = nslot;
             ht->comp    = cfg->comp;
             ht->hash    = cfg->hash;
             ht->free    = cfg->free;
 
-            mrp_list_init(&ht->used);
+            if ((ht->tables = mrp_allocz(sizeof(*ht->tables))) != NULL) {
+                if (table_init(ht->tables, nslot)) {
+                    ht->ntable = 1;
 
-            ht->buckets = mrp_allocz(sizeof(*ht->buckets) * ht->nbucket);
-            if (ht->buckets != NULL) {
-                for (i = 0; i < ht->nbucket; i++) {
-                    mrp_list_init(&ht->buckets[i].entries);
-                    mrp_list_init(&ht->buckets[i].used);
+                    return ht;
                 }
 
-                return ht;
-            }
-            else {
-                mrp_free(ht);
-                ht = NULL;
+                mrp_free(ht->tables);
             }
+
+            mrp_free(ht);
         }
     }
 
@@ -126,165 +187,368 @@ mrp_htbl_t *mrp_htbl_create(mrp_htbl_config_t *cfg)
 
 void mrp_htbl_destroy(mrp_htbl_t *ht, int free)
 {
+    int i;
+
     if (ht != NULL) {
         if (free)
             mrp_htbl_reset(ht, free);
 
-        mrp_free(ht->buckets);
+        for (i = 0; i < ht->ntable; i++)
+            mrp_free(ht->tables[i].slots);
+
+        mrp_free(ht->tables);
         mrp_free(ht);
     }
 }
 
 
-static inline void free_entry(mrp_htbl_t *ht, entry_t *entry, int free)
+static inline void free_entry(mrp_htbl_t *ht, void *key, void *obj, int free)
 {
     if (free && ht->free)
-        ht->free(entry->key, entry->obj);
-    mrp_free(entry);
+        ht->free(key, obj);
 }
 
 
-void mrp_htbl_reset(mrp_htbl_t *ht, int free)
+static slot_t *find_slot(mrp_htbl_t *ht, table_t *t, void *key, uint32_t hash)
 {
-    mrp_list_hook_t *bp, *bn, *ep, *en;
-    bucket_t        *bucket;
-    entry_t         *entry;
+    size_t  mask = t->nslot - 1;
+    size_t  i;
+    slot_t *s;
 
-    mrp_list_foreach(&ht->used, bp, bn) {
-        bucket = mrp_list_entry(bp, bucket_t, used);
+    if (t->nused == 0)
+        return NULL;
 
-        mrp_list_foreach(&bucket->entries, ep, en) {
-            entry = mrp_list_entry(ep, entry_t, hook);
-            mrp_list_delete(ep);
-            free_entry(ht, entry, free);
-        }
+    for (i = slot_index(t, hash); ; i = (i + 1) & mask) {
+        s = t->slots + i;
+
+        if (s->state == SLOT_FREE)
+            return NULL;
 
-        mrp_list_delete(&bucket->used);
+        if (s->state == SLOT_USED && s->hash == hash && !ht->comp(s->key, key))
+            return s;
     }
 }
 
 
-int mrp_htbl_insert(mrp_htbl_t *ht, void *key, void *object)
+static slot_t *free_slot(mrp_htbl_t *ht, table_t *t, void *key, uint32_t hash)
 {
-    uint32_t  idx    = ht->hash(key) & (ht->nbucket - 1);
-    bucket_t *bucket = ht->buckets + idx;
-    int       first  = mrp_list_empty(&bucket->entries);
-    entry_t  *entry;
-
-    if ((entry = mrp_allocz(sizeof(*entry))) != NULL) {
-        entry->key = key;
-        entry->obj = object;
-        mrp_list_append(&bucket->entries, &entry->hook);
-        if (first)
-            mrp_list_append(&ht->used, &bucket->used);
-
-        return TRUE;
+    size_t  mask = t->nslot - 1;
+    size_t  i;
+    slot_t *s, *deleted;
+
+    /*
+     * Find a slot for a new entry. This is the first free slot along
+     * the probe sequence, or the first deleted one unless that is in
+     * front of another entry with the same key. This way lookups keep
+     * finding the earliest inserted of entries with equal keys. A free
+     * slot is always past any such entry, so keys only need to be
+     * compared once we have passed a deleted slot.
+     */
+
+    deleted = NULL;
+
+    for (i = slot_index(t, hash); ; i = (i + 1) & mask) {
+        s = t->slots + i;
+
+        switch (s->state) {
+        case SLOT_FREE:
+            return deleted != NULL ? deleted : s;
+
+        case SLOT_DELETED:
+            if (deleted == NULL)
+                deleted = s;
+            break;
+
+        default:
+            if (deleted != NULL && s->hash == hash && !ht->comp(s->key, key))
+                deleted = NULL;
+            break;
+        }
     }
-    else
-        return FALSE;
 }
 
 
-static inline entry_t *lookup(mrp_htbl_t *ht, void *key, bucket_t **bucketp)
+static inline void fill_slot(table_t *t, slot_t *s, void *key, void *obj,
+                             uint32_t hash)
 {
-    uint32_t        idx    = ht->hash(key) & (ht->nbucket - 1);
-    bucket_t       *bucket = ht->buckets + idx;
-    mrp_list_hook_t *p, *n;
-    entry_t        *entry;
-
-    mrp_list_foreach(&bucket->entries, p, n) {
-        entry = mrp_list_entry(p, entry_t, hook);
-
-        if (!ht->comp(entry->key, key)) {
-            if (bucketp != NULL)
-                *bucketp = bucket;
-            return entry;
-        }
+    if (s->state == SLOT_DELETED)
+        t->ndeleted--;
+    t->nused++;
+
+    s->key   = key;
+    s->obj   = obj;
+    s->hash  = hash;
+    s->state = SLOT_USED;
+}
+
+
+static void clear_slot(table_t *t, slot_t *s)
+{
+    size_t mask = t->nslot - 1;
+    size_t i    = s - t->slots;
+
+    /*
+     * A deleted slot can be marked free, instead of deleted, if it is
+     * followed by a free one, as then it can't be part of any probe
+     * sequence leading to a used slot. The same then holds for any
+     * deleted slots immediately preceding it.
+     */
+
+    t->nused--;
+
+    if (t->slots[(i + 1) & mask].state != SLOT_FREE) {
+        s->state = SLOT_DELETED;
+        t->ndeleted++;
+        return;
     }
 
-    return NULL;
+    s->state = SLOT_FREE;
+
+    for (i = (i - 1) & mask; t->slots[i].state == SLOT_DELETED;
+         i = (i - 1) & mask) {
+        t->slots[i].state = SLOT_FREE;
+        t->ndeleted--;
+    }
 }
 
 
-void *mrp_htbl_lookup(mrp_htbl_t *ht, void *key)
+static void move_slot(mrp_htbl_t *ht, table_t *from, slot_t *s)
 {
-    entry_t *entry;
+    table_t *to = newest_table(ht);
+    slot_t  *d;
 
-    entry = lookup(ht, key, NULL);
-    if (entry != NULL)
-        return entry->obj;
-    else
-        return NULL;
+    d = free_slot(ht, to, s->key, s->hash);
+    fill_slot(to, d, s->key, s->obj, s->hash);
+    clear_slot(from, s);
 }
 
 
-static void delete_from_bucket(mrp_htbl_t *ht, bucket_t *bucket, entry_t *entry)
+static void migrate(mrp_htbl_t *ht, size_t nslot)
 {
-    mrp_list_hook_t *eh = &entry->hook;
-
+    table_t *old;
+    size_t   mask;
+    slot_t  *s;
 
     /*
-     * If there is an iterator active and this entry would
-     * have been the next one to iterate over, we need to
-     * update the iterator to skip to the next entry instead
-     * as this one will be removed. Failing to update the
-     * iterator could crash mrp_htbl_foreach or drive it into
-     * an infinite loop.
+     * Move entries from the oldest table to the newest one, looking
+     * at no more than @nslot slots. Free the oldest table once it has
+     * been drained.
+     *
+     * We start right after a free slot and wrap around, so that every
+     * run of used slots, and with that every set of entries with equal
+     * keys, is moved over in probe order. This keeps duplicates in
+     * insertion order.
      */
 
-    if (ht->iter != NULL && ht->iter->en == eh)
-        ht->iter->en = eh->next;
+    while (ht->ntable > 1 && nslot > 0) {
+        old  = ht->tables;
+        mask = old->nslot - 1;
+
+        if (ht->migrated == 0)
+            for (ht->mstart = 0; old->slots[ht->mstart].state != SLOT_FREE;
+                 ht->mstart++)
+                ;
 
-    mrp_list_delete(eh);
+        while (old->nused > 0 && nslot > 0) {
+            s = old->slots + ((ht->mstart + ++ht->migrated) & mask);
+            nslot--;
 
+            if (s->state == SLOT_USED)
+                move_slot(ht, old, s);
+        }
+
+        if (old->nused == 0) {
+            mrp_free(old->slots);
+            memmove(ht->tables, ht->tables + 1,
+                    (ht->ntable - 1) * sizeof(*ht->tables));
+            ht->ntable--;
+            ht->migrated = 0;
+        }
+    }
+}
+
+
+static void migrate_key(mrp_htbl_t *ht, void *key, uint32_t hash)
+{
+    table_t *t;
+    slot_t  *s;
+    int      i;
 
     /*
-     * If the bucket became empty, unlink it from the used list.
-     * If also there is an iterator active and this bucket would
-     * have been the next one to iterate over, we need to
-     * update the iterator to skip to the next bucket instead
-     * as this one just became empty and will be removed from
-     * the used bucket list. Failing to update the iterator
-     * could drive mrp_htbl_foreach into an infinite loop
-     * because of the unexpected hop from the used bucket list
-     * (to a single empty bucket).
+     * Move all entries for @key to the newest table, oldest first.
+     * Used before inserting a new entry with the same key, so that
+     * it ends up behind all of them.
      */
 
-    if (mrp_list_empty(&bucket->entries)) {
-        if (ht->iter != NULL && ht->iter->bn == &bucket->used)
-                ht->iter->bn = bucket->used.next;
+    for (i = 0; i < ht->ntable - 1; i++) {
+        t = ht->tables + i;
 
-        mrp_list_delete(&bucket->used);
+        while ((s = find_slot(ht, t, key, hash)) != NULL)
+            move_slot(ht, t, s);
     }
 }
 
 
-void *mrp_htbl_remove(mrp_htbl_t *ht, void *key, int free)
+static inline void migrate_step(mrp_htbl_t *ht)
 {
-    bucket_t *bucket;
-    entry_t  *entry;
-    void     *object;
+    if (ht->ntable > 1 && ht->iter == NULL)
+        migrate(ht, MIGRATE_STEP);
+}
+
+
+static int resize(mrp_htbl_t *ht, size_t nslot)
+{
+    table_t *tables;
+
+    tables = mrp_realloc(ht->tables, (ht->ntable + 1) * sizeof(*ht->tables));
+
+    if (tables == NULL || !table_init(tables + ht->ntable, nslot))
+        return FALSE;
+
+    ht->ntable++;
+    migrate_step(ht);
+
+    return TRUE;
+}
+
+
+void mrp_htbl_reset(mrp_htbl_t *ht, int free)
+{
+    table_t *t;
+    slot_t  *s;
+    size_t   i;
+    int      j;
+
+    if (free && ht->free != NULL) {
+        for (j = 0; j < ht->ntable; j++) {
+            t = ht->tables + j;
+
+            for (i = 0, s = t->slots; i < t->nslot; i++, s++)
+                if (s->state == SLOT_USED)
+                    free_entry(ht, s->key, s->obj, free);
+        }
+    }
+
+    for (j = 0; j < ht->ntable; j++) {
+        t = ht->tables + j;
+
+        memset(t->slots, 0, t->nslot * sizeof(*t->slots));
+        t->nused    = 0;
+        t->ndeleted = 0;
+    }
+
+    ht->nentry = 0;
+
+    if (ht->iter != NULL)
+        ht->iter->busy = FALSE;
+    else
+        migrate(ht, (size_t)-1);
+}
+
+
+int mrp_htbl_insert(mrp_htbl_t *ht, void *key, void *object)
+{
+    uint32_t  hash = ht->hash(key);
+    table_t  *t;
+    slot_t   *s;
+
+    migrate_step(ht);
+
+    if (ht->ntable > 1 && ht->iter == NULL)
+        migrate_key(ht, key, hash);
 
     /*
-     * We need to check the found entry and its hash-bucket
-     * against any potentially active iterator. Special care
-     * needs to be taken if the entry is being iterated over
-     * or if the bucket becomes empty and it would be the next
-     * bucket to iterate over. The former is taken care of
-     * here while the latter is handled in delete_from_bucket.
+     * All entries end up in the newest table, so grow if it would not
+     * stay below 3/4 full with every entry of the older tables in it.
      */
-    if ((entry = lookup(ht, key, &bucket)) != NULL) {
-        delete_from_bucket(ht, bucket, entry);
-        object = entry->obj;
 
-        if (ht->iter != NULL && entry == ht->iter->entry) /* being iterated */
-            ht->iter->verdict = free ? MRP_HTBL_ITER_DELETE : 0;
+    t = newest_table(ht);
+
+    if ((ht->nentry + t->ndeleted + 1) * 4 > t->nslot * 3) {
+        if (resize(ht, calc_slots(ht->nentry + 1)))
+            t = newest_table(ht);
         else {
-            free_entry(ht, entry, free);
+            if (t->nused + t->ndeleted + 2 > t->nslot)
+                return FALSE;
         }
     }
+
+    s = free_slot(ht, t, key, hash);
+    fill_slot(t, s, key, object, hash);
+    ht->nentry++;
+
+    return TRUE;
+}
+
+
+static slot_t *lookup(mrp_htbl_t *ht, void *key, int *tidxp)
+{
+    uint32_t  hash = ht->hash(key);
+    slot_t   *s;
+    int       i;
+
+    migrate_step(ht);
+
+    for (i = 0; i < ht->ntable; i++) {
+        if ((s = find_slot(ht, ht->tables + i, key, hash)) != NULL) {
+            if (tidxp != NULL)
+                *tidxp = i;
+            return s;
+        }
+    }
+
+    return NULL;
+}
+
+
+void *mrp_htbl_lookup(mrp_htbl_t *ht, void *key)
+{
+    slot_t *s;
+
+    s = lookup(ht, key, NULL);
+    if (s != NULL)
+        return s->obj;
     else
-        object = NULL;
+        return NULL;
+}
+
+
+void *mrp_htbl_remove(mrp_htbl_t *ht, void *key, int free)
+{
+    iter_t  *iter = ht->iter;
+    table_t *t;
+    slot_t  *s;
+    void    *object;
+    int      tidx;
+
+    if ((s = lookup(ht, key, &tidx)) == NULL)
+        return NULL;
+
+    t      = ht->tables + tidx;
+    key    = s->key;
+    object = s->obj;
+
+    clear_slot(t, s);
+    ht->nentry--;
+
+    /*
+     * If the entry is being iterated over, leave freeing it to
+     * mrp_htbl_foreach once the callback has returned.
+     */
+
+    if (iter != NULL && iter->busy &&
+        iter->tidx == tidx && iter->sidx == (size_t)(s - t->slots)) {
+        iter->busy    = FALSE;
+        iter->verdict = free ? MRP_HTBL_ITER_DELETE : 0;
+    }
+    else
+        free_entry(ht, key, object, free);
+
+    /* shrink if the table became mostly empty */
+    if (iter == NULL && ht->ntable == 1 && t->nslot > ht->minslot &&
+        ht->nentry * 8 < t->nslot) {
+        resize(ht, MRP_MAX(calc_slots(ht->nentry), ht->minslot));
+    }
 
     return object;
 }
@@ -292,14 +556,19 @@ void *mrp_htbl_remove(mrp_htbl_t *ht, void *key, int free)
 
 int mrp_htbl_foreach(mrp_htbl_t *ht, mrp_htbl_iter_cb_t cb, void *user_data)
 {
-    iter_t    iter;
-    bucket_t *bucket;
-    entry_t  *entry;
-    int       cb_verdict, ht_verdict;
+    iter_t   iter;
+    table_t *t;
+    slot_t  *s;
+    int      cb_verdict;
 
     /*
      * Now we can only handle a single callback-based iterator.
      * If there is already one we're busy so just bail out.
+     *
+     * Entries do not move while the iterator is active and tables
+     * are only appended, so we can simply walk all slots of all
+     * tables by index. Entries inserted by the callback may or may
+     * not be visited.
      */
     if (ht->iter != NULL)
         return FALSE;
@@ -307,30 +576,46 @@ int mrp_htbl_foreach(mrp_htbl_t *ht, mrp_htbl_iter_cb_t cb, void *user_data)
     mrp_clear(&iter);
     ht->iter = &iter;
 
-    mrp_list_foreach(&ht->used, iter.bp, iter.bn) {
-        bucket = mrp_list_entry(iter.bp, bucket_t, used);
+    for (iter.tidx = 0; iter.tidx < ht->ntable; iter.tidx++) {
+        for (iter.sidx = 0; ; iter.sidx++) {
+            t = ht->tables + iter.tidx;
+
+            if (iter.sidx >= t->nslot)
+                break;
+
+            s = t->slots + iter.sidx;
 
-        mrp_list_foreach(&bucket->entries, iter.ep, iter.en) {
-            iter.entry = entry = mrp_list_entry(iter.ep, entry_t, hook);
-            cb_verdict = cb(entry->key, entry->obj, user_data);
-            ht_verdict = iter.verdict;
+            if (s->state != SLOT_USED)
+                continue;
+
+            iter.key     = s->key;
+            iter.obj     = s->obj;
+            iter.busy    = TRUE;
+            iter.verdict = 0;
+
+            cb_verdict = cb(iter.key, iter.obj, user_data);
 
             /* delete was called from cb (unhashed entry and marked it) */
-            if (ht_verdict & MRP_HTBL_ITER_DELETE) {
-                free_entry(ht, entry, TRUE);
-            }
+            if (iter.verdict & MRP_HTBL_ITER_DELETE)
+                free_entry(ht, iter.key, iter.obj, TRUE);
             else {
-                /* cb wants us to unhash (safe even if unhashed in remove) */
-                if (cb_verdict & MRP_HTBL_ITER_UNHASH)
-                    mrp_list_delete(iter.ep);
+                /* cb wants us to unhash (unless unhashed in remove) */
+                if ((cb_verdict & MRP_HTBL_ITER_UNHASH) && iter.busy) {
+                    t = ht->tables + iter.tidx;
+                    clear_slot(t, t->slots + iter.sidx);
+                    ht->nentry--;
+                }
                 /* cb want us to free entry (and remove was not called) */
-                if (cb_verdict & MRP_HTBL_ITER_DELETE)
-                    free_entry(ht, entry, TRUE);
-
-                /* cb wants to stop iterating */
-                if (!(cb_verdict & MRP_HTBL_ITER_MORE))
-                    goto out;
+                if ((cb_verdict & MRP_HTBL_ITER_DELETE) ==
+                    MRP_HTBL_ITER_DELETE)
+                    free_entry(ht, iter.key, iter.obj, TRUE);
             }
+
+            iter.busy = FALSE;
+
+            /* cb wants to stop iterating */
+            if (!(cb_verdict & MRP_HTBL_ITER_MORE))
+                goto out;
         }
     }
 
@@ -343,9 +628,10 @@ int mrp_htbl_foreach(mrp_htbl_t *ht, mrp_htbl_iter_cb_t cb, void *user_data)
 
 void *mrp_htbl_find(mrp_htbl_t *ht, mrp_htbl_find_cb_t cb, void *user_data)
 {
-    iter_t    iter;
-    bucket_t *bucket;
-    entry_t  *entry, *found;
+    iter_t   iter;
+    table_t *t;
+    slot_t  *s;
+    void    *found;
 
     /*
      * Bail out if there is also an iterator active...
@@ -357,14 +643,17 @@ void *mrp_htbl_find(mrp_htbl_t *ht, mrp_htbl_find_cb_t cb, void *user_data)
     ht->iter = &iter;
     found    = NULL;
 
-    mrp_list_foreach(&ht->used, iter.bp, iter.bn) {
-        bucket = mrp_list_entry(iter.bp, bucket_t, used);
+    for (iter.tidx = 0; iter.tidx < ht->ntable; iter.tidx++) {
+        for (iter.sidx = 0; ; iter.sidx++) {
+            t = ht->tables + iter.tidx;
+
+            if (iter.sidx >= t->nslot)
+                break;
 
-        mrp_list_foreach(&bucket->entries, iter.ep, iter.en) {
-            entry = mrp_list_entry(iter.ep, entry_t, hook);
+            s = t->slots + iter.sidx;
 
-            if (cb(entry->key, entry->obj, user_data)) {
-                found = entry->obj;
+            if (s->state == SLOT_USED && cb(s->key, s->obj, user_data)) {
+                found = s->obj;
                 goto out;
             }
         }
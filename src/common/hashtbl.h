@@ -56,7 +56,7 @@ typedef struct {
     mrp_htbl_comp_fn_t comp;                     /* comparison function */
     mrp_htbl_hash_fn_t hash;                     /* hash function */
     mrp_htbl_free_fn_t free;                     /* freeing function */
-    size_t             nbucket;                  /* number of buckets, or 0 */
+    size_t             nbucket;                  /* used if nentry is 0 */
 } mrp_htbl_config_t;
 
 
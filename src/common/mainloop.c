@@ -74,16 +74,21 @@ struct mrp_io_watch_s {
  */
 
 struct mrp_timer_s {
-    mrp_list_hook_t  hook;                       /* to list of timers */
+    mrp_list_hook_t  hook;                       /* unused, for deleted_t */
     mrp_list_hook_t  deleted;                    /* to list of pending delete */
     int            (*free)(void *ptr);           /* cb to free memory */
     mrp_mainloop_t  *ml;                         /* mainloop */
     unsigned int     msecs;                      /* timer interval */
+    unsigned int     slack;                      /* allowed delay, or 0 */
     uint64_t         expire;                     /* next expiration time */
+    int              idx;                        /* timer heap index, or -1 */
     mrp_timer_cb_t   cb;                         /* user callback */
     void            *user_data;                  /* opaque user data */
 };
 
+#define TIMER_HEAP_ARITY 4                       /* timer heap fan-out */
+#define TIMER_HEAP_MIN   16                      /* initial heap size */
+
 
 /*
  * deferred callbacks
@@ -218,8 +223,9 @@ struct mrp_mainloop_s {
     int                  niowatch;               /* number of I/O watches */
     mrp_io_event_t       iomode;                 /* default event trigger mode */
 
-    mrp_list_hook_t      timers;                 /* list of timers */
-    mrp_timer_t         *next_timer;             /* next expiring timer */
+    mrp_timer_t        **timers;                 /* timer heap */
+    int                  ntimer;                 /* number of timers in heap */
+    int                  ntimer_max;             /* allocated heap size */
 
     mrp_list_hook_t      deferred;               /* list of deferred cbs */
     mrp_list_hook_t      inactive_deferred;      /* inactive defferred cbs */
@@ -248,6 +254,17 @@ struct mrp_mainloop_s {
 };
 
 
+/*
+ * object pools
+ *
+ * Timers and deferred callbacks are typically created and deleted at a
+ * high rate so we allocate them from object pools instead of the heap.
+ */
+
+static mrp_objpool_t *timer_pool;                /* pool for timers */
+static mrp_objpool_t *deferred_pool;             /* pool for deferred cbs */
+
+
 static void dump_pollfds(const char *prefix, struct pollfd *fds, int nfd);
 static void adjust_superloop_timer(mrp_mainloop_t *ml);
 static size_t poll_events(void *id, mrp_mainloop_t *ml, void **bufp);
@@ -256,6 +273,24 @@ static size_t poll_events(void *id, mrp_mainloop_t *ml, void **bufp);
  * fd table manipulation
  */
 
+static void *pool_alloc(mrp_objpool_t **poolp, const char *name, size_t size)
+{
+    mrp_objpool_config_t cfg;
+
+    if (MRP_UNLIKELY(*poolp == NULL)) {
+        mrp_clear(&cfg);
+        cfg.name    = (char *)name;
+        cfg.objsize = size;
+        cfg.flags   = MRP_OBJPOOL_FLAG_ZERO;
+
+        if ((*poolp = mrp_objpool_create(&cfg)) == NULL)
+            return NULL;
+    }
+
+    return mrp_objpool_alloc(*poolp);
+}
+
+
 static int fd_cmp(const void *key1, const void *key2)
 {
     return key2 - key1;
@@ -625,72 +660,174 @@ static inline int usecs_to_msecs(uint64_t usecs)
 }
 
 
-static void insert_timer(mrp_timer_t *t)
+/*
+ * timer heap
+ *
+ * Active timers are kept in a 4-ary min-heap ordered by expiration time,
+ * so adding, modifying and removing a timer is O(log n) and the nearest
+ * timer is always found at the root. Deleting a timer only marks it, like
+ * for every other mainloop object. Deleted timers are popped off the heap
+ * lazily once they surface at the root, or when they are finally purged.
+ */
+
+static inline void heap_set(mrp_mainloop_t *ml, int idx, mrp_timer_t *t)
 {
-    mrp_mainloop_t  *ml = t->ml;
-    mrp_list_hook_t *p, *n;
-    mrp_timer_t     *t1, *next;
-    int              inserted;
+    ml->timers[idx] = t;
+    t->idx = idx;
+}
 
-    /*
-     * Notes:
-     *     If there is ever a need to run a large number of
-     *     simultaneous timers, we need to change this to a
-     *     self-balancing data structure, eg. an red-black tree.
-     */
 
-    inserted = FALSE;
-    next     = NULL;
-    mrp_list_foreach(&ml->timers, p, n) {
-        t1 = mrp_list_entry(p, mrp_timer_t, hook);
+static void heap_up(mrp_mainloop_t *ml, int idx)
+{
+    mrp_timer_t *t = ml->timers[idx];
+    mrp_timer_t *p;
+    int          parent;
 
-        if (!is_deleted(t1)) {
-            if (t->expire <= t1->expire) {
-                mrp_list_prepend(p->prev, &t->hook);
-                inserted = TRUE;
-                break;
-            }
-            if (next == NULL)
-                next = t1;
-        }
+    while (idx > 0) {
+        parent = (idx - 1) / TIMER_HEAP_ARITY;
+        p      = ml->timers[parent];
+
+        if (p->expire <= t->expire)
+            break;
+
+        heap_set(ml, idx, p);
+        idx = parent;
     }
 
-    if (!inserted)
-        mrp_list_append(&ml->timers, &t->hook);
+    heap_set(ml, idx, t);
+}
+
 
-    if (next)
-        ml->next_timer = next;
-    else {
-        ml->next_timer = t;
-        adjust_superloop_timer(ml);
+static void heap_down(mrp_mainloop_t *ml, int idx)
+{
+    mrp_timer_t *t = ml->timers[idx];
+    mrp_timer_t *c;
+    int          child, last, min, i;
+
+    while ((child = idx * TIMER_HEAP_ARITY + 1) < ml->ntimer) {
+        last = MRP_MIN(child + TIMER_HEAP_ARITY, ml->ntimer);
+        min  = child;
+
+        for (i = child + 1; i < last; i++)
+            if (ml->timers[i]->expire < ml->timers[min]->expire)
+                min = i;
+
+        c = ml->timers[min];
+
+        if (t->expire <= c->expire)
+            break;
+
+        heap_set(ml, idx, c);
+        idx = min;
     }
+
+    heap_set(ml, idx, t);
 }
 
 
-static inline void rearm_timer(mrp_timer_t *t)
+static int heap_insert(mrp_mainloop_t *ml, mrp_timer_t *t)
 {
-    mrp_list_delete(&t->hook);
-    t->expire = time_now() + t->msecs * USECS_PER_MSEC;
-    insert_timer(t);
+    int size;
+
+    if (ml->ntimer >= ml->ntimer_max) {
+        size = ml->ntimer_max ? 2 * ml->ntimer_max : TIMER_HEAP_MIN;
+
+        if (mrp_reallocz(ml->timers, ml->ntimer_max, size) == NULL)
+            return FALSE;
+
+        ml->ntimer_max = size;
+    }
+
+    heap_set(ml, ml->ntimer++, t);
+    heap_up(ml, t->idx);
+
+    return TRUE;
 }
 
 
-static mrp_timer_t *find_next_timer(mrp_mainloop_t *ml)
+static void heap_remove(mrp_mainloop_t *ml, mrp_timer_t *t)
 {
-    mrp_list_hook_t *p, *n;
-    mrp_timer_t     *t = NULL;
+    mrp_timer_t *last;
+    int          idx;
 
-    mrp_list_foreach(&ml->timers, p, n) {
-        t = mrp_list_entry(p, typeof(*t), hook);
+    if ((idx = t->idx) < 0)
+        return;
 
-        if (!is_deleted(t))
-            break;
-        else
-            t = NULL;
+    t->idx = -1;
+    last   = ml->timers[--ml->ntimer];
+    ml->timers[ml->ntimer] = NULL;
+
+    if (last == t)
+        return;
+
+    heap_set(ml, idx, last);
+
+    if (last->expire < t->expire)
+        heap_up(ml, idx);
+    else
+        heap_down(ml, idx);
+}
+
+
+static inline void heap_update(mrp_mainloop_t *ml, mrp_timer_t *t)
+{
+    heap_up(ml, t->idx);
+    heap_down(ml, t->idx);
+}
+
+
+static uint64_t timer_expiry(mrp_timer_t *t, uint64_t now)
+{
+    uint64_t expire, slack;
+
+    /*
+     * A timer with slack may fire up to slack msecs late. We round its
+     * expiration up to the nearest multiple of the slack so that timers
+     * with similar slack coalesce to a single wakeup of the mainloop.
+     */
+
+    expire = now + (uint64_t)t->msecs * USECS_PER_MSEC;
+
+    if (t->slack != 0) {
+        slack  = (uint64_t)t->slack * USECS_PER_MSEC;
+        expire = ((expire + slack - 1) / slack) * slack;
     }
 
-    ml->next_timer = t;
-    return t;
+    return expire;
+}
+
+
+static mrp_timer_t *next_timer(mrp_mainloop_t *ml)
+{
+    while (ml->ntimer > 0 && is_deleted(ml->timers[0]))
+        heap_remove(ml, ml->timers[0]);
+
+    return ml->ntimer > 0 ? ml->timers[0] : NULL;
+}
+
+
+static int insert_timer(mrp_timer_t *t)
+{
+    mrp_mainloop_t *ml = t->ml;
+
+    if (t->idx < 0) {
+        if (!heap_insert(ml, t))
+            return FALSE;
+    }
+    else
+        heap_update(ml, t);
+
+    if (next_timer(ml) == t)
+        adjust_superloop_timer(ml);
+
+    return TRUE;
+}
+
+
+static inline void rearm_timer(mrp_timer_t *t)
+{
+    t->expire = timer_expiry(t, time_now());
+    insert_timer(t);
 }
 
 
@@ -698,7 +835,8 @@ static int free_timer(void *ptr)
 {
     mrp_timer_t *t = (mrp_timer_t *)ptr;
 
-    mrp_free(t);
+    heap_remove(t->ml, t);
+    mrp_objpool_free(t);
 
     return TRUE;
 }
@@ -713,17 +851,21 @@ mrp_timer_t *mrp_add_timer(mrp_mainloop_t *ml, unsigned int msecs,
     if (cb == NULL)
         return NULL;
 
-    if ((t = mrp_allocz(sizeof(*t))) != NULL) {
+    if ((t = pool_alloc(&timer_pool, "timer", sizeof(*t))) != NULL) {
         mrp_list_init(&t->hook);
         mrp_list_init(&t->deleted);
         t->ml        = ml;
-        t->expire    = time_now() + msecs * USECS_PER_MSEC;
         t->msecs     = msecs;
+        t->expire    = timer_expiry(t, time_now());
+        t->idx       = -1;
         t->cb        = cb;
         t->user_data = user_data;
         t->free      = free_timer;
 
-        insert_timer(t);
+        if (!insert_timer(t)) {
+            mrp_objpool_free(t);
+            t = NULL;
+        }
     }
 
     return t;
@@ -741,26 +883,44 @@ void mrp_mod_timer(mrp_timer_t *t, unsigned int msecs)
 }
 
 
+void mrp_set_timer_slack(mrp_timer_t *t, unsigned int msecs)
+{
+    uint64_t slack;
+
+    if (t != NULL && !is_deleted(t)) {
+        t->slack = msecs;
+
+        if (msecs != 0) {
+            slack     = (uint64_t)msecs * USECS_PER_MSEC;
+            t->expire = ((t->expire + slack - 1) / slack) * slack;
+            insert_timer(t);
+        }
+    }
+}
+
+
 void mrp_del_timer(mrp_timer_t *t)
 {
+    mrp_mainloop_t *ml;
+
     /*
      * Notes: It is not safe to simply free this entry here as we might
      *        be dispatching with this entry being the next to process.
-     *        We check for this and if it is not the case we relink this
-     *        to the list of deleted items which will be then processed
-     *        at end of the mainloop iteration. Otherwise we only mark the
-     *        this entry for deletion and the rest will be taken care of in
-     *        dispatch_timers().
+     *        We only mark the entry deleted and link it to the list of
+     *        deleted items which will be then processed at end of the
+     *        mainloop iteration. The entry is left in the timer heap
+     *        until it either bubbles up to the top or gets purged.
      */
 
     if (t != NULL && !is_deleted(t)) {
         mrp_debug("marking timer %p deleted", t);
 
+        ml = t->ml;
         mark_deleted(t);
 
-        if (t->ml->next_timer == t) {
-            find_next_timer(t->ml);
-            adjust_superloop_timer(t->ml);
+        if (t->idx == 0) {
+            next_timer(ml);
+            adjust_superloop_timer(ml);
         }
     }
 }
@@ -776,6 +936,14 @@ mrp_mainloop_t *mrp_get_timer_mainloop(mrp_timer_t *t)
  * deferred/idle callbacks
  */
 
+static int free_deferred(void *ptr)
+{
+    mrp_objpool_free(ptr);
+
+    return TRUE;
+}
+
+
 mrp_deferred_t *mrp_add_deferred(mrp_mainloop_t *ml, mrp_deferred_cb_t cb,
                                  void *user_data)
 {
@@ -784,12 +952,13 @@ mrp_deferred_t *mrp_add_deferred(mrp_mainloop_t *ml, mrp_deferred_cb_t cb,
     if (cb == NULL)
         return NULL;
 
-    if ((d = mrp_allocz(sizeof(*d))) != NULL) {
+    if ((d = pool_alloc(&deferred_pool, "deferred", sizeof(*d))) != NULL) {
         mrp_list_init(&d->hook);
         mrp_list_init(&d->deleted);
         d->ml        = ml;
         d->cb        = cb;
         d->user_data = user_data;
+        d->free      = free_deferred;
 
         mrp_list_append(&ml->deferred, &d->hook);
     }
@@ -1374,15 +1543,19 @@ static void purge_io_watches(mrp_mainloop_t *ml)
 
 static void purge_timers(mrp_mainloop_t *ml)
 {
-    mrp_list_hook_t *p, *n;
-    mrp_timer_t     *t;
+    mrp_timer_t *t;
+    int          i;
 
-    mrp_list_foreach(&ml->timers, p, n) {
-        t = mrp_list_entry(p, typeof(*t), hook);
-        mrp_list_delete(&t->hook);
+    for (i = 0; i < ml->ntimer; i++) {
+        t = ml->timers[i];
         mrp_list_delete(&t->deleted);
-        mrp_free(t);
+        mrp_objpool_free(t);
     }
+
+    mrp_free(ml->timers);
+    ml->timers     = NULL;
+    ml->ntimer     = 0;
+    ml->ntimer_max = 0;
 }
 
 
@@ -1395,14 +1568,14 @@ static void purge_deferred(mrp_mainloop_t *ml)
         d = mrp_list_entry(p, typeof(*d), hook);
         mrp_list_delete(&d->hook);
         mrp_list_delete(&d->deleted);
-        mrp_free(d);
+        mrp_objpool_free(d);
     }
 
     mrp_list_foreach(&ml->inactive_deferred, p, n) {
         d = mrp_list_entry(p, typeof(*d), hook);
         mrp_list_delete(&d->hook);
         mrp_list_delete(&d->deleted);
-        mrp_free(d);
+        mrp_objpool_free(d);
     }
 }
 
@@ -1484,7 +1657,6 @@ mrp_mainloop_t *mrp_mainloop_create(void)
 
         if (ml->epollfd >= 0 && ml->fdtbl != NULL) {
             mrp_list_init(&ml->iowatches);
-            mrp_list_init(&ml->timers);
             mrp_list_init(&ml->deferred);
             mrp_list_init(&ml->inactive_deferred);
             mrp_list_init(&ml->sighandlers);
@@ -1701,41 +1873,33 @@ static int prepare_subloops(mrp_mainloop_t *ml)
 #if 0
 static inline void dump_timers(mrp_mainloop_t *ml)
 {
-    mrp_timer_t     *t;
-    mrp_list_hook_t *p, *n;
-    int              i;
-    mrp_timer_t     *next = NULL;
+    mrp_timer_t *t, *p;
+    int          i;
 
     mrp_debug("timer dump:");
-    i = 0;
-    mrp_list_foreach(&ml->timers, p, n) {
-        t = mrp_list_entry(p, typeof(*t), hook);
+    for (i = 0; i < ml->ntimer; i++) {
+        t = ml->timers[i];
 
         mrp_debug("  #%d: %p, @%u, next %llu (%s)", i, t, t->msecs, t->expire,
                   is_deleted(t) ? "DEAD" : "alive");
 
-        if (!is_deleted(t) && next == NULL)
-            next = t;
+        p = i > 0 ? ml->timers[(i - 1) / TIMER_HEAP_ARITY] : NULL;
 
-        i++;
+        if (t->idx != i || (p != NULL && p->expire > t->expire)) {
+            mrp_debug("*** BUG timer heap is corrupted at #%d !!! ***", i);
+            if (getenv("__MURPHY_TIMER_CHECK_ABORT") != NULL)
+                abort();
+        }
     }
 
-    mrp_debug("next timer: %p", ml->next_timer);
     mrp_debug("poll timer: %d", ml->poll_timeout);
-
-    if (next != NULL && ml->next_timer != NULL &&
-        !is_deleted(ml->next_timer) && next != ml->next_timer) {
-        mrp_debug("*** BUG ml->next_timer is not the nearest !!! ***");
-        if (getenv("__MURPHY_TIMER_CHECK_ABORT") != NULL)
-            abort();
-    }
 }
 #endif
 
 
 int mrp_mainloop_prepare(mrp_mainloop_t *ml)
 {
-    mrp_timer_t *next_timer;
+    mrp_timer_t *next;
     int          timeout, ext_timeout;
     uint64_t     now;
 
@@ -1743,16 +1907,16 @@ int mrp_mainloop_prepare(mrp_mainloop_t *ml)
         timeout = 0;
     }
     else {
-        next_timer = ml->next_timer;
+        next = next_timer(ml);
 
-        if (next_timer == NULL)
+        if (next == NULL)
             timeout = -1;
         else {
             now = time_now();
-            if (MRP_UNLIKELY(next_timer->expire <= now))
+            if (MRP_UNLIKELY(next->expire <= now))
                 timeout = 0;
             else
-                timeout = usecs_to_msecs(next_timer->expire - now);
+                timeout = usecs_to_msecs(next->expire - now);
         }
     }
 
@@ -1957,29 +2121,29 @@ static void dispatch_deferred(mrp_mainloop_t *ml)
 
 static void dispatch_timers(mrp_mainloop_t *ml)
 {
-    mrp_list_hook_t *p, *n;
-    mrp_timer_t     *t;
-    uint64_t         now;
+    mrp_timer_t *t;
+    uint64_t     now;
 
     now = time_now();
 
-    mrp_list_foreach(&ml->timers, p, n) {
-        t = mrp_list_entry(p, typeof(*t), hook);
+    while ((t = next_timer(ml)) != NULL && t->expire <= now) {
+        mrp_debug("dispatching expired timer %p", t);
 
-        if (!is_deleted(t)) {
-            if (t->expire <= now) {
-                mrp_debug("dispatching expired timer %p", t);
+        t->cb(t, t->user_data);
+
+        /*
+         * Notes: A timer rearmed with a 0 timeout might still appear to
+         *        be expired. Push it beyond now to dispatch it only once.
+         */
 
-                t->cb(t, t->user_data);
+        if (!is_deleted(t)) {
+            rearm_timer(t);
 
-                if (!is_deleted(t))
-                    rearm_timer(t);
+            if (t->expire <= now) {
+                t->expire = now + 1;
+                heap_update(ml, t);
             }
-            else
-                break;
         }
-        else
-            mrp_debug("skipping deleted timer %p", t);
 
         if (ml->quit)
             break;
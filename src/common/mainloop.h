@@ -99,6 +99,9 @@ mrp_timer_t *mrp_add_timer(mrp_mainloop_t *ml, unsigned int msecs,
 #define MRP_TIMER_RESTART (unsigned int)-1
 void mrp_mod_timer(mrp_timer_t *t, unsigned int msecs);
 
+/** Let the timer fire up to @msecs late to coalesce it with others. */
+void mrp_set_timer_slack(mrp_timer_t *t, unsigned int msecs);
+
 /** Delete a timer. */
 void mrp_del_timer(mrp_timer_t *t);
 
@@ -868,6 +868,8 @@ static void chunk_foreach_object(pool_chunk_t *chunk,
                                  void (*cb)(void *obj, void *user_data),
                                  void *user_data);
 
+static MRP_LIST_HOOK(pools);                     /* all object pools */
+
 
 /*
  * an object pool
@@ -879,17 +881,19 @@ struct mrp_objpool_s {
     size_t            objsize;                   /* size of a single object */
     size_t            prealloc;                  /* preallocate this many */
     size_t            nobj;                      /* currently allocated */
+    size_t            nmax;                      /* high-water mark */
     int             (*setup)(void *);            /* object setup callback */
     void            (*cleanup)(void *);          /* object cleanup callback */
     uint32_t          flags;                     /* pool flags */
     int               poison;                    /* poisoning pattern */
 
     size_t            nperchunk;                 /* objects per chunk */
-    size_t            dataidx;                   /* data  */
+    size_t            dataoffs;                  /* offset of first object */
     mrp_list_hook_t   space;                     /* chunk with frees slots */
     size_t            nspace;                    /* number of such chunks */
     mrp_list_hook_t   full;                      /* fully allocated chunks */
     size_t            nfull;                     /* number of such chunks */
+    mrp_list_hook_t   hook;                      /* to list of all pools */
 };
 
 
@@ -911,6 +915,10 @@ mrp_objpool_t *mrp_objpool_create(mrp_objpool_config_t *cfg)
     mrp_objpool_t *pool;
 
     if ((pool = mrp_allocz(sizeof(*pool))) != NULL) {
+        mrp_list_init(&pool->space);
+        mrp_list_init(&pool->full);
+        mrp_list_init(&pool->hook);
+
         if ((pool->name = mrp_strdup(cfg->name)) == NULL)
             goto fail;
 
@@ -922,17 +930,14 @@ mrp_objpool_t *mrp_objpool_create(mrp_objpool_config_t *cfg)
         pool->flags    = cfg->flags;
         pool->poison   = cfg->poison;
 
-        mrp_list_init(&pool->space);
-        mrp_list_init(&pool->full);
-        pool->nspace = 0;
-        pool->nfull  = 0;
-
         if (!pool_calc_sizes(pool))
             goto fail;
 
         if (!mrp_objpool_grow(pool, pool->prealloc))
             goto fail;
 
+        mrp_list_append(&pools, &pool->hook);
+
         mrp_debug("pool <%s> created, with %zd/%zd objects.", pool->name,
                   pool->prealloc, pool->limit);
 
@@ -957,10 +962,26 @@ static void free_object(void *obj, void *user_data)
 
 void mrp_objpool_destroy(mrp_objpool_t *pool)
 {
+    mrp_list_hook_t *p, *n;
+    pool_chunk_t    *chunk;
+
     if (pool != NULL) {
         if (pool->cleanup != NULL)
             pool_foreach_object(pool, free_object, pool);
 
+        mrp_list_foreach(&pool->full, p, n) {
+            chunk = mrp_list_entry(p, pool_chunk_t, hook);
+            mrp_list_delete(&chunk->hook);
+            chunk_free(chunk);
+        }
+
+        mrp_list_foreach(&pool->space, p, n) {
+            chunk = mrp_list_entry(p, pool_chunk_t, hook);
+            mrp_list_delete(&chunk->hook);
+            chunk_free(chunk);
+        }
+
+        mrp_list_delete(&pool->hook);
         mrp_free(pool->name);
         mrp_free(pool);
     }
@@ -1001,15 +1022,15 @@ void *mrp_objpool_alloc(mrp_objpool_t *pool)
         uidx--;
 
     sidx = cidx * MASK_BITS + uidx;
-    obj  = ((void *)&chunk->used[pool->dataidx]) + (sidx * pool->objsize);
+    obj  = ((void *)chunk) + pool->dataoffs + (sidx * pool->objsize);
 
     mrp_debug("%p: %u/%u: %u, offs %zd\n", obj, cidx, uidx, sidx,
               sidx * pool->objsize);
 
-    chunk->used[cidx] &= ~(1 << uidx);
+    chunk->used[cidx] &= ~((mask_t)1 << uidx);
 
     if (chunk->used[cidx] == MASK_FULL) {
-        chunk->cache &= ~(1 << cidx);
+        chunk->cache &= ~((mask_t)1 << cidx);
 
         if (chunk->cache == MASK_FULL) {          /* chunk exhausted */
             mrp_list_delete(&chunk->hook);
@@ -1019,10 +1040,14 @@ void *mrp_objpool_alloc(mrp_objpool_t *pool)
         }
     }
 
-    if (pool->setup == NULL || pool->setup(obj)) {
-        pool->nobj++;
+    if (pool->flags & MRP_OBJPOOL_FLAG_ZERO)
+        memset(obj, 0, pool->objsize);
+
+    if (++pool->nobj > pool->nmax)
+        pool->nmax = pool->nobj;
+
+    if (pool->setup == NULL || pool->setup(obj))
         return obj;
-    }
     else {
         mrp_objpool_free(obj);
         return NULL;
@@ -1044,7 +1069,7 @@ void mrp_objpool_free(void *obj)
     chunk = (pool_chunk_t *)(((ptrdiff_t)obj) & ~(__mm.chunk_size - 1));
     pool  = chunk->pool;
 
-    base = (void *)&chunk->used[pool->dataidx];
+    base = ((void *)chunk) + pool->dataoffs;
     sidx = (obj - base) / pool->objsize;
     cidx = sidx / MASK_BITS;
     uidx = sidx & (MASK_BITS - 1);
@@ -1055,7 +1080,7 @@ void mrp_objpool_free(void *obj)
     cache = chunk->cache;
     used  = chunk->used[cidx];
 
-    if (used & (1 << uidx)) {
+    if (used & ((mask_t)1 << uidx)) {
         mrp_log_error("Trying to free unallocated object %p of pool <%s>.",
                       obj, pool->name);
         return;
@@ -1067,8 +1092,8 @@ void mrp_objpool_free(void *obj)
     if (pool->flags & MRP_OBJPOOL_FLAG_POISON)
         memset(obj, pool->poison, pool->objsize);
 
-    chunk->used[cidx] |= (1 << uidx);
-    chunk->cache      |= (1 << cidx);
+    chunk->used[cidx] |= ((mask_t)1 << uidx);
+    chunk->cache      |= ((mask_t)1 << cidx);
 
     if (cache == MASK_FULL) {                    /* chunk was full */
         mrp_list_delete(&chunk->hook);
@@ -1097,6 +1122,38 @@ int mrp_objpool_shrink(mrp_objpool_t *pool, int nobj)
 }
 
 
+void mrp_objpool_stats(mrp_objpool_t *pool, mrp_objpool_stats_t *stats)
+{
+    stats->name      = pool->name;
+    stats->objsize   = pool->objsize;
+    stats->nperchunk = pool->nperchunk;
+    stats->nobj      = pool->nobj;
+    stats->nmax      = pool->nmax;
+    stats->nchunk    = pool->nspace + pool->nfull;
+    stats->nfull     = pool->nfull;
+}
+
+
+int mrp_objpool_get_stats(mrp_objpool_stats_t *stats, int size)
+{
+    mrp_list_hook_t *p, *n;
+    mrp_objpool_t   *pool;
+    int              cnt;
+
+    cnt = 0;
+    mrp_list_foreach(&pools, p, n) {
+        pool = mrp_list_entry(p, mrp_objpool_t, hook);
+
+        if (cnt < size)
+            mrp_objpool_stats(pool, stats + cnt);
+
+        cnt++;
+    }
+
+    return cnt;
+}
+
+
 static int pool_calc_sizes(mrp_objpool_t *pool)
 {
     size_t S, C, Hf, Hv, P;
@@ -1151,6 +1208,10 @@ static int pool_calc_sizes(mrp_objpool_t *pool)
 
     S  = MRP_ALIGN(pool->objsize, MRP_MM_ALIGN);
     n  = (B * C - B * Hf - W * (2*B - 1)) / (B * S + W);
+
+    if (n > B * B)                               /* cache word is the limit */
+        n = B * B;
+
     Hv = W + W * (n + B - 1) / B;
 
     P = (Hf + Hv) % sizeof(void *);
@@ -1171,7 +1232,8 @@ static int pool_calc_sizes(mrp_objpool_t *pool)
     }
 
     pool->nperchunk = n;
-    pool->dataidx   = (n + B - 1) / B;
+    pool->dataoffs  = MRP_ALIGN(MRP_OFFSET(pool_chunk_t, used[(n + B - 1) / B]),
+                                MRP_MM_ALIGN);
 
     if (pool->limit && (pool->limit % pool->nperchunk) != 0)
         pool->limit += (pool->nperchunk - (pool->limit % pool->nperchunk));
@@ -1260,8 +1322,8 @@ static void chunk_foreach_object(pool_chunk_t *chunk,
         uidx = sidx & (MASK_BITS - 1);
         used = chunk->used[cidx];
 
-        if (!(used & (1 << uidx))) {
-            obj = ((void *)&chunk->used[pool->dataidx]) + (sidx*pool->objsize);
+        if (!(used & ((mask_t)1 << uidx))) {
+            obj = ((void *)chunk) + pool->dataoffs + (sidx * pool->objsize);
             cb(obj, user_data);
             sidx++;
         }
@@ -1275,19 +1337,30 @@ static void chunk_foreach_object(pool_chunk_t *chunk,
 }
 
 
+static inline mask_t cache_mask(int nperchunk)
+{
+    int nword = (nperchunk + MASK_BITS - 1) / MASK_BITS;
+
+    if (nword >= (int)MASK_BITS)
+        return MASK_EMPTY;
+    else
+        return ((mask_t)1 << nword) - 1;
+}
+
+
 static inline int chunk_empty(pool_chunk_t *chunk)
 {
     mask_t mask;
     int    i, n;
 
-    if (chunk->cache != (MASK_EMPTY & 0xffff))
+    if (chunk->cache != cache_mask(chunk->pool->nperchunk))
         return FALSE;
     else {
         for (n = chunk->pool->nperchunk, i = 0; n > 0; n -= MASK_BITS, i++) {
             if (n >= (int)MASK_BITS)
                 mask = MASK_EMPTY;
             else
-                mask = (1 << n) - 1;
+                mask = ((mask_t)1 << n) - 1;
 
             if ((chunk->used[i] & mask) != mask)
                 return FALSE;
@@ -1300,12 +1373,11 @@ static inline int chunk_empty(pool_chunk_t *chunk)
 
 static void chunk_init(pool_chunk_t *chunk, int nperchunk)
 {
-    int nword, left, i;
+    int left, i;
 
     mrp_list_init(&chunk->hook);
 
-    left  = nperchunk;
-    nword = (nperchunk + MASK_BITS - 1) / MASK_BITS;
+    left = nperchunk;
 
     /*
      * initialize allocation bitmask
@@ -1315,7 +1387,7 @@ static void chunk_init(pool_chunk_t *chunk, int nperchunk)
      * code paths simpler.
      */
 
-    chunk->cache = (1 << nword) - 1;
+    chunk->cache = cache_mask(nperchunk);
 
     for (i = 0; left > 0; i++) {
         if (left >= (int)MASK_BITS)
@@ -127,6 +127,7 @@ void mrp_mm_free(void *ptr, const char *file, int line, const char *func);
 
 enum {
     MRP_OBJPOOL_FLAG_POISON = 0x1,               /* poison free'd objects */
+    MRP_OBJPOOL_FLAG_ZERO   = 0x2,               /* zero allocated objects */
 };
 
 
@@ -148,6 +149,21 @@ typedef struct {
 
 typedef struct mrp_objpool_s mrp_objpool_t;
 
+
+/*
+ * object pool usage statistics
+ */
+
+typedef struct {
+    const char *name;                            /* verbose pool name */
+    size_t      objsize;                         /* (aligned) object size */
+    size_t      nperchunk;                       /* objects per chunk */
+    size_t      nobj;                            /* currently allocated */
+    size_t      nmax;                            /* high-water mark */
+    size_t      nchunk;                          /* number of chunks */
+    size_t      nfull;                           /* fully allocated chunks */
+} mrp_objpool_stats_t;
+
 /** Create a new object pool with the given configuration. */
 mrp_objpool_t *mrp_objpool_create(mrp_objpool_config_t *cfg);
 
@@ -166,6 +182,12 @@ int mrp_objpool_grow(mrp_objpool_t *pool, int nobj);
 /** Shrink @pool by @nobj new objects, if possible. */
 int mrp_objpool_shrink(mrp_objpool_t *pool, int nobj);
 
+/** Get the usage statistics of @pool. */
+void mrp_objpool_stats(mrp_objpool_t *pool, mrp_objpool_stats_t *stats);
+
+/** Get the statistics of at most @size pools, return the number of pools. */
+int mrp_objpool_get_stats(mrp_objpool_stats_t *stats, int size);
+
 /** Get the value of a boolean key from the configuration. */
 int mrp_mm_config_bool(const char *key, int defval);
 
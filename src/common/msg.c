@@ -46,250 +46,296 @@ static mrp_data_descr_t **other_types;   /* linearly searched types */
 static int                nother_type;
 
 
-static inline void destroy_field(mrp_msg_field_t *f)
+/*
+ * message storage
+ *
+ * The fields of a message are kept in a contiguous array, indexed in
+ * the order they were added to the message. Strings, blobs and arrays
+ * are stored in a per-message arena, a list of chunks which is only
+ * ever freed as a whole together with the message. The message itself,
+ * a small initial field array and the first arena chunk are allocated
+ * in a single block, so a typical message takes just one allocation.
+ *
+ * Larger messages get a sorted tag index for looking up fields, built
+ * on demand and invalidated whenever the set of fields changes.
+ */
+
+#define MSG_NFIELD     8                 /* initial number of fields */
+#define MSG_GROW      32                 /* first growth of fields */
+#define MSG_ARENA    256                 /* initial arena size */
+#define MSG_INDEXED   16                 /* index messages this big */
+#define MSG_PROBE      8                 /* scan this far before indexing */
+
+struct mrp_msg_chunk_s {
+    mrp_msg_chunk_t *next;               /* next (older) chunk */
+    size_t           size;               /* usable size of this chunk */
+    size_t           used;               /* amount used up */
+    char             data[0];            /* chunk data */
+};
+
+
+static mrp_msg_t *msg_alloc(size_t nfield, size_t arena)
 {
-    uint32_t i;
+    mrp_msg_t       *msg;
+    mrp_msg_chunk_t *chunk;
 
-    if (f != NULL) {
-        mrp_list_delete(&f->hook);
+    arena = MRP_ALIGN(arena, MRP_MM_ALIGN);
+    msg   = mrp_alloc(sizeof(*msg) + nfield * sizeof(msg->fields[0]) +
+                      sizeof(*chunk) + arena);
 
-        switch (f->type) {
-        case MRP_MSG_FIELD_STRING:
-            mrp_free(f->str);
-            break;
+    if (msg == NULL)
+        return NULL;
 
-        case MRP_MSG_FIELD_BLOB:
-            mrp_free(f->blb);
-            break;
+    msg->fields = (mrp_msg_field_t *)(msg + 1);
+    msg->nfield = 0;
+    msg->nalloc = nfield;
+    msg->buf    = NULL;
+    msg->index  = NULL;
+    msg->nindex = 0;
+    mrp_refcnt_init(&msg->refcnt);
 
-        default:
-            if (f->type & MRP_MSG_FIELD_ARRAY) {
-                if ((f->type & ~MRP_MSG_FIELD_ARRAY) == MRP_MSG_FIELD_STRING) {
-                    for (i = 0; i < f->size[0]; i++) {
-                        mrp_free(f->astr[i]);
-                    }
-                }
+    chunk = (mrp_msg_chunk_t *)(msg->fields + nfield);
+    chunk->next = NULL;
+    chunk->size = arena;
+    chunk->used = 0;
+    msg->chunks = chunk;
 
-                mrp_free(f->aany);
-            }
-            break;
+    return msg;
+}
+
+
+static void msg_destroy(mrp_msg_t *msg)
+{
+    mrp_msg_chunk_t *chunk;
+
+    if (msg != NULL) {
+        /* the oldest chunk and the initial fields are part of msg */
+        while ((chunk = msg->chunks)->next != NULL) {
+            msg->chunks = chunk->next;
+            mrp_free(chunk);
         }
 
-        mrp_free(f);
+        if (msg->fields != (mrp_msg_field_t *)(msg + 1))
+            mrp_free(msg->fields);
+
+        mrp_free(msg->index);
+        mrp_rcvbuf_unref(msg->buf);
+        mrp_free(msg);
     }
 }
 
 
-static inline mrp_msg_field_t *create_field(uint16_t tag, va_list *ap)
+static void *arena_alloc(mrp_msg_t *msg, size_t size)
 {
-    mrp_msg_field_t *f;
-    uint16_t         type, base;
-    uint32_t         size;
-    void            *blb;
+    mrp_msg_chunk_t *chunk = msg->chunks;
+    size_t           csize;
+    void            *ptr;
+
+    size = MRP_ALIGN(size, MRP_MM_ALIGN);
+
+    if (chunk->size - chunk->used < size) {
+        csize = MRP_MAX(2 * chunk->size, (size_t)MSG_ARENA);
+
+        if (csize < size)
+            csize = size;
+
+        if ((chunk = mrp_alloc(sizeof(*chunk) + csize)) == NULL)
+            return NULL;
+
+        chunk->next = msg->chunks;
+        chunk->size = csize;
+        chunk->used = 0;
+        msg->chunks = chunk;
+    }
+
+    ptr = chunk->data + chunk->used;
+    chunk->used += size;
+
+    return ptr;
+}
+
+
+static void *arena_copy(mrp_msg_t *msg, const void *data, size_t size)
+{
+    void *ptr;
+
+    if ((ptr = arena_alloc(msg, size)) != NULL && size > 0)
+        memcpy(ptr, data, size);
+
+    return ptr;
+}
+
+
+static inline char *arena_strdup(mrp_msg_t *msg, const char *str)
+{
+    return arena_copy(msg, str, strlen(str) + 1);
+}
+
+
+static int reserve_fields(mrp_msg_t *msg, size_t n)
+{
+    mrp_msg_field_t *fields;
+    size_t           nalloc;
+
+    if (msg->nfield + n <= msg->nalloc)
+        return TRUE;
+
+    nalloc = MRP_MAX(2 * msg->nalloc, (size_t)MSG_GROW);
+
+    if (nalloc < msg->nfield + n)
+        nalloc = msg->nfield + n;
+
+    if (msg->fields == (mrp_msg_field_t *)(msg + 1)) {
+        fields = mrp_alloc_array(mrp_msg_field_t, nalloc);
+
+        if (fields != NULL)
+            memcpy(fields, msg->fields, msg->nfield * sizeof(fields[0]));
+    }
+    else
+        fields = mrp_realloc(msg->fields, nalloc * sizeof(fields[0]));
+
+    if (fields == NULL)
+        return FALSE;
+
+    msg->fields = fields;
+    msg->nalloc = nalloc;
+
+    return TRUE;
+}
+
+
+static int init_field(mrp_msg_t *msg, mrp_msg_field_t *f, uint16_t tag,
+                      va_list *ap)
+{
+    uint16_t  type, base;
+    uint32_t  size, i;
+    void     *data;
 
     type = va_arg(*ap, uint32_t);
 
-#define CREATE(_f, _tag, _type, _fldtype, _fld, _last, _errlbl) do {      \
-                                                                          \
-            (_f) = mrp_allocz(MRP_OFFSET(typeof(*_f), _last) +            \
-                              sizeof(_f->_last));                         \
-                                                                          \
-            if ((_f) != NULL) {                                           \
-                mrp_list_init(&(_f)->hook);                             \
-                (_f)->tag  = _tag;                                        \
-                (_f)->type = _type;                                       \
-                (_f)->_fld = va_arg(*ap, _fldtype);                       \
-            }                                                             \
-            else {                                                        \
-                goto _errlbl;                                             \
-            }                                                             \
-        } while (0)
-
-#define CREATE_ARRAY(_f, _tag, _type, _fld, _fldtype, _errlbl) do {       \
-            uint16_t _base;                                               \
-            uint32_t _i;                                                  \
-                                                                          \
-            (_f) = mrp_allocz(MRP_OFFSET(typeof(*_f), size[1]));          \
-                                                                          \
-            if ((_f) != NULL) {                                           \
-                mrp_list_init(&(_f)->hook);                               \
-                (_f)->tag  = _tag;                                        \
-                (_f)->type = _type | MRP_MSG_FIELD_ARRAY;                 \
-                _base      = _type & ~MRP_MSG_FIELD_ARRAY;                \
-                                                                          \
-                _f->size[0] = va_arg(*ap, uint32_t);                      \
-                _f->_fld    = mrp_allocz_array(typeof(*_f->_fld),         \
-                                               _f->size[0]);              \
-                                                                          \
-                if (_f->_fld == NULL && _f->size[0] != 0)                 \
-                    goto _errlbl;                                         \
-                else                                                      \
-                    memcpy(_f->_fld, va_arg(*ap, typeof(_f->_fld)),       \
-                           _f->size[0] * sizeof(_f->_fld[0]));            \
-                                                                          \
-                if (_base == MRP_MSG_FIELD_STRING) {                      \
-                    for (_i = 0; _i < _f->size[0]; _i++) {                \
-                        _f->astr[_i] = mrp_strdup(_f->astr[_i]);          \
-                        if (_f->astr[_i] == NULL)                         \
-                            goto _errlbl;                                 \
-                    }                                                     \
-                }                                                         \
-            }                                                             \
-            else                                                          \
-                goto _errlbl;                                             \
-        } while (0)
-
-    f = NULL;
+    f->tag      = tag;
+    f->type     = type;
+    f->borrowed = FALSE;
+    f->size[0]  = 0;
+
+#define SET(_fldtype, _fld)                     \
+    f->_fld = va_arg(*ap, _fldtype);            \
+    break
+
+#define SET_ARRAY(_type, _fld)                                            \
+    case MRP_MSG_FIELD_##_type:                                           \
+        size = va_arg(*ap, uint32_t);                                     \
+        data = va_arg(*ap, void *);                                       \
+        f->_fld = arena_copy(msg, data, size * sizeof(f->_fld[0]));       \
+        f->size[0] = size;                                                \
+        break
 
     switch (type) {
     case MRP_MSG_FIELD_STRING:
-        CREATE(f, tag, type, char *, str, str, fail);
-        f->str = mrp_strdup(f->str);
-        if (f->str == NULL)
-            goto fail;
-        break;
-    case MRP_MSG_FIELD_BOOL:
-        CREATE(f, tag, type, int, bln, bln, fail);
-        break;
-    case MRP_MSG_FIELD_UINT8:
-        CREATE(f, tag, type, unsigned int, u8, u8, fail);
-        break;
-    case MRP_MSG_FIELD_SINT8:
-        CREATE(f, tag, type, signed int, s8, s8, fail);
-        break;
-    case MRP_MSG_FIELD_UINT16:
-        CREATE(f, tag, type, unsigned int, u16, u16, fail);
-        break;
-    case MRP_MSG_FIELD_SINT16:
-        CREATE(f, tag, type, signed int, s16, s16, fail);
-        break;
-    case MRP_MSG_FIELD_UINT32:
-        CREATE(f, tag, type, unsigned int, u32, u32, fail);
-        break;
-    case MRP_MSG_FIELD_SINT32:
-        CREATE(f, tag, type, signed int, s32, s32, fail);
-        break;
-    case MRP_MSG_FIELD_UINT64:
-        CREATE(f, tag, type, uint64_t, u64, u64, fail);
-        break;
-    case MRP_MSG_FIELD_SINT64:
-        CREATE(f, tag, type, int64_t, s64, s64, fail);
-        break;
-    case MRP_MSG_FIELD_DOUBLE:
-        CREATE(f, tag, type, double, dbl, dbl, fail);
+        f->str = arena_strdup(msg, va_arg(*ap, char *));
         break;
+    case MRP_MSG_FIELD_BOOL:   SET(int, bln);
+    case MRP_MSG_FIELD_UINT8:  SET(unsigned int, u8);
+    case MRP_MSG_FIELD_SINT8:  SET(signed int, s8);
+    case MRP_MSG_FIELD_UINT16: SET(unsigned int, u16);
+    case MRP_MSG_FIELD_SINT16: SET(signed int, s16);
+    case MRP_MSG_FIELD_UINT32: SET(unsigned int, u32);
+    case MRP_MSG_FIELD_SINT32: SET(signed int, s32);
+    case MRP_MSG_FIELD_UINT64: SET(uint64_t, u64);
+    case MRP_MSG_FIELD_SINT64: SET(int64_t, s64);
+    case MRP_MSG_FIELD_DOUBLE: SET(double, dbl);
 
     case MRP_MSG_FIELD_BLOB:
-        size = va_arg(*ap, uint32_t);
-        CREATE(f, tag, type, void *, blb, size[0], fail);
-
-        blb        = f->blb;
+        size       = va_arg(*ap, uint32_t);
+        data       = va_arg(*ap, void *);
+        f->blb     = arena_copy(msg, data, size);
         f->size[0] = size;
-        f->blb     = mrp_allocz(size);
-
-        if (f->blb != NULL) {
-            memcpy(f->blb, blb, size);
-            f->size[0] = size;
-        }
-        else
-            goto fail;
         break;
 
     default:
         if (!(type & MRP_MSG_FIELD_ARRAY)) {
             errno = EINVAL;
-            goto fail;
+            return FALSE;
         }
 
         base = type & ~MRP_MSG_FIELD_ARRAY;
 
         switch (base) {
-        case MRP_MSG_FIELD_STRING:
-            CREATE_ARRAY(f, tag, base, astr, char *, fail);
-            break;
-        case MRP_MSG_FIELD_BOOL:
-            CREATE_ARRAY(f, tag, base, abln, int, fail);
-            break;
-        case MRP_MSG_FIELD_UINT8:
-            CREATE_ARRAY(f, tag, base, au8, unsigned int, fail);
-            break;
-        case MRP_MSG_FIELD_SINT8:
-            CREATE_ARRAY(f, tag, base, as8, int, fail);
-            break;
-        case MRP_MSG_FIELD_UINT16:
-            CREATE_ARRAY(f, tag, base, au16, unsigned int, fail);
-            break;
-        case MRP_MSG_FIELD_SINT16:
-            CREATE_ARRAY(f, tag, base, as16, int, fail);
-            break;
-        case MRP_MSG_FIELD_UINT32:
-            CREATE_ARRAY(f, tag, base, au32, unsigned int, fail);
-            break;
-        case MRP_MSG_FIELD_SINT32:
-            CREATE_ARRAY(f, tag, base, as32, int, fail);
-            break;
-        case MRP_MSG_FIELD_UINT64:
-            CREATE_ARRAY(f, tag, base, au64, unsigned long long, fail);
-            break;
-        case MRP_MSG_FIELD_SINT64:
-            CREATE_ARRAY(f, tag, base, as64, long long, fail);
-            break;
-        case MRP_MSG_FIELD_DOUBLE:
-            CREATE_ARRAY(f, tag, base, adbl, double, fail);
-            break;
+            SET_ARRAY(STRING, astr);
+            SET_ARRAY(BOOL  , abln);
+            SET_ARRAY(UINT8 , au8 );
+            SET_ARRAY(SINT8 , as8 );
+            SET_ARRAY(UINT16, au16);
+            SET_ARRAY(SINT16, as16);
+            SET_ARRAY(UINT32, au32);
+            SET_ARRAY(SINT32, as32);
+            SET_ARRAY(UINT64, au64);
+            SET_ARRAY(SINT64, as64);
+            SET_ARRAY(DOUBLE, adbl);
         default:
             errno = EINVAL;
-            goto fail;
+            return FALSE;
+        }
+
+        if (f->aany != NULL && base == MRP_MSG_FIELD_STRING) {
+            for (i = 0; i < f->size[0]; i++)
+                if ((f->astr[i] = arena_strdup(msg, f->astr[i])) == NULL)
+                    return FALSE;
         }
         break;
     }
 
-    return f;
-
- fail:
-    destroy_field(f);
-    return NULL;
+    /* strings, blobs and arrays all need arena space */
+    switch (type) {
+    case MRP_MSG_FIELD_BOOL:
+    case MRP_MSG_FIELD_UINT8:
+    case MRP_MSG_FIELD_SINT8:
+    case MRP_MSG_FIELD_UINT16:
+    case MRP_MSG_FIELD_SINT16:
+    case MRP_MSG_FIELD_UINT32:
+    case MRP_MSG_FIELD_SINT32:
+    case MRP_MSG_FIELD_UINT64:
+    case MRP_MSG_FIELD_SINT64:
+    case MRP_MSG_FIELD_DOUBLE:
+        return TRUE;
+    default:
+        return f->aany != NULL;
+    }
 
-#undef CREATE
-#undef CREATE_ARRAY
+#undef SET
+#undef SET_ARRAY
 }
 
 
-static void msg_destroy(mrp_msg_t *msg)
+static int insert_field(mrp_msg_t *msg, size_t idx, uint16_t tag,
+                        va_list *ap)
 {
-    mrp_list_hook_t *p, *n;
-    mrp_msg_field_t *f;
+    mrp_msg_field_t f;
 
-    if (msg != NULL) {
-        mrp_list_foreach(&msg->fields, p, n) {
-            f = mrp_list_entry(p, typeof(*f), hook);
-            destroy_field(f);
-        }
+    if (!init_field(msg, &f, tag, ap) || !reserve_fields(msg, 1))
+        return FALSE;
 
-        mrp_free(msg);
-    }
+    if (idx < msg->nfield)
+        memmove(msg->fields + idx + 1, msg->fields + idx,
+                (msg->nfield - idx) * sizeof(f));
+
+    msg->fields[idx] = f;
+    msg->nfield++;
+    msg->nindex = 0;
+
+    return TRUE;
 }
 
 
 mrp_msg_t *mrp_msg_createv(uint16_t tag, va_list ap)
 {
-    mrp_msg_t       *msg;
-    mrp_msg_field_t *f;
-    va_list          aq;
+    mrp_msg_t *msg;
+    va_list    aq;
 
     va_copy(aq, ap);
-    if ((msg = mrp_allocz(sizeof(*msg))) != NULL) {
-        mrp_list_init(&msg->fields);
-        mrp_refcnt_init(&msg->refcnt);
-
+    if ((msg = msg_alloc(MSG_NFIELD, MSG_ARENA)) != NULL) {
         while (tag != MRP_MSG_FIELD_INVALID) {
-            f = create_field(tag, &aq);
-
-            if (f != NULL) {
-                mrp_list_append(&msg->fields, &f->hook);
-                msg->nfield++;
-            }
-            else {
+            if (!insert_field(msg, msg->nfield, tag, &aq)) {
                 msg_destroy(msg);
                 msg = NULL;
                 goto out;
@@ -332,79 +378,168 @@ void mrp_msg_unref(mrp_msg_t *msg)
 
 int mrp_msg_append(mrp_msg_t *msg, uint16_t tag, ...)
 {
-    mrp_msg_field_t *f;
-    va_list          ap;
+    va_list ap;
+    int     success;
 
     va_start(ap, tag);
-    f = create_field(tag, &ap);
+    success = insert_field(msg, msg->nfield, tag, &ap);
     va_end(ap);
 
-    if (f != NULL) {
-        mrp_list_append(&msg->fields, &f->hook);
-        msg->nfield++;
-        return TRUE;
-    }
-    else
-        return FALSE;
+    return success;
 }
 
 
 int mrp_msg_prepend(mrp_msg_t *msg, uint16_t tag, ...)
 {
-    mrp_msg_field_t *f;
-    va_list          ap;
+    va_list ap;
+    int     success;
 
     va_start(ap, tag);
-    f = create_field(tag, &ap);
+    success = insert_field(msg, 0, tag, &ap);
     va_end(ap);
 
-    if (f != NULL) {
-        mrp_list_prepend(&msg->fields, &f->hook);
-        msg->nfield++;
+    return success;
+}
+
+
+static int cmp_index(const void *a, const void *b)
+{
+    uint32_t ka = *(const uint32_t *)a, kb = *(const uint32_t *)b;
+
+    return (ka > kb) - (ka < kb);
+}
+
+
+static int build_index(mrp_msg_t *msg)
+{
+    uint32_t *index;
+    size_t    i;
+
+    if (msg->nfield < MSG_INDEXED || msg->nfield > 0xffff)
+        return FALSE;
+
+    if (msg->nindex == msg->nfield)
         return TRUE;
-    }
-    else
+
+    index = mrp_realloc(msg->index, msg->nfield * sizeof(*index));
+
+    if (index == NULL)
         return FALSE;
+
+    /* keys sort by tag, then by field index */
+    for (i = 0; i < msg->nfield; i++)
+        index[i] = ((uint32_t)msg->fields[i].tag << 16) | i;
+
+    qsort(index, msg->nfield, sizeof(*index), cmp_index);
+
+    msg->index  = index;
+    msg->nindex = msg->nfield;
+
+    return TRUE;
 }
 
 
-int mrp_msg_set(mrp_msg_t *msg, uint16_t tag, ...)
+static size_t search_index(mrp_msg_t *msg, uint32_t key)
 {
-    mrp_msg_field_t *of, *nf;
-    va_list          ap;
+    size_t lo, hi, mid;
+
+    lo = 0;
+    hi = msg->nindex;
+
+    while (lo < hi) {
+        mid = (lo + hi) / 2;
+
+        if (msg->index[mid] < key)
+            lo = mid + 1;
+        else
+            hi = mid;
+    }
+
+    return lo;
+}
+
+
+/*
+ * Look up a field by tag, scanning the message circularly from start
+ * but skipping the field right before start, ie. the one previously
+ * returned when called with start set to the next index. Returns the
+ * index of the field found, or -1 if there was none.
+ */
+
+static inline ssize_t find_field(mrp_msg_t *msg, uint16_t tag, size_t start)
+{
+    size_t n = msg->nfield;
+    size_t i, k, end;
+
+    if (n == 0)
+        return -1;
 
-    of = mrp_msg_find(msg, tag);
+    /* callers often look up fields in order, check the next few first */
+    for (i = start; i < n && i < start + MSG_PROBE; i++)
+        if (msg->fields[i].tag == tag)
+            return i;
 
-    if (of != NULL) {
-        va_start(ap, tag);
-        nf = create_field(tag, &ap);
-        va_end(ap);
+    if (build_index(msg)) {
+        k = search_index(msg, ((uint32_t)tag << 16) | MRP_MIN(start, n));
 
-        if (nf != NULL) {
-            mrp_list_append(&of->hook, &nf->hook);
-            destroy_field(of);
+        if (k < n && (msg->index[k] >> 16) == tag)
+            return msg->index[k] & 0xffff;
 
-            return TRUE;
+        k = search_index(msg, (uint32_t)tag << 16);
+
+        if (k < n && (msg->index[k] >> 16) == tag) {
+            i = msg->index[k] & 0xffff;
+            if (start == 0 || i != start - 1)
+                return i;
         }
+
+        return -1;
+    }
+
+    end = (start > 0 ? n - 1 : n);
+
+    for (k = 0; k < end; k++) {
+        i = (start + k) % n;
+        if (msg->fields[i].tag == tag)
+            return i;
     }
 
-    return FALSE;
+    return -1;
+}
+
+
+int mrp_msg_set(mrp_msg_t *msg, uint16_t tag, ...)
+{
+    mrp_msg_field_t f;
+    ssize_t         i;
+    va_list         ap;
+    int             success;
+
+    if ((i = find_field(msg, tag, 0)) < 0)
+        return FALSE;
+
+    /* the old value stays in the arena until the message is freed */
+    va_start(ap, tag);
+    success = init_field(msg, &f, tag, &ap);
+    va_end(ap);
+
+    if (success)
+        msg->fields[i] = f;
+
+    return success;
 }
 
 
 int mrp_msg_iterate(mrp_msg_t *msg, void **it, uint16_t *tagp, uint16_t *typep,
                     mrp_msg_value_t *valp, size_t *sizep)
 {
-    mrp_list_hook_t *p = *(mrp_list_hook_t **)it;
+    size_t           i = (size_t)*it;
     mrp_msg_field_t *f;
 
-    if (p == NULL)
-        p = msg->fields.next;
-
-    if (p == &msg->fields)
+    if (i >= msg->nfield)
         return FALSE;
 
-    f = mrp_list_entry(p, typeof(*f), hook);
+    f = msg->fields + i;
 
     *tagp  = f->tag;
     *typep = f->type;
@@ -451,7 +586,7 @@ int mrp_msg_iterate(mrp_msg_t *msg, void **it, uint16_t *tagp, uint16_t *typep,
 #undef HANDLE_TYPE
     }
 
-    *it = p->next;
+    *it = (void *)(i + 1);
 
     return TRUE;
 }
@@ -459,16 +594,9 @@ int mrp_msg_iterate(mrp_msg_t *msg, void **it, uint16_t *tagp, uint16_t *typep,
 
 mrp_msg_field_t *mrp_msg_find(mrp_msg_t *msg, uint16_t tag)
 {
-    mrp_msg_field_t *f;
-    mrp_list_hook_t *p, *n;
-
-    mrp_list_foreach(&msg->fields, p, n) {
-        f = mrp_list_entry(p, typeof(*f), hook);
-        if (f->tag == tag)
-            return f;
-    }
+    ssize_t i = find_field(msg, tag, 0);
 
-    return NULL;
+    return i < 0 ? NULL : msg->fields + i;
 }
 
 
@@ -492,7 +620,8 @@ int mrp_msg_get(mrp_msg_t *msg, ...)
     mrp_msg_field_t *f;
     mrp_msg_value_t *valp;
     uint32_t        *cntp;
-    mrp_list_hook_t *start, *p;
+    size_t           start;
+    ssize_t          i;
     uint16_t         tag, type;
     int              found;
     va_list          ap;
@@ -500,80 +629,65 @@ int mrp_msg_get(mrp_msg_t *msg, ...)
     va_start(ap, msg);
 
     /*
-     * Okay... this might look a bit weird at first sight. This is
-     * mostly because we don't use the standard list iterating macros
-     * in the inner loop. There is a good reason for that: we want to
-     * minimise the number of times we scan the message which is just
-     * a linked list of fields. We do this by arranging the nested
-     * loops below in such a way that if the order of fields to fetch
-     * in the argument list matches the order of fields in the message
-     * we end up running the outer and inner loops in a 'phase lock'.
-     * So if the caller fetches the fields in the correct order we end
-     * up scanning the message at most once but only up to the last
-     * field to fetch.
+     * We look for each field starting right after the previous one we
+     * fetched. So if the order of fields to fetch in the argument list
+     * matches the order of fields in the message, every lookup hits on
+     * the first field it checks. Otherwise find_field either scans the
+     * message or, for larger messages, uses the tag index.
      */
 
-    start = msg->fields.next;
+    start = 0;
     found = FALSE;
 
     while ((tag = va_arg(ap, unsigned int)) != MRP_MSG_FIELD_INVALID) {
         type  = va_arg(ap, unsigned int);
         found = FALSE;
 
-        for (p = start; p != start->prev; p = p->next) {
-            if (p == &msg->fields)
-                continue;
+        if ((i = find_field(msg, tag, start)) < 0)
+            break;
 
-            f = mrp_list_entry(p, typeof(*f), hook);
+        f = msg->fields + i;
 
-            if (f->tag != tag)
-                continue;
+        if (f->type != type)
+            goto out;
 
-            if (f->type != type)
-                goto out;
-
-            switch (type) {
-                HANDLE_TYPE(STRING, str);
-                HANDLE_TYPE(BOOL  , bln);
-                HANDLE_TYPE(UINT8 , u8 );
-                HANDLE_TYPE(SINT8 , s8 );
-                HANDLE_TYPE(UINT16, u16);
-                HANDLE_TYPE(SINT16, s16);
-                HANDLE_TYPE(UINT32, u32);
-                HANDLE_TYPE(SINT32, s32);
-                HANDLE_TYPE(UINT64, u64);
-                HANDLE_TYPE(SINT64, s64);
-                HANDLE_TYPE(DOUBLE, dbl);
-            default:
-                if (type & MRP_MSG_FIELD_ARRAY) {
-                    switch (type & ~MRP_MSG_FIELD_ARRAY) {
-                        HANDLE_ARRAY(STRING, astr);
-                        HANDLE_ARRAY(BOOL  , abln);
-                        HANDLE_ARRAY(UINT8 , au8 );
-                        HANDLE_ARRAY(SINT8 , as8 );
-                        HANDLE_ARRAY(UINT16, au16);
-                        HANDLE_ARRAY(SINT16, as16);
-                        HANDLE_ARRAY(UINT32, au32);
-                        HANDLE_ARRAY(SINT32, as32);
-                        HANDLE_ARRAY(UINT64, au64);
-                        HANDLE_ARRAY(SINT64, as64);
-                        HANDLE_ARRAY(DOUBLE, adbl);
-                    default:
-                        goto out;
+        switch (type) {
+            HANDLE_TYPE(STRING, str);
+            HANDLE_TYPE(BOOL  , bln);
+            HANDLE_TYPE(UINT8 , u8 );
+            HANDLE_TYPE(SINT8 , s8 );
+            HANDLE_TYPE(UINT16, u16);
+            HANDLE_TYPE(SINT16, s16);
+            HANDLE_TYPE(UINT32, u32);
+            HANDLE_TYPE(SINT32, s32);
+            HANDLE_TYPE(UINT64, u64);
+            HANDLE_TYPE(SINT64, s64);
+            HANDLE_TYPE(DOUBLE, dbl);
+        default:
+            if (type & MRP_MSG_FIELD_ARRAY) {
+                switch (type & ~MRP_MSG_FIELD_ARRAY) {
+                    HANDLE_ARRAY(STRING, astr);
+                    HANDLE_ARRAY(BOOL  , abln);
+                    HANDLE_ARRAY(UINT8 , au8 );
+                    HANDLE_ARRAY(SINT8 , as8 );
+                    HANDLE_ARRAY(UINT16, au16);
+                    HANDLE_ARRAY(SINT16, as16);
+                    HANDLE_ARRAY(UINT32, au32);
+                    HANDLE_ARRAY(SINT32, as32);
+                    HANDLE_ARRAY(UINT64, au64);
+                    HANDLE_ARRAY(SINT64, as64);
+                    HANDLE_ARRAY(DOUBLE, adbl);
+                default:
+                    goto out;
 
-                    }
                 }
-                else
-                    goto out;
             }
-
-            start = p->next;
-            found = TRUE;
-            break;
+            else
+                goto out;
         }
 
-        if (!found)
-            break;
+        start = i + 1;
+        found = TRUE;
     }
 
  out:
@@ -611,7 +725,8 @@ int mrp_msg_iterate_get(mrp_msg_t *msg, void **it, ...)
     mrp_msg_field_t *f;
     mrp_msg_value_t *valp;
     uint32_t        *cntp;
-    mrp_list_hook_t *start, *p;
+    size_t           start;
+    ssize_t          i;
     uint16_t         tag, type, *typep;
     int              found;
     va_list          ap;
@@ -619,20 +734,14 @@ int mrp_msg_iterate_get(mrp_msg_t *msg, void **it, ...)
     va_start(ap, it);
 
     /*
-     * Okay... this might look a bit weird at first sight. This is
-     * mostly because we don't use the standard list iterating macros
-     * in the inner loop. There is a good reason for that: we want to
-     * minimise the number of times we scan the message which is just
-     * a linked list of fields. We do this by arranging the nested
-     * loops below in such a way that if the order of fields to fetch
-     * in the argument list matches the order of fields in the message
-     * we end up running the outer and inner loops in a 'phase lock'.
-     * So if the caller fetches the fields in the correct order we end
-     * up scanning the message at most once but only up to the last
-     * field to fetch.
+     * We look for each field starting right after the previous one we
+     * fetched. So if the order of fields to fetch in the argument list
+     * matches the order of fields in the message, every lookup hits on
+     * the first field it checks. Otherwise find_field either scans the
+     * message or, for larger messages, uses the tag index.
      */
 
-    start = (*it) ? (mrp_list_hook_t *)*it : msg->fields.next;
+    start = (size_t)*it;
     found = FALSE;
 
     while ((tag = va_arg(ap, unsigned int)) != MRP_MSG_FIELD_INVALID) {
@@ -648,90 +757,81 @@ int mrp_msg_iterate_get(mrp_msg_t *msg, void **it, ...)
             valp  = NULL;
         }
 
-        for (p = start; p != start->prev; p = p->next) {
-            if (p == &msg->fields)
-                continue;
-
-            f = mrp_list_entry(p, typeof(*f), hook);
-
-            if (f->tag != tag)
-                continue;
-
-            if (type == MRP_MSG_FIELD_ANY) {
-                *typep = f->type;
-                switch (f->type) {
-                ANY_TYPE(STRING, str);
-                ANY_TYPE(BOOL  , bln);
-                ANY_TYPE(UINT8 , u8 );
-                ANY_TYPE(SINT8 , s8 );
-                ANY_TYPE(UINT16, u16);
-                ANY_TYPE(SINT16, s16);
-                ANY_TYPE(UINT32, u32);
-                ANY_TYPE(SINT32, s32);
-                ANY_TYPE(UINT64, u64);
-                ANY_TYPE(SINT64, s64);
-                ANY_TYPE(DOUBLE, dbl);
-                default:
-                    mrp_log_error("XXX TODO: currently cannot fetch array "
-                                  "message fields with iterators.");
-                }
+        if ((i = find_field(msg, tag, start)) < 0)
+            break;
 
-                goto next;
+        f = msg->fields + i;
+
+        if (type == MRP_MSG_FIELD_ANY) {
+            *typep = f->type;
+            switch (f->type) {
+            ANY_TYPE(STRING, str);
+            ANY_TYPE(BOOL  , bln);
+            ANY_TYPE(UINT8 , u8 );
+            ANY_TYPE(SINT8 , s8 );
+            ANY_TYPE(UINT16, u16);
+            ANY_TYPE(SINT16, s16);
+            ANY_TYPE(UINT32, u32);
+            ANY_TYPE(SINT32, s32);
+            ANY_TYPE(UINT64, u64);
+            ANY_TYPE(SINT64, s64);
+            ANY_TYPE(DOUBLE, dbl);
+            default:
+                mrp_log_error("XXX TODO: currently cannot fetch array "
+                              "message fields with iterators.");
             }
 
-            if (f->type != type)
-                goto out;
+            goto next;
+        }
 
-            switch (type) {
-                HANDLE_TYPE(STRING, str);
-                HANDLE_TYPE(BOOL  , bln);
-                HANDLE_TYPE(UINT8 , u8 );
-                HANDLE_TYPE(SINT8 , s8 );
-                HANDLE_TYPE(UINT16, u16);
-                HANDLE_TYPE(SINT16, s16);
-                HANDLE_TYPE(UINT32, u32);
-                HANDLE_TYPE(SINT32, s32);
-                HANDLE_TYPE(UINT64, u64);
-                HANDLE_TYPE(SINT64, s64);
-                HANDLE_TYPE(DOUBLE, dbl);
-            default:
-                if (type & MRP_MSG_FIELD_ARRAY) {
-                    switch (type & ~MRP_MSG_FIELD_ARRAY) {
-                        HANDLE_ARRAY(STRING, astr);
-                        HANDLE_ARRAY(BOOL  , abln);
-                        HANDLE_ARRAY(UINT8 , au8 );
-                        HANDLE_ARRAY(SINT8 , as8 );
-                        HANDLE_ARRAY(UINT16, au16);
-                        HANDLE_ARRAY(SINT16, as16);
-                        HANDLE_ARRAY(UINT32, au32);
-                        HANDLE_ARRAY(SINT32, as32);
-                        HANDLE_ARRAY(UINT64, au64);
-                        HANDLE_ARRAY(SINT64, as64);
-                        HANDLE_ARRAY(DOUBLE, adbl);
-                    default:
-                        goto out;
+        if (f->type != type)
+            goto out;
 
-                    }
-                }
-                else
+        switch (type) {
+            HANDLE_TYPE(STRING, str);
+            HANDLE_TYPE(BOOL  , bln);
+            HANDLE_TYPE(UINT8 , u8 );
+            HANDLE_TYPE(SINT8 , s8 );
+            HANDLE_TYPE(UINT16, u16);
+            HANDLE_TYPE(SINT16, s16);
+            HANDLE_TYPE(UINT32, u32);
+            HANDLE_TYPE(SINT32, s32);
+            HANDLE_TYPE(UINT64, u64);
+            HANDLE_TYPE(SINT64, s64);
+            HANDLE_TYPE(DOUBLE, dbl);
+        default:
+            if (type & MRP_MSG_FIELD_ARRAY) {
+                switch (type & ~MRP_MSG_FIELD_ARRAY) {
+                    HANDLE_ARRAY(STRING, astr);
+                    HANDLE_ARRAY(BOOL  , abln);
+                    HANDLE_ARRAY(UINT8 , au8 );
+                    HANDLE_ARRAY(SINT8 , as8 );
+                    HANDLE_ARRAY(UINT16, au16);
+                    HANDLE_ARRAY(SINT16, as16);
+                    HANDLE_ARRAY(UINT32, au32);
+                    HANDLE_ARRAY(SINT32, as32);
+                    HANDLE_ARRAY(UINT64, au64);
+                    HANDLE_ARRAY(SINT64, as64);
+                    HANDLE_ARRAY(DOUBLE, adbl);
+                default:
                     goto out;
-            }
 
-        next:
-            start = p->next;
-            found = TRUE;
-            break;
+                }
+            }
+            else
+                goto out;
         }
 
-        if (!found)
-            break;
+    next:
+        start = i + 1;
+        found = TRUE;
     }
 
  out:
     va_end(ap);
 
     if (found)
-        *it = start;
+        *it = (void *)start;
 
     return found;
 
@@ -797,7 +897,6 @@ static const char *field_type_name(uint16_t type)
 int mrp_msg_dump(mrp_msg_t *msg, FILE *fp)
 {
     mrp_msg_field_t *f;
-    mrp_list_hook_t *p, *n;
     int              l;
     uint32_t         i;
     uint16_t         base;
@@ -807,8 +906,7 @@ int mrp_msg_dump(mrp_msg_t *msg, FILE *fp)
         return fprintf(fp, "{\n    <no message>\n}\n");
 
     l = fprintf(fp, "{\n");
-    mrp_list_foreach(&msg->fields, p, n) {
-        f = mrp_list_entry(p, typeof(*f), hook);
+    for (f = msg->fields; f < msg->fields + msg->nfield; f++) {
 
         l += fprintf(fp, "    0x%x ", f->tag);
 
@@ -916,387 +1014,398 @@ int mrp_msg_dump(mrp_msg_t *msg, FILE *fp)
                     }
                 }
             }
-            else
-                fprintf(fp, "= <%s>\n", tname);
+            else
+                fprintf(fp, "= <%s>\n", tname);
+        }
+    }
+    l += fprintf(fp, "}\n");
+
+    return l;
+#undef DUMP
+}
+
+
+#define MSG_MIN_CHUNK 32
+
+/*
+ * message encoding
+ *
+ * The encoders serialize straight into a caller-provided buffer. Like
+ * snprintf they always return the full encoded size, even if it did not
+ * fit into the buffer. So the caller can either ask for the exact size
+ * first, or encode optimistically into a reusable scratch buffer and
+ * retry with a bigger one if the message turns out to be too large.
+ */
+
+typedef struct {
+    char   *buf;                         /* buffer to encode to */
+    size_t  size;                        /* size of the buffer */
+    size_t  used;                        /* amount of data encoded */
+} encbuf_t;
+
+
+static inline void put_data(encbuf_t *eb, const void *data, size_t size)
+{
+    if (eb->used + size <= eb->size)
+        memcpy(eb->buf + eb->used, data, size);
+
+    eb->used += size;
+}
+
+
+#define PUT_VALUE(_eb, _val) do {               \
+        typeof(_val) _v = (_val);               \
+                                                \
+        put_data((_eb), &_v, sizeof(_v));       \
+    } while (0)
+
+
+static int encode_value(encbuf_t *eb, uint16_t type, mrp_msg_value_t *v,
+                        uint32_t cnt)
+{
+    uint32_t len, i;
+
+    switch (type) {
+    case MRP_MSG_FIELD_STRING:
+        len = strlen(v->str) + 1;
+        PUT_VALUE(eb, htobe32(len));
+        put_data(eb, v->str, len);
+        break;
+
+    case MRP_MSG_FIELD_BOOL:
+        PUT_VALUE(eb, htobe32(v->bln ? TRUE : FALSE));
+        break;
+
+    case MRP_MSG_FIELD_UINT8:  PUT_VALUE(eb, v->u8);           break;
+    case MRP_MSG_FIELD_SINT8:  PUT_VALUE(eb, v->s8);           break;
+    case MRP_MSG_FIELD_UINT16: PUT_VALUE(eb, htobe16(v->u16)); break;
+    case MRP_MSG_FIELD_SINT16: PUT_VALUE(eb, htobe16(v->s16)); break;
+    case MRP_MSG_FIELD_UINT32: PUT_VALUE(eb, htobe32(v->u32)); break;
+    case MRP_MSG_FIELD_SINT32: PUT_VALUE(eb, htobe32(v->s32)); break;
+    case MRP_MSG_FIELD_UINT64: PUT_VALUE(eb, htobe64(v->u64)); break;
+    case MRP_MSG_FIELD_SINT64: PUT_VALUE(eb, htobe64(v->s64)); break;
+    case MRP_MSG_FIELD_DOUBLE: PUT_VALUE(eb, v->dbl);          break;
+
+    case MRP_MSG_FIELD_BLOB:
+        PUT_VALUE(eb, htobe32(cnt));
+        put_data(eb, v->blb, cnt);
+        break;
+
+    default:
+        if (!(type & MRP_MSG_FIELD_ARRAY))
+            return FALSE;
+
+        PUT_VALUE(eb, htobe32(cnt));
+
+#define PUT_ARRAY(_type, _fld, _conv)                                     \
+        case MRP_MSG_FIELD_##_type:                                       \
+            for (i = 0; i < cnt; i++)                                     \
+                PUT_VALUE(eb, _conv(v->_fld[i]));                         \
+            break
+
+        /* single bytes and doubles go out as is, the rest are swapped */
+        switch (type & ~MRP_MSG_FIELD_ARRAY) {
+        case MRP_MSG_FIELD_STRING:
+            for (i = 0; i < cnt; i++) {
+                len = strlen(v->astr[i]) + 1;
+                PUT_VALUE(eb, htobe32(len));
+                put_data(eb, v->astr[i], len);
+            }
+            break;
+
+        case MRP_MSG_FIELD_BOOL:
+            for (i = 0; i < cnt; i++)
+                PUT_VALUE(eb, htobe32(v->abln[i] ? TRUE : FALSE));
+            break;
+
+        case MRP_MSG_FIELD_UINT8:
+        case MRP_MSG_FIELD_SINT8:
+            put_data(eb, v->aany, cnt);
+            break;
+
+        case MRP_MSG_FIELD_DOUBLE:
+            put_data(eb, v->aany, cnt * sizeof(v->adbl[0]));
+            break;
+
+            PUT_ARRAY(UINT16, au16, htobe16);
+            PUT_ARRAY(SINT16, as16, htobe16);
+            PUT_ARRAY(UINT32, au32, htobe32);
+            PUT_ARRAY(SINT32, as32, htobe32);
+            PUT_ARRAY(UINT64, au64, htobe64);
+            PUT_ARRAY(SINT64, as64, htobe64);
+
+        default:
+            return FALSE;
         }
+#undef PUT_ARRAY
     }
-    l += fprintf(fp, "}\n");
 
-    return l;
-#undef DUMP
+    return TRUE;
 }
 
 
-#define MSG_MIN_CHUNK 32
-
-ssize_t mrp_msg_default_encode(mrp_msg_t *msg, void **bufp)
+ssize_t mrp_msg_default_encode_to(mrp_msg_t *msg, void *buf, size_t size)
 {
     mrp_msg_field_t *f;
-    mrp_list_hook_t *p, *n;
-    mrp_msgbuf_t     mb;
-    uint32_t         len, asize, i;
-    uint16_t         type;
-    size_t           size;
+    encbuf_t         eb;
 
-    size = msg->nfield * (2 * sizeof(uint16_t) + sizeof(uint64_t));
+    eb.buf  = buf;
+    eb.size = buf != NULL ? size : 0;
+    eb.used = 0;
 
-    if (mrp_msgbuf_write(&mb, size)) {
-        MRP_MSGBUF_PUSH(&mb, htobe16(MRP_MSG_TAG_DEFAULT), 1, nomem);
-        MRP_MSGBUF_PUSH(&mb, htobe16(msg->nfield), 1, nomem);
+    PUT_VALUE(&eb, htobe16(MRP_MSG_TAG_DEFAULT));
+    PUT_VALUE(&eb, htobe16(msg->nfield));
 
-        mrp_list_foreach(&msg->fields, p, n) {
-            f = mrp_list_entry(p, typeof(*f), hook);
+    for (f = msg->fields; f < msg->fields + msg->nfield; f++) {
+        PUT_VALUE(&eb, htobe16(f->tag));
+        PUT_VALUE(&eb, htobe16(f->type));
 
-            MRP_MSGBUF_PUSH(&mb, htobe16(f->tag) , 1, nomem);
-            MRP_MSGBUF_PUSH(&mb, htobe16(f->type), 1, nomem);
+        if (!encode_value(&eb, f->type, (mrp_msg_value_t *)&f->str,
+                          f->size[0])) {
+            errno = EINVAL;
+            return -1;
+        }
+    }
 
-            switch (f->type) {
-            case MRP_MSG_FIELD_STRING:
-                len = strlen(f->str) + 1;
-                MRP_MSGBUF_PUSH(&mb, htobe32(len), 1, nomem);
-                MRP_MSGBUF_PUSH_DATA(&mb, f->str, len, 1, nomem);
-                break;
+    return (ssize_t)eb.used;
+}
 
-            case MRP_MSG_FIELD_BOOL:
-                MRP_MSGBUF_PUSH(&mb, htobe32(f->bln ? TRUE : FALSE), 1, nomem);
-                break;
 
-            case MRP_MSG_FIELD_UINT8:
-                MRP_MSGBUF_PUSH(&mb, f->u8, 1, nomem);
-                break;
+ssize_t mrp_msg_default_encode(mrp_msg_t *msg, void **bufp)
+{
+    ssize_t size;
 
-            case MRP_MSG_FIELD_SINT8:
-                MRP_MSGBUF_PUSH(&mb, f->s8, 1, nomem);
-                break;
+    *bufp = NULL;
+    size  = mrp_msg_default_encode_to(msg, NULL, 0);
 
-            case MRP_MSG_FIELD_UINT16:
-                MRP_MSGBUF_PUSH(&mb, htobe16(f->u16), 1, nomem);
-                break;
+    if (size < 0 || (*bufp = mrp_alloc(size)) == NULL)
+        return -1;
 
-            case MRP_MSG_FIELD_SINT16:
-                MRP_MSGBUF_PUSH(&mb, htobe16(f->s16), 1, nomem);
-                break;
+    return mrp_msg_default_encode_to(msg, *bufp, size);
+}
 
-            case MRP_MSG_FIELD_UINT32:
-                MRP_MSGBUF_PUSH(&mb, htobe32(f->u32), 1, nomem);
-                break;
 
-            case MRP_MSG_FIELD_SINT32:
-                MRP_MSGBUF_PUSH(&mb, htobe32(f->s32), 1, nomem);
-                break;
+mrp_rcvbuf_t *mrp_rcvbuf_create(size_t size)
+{
+    mrp_rcvbuf_t *buf;
 
-            case MRP_MSG_FIELD_UINT64:
-                MRP_MSGBUF_PUSH(&mb, htobe64(f->u64), 1, nomem);
-                break;
+    if ((buf = mrp_alloc(sizeof(*buf) + size)) != NULL) {
+        mrp_refcnt_init(&buf->refcnt);
+        buf->size = size;
+    }
 
-            case MRP_MSG_FIELD_SINT64:
-                MRP_MSGBUF_PUSH(&mb, htobe64(f->s64), 1, nomem);
-                break;
+    return buf;
+}
 
-            case MRP_MSG_FIELD_DOUBLE:
-                MRP_MSGBUF_PUSH(&mb, f->dbl, 1, nomem);
-                break;
 
-            case MRP_MSG_FIELD_BLOB:
-                len   = f->size[0];
-                MRP_MSGBUF_PUSH(&mb, htobe32(len), 1, nomem);
-                MRP_MSGBUF_PUSH_DATA(&mb, f->blb, len, 1, nomem);
-                break;
+mrp_rcvbuf_t *mrp_rcvbuf_ref(mrp_rcvbuf_t *buf)
+{
+    return mrp_ref_obj(buf, refcnt);
+}
 
-            default:
-                if (f->type & MRP_MSG_FIELD_ARRAY) {
-                    type  = f->type & ~(MRP_MSG_FIELD_ARRAY);
-                    asize = f->size[0];
-                    MRP_MSGBUF_PUSH(&mb, htobe32(asize), 1, nomem);
-
-                    for (i = 0; i < asize; i++) {
-                        switch (type) {
-                        case MRP_MSG_FIELD_STRING:
-                            len = strlen(f->astr[i]) + 1;
-                            MRP_MSGBUF_PUSH(&mb, htobe32(len), 1, nomem);
-                            MRP_MSGBUF_PUSH_DATA(&mb, f->astr[i], len,
-                                                 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_BOOL:
-                            MRP_MSGBUF_PUSH(&mb, htobe32(f->abln[i]?TRUE:FALSE),
-                                            1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_UINT8:
-                            MRP_MSGBUF_PUSH(&mb, f->au8[i], 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_SINT8:
-                            MRP_MSGBUF_PUSH(&mb, f->as8[i], 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_UINT16:
-                            MRP_MSGBUF_PUSH(&mb, htobe16(f->au16[i]), 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_SINT16:
-                            MRP_MSGBUF_PUSH(&mb, htobe16(f->as16[i]), 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_UINT32:
-                            MRP_MSGBUF_PUSH(&mb, htobe32(f->au32[i]), 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_SINT32:
-                            MRP_MSGBUF_PUSH(&mb, htobe32(f->as32[i]), 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_UINT64:
-                            MRP_MSGBUF_PUSH(&mb, htobe64(f->au64[i]), 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_SINT64:
-                            MRP_MSGBUF_PUSH(&mb, htobe64(f->as64[i]), 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_DOUBLE:
-                            MRP_MSGBUF_PUSH(&mb, f->adbl[i], 1, nomem);
-                            break;
-
-                        default:
-                            goto invalid_type;
-                        }
-                    }
-                }
-                else {
-                invalid_type:
-                    errno = EINVAL;
-                    mrp_msgbuf_cancel(&mb);
-                nomem:
-                    *bufp = NULL;
-                    return -1;
-                }
-            }
-        }
+
+void mrp_rcvbuf_unref(mrp_rcvbuf_t *buf)
+{
+    if (mrp_unref_obj(buf, refcnt))
+        mrp_free(buf);
+}
+
+
+static char *pull_string(mrp_msgbuf_t *mb, uint32_t len)
+{
+    char *str;
+
+    if (len == 0)
+        return "";
+
+    if ((str = mrp_msgbuf_pull(mb, len, 1)) == NULL)
+        return NULL;
+
+    if (str[len - 1] != '\0') {
+        errno = EINVAL;
+        return NULL;
     }
 
-    *bufp = mb.buf;
-    return mb.p - mb.buf;
+    return str;
 }
 
 
-mrp_msg_t *mrp_msg_default_decode(void *buf, size_t size)
+static mrp_msg_t *msg_decode(mrp_rcvbuf_t *rb, void *buf, size_t size)
 {
     mrp_msg_t       *msg;
+    mrp_msg_field_t *f;
     mrp_msgbuf_t     mb;
-    mrp_msg_value_t  v;
-    void            *value;
-    uint16_t         nfield, tag, type, base;
+    uint16_t         nfield, base;
     uint32_t         len, n, i, j;
+    char            *str;
+
+    msg = NULL;
+    mrp_msgbuf_read(&mb, buf, size);
+
+    nfield = be16toh(MRP_MSGBUF_PULL(&mb, typeof(nfield), 1, nodata));
+
+    /*
+     * When copying, the encoded size is a good estimate of the arena space
+     * we need. When decoding in place, only numeric arrays and the pointer
+     * arrays of string arrays go to the arena.
+     */
 
-    msg = mrp_msg_create_empty();
+    msg = msg_alloc(nfield, rb != NULL ? MSG_ARENA : size + nfield * 8);
 
     if (msg == NULL)
         return NULL;
 
-    mrp_msgbuf_read(&mb, buf, size);
-
-    nfield = be16toh(MRP_MSGBUF_PULL(&mb, typeof(nfield), 1, nodata));
+    if (rb != NULL)
+        msg->buf = mrp_rcvbuf_ref(rb);
+
+#define PULL_ARRAY(_type, _fld, _conv)                                    \
+        case MRP_MSG_FIELD_##_type:                                       \
+            f->_fld = arena_alloc(msg, n * sizeof(f->_fld[0]));           \
+            if (f->_fld == NULL)                                          \
+                goto fail;                                                \
+            for (j = 0; j < n; j++)                                       \
+                f->_fld[j] = _conv(MRP_MSGBUF_PULL(&mb,                   \
+                                                   typeof(f->_fld[0]),    \
+                                                   1, nodata));           \
+            break
 
     for (i = 0; i < nfield; i++) {
-        tag  = be16toh(MRP_MSGBUF_PULL(&mb, typeof(tag) , 1, nodata));
-        type = be16toh(MRP_MSGBUF_PULL(&mb, typeof(type), 1, nodata));
+        f = msg->fields + i;
 
-        switch (type) {
+        f->tag      = be16toh(MRP_MSGBUF_PULL(&mb, uint16_t, 1, nodata));
+        f->type     = be16toh(MRP_MSGBUF_PULL(&mb, uint16_t, 1, nodata));
+        f->borrowed = (rb != NULL);
+        f->size[0]  = 0;
+
+        switch (f->type) {
         case MRP_MSG_FIELD_STRING:
             len = be32toh(MRP_MSGBUF_PULL(&mb, typeof(len), 1, nodata));
-            if (len > 0)
-                value = MRP_MSGBUF_PULL_DATA(&mb, len, 1, nodata);
+            str = pull_string(&mb, len);
+            if (str == NULL)
+                goto nodata;
+            if (rb != NULL)
+                f->str = str;
             else
-                value = "";
-            if (!mrp_msg_append(msg, tag, type, value))
-                goto fail;
+                if ((f->str = arena_copy(msg, str, len ? len : 1)) == NULL)
+                    goto fail;
             break;
 
         case MRP_MSG_FIELD_BOOL:
-            v.bln = be32toh(MRP_MSGBUF_PULL(&mb, uint32_t, 1, nodata));
-            if (!mrp_msg_append(msg, tag, type, v.bln))
-                goto fail;
+            f->bln = be32toh(MRP_MSGBUF_PULL(&mb, uint32_t, 1, nodata));
             break;
 
         case MRP_MSG_FIELD_UINT8:
-            v.u8 = MRP_MSGBUF_PULL(&mb, typeof(v.u8), 1, nodata);
-            if (!mrp_msg_append(msg, tag, type, v.u8))
-                goto fail;
+            f->u8 = MRP_MSGBUF_PULL(&mb, typeof(f->u8), 1, nodata);
             break;
 
         case MRP_MSG_FIELD_SINT8:
-            v.s8 = MRP_MSGBUF_PULL(&mb, typeof(v.s8), 1, nodata);
-            if (!mrp_msg_append(msg, tag, type, v.s8))
-                goto fail;
+            f->s8 = MRP_MSGBUF_PULL(&mb, typeof(f->s8), 1, nodata);
             break;
 
         case MRP_MSG_FIELD_UINT16:
-            v.u16 = be16toh(MRP_MSGBUF_PULL(&mb, typeof(v.u16), 1, nodata));
-            if (!mrp_msg_append(msg, tag, type, v.u16))
-                goto fail;
+            f->u16 = be16toh(MRP_MSGBUF_PULL(&mb, typeof(f->u16), 1, nodata));
             break;
 
         case MRP_MSG_FIELD_SINT16:
-            v.s16 = be16toh(MRP_MSGBUF_PULL(&mb, typeof(v.s16), 1, nodata));
-            if (!mrp_msg_append(msg, tag, type, v.s16))
-                goto fail;
+            f->s16 = be16toh(MRP_MSGBUF_PULL(&mb, typeof(f->s16), 1, nodata));
             break;
 
         case MRP_MSG_FIELD_UINT32:
-            v.u32 = be32toh(MRP_MSGBUF_PULL(&mb, typeof(v.u32), 1, nodata));
-            if (!mrp_msg_append(msg, tag, type, v.u32))
-                goto fail;
+            f->u32 = be32toh(MRP_MSGBUF_PULL(&mb, typeof(f->u32), 1, nodata));
             break;
 
         case MRP_MSG_FIELD_SINT32:
-            v.s32 = be32toh(MRP_MSGBUF_PULL(&mb, typeof(v.s32), 1, nodata));
-            if (!mrp_msg_append(msg, tag, type, v.s32))
-                goto fail;
+            f->s32 = be32toh(MRP_MSGBUF_PULL(&mb, typeof(f->s32), 1, nodata));
             break;
 
         case MRP_MSG_FIELD_UINT64:
-            v.u64 = be64toh(MRP_MSGBUF_PULL(&mb, typeof(v.u64), 1, nodata));
-            if (!mrp_msg_append(msg, tag, type, v.u64))
-                goto fail;
+            f->u64 = be64toh(MRP_MSGBUF_PULL(&mb, typeof(f->u64), 1, nodata));
             break;
 
         case MRP_MSG_FIELD_SINT64:
-            v.s64 = be64toh(MRP_MSGBUF_PULL(&mb, typeof(v.s64), 1, nodata));
-            if (!mrp_msg_append(msg, tag, type, v.s64))
-                goto fail;
+            f->s64 = be64toh(MRP_MSGBUF_PULL(&mb, typeof(f->s64), 1, nodata));
             break;
 
         case MRP_MSG_FIELD_DOUBLE:
-            v.dbl = MRP_MSGBUF_PULL(&mb, typeof(v.dbl), 1, nodata);
-            if (!mrp_msg_append(msg, tag, type, v.dbl))
-                goto fail;
+            f->dbl = MRP_MSGBUF_PULL(&mb, typeof(f->dbl), 1, nodata);
             break;
 
         case MRP_MSG_FIELD_BLOB:
-            len   = be32toh(MRP_MSGBUF_PULL(&mb, typeof(len), 1, nodata));
-            value = MRP_MSGBUF_PULL_DATA(&mb, len, 1, nodata);
-            if (!mrp_msg_append(msg, tag, type, len, value))
-                goto fail;
+            len = be32toh(MRP_MSGBUF_PULL(&mb, typeof(len), 1, nodata));
+            f->blb = MRP_MSGBUF_PULL_DATA(&mb, len, 1, nodata);
+            f->size[0] = len;
+            if (rb == NULL)
+                if ((f->blb = arena_copy(msg, f->blb, len)) == NULL)
+                    goto fail;
             break;
 
         default:
-            if (!(type & MRP_MSG_FIELD_ARRAY)) {
+            if (!(f->type & MRP_MSG_FIELD_ARRAY)) {
                 errno = EINVAL;
                 goto fail;
             }
 
-            base  = type & ~MRP_MSG_FIELD_ARRAY;
-            n     = be32toh(MRP_MSGBUF_PULL(&mb, typeof(n), 1, nodata));
-            {
-                char    *astr[n];
-                bool     abln[n];
-                uint8_t  au8 [n];
-                int8_t   as8 [n];
-                uint16_t au16[n];
-                int16_t  as16[n];
-                uint32_t au32[n];
-                int32_t  as32[n];
-                uint64_t au64[n];
-                int64_t  as64[n];
-                double   adbl[n];
-
-                for (j = 0; j < n; j++) {
-
-                    switch (base) {
-                    case MRP_MSG_FIELD_STRING:
-                        len = be32toh(MRP_MSGBUF_PULL(&mb, typeof(len),
-                                                      1, nodata));
-                        if (len > 0)
-                            astr[j] = MRP_MSGBUF_PULL_DATA(&mb, len, 1, nodata);
-                        else
-                            astr[j] = "";
-                        break;
-
-                    case MRP_MSG_FIELD_BOOL:
-                        abln[j] = be32toh(MRP_MSGBUF_PULL(&mb, uint32_t, 1,
-                                                          nodata));
-                        break;
-
-                    case MRP_MSG_FIELD_UINT8:
-                        au8[j] = MRP_MSGBUF_PULL(&mb, typeof(v.u8), 1, nodata);
-                        break;
-
-                    case MRP_MSG_FIELD_SINT8:
-                        as8[j] = MRP_MSGBUF_PULL(&mb, typeof(v.s8), 1, nodata);
-                        break;
-
-                    case MRP_MSG_FIELD_UINT16:
-                        au16[j] = be16toh(MRP_MSGBUF_PULL(&mb, typeof(v.u16),
-                                                          1, nodata));
-                        break;
-
-                    case MRP_MSG_FIELD_SINT16:
-                        as16[j] = be16toh(MRP_MSGBUF_PULL(&mb, typeof(v.s16),
-                                                          1, nodata));
-                        break;
-
-                    case MRP_MSG_FIELD_UINT32:
-                        au32[j] = be32toh(MRP_MSGBUF_PULL(&mb, typeof(v.u32),
-                                                          1, nodata));
-                        break;
-
-                    case MRP_MSG_FIELD_SINT32:
-                        as32[j] = be32toh(MRP_MSGBUF_PULL(&mb, typeof(v.s32),
-                                                          1, nodata));
-                        break;
-
-                    case MRP_MSG_FIELD_UINT64:
-                        au64[j] = be64toh(MRP_MSGBUF_PULL(&mb, typeof(v.u64),
-                                                          1, nodata));
-                        break;
+            base = f->type & ~MRP_MSG_FIELD_ARRAY;
+            n    = be32toh(MRP_MSGBUF_PULL(&mb, typeof(n), 1, nodata));
 
-                    case MRP_MSG_FIELD_SINT64:
-                        as64[j] = be64toh(MRP_MSGBUF_PULL(&mb, typeof(v.s64),
-                                                          1, nodata));
-                        break;
+            /* don't let a bogus count make us allocate a huge array */
+            if (n > mb.l) {
+                errno = EINVAL;
+                goto fail;
+            }
 
-                    case MRP_MSG_FIELD_DOUBLE:
-                        adbl[j] = MRP_MSGBUF_PULL(&mb, typeof(v.dbl),
-                                                  1, nodata);
-                    break;
+            f->size[0] = n;
 
-                    default:
-                        errno = EINVAL;
-                        goto fail;
-                    }
+            switch (base) {
+            case MRP_MSG_FIELD_STRING:
+                f->astr = arena_alloc(msg, n * sizeof(f->astr[0]));
+                if (f->astr == NULL)
+                    goto fail;
+                for (j = 0; j < n; j++) {
+                    len = be32toh(MRP_MSGBUF_PULL(&mb, typeof(len),
+                                                  1, nodata));
+                    str = pull_string(&mb, len);
+                    if (str == NULL)
+                        goto nodata;
+                    if (rb != NULL)
+                        f->astr[j] = str;
+                    else
+                        if ((f->astr[j] = arena_copy(msg, str,
+                                                     len ? len : 1)) == NULL)
+                            goto fail;
                 }
+                break;
 
-#define HANDLE_TYPE(_type, _var)                                          \
-                case _type:                                               \
-                    if (!mrp_msg_append(msg, tag,                         \
-                                        MRP_MSG_FIELD_ARRAY |_type,       \
-                                        n, _var))                         \
-                        goto fail;                                        \
-                    break
-
-                switch (base) {
-                    HANDLE_TYPE(MRP_MSG_FIELD_STRING, astr);
-                    HANDLE_TYPE(MRP_MSG_FIELD_BOOL  , abln);
-                    HANDLE_TYPE(MRP_MSG_FIELD_UINT8 , au8 );
-                    HANDLE_TYPE(MRP_MSG_FIELD_SINT8 , as8 );
-                    HANDLE_TYPE(MRP_MSG_FIELD_UINT16, au16);
-                    HANDLE_TYPE(MRP_MSG_FIELD_SINT16, as16);
-                    HANDLE_TYPE(MRP_MSG_FIELD_UINT32, au32);
-                    HANDLE_TYPE(MRP_MSG_FIELD_SINT32, as32);
-                    HANDLE_TYPE(MRP_MSG_FIELD_UINT64, au64);
-                    HANDLE_TYPE(MRP_MSG_FIELD_SINT64, as64);
-                    HANDLE_TYPE(MRP_MSG_FIELD_DOUBLE, adbl);
-                default:
-                    errno = EINVAL;
+            case MRP_MSG_FIELD_BOOL:
+                f->abln = arena_alloc(msg, n * sizeof(f->abln[0]));
+                if (f->abln == NULL)
                     goto fail;
-                }
-#undef HANDLE_TYPE
+                for (j = 0; j < n; j++)
+                    f->abln[j] = be32toh(MRP_MSGBUF_PULL(&mb, uint32_t,
+                                                         1, nodata));
+                break;
+
+                PULL_ARRAY(UINT8 , au8 , );
+                PULL_ARRAY(SINT8 , as8 , );
+                PULL_ARRAY(UINT16, au16, be16toh);
+                PULL_ARRAY(SINT16, as16, be16toh);
+                PULL_ARRAY(UINT32, au32, be32toh);
+                PULL_ARRAY(SINT32, as32, be32toh);
+                PULL_ARRAY(UINT64, au64, be64toh);
+                PULL_ARRAY(SINT64, as64, be64toh);
+                PULL_ARRAY(DOUBLE, adbl, );
+
+            default:
+                errno = EINVAL;
+                goto fail;
             }
         }
+
+        msg->nfield++;
     }
 
+#undef PULL_ARRAY
+
     return msg;
 
 
@@ -1307,6 +1416,19 @@ mrp_msg_t *mrp_msg_default_decode(void *buf, size_t size)
 }
 
 
+mrp_msg_t *mrp_msg_default_decode(void *buf, size_t size)
+{
+    return msg_decode(NULL, buf, size);
+}
+
+
+mrp_msg_t *mrp_msg_default_decode_inplace(mrp_rcvbuf_t *buf, void *data,
+                                          size_t size)
+{
+    return msg_decode(buf, data, size);
+}
+
+
 static int guarded_array_size(void *data, mrp_data_member_t *array)
 {
 #define MAX_ITEMS (32 * 1024)
@@ -1541,168 +1663,57 @@ static __attribute__((destructor)) void cleanup_types(void)
 }
 
 
-size_t mrp_data_encode(void **bufp, void *data, mrp_data_descr_t *descr,
-                       size_t reserve)
+ssize_t mrp_data_encode_to(void *buf, size_t size, void *data,
+                           mrp_data_descr_t *descr)
 {
-    mrp_data_member_t *fields, *f;
-    int                nfield;
-    uint16_t           type;
-    mrp_msgbuf_t       mb;
+    mrp_data_member_t *f;
     mrp_msg_value_t   *v;
-    uint32_t           len, asize, blblen, j;
+    encbuf_t           eb;
     int                i, cnt;
-    size_t             size;
-
-    fields = descr->fields;
-    nfield = descr->nfield;
-    size   = reserve + nfield * (2 * sizeof(uint16_t) + sizeof(uint64_t));
-
-    if (mrp_msgbuf_write(&mb, size)) {
-        if (reserve)
-            mrp_msgbuf_reserve(&mb, reserve, 1);
-
-        for (i = 0, f = fields; i < nfield; i++, f++) {
-            MRP_MSGBUF_PUSH(&mb, htobe16(f->tag) , 1, nomem);
-
-            v = (mrp_msg_value_t *)(data + f->offs);
-
-            switch (f->type) {
-            case MRP_MSG_FIELD_STRING:
-                len = strlen(v->str) + 1;
-                MRP_MSGBUF_PUSH(&mb, htobe32(len), 1, nomem);
-                MRP_MSGBUF_PUSH_DATA(&mb, v->str, len, 1, nomem);
-                break;
 
-            case MRP_MSG_FIELD_BOOL:
-                MRP_MSGBUF_PUSH(&mb, htobe32(v->bln ? TRUE : FALSE), 1, nomem);
-                break;
-
-            case MRP_MSG_FIELD_UINT8:
-                MRP_MSGBUF_PUSH(&mb, v->u8, 1, nomem);
-                break;
-
-            case MRP_MSG_FIELD_SINT8:
-                MRP_MSGBUF_PUSH(&mb, v->s8, 1, nomem);
-                break;
-
-            case MRP_MSG_FIELD_UINT16:
-                MRP_MSGBUF_PUSH(&mb, htobe16(v->u16), 1, nomem);
-                break;
+    eb.buf  = buf;
+    eb.size = buf != NULL ? size : 0;
+    eb.used = 0;
 
-            case MRP_MSG_FIELD_SINT16:
-                MRP_MSGBUF_PUSH(&mb, htobe16(v->s16), 1, nomem);
-                break;
+    for (i = 0, f = descr->fields; i < descr->nfield; i++, f++) {
+        PUT_VALUE(&eb, htobe16(f->tag));
 
-            case MRP_MSG_FIELD_UINT32:
-                MRP_MSGBUF_PUSH(&mb, htobe32(v->u32), 1, nomem);
-                break;
+        v = (mrp_msg_value_t *)(data + f->offs);
 
-            case MRP_MSG_FIELD_SINT32:
-                MRP_MSGBUF_PUSH(&mb, htobe32(v->s32), 1, nomem);
-                break;
+        if (f->type == MRP_MSG_FIELD_BLOB)
+            cnt = get_blob_size(data, descr, i);
+        else if (f->type & MRP_MSG_FIELD_ARRAY)
+            cnt = get_array_size(data, descr, i);
+        else
+            cnt = 0;
 
-            case MRP_MSG_FIELD_UINT64:
-                MRP_MSGBUF_PUSH(&mb, htobe64(v->u64), 1, nomem);
-                break;
+        if (cnt < 0 || !encode_value(&eb, f->type, v, (uint32_t)cnt)) {
+            errno = EINVAL;
+            return -1;
+        }
+    }
 
-            case MRP_MSG_FIELD_SINT64:
-                MRP_MSGBUF_PUSH(&mb, htobe64(v->s64), 1, nomem);
-                break;
+    return (ssize_t)eb.used;
+}
 
-            case MRP_MSG_FIELD_DOUBLE:
-                MRP_MSGBUF_PUSH(&mb, v->dbl, 1, nomem);
-                break;
 
-            case MRP_MSG_FIELD_BLOB:
-                blblen = (uint32_t)get_blob_size(data, descr, i);
+size_t mrp_data_encode(void **bufp, void *data, mrp_data_descr_t *descr,
+                       size_t reserve)
+{
+    ssize_t size;
+    char   *buf;
 
-                if (blblen == (uint32_t)-1)
-                    goto invalid_type;
+    *bufp = NULL;
+    size  = mrp_data_encode_to(NULL, 0, data, descr);
 
-                MRP_MSGBUF_PUSH(&mb, htobe32(v->u32), 1, nomem);
-                MRP_MSGBUF_PUSH_DATA(&mb, v->blb, blblen, 1, nomem);
-                break;
+    if (size < 0 || (buf = mrp_alloc(reserve + size)) == NULL)
+        return 0;
 
-            default:
-                if (f->type & MRP_MSG_FIELD_ARRAY) {
-                    type  = f->type & ~(MRP_MSG_FIELD_ARRAY);
-                    cnt   = get_array_size(data, descr, i);
-
-                    if (cnt < 0)
-                        goto invalid_type;
-
-                    asize = (uint32_t)cnt;
-                    MRP_MSGBUF_PUSH(&mb, htobe32(asize), 1, nomem);
-
-                    for (j = 0; j < asize; j++) {
-                        switch (type) {
-                        case MRP_MSG_FIELD_STRING:
-                            len = strlen(v->astr[j]) + 1;
-                            MRP_MSGBUF_PUSH(&mb, htobe32(len), 1, nomem);
-                            MRP_MSGBUF_PUSH_DATA(&mb, v->astr[j], len,
-                                                 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_BOOL:
-                            MRP_MSGBUF_PUSH(&mb, htobe32(v->abln[j]?TRUE:FALSE),
-                                            1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_UINT8:
-                            MRP_MSGBUF_PUSH(&mb, v->au8[j], 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_SINT8:
-                            MRP_MSGBUF_PUSH(&mb, v->as8[j], 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_UINT16:
-                            MRP_MSGBUF_PUSH(&mb, htobe16(v->au16[j]), 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_SINT16:
-                            MRP_MSGBUF_PUSH(&mb, htobe16(v->as16[j]), 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_UINT32:
-                            MRP_MSGBUF_PUSH(&mb, htobe32(v->au32[j]), 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_SINT32:
-                            MRP_MSGBUF_PUSH(&mb, htobe32(v->as32[j]), 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_UINT64:
-                            MRP_MSGBUF_PUSH(&mb, htobe64(v->au64[j]), 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_SINT64:
-                            MRP_MSGBUF_PUSH(&mb, htobe64(v->as64[j]), 1, nomem);
-                            break;
-
-                        case MRP_MSG_FIELD_DOUBLE:
-                            MRP_MSGBUF_PUSH(&mb, v->adbl[j], 1, nomem);
-                            break;
-
-                        default:
-                            goto invalid_type;
-                        }
-                    }
-                }
-                else {
-                invalid_type:
-                    errno = EINVAL;
-                    mrp_msgbuf_cancel(&mb);
-                nomem:
-                    *bufp = NULL;
-                    return 0;
-                }
-            }
-        }
-    }
+    memset(buf, 0, reserve);
+    mrp_data_encode_to(buf + reserve, size, data, descr);
 
-    *bufp = mb.buf;
-    return (size_t)(mb.p - mb.buf);
+    *bufp = buf;
+    return reserve + size;
 }
 
 
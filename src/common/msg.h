@@ -175,18 +175,57 @@ typedef enum {
 typedef MRP_MSG_VALUE_UNION mrp_msg_value_t;
 
 typedef struct {
-    mrp_list_hook_t hook;                /* hook to list of fields */
     uint16_t        tag;                 /* message field tag */
     uint16_t        type;                /* message field type */
+    uint16_t        borrowed;            /* data points into a receive buffer */
     MRP_MSG_VALUE_UNION;                 /* message field value */
-    uint32_t        size[0];             /* size, if an array or a blob */
+    uint32_t        size[1];             /* size, if an array or a blob */
 } mrp_msg_field_t;
 
 
+/*
+ * reference-counted receive buffers
+ *
+ * Messages can be decoded in place from a reference-counted receive buffer.
+ * The string and blob fields of such a message point directly into the
+ * buffer instead of being copied and the message holds a reference to the
+ * buffer for as long as it is alive. A transport can reuse its buffer once
+ * it is the only one holding a reference to it.
+ */
+
 typedef struct {
-    mrp_list_hook_t fields;              /* list of message fields */
-    size_t          nfield;              /* number of fields */
-    mrp_refcnt_t    refcnt;              /* reference count */
+    mrp_refcnt_t refcnt;                 /* reference count */
+    size_t       size;                   /* size of the buffer */
+    char         data[0];                /* buffer data */
+} mrp_rcvbuf_t;
+
+/** Create a new receive buffer of the given size. */
+mrp_rcvbuf_t *mrp_rcvbuf_create(size_t size);
+
+/** Increase the refcount of the given receive buffer. */
+mrp_rcvbuf_t *mrp_rcvbuf_ref(mrp_rcvbuf_t *buf);
+
+/** Decrease the refcount, free the buffer if refcount drops to zero. */
+void mrp_rcvbuf_unref(mrp_rcvbuf_t *buf);
+
+/** Check whether anyone else than the creator holds a reference. */
+static inline int mrp_rcvbuf_shared(mrp_rcvbuf_t *buf)
+{
+    return buf->refcnt > 1;
+}
+
+
+typedef struct mrp_msg_chunk_s mrp_msg_chunk_t;
+
+typedef struct {
+    mrp_msg_field_t *fields;             /* array of message fields */
+    size_t           nfield;             /* number of fields */
+    size_t           nalloc;             /* number of allocated fields */
+    mrp_refcnt_t     refcnt;             /* reference count */
+    mrp_rcvbuf_t    *buf;                /* buffer we were decoded from */
+    mrp_msg_chunk_t *chunks;             /* arena for strings, blobs, arrays */
+    uint32_t        *index;              /* sorted tag index, if any */
+    size_t           nindex;             /* number of indexed fields */
 } mrp_msg_t;
 
 
@@ -225,7 +264,8 @@ int mrp_msg_iterate_matching(mrp_msg_t *msg, void **it, uint16_t *tagp,
                              uint16_t *typep, mrp_msg_value_t *valp,
                              size_t *sizep);
 
-/** Find a field in a message. */
+/** Find a field in a message. The returned field is only valid until
+    the next field is added to the message. */
 mrp_msg_field_t *mrp_msg_find(mrp_msg_t *msg, uint16_t tag);
 
 /** Get the given fields (with matching tags and types) from the message. */
@@ -240,9 +280,18 @@ int mrp_msg_dump(mrp_msg_t *msg, FILE *fp);
 /** Encode the given message using the default message encoder. */
 ssize_t mrp_msg_default_encode(mrp_msg_t *msg, void **bufp);
 
+/** Encode the given message into buf. Returns the full encoded size, which
+    may be larger than size, in which case buf has not been filled in. Call
+    with a NULL buf to just calculate the encoded size. */
+ssize_t mrp_msg_default_encode_to(mrp_msg_t *msg, void *buf, size_t size);
+
 /** Decode the given message using the default message decoder. */
 mrp_msg_t *mrp_msg_default_decode(void *buf, size_t size);
 
+/** Decode the given message in place from the given receive buffer. */
+mrp_msg_t *mrp_msg_default_decode_inplace(mrp_rcvbuf_t *buf, void *data,
+                                          size_t size);
+
 
 /*
  * custom data types
@@ -335,6 +384,10 @@ typedef struct {
 size_t mrp_data_encode(void **bufp, void *data, mrp_data_descr_t *descr,
                        size_t reserve);
 
+/** Encode a structure into buf, like mrp_msg_default_encode_to. */
+ssize_t mrp_data_encode_to(void *buf, size_t size, void *data,
+                           mrp_data_descr_t *descr);
+
 /** Decode a structure using the given message descriptor. */
 void *mrp_data_decode(void **bufp, size_t *sizep, mrp_data_descr_t *descr);
 
@@ -52,25 +52,73 @@ typedef enum {
 
 
 /*
- * extra header we use to keep track of memory while decoding
+ * compiled codecs
+ *
+ * When a native type is registered, we compile it into a codec: a linear
+ * program with one instruction per member. Each instruction carries the
+ * precomputed TLV header of its member, the offset of the member within
+ * the native data, and the conversion needed between the native and the
+ * wire representation. The encoder and decoder simply run this program
+ * instead of interpreting the member descriptors. Arrays of types with an
+ * identical native and wire representation are copied with a single memcpy.
+ *
+ * Encoding first calculates the exact size of the encoded data, then
+ * encodes it into a buffer of that size. Decoding first validates the
+ * input and calculates the amount of memory needed for the decoded data,
+ * then decodes everything into a single allocation.
  */
 
-typedef struct {
-    mrp_list_hook_t hook;                /* hook to chunk list */
-    char            data[0];             /* user-visible data */
-} chunk_t;
+typedef enum {
+    OP_NONE = 0,                         /* unsupported member type */
+    OP_COPY,                             /* copy as such */
+    OP_BE16,                             /* 16-bit integer */
+    OP_BE32,                             /* 32-bit integer */
+    OP_BE64,                             /* 64-bit integer */
+    OP_INT32,                            /* signed integer as 32 bits */
+    OP_UINT32,                           /* unsigned integer as 32 bits */
+    OP_STRING,                           /* pointer to a string */
+    OP_INLINED,                          /* inlined string buffer */
+    OP_STRUCT,                           /* pointer to a native structure */
+    OP_ARRAY,                            /* an array */
+} opcode_t;
+
+typedef struct codec_s codec_t;
 
+typedef struct {
+    uint8_t      op;                     /* opcode for this member */
+    uint8_t      indirect;               /* accessed via a pointer */
+    uint8_t      inlined;                /* an inlined array */
+    uint8_t      kind;                   /* array size kind */
+    uint32_t     type;                   /* member type */
+    size_t       offs;                   /* offset within native data */
+    size_t       nsize;                  /* native size (of element) */
+    size_t       wsize;                  /* fixed wire size */
+    size_t       ewsize;                 /* minimum wire size of element */
+    char         hdr[8];                 /* precomputed member header */
+    uint8_t      eop;                    /* array element opcode */
+    uint32_t     eid;                    /* element or struct type id */
+    codec_t     *ecodec;                 /* element or struct codec */
+    size_t       nelem;                  /* number of elements if fixed */
+    uint32_t     count;                  /* index of size member if sized */
+    size_t       goffs;                  /* sentinel offset if guarded */
+    size_t       gsize;                  /* sentinel size if guarded */
+    mrp_value_t  sentinel;               /* sentinel value if guarded */
+} insn_t;
+
+struct codec_s {
+    mrp_native_type_t *type;             /* type compiled for */
+    insn_t            *insns;            /* instructions, one per member */
+    size_t             ninsn;            /* number of instructions */
+    size_t             fixed;            /* fixed part of encoded size */
+};
+
+#define DATA_ALIGN 8                     /* alignment of decoded data */
 
-static int encode_struct(mrp_tlv_t *tlv, void *data, mrp_native_type_t *t,
-                         mrp_typemap_t *idmap);
-static int decode_struct(mrp_tlv_t *tlv, mrp_list_hook_t **chunks,
-                         void **datap, uint32_t *idp, mrp_typemap_t *idmap);
 static int print_struct(char **buf, size_t *size, int level,
                         void *data, mrp_native_type_t *t);
 static void free_native(mrp_native_type_t *t);
-
-static void *alloc_chunk(mrp_list_hook_t **chunks, size_t size);
-static void free_chunks(mrp_list_hook_t *chunks);
+static codec_t *compile_type(mrp_native_type_t *t);
+static void free_codec(codec_t *c);
 
 
 /*
@@ -81,6 +129,7 @@ static MRP_LIST_HOOK(types);
 static int           ntype;
 
 static mrp_native_type_t **typetbl;
+static codec_t           **codectbl;
 
 
 static mrp_native_member_t *native_member(mrp_native_type_t *t, int idx)
@@ -286,7 +335,8 @@ static void register_default_types(void)
     mrp_list_append(&types, &(_type)->hook);    \
     typetbl[(_type)->id] = (_type)
 
-    if (mrp_reallocz(typetbl, 0, DEFAULT_NTYPE) == NULL) {
+    if (mrp_reallocz(typetbl, 0, DEFAULT_NTYPE) == NULL ||
+        mrp_reallocz(codectbl, 0, DEFAULT_NTYPE) == NULL) {
         mrp_log_error("Failed to initialize native type table.");
         abort();
     }
@@ -347,6 +397,7 @@ uint32_t mrp_register_native(mrp_native_type_t *type)
     mrp_native_type_t   *existing = find_type(type->name);
     mrp_native_type_t   *t, *elemt;
     mrp_native_member_t *s, *d, *m;
+    codec_t             *c;
     int                  idx;
 
     (void)member_type;
@@ -362,6 +413,7 @@ uint32_t mrp_register_native(mrp_native_type_t *type)
     if ((t = mrp_allocz(sizeof(*t))) == NULL)
         return MRP_INVALID_TYPE;
 
+    c = NULL;
     mrp_list_init(&t->hook);
     t->name = mrp_strdup(type->name);
 
@@ -499,17 +551,23 @@ uint32_t mrp_register_native(mrp_native_type_t *type)
         }
     }
 
-    if (mrp_reallocz(typetbl, ntype, ntype + 1) == NULL)
+    if ((c = compile_type(t)) == NULL)
+        goto fail;
+
+    if (mrp_reallocz(typetbl, ntype, ntype + 1) == NULL ||
+        mrp_reallocz(codectbl, ntype, ntype + 1) == NULL)
         goto fail;
 
     t->id = ntype;
     mrp_list_append(&types, &t->hook);
-    typetbl[ntype] = t;
+    typetbl[ntype]  = t;
+    codectbl[ntype] = c;
     ntype++;
 
     return t->id;
 
  fail:
+    free_codec(c);
     free_native(t);
 
     return MRP_INVALID_TYPE;
@@ -533,71 +591,6 @@ static void free_native(mrp_native_type_t *t)
 }
 
 
-static int encode_basic(mrp_tlv_t *tlv, mrp_type_t type, mrp_value_t *v)
-{
-    switch (type) {
-    case MRP_TYPE_INT8:    return mrp_tlv_push_int8  (tlv, TAG_NONE, v->s8);
-    case MRP_TYPE_UINT8:   return mrp_tlv_push_uint8 (tlv, TAG_NONE, v->u8);
-    case MRP_TYPE_INT16:   return mrp_tlv_push_int16 (tlv, TAG_NONE, v->s16);
-    case MRP_TYPE_UINT16:  return mrp_tlv_push_uint16(tlv, TAG_NONE, v->u16);
-    case MRP_TYPE_INT32:   return mrp_tlv_push_int32 (tlv, TAG_NONE, v->s32);
-    case MRP_TYPE_UINT32:  return mrp_tlv_push_uint32(tlv, TAG_NONE, v->u32);
-    case MRP_TYPE_INT64:   return mrp_tlv_push_int64 (tlv, TAG_NONE, v->s64);
-    case MRP_TYPE_UINT64:  return mrp_tlv_push_uint64(tlv, TAG_NONE, v->u64);
-    case MRP_TYPE_FLOAT:   return mrp_tlv_push_float (tlv, TAG_NONE, v->flt);
-    case MRP_TYPE_DOUBLE:  return mrp_tlv_push_double(tlv, TAG_NONE, v->dbl);
-    case MRP_TYPE_BOOL:    return mrp_tlv_push_bool  (tlv, TAG_NONE, v->bln);
-    case MRP_TYPE_STRING:  return mrp_tlv_push_string(tlv, TAG_NONE, v->str);
-
-    case MRP_TYPE_INT:
-        return mrp_tlv_push_int32 (tlv, TAG_NONE, (int32_t)v->i);
-    case MRP_TYPE_UINT:
-        return mrp_tlv_push_uint32(tlv, TAG_NONE, (uint32_t)v->ui);
-    case MRP_TYPE_SHORT:
-        return mrp_tlv_push_int32 (tlv, TAG_NONE, (int32_t)v->si);
-    case MRP_TYPE_USHORT:
-        return mrp_tlv_push_uint32(tlv, TAG_NONE, (uint32_t)v->usi);
-    case MRP_TYPE_SIZET:
-        return mrp_tlv_push_uint32(tlv, TAG_NONE, (uint32_t)v->sz);
-    case MRP_TYPE_SSIZET:
-        return mrp_tlv_push_int32 (tlv, TAG_NONE, (int32_t)v->ssz);
-
-    default:
-        return -1;
-    }
-}
-
-
-static inline int get_blob_size(void *base, mrp_native_type_t *t,
-                                mrp_native_blob_t *m, size_t *sizep)
-{
-    mrp_native_member_t *sizem;
-    mrp_value_t         *v;
-
-    if ((sizem = native_member(t, m->size.idx)) == NULL)
-        return -1;
-
-    if (sizem->any.layout == MRP_LAYOUT_INDIRECT)
-        v = *(void **)base;
-    else
-        v = base;
-
-    switch (sizem->any.type) {
-    case MRP_TYPE_INT8:   *sizep = v->s8;          return 0;
-    case MRP_TYPE_UINT8:  *sizep = v->u8;          return 0;
-    case MRP_TYPE_INT16:  *sizep = v->s16;         return 0;
-    case MRP_TYPE_UINT16: *sizep = v->u16;         return 0;
-    case MRP_TYPE_INT32:  *sizep = v->s32;         return 0;
-    case MRP_TYPE_UINT32: *sizep = v->u32;         return 0;
-    case MRP_TYPE_INT64:  *sizep = (size_t)v->s32; return 0;
-    case MRP_TYPE_UINT64: *sizep = (size_t)v->u32; return 0;
-    default:
-        errno = EINVAL;
-        return -1;
-    }
-}
-
-
 static int guard_offset_and_size(mrp_native_array_t *m, size_t *offsp,
                                  size_t *sizep)
 {
@@ -735,298 +728,322 @@ static int get_array_size(void *base, mrp_native_type_t *t, void *arrp,
 }
 
 
-static int terminate_guarded_array(void *elem, mrp_native_array_t *m,
-                                   mrp_native_type_t *mt)
-{
-    mrp_native_member_t *g;
+/*
+ * codec compilation
+ */
 
-    if (m->elem.id <= MRP_TYPE_STRING)
-        memcpy(elem, &m->sentinel, mt->size);
-    else if (m->elem.id > MRP_TYPE_STRUCT) {
-        if ((g = native_member(mt, m->size.idx)) == NULL)
-            return -1;
+static const struct {
+    uint8_t op;                          /* opcode */
+    uint8_t nsize;                       /* native size */
+    uint8_t wsize;                       /* wire size */
+} scalars[MRP_TYPE_STRING] = {
+    [MRP_TYPE_INT8]   = { OP_COPY  , sizeof(int8_t)        , 1 },
+    [MRP_TYPE_UINT8]  = { OP_COPY  , sizeof(uint8_t)       , 1 },
+    [MRP_TYPE_INT16]  = { OP_BE16  , sizeof(int16_t)       , 2 },
+    [MRP_TYPE_UINT16] = { OP_BE16  , sizeof(uint16_t)      , 2 },
+    [MRP_TYPE_INT32]  = { OP_BE32  , sizeof(int32_t)       , 4 },
+    [MRP_TYPE_UINT32] = { OP_BE32  , sizeof(uint32_t)      , 4 },
+    [MRP_TYPE_INT64]  = { OP_BE64  , sizeof(int64_t)       , 8 },
+    [MRP_TYPE_UINT64] = { OP_BE64  , sizeof(uint64_t)      , 8 },
+    [MRP_TYPE_FLOAT]  = { OP_COPY  , sizeof(float)         , sizeof(float)  },
+    [MRP_TYPE_DOUBLE] = { OP_COPY  , sizeof(double)        , sizeof(double) },
+    [MRP_TYPE_BOOL]   = { OP_COPY  , sizeof(bool)          , sizeof(bool)   },
+    [MRP_TYPE_INT]    = { OP_INT32 , sizeof(int)           , 4 },
+    [MRP_TYPE_UINT]   = { OP_UINT32, sizeof(unsigned int)  , 4 },
+    [MRP_TYPE_SHORT]  = { OP_INT32 , sizeof(short)         , 4 },
+    [MRP_TYPE_USHORT] = { OP_UINT32, sizeof(unsigned short), 4 },
+    [MRP_TYPE_SIZET]  = { OP_UINT32, sizeof(size_t)        , 4 },
+    [MRP_TYPE_SSIZET] = { OP_INT32 , sizeof(ssize_t)       , 4 },
+};
+
+
+static inline int scalar_type(uint32_t type)
+{
+    return type < MRP_TYPE_STRING && scalars[type].op != OP_NONE;
+}
 
-        memcpy(elem + g->any.offs, &m->sentinel, type_size(g->any.type));
-    }
 
-    return 0;
+static inline codec_t *lookup_codec(uint32_t id)
+{
+    if (MRP_TYPE_STRUCT < id && id < (uint32_t)ntype)
+        return codectbl[id];
+    else
+        return NULL;
 }
 
 
-static int encode_array(mrp_tlv_t *tlv, void *arrp, mrp_native_array_t *m,
-                        size_t nelem, size_t elem_size, mrp_typemap_t *idmap)
+static inline char *put_tag(char *p, uint32_t tag, uint32_t v)
 {
-    mrp_native_type_t *t;
-    mrp_value_t       *v;
-    void              *elem;
-    size_t             i;
+    tag = htobe32(tag);
+    v   = htobe32(v);
 
-    if (mrp_tlv_push_uint32(tlv, TAG_ARRAY, map_type(m->elem.id, idmap)) < 0)
-        return -1;
+    memcpy(p, &tag, sizeof(tag));
+    memcpy(p + sizeof(tag), &v, sizeof(v));
 
-    if (mrp_tlv_push_uint32(tlv, TAG_NELEM, nelem) < 0)
-        return -1;
+    return p + sizeof(tag) + sizeof(v);
+}
 
-    if ((t = lookup_type(m->elem.id)) == NULL)
+
+static int compile_array(codec_t *c, insn_t *in, mrp_native_array_t *a)
+{
+    mrp_native_type_t *et;
+
+    if ((et = lookup_type(a->elem.id)) == NULL)
         return -1;
 
-    for (i = 0, elem = arrp; i < nelem; i++, elem += elem_size) {
-        v = elem;
+    in->op      = OP_ARRAY;
+    in->inlined = (a->layout == MRP_LAYOUT_INLINED);
+    in->kind    = a->kind;
+    in->eid     = a->elem.id;
+    in->nsize   = et->size;
 
-        switch (t->id) {
-        case MRP_TYPE_STRING:
-            v = *(void **)elem;
-        case MRP_TYPE_INT8:
-        case MRP_TYPE_UINT8:
-        case MRP_TYPE_INT16:
-        case MRP_TYPE_UINT16:
-        case MRP_TYPE_INT32:
-        case MRP_TYPE_UINT32:
-        case MRP_TYPE_INT64:
-        case MRP_TYPE_UINT64:
-        case MRP_TYPE_FLOAT:
-        case MRP_TYPE_DOUBLE:
-        case MRP_TYPE_BOOL:
-        case MRP_TYPE_INT:
-        case MRP_TYPE_UINT:
-        case MRP_TYPE_SHORT:
-        case MRP_TYPE_USHORT:
-        case MRP_TYPE_SIZET:
-        case MRP_TYPE_SSIZET:
-            if (encode_basic(tlv, t->id, v) < 0)
-                return -1;
-            break;
+    if (scalar_type(et->id)) {
+        in->eop    = scalars[et->id].op;
+        in->ewsize = scalars[et->id].wsize;
+    }
+    else if (et->id == MRP_TYPE_STRING) {
+        in->eop    = OP_STRING;
+        in->ewsize = sizeof(uint32_t);
+    }
+    else if (et->id > MRP_TYPE_STRUCT) {
+        in->eop    = OP_STRUCT;
+        in->ewsize = 2 * sizeof(uint32_t);
+        in->ecodec = lookup_codec(et->id);
 
-        case MRP_TYPE_BLOB: /* XXX TODO implement blobs */
+        if (in->ecodec == NULL)
             return -1;
+    }
+    else {
+        in->eop    = OP_NONE;            /* XXX TODO: blobs, nested arrays */
+        in->ewsize = 1;
+    }
 
-        case MRP_TYPE_ARRAY:
+    switch (a->kind) {
+    case MRP_ARRAY_SIZE_FIXED:
+        in->nelem = a->size.nelem;
+        break;
+
+    case MRP_ARRAY_SIZE_EXPLICIT:
+        /* size members are always registered before their arrays */
+        if (a->size.idx >= (uint32_t)(in - c->insns))
             return -1;
 
-        default:
-            /* an MRP_TYPE_STRUCT */
-            if (encode_struct(tlv, elem, t, idmap) < 0)
-                return -1;
+        in->count = a->size.idx;
+
+        switch (c->type->members[in->count].any.type) {
+        case MRP_TYPE_INT8:  case MRP_TYPE_UINT8:
+        case MRP_TYPE_INT16: case MRP_TYPE_UINT16:
+        case MRP_TYPE_INT32: case MRP_TYPE_UINT32:
+        case MRP_TYPE_INT64: case MRP_TYPE_UINT64:
+        case MRP_TYPE_INT:   case MRP_TYPE_UINT:
+        case MRP_TYPE_SHORT: case MRP_TYPE_USHORT:
+        case MRP_TYPE_SIZET: case MRP_TYPE_SSIZET:
             break;
+        default:
+            errno = EINVAL;
+            return -1;
         }
+        break;
+
+    case MRP_ARRAY_SIZE_GUARDED:
+        if (guard_offset_and_size(a, &in->goffs, &in->gsize) < 0)
+            return -1;
+        if (in->goffs + in->gsize > in->nsize ||
+            in->gsize > sizeof(in->sentinel))
+            return -1;
+        in->sentinel = a->sentinel;
+        break;
+
+    default:
+        return -1;
     }
 
+    /* we only know the capacity of fixed inlined arrays */
+    if (in->inlined && a->kind != MRP_ARRAY_SIZE_FIXED)
+        in->eop = OP_NONE;
+
     return 0;
 }
 
 
-static int encode_struct(mrp_tlv_t *tlv, void *data, mrp_native_type_t *t,
-                         mrp_typemap_t *idmap)
+static codec_t *compile_type(mrp_native_type_t *t)
 {
     mrp_native_member_t *m;
-    mrp_native_type_t   *mt;
-    mrp_value_t         *v;
-    uint32_t             idx;
-    size_t               size, nelem;
+    codec_t             *c;
+    insn_t              *in;
+    size_t               i;
 
-    if (t == NULL)
-        return -1;
+    if ((c = mrp_allocz(sizeof(*c))) == NULL)
+        return NULL;
 
-    if (mrp_tlv_push_uint32(tlv, TAG_STRUCT, map_type(t->id, idmap)) < 0)
-        return -1;
+    c->insns = mrp_allocz_array(insn_t, t->nmember);
 
-    for (idx = 0, m = t->members; idx < t->nmember; idx++, m++) {
-        if (mrp_tlv_push_uint32(tlv, TAG_MEMBER, idx) < 0)
-            return -1;
+    if (c->insns == NULL && t->nmember != 0)
+        goto fail;
 
-        if (m->any.layout == MRP_LAYOUT_INDIRECT)
-            v = *(void **)(data + m->any.offs);
-        else
-            v = data + m->any.offs;
+    c->type  = t;
+    c->ninsn = t->nmember;
+    c->fixed = 2 * sizeof(uint32_t);
+
+    m  = t->members;
+    in = c->insns;
+
+    for (i = 0; i < t->nmember; i++, m++, in++) {
+        in->type = m->any.type;
+        in->offs = m->any.offs;
+        put_tag(in->hdr, TAG_MEMBER, i);
+
+        c->fixed += sizeof(in->hdr);
+
+        if (scalar_type(m->any.type)) {
+            in->op       = scalars[m->any.type].op;
+            in->nsize    = scalars[m->any.type].nsize;
+            in->wsize    = scalars[m->any.type].wsize;
+            in->indirect = (m->any.layout == MRP_LAYOUT_INDIRECT);
+            c->fixed    += in->wsize;
+            continue;
+        }
 
         switch (m->any.type) {
-        case MRP_TYPE_INT8:
-        case MRP_TYPE_UINT8:
-        case MRP_TYPE_INT16:
-        case MRP_TYPE_UINT16:
-        case MRP_TYPE_INT32:
-        case MRP_TYPE_UINT32:
-        case MRP_TYPE_INT64:
-        case MRP_TYPE_UINT64:
-        case MRP_TYPE_FLOAT:
-        case MRP_TYPE_DOUBLE:
-        case MRP_TYPE_BOOL:
         case MRP_TYPE_STRING:
-        case MRP_TYPE_INT:
-        case MRP_TYPE_UINT:
-        case MRP_TYPE_SHORT:
-        case MRP_TYPE_USHORT:
-        case MRP_TYPE_SIZET:
-        case MRP_TYPE_SSIZET:
-            if (encode_basic(tlv, m->any.type, v) < 0)
-                return -1;
+            if (m->any.layout == MRP_LAYOUT_INLINED) {
+                in->op    = OP_INLINED;
+                in->nsize = m->str.size;
+            }
+            else {
+                in->op    = OP_STRING;
+                in->nsize = sizeof(char *);
+            }
+            in->wsize = sizeof(uint32_t);
             break;
 
-        case MRP_TYPE_BLOB: /* XXX TODO implement blobs */
-            if (get_blob_size(data, t, &m->blob, &size) < 0)
-                return -1;
-            return -1;
+        case MRP_TYPE_STRUCT:
+            in->op     = OP_STRUCT;
+            in->eid    = m->strct.data_type.id;
+            in->ecodec = lookup_codec(in->eid);
+            in->wsize  = 0;
 
-        case MRP_TYPE_ARRAY:
-            if (get_array_size(data, t, v->ptr, &m->array, &nelem, &size) < 0)
-                return -1;
-            if (encode_array(tlv, v->ptr, &m->array, nelem,
-                             size, idmap) < 0)
-                return -1;
+            if (in->ecodec == NULL)
+                goto fail;
             break;
 
-        case MRP_TYPE_STRUCT:
-            if ((mt = lookup_type(m->strct.data_type.id)) == NULL)
-                return -1;
-            if (encode_struct(tlv, v->ptr, mt, idmap) < 0)
-                return -1;
+        case MRP_TYPE_ARRAY:
+            if (compile_array(c, in, &m->array) < 0)
+                goto fail;
+            in->wsize = 4 * sizeof(uint32_t);
             break;
 
-        default:
-            return -1;
+        default:                         /* XXX TODO: implement blobs */
+            in->op    = OP_NONE;
+            in->wsize = 0;
+            break;
         }
+
+        c->fixed += in->wsize;
     }
 
-    return 0;
+    return c;
+
+ fail:
+    free_codec(c);
+    return NULL;
 }
 
 
-int mrp_encode_native(void *data, uint32_t id, size_t reserve, void **bufp,
-                      size_t *sizep, mrp_typemap_t *idmap)
+static void free_codec(codec_t *c)
 {
-    mrp_native_type_t *t = lookup_type(id);
-    mrp_tlv_t          tlv;
-
-    *bufp  = NULL;
-    *sizep = 0;
-
-    if (t == NULL)
-        return -1;
-
-    if (mrp_tlv_setup_write(&tlv, reserve + 4096) < 0)
-        return -1;
+    if (c != NULL) {
+        mrp_free(c->insns);
+        mrp_free(c);
+    }
+}
 
-    if (reserve > 0)
-        if (mrp_tlv_reserve(&tlv, reserve, 1) == NULL)
-            goto fail;
 
-    if (encode_struct(&tlv, data, t, idmap) < 0)
-        goto fail;
+/*
+ * encoding
+ */
 
-    mrp_tlv_trim(&tlv);
-    mrp_tlv_steal(&tlv, bufp, sizep);
+static inline int64_t get_signed(const void *v, size_t size)
+{
+    switch (size) {
+    case sizeof(int8_t):  return *(const int8_t  *)v;
+    case sizeof(int16_t): return *(const int16_t *)v;
+    case sizeof(int32_t): return *(const int32_t *)v;
+    default:              return *(const int64_t *)v;
+    }
+}
 
-    return 0;
 
- fail:
-    mrp_tlv_cleanup(&tlv);
-    return -1;
+static inline uint64_t get_unsigned(const void *v, size_t size)
+{
+    switch (size) {
+    case sizeof(uint8_t):  return *(const uint8_t  *)v;
+    case sizeof(uint16_t): return *(const uint16_t *)v;
+    case sizeof(uint32_t): return *(const uint32_t *)v;
+    default:               return *(const uint64_t *)v;
+    }
 }
 
 
-static void *allocate_indirect(mrp_list_hook_t **chunks, mrp_value_t *v,
-                               mrp_native_member_t *m, mrp_typemap_t *idmap)
+static ssize_t get_count(void *data, codec_t *c, insn_t *in)
 {
-    size_t size;
+    insn_t  *cin = c->insns + in->count;
+    void    *v   = data + cin->offs;
+    int64_t  n;
+
+    if (cin->indirect && (v = *(void **)v) == NULL)
+        return -1;
 
-    switch (m->any.type) {
+    switch (cin->type) {
     case MRP_TYPE_INT8:
-    case MRP_TYPE_UINT8:
-        return (v->ptr = alloc_chunk(chunks, sizeof(int8_t)));
     case MRP_TYPE_INT16:
-    case MRP_TYPE_UINT16:
-        return (v->ptr = alloc_chunk(chunks, sizeof(int16_t)));
     case MRP_TYPE_INT32:
-    case MRP_TYPE_UINT32:
-        return (v->ptr = alloc_chunk(chunks, sizeof(int32_t)));
     case MRP_TYPE_INT64:
-    case MRP_TYPE_UINT64:
-        return (v->ptr = alloc_chunk(chunks, sizeof(int64_t)));
-    case MRP_TYPE_FLOAT:
-        return (v->ptr = alloc_chunk(chunks, sizeof(float)));
-    case MRP_TYPE_DOUBLE:
-        return (v->ptr = alloc_chunk(chunks, sizeof(double)));
-    case MRP_TYPE_BOOL:
-        return (v->ptr = alloc_chunk(chunks, sizeof(bool)));
-    case MRP_TYPE_STRING:
-        return v;                        /* will be allocated by TLV pull */
-    case MRP_TYPE_BLOB:
-        return v;                        /* will be allocated by decoder */
-    case MRP_TYPE_ARRAY:
-        return v;                        /* will be allocated by decoder */
-    case MRP_TYPE_STRUCT:
-        if ((size = type_size(mapped_type(m->strct.data_type.id, idmap))) == 0)
-            return NULL;
-        return (v->ptr = alloc_chunk(chunks, size));
+    case MRP_TYPE_INT:
+    case MRP_TYPE_SHORT:
+    case MRP_TYPE_SSIZET:
+        n = get_signed(v, cin->nsize);
+        break;
     default:
-        return NULL;
+        n = (int64_t)get_unsigned(v, cin->nsize);
+        break;
     }
-}
 
+    if (n < 0 || n > INT32_MAX)
+        return -1;
 
-static void *alloc_str_chunk(size_t size, void *chunksp)
-{
-    return alloc_chunk((mrp_list_hook_t **)chunksp, size);
+    return (ssize_t)n;
 }
 
 
-static int decode_basic(mrp_tlv_t *tlv, mrp_list_hook_t **chunks,
-                        mrp_type_t type, mrp_value_t *v)
+static ssize_t array_size(void *data, codec_t *c, insn_t *in, void **arrp)
 {
-    int32_t  i;
-    uint32_t u;
+    void   *arr, *g;
+    size_t  n;
 
-    switch (type) {
-    case MRP_TYPE_INT8:    return mrp_tlv_pull_int8  (tlv, TAG_NONE, &v->s8);
-    case MRP_TYPE_UINT8:   return mrp_tlv_pull_uint8 (tlv, TAG_NONE, &v->u8);
-    case MRP_TYPE_INT16:   return mrp_tlv_pull_int16 (tlv, TAG_NONE, &v->s16);
-    case MRP_TYPE_UINT16:  return mrp_tlv_pull_uint16(tlv, TAG_NONE, &v->u16);
-    case MRP_TYPE_INT32:   return mrp_tlv_pull_int32 (tlv, TAG_NONE, &v->s32);
-    case MRP_TYPE_UINT32:  return mrp_tlv_pull_uint32(tlv, TAG_NONE, &v->u32);
-    case MRP_TYPE_INT64:   return mrp_tlv_pull_int64 (tlv, TAG_NONE, &v->s64);
-    case MRP_TYPE_UINT64:  return mrp_tlv_pull_uint64(tlv, TAG_NONE, &v->u64);
-    case MRP_TYPE_FLOAT:   return mrp_tlv_pull_float (tlv, TAG_NONE, &v->flt);
-    case MRP_TYPE_DOUBLE:  return mrp_tlv_pull_double(tlv, TAG_NONE, &v->dbl);
-    case MRP_TYPE_BOOL:    return mrp_tlv_pull_bool  (tlv, TAG_NONE, &v->bln);
-    case MRP_TYPE_STRING:
-        return mrp_tlv_pull_string(tlv, TAG_NONE, &v->strp,
-                                   -1, alloc_str_chunk, chunks);
+    if (in->inlined)
+        arr = data + in->offs;
+    else
+        arr = *(void **)(data + in->offs);
 
-    case MRP_TYPE_INT:
-        if (mrp_tlv_pull_int32(tlv, TAG_NONE, &i) < 0)
-            return -1;
-        v->i = (int)i;
-        return 0;
+    *arrp = arr;
 
-    case MRP_TYPE_UINT:
-        if (mrp_tlv_pull_uint32(tlv, TAG_NONE, &u) < 0)
-            return -1;
-        v->ui = (unsigned int)u;
-        return 0;
+    switch (in->kind) {
+    case MRP_ARRAY_SIZE_FIXED:
+        return in->nelem;
 
-    case MRP_TYPE_SHORT:
-        if (mrp_tlv_pull_int32(tlv, TAG_NONE, &i) < 0)
-            return -1;
-        v->si = (short)i;
-        return 0;
+    case MRP_ARRAY_SIZE_EXPLICIT:
+        return get_count(data, c, in);
 
-    case MRP_TYPE_USHORT:
-        if (mrp_tlv_pull_uint32(tlv, TAG_NONE, &u) < 0)
-            return -1;
-        v->usi = (unsigned short)u;
-        return 0;
+    case MRP_ARRAY_SIZE_GUARDED:
+        if (arr == NULL)
+            return 0;
 
-    case MRP_TYPE_SIZET:
-        if (mrp_tlv_pull_uint32(tlv, TAG_NONE, &u) < 0)
-            return -1;
-        v->sz = (size_t)u;
-        return 0;
+        g = arr + in->goffs;
+        for (n = 0; memcmp(g, &in->sentinel, in->gsize); n++)
+            g += in->nsize;
 
-    case MRP_TYPE_SSIZET:
-        if (mrp_tlv_pull_int32(tlv, TAG_NONE, &i) < 0)
-            return -1;
-        v->ssz = (ssize_t)i;
-        return 0;
+        return n;
 
     default:
         return -1;
@@ -1034,217 +1051,650 @@ static int decode_basic(mrp_tlv_t *tlv, mrp_list_hook_t **chunks,
 }
 
 
-static int decode_array(mrp_tlv_t *tlv, mrp_list_hook_t **chunks,
-                        void **arrp, mrp_native_array_t *m,
-                        void *data, mrp_native_type_t *t,
-                        mrp_typemap_t *idmap)
+static ssize_t encoded_size(void *data, codec_t *c)
 {
-    mrp_native_type_t *mt;
-    mrp_value_t       *v;
-    void              *elem, *base;
-    size_t             elem_size, i;
-    uint32_t           id, nelem;
-    int                n, guard;
+    insn_t   *in, *end;
+    void     *v, *arr;
+    char    **strs;
+    size_t    size;
+    ssize_t   n, i, s;
+
+    size = c->fixed;
+
+    for (in = c->insns, end = in + c->ninsn; in < end; in++) {
+        v = data + in->offs;
+
+        switch (in->op) {
+        case OP_COPY:
+        case OP_BE16:
+        case OP_BE32:
+        case OP_BE64:
+        case OP_INT32:
+        case OP_UINT32:
+            if (in->indirect && *(void **)v == NULL)
+                return -1;
+            break;
 
-    if (mrp_tlv_pull_uint32(tlv, TAG_ARRAY, &id) < 0)
-        return -1;
+        case OP_STRING:
+            if (*(char **)v != NULL)
+                size += strlen(*(char **)v) + 1;
+            break;
 
-    if ((id = mapped_type(id, idmap)) != m->elem.id)
-        return -1;
+        case OP_INLINED:
+            size += strnlen(v, in->nsize) + 1;
+            break;
 
-    if ((elem_size = type_size(id)) == 0)
-        return -1;
+        case OP_STRUCT:
+            if (*(void **)v == NULL)
+                return -1;
+            if ((s = encoded_size(*(void **)v, in->ecodec)) < 0)
+                return -1;
+            size += s;
+            break;
 
-    if (mrp_tlv_pull_uint32(tlv, TAG_NELEM, &nelem) < 0)
-        return -1;
+        case OP_ARRAY:
+            if ((n = array_size(data, c, in, &arr)) <= 0) {
+                if (n < 0)
+                    return -1;
+                break;
+            }
 
-    if ((mt = lookup_type(m->elem.id)) == NULL)
-        return -1;
+            if (arr == NULL)
+                return -1;
 
-    switch (m->kind) {
-    case MRP_ARRAY_SIZE_EXPLICIT:
-        if ((n = get_explicit_array_size(data, t, m)) < 0)
+            switch (in->eop) {
+            case OP_STRING:
+                size += n * sizeof(uint32_t);
+                for (i = 0, strs = arr; i < n; i++)
+                    if (strs[i] != NULL)
+                        size += strlen(strs[i]) + 1;
+                break;
+
+            case OP_STRUCT:
+                for (i = 0; i < n; i++, arr += in->nsize) {
+                    if ((s = encoded_size(arr, in->ecodec)) < 0)
+                        return -1;
+                    size += s;
+                }
+                break;
+
+            case OP_NONE:
+                return -1;
+
+            default:
+                size += n * in->ewsize;
+                break;
+            }
+            break;
+
+        default:
             return -1;
-        guard = 0;
+        }
+    }
+
+    return size;
+}
+
+
+static inline char *put_value(char *p, int op, size_t nsize, const void *v)
+{
+    uint16_t u16;
+    uint32_t u32;
+    uint64_t u64;
+
+    switch (op) {
+    case OP_COPY:
+        memcpy(p, v, nsize);
+        return p + nsize;
+
+    case OP_BE16:
+        u16 = htobe16(*(const uint16_t *)v);
+        memcpy(p, &u16, sizeof(u16));
+        return p + sizeof(u16);
+
+    case OP_BE64:
+        u64 = htobe64(*(const uint64_t *)v);
+        memcpy(p, &u64, sizeof(u64));
+        return p + sizeof(u64);
+
+    case OP_BE32:
+        u32 = htobe32(*(const uint32_t *)v);
         break;
-    case MRP_ARRAY_SIZE_FIXED:
-        n     = m->size.nelem;
-        guard = 0;
+    case OP_INT32:
+        u32 = htobe32((uint32_t)(int32_t)get_signed(v, nsize));
         break;
-    case MRP_ARRAY_SIZE_GUARDED:
-        n     = nelem;
-        guard = 1;
+    case OP_UINT32:
+        u32 = htobe32((uint32_t)get_unsigned(v, nsize));
         break;
+
     default:
-        return -1;
+        return p;
     }
 
-    if (n != (int)nelem)
-        return -1;
+    memcpy(p, &u32, sizeof(u32));
+    return p + sizeof(u32);
+}
+
 
-    switch (m->layout) {
-    case MRP_LAYOUT_INLINED:
-        base = (void *)arrp;
+static inline char *put_string(char *p, const char *str, size_t len)
+{
+    uint32_t l = htobe32((uint32_t)len);
+
+    memcpy(p, &l, sizeof(l));
+    p += sizeof(l);
+
+    if (len > 0) {
+        memcpy(p, str, len - 1);
+        p[len - 1] = '\0';
+        p += len;
+    }
+
+    return p;
+}
+
+
+static char *encode_struct(char *p, void *data, codec_t *c, uint32_t id,
+                           mrp_typemap_t *idmap);
+
+static char *encode_array(char *p, void *data, codec_t *c, insn_t *in,
+                          mrp_typemap_t *idmap)
+{
+    void     *arr;
+    char    **strs;
+    size_t    n, i;
+    uint32_t  id;
+
+    n = (size_t)array_size(data, c, in, &arr);
+    p = put_tag(p, TAG_ARRAY, map_type(in->eid, idmap));
+    p = put_tag(p, TAG_NELEM, n);
+
+    if (n == 0)
+        return p;
+
+    switch (in->eop) {
+    case OP_COPY:
+        memcpy(p, arr, n * in->nsize);
+        p += n * in->nsize;
         break;
-    case MRP_LAYOUT_INDIRECT:
-    case MRP_LAYOUT_DEFAULT:
-        if ((*arrp = alloc_chunk(chunks, (nelem + guard) * elem_size)) == NULL)
-            return (nelem + guard) ? -1 : 0;
-        base = *arrp;
+
+    case OP_STRING:
+        for (i = 0, strs = arr; i < n; i++)
+            p = put_string(p, strs[i], strs[i] ? strlen(strs[i]) + 1 : 0);
         break;
+
+    case OP_STRUCT:
+        id = map_type(in->eid, idmap);
+        for (i = 0; i < n; i++, arr += in->nsize)
+            p = encode_struct(p, arr, in->ecodec, id, idmap);
+        break;
+
     default:
-        return -1;
+        for (i = 0; i < n; i++, arr += in->nsize)
+            p = put_value(p, in->eop, in->nsize, arr);
+        break;
     }
 
-    for (i = 0, elem = base; i < nelem; i++, elem += elem_size) {
-        v = elem;
+    return p;
+}
 
-        switch (mt->id) {
-        case MRP_TYPE_INT8:
-        case MRP_TYPE_UINT8:
-        case MRP_TYPE_INT16:
-        case MRP_TYPE_UINT16:
-        case MRP_TYPE_INT32:
-        case MRP_TYPE_UINT32:
-        case MRP_TYPE_INT64:
-        case MRP_TYPE_UINT64:
-        case MRP_TYPE_FLOAT:
-        case MRP_TYPE_DOUBLE:
-        case MRP_TYPE_BOOL:
-        case MRP_TYPE_STRING:
-        case MRP_TYPE_INT:
-        case MRP_TYPE_UINT:
-        case MRP_TYPE_SHORT:
-        case MRP_TYPE_USHORT:
-        case MRP_TYPE_SIZET:
-        case MRP_TYPE_SSIZET:
-            if (decode_basic(tlv, chunks, mt->id, v) < 0)
-                return -1;
+
+static char *encode_struct(char *p, void *data, codec_t *c, uint32_t id,
+                           mrp_typemap_t *idmap)
+{
+    insn_t *in, *end;
+    void   *v;
+    char   *str;
+
+    p = put_tag(p, TAG_STRUCT, id);
+
+    for (in = c->insns, end = in + c->ninsn; in < end; in++) {
+        memcpy(p, in->hdr, sizeof(in->hdr));
+        p += sizeof(in->hdr);
+        v  = data + in->offs;
+
+        switch (in->op) {
+        case OP_STRING:
+            str = *(char **)v;
+            p   = put_string(p, str, str ? strlen(str) + 1 : 0);
             break;
 
-        case MRP_TYPE_BLOB: /* XXX TODO implement blobs */
-            return -1;
+        case OP_INLINED:
+            p = put_string(p, v, strnlen(v, in->nsize) + 1);
+            break;
 
-        case MRP_TYPE_ARRAY:
-            return -1;
+        case OP_STRUCT:
+            p = encode_struct(p, *(void **)v, in->ecodec,
+                              map_type(in->eid, idmap), idmap);
+            break;
+
+        case OP_ARRAY:
+            p = encode_array(p, data, c, in, idmap);
+            break;
 
         default:
-            /* an MRP_TYPE_STRUCT */
-            if (decode_struct(tlv, chunks, &elem, &id, idmap) < 0)
-                return -1;
+            if (in->indirect)
+                v = *(void **)v;
+            p = put_value(p, in->op, in->nsize, v);
+            break;
         }
     }
 
-    if (guard) {
-        if (terminate_guarded_array(elem, m, mt) < 0)
-            return -1;
+    return p;
+}
+
+
+int mrp_encode_native(void *data, uint32_t id, size_t reserve, void **bufp,
+                      size_t *sizep, mrp_typemap_t *idmap)
+{
+    codec_t *c = lookup_codec(id);
+    char    *buf;
+    ssize_t  size;
+
+    *bufp  = NULL;
+    *sizep = 0;
+
+    if (c == NULL || data == NULL) {
+        errno = EINVAL;
+        return -1;
+    }
+
+    if ((size = encoded_size(data, c)) < 0) {
+        errno = EINVAL;
+        return -1;
     }
 
+    if ((buf = mrp_alloc(reserve + size)) == NULL)
+        return -1;
+
+    memset(buf, 0, reserve);
+    encode_struct(buf + reserve, data, c, map_type(id, idmap), idmap);
+
+    *bufp  = buf;
+    *sizep = reserve + size;
+
     return 0;
 }
 
 
-static int decode_struct(mrp_tlv_t *tlv, mrp_list_hook_t **chunks,
-                         void **datap, uint32_t *idp, mrp_typemap_t *idmap)
+/*
+ * decoding
+ */
+
+typedef struct {
+    const char    *p;                    /* input read pointer */
+    const char    *end;                  /* end of input */
+    char          *out;                  /* next free decoded data */
+    size_t         size;                 /* amount of data needed */
+    mrp_typemap_t *idmap;                /* type id mapping */
+} decoder_t;
+
+
+static inline size_t data_size(size_t size)
 {
-    mrp_native_type_t   *t;
-    mrp_native_member_t *m;
-    mrp_value_t         *v;
-    char                *str, **strp;
-    size_t               max, i;
-    uint32_t             idx, id;
+    return MRP_ALIGN(size, DATA_ALIGN);
+}
+
+
+static inline uint32_t get_u32(const char *p)
+{
+    uint32_t v;
+
+    memcpy(&v, p, sizeof(v));
 
-    if (datap == NULL) {
-        errno = EFAULT;
+    return be32toh(v);
+}
+
+
+static inline int check_input(decoder_t *d, size_t size)
+{
+    return (size_t)(d->end - d->p) >= size ? 0 : -1;
+}
+
+
+static int check_tag(decoder_t *d, uint32_t tag, uint32_t *vp)
+{
+    if (check_input(d, 2 * sizeof(uint32_t)) < 0 || get_u32(d->p) != tag)
         return -1;
-    }
 
-    if (mrp_tlv_pull_uint32(tlv, TAG_STRUCT, &id) < 0)
+    *vp   = get_u32(d->p + sizeof(uint32_t));
+    d->p += 2 * sizeof(uint32_t);
+
+    return 0;
+}
+
+
+static int check_type(decoder_t *d, uint32_t tag, uint32_t id)
+{
+    uint32_t mapped;
+
+    if (check_tag(d, tag, &mapped) < 0)
         return -1;
-    else
-        id = mapped_type(id, idmap);
 
-    if (*idp) {
-        if (*idp != id) {
-            errno = EINVAL;
+    return mapped_type(mapped, d->idmap) == id ? 0 : -1;
+}
+
+
+static int check_string(decoder_t *d, size_t max, size_t *lenp)
+{
+    size_t len;
+
+    if (check_input(d, sizeof(uint32_t)) < 0)
+        return -1;
+
+    len   = get_u32(d->p);
+    d->p += sizeof(uint32_t);
+
+    if (len > max || check_input(d, len) < 0)
+        return -1;
+
+    d->p  += len;
+    *lenp  = len;
+
+    return 0;
+}
+
+
+static int check_struct(decoder_t *d, codec_t *c);
+
+static int check_array(decoder_t *d, insn_t *in)
+{
+    uint32_t n;
+    size_t   guard, len, i;
+
+    if (check_type(d, TAG_ARRAY, in->eid) < 0)
+        return -1;
+
+    if (check_tag(d, TAG_NELEM, &n) < 0)
+        return -1;
+
+    if (in->kind == MRP_ARRAY_SIZE_FIXED && n != in->nelem)
+        return -1;
+
+    if (n > 0 && in->eop == OP_NONE)
+        return -1;
+
+    if (n > (size_t)(d->end - d->p) / in->ewsize)
+        return -1;
+
+    guard = (in->kind == MRP_ARRAY_SIZE_GUARDED);
+
+    if (!in->inlined) {
+        if (n + guard > (size_t)-1 / in->nsize)
             return -1;
+
+        d->size += data_size((n + guard) * in->nsize);
+    }
+
+    switch (in->eop) {
+    case OP_STRING:
+        for (i = 0; i < n; i++) {
+            if (check_string(d, (size_t)-1, &len) < 0)
+                return -1;
+            d->size += data_size(len);
         }
+        break;
+
+    case OP_STRUCT:
+        for (i = 0; i < n; i++)
+            if (check_type(d, TAG_STRUCT, in->eid) < 0 ||
+                check_struct(d, in->ecodec) < 0)
+                return -1;
+        break;
+
+    default:
+        d->p += n * in->ewsize;
+        break;
     }
-    else
-        *idp = id;
 
-    if ((t = lookup_type(id)) == NULL)
-        return -1;
+    return 0;
+}
 
-    if (*datap == NULL)
-        if ((*datap = alloc_chunk(chunks, t->size)) == NULL)
-            return -1;
 
-    for (i = 0, m = t->members; i < t->nmember; i++, m++) {
-        if (mrp_tlv_pull_uint32(tlv, TAG_MEMBER, &idx) < 0)
+static int check_struct(decoder_t *d, codec_t *c)
+{
+    insn_t *in, *end;
+    size_t  len;
+
+    for (in = c->insns, end = in + c->ninsn; in < end; in++) {
+        if (check_input(d, sizeof(in->hdr)) < 0 ||
+            memcmp(d->p, in->hdr, sizeof(in->hdr)) != 0)
             return -1;
 
-        v = *datap + m->any.offs;
+        d->p += sizeof(in->hdr);
 
-        if (m->any.layout == MRP_LAYOUT_INDIRECT) {
-            if ((v = allocate_indirect(chunks, v, m, idmap)) == NULL)
+        switch (in->op) {
+        case OP_COPY:
+        case OP_BE16:
+        case OP_BE32:
+        case OP_BE64:
+        case OP_INT32:
+        case OP_UINT32:
+            if (check_input(d, in->wsize) < 0)
                 return -1;
-        }
+            d->p += in->wsize;
+            if (in->indirect)
+                d->size += data_size(in->nsize);
+            break;
 
-        switch (m->any.type) {
-        case MRP_TYPE_INT8:
-        case MRP_TYPE_UINT8:
-        case MRP_TYPE_INT16:
-        case MRP_TYPE_UINT16:
-        case MRP_TYPE_INT32:
-        case MRP_TYPE_UINT32:
-        case MRP_TYPE_INT64:
-        case MRP_TYPE_UINT64:
-        case MRP_TYPE_FLOAT:
-        case MRP_TYPE_DOUBLE:
-        case MRP_TYPE_BOOL:
-        case MRP_TYPE_INT:
-        case MRP_TYPE_UINT:
-        case MRP_TYPE_SHORT:
-        case MRP_TYPE_USHORT:
-        case MRP_TYPE_SIZET:
-        case MRP_TYPE_SSIZET:
-            if (decode_basic(tlv, chunks, m->any.type, v) < 0)
+        case OP_STRING:
+            if (check_string(d, (size_t)-1, &len) < 0)
                 return -1;
+            d->size += data_size(len);
             break;
 
-        case MRP_TYPE_STRING:
-            if (m->any.layout == MRP_LAYOUT_INLINED) {
-                max  = m->str.size;
-                str  = v->str;
-                strp = &str;
-            }
-            else {
-                max  = (size_t)-1;
-                strp = &v->strp;
-            }
-            if (mrp_tlv_pull_string(tlv, TAG_NONE, strp, max,
-                                    alloc_str_chunk, chunks) < 0)
+        case OP_INLINED:
+            if (check_string(d, in->nsize, &len) < 0)
                 return -1;
             break;
 
-        case MRP_TYPE_BLOB: /* XXX TODO implement blobs */
+        case OP_STRUCT:
+            if (check_type(d, TAG_STRUCT, in->eid) < 0)
+                return -1;
+            d->size += data_size(in->ecodec->type->size);
+            if (check_struct(d, in->ecodec) < 0)
+                return -1;
+            break;
+
+        case OP_ARRAY:
+            if (check_array(d, in) < 0)
+                return -1;
+            break;
+
+        default:
             return -1;
+        }
+    }
 
-        case MRP_TYPE_ARRAY:
-            if (decode_array(tlv, chunks, &v->ptr, &m->array,
-                             *datap, t, idmap) < 0)
+    return 0;
+}
+
+
+static inline void *alloc_data(decoder_t *d, size_t size)
+{
+    void *ptr = d->out;
+
+    d->out += data_size(size);
+
+    return ptr;
+}
+
+
+static inline void set_signed(void *v, size_t size, int32_t i)
+{
+    switch (size) {
+    case sizeof(int8_t):  *(int8_t  *)v = (int8_t)i;  break;
+    case sizeof(int16_t): *(int16_t *)v = (int16_t)i; break;
+    case sizeof(int32_t): *(int32_t *)v = i;          break;
+    default:              *(int64_t *)v = i;          break;
+    }
+}
+
+
+static inline void set_unsigned(void *v, size_t size, uint32_t u)
+{
+    switch (size) {
+    case sizeof(uint8_t):  *(uint8_t  *)v = (uint8_t)u;  break;
+    case sizeof(uint16_t): *(uint16_t *)v = (uint16_t)u; break;
+    case sizeof(uint32_t): *(uint32_t *)v = u;           break;
+    default:               *(uint64_t *)v = u;           break;
+    }
+}
+
+
+static inline const char *get_value(const char *p, int op, size_t nsize,
+                                    void *v)
+{
+    uint16_t u16;
+    uint64_t u64;
+
+    switch (op) {
+    case OP_COPY:
+        memcpy(v, p, nsize);
+        return p + nsize;
+
+    case OP_BE16:
+        memcpy(&u16, p, sizeof(u16));
+        *(uint16_t *)v = be16toh(u16);
+        return p + sizeof(u16);
+
+    case OP_BE64:
+        memcpy(&u64, p, sizeof(u64));
+        *(uint64_t *)v = be64toh(u64);
+        return p + sizeof(u64);
+
+    case OP_BE32:
+        *(uint32_t *)v = get_u32(p);
+        break;
+    case OP_INT32:
+        set_signed(v, nsize, (int32_t)get_u32(p));
+        break;
+    case OP_UINT32:
+        set_unsigned(v, nsize, get_u32(p));
+        break;
+
+    default:
+        return p;
+    }
+
+    return p + sizeof(uint32_t);
+}
+
+
+static char *get_string(decoder_t *d, char *str)
+{
+    size_t len;
+
+    len   = get_u32(d->p);
+    d->p += sizeof(uint32_t);
+
+    if (len == 0)
+        return NULL;
+
+    if (str == NULL)
+        str = alloc_data(d, len);
+
+    memcpy(str, d->p, len - 1);
+    str[len - 1] = '\0';
+    d->p += len;
+
+    return str;
+}
+
+
+static int decode_struct(decoder_t *d, void *data, codec_t *c);
+
+static int decode_array(decoder_t *d, void *data, codec_t *c, insn_t *in)
+{
+    void    *arr, *elem;
+    char   **strs;
+    size_t   n, guard, i;
+
+    n     = get_u32(d->p + 3 * sizeof(uint32_t));
+    d->p += 4 * sizeof(uint32_t);
+    guard = (in->kind == MRP_ARRAY_SIZE_GUARDED);
+
+    if (in->kind == MRP_ARRAY_SIZE_EXPLICIT)
+        if (get_count(data, c, in) != (ssize_t)n)
+            return -1;
+
+    if (in->inlined)
+        arr = data + in->offs;
+    else {
+        arr = n + guard ? alloc_data(d, (n + guard) * in->nsize) : NULL;
+        *(void **)(data + in->offs) = arr;
+    }
+
+    if (n == 0)
+        goto terminate;
+
+    switch (in->eop) {
+    case OP_COPY:
+        memcpy(arr, d->p, n * in->nsize);
+        d->p += n * in->nsize;
+        break;
+
+    case OP_STRING:
+        for (i = 0, strs = arr; i < n; i++)
+            strs[i] = get_string(d, NULL);
+        break;
+
+    case OP_STRUCT:
+        for (i = 0, elem = arr; i < n; i++, elem += in->nsize) {
+            d->p += 2 * sizeof(uint32_t);
+            if (decode_struct(d, elem, in->ecodec) < 0)
                 return -1;
+        }
+        break;
+
+    default:
+        for (i = 0, elem = arr; i < n; i++, elem += in->nsize)
+            d->p = get_value(d->p, in->eop, in->nsize, elem);
+        break;
+    }
+
+ terminate:
+    if (guard)
+        memcpy(arr + n * in->nsize + in->goffs, &in->sentinel, in->gsize);
+
+    return 0;
+}
+
+
+static int decode_struct(decoder_t *d, void *data, codec_t *c)
+{
+    insn_t *in, *end;
+    void   *v;
+
+    for (in = c->insns, end = in + c->ninsn; in < end; in++) {
+        d->p += sizeof(in->hdr);
+        v     = data + in->offs;
+
+        switch (in->op) {
+        case OP_STRING:
+            *(char **)v = get_string(d, NULL);
             break;
 
-        case MRP_TYPE_STRUCT:
-            id = m->strct.data_type.id;
-            if (decode_struct(tlv, chunks, &v->ptr, &id, idmap) < 0)
+        case OP_INLINED:
+            get_string(d, v);
+            break;
+
+        case OP_STRUCT:
+            d->p        += 2 * sizeof(uint32_t);
+            *(void **)v  = alloc_data(d, in->ecodec->type->size);
+            if (decode_struct(d, *(void **)v, in->ecodec) < 0)
+                return -1;
+            break;
+
+        case OP_ARRAY:
+            if (decode_array(d, data, c, in) < 0)
                 return -1;
             break;
 
         default:
-            return -1;
+            if (in->indirect)
+                v = *(void **)v = alloc_data(d, in->nsize);
+            d->p = get_value(d->p, in->op, in->nsize, v);
+            break;
         }
     }
 
@@ -1255,45 +1705,68 @@ static int decode_struct(mrp_tlv_t *tlv, mrp_list_hook_t **chunks,
 int mrp_decode_native(void **bufp, size_t *sizep, void **datap, uint32_t *idp,
                       mrp_typemap_t *idmap)
 {
-    mrp_tlv_t        tlv;
-    mrp_list_hook_t *chunks;
-    void            *data;
-    size_t           diff;
+    decoder_t   d;
+    codec_t    *c;
+    const char *start;
+    void       *data;
+    uint32_t    id;
+
+    d.p     = *bufp;
+    d.end   = d.p + *sizep;
+    d.out   = NULL;
+    d.idmap = idmap;
+
+    if (check_tag(&d, TAG_STRUCT, &id) < 0)
+        goto invalid;
+    else
+        id = mapped_type(id, idmap);
 
-    chunks = NULL;
-    data   = NULL;
+    if (*idp) {
+        if (*idp != id)
+            goto invalid;
+    }
+    else
+        *idp = id;
 
-    if (mrp_tlv_setup_read(&tlv, *bufp, *sizep) < 0)
-        return -1;
+    if ((c = lookup_codec(id)) == NULL)
+        goto invalid;
 
-    if (decode_struct(&tlv, &chunks, &data, idp, idmap) == 0) {
-        diff = mrp_tlv_offset(&tlv);
+    /* validate input and calculate the size of decoded data */
+    start  = d.p;
+    d.size = data_size(c->type->size);
 
-        if (diff <= *sizep) {
-            *bufp  += diff;
-            *sizep -= diff;
-            *datap  = data;
+    if (check_struct(&d, c) < 0)
+        goto invalid;
 
-            return 0;
-        }
+    /* decode everything into a single allocation */
+    if ((data = mrp_allocz(d.size)) == NULL)
+        return -1;
+
+    d.p   = start;
+    d.out = data + data_size(c->type->size);
+
+    if (decode_struct(&d, data, c) < 0) {
+        mrp_free(data);
+        goto invalid;
     }
 
-    free_chunks(chunks);
+    *sizep -= d.p - (const char *)*bufp;
+    *bufp   = (void *)d.p;
+    *datap  = data;
+
+    return 0;
 
+ invalid:
+    errno = EINVAL;
     return -1;
 }
 
 
 void mrp_free_native(void *data, uint32_t id)
 {
-    mrp_list_hook_t *chunks;
-
     MRP_UNUSED(id);
 
-    if (data != NULL) {
-        chunks = ((void *)data) - MRP_OFFSET(chunk_t, data);
-        free_chunks(chunks);
-    }
+    mrp_free(data);
 }
 
 
@@ -1577,50 +2050,3 @@ ssize_t mrp_print_native(char *buf, size_t size, void *data, uint32_t id)
     else
         return -1;
 }
-
-
-static inline size_t chunk_size(size_t size)
-{
-    return MRP_OFFSET(chunk_t, data[size]);
-}
-
-
-static void *alloc_chunk(mrp_list_hook_t **chunks, size_t size)
-{
-    chunk_t *chunk;
-
-    if (size == 0)
-        return NULL;
-
-    if (*chunks == NULL) {
-        if ((*chunks = mrp_allocz(sizeof(*chunks))) == NULL)
-            return NULL;
-        else
-            mrp_list_init(*chunks);
-    }
-
-    if ((chunk = mrp_allocz(chunk_size(size))) == NULL)
-        return NULL;
-
-    mrp_list_init(&chunk->hook);
-    mrp_list_append(*chunks, &chunk->hook);
-
-    return &chunk->data[0];
-}
-
-
-static void free_chunks(mrp_list_hook_t *chunks)
-{
-    mrp_list_hook_t *p, *n;
-
-    if (chunks != NULL) {
-        mrp_list_foreach(chunks, p, n) {
-            mrp_list_delete(p);
-
-            if (p != chunks)
-                mrp_free(p);
-        }
-
-        mrp_free(chunks);
-    }
-}
@@ -34,16 +34,16 @@
 #include <fcntl.h>
 #include <sys/types.h>
 #include <sys/socket.h>
-#include <sys/ioctl.h>
 #include <netinet/in.h>
 #include <sys/un.h>
 #include <sys/uio.h>
+#include <poll.h>
 
 #include <murphy/common/macros.h>
 #include <murphy/common/mm.h>
+#include <murphy/common/list.h>
 #include <murphy/common/log.h>
 #include <murphy/common/msg.h>
-#include <murphy/common/fragbuf.h>
 #include <murphy/common/transport.h>
 
 #ifndef UNIX_PATH_MAX
@@ -57,18 +57,45 @@
 #define UNXS  "unxs"
 #define UNXSL 4
 
-#define DEFAULT_SIZE 128                 /* default input buffer size */
+#define RCVBUF_SIZE  (32 * 1024)         /* default input buffer size */
+#define SCRATCH_MIN  1024                /* initial encoding buffer size */
+#define SCRATCH_MAX  (64 * 1024)         /* max. encoding buffer to keep */
+#define SNDQ_IOVMAX  64                  /* max. iovecs per writev */
 
 typedef struct {
     MRP_TRANSPORT_PUBLIC_FIELDS;         /* common transport fields */
     int             sock;                /* TCP socket */
     mrp_io_watch_t *iow;                 /* socket I/O watch */
-    mrp_fragbuf_t  *buf;                 /* fragment buffer */
+    mrp_rcvbuf_t   *buf;                 /* input buffer */
+    size_t          rhead;               /* start of unprocessed input */
+    size_t          rtail;               /* end of unprocessed input */
+    mrp_io_watch_t *oww;                 /* output watch, while queueing */
+    mrp_list_hook_t sndq;                /* output queue */
+    size_t          qsize;               /* amount of data queued */
+    size_t          hiwat;               /* output queue high-water mark */
+    int             policy;              /* policy for slow readers */
+    int             timeout;             /* max. time to block (ms) */
+    int             error;               /* error to close the transport with */
+    unsigned int    congested : 1;       /* whether above high-water mark */
+    char           *sbuf;                /* scratch buffer for encoding */
+    size_t          ssize;               /* scratch buffer size */
 } strm_t;
 
+typedef struct {
+    mrp_list_hook_t hook;                /* to output queue */
+    uint32_t        len;                 /* length prefix, if any */
+    size_t          hdr;                 /* size of length prefix */
+    void           *data;                /* data to send */
+    size_t          size;                /* amount of data */
+    size_t          sent;                /* amount already sent */
+    int             owned;               /* whether data is ours to free */
+} sndbuf_t;
+
 
 static void strm_recv_cb(mrp_io_watch_t *w, int fd, mrp_io_event_t events,
                          void *user_data);
+static void strm_send_cb(mrp_io_watch_t *w, int fd, mrp_io_event_t events,
+                         void *user_data);
 static int strm_disconnect(mrp_transport_t *mt);
 static int open_socket(strm_t *t, int family);
 
@@ -246,16 +273,437 @@ static socklen_t strm_resolve(const char *str, mrp_sockaddr_t *addr,
 }
 
 
+static mrp_rcvbuf_t *rcvbuf_create(strm_t *t)
+{
+    t->rhead = 0;
+    t->rtail = 0;
+
+    return mrp_rcvbuf_create(RCVBUF_SIZE);
+}
+
+
+static void *rcvbuf_space(strm_t *t, size_t *spacep)
+{
+    mrp_rcvbuf_t *buf = t->buf, *nbuf;
+    size_t        used, need;
+    uint32_t      size;
+
+    used = t->rtail - t->rhead;
+
+    /* rewind once everything is consumed and no message points to us */
+    if (used == 0 && !mrp_rcvbuf_shared(buf))
+        t->rhead = t->rtail = 0;
+
+    if (t->rtail < buf->size) {
+        *spacep = buf->size - t->rtail;
+        return buf->data + t->rtail;
+    }
+
+    /*
+     * We're full. Move the incomplete frame to the beginning of the
+     * buffer if nobody else is using it. Otherwise, or if the frame is
+     * too big to fit, switch to a new buffer, growing at most twofold
+     * at a time so a bogus frame size won't have us allocate all at once.
+     */
+
+    need = RCVBUF_SIZE;
+
+    if (used >= sizeof(size)) {
+        size = be32toh(*(uint32_t *)(buf->data + t->rhead));
+        need = MRP_MAX(need, MRP_MIN(sizeof(size) + size, 2 * buf->size));
+    }
+
+    if (!mrp_rcvbuf_shared(buf) && need <= buf->size)
+        memmove(buf->data, buf->data + t->rhead, used);
+    else {
+        if ((nbuf = mrp_rcvbuf_create(need)) == NULL)
+            return NULL;
+
+        memcpy(nbuf->data, buf->data + t->rhead, used);
+        mrp_rcvbuf_unref(buf);
+        t->buf = buf = nbuf;
+    }
+
+    t->rhead = 0;
+    t->rtail = used;
+
+    *spacep = buf->size - used;
+    return buf->data + used;
+}
+
+
+static void sndq_init(strm_t *t, strm_t *lt)
+{
+    mrp_list_init(&t->sndq);
+
+    if (lt != NULL) {
+        t->hiwat   = lt->hiwat;
+        t->policy  = lt->policy;
+        t->timeout = lt->timeout;
+    }
+    else {
+        t->hiwat   = MRP_TRANSPORT_SNDQ_HIGHWAT;
+        t->policy  = MRP_TRANSPORT_SNDQ_DROP_OLDEST;
+        t->timeout = MRP_TRANSPORT_SNDQ_TIMEOUT;
+    }
+}
+
+
+static void sndbuf_free(sndbuf_t *b)
+{
+    mrp_list_delete(&b->hook);
+
+    if (b->owned)
+        mrp_free(b->data);
+
+    mrp_free(b);
+}
+
+
+static void sndq_purge(strm_t *t)
+{
+    mrp_list_hook_t *p, *n;
+
+    mrp_del_io_watch(t->oww);
+    t->oww = NULL;
+
+    mrp_list_foreach(&t->sndq, p, n) {
+        sndbuf_free(mrp_list_entry(p, sndbuf_t, hook));
+    }
+
+    t->qsize     = 0;
+    t->congested = FALSE;
+}
+
+
+static int sndq_flush(strm_t *t)
+{
+    struct iovec     iov[SNDQ_IOVMAX];
+    mrp_list_hook_t *p, *n;
+    sndbuf_t        *b;
+    size_t           total, offs, left;
+    ssize_t          cnt;
+    int              i, full;
+
+    while (!mrp_list_empty(&t->sndq)) {
+        i     = 0;
+        total = 0;
+
+        mrp_list_foreach(&t->sndq, p, n) {
+            if (i > SNDQ_IOVMAX - 2)
+                break;
+
+            b = mrp_list_entry(p, sndbuf_t, hook);
+
+            if (b->sent < b->hdr) {
+                iov[i].iov_base = (char *)&b->len + b->sent;
+                iov[i].iov_len  = b->hdr - b->sent;
+                total += iov[i++].iov_len;
+                offs = 0;
+            }
+            else
+                offs = b->sent - b->hdr;
+
+            iov[i].iov_base = b->data + offs;
+            iov[i].iov_len  = b->size - offs;
+            total += iov[i++].iov_len;
+        }
+
+        cnt = writev(t->sock, iov, i);
+
+        if (cnt < 0) {
+            if (errno == EINTR)
+                continue;
+            if (errno == EAGAIN)
+                return 0;
+
+            return -1;
+        }
+
+        /* a short write means the socket buffer is full */
+        full      = ((size_t)cnt < total);
+        t->qsize -= cnt;
+
+        mrp_list_foreach(&t->sndq, p, n) {
+            b    = mrp_list_entry(p, sndbuf_t, hook);
+            left = b->hdr + b->size - b->sent;
+
+            if ((size_t)cnt < left) {
+                b->sent += cnt;
+                break;
+            }
+
+            cnt -= left;
+            sndbuf_free(b);
+        }
+
+        if (full)
+            return 0;
+    }
+
+    return 0;
+}
+
+
+static void sndq_abort(strm_t *t, int error)
+{
+    mrp_debug("aborting transport %p with error %d", t, error);
+
+    sndq_purge(t);
+
+    /* the resulting hangup will emit the closed event */
+    t->error = error;
+    shutdown(t->sock, SHUT_RDWR);
+}
+
+
+static int sndq_drop(strm_t *t)
+{
+    mrp_list_hook_t *p, *n;
+    sndbuf_t        *b;
+    int              cnt;
+
+    cnt = 0;
+
+    mrp_list_foreach(&t->sndq, p, n) {
+        /* always keep the newest message */
+        if (t->qsize <= t->hiwat || n == &t->sndq)
+            break;
+
+        b = mrp_list_entry(p, sndbuf_t, hook);
+
+        /* a partially sent message must be completed to keep framing */
+        if (b->sent > 0)
+            continue;
+
+        t->qsize -= b->hdr + b->size;
+        sndbuf_free(b);
+        cnt++;
+    }
+
+    mrp_debug("dropped %d queued messages of transport %p", cnt, t);
+
+    return TRUE;
+}
+
+
+static int sndq_block(strm_t *t)
+{
+    struct pollfd pfd;
+    int           n;
+
+    while (t->qsize > t->hiwat) {
+        pfd.fd      = t->sock;
+        pfd.events  = POLLOUT;
+        pfd.revents = 0;
+
+        /* give up on readers that make no progress within the timeout */
+        if ((n = poll(&pfd, 1, t->timeout)) <= 0) {
+            if (n == 0)
+                errno = ETIMEDOUT;
+            else if (errno == EINTR)
+                continue;
+
+            goto fail;
+        }
+
+        if (pfd.revents & (POLLERR | POLLHUP | POLLNVAL)) {
+            errno = EPIPE;
+            goto fail;
+        }
+
+        if (sndq_flush(t) < 0)
+            goto fail;
+    }
+
+    return TRUE;
+
+ fail:
+    sndq_abort(t, errno);
+    return FALSE;
+}
+
+
+static int sndq_check(strm_t *t)
+{
+    mrp_transport_t *mt = (mrp_transport_t *)t;
+
+    if (t->qsize <= t->hiwat)
+        return TRUE;
+
+    if (!t->congested) {
+        t->congested = TRUE;
+
+        if (t->evt.congested != NULL) {
+            MRP_TRANSPORT_BUSY(mt, {
+                    mt->evt.congested(mt, TRUE, mt->user_data);
+                });
+
+            if (t->qsize <= t->hiwat)
+                return TRUE;
+        }
+    }
+
+    switch (t->policy) {
+    case MRP_TRANSPORT_SNDQ_DROP_OLDEST:
+        return sndq_drop(t);
+
+    case MRP_TRANSPORT_SNDQ_BLOCK:
+        return sndq_block(t);
+
+    case MRP_TRANSPORT_SNDQ_DISCONNECT:
+    default:
+        mrp_log_warning("Disconnecting slow reader on transport %p.", t);
+        sndq_abort(t, ENOBUFS);
+        return FALSE;
+    }
+}
+
+
+static int sndq_send(strm_t *t, void *hdr, size_t hdrlen, void *data,
+                     size_t size, int owned)
+{
+    struct iovec  iov[2];
+    sndbuf_t     *b;
+    ssize_t       n;
+    int           cnt;
+
+    if (t->error != 0)
+        goto fail;
+
+    n = 0;
+
+    /* try to send right away unless there is older data waiting */
+    if (mrp_list_empty(&t->sndq)) {
+        cnt = 0;
+
+        if (hdrlen > 0) {
+            iov[cnt].iov_base = hdr;
+            iov[cnt].iov_len  = hdrlen;
+            cnt++;
+        }
+
+        iov[cnt].iov_base = data;
+        iov[cnt].iov_len  = size;
+        cnt++;
+
+        n = writev(t->sock, iov, cnt);
+
+        if (n == (ssize_t)(hdrlen + size)) {
+            if (owned)
+                mrp_free(data);
+
+            return TRUE;
+        }
+
+        if (n < 0) {
+            if (errno != EAGAIN && errno != EINTR)
+                goto fail;
+
+            n = 0;
+        }
+    }
+
+    if (owned)
+        b = mrp_allocz(sizeof(*b));
+    else {
+        b = mrp_allocz(sizeof(*b) + size);
+
+        if (b != NULL) {
+            memcpy(b + 1, data, size);
+            data = b + 1;
+        }
+    }
+
+    if (b == NULL) {
+        /* we can't leave a partially sent message behind */
+        if (n > 0)
+            sndq_abort(t, ENOMEM);
+        goto fail;
+    }
+
+    mrp_list_init(&b->hook);
+    if (hdrlen > 0)
+        memcpy(&b->len, hdr, hdrlen);
+    b->hdr   = hdrlen;
+    b->data  = data;
+    b->size  = size;
+    b->sent  = n;
+    b->owned = owned;
+
+    mrp_list_append(&t->sndq, &b->hook);
+    t->qsize += hdrlen + size - n;
+
+    if (t->oww == NULL) {
+        t->oww = mrp_add_io_watch(t->ml, t->sock, MRP_IO_EVENT_OUT,
+                                  strm_send_cb, t);
+
+        if (t->oww == NULL)
+            mrp_log_error("Failed to create output watch for transport %p.",
+                          t);
+    }
+
+    return sndq_check(t);
+
+ fail:
+    if (owned)
+        mrp_free(data);
+
+    return FALSE;
+}
+
+
 static int strm_open(mrp_transport_t *mt)
 {
     strm_t *t = (strm_t *)mt;
 
     t->sock = -1;
+    sndq_init(t, NULL);
 
     return TRUE;
 }
 
 
+static int strm_setopt(mrp_transport_t *mt, const char *opt, const void *val)
+{
+    strm_t *t = (strm_t *)mt;
+
+    if (val == NULL)
+        return FALSE;
+
+    if (!strcmp(opt, MRP_TRANSPORT_OPT_SNDQ_HIGHWAT)) {
+        if (*(size_t *)val == 0)
+            return FALSE;
+
+        t->hiwat = *(size_t *)val;
+        return TRUE;
+    }
+
+    if (!strcmp(opt, MRP_TRANSPORT_OPT_SNDQ_TIMEOUT)) {
+        if (*(int *)val <= 0)
+            return FALSE;
+
+        t->timeout = *(int *)val;
+        return TRUE;
+    }
+
+    if (!strcmp(opt, MRP_TRANSPORT_OPT_SNDQ_POLICY)) {
+        if (!strcmp(val, "drop-oldest"))
+            t->policy = MRP_TRANSPORT_SNDQ_DROP_OLDEST;
+        else if (!strcmp(val, "disconnect"))
+            t->policy = MRP_TRANSPORT_SNDQ_DISCONNECT;
+        else if (!strcmp(val, "block"))
+            t->policy = MRP_TRANSPORT_SNDQ_BLOCK;
+        else
+            return FALSE;
+
+        return TRUE;
+    }
+
+    return FALSE;
+}
+
+
 static int strm_createfrom(mrp_transport_t *mt, void *conn)
 {
     strm_t           *t = (strm_t *)mt;
@@ -264,6 +712,7 @@ static int strm_createfrom(mrp_transport_t *mt, void *conn)
     long             nb;
 
     t->sock = *(int *)conn;
+    sndq_init(t, NULL);
 
     if (t->sock >= 0) {
         if (mt->flags & MRP_TRANSPORT_REUSEADDR) {
@@ -277,7 +726,7 @@ static int strm_createfrom(mrp_transport_t *mt, void *conn)
 
         if (t->connected || t->listened) {
             if (!t->connected ||
-                (t->buf = mrp_fragbuf_create(TRUE, 0)) != NULL) {
+                (t->buf = rcvbuf_create(t)) != NULL) {
                 events = MRP_IO_EVENT_IN | MRP_IO_EVENT_HUP;
                 t->iow = mrp_add_io_watch(t->ml, t->sock, events,
                                           strm_recv_cb, t);
@@ -285,7 +734,7 @@ static int strm_createfrom(mrp_transport_t *mt, void *conn)
                 if (t->iow != NULL)
                     return TRUE;
 
-                mrp_fragbuf_destroy(t->buf);
+                mrp_rcvbuf_unref(t->buf);
                 t->buf = NULL;
             }
         }
@@ -341,9 +790,11 @@ static int strm_accept(mrp_transport_t *mt, mrp_transport_t *mlt)
     t  = (strm_t *)mt;
     lt = (strm_t *)mlt;
 
+    sndq_init(t, lt);
+
     addrlen = sizeof(addr);
     t->sock = accept(lt->sock, &addr.any, &addrlen);
-    t->buf  = mrp_fragbuf_create(TRUE, 0);
+    t->buf  = rcvbuf_create(t);
 
     if (t->sock >= 0 && t->buf != NULL) {
         if (mt->flags & MRP_TRANSPORT_REUSEADDR) {
@@ -372,7 +823,7 @@ static int strm_accept(mrp_transport_t *mt, mrp_transport_t *mlt)
         }
     }
     else
-        mrp_fragbuf_destroy(t->buf);
+        mrp_rcvbuf_unref(t->buf);
 
     mrp_debug("failed to accept connection on transport %p/%p", mlt, mt);
     return FALSE;
@@ -385,12 +836,18 @@ static void strm_close(mrp_transport_t *mt)
 
     mrp_debug("closing transport %p", mt);
 
+    sndq_purge(t);
+
     mrp_del_io_watch(t->iow);
     t->iow = NULL;
 
-    mrp_fragbuf_destroy(t->buf);
+    mrp_rcvbuf_unref(t->buf);
     t->buf = NULL;
 
+    mrp_free(t->sbuf);
+    t->sbuf  = NULL;
+    t->ssize = 0;
+
     if (t->sock >= 0){
         close(t->sock);
         t->sock = -1;
@@ -404,8 +861,8 @@ static void strm_recv_cb(mrp_io_watch_t *w, int fd, mrp_io_event_t events,
     strm_t          *t  = (strm_t *)user_data;
     mrp_transport_t *mt = (mrp_transport_t *)t;
     void            *data, *buf;
-    uint32_t         pending;
-    size_t           size;
+    uint32_t         size;
+    size_t           space;
     ssize_t          n;
     int              error;
 
@@ -424,42 +881,55 @@ static void strm_recv_cb(mrp_io_watch_t *w, int fd, mrp_io_event_t events,
             return;
         }
 
-        while (ioctl(fd, FIONREAD, &pending) == 0 && pending > 0) {
-            buf = mrp_fragbuf_alloc(t->buf, pending);
-
-            if (buf == NULL) {
-                error = ENOMEM;
-            fatal_error:
-                mrp_debug("transport %p closed with error %d", mt, error);
-            closed:
-                strm_disconnect(mt);
-
-                if (t->evt.closed != NULL)
-                    MRP_TRANSPORT_BUSY(mt, {
-                            mt->evt.closed(mt, error, mt->user_data);
-                        });
-
-                t->check_destroy(mt);
-                return;
-            }
+        /*
+         * Read straight into the free space of our input buffer, then
+         * hand out the complete frames in it without copying. If there
+         * is more pending input we'll get called again for it, unless
+         * the peer has hung up in which case we read it all right away.
+         */
+
+    next:
+        if ((buf = rcvbuf_space(t, &space)) == NULL) {
+            error = ENOMEM;
+        fatal_error:
+            mrp_debug("transport %p closed with error %d", mt, error);
+        closed:
+            strm_disconnect(mt);
+
+            if (t->evt.closed != NULL)
+                MRP_TRANSPORT_BUSY(mt, {
+                        mt->evt.closed(mt, error, mt->user_data);
+                    });
 
-            n = read(fd, buf, pending);
+            t->check_destroy(mt);
+            return;
+        }
 
-            if (n >= 0) {
-                if (n < (ssize_t)pending)
-                    mrp_fragbuf_trim(t->buf, buf, pending, n);
-            }
+        n = read(fd, buf, space);
 
-            if (n < 0 && errno != EAGAIN) {
+        if (n < 0) {
+            if (errno != EAGAIN && errno != EINTR) {
                 error = EIO;
                 goto fatal_error;
             }
         }
+        else if (n == 0) {
+            mrp_debug("transport %p closed by peer", mt);
+            error = t->error;
+            goto closed;
+        }
+        else
+            t->rtail += n;
+
+        while (t->buf != NULL && t->rtail - t->rhead >= sizeof(size)) {
+            size = be32toh(*(uint32_t *)(t->buf->data + t->rhead));
 
-        data = NULL;
-        size = 0;
-        while (mrp_fragbuf_pull(t->buf, &data, &size)) {
-            error = t->recv_data(mt, data, size, NULL, 0);
+            if (t->rtail - t->rhead - sizeof(size) < size)
+                break;
+
+            data      = t->buf->data + t->rhead + sizeof(size);
+            t->rhead += sizeof(size) + size;
+            error     = t->recv_buffer(mt, t->buf, data, size, NULL, 0);
 
             if (error)
                 goto fatal_error;
@@ -467,16 +937,66 @@ static void strm_recv_cb(mrp_io_watch_t *w, int fd, mrp_io_event_t events,
             if (t->check_destroy(mt))
                 return;
         }
+
+        if ((events & MRP_IO_EVENT_HUP) && n > 0 && t->buf != NULL)
+            goto next;
     }
 
     if (events & MRP_IO_EVENT_HUP) {
         mrp_debug("transport %p closed by peer", mt);
-        error = 0;
+        error = t->error;
         goto closed;
     }
 }
 
 
+static void strm_send_cb(mrp_io_watch_t *w, int fd, mrp_io_event_t events,
+                         void *user_data)
+{
+    strm_t          *t  = (strm_t *)user_data;
+    mrp_transport_t *mt = (mrp_transport_t *)t;
+    int              error;
+
+    MRP_UNUSED(w);
+    MRP_UNUSED(fd);
+
+    if (!(events & MRP_IO_EVENT_OUT))
+        return;
+
+    if (sndq_flush(t) < 0) {
+        error = errno;
+        mrp_debug("transport %p closed with error %d", mt, error);
+
+        strm_disconnect(mt);
+
+        if (t->evt.closed != NULL)
+            MRP_TRANSPORT_BUSY(mt, {
+                    mt->evt.closed(mt, error, mt->user_data);
+                });
+
+        t->check_destroy(mt);
+        return;
+    }
+
+    if (mrp_list_empty(&t->sndq)) {
+        mrp_del_io_watch(t->oww);
+        t->oww = NULL;
+    }
+
+    if (t->congested && t->qsize <= t->hiwat / 2) {
+        t->congested = FALSE;
+
+        if (t->evt.congested != NULL) {
+            MRP_TRANSPORT_BUSY(mt, {
+                    mt->evt.congested(mt, FALSE, mt->user_data);
+                });
+
+            t->check_destroy(mt);
+        }
+    }
+}
+
+
 static int open_socket(strm_t *t, int family)
 {
     mrp_io_event_t events;
@@ -528,7 +1048,7 @@ static int strm_connect(mrp_transport_t *mt, mrp_sockaddr_t *addr,
         goto fail;
 
     if (connect(t->sock, &addr->any, addrlen) == 0) {
-        t->buf = mrp_fragbuf_create(TRUE, 0);
+        t->buf = rcvbuf_create(t);
 
         if (t->buf != NULL) {
             events = MRP_IO_EVENT_IN | MRP_IO_EVENT_HUP;
@@ -545,7 +1065,7 @@ static int strm_connect(mrp_transport_t *mt, mrp_sockaddr_t *addr,
                 return TRUE;
             }
 
-            mrp_fragbuf_destroy(t->buf);
+            mrp_rcvbuf_unref(t->buf);
             t->buf = NULL;
         }
     }
@@ -567,12 +1087,15 @@ static int strm_disconnect(mrp_transport_t *mt)
     strm_t *t = (strm_t *)mt;
 
     if (t->connected/* || t->iow != NULL*/) {
+        sndq_flush(t);
+        sndq_purge(t);
+
         mrp_del_io_watch(t->iow);
         t->iow = NULL;
 
         shutdown(t->sock, SHUT_RDWR);
 
-        mrp_fragbuf_destroy(t->buf);
+        mrp_rcvbuf_unref(t->buf);
         t->buf = NULL;
 
         mrp_debug("disconnected transport %p", mt);
@@ -584,61 +1107,76 @@ static int strm_disconnect(mrp_transport_t *mt)
 }
 
 
-static int strm_send(mrp_transport_t *mt, mrp_msg_t *msg)
+/*
+ * Get a buffer of at least size bytes for encoding an outgoing frame.
+ * Frames are normally encoded into a scratch buffer we keep around and
+ * reuse. sndq_send only copies them if they can't be sent right away.
+ * Huge frames get a buffer of their own that the send queue takes over.
+ */
+static char *scratch_alloc(strm_t *t, size_t size, int *ownedp)
 {
-    strm_t        *t = (strm_t *)mt;
-    struct iovec  iov[2];
-    void         *buf;
-    ssize_t       size, n;
-    uint32_t      len;
+    size_t ssize;
 
-    if (t->connected) {
-        size = mrp_msg_default_encode(msg, &buf);
+    if (size > SCRATCH_MAX) {
+        *ownedp = TRUE;
+        return mrp_alloc(size);
+    }
 
-        if (size >= 0) {
-            len = htobe32(size);
-            iov[0].iov_base = &len;
-            iov[0].iov_len  = sizeof(len);
-            iov[1].iov_base = buf;
-            iov[1].iov_len  = size;
+    *ownedp = FALSE;
 
-            n = writev(t->sock, iov, 2);
-            mrp_free(buf);
+    if (size > t->ssize) {
+        ssize = MRP_MAX(t->ssize, (size_t)SCRATCH_MIN);
 
-            if (n == (ssize_t)(size + sizeof(len)))
-                return TRUE;
-            else {
-                if (n == -1 && errno == EAGAIN) {
-                    mrp_log_error("%s(): XXX TODO: this sucks, need to add "
-                                  "output queuing for strm-transport.",
-                                  __FUNCTION__);
-                }
-            }
-        }
+        while (ssize < size)
+            ssize *= 2;
+
+        if (mrp_realloc(t->sbuf, ssize) == NULL)
+            return NULL;
+
+        t->ssize = ssize;
     }
 
-    return FALSE;
+    return t->sbuf;
 }
 
 
-static int strm_sendraw(mrp_transport_t *mt, void *data, size_t size)
+static int strm_send(mrp_transport_t *mt, mrp_msg_t *msg)
 {
-    strm_t  *t = (strm_t *)mt;
-    ssize_t  n;
+    strm_t   *t = (strm_t *)mt;
+    char     *buf;
+    ssize_t   size;
+    size_t    hdr, avail;
+    uint32_t *lenp;
+    int       owned;
+
+    if (!t->connected)
+        return FALSE;
 
-    if (t->connected) {
-        n = write(t->sock, data, size);
+    /* optimistically encode to the scratch buffer, retry if too small */
+    hdr   = sizeof(*lenp);
+    avail = t->ssize > hdr ? t->ssize - hdr : 0;
+    size  = mrp_msg_default_encode_to(msg, avail ? t->sbuf + hdr : NULL,
+                                      avail);
 
-        if (n == (ssize_t)size)
-            return TRUE;
-        else {
-            if (n == -1 && errno == EAGAIN) {
-                mrp_log_error("%s(): XXX TODO: this sucks, need to add "
-                              "output queuing for strm-transport.",
-                              __FUNCTION__);
-            }
-        }
-    }
+    if (size < 0 || (buf = scratch_alloc(t, hdr + size, &owned)) == NULL)
+        return FALSE;
+
+    if ((size_t)size > avail)
+        mrp_msg_default_encode_to(msg, buf + hdr, size);
+
+    lenp  = (uint32_t *)buf;
+    *lenp = htobe32(size);
+
+    return sndq_send(t, NULL, 0, buf, hdr + size, owned);
+}
+
+
+static int strm_sendraw(mrp_transport_t *mt, void *data, size_t size)
+{
+    strm_t *t = (strm_t *)mt;
+
+    if (t->connected)
+        return sndq_send(t, NULL, 0, data, size, FALSE);
 
     return FALSE;
 }
@@ -648,44 +1186,33 @@ static int strm_senddata(mrp_transport_t *mt, void *data, uint16_t tag)
 {
     strm_t           *t = (strm_t *)mt;
     mrp_data_descr_t *type;
-    ssize_t           n;
-    void             *buf;
-    size_t            size, reserve, len;
+    char             *buf;
+    ssize_t           size;
+    size_t            hdr, avail;
     uint32_t         *lenp;
     uint16_t         *tagp;
+    int               owned;
 
-    if (t->connected) {
-        type = mrp_msg_find_type(tag);
+    if (!t->connected || (type = mrp_msg_find_type(tag)) == NULL)
+        return FALSE;
 
-        if (type != NULL) {
-            reserve = sizeof(*lenp) + sizeof(*tagp);
-            size    = mrp_data_encode(&buf, data, type, reserve);
+    hdr   = sizeof(*lenp) + sizeof(*tagp);
+    avail = t->ssize > hdr ? t->ssize - hdr : 0;
+    size  = mrp_data_encode_to(avail ? t->sbuf + hdr : NULL, avail,
+                               data, type);
 
-            if (size > 0) {
-                lenp  = buf;
-                len   = size - sizeof(*lenp);
-                tagp  = buf + sizeof(*lenp);
-                *lenp = htobe32(len);
-                *tagp = htobe16(tag);
+    if (size < 0 || (buf = scratch_alloc(t, hdr + size, &owned)) == NULL)
+        return FALSE;
 
-                n = write(t->sock, buf, len + sizeof(*lenp));
+    if ((size_t)size > avail)
+        mrp_data_encode_to(buf + hdr, size, data, type);
 
-                mrp_free(buf);
+    lenp  = (uint32_t *)buf;
+    tagp  = (uint16_t *)(buf + sizeof(*lenp));
+    *lenp = htobe32(sizeof(*tagp) + size);
+    *tagp = htobe16(tag);
 
-                if (n == (ssize_t)(len + sizeof(*lenp)))
-                    return TRUE;
-                else {
-                    if (n == -1 && errno == EAGAIN) {
-                        mrp_log_error("%s(): XXX TODO: this sucks, need to add"
-                                      " output queueing for strm-transport.",
-                                      __FUNCTION__);
-                    }
-                }
-            }
-        }
-    }
-
-    return FALSE;
+    return sndq_send(t, NULL, 0, buf, hdr + size, owned);
 }
 
 
@@ -696,7 +1223,6 @@ static int strm_sendnative(mrp_transport_t *mt, void *data, uint32_t type_id)
     void          *buf;
     size_t         size, reserve;
     uint32_t      *lenp;
-    ssize_t        n;
 
     if (t->connected) {
         reserve = sizeof(*lenp);
@@ -705,19 +1231,7 @@ static int strm_sendnative(mrp_transport_t *mt, void *data, uint32_t type_id)
             lenp  = buf;
             *lenp = htobe32(size - sizeof(*lenp));
 
-            n = write(t->sock, buf, size);
-
-            mrp_free(buf);
-
-            if (n == (ssize_t)size)
-                return TRUE;
-            else {
-                if (n == -1 && errno == EAGAIN) {
-                    mrp_log_error("%s(): XXX TODO: this sucks, need to add"
-                                  " output queueing for strm-transport.",
-                                  __FUNCTION__);
-                }
-            }
+            return sndq_send(t, NULL, 0, buf, size, TRUE);
         }
     }
 
@@ -726,7 +1240,7 @@ static int strm_sendnative(mrp_transport_t *mt, void *data, uint32_t type_id)
 
 
 MRP_REGISTER_TRANSPORT(tcp4, TCP4, strm_t, strm_resolve,
-                       strm_open, strm_createfrom, strm_close, NULL,
+                       strm_open, strm_createfrom, strm_close, strm_setopt,
                        strm_bind, strm_listen, strm_accept,
                        strm_connect, strm_disconnect,
                        strm_send, NULL,
@@ -736,7 +1250,7 @@ MRP_REGISTER_TRANSPORT(tcp4, TCP4, strm_t, strm_resolve,
                        strm_sendnative, NULL);
 
 MRP_REGISTER_TRANSPORT(tcp6, TCP6, strm_t, strm_resolve,
-                       strm_open, strm_createfrom, strm_close, NULL,
+                       strm_open, strm_createfrom, strm_close, strm_setopt,
                        strm_bind, strm_listen, strm_accept,
                        strm_connect, strm_disconnect,
                        strm_send, NULL,
@@ -746,7 +1260,7 @@ MRP_REGISTER_TRANSPORT(tcp6, TCP6, strm_t, strm_resolve,
                        strm_sendnative, NULL);
 
 MRP_REGISTER_TRANSPORT(unxstrm, UNXS, strm_t, strm_resolve,
-                       strm_open, strm_createfrom, strm_close, NULL,
+                       strm_open, strm_createfrom, strm_close, strm_setopt,
                        strm_bind, strm_listen, strm_accept,
                        strm_connect, strm_disconnect,
                        strm_send, NULL,
@@ -32,11 +32,13 @@
 #include <stdint.h>
 #include <string.h>
 #include <unistd.h>
+#include <time.h>
 
 #include <murphy/common/mm.h>
 #include <murphy/common/list.h>
 #include <murphy/common/macros.h>
 #include <murphy/common/hashtbl.h>
+#include <murphy/common/utils.h>
 
 #define MEMBER_OFFSET MRP_OFFSET
 #define ALLOC_ARR(type, n) mrp_allocz(sizeof(type) * (n))
@@ -59,9 +61,11 @@
 #define NKEY   4
 #define NPHASE 0xff
 
-#define INFO(fmt, args...)  do {                         \
-        printf("[%s] "fmt"\n" , __FUNCTION__ , ## args); \
-        fflush(stdout);                                  \
+#define INFO(fmt, args...)  do {                             \
+        if (verbose) {                                       \
+            printf("[%s] "fmt"\n" , __FUNCTION__ , ## args); \
+            fflush(stdout);                                  \
+        }                                                    \
     } while (0)
 
 #define ERROR(fmt, args...) do {                                \
@@ -93,7 +97,7 @@
         _key; })
 
 #define PATTERN_BIT(pattern, idx)                       \
-    (pattern & (1 << ((idx) & ((sizeof(pattern) * 8) - 1))))
+    (pattern & (1U << ((idx) & ((sizeof(pattern) * 8) - 1))))
 
 typedef struct {
     char        *str1;
@@ -119,6 +123,7 @@ typedef struct {
 
 
 test_t test;
+int    verbose = TRUE;
 
 void
 populate(void)
@@ -350,6 +355,7 @@ test_run(void)
      * then delete the hash table
      */
 
+    mrp_clear(&cfg);
     cfg.nbucket = test.size / 4;
     cfg.hash    = hash_func;
     cfg.comp    = cmp_func;
@@ -384,6 +390,70 @@ test_run(void)
 }
 
 
+/*
+ * benchmarking
+ *
+ * Measure the time it takes to populate a table, run a few phases of
+ * evicting, checking and re-adding entries, then empty the table. Do
+ * this both with the hash function of the tests and mrp_string_hash.
+ */
+
+static double bench_now(void)
+{
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+
+    return ts.tv_sec + ts.tv_nsec / 1000000000.0;
+}
+
+
+static void bench_report(const char *what, int cnt, double secs)
+{
+    printf("  %-10s %8d entries %8.3f s %10.1f ns/entry\n",
+           what, cnt, secs, cnt ? secs * 1000000000.0 / cnt : 0.0);
+}
+
+
+void
+bench_run(const char *name, mrp_htbl_hash_fn_t hash, int nphase)
+{
+    hash_tbl_cfg_t cfg;
+    double         start;
+    int            j;
+
+    mrp_clear(&cfg);
+    cfg.nbucket = test.size / 4;
+    cfg.hash    = hash;
+    cfg.comp    = cmp_func;
+    test.ht     = hash_tbl_create(&cfg);
+
+    if (test.ht == NULL)
+        FATAL("failed to create hash table (size %zd)", test.size);
+
+    printf("%s:\n", name);
+
+    start = bench_now();
+    populate();
+    bench_report("populate", test.nentry, bench_now() - start);
+
+    start = bench_now();
+    for (test.pattern = 0, j = 0; j < nphase; j++, test.pattern++) {
+        evict();
+        check();
+        readd();
+    }
+    bench_report("phases", nphase * test.nentry, bench_now() - start);
+
+    start = bench_now();
+    reset();
+    bench_report("reset", test.nentry, bench_now() - start);
+
+    hash_tbl_delete(test.ht, FALSE);
+    test.ht = NULL;
+}
+
+
 int
 main(int argc, char *argv[])
 {
@@ -391,6 +461,24 @@ main(int argc, char *argv[])
 
     memset(&test, 0, sizeof(test));
 
+    if (argc > 1 && !strcmp(argv[1], "--benchmark")) {
+        int nphase  = argc > 3 ? (int)strtoul(argv[3], NULL, 10) : 8;
+
+        verbose     = FALSE;
+        test.nentry = argc > 2 ? (int)strtoul(argv[2], NULL, 10) : 10000;
+
+        if (test.nentry <= 16)
+            test.nentry = 16;
+
+        test_init();
+        test.size = test.nentry;
+        bench_run("test hash", hash_func, nphase);
+        bench_run("mrp_string_hash", mrp_string_hash, nphase);
+        test_exit();
+
+        return 0;
+    }
+
     if (argc < 2 || (test.nentry = (int)strtoul(argv[1], NULL, 10)) <= 16)
         test.nentry = 16;
 
@@ -31,6 +31,7 @@
 #include <stdlib.h>
 #include <errno.h>
 #include <stdint.h>
+#include <stddef.h>
 #include <string.h>
 #include <stdarg.h>
 #include <unistd.h>
@@ -124,6 +125,8 @@ typedef struct {
     int ngio;
     int ngtimer;
 
+    int timer_bench;
+
     int ndbus_method;
     int ndbus_signal;
 
@@ -289,6 +292,151 @@ static void check_timers(void)
 }
 
 
+/*
+ * native timer benchmark
+ */
+
+#define BENCH_TIMERS 100000                      /* default number of timers */
+#define BENCH_SLACK  10                          /* slack for every 2nd timer */
+
+typedef struct {
+    mrp_mainloop_t *ml;
+    int             pending;
+    int             fired;
+    int             wakeups;
+    int             maxlag;
+    struct timeval  start;
+    int            *due;
+} timer_bench_t;
+
+static timer_bench_t bench;
+
+
+static void bench_timer_cb(mrp_timer_t *timer, void *user_data)
+{
+    int            id = (int)(ptrdiff_t)user_data;
+    struct timeval now;
+    int            lag;
+
+    timeval_now(&now);
+    lag = timeval_diff(&now, &bench.start) / 1000 - bench.due[id];
+
+    if (lag > bench.maxlag)
+        bench.maxlag = lag;
+
+    bench.fired++;
+    mrp_del_timer(timer);
+
+    if (--bench.pending <= 0)
+        mrp_mainloop_quit(bench.ml, 0);
+}
+
+
+static void bench_wakeup_cb(mrp_wakeup_t *w, mrp_wakeup_event_t event,
+                            void *user_data)
+{
+    MRP_UNUSED(w);
+    MRP_UNUSED(event);
+    MRP_UNUSED(user_data);
+
+    bench.wakeups++;
+}
+
+
+static void run_timer_bench(int ntimer)
+{
+    mrp_timer_t    **t;
+    mrp_wakeup_t    *w;
+    struct timeval   start, end;
+    int              add, mod, del, run, msecs, i;
+
+    /*
+     * Add ntimer timers with intervals spread over a second, rearm each
+     * of them once, delete every 4th of them, then run the mainloop
+     * until the rest have fired. Every 2nd timer is given some slack
+     * to let it coalesce with its neighbours.
+     */
+
+    mrp_clear(&bench);
+
+    if ((bench.ml = mrp_mainloop_create()) == NULL)
+        fatal("failed to create mainloop for timer benchmark");
+
+    t         = mrp_allocz_array(mrp_timer_t *, ntimer);
+    bench.due = mrp_allocz_array(int, ntimer);
+
+    if (t == NULL || bench.due == NULL)
+        fatal("could not allocate %d benchmark timers", ntimer);
+
+    w = mrp_add_wakeup(bench.ml, MRP_WAKEUP_EVENT_ANY, MRP_WAKEUP_NOLIMIT,
+                       MRP_WAKEUP_NOLIMIT, bench_wakeup_cb, NULL);
+
+    if (w == NULL)
+        fatal("failed to create wakeup callback for timer benchmark");
+
+    timeval_now(&bench.start);
+
+    timeval_now(&start);
+    for (i = 0; i < ntimer; i++) {
+        t[i] = mrp_add_timer(bench.ml, 1 + (i * 7919) % 1000, bench_timer_cb,
+                             (void *)(ptrdiff_t)i);
+
+        if (t[i] == NULL)
+            fatal("failed to create benchmark timer #%d", i);
+
+        if (i & 0x1)
+            mrp_set_timer_slack(t[i], BENCH_SLACK);
+    }
+    timeval_now(&end);
+    add = timeval_diff(&end, &start);
+
+    timeval_now(&start);
+    for (i = 0; i < ntimer; i++) {
+        msecs = 1 + (i * 104729) % 1000;
+        bench.due[i] = timeval_diff(&start, &bench.start) / 1000 + msecs;
+        mrp_mod_timer(t[i], msecs);
+    }
+    timeval_now(&end);
+    mod = timeval_diff(&end, &start);
+
+    bench.pending = ntimer;
+
+    timeval_now(&start);
+    for (i = 0; i < ntimer; i += 4) {
+        mrp_del_timer(t[i]);
+        bench.pending--;
+    }
+    timeval_now(&end);
+    del = timeval_diff(&end, &start);
+
+    timeval_now(&start);
+    mrp_mainloop_run(bench.ml);
+    timeval_now(&end);
+    run = timeval_diff(&end, &start);
+
+    info("MRPH timer benchmark: %d timers", ntimer);
+    info("MRPH   add: %.3f msecs (%.3f usecs/timer)", add / 1000.0,
+         1.0 * add / ntimer);
+    info("MRPH   mod: %.3f msecs (%.3f usecs/timer)", mod / 1000.0,
+         1.0 * mod / ntimer);
+    info("MRPH   del: %.3f msecs", del / 1000.0);
+    info("MRPH   run: %.3f msecs, %d timers fired in %d wakeups, "
+         "max lag %d msecs", run / 1000.0, bench.fired, bench.wakeups,
+         bench.maxlag);
+
+    if (bench.pending != 0)
+        warning("MRPH timer benchmark: FAIL (%d timers did not fire)",
+                bench.pending);
+    else
+        info("MRPH timer benchmark: OK");
+
+    mrp_del_wakeup(w);
+    mrp_mainloop_destroy(bench.ml);
+    mrp_free(bench.due);
+    mrp_free(t);
+}
+
+
 /*
  * native I/O
  */
@@ -1360,6 +1508,7 @@ static void print_usage(const char *argv0, int exit_code, const char *fmt, ...)
            "  -r, --runtime                  how many seconds to run tests\n"
            "  -i, --ios                      number of I/O watches\n"
            "  -t, --timers                   number of timers\n"
+           "  -b, --timer-bench[=N]          benchmark N (100000) timers\n"
            "  -s, --signals                  number of POSIX signals\n"
            "  -I, --glib-ios                 number of glib I/O watches\n"
            "  -T, --glib-timers              number of glib timers\n"
@@ -1417,12 +1566,13 @@ int parse_cmdline(test_config_t *cfg, int argc, char **argv)
 #endif
 
 
-#   define OPTIONS "r:i:t:s:I:T:S:M:l:w:W:o:vd:h" \
+#   define OPTIONS "r:i:t:b::s:I:T:S:M:l:w:W:o:vd:h" \
         PULSE_OPTION""ECORE_OPTION""GLIB_OPTION""QT_OPTION
     struct option options[] = {
         { "runtime"     , required_argument, NULL, 'r' },
         { "ios"         , required_argument, NULL, 'i' },
         { "timers"      , required_argument, NULL, 't' },
+        { "timer-bench" , optional_argument, NULL, 'b' },
         { "signals"     , required_argument, NULL, 's' },
         { "glib-ios"    , required_argument, NULL, 'I' },
         { "glib-timers" , required_argument, NULL, 'T' },
@@ -1477,6 +1627,17 @@ int parse_cmdline(test_config_t *cfg, int argc, char **argv)
                             "invalid number of timers '%s'.", optarg);
             break;
 
+        case 'b':
+            if (optarg == NULL)
+                cfg->timer_bench = BENCH_TIMERS;
+            else {
+                cfg->timer_bench = (int)strtoul(optarg, &end, 10);
+                if ((end && *end) || cfg->timer_bench <= 0)
+                    print_usage(argv[0], EINVAL,
+                                "invalid number of timers '%s'.", optarg);
+            }
+            break;
+
         case 's':
             cfg->nsignal = (int)strtoul(optarg, &end, 10);
             if (end && *end)
@@ -1734,6 +1895,11 @@ int main(int argc, char *argv[])
     mrp_log_set_mask(cfg.log_mask);
     mrp_log_set_target(cfg.log_target);
 
+    if (cfg.timer_bench > 0) {
+        run_timer_bench(cfg.timer_bench);
+        exit(0);
+    }
+
     ml = mainloop_create(&cfg);
 
     if (ml == NULL)
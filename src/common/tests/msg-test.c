@@ -27,6 +27,8 @@
  * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
  */
 
+#include <time.h>
+
 #include <murphy/common.h>
 
 #include <murphy/common/msg.h>
@@ -589,12 +591,291 @@ static void test_basic(void)
 }
 
 
+static void test_indexed(void)
+{
+    mrp_msg_t       *msg;
+    mrp_msg_field_t *f;
+    uint32_t         u32, first, second;
+    void            *it;
+    int              i;
+
+    /* big enough to get indexed, with every tag present twice */
+    if ((msg = mrp_msg_create_empty()) == NULL) {
+        mrp_log_error("Failed to create message.");
+        exit(1);
+    }
+
+    for (i = 0; i < 64; i++) {
+        if (!mrp_msg_append(msg, MRP_MSG_TAG_UINT32(1 + (i % 32), i))) {
+            mrp_log_error("Failed to append field #%d.", i);
+            exit(1);
+        }
+    }
+
+    for (i = 1; i <= 32; i++) {
+        f = mrp_msg_find(msg, i);
+
+        if (f == NULL || f->u32 != (uint32_t)i - 1) {
+            mrp_log_error("Failed to find field 0x%x.", i);
+            exit(1);
+        }
+    }
+
+    /* fetching the same tag twice should give both occurrences */
+    for (i = 32; i >= 1; i--) {
+        if (!mrp_msg_get(msg,
+                         i, MRP_MSG_FIELD_UINT32, &first,
+                         i, MRP_MSG_FIELD_UINT32, &second,
+                         MRP_MSG_END) ||
+            first != (uint32_t)i - 1 || second != (uint32_t)i + 31) {
+            mrp_log_error("Failed to get both fields 0x%x.", i);
+            exit(1);
+        }
+    }
+
+    it = NULL;
+    for (i = 1; i <= 32; i++) {
+        if (!mrp_msg_iterate_get(msg, &it,
+                                 i, MRP_MSG_FIELD_UINT32, &u32,
+                                 MRP_MSG_END) || u32 != (uint32_t)i - 1) {
+            mrp_log_error("Failed to iterate to field 0x%x.", i);
+            exit(1);
+        }
+    }
+
+    if (!mrp_msg_prepend(msg, MRP_MSG_TAG_UINT32(0x20, 1000)) ||
+        !mrp_msg_set(msg, MRP_MSG_TAG_STRING(0x10, "sixteen"))) {
+        mrp_log_error("Failed to update message.");
+        exit(1);
+    }
+
+    if ((f = mrp_msg_find(msg, 0x20)) == NULL || f->u32 != 1000 ||
+        (f = mrp_msg_find(msg, 0x10)) == NULL ||
+        f->type != MRP_MSG_FIELD_STRING || strcmp(f->str, "sixteen")) {
+        mrp_log_error("Updated fields not found.");
+        exit(1);
+    }
+
+    if (mrp_msg_find(msg, 0x21) != NULL) {
+        mrp_log_error("Hmm... non-existent field found.");
+        exit(1);
+    }
+
+    mrp_log_info("Indexed message lookups OK.");
+
+    mrp_msg_unref(msg);
+}
+
+
+/*
+ * benchmarking
+ *
+ * Measure the time and the number of memory allocations it takes to
+ * create, look up, encode and decode a message resembling a typical
+ * resource event.
+ */
+
+#ifdef __GLIBC__
+extern void *__libc_malloc(size_t size);
+extern void *__libc_calloc(size_t n, size_t size);
+extern void *__libc_realloc(void *ptr, size_t size);
+
+static unsigned long nalloc;
+
+void *malloc(size_t size)
+{
+    nalloc++;
+    return __libc_malloc(size);
+}
+
+
+void *calloc(size_t n, size_t size)
+{
+    nalloc++;
+    return __libc_calloc(n, size);
+}
+
+
+void *realloc(void *ptr, size_t size)
+{
+    nalloc++;
+    return __libc_realloc(ptr, size);
+}
+#else
+static unsigned long nalloc;             /* can't count, always zero */
+#endif
+
+
+static double bench_now(void)
+{
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+
+    return ts.tv_sec + ts.tv_nsec / 1000000000.0;
+}
+
+
+static void bench_report(const char *what, int cnt, double secs,
+                         unsigned long nalloc)
+{
+    printf("%-16s %8d msgs %8.3f s %10.0f msgs/s %6.2f allocs/msg\n",
+           what, cnt, secs, secs > 0 ? cnt / secs : 0.0,
+           cnt ? (double)nalloc / cnt : 0.0);
+}
+
+
+static mrp_msg_t *bench_msg(int seq)
+{
+    static const char *names[] = { "audio_playback", "audio_recording",
+                                   "video_playback", "video_recording" };
+    static uint32_t    ids[] = { 1, 2, 3, 4, 5, 6, 7, 8 };
+    mrp_msg_t         *msg;
+    int                i;
+
+    msg = mrp_msg_create(MRP_MSG_TAG_UINT32(0x1, seq),
+                         MRP_MSG_TAG_UINT16(0x2, 3),
+                         MRP_MSG_TAG_UINT32(0x3, seq & 0xff),
+                         MRP_MSG_TAG_UINT16(0x4, 2),
+                         MRP_MSG_TAG_UINT32(0x5, 0x3),
+                         MRP_MSG_TAG_UINT32(0x6, 0x1),
+                         MRP_MSG_TAG_UINT32(0x7, 0x0),
+                         MRP_MSG_TAG_UINT32(0x8, 0x3),
+                         MRP_MSG_END);
+
+    if (msg == NULL)
+        return NULL;
+
+    for (i = 0; i < 4; i++) {
+        if (!mrp_msg_append(msg, MRP_MSG_TAG_UINT32(0x10, i)) ||
+            !mrp_msg_append(msg, MRP_MSG_TAG_STRING(0x11, names[i])) ||
+            !mrp_msg_append(msg, MRP_MSG_TAG_UINT32(0x12, i & 1)) ||
+            !mrp_msg_append(msg, MRP_MSG_TAG_STRING(0x13, "role")) ||
+            !mrp_msg_append(msg, MRP_MSG_TAG_STRING(0x14, "music")) ||
+            !mrp_msg_append(msg, MRP_MSG_TAG_UINT32(0x15, 0))) {
+            mrp_msg_unref(msg);
+            return NULL;
+        }
+    }
+
+    if (!mrp_msg_append(msg, MRP_MSG_TAG_ARRAY(0x20, UINT32,
+                                               MRP_ARRAY_SIZE(ids), ids))) {
+        mrp_msg_unref(msg);
+        return NULL;
+    }
+
+    return msg;
+}
+
+
+static void test_benchmark(int cnt)
+{
+    mrp_msg_t       *msg;
+    mrp_msg_field_t *f;
+    void            *encoded;
+    ssize_t          size;
+    unsigned long    n;
+    double           start;
+    uint32_t         u32;
+    uint16_t         u16;
+    char            *str;
+    int              i;
+
+    n     = nalloc;
+    start = bench_now();
+    for (i = 0; i < cnt; i++) {
+        if ((msg = bench_msg(i)) == NULL)
+            goto fail;
+        mrp_msg_unref(msg);
+    }
+    bench_report("create", cnt, bench_now() - start, nalloc - n);
+
+    msg = bench_msg(1);
+
+    if (msg == NULL)
+        goto fail;
+
+    n     = nalloc;
+    start = bench_now();
+    for (i = 0; i < cnt; i++) {
+        if (!mrp_msg_get(msg,
+                         0x1, MRP_MSG_FIELD_UINT32, &u32,
+                         0x2, MRP_MSG_FIELD_UINT16, &u16,
+                         0x8, MRP_MSG_FIELD_UINT32, &u32,
+                         0x11, MRP_MSG_FIELD_STRING, &str,
+                         0x14, MRP_MSG_FIELD_STRING, &str,
+                         MRP_MSG_END))
+            goto fail;
+    }
+    bench_report("get (in order)", cnt, bench_now() - start, nalloc - n);
+
+    n     = nalloc;
+    start = bench_now();
+    for (i = 0; i < cnt; i++) {
+        if (!mrp_msg_get(msg,
+                         0x14, MRP_MSG_FIELD_STRING, &str,
+                         0x8, MRP_MSG_FIELD_UINT32, &u32,
+                         0x11, MRP_MSG_FIELD_STRING, &str,
+                         0x2, MRP_MSG_FIELD_UINT16, &u16,
+                         0x1, MRP_MSG_FIELD_UINT32, &u32,
+                         MRP_MSG_END))
+            goto fail;
+    }
+    bench_report("get (reversed)", cnt, bench_now() - start, nalloc - n);
+
+    n     = nalloc;
+    start = bench_now();
+    for (i = 0; i < cnt; i++) {
+        if ((f = mrp_msg_find(msg, 0x20)) == NULL)
+            goto fail;
+    }
+    bench_report("find (last)", cnt, bench_now() - start, nalloc - n);
+
+    n     = nalloc;
+    start = bench_now();
+    for (i = 0; i < cnt; i++) {
+        if ((size = mrp_msg_default_encode(msg, &encoded)) <= 0)
+            goto fail;
+        mrp_free(encoded);
+    }
+    bench_report("encode", cnt, bench_now() - start, nalloc - n);
+
+    if ((size = mrp_msg_default_encode(msg, &encoded)) <= 0)
+        goto fail;
+    mrp_msg_unref(msg);
+
+    /* skip the message tag, that's taken care of by the transport */
+    n     = nalloc;
+    start = bench_now();
+    for (i = 0; i < cnt; i++) {
+        msg = mrp_msg_default_decode(encoded + 2, size - 2);
+        if (msg == NULL)
+            goto fail;
+        mrp_msg_unref(msg);
+    }
+    bench_report("decode", cnt, bench_now() - start, nalloc - n);
+
+    mrp_free(encoded);
+    return;
+
+ fail:
+    mrp_log_error("Message benchmark failed.");
+    exit(1);
+}
+
+
 int main(int argc, char *argv[])
 {
     mrp_log_set_mask(MRP_LOG_UPTO(MRP_LOG_DEBUG));
     mrp_log_set_target(MRP_LOG_TO_STDOUT);
 
+    if (argc > 1 && !strcmp(argv[1], "--benchmark")) {
+        test_benchmark(argc > 2 ? (int)strtol(argv[2], NULL, 10) : 100000);
+        return 0;
+    }
+
     test_basic();
+    test_indexed();
 
     test_default_encode_decode(argc, argv);
     test_custom_encode_decode();
@@ -1,12 +1,16 @@
+#include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
 #include <unistd.h>
 #include <fcntl.h>
+#include <time.h>
 #include <sys/types.h>
 #include <sys/stat.h>
 
 #include <murphy/common/macros.h>
 #include <murphy/common/debug.h>
 #include <murphy/common/log.h>
+#include <murphy/common/mm.h>
 #include <murphy/common/native-types.h>
 
 
@@ -202,6 +206,109 @@ person_t tom_dick_and_harry[] = {
 family_t family = { &pap, &mom, &tom_dick_and_harry[0] };
 
 
+/*
+ * benchmarking
+ *
+ * Measure the time and the number of memory allocations it takes to
+ * encode and decode a flat and a nested native type.
+ */
+
+#ifdef __GLIBC__
+extern void *__libc_malloc(size_t size);
+extern void *__libc_calloc(size_t n, size_t size);
+extern void *__libc_realloc(void *ptr, size_t size);
+
+static unsigned long nalloc;
+
+void *malloc(size_t size)
+{
+    nalloc++;
+    return __libc_malloc(size);
+}
+
+
+void *calloc(size_t n, size_t size)
+{
+    nalloc++;
+    return __libc_calloc(n, size);
+}
+
+
+void *realloc(void *ptr, size_t size)
+{
+    nalloc++;
+    return __libc_realloc(ptr, size);
+}
+#else
+static unsigned long nalloc;             /* can't count, always zero */
+#endif
+
+
+static double bench_now(void)
+{
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+
+    return ts.tv_sec + ts.tv_nsec / 1000000000.0;
+}
+
+
+static void bench_report(const char *what, int cnt, double secs,
+                         unsigned long nalloc)
+{
+    printf("%-16s %8d msgs %8.3f s %10.0f msgs/s %6.2f allocs/msg\n",
+           what, cnt, secs, secs > 0 ? cnt / secs : 0.0,
+           cnt ? (double)nalloc / cnt : 0.0);
+}
+
+
+static void bench_type(const char *name, void *data, uint32_t id,
+                       mrp_typemap_t *map, int cnt)
+{
+    char           what[64];
+    void          *ebuf, *dbuf, *buf;
+    size_t         esize, size;
+    uint32_t       type_id;
+    unsigned long  n;
+    double         start;
+    int            i;
+
+    snprintf(what, sizeof(what), "encode %s", name);
+    n     = nalloc;
+    start = bench_now();
+    for (i = 0; i < cnt; i++) {
+        if (mrp_encode_native(data, id, 0, &ebuf, &esize, map) < 0)
+            goto fail;
+        mrp_free(ebuf);
+    }
+    bench_report(what, cnt, bench_now() - start, nalloc - n);
+
+    if (mrp_encode_native(data, id, 0, &ebuf, &esize, map) < 0)
+        goto fail;
+
+    snprintf(what, sizeof(what), "decode %s", name);
+    n     = nalloc;
+    start = bench_now();
+    for (i = 0; i < cnt; i++) {
+        buf     = ebuf;
+        size    = esize;
+        type_id = id;
+        if (mrp_decode_native(&buf, &size, &dbuf, &type_id, map) < 0)
+            goto fail;
+        mrp_free_native(dbuf, type_id);
+    }
+    bench_report(what, cnt, bench_now() - start, nalloc - n);
+
+    mrp_free(ebuf);
+    return;
+
+ fail:
+    mrp_log_error("Native type benchmark failed.");
+    exit(1);
+}
+
+
 int main(int argc, char *argv[])
 {
     MRP_NATIVE_TYPE(art_type, art_t,
@@ -233,16 +340,13 @@ int main(int argc, char *argv[])
     mrp_typemap_t map[4];
 
     uint32_t  art_type_id, person_type_id, family_type_id;
-    void     *ebuf;
+    void     *ebuf, *buf;
     size_t    esize;
     int       fd;
     void     *dbuf;
     family_t *decoded;
     char      dump[16 * 1024];
 
-    MRP_UNUSED(argc);
-    MRP_UNUSED(argv);
-
     mrp_log_set_mask(MRP_LOG_UPTO(MRP_LOG_INFO));
 
     art_type_id = mrp_register_native(&art_type);
@@ -273,6 +377,16 @@ int main(int argc, char *argv[])
     map[2] = (mrp_typemap_t)MRP_TYPEMAP(3, family_type_id);
     map[3] = (mrp_typemap_t)MRP_TYPEMAP_END;
 
+    if (argc > 1 && !strcmp(argv[1], "--benchmark")) {
+        int cnt = argc > 2 ? (int)strtol(argv[2], NULL, 10) : 100000;
+
+        bench_type("art", &paps_favourites[0], art_type_id, map, cnt);
+        bench_type("person", &pap, person_type_id, map, cnt);
+        bench_type("family", &family, family_type_id, map, cnt);
+
+        return 0;
+    }
+
     if (mrp_encode_native(&family, family_type_id, 0, &ebuf, &esize, map) < 0) {
         mrp_log_error("Failed to encode test data.");
         exit(1);
@@ -287,7 +401,9 @@ int main(int argc, char *argv[])
         close(fd);
     }
 
-    if (mrp_decode_native(&ebuf, &esize, &dbuf, &family_type_id, map) < 0) {
+    buf = ebuf;
+
+    if (mrp_decode_native(&buf, &esize, &dbuf, &family_type_id, map) < 0) {
         mrp_log_error("Failed to decode test data.");
         exit(1);
     }
@@ -302,6 +418,7 @@ int main(int argc, char *argv[])
         mrp_log_error("Failed to dump decoded data.");
 
     mrp_free_native(dbuf, family_type_id);
+    mrp_free(ebuf);
 
     return 0;
 }
@@ -28,12 +28,15 @@
  */
 
 #include <unistd.h>
+#include <time.h>
 #include <string.h>
 #include <errno.h>
 #include <netdb.h>
 #include <fcntl.h>
 #include <sys/types.h>
 #include <sys/socket.h>
+#include <sys/wait.h>
+#include <signal.h>
 
 #define _GNU_SOURCE
 #include <getopt.h>
@@ -153,6 +156,9 @@ typedef struct {
     int              log_mask;
     const char      *log_target;
     uint32_t         seqno;
+    int              bench;
+    int              sndq;
+    uint32_t         received;
 } context_t;
 
 
@@ -540,33 +546,41 @@ void server_init(context_t *c)
 }
 
 
+mrp_msg_t *create_msg(uint32_t seq)
+{
+    char      buf[256];
+    char     *astr[] = { "this", "is", "an", "array", "of", "strings" };
+    uint32_t  au32[] = { 1, 2, 3,
+                         1 << 16, 2 << 16, 3 << 16,
+                         1 << 24, 2 << 24, 3 << 24 };
+    uint32_t  nstr = MRP_ARRAY_SIZE(astr);
+    uint32_t  nu32 = MRP_ARRAY_SIZE(au32);
+
+    snprintf(buf, sizeof(buf), "this is message #%u", (unsigned int)seq);
+
+    return mrp_msg_create(TAG_SEQ , MRP_MSG_FIELD_UINT32, seq,
+                          TAG_MSG , MRP_MSG_FIELD_STRING, buf,
+                          TAG_U8  , MRP_MSG_FIELD_UINT8 ,   seq & 0xf,
+                          TAG_S8  , MRP_MSG_FIELD_SINT8 , -(seq & 0xf),
+                          TAG_U16 , MRP_MSG_FIELD_UINT16,   seq,
+                          TAG_S16 , MRP_MSG_FIELD_SINT16, - seq,
+                          TAG_DBL , MRP_MSG_FIELD_DOUBLE, seq / 3.0,
+                          TAG_BLN , MRP_MSG_FIELD_BOOL  , seq & 0x1,
+                          TAG_ASTR, MRP_MSG_FIELD_ARRAY_OF(STRING), nstr, astr,
+                          TAG_AU32, MRP_MSG_FIELD_ARRAY_OF(UINT32), nu32, au32,
+                          TAG_END);
+}
+
+
 void send_msg(context_t *c)
 {
     mrp_msg_t *msg;
     uint32_t   seq;
-    char       buf[256];
-    char      *astr[] = { "this", "is", "an", "array", "of", "strings" };
-    uint32_t   au32[] = { 1, 2, 3,
-                          1 << 16, 2 << 16, 3 << 16,
-                          1 << 24, 2 << 24, 3 << 24 };
-    uint32_t   nstr = MRP_ARRAY_SIZE(astr);
-    uint32_t   nu32 = MRP_ARRAY_SIZE(au32);
     int        status;
 
     seq = c->seqno++;
-    snprintf(buf, sizeof(buf), "this is message #%u", (unsigned int)seq);
 
-    msg = mrp_msg_create(TAG_SEQ , MRP_MSG_FIELD_UINT32, seq,
-                         TAG_MSG , MRP_MSG_FIELD_STRING, buf,
-                         TAG_U8  , MRP_MSG_FIELD_UINT8 ,   seq & 0xf,
-                         TAG_S8  , MRP_MSG_FIELD_SINT8 , -(seq & 0xf),
-                         TAG_U16 , MRP_MSG_FIELD_UINT16,   seq,
-                         TAG_S16 , MRP_MSG_FIELD_SINT16, - seq,
-                         TAG_DBL , MRP_MSG_FIELD_DOUBLE, seq / 3.0,
-                         TAG_BLN , MRP_MSG_FIELD_BOOL  , seq & 0x1,
-                         TAG_ASTR, MRP_MSG_FIELD_ARRAY_OF(STRING), nstr, astr,
-                         TAG_AU32, MRP_MSG_FIELD_ARRAY_OF(UINT32), nu32, au32,
-                         TAG_END);
+    msg = create_msg(seq);
 
     if (msg == NULL) {
         mrp_log_error("Failed to create new message.");
@@ -783,6 +797,672 @@ void client_init(context_t *c)
 }
 
 
+/*
+ * benchmarking
+ *
+ * In benchmark mode we pump generic messages through a stream transport
+ * connection within a single process, measuring the throughput and the
+ * number of memory allocations it takes to send and receive a message.
+ * Additionally we measure the default (copying) message decoder against
+ * the in-place one used by stream transports.
+ */
+
+#ifdef __GLIBC__
+extern void *__libc_malloc(size_t size);
+extern void *__libc_calloc(size_t n, size_t size);
+extern void *__libc_realloc(void *ptr, size_t size);
+
+static unsigned long nalloc;
+
+void *malloc(size_t size)
+{
+    nalloc++;
+    return __libc_malloc(size);
+}
+
+
+void *calloc(size_t n, size_t size)
+{
+    nalloc++;
+    return __libc_calloc(n, size);
+}
+
+
+void *realloc(void *ptr, size_t size)
+{
+    nalloc++;
+    return __libc_realloc(ptr, size);
+}
+#else
+static unsigned long nalloc;             /* can't count, always zero */
+#endif
+
+
+static double bench_now(void)
+{
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+
+    return ts.tv_sec + ts.tv_nsec / 1000000000.0;
+}
+
+
+static void bench_report(const char *what, uint32_t cnt, double secs,
+                         unsigned long nalloc)
+{
+    if (secs < 0)
+        printf("%-24s %8u msgs %30s %6.2f allocs/msg\n", what, cnt, "",
+               cnt ? (double)nalloc / cnt : 0.0);
+    else
+        printf("%-24s %8u msgs %8.3f s %10.0f msgs/s %6.2f allocs/msg\n",
+               what, cnt, secs, secs > 0 ? cnt / secs : 0.0,
+               cnt ? (double)nalloc / cnt : 0.0);
+}
+
+
+static void bench_recv(mrp_transport_t *t, mrp_msg_t *msg, void *user_data)
+{
+    context_t *c = (context_t *)user_data;
+
+    MRP_UNUSED(t);
+    MRP_UNUSED(msg);
+
+    c->received++;
+}
+
+
+static void bench_connection(mrp_transport_t *lt, void *user_data)
+{
+    context_t *c = (context_t *)user_data;
+    int        flags;
+
+    flags = MRP_TRANSPORT_REUSEADDR | MRP_TRANSPORT_NONBLOCK;
+    c->t  = mrp_transport_accept(lt, c, flags);
+
+    if (c->t == NULL) {
+        mrp_log_error("Failed to accept new connection.");
+        exit(1);
+    }
+}
+
+
+static void bench_decode(uint32_t cnt)
+{
+    mrp_msg_t     *msg;
+    mrp_rcvbuf_t  *rb;
+    void          *buf;
+    char          *data;
+    ssize_t        size;
+    unsigned long  n;
+    double         start;
+    uint32_t       i;
+
+    msg  = create_msg(1);
+    size = mrp_msg_default_encode(msg, &buf);
+    rb   = size > 0 ? mrp_rcvbuf_create(size) : NULL;
+
+    if (rb == NULL) {
+        mrp_log_error("Failed to encode benchmark message.");
+        exit(1);
+    }
+
+    /* skip the message tag, that's taken care of by the transport */
+    memcpy(rb->data, buf, size);
+    data  = rb->data + sizeof(uint16_t);
+    size -= sizeof(uint16_t);
+    mrp_msg_unref(msg);
+
+    n     = nalloc;
+    start = bench_now();
+    for (i = 0; i < cnt; i++) {
+        if ((msg = mrp_msg_default_decode(data, size)) == NULL)
+            goto fail;
+        mrp_msg_unref(msg);
+    }
+    bench_report("decode (copying)", cnt, bench_now() - start, nalloc - n);
+
+    n     = nalloc;
+    start = bench_now();
+    for (i = 0; i < cnt; i++) {
+        if ((msg = mrp_msg_default_decode_inplace(rb, data, size)) == NULL)
+            goto fail;
+        mrp_msg_unref(msg);
+    }
+    bench_report("decode (in place)", cnt, bench_now() - start, nalloc - n);
+
+    mrp_rcvbuf_unref(rb);
+    mrp_free(buf);
+    return;
+
+ fail:
+    mrp_log_error("Failed to decode benchmark message.");
+    exit(1);
+}
+
+
+void run_benchmark(context_t *c)
+{
+    static mrp_transport_evt_t evt = {
+        { .recvmsg     = bench_recv },
+        { .recvmsgfrom = NULL },
+        .closed        = closed_evt,
+        .connection    = bench_connection,
+    };
+
+    mrp_transport_t *t;
+    mrp_msg_t       *msg;
+    unsigned long    nsend, nrecv, n;
+    double           start;
+    uint32_t         cnt, sent, i;
+    int              flags;
+
+    if (!c->stream || (c->mode != MODE_DEFAULT && c->mode != MODE_MESSAGE)) {
+        mrp_log_error("Benchmarking needs a stream transport in message mode.");
+        exit(1);
+    }
+
+    cnt   = c->bench;
+    flags = MRP_TRANSPORT_REUSEADDR | MRP_TRANSPORT_MODE_MSG;
+    c->lt = mrp_transport_create(c->ml, c->atype, &evt, c, flags);
+
+    if (c->lt == NULL || !mrp_transport_bind(c->lt, &c->addr, c->alen) ||
+        !mrp_transport_listen(c->lt, 0)) {
+        mrp_log_error("Failed to set up benchmark server transport.");
+        exit(1);
+    }
+
+    t = mrp_transport_create(c->ml, c->atype, &evt, c, MRP_TRANSPORT_MODE_MSG);
+
+    if (t == NULL || !mrp_transport_connect(t, &c->addr, c->alen)) {
+        mrp_log_error("Failed to connect benchmark client transport.");
+        exit(1);
+    }
+
+    while (c->t == NULL)
+        mrp_mainloop_iterate(c->ml);
+
+    if ((msg = create_msg(1)) == NULL) {
+        mrp_log_error("Failed to create benchmark message.");
+        exit(1);
+    }
+
+    nsend = nrecv = 0;
+    sent  = 0;
+    start = bench_now();
+
+    while (sent < cnt) {
+        n = nalloc;
+        for (i = 0; i < 64 && sent < cnt; i++, sent++) {
+            if (!mrp_transport_send(t, msg)) {
+                mrp_log_error("Failed to send message #%u.", sent);
+                exit(1);
+            }
+        }
+        nsend += nalloc - n;
+
+        n = nalloc;
+        while (c->received < sent)
+            mrp_mainloop_iterate(c->ml);
+        nrecv += nalloc - n;
+    }
+
+    bench_report("transport (total)", cnt, bench_now() - start, nsend + nrecv);
+    bench_report("transport (sending)", cnt, -1, nsend);
+    bench_report("transport (receiving)", cnt, -1, nrecv);
+
+    mrp_msg_unref(msg);
+    mrp_transport_destroy(t);
+    mrp_transport_destroy(c->t);
+    mrp_transport_destroy(c->lt);
+
+    bench_decode(cnt);
+}
+
+
+/*
+ * In send queue test mode we check the output queueing of stream
+ * transports. The transport under test is created on one end of a socket
+ * pair with a small socket buffer. The other end is read directly, so the
+ * test decides when the socket can drain. Every test message carries its
+ * sequence number, which lets the reader check what got dropped.
+ */
+
+#define SNDQ_CHUNK 4096                  /* size of a test message */
+#define SNDQ_COUNT 64                    /* number of test messages */
+#define SNDQ_HIWAT (4 * SNDQ_CHUNK)      /* high-water mark for the tests */
+
+typedef struct {
+    mrp_mainloop_t  *ml;
+    mrp_transport_t *t;                  /* transport under test */
+    int              peer;               /* other end of the socket pair */
+    int              congested;          /* congestion notifications */
+    int              decongested;        /* decongestion notifications */
+    int              closed;             /* whether closed */
+    int              error;              /* error we got closed with */
+    int              failed;             /* whether the reader failed */
+    uint32_t         next;               /* next sequence number expected */
+    uint32_t         received;           /* messages received */
+    size_t           partial;            /* amount of partial message */
+    char             buf[SNDQ_CHUNK];    /* partial message */
+} sndq_test_t;
+
+
+static void sndq_recv(mrp_transport_t *t, void *data, size_t size,
+                      void *user_data)
+{
+    MRP_UNUSED(t);
+    MRP_UNUSED(data);
+    MRP_UNUSED(size);
+    MRP_UNUSED(user_data);
+}
+
+
+static void sndq_recvfrom(mrp_transport_t *t, void *data, size_t size,
+                          mrp_sockaddr_t *addr, socklen_t alen,
+                          void *user_data)
+{
+    MRP_UNUSED(addr);
+    MRP_UNUSED(alen);
+
+    sndq_recv(t, data, size, user_data);
+}
+
+
+static void sndq_closed(mrp_transport_t *t, int error, void *user_data)
+{
+    sndq_test_t *st = (sndq_test_t *)user_data;
+
+    MRP_UNUSED(t);
+
+    st->closed = TRUE;
+    st->error  = error;
+}
+
+
+static void sndq_congested(mrp_transport_t *t, int congested, void *user_data)
+{
+    sndq_test_t *st = (sndq_test_t *)user_data;
+
+    MRP_UNUSED(t);
+
+    if (congested)
+        st->congested++;
+    else
+        st->decongested++;
+}
+
+
+static void sndq_tick(mrp_timer_t *t, void *user_data)
+{
+    MRP_UNUSED(t);
+    MRP_UNUSED(user_data);
+}
+
+
+static int sndq_setup(sndq_test_t *st, mrp_mainloop_t *ml,
+                      const char *policy, size_t hiwat)
+{
+    static mrp_transport_evt_t evt = {
+        { .recvraw     = sndq_recv },
+        { .recvrawfrom = sndq_recvfrom },
+        .closed        = sndq_closed,
+        .congested     = sndq_congested,
+    };
+
+    int fd[2], size, flags;
+
+    mrp_clear(st);
+    st->ml = ml;
+
+    if (socketpair(AF_UNIX, SOCK_STREAM, 0, fd) < 0)
+        return FALSE;
+
+    size = SNDQ_CHUNK;
+    setsockopt(fd[0], SOL_SOCKET, SO_SNDBUF, &size, sizeof(size));
+    setsockopt(fd[1], SOL_SOCKET, SO_RCVBUF, &size, sizeof(size));
+    fcntl(fd[1], F_SETFL, O_NONBLOCK);
+
+    flags    = MRP_TRANSPORT_MODE_RAW | MRP_TRANSPORT_NONBLOCK;
+    st->peer = fd[1];
+    st->t    = mrp_transport_create_from(ml, "unxs", &fd[0], &evt, st, flags,
+                                         MRP_TRANSPORT_CONNECTED);
+
+    if (st->t == NULL) {
+        close(fd[0]);
+        close(fd[1]);
+        return FALSE;
+    }
+
+    return (mrp_transport_setopt(st->t, MRP_TRANSPORT_OPT_SNDQ_POLICY,
+                                 policy) &&
+            mrp_transport_setopt(st->t, MRP_TRANSPORT_OPT_SNDQ_HIGHWAT,
+                                 &hiwat));
+}
+
+
+static void sndq_cleanup(sndq_test_t *st)
+{
+    mrp_transport_destroy(st->t);
+    close(st->peer);
+}
+
+
+static int sndq_send(sndq_test_t *st, uint32_t seq)
+{
+    char buf[SNDQ_CHUNK];
+
+    memset(buf, seq & 0xff, sizeof(buf));
+    memcpy(buf, &seq, sizeof(seq));
+
+    return mrp_transport_sendraw(st->t, buf, sizeof(buf));
+}
+
+
+/* read what is available, checking the messages for order and content */
+static void sndq_read(sndq_test_t *st, int gaps)
+{
+    uint32_t seq;
+    ssize_t  n;
+    size_t   i;
+
+    while (st->next < SNDQ_COUNT &&
+           (n = read(st->peer, st->buf + st->partial,
+                     SNDQ_CHUNK - st->partial)) > 0) {
+        if ((st->partial += n) < SNDQ_CHUNK)
+            continue;
+
+        st->partial = 0;
+        memcpy(&seq, st->buf, sizeof(seq));
+
+        if (seq < st->next || (!gaps && seq != st->next))
+            st->failed = TRUE;
+
+        for (i = sizeof(seq); i < SNDQ_CHUNK; i++)
+            if (st->buf[i] != (char)(seq & 0xff))
+                st->failed = TRUE;
+
+        st->next = seq + 1;
+        st->received++;
+    }
+}
+
+
+/* read until the last test message arrives, or we time out */
+static void sndq_drain(sndq_test_t *st, int gaps)
+{
+    mrp_timer_t *t;
+    double       deadline;
+
+    t        = mrp_add_timer(st->ml, 10, sndq_tick, NULL);
+    deadline = bench_now() + 5;
+
+    sndq_read(st, gaps);
+
+    while (st->next < SNDQ_COUNT && !st->failed && bench_now() < deadline) {
+        mrp_mainloop_iterate(st->ml);
+        sndq_read(st, gaps);
+    }
+
+    mrp_del_timer(t);
+}
+
+
+/* let the transport notice that it got closed */
+static void sndq_wait_closed(sndq_test_t *st)
+{
+    mrp_timer_t *t;
+    double       deadline;
+
+    t        = mrp_add_timer(st->ml, 10, sndq_tick, NULL);
+    deadline = bench_now() + 5;
+
+    while (!st->closed && bench_now() < deadline)
+        mrp_mainloop_iterate(st->ml);
+
+    mrp_del_timer(t);
+}
+
+
+static int sndq_test_queueing(mrp_mainloop_t *ml)
+{
+    sndq_test_t st;
+    uint32_t    i;
+    int         ok;
+
+    if (!sndq_setup(&st, ml, "disconnect", MRP_TRANSPORT_SNDQ_HIGHWAT))
+        return FALSE;
+
+    ok = TRUE;
+
+    for (i = 0; i < SNDQ_COUNT; i++)
+        ok &= sndq_send(&st, i);
+
+    /* the socket could not take it all, the rest must have been queued */
+    sndq_read(&st, FALSE);
+    ok &= (st.received < SNDQ_COUNT);
+
+    sndq_drain(&st, FALSE);
+    ok &= (!st.failed && st.received == SNDQ_COUNT);
+    ok &= (st.congested == 0 && !st.closed);
+
+    sndq_cleanup(&st);
+
+    return ok;
+}
+
+
+static int sndq_test_congestion(mrp_mainloop_t *ml)
+{
+    sndq_test_t st;
+    uint32_t    i;
+    int         ok;
+
+    if (!sndq_setup(&st, ml, "drop-oldest", SNDQ_HIWAT))
+        return FALSE;
+
+    ok = TRUE;
+
+    for (i = 0; i < SNDQ_COUNT && !st.congested; i++)
+        ok &= sndq_send(&st, i);
+
+    /* we only get notified again once the queue drains */
+    for (; i < SNDQ_COUNT; i++)
+        ok &= sndq_send(&st, i);
+
+    ok &= (st.congested == 1 && st.decongested == 0);
+
+    sndq_drain(&st, TRUE);
+    ok &= (!st.failed && st.congested == 1 && st.decongested == 1);
+
+    sndq_cleanup(&st);
+
+    return ok;
+}
+
+
+static int sndq_test_drop(mrp_mainloop_t *ml)
+{
+    sndq_test_t st;
+    uint32_t    i;
+    int         ok;
+
+    if (!sndq_setup(&st, ml, "drop-oldest", SNDQ_HIWAT))
+        return FALSE;
+
+    ok = TRUE;
+
+    for (i = 0; i < SNDQ_COUNT; i++)
+        ok &= sndq_send(&st, i);
+
+    /* whole messages are dropped, but never the newest one */
+    sndq_drain(&st, TRUE);
+    ok &= (!st.failed && st.next == SNDQ_COUNT && st.partial == 0);
+    ok &= (st.received < SNDQ_COUNT && !st.closed);
+
+    sndq_cleanup(&st);
+
+    return ok;
+}
+
+
+static int sndq_test_disconnect(mrp_mainloop_t *ml)
+{
+    sndq_test_t st;
+    uint32_t    i;
+    int         ok;
+
+    if (!sndq_setup(&st, ml, "disconnect", SNDQ_HIWAT))
+        return FALSE;
+
+    for (i = 0; i < SNDQ_COUNT; i++)
+        if (!sndq_send(&st, i))
+            break;
+
+    ok = (i < SNDQ_COUNT && st.congested == 1);
+
+    /* once disconnected, nothing gets sent any more */
+    ok &= !sndq_send(&st, i);
+
+    sndq_wait_closed(&st);
+    ok &= (st.closed && st.error == ENOBUFS);
+
+    sndq_cleanup(&st);
+
+    return ok;
+}
+
+
+static int sndq_test_block(mrp_mainloop_t *ml)
+{
+    sndq_test_t  st;
+    mrp_timer_t *t;
+    double       deadline;
+    uint32_t     i;
+    pid_t        pid;
+    int          ok, status;
+
+    if (!sndq_setup(&st, ml, "block", SNDQ_HIWAT))
+        return FALSE;
+
+    /* a slow reader, that takes a while to get going */
+    if ((pid = fork()) < 0) {
+        sndq_cleanup(&st);
+        return FALSE;
+    }
+
+    if (pid == 0) {
+        usleep(100 * 1000);
+        fcntl(st.peer, F_SETFL, 0);
+        sndq_read(&st, FALSE);
+        _exit(!st.failed && st.received == SNDQ_COUNT ? 0 : 1);
+    }
+
+    close(st.peer);
+    st.peer = -1;
+
+    ok = TRUE;
+
+    for (i = 0; i < SNDQ_COUNT; i++)
+        ok &= sndq_send(&st, i);
+
+    ok &= (st.congested >= 1);
+
+    /* flush the rest of the queue to the reader */
+    t        = mrp_add_timer(ml, 10, sndq_tick, NULL);
+    deadline = bench_now() + 5;
+
+    while (waitpid(pid, &status, WNOHANG) == 0) {
+        if (bench_now() > deadline) {
+            kill(pid, SIGKILL);
+            waitpid(pid, &status, 0);
+            ok = FALSE;
+            break;
+        }
+
+        mrp_mainloop_iterate(ml);
+    }
+
+    mrp_del_timer(t);
+
+    /*
+     * The reader exits once it has everything, so we may well have seen
+     * the end of the stream by now. Only a close with an error is bad.
+     */
+    ok &= (WIFEXITED(status) && WEXITSTATUS(status) == 0);
+    ok &= !(st.closed && st.error != 0);
+
+    mrp_transport_destroy(st.t);
+
+    return ok;
+}
+
+
+static int sndq_test_timeout(mrp_mainloop_t *ml)
+{
+    sndq_test_t st;
+    uint32_t    i;
+    int         timeout, ok;
+
+    if (!sndq_setup(&st, ml, "block", SNDQ_HIWAT))
+        return FALSE;
+
+    timeout = 100;
+
+    if (!mrp_transport_setopt(st.t, MRP_TRANSPORT_OPT_SNDQ_TIMEOUT,
+                              &timeout)) {
+        sndq_cleanup(&st);
+        return FALSE;
+    }
+
+    /* nobody reads, so blocking eventually times out */
+    for (i = 0; i < SNDQ_COUNT; i++)
+        if (!sndq_send(&st, i))
+            break;
+
+    ok = (i < SNDQ_COUNT);
+
+    sndq_wait_closed(&st);
+    ok &= (st.closed && st.error == ETIMEDOUT);
+
+    sndq_cleanup(&st);
+
+    return ok;
+}
+
+
+int run_sndq_tests(context_t *c)
+{
+    static struct {
+        const char *name;
+        int       (*test)(mrp_mainloop_t *ml);
+    } tests[] = {
+        { "queueing"  , sndq_test_queueing   },
+        { "congestion", sndq_test_congestion },
+        { "drop"      , sndq_test_drop       },
+        { "disconnect", sndq_test_disconnect },
+        { "block"     , sndq_test_block      },
+        { "timeout"   , sndq_test_timeout    },
+    };
+
+    size_t i;
+    int    failed;
+
+    failed = 0;
+
+    for (i = 0; i < MRP_ARRAY_SIZE(tests); i++) {
+        if (tests[i].test(c->ml))
+            mrp_log_info("send queue %s test passed.", tests[i].name);
+        else {
+            mrp_log_error("send queue %s test failed.", tests[i].name);
+            failed++;
+        }
+    }
+
+    return failed;
+}
+
+
 static void print_usage(const char *argv0, int exit_code, const char *fmt, ...)
 {
     va_list ap;
@@ -804,6 +1484,8 @@ static void print_usage(const char *argv0, int exit_code, const char *fmt, ...)
            "  -r, --raw                      use raw messages\n"
            "  -n, --native                   use native messages\n"
            "  -b, --buggy                    use buggy data descriptors\n"
+           "  -B, --benchmark=COUNT          benchmark with COUNT messages\n"
+           "  -Q, --sndq                     test stream output queueing\n"
            "  -t, --log-target=TARGET        log target to use\n"
            "      TARGET is one of stderr,stdout,syslog, or a logfile path\n"
            "  -l, --log-level=LEVELS         logging level to use\n"
@@ -832,7 +1514,7 @@ static void config_set_defaults(context_t *ctx)
 
 int parse_cmdline(context_t *ctx, int argc, char **argv)
 {
-#   define OPTIONS "scmrnbCa:l:t:v:d:h"
+#   define OPTIONS "scmrnbB:QCa:l:t:v:d:h"
     struct option options[] = {
         { "server"    , no_argument      , NULL, 's' },
         { "address"   , required_argument, NULL, 'a' },
@@ -843,6 +1525,8 @@ int parse_cmdline(context_t *ctx, int argc, char **argv)
         { "connect"   , no_argument      , NULL, 'C' },
 
         { "buggy"     , no_argument      , NULL, 'b' },
+        { "benchmark" , required_argument, NULL, 'B' },
+        { "sndq"      , no_argument      , NULL, 'Q' },
         { "log-level" , required_argument, NULL, 'l' },
         { "log-target", required_argument, NULL, 't' },
         { "verbose"   , optional_argument, NULL, 'v' },
@@ -901,6 +1585,16 @@ int parse_cmdline(context_t *ctx, int argc, char **argv)
             ctx->buggy = TRUE;
             break;
 
+        case 'B':
+            ctx->bench = (int)strtoul(optarg, NULL, 10);
+            if (ctx->bench <= 0)
+                print_usage(argv[0], EINVAL, "invalid count '%s'", optarg);
+            break;
+
+        case 'Q':
+            ctx->sndq = TRUE;
+            break;
+
         case 'C':
             ctx->connect = TRUE;
             break;
@@ -987,6 +1681,14 @@ int main(int argc, char *argv[])
 
     c.ml = mrp_mainloop_create();
 
+    if (c.bench) {
+        run_benchmark(&c);
+        return 0;
+    }
+
+    if (c.sndq)
+        return run_sndq_tests(&c) ? 1 : 0;
+
     if (c.server)
         server_init(&c);
     else
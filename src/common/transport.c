@@ -39,6 +39,8 @@
 static int check_destroy(mrp_transport_t *t);
 static int recv_data(mrp_transport_t *t, void *data, size_t size,
                      mrp_sockaddr_t *addr, socklen_t addrlen);
+static int recv_buffer(mrp_transport_t *t, mrp_rcvbuf_t *buf, void *data,
+                       size_t size, mrp_sockaddr_t *addr, socklen_t addrlen);
 static inline int purge_destroyed(mrp_transport_t *t);
 
 
@@ -165,6 +167,7 @@ mrp_transport_t *mrp_transport_create(mrp_mainloop_t *ml, const char *type,
 
             t->check_destroy = check_destroy;
             t->recv_data     = recv_data;
+            t->recv_buffer   = recv_buffer;
             t->flags         = flags & ~MRP_TRANSPORT_MODE_MASK;
             t->mode          = flags &  MRP_TRANSPORT_MODE_MASK;
 
@@ -206,6 +209,7 @@ mrp_transport_t *mrp_transport_create_from(mrp_mainloop_t *ml, const char *type,
 
             t->check_destroy = check_destroy;
             t->recv_data     = recv_data;
+            t->recv_buffer   = recv_buffer;
             t->flags         = flags & ~MRP_TRANSPORT_MODE_MASK;
             t->mode          = flags &  MRP_TRANSPORT_MODE_MASK;
 
@@ -233,14 +237,13 @@ mrp_transport_t *mrp_transport_create_from(mrp_mainloop_t *ml, const char *type,
 int mrp_transport_setopt(mrp_transport_t *t, const char *opt, const void *val)
 {
     if (t != NULL) {
-        if (t->descr->req.setopt != NULL)
-            return t->descr->req.setopt(t, opt, val);
-        else {
-            if (t->mode == MRP_TRANSPORT_MODE_NATIVE) {
-                if (!strcmp(opt, MRP_TRANSPORT_OPT_TYPEMAP)) {
-                    t->map = (void *)val;
-                    return TRUE;
-                }
+        if (t->descr->req.setopt != NULL && t->descr->req.setopt(t, opt, val))
+            return TRUE;
+
+        if (t->mode == MRP_TRANSPORT_MODE_NATIVE) {
+            if (!strcmp(opt, MRP_TRANSPORT_OPT_TYPEMAP)) {
+                t->map = (void *)val;
+                return TRUE;
             }
         }
     }
@@ -330,6 +333,7 @@ mrp_transport_t *mrp_transport_accept(mrp_transport_t *lt,
 
         t->check_destroy = check_destroy;
         t->recv_data     = recv_data;
+        t->recv_buffer   = recv_buffer;
         t->flags         = (lt->flags & MRP_TRANSPORT_INHERIT) | flags;
         t->flags         = t->flags & ~MRP_TRANSPORT_MODE_MASK;
         t->mode          = lt->mode;
@@ -631,6 +635,26 @@ int mrp_transport_sendnativeto(mrp_transport_t *t, void *data, uint32_t type_id,
 }
 
 
+static int recv_msg(mrp_transport_t *t, mrp_msg_t *msg,
+                    mrp_sockaddr_t *addr, socklen_t addrlen)
+{
+    if (t->connected) {
+        MRP_TRANSPORT_BUSY(t, {
+                t->evt.recvmsg(t, msg, t->user_data);
+            });
+    }
+    else {
+        MRP_TRANSPORT_BUSY(t, {
+                t->evt.recvmsgfrom(t, msg, addr, addrlen, t->user_data);
+            });
+    }
+
+    mrp_msg_unref(msg);
+
+    return 0;
+}
+
+
 static int recv_data(mrp_transport_t *t, void *data, size_t size,
                      mrp_sockaddr_t *addr, socklen_t addrlen)
 {
@@ -703,23 +727,8 @@ static int recv_data(mrp_transport_t *t, void *data, size_t size,
             (msg = mrp_msg_default_decode(data, size)) == NULL) {
             return -EPROTO;
         }
-        else {
-            if (t->connected) {
-                MRP_TRANSPORT_BUSY(t, {
-                        t->evt.recvmsg(t, msg, t->user_data);
-                    });
-            }
-            else {
-                MRP_TRANSPORT_BUSY(t, {
-                        t->evt.recvmsgfrom(t, msg, addr, addrlen,
-                                           t->user_data);
-                    });
-            }
-
-            mrp_msg_unref(msg);
-
-            return 0;
-        }
+        else
+            return recv_msg(t, msg, addr, addrlen);
         break;
 
     case MRP_TRANSPORT_MODE_CUSTOM:
@@ -772,3 +781,24 @@ static int recv_data(mrp_transport_t *t, void *data, size_t size,
     }
 }
 
+
+static int recv_buffer(mrp_transport_t *t, mrp_rcvbuf_t *buf, void *data,
+                       size_t size, mrp_sockaddr_t *addr, socklen_t addrlen)
+{
+    mrp_msg_t *msg;
+    uint16_t   tag;
+
+    /* only generic messages are decoded in place, for now */
+    if (t->mode != MRP_TRANSPORT_MODE_MSG)
+        return recv_data(t, data, size, addr, addrlen);
+
+    tag   = be16toh(*(uint16_t *)data);
+    data += sizeof(tag);
+    size -= sizeof(tag);
+
+    if (tag != MRP_MSG_TAG_DEFAULT ||
+        (msg = mrp_msg_default_decode_inplace(buf, data, size)) == NULL)
+        return -EPROTO;
+    else
+        return recv_msg(t, msg, addr, addrlen);
+}
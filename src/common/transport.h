@@ -97,6 +97,34 @@ typedef enum {
 
 #define MRP_TRANSPORT_OPT_TYPEMAP "type-map"
 
+
+/*
+ * output queueing for stream transports
+ *
+ * Messages that cannot be written to the socket right away are put on a
+ * per-transport output queue which is flushed, with as few writev calls
+ * as possible, once the socket becomes writable again. If the amount of
+ * queued data exceeds the high-water mark the transport is considered
+ * congested, the congested event callback is invoked and the configured
+ * policy for slow readers is applied. The congested callback is invoked
+ * again once the queue has drained below half of the high-water mark.
+ * With the blocking policy a reader which makes no progress within the
+ * block timeout is disconnected.
+ */
+
+#define MRP_TRANSPORT_OPT_SNDQ_HIGHWAT "sndq-high-water" /* size_t * */
+#define MRP_TRANSPORT_OPT_SNDQ_POLICY  "sndq-policy"     /* policy name */
+#define MRP_TRANSPORT_OPT_SNDQ_TIMEOUT "sndq-timeout"    /* int *, in msecs */
+
+#define MRP_TRANSPORT_SNDQ_HIGHWAT (1024 * 1024) /* default high-water mark */
+#define MRP_TRANSPORT_SNDQ_TIMEOUT 5000          /* default block timeout */
+
+typedef enum {
+    MRP_TRANSPORT_SNDQ_DROP_OLDEST = 0,  /* drop the oldest queued messages */
+    MRP_TRANSPORT_SNDQ_DISCONNECT,       /* disconnect the slow reader */
+    MRP_TRANSPORT_SNDQ_BLOCK,            /* block until below high-water */
+} mrp_transport_sndq_policy_t;
+
 /*
  * transport requests
  *
@@ -212,6 +240,8 @@ typedef struct {
     void (*closed)(mrp_transport_t *t, int error, void *user_data);
     /** Connection attempt on a socket being listened on. */
     void (*connection)(mrp_transport_t *t, void *user_data);
+    /** Output queue got above or drained below its high-water mark. */
+    void (*congested)(mrp_transport_t *t, int congested, void *user_data);
 } mrp_transport_evt_t;
 
 
@@ -242,6 +272,11 @@ typedef struct {
                                         size_t size,                      \
                                         mrp_sockaddr_t *addr,             \
                                         socklen_t addrlen);               \
+    int                    (*recv_buffer)(mrp_transport_t *t,             \
+                                          mrp_rcvbuf_t *buf, void *data,  \
+                                          size_t size,                    \
+                                          mrp_sockaddr_t *addr,           \
+                                          socklen_t addrlen);             \
     void                    *user_data;                                   \
     mrp_typemap_t           *map;                                         \
     int                      flags;                                       \
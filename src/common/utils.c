@@ -202,9 +202,14 @@ uint32_t mrp_string_hash(const void *key)
     uint32_t    h;
     const char *p;
 
-    for (h = 0, p = key; *p; p++) {
-        h <<= 1;
-        h  ^= *p;
+    /*
+     * 32-bit FNV-1a. Hash tables use open addressing, so we need a hash
+     * that spreads similar keys (like D-Bus paths ending in a counter)
+     * properly.
+     */
+    for (h = 2166136261U, p = key; *p; p++) {
+        h ^= (unsigned char)*p;
+        h *= 16777619U;
     }
 
     return h;
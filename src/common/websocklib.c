@@ -1197,30 +1197,40 @@ int wsl_set_sendmode(wsl_sck_t *sck, wsl_sendmode_t mode)
 }
 
 
-int wsl_send(wsl_sck_t *sck, void *payload, size_t size)
+size_t wsl_send_headroom(wsl_sck_t *sck)
+{
+    size_t pre = LWS_SEND_BUFFER_PRE_PADDING;
+
+    if (sck != NULL && sck->proto != NULL && sck->proto->framed)
+        pre += sizeof(uint32_t);
+
+    return pre;
+}
+
+
+size_t wsl_send_tailroom(wsl_sck_t *sck)
+{
+    MRP_UNUSED(sck);
+
+    return LWS_SEND_BUFFER_POST_PADDING;
+}
+
+
+int wsl_send_inplace(wsl_sck_t *sck, void *payload, size_t size)
 {
     unsigned char *buf;
-    size_t         pre, post, total;
-    uint32_t      *len;
+    size_t         total;
+    uint32_t       len;
 
     if (sck != NULL && sck->sck != NULL) {
-        if (sck->proto->framed) {
-            pre  = LWS_SEND_BUFFER_PRE_PADDING;
-            post = LWS_SEND_BUFFER_POST_PADDING;
-            buf  = alloca(pre + sizeof(*len) + size + post);
-            len  = (uint32_t *)(buf + pre);
-            *len = htobe32(size);
-
-            memcpy(buf + pre + sizeof(*len), payload, size);
-            total = sizeof(*len) + size;
-        }
-        else {
-            pre  = LWS_SEND_BUFFER_PRE_PADDING;
-            post = LWS_SEND_BUFFER_POST_PADDING;
-            buf  = alloca(pre + size + post);
+        buf   = payload;
+        total = size;
 
-            memcpy(buf + pre, payload, size);
-            total = size;
+        if (sck->proto->framed) {
+            len    = htobe32(size);
+            buf   -= sizeof(len);
+            total += sizeof(len);
+            memcpy(buf, &len, sizeof(len));
         }
 
 #if (WSL_SEND_TEXT != 0)
@@ -1228,7 +1238,7 @@ int wsl_send(wsl_sck_t *sck, void *payload, size_t size)
             sck->send_mode = WSL_SEND_TEXT;
 #endif
 
-        if (libwebsocket_write(sck->sck, buf + pre, total, sck->send_mode) >= 0)
+        if (libwebsocket_write(sck->sck, buf, total, sck->send_mode) >= 0)
             return TRUE;
     }
 
@@ -1236,6 +1246,25 @@ int wsl_send(wsl_sck_t *sck, void *payload, size_t size)
 }
 
 
+int wsl_send(wsl_sck_t *sck, void *payload, size_t size)
+{
+    unsigned char *buf;
+    size_t         pre, post;
+
+    if (sck != NULL && sck->sck != NULL) {
+        pre  = wsl_send_headroom(sck);
+        post = wsl_send_tailroom(sck);
+        buf  = alloca(pre + size + post);
+
+        memcpy(buf + pre, payload, size);
+
+        return wsl_send_inplace(sck, buf + pre, size);
+    }
+
+    return FALSE;
+}
+
+
 int wsl_serve_http_file(wsl_sck_t *sck, const char *path, const char *type)
 {
     mrp_debug("serving file '%s' (%s) over websocket %p", path, type, sck->sck);
@@ -230,6 +230,15 @@ int wsl_set_sendmode(wsl_sck_t *sck, wsl_sendmode_t mode);
 /** Send data over a wbesocket. */
 int wsl_send(wsl_sck_t *sck, void *payload, size_t size);
 
+/** Get the amount of space wsl_send_inplace needs before the payload. */
+size_t wsl_send_headroom(wsl_sck_t *sck);
+
+/** Get the amount of space wsl_send_inplace needs after the payload. */
+size_t wsl_send_tailroom(wsl_sck_t *sck);
+
+/** Send data with the necessary head- and tailroom without copying it. */
+int wsl_send_inplace(wsl_sck_t *sck, void *payload, size_t size);
+
 /** Serve the given file over the given socket. */
 int wsl_serve_http_file(wsl_sck_t *sck, const char *path, const char *mime);
 
@@ -53,6 +53,7 @@
 
 #define WSCKP "wsck"                     /* websocket transport prefix */
 #define WSCKL 4                          /* websocket transport prefix length */
+#define SCRATCH_MIN 1024                 /* initial encoding buffer size */
 
 
 /*
@@ -74,6 +75,8 @@ typedef struct {
     char               *protocol;        /* websocket protocol name */
     wsl_proto_t         proto[2];        /* protocol setup */
     mrp_list_hook_t     http_clients;    /* pure HTTP clients */
+    char               *sbuf;            /* scratch buffer for encoding */
+    size_t              ssize;           /* scratch buffer size */
 } wsck_t;
 
 
@@ -176,6 +179,9 @@ static void wsck_close(mrp_transport_t *mt)
     t->ctx = NULL;
     mrp_free(t->protocol);
     t->protocol = NULL;
+    mrp_free(t->sbuf);
+    t->sbuf  = NULL;
+    t->ssize = 0;
 
     user_data = wsl_close(sck);
 
@@ -432,23 +438,47 @@ static int wsck_disconnect(mrp_transport_t *mt)
 }
 
 
+static char *scratch_alloc(wsck_t *t, size_t size)
+{
+    size_t ssize;
+
+    if (size > t->ssize) {
+        ssize = MRP_MAX(t->ssize, (size_t)SCRATCH_MIN);
+
+        while (ssize < size)
+            ssize *= 2;
+
+        if (mrp_realloc(t->sbuf, ssize) == NULL)
+            return NULL;
+
+        t->ssize = ssize;
+    }
+
+    return t->sbuf;
+}
+
+
 static int wsck_send(mrp_transport_t *mt, mrp_msg_t *msg)
 {
     wsck_t  *t = (wsck_t *)mt;
-    void    *buf;
+    char    *buf;
     ssize_t  size;
-    int      success;
+    size_t   head, tail, avail;
 
-    size = mrp_msg_default_encode(msg, &buf);
+    /* encode in place leaving room for libwebsockets, retry if too small */
+    head  = wsl_send_headroom(t->sck);
+    tail  = wsl_send_tailroom(t->sck);
+    avail = t->ssize > head + tail ? t->ssize - head - tail : 0;
+    size  = mrp_msg_default_encode_to(msg, avail ? t->sbuf + head : NULL,
+                                      avail);
 
-    if (wsl_send(t->sck, buf, size))
-        success = TRUE;
-    else
-        success = FALSE;
+    if (size < 0 || (buf = scratch_alloc(t, head + size + tail)) == NULL)
+        return FALSE;
 
-    mrp_free(buf);
+    if ((size_t)size > avail)
+        mrp_msg_default_encode_to(msg, buf + head, size);
 
-    return success;
+    return wsl_send_inplace(t->sck, buf + head, size);
 }
 
 
@@ -464,29 +494,33 @@ static int wsck_senddata(mrp_transport_t *mt, void *data, uint16_t tag)
 {
     wsck_t           *t = (wsck_t *)mt;
     mrp_data_descr_t *type;
-    void             *buf;
-    size_t            size, reserve;
+    char             *buf;
+    ssize_t           size;
+    size_t            head, tail, avail;
     uint16_t         *tagp;
-    int               status;
 
     type = mrp_msg_find_type(tag);
 
-    if (type != NULL) {
-        reserve = sizeof(*tagp);
-        size    = mrp_data_encode(&buf, data, type, reserve);
+    if (type == NULL)
+        return FALSE;
 
-        if (size > 0) {
-            tagp  = buf;
-            *tagp = htobe16(tag);
+    head  = wsl_send_headroom(t->sck) + sizeof(*tagp);
+    tail  = wsl_send_tailroom(t->sck);
+    avail = t->ssize > head + tail ? t->ssize - head - tail : 0;
+    size  = mrp_data_encode_to(avail ? t->sbuf + head : NULL, avail,
+                               data, type);
 
-            status = wsl_send(t->sck, buf, size);
+    if (size < 0 || (buf = scratch_alloc(t, head + size + tail)) == NULL)
+        return FALSE;
 
-            mrp_free(buf);
-            return status;
-        }
-    }
+    if ((size_t)size > avail)
+        mrp_data_encode_to(buf + head, size, data, type);
 
-    return FALSE;
+    tagp  = (uint16_t *)(buf + head - sizeof(*tagp));
+    *tagp = htobe16(tag);
+
+    return wsl_send_inplace(t->sck, buf + head - sizeof(*tagp),
+                            sizeof(*tagp) + size);
 }
 
 
@@ -31,3 +31,4 @@
 #include "console-debug.c"
 #include "console-db.c"
 #include "console-log.c"
+#include "console-mem.c"
@@ -0,0 +1,80 @@
+/*
+ * Copyright (c) 2012, Intel Corporation
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met:
+ *
+ *   * Redistributions of source code must retain the above copyright notice,
+ *     this list of conditions and the following disclaimer.
+ *   * Redistributions in binary form must reproduce the above copyright
+ *     notice, this list of conditions and the following disclaimer in the
+ *     documentation and/or other materials provided with the distribution.
+ *   * Neither the name of Intel Corporation nor the names of its contributors
+ *     may be used to endorse or promote products derived from this software
+ *     without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+
+/*
+ * memory commands
+ */
+
+#include <murphy-db/mdb.h>
+
+#define MAX_POOLS 128
+
+static void mem_pools(mrp_console_t *c, void *user_data,
+                      int argc, char **argv)
+{
+    mrp_objpool_stats_t  mrp[MAX_POOLS];
+    mdb_pool_stats_t     mdb[MAX_POOLS];
+    int                  nmrp, nmdb, i;
+
+    MRP_UNUSED(c);
+    MRP_UNUSED(user_data);
+    MRP_UNUSED(argc);
+    MRP_UNUSED(argv);
+
+    nmrp = MRP_MIN(mrp_objpool_get_stats(mrp, MAX_POOLS), MAX_POOLS);
+    nmdb = MRP_MIN(mdb_pool_get_stats(mdb, MAX_POOLS), MAX_POOLS);
+
+    printf("%-32s %6s %8s %8s %8s\n", "object pool", "size", "live",
+           "max", "chunks");
+
+    for (i = 0; i < nmrp; i++)
+        printf("%-32.32s %6zu %8zu %8zu %8zu\n", mrp[i].name,
+               mrp[i].objsize, mrp[i].nobj, mrp[i].nmax, mrp[i].nchunk);
+
+    for (i = 0; i < nmdb; i++)
+        printf("db:%-29.29s %6zu %8zu %8zu %8zu\n", mdb[i].name,
+               mdb[i].objsize, mdb[i].nobj, mdb[i].nmax, mdb[i].nchunk);
+}
+
+
+#define MEM_GROUP_DESCRIPTION                                               \
+    "Memory commands provide means to inspect the memory usage of Murphy.\n"
+
+#define POOLS_SYNTAX      ""
+#define POOLS_SUMMARY     "show the usage of the object pools"
+#define POOLS_DESCRIPTION \
+    "Lists the object pools with their object size, the number of live\n" \
+    "objects, the maximum number of objects ever allocated and the number\n" \
+    "of allocated chunks.\n"
+
+MRP_CORE_CONSOLE_GROUP(mem_group, "mem", MEM_GROUP_DESCRIPTION, NULL, {
+        MRP_TOKENIZED_CMD("pools", mem_pools, FALSE,
+                          POOLS_SYNTAX, POOLS_SUMMARY, POOLS_DESCRIPTION)
+});
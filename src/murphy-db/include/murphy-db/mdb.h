@@ -30,10 +30,21 @@
 #ifndef __MDB_MDB_H__
 #define __MDB_MDB_H__
 
+#include <stddef.h>
+
 #include <murphy-db/mqi-types.h>
 
 typedef struct mdb_table_s mdb_table_t;
 
+typedef struct {
+    const char *name;
+    size_t      objsize;
+    size_t      nobj;       /* objects in use */
+    size_t      nmax;       /* max. objects ever in use */
+    size_t      nchunk;     /* number of allocated chunks */
+    size_t      nslot;      /* object slots in the chunks */
+} mdb_pool_stats_t;
+
 
 int mdb_trigger_add_column_callback(mdb_table_t *, int, mqi_trigger_cb_t,
                                   void *, mqi_column_desc_t *);
@@ -52,11 +63,23 @@ int mdb_transaction_commit(uint32_t);
 int mdb_transaction_rollback(uint32_t);
 uint32_t mdb_transaction_get_depth(void);
 
+int mdb_persist_open(const char *, int, int);
+int mdb_persist_close(void);
+int mdb_persist_sync(void);
+int mdb_persist_set_timer(mqi_timer_ops_t *, void *);
+int mdb_persist_checkpoint(void);
+int mdb_persist_table(mdb_table_t *);
+int mdb_persist_get_tables(mdb_table_t **, int);
+
+int mdb_pool_get_stats(mdb_pool_stats_t *, int);
+
 
 mdb_table_t *mdb_table_create(char *, char **, mqi_column_def_t *);
 int mdb_table_register_handle(mdb_table_t *, mqi_handle_t);
 int mdb_table_drop(mdb_table_t *);
 int mdb_table_create_index(mdb_table_t *, char **);
+int mdb_table_create_named_index(mdb_table_t *, char *, uint32_t, char **);
+int mdb_table_drop_index(mdb_table_t *, char *);
 int mdb_table_describe(mdb_table_t *, mqi_column_def_t *, int);
 int mdb_table_insert(mdb_table_t *, int, mqi_column_desc_t *, void **);
 int mdb_table_select(mdb_table_t *, mqi_cond_entry_t *,
@@ -66,9 +89,11 @@ int mdb_table_select_by_index(mdb_table_t *, mqi_variable_t *,
 int mdb_table_update(mdb_table_t *, mqi_cond_entry_t *,
                      mqi_column_desc_t *, void *);
 int mdb_table_delete(mdb_table_t *, mqi_cond_entry_t *);
+int mdb_table_explain(mdb_table_t *, mqi_cond_entry_t *, char *, int);
 
 
 mdb_table_t *mdb_table_find(char *);
+char *mdb_table_get_name(mdb_table_t *);
 int mdb_table_get_column_index(mdb_table_t *, char *);
 int mdb_table_get_size(mdb_table_t *);
 char *mdb_table_get_column_name(mdb_table_t *, int);
@@ -77,6 +77,9 @@
 #define MQI_COLUMN_KEY        (1UL << 0)
 #define MQI_COLUMN_AUTOINCR   (1UL << 1)
 
+#define MQI_INDEX_HASH        0             /* equality lookups only */
+#define MQI_INDEX_ORDERED     (1UL << 0)    /* equality and range lookups */
+
 enum mqi_data_type_e {
     mqi_error = -1,    /* not a data type; used to return error conditions */
     mqi_unknown = 0,
@@ -150,6 +153,17 @@ typedef struct mqi_transact_event_s  mqi_transact_event_t;
 
 typedef void (*mqi_trigger_cb_t)(mqi_event_t *, void *);
 
+/*
+ * timers for the storage, provided by whoever owns the mainloop
+ */
+typedef struct {
+    /* arm a one-shot timer to call cb(cb_data) after msecs */
+    void *(*add)(void *data, unsigned int msecs,
+                 void (*cb)(void *cb_data), void *cb_data);
+    /* cancel a timer, called from its callback as well */
+    void  (*del)(void *data, void *timer);
+} mqi_timer_ops_t;
+
 
 
 struct mqi_column_def_s {
@@ -225,12 +239,15 @@ struct mqi_column_event_s {
     mqi_change_coldsc_t column;
     mqi_change_value_t  value;
     mqi_change_select_t select;
+    mqi_bitfld_t        colmask;   /* all the changed columns of the row */
+    const void         *row;       /* identity of the row within a commit */
 };
 
 struct mqi_row_event_s {
     mqi_event_type_t    event;
     mqi_change_table_t  table;
     mqi_change_select_t select;
+    const void         *row;       /* identity of the row within a commit */
 };
 
 struct mqi_table_event_s {
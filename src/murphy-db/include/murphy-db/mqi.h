@@ -66,7 +66,7 @@
     {.type=mqi_operator, .u.operator_=mqi_##op}
 
 
-#define MQI_EXPRESSION(seq)        MQI_OPERATOR(begin), seq, MQI_OPERATOR(end),
+#define MQI_EXPRESSION(seq...)     MQI_OPERATOR(begin), seq MQI_OPERATOR(end),
 
 
 #define MQI_STRING_VAL(val)        MQI_VALUE(varchar, (char **)&val),
@@ -158,6 +158,12 @@
 int mqi_open(void);
 int mqi_close(void);
 
+int mqi_open_storage(const char *, int, int);
+int mqi_sync_storage(void);
+int mqi_set_storage_timer(mqi_timer_ops_t *, void *);
+int mqi_checkpoint_storage(void);
+int mqi_close_storage(void);
+
 int mqi_show_tables(uint32_t, char **, int);
 
 int mqi_create_transaction_trigger(mqi_trigger_cb_t, void *);
@@ -177,6 +183,8 @@ mqi_handle_t mqi_get_transaction_handle(void);
 uint32_t mqi_get_transaction_depth(void);
 mqi_handle_t mqi_create_table(char *, uint32_t, char **, mqi_column_def_t *);
 int mqi_create_index(mqi_handle_t, char **);
+int mqi_create_named_index(mqi_handle_t, char *, uint32_t, char **);
+int mqi_drop_index(mqi_handle_t, char *);
 int mqi_drop_table(mqi_handle_t);
 int mqi_describe(mqi_handle_t, mqi_column_def_t *, int);
 int mqi_insert_into(mqi_handle_t, int, mqi_column_desc_t *, void **);
@@ -195,6 +203,7 @@ mqi_data_type_t mqi_get_column_type(mqi_handle_t, int);
 int mqi_get_column_size(mqi_handle_t, int);
 uint32_t mqi_get_table_stamp(mqi_handle_t);
 int mqi_print_rows(mqi_handle_t, char *, int);
+int mqi_explain(mqi_handle_t, mqi_cond_entry_t *, char *, int);
 
 
 #endif /* __MQI_MQI_H__ */
@@ -61,6 +61,7 @@ int mdb_sequence_table_print(mdb_sequence_t *, char *, int);
 int mdb_sequence_add(mdb_sequence_t *, int, void *, void *);
 void *mdb_sequence_delete(mdb_sequence_t *, int, void *);
 void *mdb_sequence_iterate(mdb_sequence_t *, void **);
+void *mdb_sequence_iterate_from(mdb_sequence_t *, int, void *, void **);
 void mdb_sequence_cursor_destroy(mdb_sequence_t *, void **);
 
 
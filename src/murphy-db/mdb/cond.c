@@ -61,6 +61,20 @@ typedef struct {
 
 #define PRECEDENCE_DATA 256
 
+#define COND_STACK_MAX  256
+
+/* relational operators as masks of the accepted comparison results */
+#define RELOP_LESS      (1 << 0)
+#define RELOP_EQUAL     (1 << 1)
+#define RELOP_GREATER   (1 << 2)
+
+#define RELOP_MATCH(mask, cmp)  (((mask) >> ((cmp) + 1)) & 1)
+#define RELOP_FLIP(mask)                                                \
+    ((((mask) & RELOP_LESS) << 2) | ((mask) & RELOP_EQUAL) |            \
+     (((mask) & RELOP_GREATER) >> 2))
+
+#define COMPARE(a, b)   (((a) > (b)) - ((a) < (b)))
+
 typedef struct {
     int                precedence; /* 256 => data, precedence otherwise */
     union {
@@ -69,12 +83,74 @@ typedef struct {
     };
 } cond_stack_t;
 
+typedef enum {
+    cond_const = 0,             /* push a constant */
+    cond_column_integer,        /* push a column value */
+    cond_column_unsignd,
+    cond_column_varchar,
+    cond_variable_integer,      /* push a variable value */
+    cond_variable_unsignd,
+    cond_variable_varchar,
+    cond_compare_integer,       /* replace the topmost two values */
+    cond_compare_unsignd,       /*   by the result of a comparison */
+    cond_compare_varchar,
+    cond_match_integer,         /* push the result of comparing a column */
+    cond_match_unsignd,         /*   with a variable */
+    cond_match_varchar,
+    cond_not_integer,           /* negate the topmost value */
+    cond_not_varchar,
+    cond_bool,                  /* turn the topmost value to 0 or 1 */
+    cond_bool_varchar,
+    cond_jump_if_false,         /* jump if the topmost value is false, */
+    cond_jump_if_true,          /*   or true, otherwise pop it */
+} cond_opcode_t;
+
+typedef struct {
+    uint16_t  opcode;
+    uint16_t  relop;            /* RELOP_* mask for comparisons */
+    int32_t   arg;              /* column offset, constant or jump target */
+    void     *var;              /* variable */
+} cond_insn_t;
+
+typedef union {
+    int32_t     integer;
+    uint32_t    unsignd;
+    const char *varchar;
+} cond_value_t;
+
+struct mdb_cond_s {
+    int          ninsn;
+    cond_insn_t  insns[0];
+};
+
+typedef struct {
+    mdb_table_t      *tbl;
+    mqi_cond_entry_t *ce;       /* next entry to compile */
+    cond_insn_t      *insns;
+    int               ninsn;
+    int               nalloc;
+    int               depth;    /* stack depth at this point */
+    int               maxdepth;
+} cond_compiler_t;
+
 static int cond_get_data(cond_stack_t*,mqi_cond_entry_t*,mdb_column_t*,void*);
 static int cond_eval(cond_stack_t *, cond_stack_t *, int);
 static int cond_relop(mqi_operator_t, cond_stack_t *, cond_stack_t *);
 static int cond_binary_logicop(mqi_operator_t, cond_stack_t *,
                                cond_stack_t *);
 static int cond_unary_logicop(mqi_operator_t, cond_stack_t *);
+static mqi_data_type_t compile_expression(cond_compiler_t *, int);
+static mqi_data_type_t compile_operand(cond_compiler_t *);
+static mqi_data_type_t compile_relop(cond_compiler_t *, mqi_operator_t,
+                                     int, int, int,
+                                     mqi_data_type_t, mqi_data_type_t);
+static mqi_data_type_t compile_logicop(cond_compiler_t *, mqi_operator_t,
+                                       int, int, int, mqi_data_type_t);
+static mqi_data_type_t compile_truth(cond_compiler_t *, int, int,
+                                     mqi_data_type_t);
+static mqi_data_type_t compile_false(cond_compiler_t *, int, int);
+static int emit(cond_compiler_t *, cond_opcode_t, int, int, int32_t, void *);
+static int compare_varchar(const char *, const char *);
 
 int mdb_cond_evaluate(mdb_table_t *tbl, mqi_cond_entry_t **cond_ptr,void *data)
 {
@@ -107,14 +183,16 @@ int mdb_cond_evaluate(mdb_table_t *tbl, mqi_cond_entry_t **cond_ptr,void *data)
 
         case mqi_operator:
             pr  = precedence[cond->u.operator_];
-            sp += cond_eval(sp, lastop, pr);
+
+            if (cond->u.operator_ != mqi_begin)
+                sp += cond_eval(sp, lastop, pr);
 
             switch (cond->u.operator_) {
 
             case mqi_begin:
+                /* a group is an operand: evaluate it and push the result */
                 cond++;
                 result = mdb_cond_evaluate(tbl, &cond, data);
-                cond++;
 
                 sp->data.v.integer = result >= 0 ? result : 0;
                 sp->precedence   = PRECEDENCE_DATA;
@@ -166,6 +244,183 @@ int mdb_cond_evaluate(mdb_table_t *tbl, mqi_cond_entry_t **cond_ptr,void *data)
     } /* for ;; */
 }
 
+/*
+ * Conditions can be compiled to a flat postfix program. The column
+ * offsets, the value types and the comparisons are all resolved at
+ * compile time, so evaluating a row is a single loop over the program.
+ * The program gives the same results as mdb_cond_evaluate(): AND binds
+ * looser than OR, operations on values of different or unsupported types
+ * are false, and a plain value is true if it is non-zero (or non-NULL).
+ */
+
+mdb_cond_t *mdb_cond_compile(mdb_table_t *tbl, mqi_cond_entry_t *cond)
+{
+    cond_compiler_t  c;
+    mdb_cond_t      *prog;
+    mqi_data_type_t  type;
+    size_t           size;
+
+    MDB_CHECKARG(tbl && cond, NULL);
+
+    memset(&c, 0, sizeof(c));
+    c.tbl = tbl;
+    c.ce  = cond;
+
+    if ((type = compile_expression(&c, 0)) == mqi_error)
+        goto failed;
+
+    if (c.ce->type != mqi_operator || c.ce->u.operator_ != mqi_end) {
+        errno = EINVAL;
+        goto failed;
+    }
+
+    if (compile_truth(&c, 0, 0, type) == mqi_error)
+        goto failed;
+
+    if (c.maxdepth > COND_STACK_MAX) {
+        errno = E2BIG;
+        goto failed;
+    }
+
+    size = sizeof(mdb_cond_t) + sizeof(cond_insn_t) * c.ninsn;
+
+    if (!(prog = malloc(size))) {
+        errno = ENOMEM;
+        goto failed;
+    }
+
+    prog->ninsn = c.ninsn;
+    memcpy(prog->insns, c.insns, sizeof(cond_insn_t) * c.ninsn);
+
+    free(c.insns);
+
+    return prog;
+
+ failed:
+    free(c.insns);
+    return NULL;
+}
+
+int mdb_cond_execute(mdb_cond_t *cond, void *data)
+{
+    cond_value_t  stack[COND_STACK_MAX];
+    cond_value_t *sp;
+    cond_insn_t  *insn, *end;
+
+    MDB_CHECKARG(cond && data, -1);
+
+    sp   = stack - 1;
+    insn = cond->insns;
+    end  = insn + cond->ninsn;
+
+    while (insn < end) {
+        switch (insn->opcode) {
+
+        case cond_const:
+            (++sp)->integer = insn->arg;
+            break;
+
+        case cond_column_integer:
+            (++sp)->integer = *(int32_t *)(data + insn->arg);
+            break;
+        case cond_column_unsignd:
+            (++sp)->unsignd = *(uint32_t *)(data + insn->arg);
+            break;
+        case cond_column_varchar:
+            (++sp)->varchar = (const char *)(data + insn->arg);
+            break;
+
+        case cond_variable_integer:
+            (++sp)->integer = *(int32_t *)insn->var;
+            break;
+        case cond_variable_unsignd:
+            (++sp)->unsignd = *(uint32_t *)insn->var;
+            break;
+        case cond_variable_varchar:
+            (++sp)->varchar = *(const char **)insn->var;
+            break;
+
+        case cond_compare_integer:
+            sp--;
+            sp->integer = RELOP_MATCH(insn->relop,
+                                      COMPARE(sp[0].integer, sp[1].integer));
+            break;
+        case cond_compare_unsignd:
+            sp--;
+            sp->integer = RELOP_MATCH(insn->relop,
+                                      COMPARE(sp[0].unsignd, sp[1].unsignd));
+            break;
+        case cond_compare_varchar:
+            sp--;
+            sp->integer = RELOP_MATCH(insn->relop,
+                                      compare_varchar(sp[0].varchar,
+                                                      sp[1].varchar));
+            break;
+
+        case cond_match_integer:
+            (++sp)->integer =
+                RELOP_MATCH(insn->relop,
+                            COMPARE(*(int32_t *)(data + insn->arg),
+                                    *(int32_t *)insn->var));
+            break;
+        case cond_match_unsignd:
+            (++sp)->integer =
+                RELOP_MATCH(insn->relop,
+                            COMPARE(*(uint32_t *)(data + insn->arg),
+                                    *(uint32_t *)insn->var));
+            break;
+        case cond_match_varchar:
+            (++sp)->integer =
+                RELOP_MATCH(insn->relop,
+                            compare_varchar((const char *)(data + insn->arg),
+                                            *(const char **)insn->var));
+            break;
+
+        case cond_not_integer:
+            sp->integer = !sp->unsignd;
+            break;
+        case cond_not_varchar:
+            sp->integer = !(sp->varchar && sp->varchar[0]);
+            break;
+
+        case cond_bool:
+            sp->integer = !!sp->unsignd;
+            break;
+        case cond_bool_varchar:
+            sp->integer = !!sp->varchar;
+            break;
+
+        case cond_jump_if_false:
+            if (!sp->unsignd) {
+                insn = cond->insns + insn->arg;
+                continue;
+            }
+            sp--;
+            break;
+        case cond_jump_if_true:
+            if (sp->unsignd) {
+                insn = cond->insns + insn->arg;
+                continue;
+            }
+            sp--;
+            break;
+
+        default:
+            errno = EINVAL;
+            return -1;
+        }
+
+        insn++;
+    }
+
+    return stack[0].integer;
+}
+
+void mdb_cond_destroy(mdb_cond_t *cond)
+{
+    free(cond);
+}
+
 static int cond_get_data(cond_stack_t     *sp,
                          mqi_cond_entry_t *cond,
                          mdb_column_t     *columns,
@@ -389,6 +644,356 @@ static int cond_unary_logicop(mqi_operator_t op, cond_stack_t *v)
     return 0;
 }
 
+static mqi_data_type_t compile_expression(cond_compiler_t *c, int minprec)
+{
+    static int precedence[mqi_operator_max] = {
+        [ mqi_and   ] = 2,
+        [ mqi_or    ] = 3,
+        [ mqi_less  ] = 4,
+        [ mqi_leq   ] = 4,
+        [ mqi_eq    ] = 4,
+        [ mqi_geq   ] = 4,
+        [ mqi_gt    ] = 4,
+    };
+
+    mqi_operator_t   op;
+    mqi_data_type_t  type, rtype;
+    int              start, depth, rstart;
+    int              pr;
+
+    start = c->ninsn;
+    depth = c->depth;
+
+    if ((type = compile_operand(c)) == mqi_error)
+        return mqi_error;
+
+    for (;;) {
+        if (c->ce->type != mqi_operator) {
+            errno = EINVAL;
+            return mqi_error;
+        }
+
+        op = c->ce->u.operator_;
+
+        /* operators of equal precedence associate to the right */
+        if (!(pr = precedence[op]) || pr < minprec)
+            return type;
+
+        c->ce++;
+
+        if (op == mqi_and || op == mqi_or)
+            type = compile_logicop(c, op, pr, start, depth, type);
+        else {
+            rstart = c->ninsn;
+
+            if ((rtype = compile_expression(c, pr)) == mqi_error)
+                return mqi_error;
+
+            type = compile_relop(c, op, start, depth, rstart, type, rtype);
+        }
+
+        if (type == mqi_error)
+            return mqi_error;
+    }
+}
+
+static mqi_data_type_t compile_operand(cond_compiler_t *c)
+{
+    mqi_cond_entry_t *ce = c->ce;
+    mdb_column_t     *col;
+    mqi_variable_t   *var;
+    mqi_data_type_t   type;
+    cond_opcode_t     opcode;
+    int               start, depth;
+
+    start = c->ninsn;
+    depth = c->depth;
+
+    switch (ce->type) {
+
+    case mqi_column:
+        if (ce->u.column < 0 || ce->u.column >= c->tbl->ncolumn) {
+            errno = EINVAL;
+            return mqi_error;
+        }
+
+        c->ce++;
+        col = c->tbl->columns + ce->u.column;
+
+        switch ((type = col->type)) {
+        case mqi_integer:  opcode = cond_column_integer;  break;
+        case mqi_unsignd:  opcode = cond_column_unsignd;  break;
+        case mqi_varchar:  opcode = cond_column_varchar;  break;
+        default:           opcode = cond_const;  type = mqi_unknown;  break;
+        }
+
+        if (emit(c, opcode, 1, 0, col->offset, NULL) < 0)
+            return mqi_error;
+
+        return type;
+
+    case mqi_variable:
+        c->ce++;
+        var = &ce->u.variable;
+
+        switch ((type = var->v.generic ? var->type : mqi_unknown)) {
+        case mqi_integer:  opcode = cond_variable_integer;  break;
+        case mqi_unsignd:  opcode = cond_variable_unsignd;  break;
+        case mqi_varchar:  opcode = cond_variable_varchar;  break;
+        default:           opcode = cond_const;  type = mqi_unknown;  break;
+        }
+
+        if (emit(c, opcode, 1, 0, 0, var->v.generic) < 0)
+            return mqi_error;
+
+        return type;
+
+    case mqi_operator:
+        c->ce++;
+
+        switch (ce->u.operator_) {
+
+        case mqi_not:
+            switch (compile_operand(c)) {
+            case mqi_error:    return mqi_error;
+            case mqi_integer:
+            case mqi_unsignd:  opcode = cond_not_integer;   break;
+            case mqi_varchar:  opcode = cond_not_varchar;   break;
+            default:           return compile_false(c, start, depth);
+            }
+
+            if (emit(c, opcode, 0, 0, 0, NULL) < 0)
+                return mqi_error;
+
+            return mqi_integer;
+
+        case mqi_begin:
+            if ((type = compile_expression(c, 0)) == mqi_error)
+                return mqi_error;
+
+            if (c->ce->type != mqi_operator || c->ce->u.operator_ != mqi_end) {
+                errno = EINVAL;
+                return mqi_error;
+            }
+
+            c->ce++;
+
+            return compile_truth(c, start, depth, type);
+
+        default:
+            errno = EINVAL;
+            return mqi_error;
+        }
+
+    default:
+        errno = EINVAL;
+        return mqi_error;
+    }
+}
+
+static mqi_data_type_t compile_relop(cond_compiler_t *c,
+                                     mqi_operator_t   op,
+                                     int              start,
+                                     int              depth,
+                                     int              rstart,
+                                     mqi_data_type_t  ltype,
+                                     mqi_data_type_t  rtype)
+{
+    static int relops[mqi_operator_max] = {
+        [ mqi_less ] = RELOP_LESS,
+        [ mqi_leq  ] = RELOP_LESS | RELOP_EQUAL,
+        [ mqi_eq   ] = RELOP_EQUAL,
+        [ mqi_geq  ] = RELOP_GREATER | RELOP_EQUAL,
+        [ mqi_gt   ] = RELOP_GREATER,
+    };
+
+    cond_insn_t   *l, *r;
+    cond_opcode_t  compare, match, column, variable;
+    int            relop = relops[op];
+
+    if (ltype != rtype)
+        return compile_false(c, start, depth);
+
+    switch (ltype) {
+    case mqi_integer:
+        compare  = cond_compare_integer;
+        match    = cond_match_integer;
+        column   = cond_column_integer;
+        variable = cond_variable_integer;
+        break;
+    case mqi_unsignd:
+        compare  = cond_compare_unsignd;
+        match    = cond_match_unsignd;
+        column   = cond_column_unsignd;
+        variable = cond_variable_unsignd;
+        break;
+    case mqi_varchar:
+        compare  = cond_compare_varchar;
+        match    = cond_match_varchar;
+        column   = cond_column_varchar;
+        variable = cond_variable_varchar;
+        break;
+    default:
+        return compile_false(c, start, depth);
+    }
+
+    /* fuse 'column relop variable' and 'variable relop column' */
+    if (rstart == start + 1 && c->ninsn == start + 2) {
+        l = c->insns + start;
+        r = l + 1;
+
+        if (l->opcode == column && r->opcode == variable) {
+            l->var = r->var;
+            goto fuse;
+        }
+
+        if (l->opcode == variable && r->opcode == column) {
+            l->arg = r->arg;
+            relop  = RELOP_FLIP(relop);
+            goto fuse;
+        }
+    }
+
+    if (emit(c, compare, -1, relop, 0, NULL) < 0)
+        return mqi_error;
+
+    return mqi_integer;
+
+ fuse:
+    l->opcode = match;
+    l->relop  = relop;
+    c->ninsn--;
+    c->depth--;
+
+    return mqi_integer;
+}
+
+static mqi_data_type_t compile_logicop(cond_compiler_t *c,
+                                       mqi_operator_t   op,
+                                       int              pr,
+                                       int              start,
+                                       int              depth,
+                                       mqi_data_type_t  ltype)
+{
+    mqi_data_type_t rtype;
+    int             jump;
+
+    if (ltype != mqi_integer && ltype != mqi_unsignd) {
+        /* false anyway, but the right hand side still needs parsing */
+        if (compile_expression(c, pr) == mqi_error)
+            return mqi_error;
+
+        return compile_false(c, start, depth);
+    }
+
+    if (compile_truth(c, start, depth, mqi_integer) == mqi_error)
+        return mqi_error;
+
+    jump = emit(c, op == mqi_and ? cond_jump_if_false : cond_jump_if_true,
+                -1, 0, 0, NULL);
+
+    if (jump < 0 || (rtype = compile_expression(c, pr)) == mqi_error)
+        return mqi_error;
+
+    if (rtype != ltype)
+        return compile_false(c, start, depth);
+
+    if (compile_truth(c, start, depth, mqi_integer) == mqi_error)
+        return mqi_error;
+
+    c->insns[jump].arg = c->ninsn;
+
+    return mqi_integer;
+}
+
+static mqi_data_type_t compile_truth(cond_compiler_t *c,
+                                     int              start,
+                                     int              depth,
+                                     mqi_data_type_t  type)
+{
+    cond_opcode_t last;
+
+    switch (type) {
+
+    case mqi_integer:
+    case mqi_unsignd:
+        /* only plain values need to be turned to 0 or 1 */
+        last = c->insns[c->ninsn - 1].opcode;
+
+        if (last >= cond_column_integer && last <= cond_variable_varchar) {
+            if (emit(c, cond_bool, 0, 0, 0, NULL) < 0)
+                return mqi_error;
+        }
+        return mqi_integer;
+
+    case mqi_varchar:
+        /* strings are true unless they are NULL */
+        if (emit(c, cond_bool_varchar, 0, 0, 0, NULL) < 0)
+            return mqi_error;
+        return mqi_integer;
+
+    default:
+        return compile_false(c, start, depth);
+    }
+}
+
+static mqi_data_type_t compile_false(cond_compiler_t *c, int start, int depth)
+{
+    c->ninsn = start;
+    c->depth = depth;
+
+    if (emit(c, cond_const, 1, 0, 0, NULL) < 0)
+        return mqi_error;
+
+    return mqi_integer;
+}
+
+static int emit(cond_compiler_t *c,
+                cond_opcode_t    opcode,
+                int              delta,
+                int              relop,
+                int32_t          arg,
+                void            *var)
+{
+    cond_insn_t *insns, *insn;
+    int          nalloc;
+
+    if (c->ninsn >= c->nalloc) {
+        nalloc = c->nalloc ? c->nalloc * 2 : 16;
+
+        if (!(insns = realloc(c->insns, sizeof(cond_insn_t) * nalloc))) {
+            errno = ENOMEM;
+            return -1;
+        }
+
+        c->insns  = insns;
+        c->nalloc = nalloc;
+    }
+
+    insn = c->insns + c->ninsn;
+    insn->opcode = opcode;
+    insn->relop  = relop;
+    insn->arg    = arg;
+    insn->var    = var;
+
+    if ((c->depth += delta) > c->maxdepth)
+        c->maxdepth = c->depth;
+
+    return c->ninsn++;
+}
+
+static int compare_varchar(const char *s1, const char *s2)
+{
+    int cmp;
+
+    if (!s1 || !s2)
+        return !s1 ? (!s2 ? 0 : -1) : 1;
+
+    cmp = strcmp(s1, s2);
+
+    return COMPARE(cmp, 0);
+}
+
 /*
  * Local Variables:
  * c-basic-offset: 4
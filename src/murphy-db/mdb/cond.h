@@ -34,8 +34,14 @@
 #include <murphy-db/mdb.h>
 
 
+typedef struct mdb_cond_s mdb_cond_t;
+
 int mdb_cond_evaluate(mdb_table_t *, mqi_cond_entry_t **, void *);
 
+mdb_cond_t *mdb_cond_compile(mdb_table_t *, mqi_cond_entry_t *);
+int mdb_cond_execute(mdb_cond_t *, void *);
+void mdb_cond_destroy(mdb_cond_t *);
+
 
 #endif /* __MDB_COND_H__ */
 
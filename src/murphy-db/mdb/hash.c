@@ -39,14 +39,34 @@
 #include <murphy-db/assert.h>
 #include <murphy-db/hash.h>
 #include <murphy-db/list.h>
+#include "pool.h"
 
 #ifndef HASH_STATISTICS
 #define HASH_STATISTICS
 #endif
 
+#define HASH_BITS           30             /* bits of a full hash value */
+#define HASH_RANGE          (1 << HASH_BITS)
+#define HASH_CHAIN_MIN      4              /* minimum number of chains */
+#define HASH_CHAIN_MAX      HASH_RANGE     /* maximum number of chains */
+#define HASH_SEGMENT_BITS   8              /* max. log2 of chains/segment */
+#define HASH_GROW_LOAD      200            /* split above 2 entries/chain */
+#define HASH_SHRINK_LOAD    50             /* merge below 1/2 entries/chain */
+
+/*
+ * The table is a linear hash table (Litwin). Chains are kept in fixed size
+ * segments hanging off a segment directory, so growing never relocates the
+ * existing chains. Whenever the load factor goes above HASH_GROW_LOAD we split
+ * a single chain (the one pointed to by split) and whenever it drops below
+ * HASH_SHRINK_LOAD we merge the last chain back to its buddy. This way the
+ * cost of resizing is spread evenly across insertions and deletions instead
+ * of having an occasional stop-the-world rehash.
+ */
+
 typedef struct mdb_hash_entry_s {
     mdb_dlist_t  clink;         /* hash link, ie. chaining */
     mdb_dlist_t  elink;         /* entry link, ie. linking all entries */
+    uint32_t     hash;          /* cached full hash value of key */
     void        *key;
     void        *data;
 } hash_entry_t;
@@ -63,7 +83,6 @@ typedef struct {
 
 
 struct mdb_hash_s {
-    int                  bits;
     mdb_hash_function_t  hfunc;
     mdb_hash_compare_t   hcomp;
     mdb_hash_print_t     hprint;
@@ -74,113 +93,108 @@ struct mdb_hash_s {
         int         max;
 #endif
     }                    entries;
-    int                  nchain;
-    hash_chain_t         chains[0];
+    int                  nentry;     /* number of entries in the table */
+    int                  nchain;     /* number of chains in use */
+    int                  minchain;   /* initial, ie. minimum number of chains */
+    uint32_t             lowmask;    /* index mask for unsplit chains */
+    uint32_t             highmask;   /* index mask for already split chains */
+    uint32_t             split;      /* index of the next chain to split */
+    int                  segbits;    /* log2 of chains per segment */
+    int                  nsegment;   /* number of allocated segments */
+    int                  maxsegment; /* size of the segment directory */
+    hash_chain_t       **segments;   /* segment directory */
+#ifdef HASH_STATISTICS
+    struct {
+        int split;
+        int merge;
+    }                    resize;
+#endif
 };
 
 
-typedef struct {
-    int  nchain;
-    int  bits;
-} table_size_t;
-
-static table_size_t  sizes[]          = {
-    {    2,  2}, {    3,  2}, {    5,  3}, {    7,  3}, {   11,  4},
-    {   13,  4}, {   17,  5}, {   19,  5}, {   23,  5}, {   29,  5},
-    {   31,  5}, {   37,  6}, {   41,  6}, {   43,  6}, {   47,  6},
-    {   53,  6}, {   59,  6}, {   61,  6}, {   67,  7}, {   71,  7},
-    {   73,  7}, {   79,  7}, {   83,  7}, {   89,  7}, {   97,  7},
-    {  101,  7}, {  103,  7}, {  107,  7}, {  109,  7}, {  113,  7},
-    {  127,  7}, {  131,  8}, {  137,  8}, {  139,  8}, {  149,  8},
-    {  151,  8}, {  157,  8}, {  163,  8}, {  167,  8}, {  173,  8},
-    {  179,  8}, {  181,  8}, {  191,  8}, {  193,  8}, {  197,  8},
-    {  199,  8}, {  211,  8}, {  223,  8}, {  227,  8}, {  229,  8},
-    {  233,  8}, {  239,  8}, {  241,  8}, {  251,  8}, {  257,  9},
-    {  263,  9}, {  269,  9}, {  271,  9}, {  277,  9}, {  281,  9},
-    {  283,  9}, {  293,  9}, {  307,  9}, {  311,  9}, {  313,  9},
-    {  317,  9}, {  331,  9}, {  337,  9}, {  347,  9}, {  349,  9},
-    {  353,  9}, {  359,  9}, {  367,  9}, {  373,  9}, {  379,  9},
-    {  383,  9}, {  389,  9}, {  397,  9}, {  401,  9}, {  409,  9},
-    {  419,  9}, {  421,  9}, {  431,  9}, {  433,  9}, {  439,  9},
-    {  443,  9}, {  449,  9}, {  457,  9}, {  461,  9}, {  463,  9},
-    {  467,  9}, {  479,  9}, {  487,  9}, {  491,  9}, {  499,  9},
-    {  503,  9}, {  509,  9}, {  521, 10}, {  523, 10}, {  541, 10},
-    {  547, 10}, {  557, 10}, {  563, 10}, {  569, 10}, {  571, 10},
-    {  577, 10}, {  587, 10}, {  593, 10}, {  599, 10}, {  601, 10},
-    {  607, 10}, {  613, 10}, {  617, 10}, {  619, 10}, {  631, 10},
-    {  641, 10}, {  643, 10}, {  647, 10}, {  653, 10}, {  659, 10},
-    {  661, 10}, {  673, 10}, {  677, 10}, {  683, 10}, {  691, 10},
-    {  701, 10}, {  709, 10}, {  719, 10}, {  727, 10}, {  733, 10},
-    {  739, 10}, {  743, 10}, {  751, 10}, {  757, 10}, {  761, 10},
-    {  769, 10}, {  773, 10}, {  787, 10}, {  797, 10}, {  809, 10},
-    {  811, 10}, {  821, 10}, {  823, 10}, {  827, 10}, {  829, 10},
-    {  839, 10}, {  853, 10}, {  857, 10}, {  859, 10}, {  863, 10},
-    {  877, 10}, {  881, 10}, {  883, 10}, {  887, 10}, {  907, 10},
-    {  911, 10}, {  919, 10}, {  929, 10}, {  937, 10}, {  941, 10},
-    {  947, 10}, {  953, 10}, {  967, 10}, {  971, 10}, {  977, 10},
-    {  983, 10}, {  991, 10}, {  997, 10}, {65535, 16}
-};
-static uint32_t  charmap[256] = {
-    /*        00  01  02  03  04  05  06  07  08  09  0a  0b  0c  0d  0e  0f */
-    /* 00 */   0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
-    /* 10 */   0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
-    /* 20 */   0,  0,  0,  0,  0,  0,  0,  0, 52, 53, 54, 55, 56, 37, 40, 50,
-    /* 30 */   1,  2,  3,  4,  5,  6,  7,  8,  9, 10, 41,  0, 42, 43, 44, 45,
-    /* 40 */  46, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25,
-    /* 50 */  26, 27, 28, 29, 30, 31, 32, 33, 34, 35, 36, 47, 48, 49, 51, 38,
-    /* 60 */   0, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25,
-    /* 70 */  26, 27, 28, 29, 30, 31, 32, 33, 34, 35, 36, 57, 58, 59, 60,  0,
-    /* 80 */   0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
-    /* 90 */   0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
-    /* a0 */   0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
-    /* b0 */   0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
-    /* c0 */   0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
-    /* d0 */   0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
-    /* e0 */   0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,
-    /* f0 */   0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0,  0
-};
+static mdb_pool_t entry_pool = MDB_POOL_INIT("hash entry", hash_entry_t);
+
 
 static void htable_reset(mdb_hash_t *, int);
-static table_size_t *get_table_size(int);
+static int  htable_add_segment(mdb_hash_t *);
+static void htable_del_segment(mdb_hash_t *);
+static void htable_grow(mdb_hash_t *);
+static void htable_shrink(mdb_hash_t *);
 static int print_chain(mdb_hash_t *, int, char *, int);
 
 
+static inline hash_chain_t *get_chain(mdb_hash_t *htbl, uint32_t index)
+{
+    uint32_t mask = (1U << htbl->segbits) - 1;
+
+    return htbl->segments[index >> htbl->segbits] + (index & mask);
+}
+
+static inline uint32_t get_index(mdb_hash_t *htbl, uint32_t hash)
+{
+    uint32_t index = hash & htbl->lowmask;
+
+    if (index < htbl->split)
+        index = hash & htbl->highmask;
+
+    return index;
+}
+
+static inline uint32_t hash_key(mdb_hash_t *htbl, int klen, void *key)
+{
+    return (uint32_t)htbl->hfunc(HASH_BITS, HASH_RANGE, klen, key);
+}
+
+
 mdb_hash_t *mdb_hash_table_create(int                  max_entries,
                                   mdb_hash_function_t  hfunc,
                                   mdb_hash_compare_t   hcomp,
                                   mdb_hash_print_t     hprint)
 {
-    mdb_hash_t   *htbl;
-    table_size_t *ts;
-    size_t        size;
-    int           i;
+    mdb_hash_t *htbl;
+    int         nchain;
+    int         segbits;
 
-    MDB_CHECKARG(hfunc && hcomp && hprint &&
-                 max_entries > 1 && max_entries < 65536, NULL);
+    MDB_CHECKARG(hfunc && hcomp && hprint && max_entries > 1, NULL);
 
-    if ((ts = get_table_size(max_entries)) == NULL) {
+    if (max_entries > HASH_CHAIN_MAX) {
         errno = EOVERFLOW;
         return NULL;
     }
 
-    size = sizeof(mdb_hash_t) + sizeof(hash_chain_t) * ts->nchain;
-    htbl = calloc(1, size);
+    for (nchain = HASH_CHAIN_MIN;  nchain < max_entries;  nchain <<= 1)
+        ;
+
+    for (segbits = 0;  segbits < HASH_SEGMENT_BITS;  segbits++) {
+        if ((1 << segbits) >= nchain)
+            break;
+    }
 
-    if (!htbl) {
+    if (!(htbl = calloc(1, sizeof(mdb_hash_t)))) {
         errno = ENOMEM;
         return NULL;
     }
 
-    htbl->bits   = ts->bits;
-    htbl->nchain = ts->nchain;
-    htbl->hfunc  = hfunc;
-    htbl->hcomp  = hcomp;
-    htbl->hprint = hprint;
+    htbl->hfunc    = hfunc;
+    htbl->hcomp    = hcomp;
+    htbl->hprint   = hprint;
+    htbl->nchain   = nchain;
+    htbl->minchain = nchain;
+    htbl->lowmask  = nchain - 1;
+    htbl->highmask = (nchain << 1) - 1;
+    htbl->split    = 0;
+    htbl->segbits  = segbits;
 
     MDB_DLIST_INIT(htbl->entries.head);
 
-    for (i = 0; i < htbl->nchain; i++)
-        MDB_DLIST_INIT(htbl->chains[i].head);
+    while ((htbl->nsegment << htbl->segbits) < htbl->nchain) {
+        if (htable_add_segment(htbl) < 0) {
+            htable_reset(htbl, 0);
+            free(htbl);
+            errno = ENOMEM;
+            return NULL;
+        }
+    }
 
     return htbl;
 }
@@ -231,18 +245,29 @@ void *mdb_hash_table_iterate(mdb_hash_t *htbl,void **key_ret,void **cursor_ptr)
 
 int mdb_hash_table_print(mdb_hash_t *htbl, char *buf, int len)
 {
-    char *p, *e;
-    int   i;
+    hash_chain_t *chain;
+    char         *p, *e;
+    int           i;
 
     MDB_CHECKARG(htbl && buf && len > 0, 0);
 
     e = (p = buf) + len;
     *buf = '\0';
 
-    for (i = 0;  i < htbl->nchain;  i++) {
-        if (!MDB_DLIST_EMPTY(htbl->chains[i].head)
+    p += snprintf(p, e-p, "   %d chains (min. %d), %d entries",
+                  htbl->nchain, htbl->minchain, htbl->nentry);
+#ifdef HASH_STATISTICS
+    p += snprintf(p, e-p, " (max. %d), %d splits, %d merges",
+                  htbl->entries.max, htbl->resize.split, htbl->resize.merge);
+#endif
+    p += snprintf(p, e-p, "\n");
+
+    for (i = 0;  i < htbl->nchain && p < e;  i++) {
+        chain = get_chain(htbl, i);
+
+        if (!MDB_DLIST_EMPTY(chain->head)
 #ifdef HASH_STATISTICS
-            || htbl->chains[i].entries.max > 0
+            || chain->entries.max > 0
 #endif
             )
             p += print_chain(htbl, i, p, e-p);
@@ -255,15 +280,15 @@ int mdb_hash_add(mdb_hash_t *htbl, int klen, void *key, void *data)
 {
     hash_entry_t *entry;
     hash_chain_t *chain;
-    int           index;
+    uint32_t      hash;
 
     MDB_CHECKARG(htbl && key && klen >= 0 && data, -1);
 
-    index = htbl->hfunc(htbl->bits, htbl->nchain, klen, key);
-    chain = htbl->chains + index;
+    hash  = hash_key(htbl, klen, key);
+    chain = get_chain(htbl, get_index(htbl, hash));
 
     MDB_DLIST_FOR_EACH(hash_entry_t, clink, entry, &chain->head) {
-        if (htbl->hcomp(klen, key, entry->key) == 0) {
+        if (entry->hash == hash && htbl->hcomp(klen, key, entry->key) == 0) {
             if (data == entry->data)
                 return 0;
             else {
@@ -273,16 +298,17 @@ int mdb_hash_add(mdb_hash_t *htbl, int klen, void *key, void *data)
         }
     }
 
-    if (!(entry = calloc(1, sizeof(hash_entry_t)))) {
-        errno = ENOMEM;
+    if (!(entry = mdb_pool_alloc(&entry_pool)))
         return -1;
-    }
+    entry->hash = hash;
     entry->key  = key;
     entry->data = data;
 
     MDB_DLIST_APPEND(hash_entry_t, clink, entry, &chain->head);
     MDB_DLIST_APPEND(hash_entry_t, elink, entry, &htbl->entries.head);
 
+    htbl->nentry++;
+
 #ifdef HASH_STATISTICS
     if (++chain->entries.curr > chain->entries.max)
         chain->entries.max = chain->entries.curr;
@@ -291,6 +317,9 @@ int mdb_hash_add(mdb_hash_t *htbl, int klen, void *key, void *data)
         htbl->entries.max = htbl->entries.curr;
 #endif
 
+    if ((int64_t)htbl->nentry * 100 > (int64_t)htbl->nchain * HASH_GROW_LOAD)
+        htable_grow(htbl);
+
     return 0;
 }
 
@@ -299,22 +328,24 @@ void *mdb_hash_delete(mdb_hash_t *htbl, int klen, void *key)
     hash_entry_t *entry;
     hash_entry_t *n;
     hash_chain_t *chain;
-    int           index;
+    uint32_t      hash;
     void         *data;
 
     MDB_CHECKARG(htbl && klen >= 0 && key, NULL);
 
-    index = htbl->hfunc(htbl->bits, htbl->nchain, klen, key);
-    chain = htbl->chains + index;
+    hash  = hash_key(htbl, klen, key);
+    chain = get_chain(htbl, get_index(htbl, hash));
 
     MDB_DLIST_FOR_EACH_SAFE(hash_entry_t, clink, entry,n, &chain->head) {
-        if (htbl->hcomp(klen, key, entry->key) == 0) {
+        if (entry->hash == hash && htbl->hcomp(klen, key, entry->key) == 0) {
             if (!(data = entry->data))
                 break;
 
             MDB_DLIST_UNLINK(hash_entry_t, clink, entry);
             MDB_DLIST_UNLINK(hash_entry_t, elink, entry);
-            free(entry);
+            mdb_pool_free(&entry_pool, entry);
+
+            htbl->nentry--;
 
 #ifdef HASH_STATISTICS
             if (--chain->entries.curr < 0)
@@ -323,6 +354,11 @@ void *mdb_hash_delete(mdb_hash_t *htbl, int klen, void *key)
             if (--htbl->entries.curr < 0)
                 htbl->entries.curr = 0;
 #endif
+
+            if ((int64_t)htbl->nentry * 100 <
+                (int64_t)htbl->nchain * HASH_SHRINK_LOAD)
+                htable_shrink(htbl);
+
             return data;
         }
     }
@@ -335,15 +371,15 @@ void *mdb_hash_get_data(mdb_hash_t *htbl, int klen, void *key)
 {
     hash_entry_t *entry;
     hash_chain_t *chain;
-    int           index;
+    uint32_t      hash;
 
     MDB_CHECKARG(htbl && klen >= 0 && key, NULL);
 
-    index = htbl->hfunc(htbl->bits, htbl->nchain, klen, key);
-    chain = htbl->chains + index;
+    hash  = hash_key(htbl, klen, key);
+    chain = get_chain(htbl, get_index(htbl, hash));
 
     MDB_DLIST_FOR_EACH(hash_entry_t, clink, entry, &chain->head) {
-        if (htbl->hcomp(klen, key, entry->key) == 0)
+        if (entry->hash == hash && htbl->hcomp(klen, key, entry->key) == 0)
             return entry->data;
     }
 
@@ -352,6 +388,35 @@ void *mdb_hash_get_data(mdb_hash_t *htbl, int klen, void *key)
 }
 
 
+/*
+ * Hash functions return a value in the range of [0, nchain). They all
+ * produce a well-mixed 32-bit value first (FNV-1a for strings and blobs,
+ * the murmur3 finalizer for fixed size keys), so that the low bits used
+ * by the table for indexing are as good as the high ones.
+ */
+
+static inline uint32_t hash_mix(uint32_t h)
+{
+    h ^= h >> 16;
+    h *= 0x85ebca6bU;
+    h ^= h >> 13;
+    h *= 0xc2b2ae35U;
+    h ^= h >> 16;
+
+    return h;
+}
+
+static inline int hash_reduce(uint32_t h, int nchain)
+{
+    if (nchain < 1)
+        return 0;
+
+    if (!(nchain & (nchain - 1)))
+        return (int)(h & (uint32_t)(nchain - 1));
+    else
+        return (int)(h % (uint32_t)nchain);
+}
+
 int mdb_hash_function_integer(int bits, int nchain, int klen, void *key)
 {
     return mdb_hash_function_unsignd(bits, nchain, klen, key);
@@ -362,72 +427,47 @@ int mdb_hash_function_unsignd(int bits, int nchain, int klen, void *key)
 {
     uint32_t unsignd;
 
-    if (klen != sizeof(unsignd) || !key ||
-        bits < 1 || bits > 16 ||
-        nchain < (1 << (bits-1)) || nchain >= (1 << bits))
+    MQI_UNUSED(bits);
+
+    if (klen != sizeof(unsignd) || !key)
         return 0;
 
     unsignd = *(uint32_t *)key;
 
-    return (int)(unsignd % nchain);
+    return hash_reduce(hash_mix(unsignd), nchain);
 }
 
 
 int mdb_hash_function_string(int bits, int nchain, int klen, void *key)
 {
-    typedef union {
-        uint64_t wide;
-        uint8_t  narrow[8];
-    } hash_t;
-
-    (void)klen;
-
-    uint8_t *varchar = (uint8_t *)key;
-    int      hashval = 0;
-    hash_t   h;
-    int      shift;
-
-    if (varchar && bits >= 1 && bits <= 16 &&
-        nchain > (1 << (bits-1)) && nchain < (1 << bits))
-    {
-        uint8_t s;
-        int     i;
-
-        for (h.wide = 0; (s = *varchar); varchar++)
-            h.wide = 33ULL * h.wide + (uint64_t)charmap[s];
-
-        if (bits <= 8) {
-            hashval = h.narrow[0] ^ h.narrow[1] ^ h.narrow[2] ^ h.narrow[3] ^
-                      h.narrow[4] ^ h.narrow[5] ^ h.narrow[6] ^ h.narrow[7];
-        }
-        else {
-            shift = (nchain + 7) / 8;
-            for (hashval = h.narrow[0], i = 1;   i < 8;  i++)
-                hashval ^= h.narrow[i] << (i * shift);
-        }
+    uint8_t  *varchar = (uint8_t *)key;
+    uint32_t  h;
+    uint8_t   s;
+
+    MQI_UNUSED(bits);
+    MQI_UNUSED(klen);
+
+    if (!varchar)
+        return 0;
 
-        hashval %= nchain;
+    for (h = 2166136261U;  (s = *varchar);  varchar++) {
+        h ^= s;
+        h *= 16777619U;
     }
 
-    return hashval;
+    return hash_reduce(hash_mix(h), nchain);
 }
 
 int mdb_hash_function_pointer(int bits, int nchain, int klen, void *key)
 {
-#define MASK(t)  ((((uint##t##_t)1) << (sizeof(int) * 8 - 3)) - 1)
-    int hash;
+    uint64_t ptr;
 
     MQI_UNUSED(bits);
     MQI_UNUSED(klen);
 
-#if __SIZEOF_POINTER__ == 8
-    hash = (int)(((uint64_t)key >> 2) & MASK(64)) % nchain;
-#else
-    hash = ((int)key >> 2) & MASK(32) % nchain;
-#endif
+    ptr = (uint64_t)(uintptr_t)key >> 2;
 
-    return hash;
-#undef MASK
+    return hash_reduce(hash_mix((uint32_t)(ptr ^ (ptr >> 32))), nchain);
 }
 
 int mdb_hash_function_varchar(int bits, int nchain, int klen, void *key)
@@ -437,37 +477,21 @@ int mdb_hash_function_varchar(int bits, int nchain, int klen, void *key)
 
 int mdb_hash_function_blob(int bits, int nchain, int klen, void *key)
 {
-    typedef union {
-        uint64_t wide;
-        uint8_t  narrow[8];
-    } hash_t;
-
-    uint8_t *data  = (uint8_t *)key;
-    int      hashval = 0;
-    hash_t   h;
-    int      shift;
-    int      i;
-
-    if (klen > 0 && data && bits >= 1 && bits <= 16 &&
-        nchain > (1 << (bits-1)) && nchain < (1 << bits))
-    {
-        for (i = 0, h.wide = 0;   i < klen;   i++)
-            h.wide = 33ULL * h.wide + (uint64_t)data[i];
-
-        if (bits <= 8) {
-            hashval = h.narrow[0] ^ h.narrow[1] ^ h.narrow[2] ^ h.narrow[3] ^
-                      h.narrow[4] ^ h.narrow[5] ^ h.narrow[6] ^ h.narrow[7];
-        }
-        else {
-            shift = (nchain + 7) / 8;
-            for (hashval = h.narrow[0], i = 1;   i < 8;  i++)
-                hashval ^= h.narrow[i] << (i * shift);
-        }
+    uint8_t  *data  = (uint8_t *)key;
+    uint32_t  h;
+    int       i;
+
+    MQI_UNUSED(bits);
+
+    if (klen <= 0 || !data)
+        return 0;
 
-        hashval %= nchain;
+    for (i = 0, h = 2166136261U;   i < klen;   i++) {
+        h ^= data[i];
+        h *= 16777619U;
     }
 
-    return hashval;
+    return hash_reduce(hash_mix(h), nchain);
 }
 
 
@@ -477,69 +501,177 @@ static void htable_reset(mdb_hash_t *htbl, int do_chain_statistics)
     hash_entry_t *entry;
     hash_entry_t *n;
 #ifdef HASH_STATISTICS
-    int i;
-#else
-    (void)do_statistics;
+    hash_chain_t *chain;
+    int           i;
 #endif
 
     MDB_DLIST_FOR_EACH_SAFE(hash_entry_t, elink, entry,n, &htbl->entries.head){
         MDB_DLIST_UNLINK(hash_entry_t, clink, entry);
         MDB_DLIST_UNLINK(hash_entry_t, elink, entry);
-        free(entry);
+        mdb_pool_free(&entry_pool, entry);
+    }
+
+    htbl->nentry = 0;
+
+    if (!do_chain_statistics) {
+        while (htbl->nsegment > 0)
+            htable_del_segment(htbl);
+
+        free(htbl->segments);
+        htbl->segments   = NULL;
+        htbl->maxsegment = 0;
     }
+    else {
+        /* fall back to the initial geometry */
+        htbl->nchain   = htbl->minchain;
+        htbl->lowmask  = htbl->minchain - 1;
+        htbl->highmask = (htbl->minchain << 1) - 1;
+        htbl->split    = 0;
+
+        while (htbl->nsegment > 1 &&
+               ((htbl->nsegment - 1) << htbl->segbits) >= htbl->nchain)
+            htable_del_segment(htbl);
 
 #ifdef HASH_STATISTICS
-    if (do_chain_statistics) {
-        for (i = 0;   i < htbl->nchain;   i++) {
-            htbl->chains[i].entries.curr = 0;
+        for (i = 0;   i < (htbl->nsegment << htbl->segbits);   i++) {
+            chain = get_chain(htbl, i);
+            chain->entries.curr = 0;
+
+            if (i >= htbl->nchain)
+                chain->entries.max = 0;
         }
+#endif
     }
 
+#ifdef HASH_STATISTICS
     htbl->entries.curr = 0;
 #endif
 }
 
-static table_size_t *get_table_size(int max_entries)
+static int htable_add_segment(mdb_hash_t *htbl)
+{
+    hash_chain_t  *segment;
+    hash_chain_t **segments;
+    int            size, max, i;
+
+    if (htbl->nsegment >= htbl->maxsegment) {
+        max = htbl->maxsegment ? htbl->maxsegment * 2 : 4;
+
+        if (!(segments = realloc(htbl->segments, sizeof(*segments) * max)))
+            return -1;
+
+        htbl->segments   = segments;
+        htbl->maxsegment = max;
+    }
+
+    size = 1 << htbl->segbits;
+
+    if (!(segment = calloc(size, sizeof(hash_chain_t))))
+        return -1;
+
+    for (i = 0;  i < size;  i++)
+        MDB_DLIST_INIT(segment[i].head);
+
+    htbl->segments[htbl->nsegment++] = segment;
+
+    return 0;
+}
+
+static void htable_del_segment(mdb_hash_t *htbl)
+{
+    if (htbl->nsegment > 0)
+        free(htbl->segments[--htbl->nsegment]);
+}
+
+static void htable_grow(mdb_hash_t *htbl)
 {
-    int dim = sizeof(sizes)/sizeof(sizes[0]);
-    int min = 0;
-    int max = dim - 1;
-    int idx;
-#ifdef DEBUG
-    int iterations = 0;
+    hash_chain_t *old, *new;
+    hash_entry_t *entry, *n;
+    uint32_t      index;
+
+    if (htbl->nchain >= HASH_CHAIN_MAX)
+        return;
+
+    if ((htbl->nchain >> htbl->segbits) >= htbl->nsegment) {
+        if (htable_add_segment(htbl) < 0)
+            return;
+    }
+
+    index = htbl->split;
+    old   = get_chain(htbl, index);
+    new   = get_chain(htbl, htbl->nchain);
+
+    MDB_DLIST_FOR_EACH_SAFE(hash_entry_t, clink, entry,n, &old->head) {
+        if ((entry->hash & htbl->highmask) != index) {
+            MDB_DLIST_UNLINK(hash_entry_t, clink, entry);
+            MDB_DLIST_APPEND(hash_entry_t, clink, entry, &new->head);
+
+#ifdef HASH_STATISTICS
+            old->entries.curr--;
+            if (++new->entries.curr > new->entries.max)
+                new->entries.max = new->entries.curr;
 #endif
+        }
+    }
+
+    htbl->nchain++;
 
-    for (;;) {
-#ifdef DEBUG
-        iterations++;
+    if (++htbl->split > htbl->lowmask) {
+        htbl->split    = 0;
+        htbl->lowmask  = htbl->highmask;
+        htbl->highmask = (htbl->highmask << 1) | 1;
+    }
+
+#ifdef HASH_STATISTICS
+    htbl->resize.split++;
 #endif
-        idx = (min + max) / 2;
+}
 
-        if (max_entries == sizes[idx].nchain)
-            break;
+static void htable_shrink(mdb_hash_t *htbl)
+{
+    hash_chain_t *src, *dst;
+    hash_entry_t *entry, *n;
 
-        if (idx == min) {
-            idx = max;
-            break;
-        }
+    if (htbl->nchain <= htbl->minchain)
+        return;
 
-        if (max_entries < sizes[idx].nchain)
-            max = idx;
-        else
-            min = idx;
+    if (htbl->split == 0) {
+        htbl->highmask = htbl->lowmask;
+        htbl->lowmask  = htbl->lowmask >> 1;
+        htbl->split    = htbl->lowmask + 1;
     }
 
-#ifdef DEBUG
-    printf("%s(%d) => {%d,%d} @ %d\n", __FUNCTION__, max_entries,
-           sizes[idx].nchain, sizes[idx].bits, iterations);
+    htbl->split--;
+    htbl->nchain--;
+
+    src = get_chain(htbl, htbl->nchain);
+    dst = get_chain(htbl, htbl->split);
+
+    MDB_DLIST_FOR_EACH_SAFE(hash_entry_t, clink, entry,n, &src->head) {
+        MDB_DLIST_UNLINK(hash_entry_t, clink, entry);
+        MDB_DLIST_APPEND(hash_entry_t, clink, entry, &dst->head);
+    }
+
+#ifdef HASH_STATISTICS
+    dst->entries.curr += src->entries.curr;
+    if (dst->entries.curr > dst->entries.max)
+        dst->entries.max = dst->entries.curr;
+
+    src->entries.curr = 0;
+    src->entries.max  = 0;
+
+    htbl->resize.merge++;
 #endif
 
-    return sizes + idx;
+    /* keep at most one spare segment around to avoid thrashing */
+    while (htbl->nsegment > 1 &&
+           ((htbl->nsegment - 2) << htbl->segbits) >= htbl->nchain)
+        htable_del_segment(htbl);
 }
 
 static int print_chain(mdb_hash_t *htbl, int index, char *buf, int len)
 {
-    hash_chain_t *chain = htbl->chains + index;
+    hash_chain_t *chain = get_chain(htbl, index);
     hash_entry_t *entry;
     char *p, *e;
     char key[256];
@@ -54,6 +54,20 @@
 #define INDEX_HASH_RESET(ix)        mdb_hash_table_reset(ix->hash)
 #define INDEX_SEQUENCE_RESET(ix)    mdb_sequence_table_reset(ix->sequence)
 
+#define BUCKET_SIZE_MIN             4
+
+static mdb_secondary_index_t *find_secondary(mdb_table_t *, char *, int *);
+static void destroy_secondary(mdb_secondary_index_t *);
+static void reset_secondary(mdb_secondary_index_t *);
+static int secondary_insert(mdb_table_t *, mdb_secondary_index_t *,
+                            mdb_row_t *);
+static int secondary_delete(mdb_table_t *, mdb_secondary_index_t *,
+                            mdb_row_t *);
+static int secondary_insert_all(mdb_table_t *, mdb_row_t *);
+static int secondary_delete_all(mdb_table_t *, mdb_row_t *);
+static void secondary_key(mdb_table_t *, mdb_secondary_index_t *,
+                          mdb_row_t *, char *);
+
 
 
 int mdb_index_create(mdb_table_t *tbl, char **index_columns)
@@ -161,9 +175,18 @@ int mdb_index_create(mdb_table_t *tbl, char **index_columns)
 void mdb_index_drop(mdb_table_t *tbl)
 {
     mdb_index_t *ix;
+    int          i;
 
     MDB_CHECKARG(tbl,);
 
+    for (i = 0;  i < tbl->nsecondary;  i++)
+        destroy_secondary(tbl->secondary[i]);
+
+    free(tbl->secondary);
+
+    tbl->nsecondary = 0;
+    tbl->secondary  = NULL;
+
     ix = &tbl->index;
 
     if (MDB_INDEX_DEFINED(ix)) {
@@ -181,9 +204,13 @@ void mdb_index_drop(mdb_table_t *tbl)
 void mdb_index_reset(mdb_table_t *tbl)
 {
     mdb_index_t *ix;
+    int          i;
 
     MDB_CHECKARG(tbl,);
 
+    for (i = 0;  i < tbl->nsecondary;  i++)
+        reset_secondary(tbl->secondary[i]);
+
     ix = &tbl->index;
 
     if (MDB_INDEX_DEFINED(ix)) {
@@ -210,8 +237,12 @@ int mdb_index_insert(mdb_table_t   *tbl,
 
     ix = &tbl->index;
 
-    if (!MDB_INDEX_DEFINED(ix))
+    if (!MDB_INDEX_DEFINED(ix)) {
+        if (secondary_insert_all(tbl, row) < 0)
+            return -1;
+
         return 1;               /* fake a sucessful insertion */
+    }
 
     hash = ix->hash;
     seq  = ix->sequence;
@@ -220,9 +251,19 @@ int mdb_index_insert(mdb_table_t   *tbl,
 
     if (mdb_hash_add(hash, lgh,key, row) == 0) {
         mdb_sequence_add(seq, lgh,key, row);
+
+        if (secondary_insert_all(tbl, row) < 0) {
+            mdb_hash_delete(hash, lgh,key);
+            mdb_sequence_delete(seq, lgh,key);
+            return -1;
+        }
+
         return 1;
     }
 
+    if (errno != EEXIST)        /* out of memory, the row is still ours */
+        return -1;
+
     /*
      * we have a duplicate at hand
      */
@@ -244,7 +285,8 @@ int mdb_index_insert(mdb_table_t   *tbl,
             return -1;
         }
         else {
-            if (mdb_row_delete(tbl, old, 0,0) < 0 ||
+            if (secondary_delete_all(tbl, old) < 0 ||
+                mdb_row_delete(tbl, old, 0,0) < 0 ||
                 mdb_log_change(tbl, txdepth, mdb_log_update,cmask,old,row) < 0)
             {
                 return -1;
@@ -252,10 +294,17 @@ int mdb_index_insert(mdb_table_t   *tbl,
 
             mdb_hash_add(hash, lgh,key, row);
             mdb_sequence_add(seq, lgh,key, row);
+
+            if (secondary_insert_all(tbl, row) < 0) {
+                mdb_hash_delete(hash, lgh,key);
+                mdb_sequence_delete(seq, lgh,key);
+                return -1;
+            }
         }
     }
     else { /* duplicate insertion is an error. keep the original row */
         mdb_row_delete(tbl, row, 0, 1);
+        errno = EEXIST;
         return -1;
     }
 
@@ -275,7 +324,7 @@ int mdb_index_delete(mdb_table_t *tbl, mdb_row_t *row)
     ix = &tbl->index;
 
     if (!MDB_INDEX_DEFINED(ix))
-        return 0;
+        return secondary_delete_all(tbl, row);
 
     hash = ix->hash;
     seq  = ix->sequence;
@@ -289,7 +338,7 @@ int mdb_index_delete(mdb_table_t *tbl, mdb_row_t *row)
         return -1;
     }
 
-    return 0;
+    return secondary_delete_all(tbl, row);
 }
 
 mdb_row_t *mdb_index_get_row(mdb_table_t *tbl, int idxlen, void *idxval)
@@ -306,10 +355,11 @@ mdb_row_t *mdb_index_get_row(mdb_table_t *tbl, int idxlen, void *idxval)
 int mdb_index_print(mdb_table_t *tbl, char *buf, int len)
 {
 #define PRINT(args...)  if (e > p) p += snprintf(p, e-p, args)
-    mdb_index_t *ix;
-    const char  *sep;
-    char        *p, *e;
-    int          i;
+    mdb_index_t           *ix;
+    mdb_secondary_index_t *sx;
+    const char            *sep;
+    char                  *p, *e;
+    int                    i, j;
 
     MDB_CHECKARG(tbl && buf && len > 0, 0);
 
@@ -328,12 +378,380 @@ int mdb_index_print(mdb_table_t *tbl, char *buf, int len)
           "\n    %-7s   %4d   %4d\n",
           mqi_data_type_str(ix->type), ix->offset, ix->length);
 
+    for (i = 0;  i < tbl->nsecondary;  i++) {
+        sx = tbl->secondary[i];
+
+        PRINT("index '%s' (%s) columns: ", sx->name,
+              (sx->flags & MQI_INDEX_ORDERED) ? "ordered" : "hash");
+
+        for (j = 0, sep = "";   j < sx->ncolumn;   j++, sep = ",")
+            PRINT("%s%02d", sep, sx->columns[j]);
+
+        PRINT("\n");
+    }
+
     return p - buf;
 
 #undef PRINT
 }
 
 
+int mdb_index_create_secondary(mdb_table_t  *tbl,
+                               char         *name,
+                               uint32_t      flags,
+                               char        **index_columns)
+{
+    mdb_secondary_index_t  *sx;
+    mdb_secondary_index_t **secondary;
+    mdb_column_t           *col;
+    mdb_row_t              *row;
+    mqi_bitfld_t            cbit;
+    int                     i, idx;
+
+    MDB_CHECKARG(tbl && name && index_columns && index_columns[0], -1);
+
+    if (find_secondary(tbl, name, NULL)) {
+        errno = EEXIST;
+        return -1;
+    }
+
+    if (!(sx = calloc(1, sizeof(mdb_secondary_index_t))) ||
+        !(sx->name = strdup(name)))
+    {
+        free(sx);
+        errno = ENOMEM;
+        return -1;
+    }
+
+    sx->flags = flags;
+
+    for (i = 0;    index_columns[i];    i++) {
+        if (!(idx = mdb_hash_get_data(tbl->chash,0,index_columns[i]) - NULL)) {
+            errno = ENOENT;
+            goto failed;
+        }
+
+        col  = tbl->columns + --idx;
+        cbit = ((mqi_bitfld_t)1) << idx;
+
+        if ((sx->cmask & cbit)) {
+            errno = EINVAL;
+            goto failed;
+        }
+
+        if (!(sx->columns = realloc(sx->columns, sizeof(int) * (i+1)))) {
+            errno = ENOMEM;
+            goto failed;
+        }
+
+        sx->columns[i] = idx;
+        sx->cmask     |= cbit;
+        sx->type       = i ? mqi_blob : col->type;
+        sx->length    += col->length;
+    }
+
+    sx->ncolumn = i;
+
+    if (sx->length <= 0 || sx->length > MDB_INDEX_LENGTH_MAX) {
+        errno = EIO;
+        goto failed;
+    }
+
+    switch (sx->type) {
+    case mqi_varchar:
+        sx->hash = INDEX_HASH_CREATE(varchar);
+        if ((flags & MQI_INDEX_ORDERED))
+            sx->sequence = INDEX_SEQUENCE_CREATE(varchar);
+        break;
+    case mqi_integer:
+        sx->hash = INDEX_HASH_CREATE(integer);
+        if ((flags & MQI_INDEX_ORDERED))
+            sx->sequence = INDEX_SEQUENCE_CREATE(integer);
+        break;
+    case mqi_unsignd:
+        sx->hash = INDEX_HASH_CREATE(unsignd);
+        if ((flags & MQI_INDEX_ORDERED))
+            sx->sequence = INDEX_SEQUENCE_CREATE(unsignd);
+        break;
+    case mqi_blob:
+        sx->hash = INDEX_HASH_CREATE(blob);
+        if ((flags & MQI_INDEX_ORDERED))
+            sx->sequence = INDEX_SEQUENCE_CREATE(blob);
+        break;
+    default:
+        errno = EINVAL;
+        goto failed;
+    }
+
+    if (!sx->hash || ((flags & MQI_INDEX_ORDERED) && !sx->sequence)) {
+        errno = ENOMEM;
+        goto failed;
+    }
+
+    MDB_DLIST_FOR_EACH(mdb_row_t, link, row, &tbl->rows) {
+        if (secondary_insert(tbl, sx, row) < 0)
+            goto failed;
+    }
+
+    secondary = realloc(tbl->secondary, sizeof(*secondary) *
+                        (tbl->nsecondary + 1));
+
+    if (!secondary) {
+        errno = ENOMEM;
+        goto failed;
+    }
+
+    secondary[tbl->nsecondary++] = sx;
+    tbl->secondary = secondary;
+
+    return 0;
+
+ failed:
+    destroy_secondary(sx);
+    return -1;
+}
+
+int mdb_index_drop_secondary(mdb_table_t *tbl, char *name)
+{
+    mdb_secondary_index_t *sx;
+    int                    i;
+
+    MDB_CHECKARG(tbl && name, -1);
+
+    if (!(sx = find_secondary(tbl, name, &i))) {
+        errno = ENOENT;
+        return -1;
+    }
+
+    memmove(tbl->secondary + i, tbl->secondary + i+1,
+            sizeof(*tbl->secondary) * (tbl->nsecondary - (i+1)));
+
+    if (--tbl->nsecondary == 0) {
+        free(tbl->secondary);
+        tbl->secondary = NULL;
+    }
+
+    destroy_secondary(sx);
+
+    return 0;
+}
+
+mqi_bitfld_t mdb_index_secondary_columns(mdb_table_t *tbl)
+{
+    mqi_bitfld_t cmask;
+    int          i;
+
+    MDB_CHECKARG(tbl, 0);
+
+    for (cmask = 0, i = 0;  i < tbl->nsecondary;  i++)
+        cmask |= tbl->secondary[i]->cmask;
+
+    return cmask;
+}
+
+mdb_index_bucket_t *mdb_index_get_bucket(mdb_secondary_index_t *sx, void *key)
+{
+    MDB_CHECKARG(sx && key, NULL);
+
+    return mdb_hash_get_data(sx->hash, sx->length, key);
+}
+
+static mdb_secondary_index_t *find_secondary(mdb_table_t *tbl,
+                                             char        *name,
+                                             int         *idx_ret)
+{
+    mdb_secondary_index_t *sx;
+    int                    i;
+
+    for (i = 0;  i < tbl->nsecondary;  i++) {
+        sx = tbl->secondary[i];
+
+        if (!strcmp(sx->name, name)) {
+            if (idx_ret)
+                *idx_ret = i;
+
+            return sx;
+        }
+    }
+
+    return NULL;
+}
+
+static void destroy_secondary(mdb_secondary_index_t *sx)
+{
+    if (sx->hash) {
+        reset_secondary(sx);
+        mdb_hash_table_destroy(sx->hash);
+    }
+
+    if (sx->sequence)
+        mdb_sequence_table_destroy(sx->sequence);
+
+    free(sx->columns);
+    free(sx->name);
+    free(sx);
+}
+
+static void reset_secondary(mdb_secondary_index_t *sx)
+{
+    mdb_index_bucket_t *bucket;
+    void               *cursor;
+
+    for (cursor = NULL;  (bucket = mdb_hash_table_iterate(sx->hash, NULL,
+                                                          &cursor));    )
+    {
+        free(bucket->rows);
+        free(bucket);
+    }
+
+    mdb_hash_table_reset(sx->hash);
+
+    if (sx->sequence)
+        mdb_sequence_table_reset(sx->sequence);
+}
+
+static int secondary_insert(mdb_table_t           *tbl,
+                            mdb_secondary_index_t *sx,
+                            mdb_row_t             *row)
+{
+    mdb_index_bucket_t *bucket;
+    mdb_row_t         **rows;
+    int                 size;
+    char                key[MDB_INDEX_LENGTH_MAX];
+
+    secondary_key(tbl, sx, row, key);
+
+    if (!(bucket = mdb_hash_get_data(sx->hash, sx->length, key))) {
+        if (!(bucket = calloc(1, sizeof(mdb_index_bucket_t) + sx->length)) ||
+            !(bucket->rows = malloc(sizeof(mdb_row_t *) * BUCKET_SIZE_MIN)))
+        {
+            free(bucket);
+            errno = ENOMEM;
+            return -1;
+        }
+
+        bucket->size = BUCKET_SIZE_MIN;
+        memcpy(bucket->key, key, sx->length);
+
+        if (mdb_hash_add(sx->hash, sx->length, bucket->key, bucket) < 0) {
+            free(bucket->rows);
+            free(bucket);
+            return -1;
+        }
+
+        if (sx->sequence &&
+            mdb_sequence_add(sx->sequence, sx->length, bucket->key, bucket) < 0)
+        {
+            mdb_hash_delete(sx->hash, sx->length, bucket->key);
+            free(bucket->rows);
+            free(bucket);
+            return -1;
+        }
+    }
+    else if (bucket->nrow >= bucket->size) {
+        size = bucket->size * 2;
+
+        if (!(rows = realloc(bucket->rows, sizeof(mdb_row_t *) * size))) {
+            errno = ENOMEM;
+            return -1;
+        }
+
+        bucket->rows = rows;
+        bucket->size = size;
+    }
+
+    bucket->rows[bucket->nrow++] = row;
+
+    return 0;
+}
+
+static int secondary_delete(mdb_table_t           *tbl,
+                            mdb_secondary_index_t *sx,
+                            mdb_row_t             *row)
+{
+    mdb_index_bucket_t *bucket;
+    int                 i;
+    char                key[MDB_INDEX_LENGTH_MAX];
+
+    secondary_key(tbl, sx, row, key);
+
+    if (!(bucket = mdb_hash_get_data(sx->hash, sx->length, key))) {
+        errno = EIO;
+        return -1;
+    }
+
+    for (i = bucket->nrow - 1;  i >= 0;  i--) {
+        if (bucket->rows[i] == row)
+            break;
+    }
+
+    if (i < 0) {
+        errno = EIO;
+        return -1;
+    }
+
+    /* keep the insertion order of the remaining rows */
+    memmove(bucket->rows + i, bucket->rows + i+1,
+            sizeof(mdb_row_t *) * (bucket->nrow - (i+1)));
+
+    if (--bucket->nrow > 0)
+        return 0;
+
+    mdb_hash_delete(sx->hash, sx->length, bucket->key);
+
+    if (sx->sequence)
+        mdb_sequence_delete(sx->sequence, sx->length, bucket->key);
+
+    free(bucket->rows);
+    free(bucket);
+
+    return 0;
+}
+
+static int secondary_insert_all(mdb_table_t *tbl, mdb_row_t *row)
+{
+    int i;
+
+    for (i = 0;  i < tbl->nsecondary;  i++) {
+        if (secondary_insert(tbl, tbl->secondary[i], row) < 0) {
+            while (--i >= 0)
+                secondary_delete(tbl, tbl->secondary[i], row);
+            return -1;
+        }
+    }
+
+    return 0;
+}
+
+static int secondary_delete_all(mdb_table_t *tbl, mdb_row_t *row)
+{
+    int sts;
+    int i;
+
+    for (sts = 0, i = 0;  i < tbl->nsecondary;  i++) {
+        if (secondary_delete(tbl, tbl->secondary[i], row) < 0)
+            sts = -1;
+    }
+
+    return sts;
+}
+
+static void secondary_key(mdb_table_t           *tbl,
+                          mdb_secondary_index_t *sx,
+                          mdb_row_t             *row,
+                          char                  *key)
+{
+    mdb_column_t *col;
+    int           i;
+
+    for (i = 0;  i < sx->ncolumn;  i++) {
+        col = tbl->columns + sx->columns[i];
+        memcpy(key, row->data + col->offset, col->length);
+        key += col->length;
+    }
+}
+
+
 /*
  * Local Variables:
  * c-basic-offset: 4
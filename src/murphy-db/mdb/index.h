@@ -52,6 +52,31 @@ typedef struct {
     int             *columns;   /* sorted */
 } mdb_index_t;
 
+/*
+ * Secondary indexes are named and non-unique. The key is the concatenation
+ * of the index columns in the order they were given. Rows sharing the same
+ * key are collected to a bucket that is hashed (and for ordered indexes
+ * also sequenced) by the key.
+ */
+typedef struct {
+    int              nrow;
+    int              size;
+    mdb_row_t      **rows;
+    char             key[0];
+} mdb_index_bucket_t;
+
+typedef struct {
+    char            *name;
+    uint32_t         flags;     /* MQI_INDEX_xxx */
+    mqi_data_type_t  type;
+    int              length;
+    mdb_hash_t      *hash;
+    mdb_sequence_t  *sequence;  /* NULL unless MQI_INDEX_ORDERED */
+    int              ncolumn;
+    int             *columns;   /* in key order */
+    mqi_bitfld_t     cmask;
+} mdb_secondary_index_t;
+
 
 int mdb_index_create(mdb_table_t *, char **);
 void mdb_index_drop(mdb_table_t *);
@@ -61,6 +86,11 @@ int mdb_index_delete(mdb_table_t *, mdb_row_t *);
 mdb_row_t *mdb_index_get_row(mdb_table_t *, int, void *);
 int mdb_index_print(mdb_table_t *, char *, int);
 
+int mdb_index_create_secondary(mdb_table_t *, char *, uint32_t, char **);
+int mdb_index_drop_secondary(mdb_table_t *, char *);
+mqi_bitfld_t mdb_index_secondary_columns(mdb_table_t *);
+mdb_index_bucket_t *mdb_index_get_bucket(mdb_secondary_index_t *, void *);
+
 
 #endif /* __MDB_INDEX_H__ */
 
@@ -42,6 +42,8 @@
 #include "log.h"
 #include "row.h"
 #include "table.h"
+#include "persist.h"
+#include "pool.h"
 
 #ifndef LOG_STATISTICS
 #define LOG_STATISTICS
@@ -79,9 +81,11 @@ typedef struct {
 
 
 
-static inline log_t *new_log(mdb_dlist_t *, mdb_dlist_t *, uint32_t, int);
+static inline log_t *new_log(mdb_dlist_t *, mdb_dlist_t *, uint32_t);
 static inline void delete_log(log_t *);
 static inline log_t *get_last_vlog(mdb_dlist_t *);
+static int append_change(tbl_log_t *, mdb_log_type_t, mqi_bitfld_t,
+                         mdb_row_t *, mdb_row_t *);
 static tx_log_t *get_tx_log(uint32_t);
 static tbl_log_t *get_tbl_log(mdb_dlist_t *, mdb_dlist_t *, uint32_t,
                               mdb_table_t *);
@@ -89,6 +93,9 @@ static void delete_tx_log(uint32_t);
 
 static MDB_DLIST_HEAD(tx_head);
 
+static mdb_pool_t log_pool    = MDB_POOL_INIT("log", tbl_log_t);
+static mdb_pool_t change_pool = MDB_POOL_INIT("change", change_t);
+
 int mdb_log_create(mdb_table_t *tbl)
 {
     MDB_CHECKARG(tbl, -1);
@@ -108,37 +115,131 @@ int mdb_log_change(mdb_table_t    *tbl,
 {
     tx_log_t  *txlog;
     tbl_log_t *tblog;
-    change_t  *change;
 
     MDB_CHECKARG(tbl, -1);
 
     if (!depth)
+        return tbl->persistent ? mdb_persist_change(tbl,type,before,after) : 0;
+
+    if (!(txlog = get_tx_log(depth)) ||
+        !(tblog = get_tbl_log(&tbl->logs, &txlog->hlink, depth, tbl)))
+    {
+        return -1;
+    }
+
+    return append_change(tblog, type, colmask, before, after);
+}
+
+int mdb_log_insert_rows(mdb_table_t   *tbl,
+                        uint32_t       depth,
+                        mqi_bitfld_t   colmask,
+                        mdb_row_t    **rows,
+                        int            nrow)
+{
+    tx_log_t  *txlog;
+    tbl_log_t *tblog;
+    int        i;
+
+    MDB_CHECKARG(tbl && nrow >= 0 && (!nrow || rows), -1);
+
+    if (!nrow)
         return 0;
 
+    if (!depth) {
+        if (tbl->persistent) {
+            for (i = 0;  i < nrow;  i++) {
+                if (mdb_persist_change(tbl,mdb_log_insert,NULL,rows[i]) < 0)
+                    return -1;
+            }
+        }
+        return 0;
+    }
+
     if (!(txlog = get_tx_log(depth)) ||
         !(tblog = get_tbl_log(&tbl->logs, &txlog->hlink, depth, tbl)))
     {
         return -1;
     }
 
-    if (!(change = calloc(1, sizeof(change_t)))) {
-        errno = ENOMEM;
+    for (i = 0;  i < nrow;  i++) {
+        if (append_change(tblog, mdb_log_insert, colmask, NULL, rows[i]) < 0)
+            return -1;
+    }
+
+    return 0;
+}
+
+int mdb_log_merge(uint32_t depth)
+{
+    tx_log_t    *txlog;
+    tx_log_t    *parent;
+    tbl_log_t   *tblog;
+    tbl_log_t   *prev;
+    change_t    *change;
+    mdb_dlist_t *hlink, *hn;
+    mdb_dlist_t *clink, *cp;
+
+    MDB_CHECKARG(depth > 1, -1);
+
+    if (!(txlog = (tx_log_t *)get_last_vlog(&tx_head)) || depth > txlog->depth)
+        return 0;               /* nothing was changed at this depth */
+
+    if (depth < txlog->depth) {
+        errno = ENOKEY;
         return -1;
     }
 
-    change->type    = type;
-    change->colmask = colmask;
-    change->before  = before;
-    change->after   = after;
+    /*
+     * Hand the changes over to the enclosing transaction, so that they
+     * are undone by its rollback and make it to its commit in the order
+     * they were made. The changes of a table simply extend its log at
+     * the enclosing level, if there is one. Otherwise the table log is
+     * moved one level up with its start entry.
+     */
+    MDB_DLIST_UNLINK(tx_log_t, vlink, txlog);
+
+    if (!(parent = get_tx_log(depth - 1))) {
+        MDB_DLIST_APPEND(tx_log_t, vlink, txlog, &tx_head);
+        return -1;
+    }
 
-    switch (type) {
-    case mdb_log_insert: tbl->cnt.inserts++; break;
-    case mdb_log_delete: tbl->cnt.deletes++; break;
-    case mdb_log_update: tbl->cnt.updates++; break;
-    default:                                 break;
+    for (hlink = txlog->hlink.next;  hlink != &txlog->hlink;  hlink = hn) {
+        hn    = hlink->next;
+        tblog = MDB_LIST_RELOCATE(tbl_log_t, hlink, hlink);
+
+        if (tblog->vlink.prev != &tblog->table->logs)
+            prev = MDB_LIST_RELOCATE(tbl_log_t, vlink, tblog->vlink.prev);
+        else
+            prev = NULL;
+
+        if (prev && prev->depth == depth - 1) {
+            for (clink = tblog->changes.prev;
+                 clink != &tblog->changes;
+                 clink = cp)
+            {
+                cp     = clink->prev;
+                change = MDB_LIST_RELOCATE(change_t, link, clink);
+
+                MDB_DLIST_UNLINK(change_t, link, change);
+
+                if (change->type == mdb_log_start) {
+                    free(change->cnt);
+                    mdb_pool_free(&change_pool, change);
+                }
+                else
+                    MDB_DLIST_PREPEND(change_t, link, change, &prev->changes);
+            }
+
+            delete_log((log_t *)tblog);
+        }
+        else {
+            MDB_DLIST_UNLINK(tbl_log_t, hlink, tblog);
+            MDB_DLIST_APPEND(tbl_log_t, hlink, tblog, &parent->hlink);
+            tblog->depth = depth - 1;
+        }
     }
 
-    MDB_DLIST_PREPEND(change_t, link, change, &tblog->changes);
+    mdb_pool_free(&log_pool, txlog);
 
     return 0;
 }
@@ -234,7 +335,7 @@ mdb_log_entry_t *mdb_log_transaction_iterate(uint32_t   depth,
 
             if (delete) {
                 MDB_DLIST_UNLINK(change_t, link, change);
-                free(change);
+                mdb_pool_free(&change_pool, change);
             }
 
             return entry;
@@ -336,7 +437,7 @@ mdb_log_entry_t *mdb_log_table_iterate(mdb_table_t  *tbl,
 
             if (delete) {
                 MDB_DLIST_UNLINK(change_t, link, change);
-                free(change);
+                mdb_pool_free(&change_pool, change);
             }
 
             return entry;
@@ -367,12 +468,11 @@ mdb_log_entry_t *mdb_log_table_iterate(mdb_table_t  *tbl,
 
 static inline log_t *new_log(mdb_dlist_t *vhead,
                              mdb_dlist_t *hhead,
-                             uint32_t     depth,
-                             int          size)
+                             uint32_t     depth)
 {
     log_t *log;
 
-    if ((log = calloc(1, size))) {
+    if ((log = mdb_pool_alloc(&log_pool))) {
         MDB_DLIST_APPEND(mdb_log_t, vlink, log, vhead);
 
         if (hhead)
@@ -391,7 +491,7 @@ static inline void delete_log(log_t *log)
     MDB_DLIST_UNLINK(log_t, vlink, log);
     MDB_DLIST_UNLINK(log_t, hlink, log);
 
-    free(log);
+    mdb_pool_free(&log_pool, log);
 }
 
 
@@ -404,12 +504,41 @@ static inline log_t *get_last_vlog(mdb_dlist_t *vhead)
 }
 
 
+static int append_change(tbl_log_t      *tblog,
+                         mdb_log_type_t  type,
+                         mqi_bitfld_t    colmask,
+                         mdb_row_t      *before,
+                         mdb_row_t      *after)
+{
+    mdb_table_t *tbl = tblog->table;
+    change_t    *change;
+
+    if (!(change = mdb_pool_alloc(&change_pool)))
+        return -1;
+
+    change->type    = type;
+    change->colmask = colmask;
+    change->before  = before;
+    change->after   = after;
+
+    switch (type) {
+    case mdb_log_insert: tbl->cnt.inserts++; break;
+    case mdb_log_delete: tbl->cnt.deletes++; break;
+    case mdb_log_update: tbl->cnt.updates++; break;
+    default:                                 break;
+    }
+
+    MDB_DLIST_PREPEND(change_t, link, change, &tblog->changes);
+
+    return 0;
+}
+
 static tx_log_t *get_tx_log(uint32_t depth)
 {
     tx_log_t *log;
 
     if (!(log = (tx_log_t *)get_last_vlog(&tx_head)) || depth > log->depth) {
-        return (tx_log_t *)new_log(&tx_head, NULL, depth, sizeof(*log));
+        return (tx_log_t *)new_log(&tx_head, NULL, depth);
     }
 
     if (depth < log->depth) {
@@ -429,17 +558,15 @@ static tbl_log_t *get_tbl_log(mdb_dlist_t *vhead,
     change_t  *change;
 
     if (!(log = (tbl_log_t *)get_last_vlog(vhead)) || depth > log->depth) {
-        if ((log = (tbl_log_t *)new_log(vhead, hhead, depth, sizeof(*log)))) {
+        if ((log = (tbl_log_t *)new_log(vhead, hhead, depth))) {
             log->table = tbl;
             MDB_DLIST_INIT(log->changes);
 
-            if (!(change = calloc(1, sizeof(change_t)))) {
-                errno = ENOMEM;
+            if (!(change = mdb_pool_alloc(&change_pool)))
                 return NULL;
-            }
 
             if (!(change->cnt = calloc(1, sizeof(*change->cnt)))) {
-                free(change);
+                mdb_pool_free(&change_pool, change);
                 errno = ENOMEM;
                 return NULL;
             }
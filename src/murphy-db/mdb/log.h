@@ -79,6 +79,9 @@ typedef struct {
 int mdb_log_create(mdb_table_t *);
 int mdb_log_change(mdb_table_t *, uint32_t, mdb_log_type_t,
                    mqi_bitfld_t, mdb_row_t *, mdb_row_t *);
+int mdb_log_insert_rows(mdb_table_t *, uint32_t, mqi_bitfld_t,
+                        mdb_row_t **, int);
+int mdb_log_merge(uint32_t);
 mdb_log_entry_t *mdb_log_transaction_iterate(uint32_t, void **, bool, int);
 mdb_log_entry_t *mdb_log_table_iterate(mdb_table_t *, void **, int);
 
@@ -55,8 +55,13 @@ int mqi_data_compare_integer(int datalen, void *data1, void *data2)
     integer1 = *(int32_t *)data1;
     integer2 = *(int32_t *)data2;
 
+    if (integer1 < integer2)
+        return -1;
+
+    if (integer1 > integer2)
+        return 1;
 
-    return (integer1 - integer2);
+    return 0;
 }
 
 int mqi_data_compare_unsignd(int datalen, void *data1, void *data2)
@@ -86,8 +91,11 @@ int mqi_data_compare_string(int datalen, void *data1, void *data2)
 
     (void)datalen;
 
-    if (!varchar1 || !varchar1[0] || !varchar2 || !varchar2[0])
-        return 0;
+    if (!varchar1)
+        varchar1 = "";
+
+    if (!varchar2)
+        varchar2 = "";
 
     return strcmp(varchar1, varchar2);
 }
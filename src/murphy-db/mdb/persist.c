@@ -0,0 +1,1505 @@
+/*
+ * Copyright (c) 2012, Intel Corporation
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met:
+ *
+ *  * Redistributions of source code must retain the above copyright notice,
+ *    this list of conditions and the following disclaimer.
+ *  * Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ *  * Neither the name of Intel Corporation nor the names of its contributors
+ *    may be used to endorse or promote products derived from this software
+ *    without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+#include <stdint.h>
+#include <stdlib.h>
+#include <stdbool.h>
+#include <stdio.h>
+#include <limits.h>
+#include <errno.h>
+#include <unistd.h>
+#include <fcntl.h>
+#include <time.h>
+#include <sys/types.h>
+#include <sys/stat.h>
+#include <sys/mman.h>
+
+#define _GNU_SOURCE
+#include <string.h>
+
+#include <murphy-db/assert.h>
+#include <murphy-db/hash.h>
+#include "persist.h"
+#include "table.h"
+#include "row.h"
+#include "index.h"
+#include "transaction.h"
+
+/*
+ * Persistent tables live in a directory as a snapshot and a write-ahead
+ * log (WAL). The snapshot is a compact image of the table definitions,
+ * indexes, stamps and rows. The WAL has everything committed since the
+ * snapshot was taken as table definitions and row images that were added
+ * to or removed from the tables. Records are grouped by commits and each
+ * group is terminated by a commit record with the checksum of the group,
+ * so a torn group at the end of the log is simply dropped on recovery.
+ *
+ * Commits are collected to a buffer and written out and synced in batches
+ * (group commit). If timers are provided with mdb_persist_set_timer, a
+ * deadline timer writes out whatever is still buffered when no further
+ * commits come to trigger it. Once the WAL outgrows the snapshot they are
+ * compacted to a new snapshot. On startup both files are mapped and replayed.
+ */
+
+#define SNAPSHOT_FILE   "snapshot"
+#define WAL_FILE        "wal"
+#define TMP_SUFFIX      ".tmp"
+
+#define SNAPSHOT_MAGIC  "MDB-SNAP"
+#define WAL_MAGIC       "MDB-WAL."
+#define FORMAT_VERSION  1
+
+#define BUFFER_MAX      (64 * 1024)     /* write out commits beyond this */
+#define WAL_MIN         (256 * 1024)    /* don't compact a WAL below this */
+#define FLUSH_DEADLINE  1000            /* flush deadline without sync_msec */
+
+typedef enum {
+    record_unknown = 0,
+    record_define,              /* table definition with its indexes */
+    record_drop,                /* table dropped */
+    record_add,                 /* row image added */
+    record_remove,              /* row image removed */
+    record_commit,              /* end of a commit group */
+} record_type_t;
+
+typedef struct {
+    char     magic[8];
+    uint32_t version;
+    uint32_t generation;
+} file_header_t;
+
+typedef struct {
+    uint32_t type;
+    uint32_t length;            /* length of the payload */
+} record_header_t;
+
+typedef struct {
+    uint8_t *data;
+    size_t   length;
+    size_t   size;
+} buffer_t;
+
+typedef struct {
+    const uint8_t *p;
+    const uint8_t *e;
+} reader_t;
+
+typedef struct {
+    mdb_table_t *table;
+    mdb_row_t   *row;
+    mdb_row_t   *orig;          /* image before the transaction, if any */
+    bool         deleted;
+    bool         replaced;      /* superseded by a replacing row */
+} net_change_t;
+
+typedef struct {
+    char          *dir;
+    int            walfd;
+    uint32_t       generation;
+    int            sync_commits; /* sync after this many commits */
+    int            sync_msec;    /* or when this much time has passed */
+    int            npending;     /* commits not synced yet */
+    uint64_t       synced;       /* time of the last sync */
+    size_t         walsize;
+    size_t         snapsize;
+    buffer_t       buf;          /* group commit buffer */
+    size_t         group;        /* start of the open commit group */
+    int            ntable;
+    mdb_table_t  **tables;
+    bool           replaying;
+    void          *timer;        /* flush deadline timer */
+} store_t;
+
+
+static int add_table(store_t *, mdb_table_t *);
+static void remove_table(store_t *, mdb_table_t *);
+static void *map_file(store_t *, const char *, size_t *);
+static int load_snapshot(store_t *);
+static int apply_record(store_t *, uint32_t, reader_t *);
+static int replay_wal(store_t *, bool *);
+static int write_file(store_t *, const char *, buffer_t *, bool);
+static int put_header(buffer_t *, const char *, uint32_t);
+static bool row_indexed(mdb_table_t *, mdb_row_t *);
+static int write_snapshot(store_t *);
+static int checkpoint(store_t *);
+static int flush(store_t *);
+static int commit(store_t *, bool);
+static void arm_deadline(store_t *);
+static void disarm_deadline(store_t *);
+static void deadline_cb(void *);
+static void abort_group(store_t *);
+static int begin_record(buffer_t *, record_type_t, size_t *);
+static void end_record(buffer_t *, size_t);
+static int put_bytes(buffer_t *, const void *, size_t);
+static int put_u32(buffer_t *, uint32_t);
+static int put_string(buffer_t *, const char *);
+static int put_schema(buffer_t *, mdb_table_t *);
+static int put_row(buffer_t *, record_type_t, mdb_table_t *, mdb_row_t *);
+static int get_u32(reader_t *, uint32_t *);
+static const char *get_string(reader_t *);
+static const void *get_bytes(reader_t *, size_t);
+static mdb_secondary_index_t *find_secondary(mdb_table_t *, const char *);
+static mdb_table_t *get_schema(store_t *, reader_t *);
+static int add_row(mdb_table_t *, const void *);
+static int remove_row(mdb_table_t *, const void *);
+static uint32_t checksum(const void *, size_t);
+static uint64_t now_msec(void);
+
+static store_t         *store;
+static mqi_timer_ops_t *timer_ops;
+static void            *timer_data;
+
+
+int mdb_persist_open(const char *dir, int sync_commits, int sync_msec)
+{
+    store_t     *st;
+    struct stat  sb;
+    char         path[PATH_MAX];
+    bool         intact;
+    int          ngroup;
+    int          err;
+    int          i;
+
+    MDB_CHECKARG(dir && dir[0], -1);
+    MDB_ASSERT(!store && !mdb_transaction_get_depth(), EBUSY, -1);
+
+    if (mkdir(dir, 0700) < 0 && errno != EEXIST)
+        return -1;
+
+    if (!(st = calloc(1, sizeof(store_t))) || !(st->dir = strdup(dir))) {
+        free(st);
+        errno = ENOMEM;
+        return -1;
+    }
+
+    st->walfd        = -1;
+    st->sync_commits = sync_commits > 0 ? sync_commits : 1;
+    st->sync_msec    = sync_msec;
+    st->replaying    = true;
+
+    store = st;
+
+    if (load_snapshot(st) < 0 || (ngroup = replay_wal(st, &intact)) < 0)
+        goto failed;
+
+    st->replaying = false;
+
+    if (ngroup > 0 || !intact) {
+        if (checkpoint(st) < 0)
+            goto failed;
+    }
+    else {
+        snprintf(path, sizeof(path), "%s/%s", dir, WAL_FILE);
+
+        if ((st->walfd = open(path, O_WRONLY | O_APPEND)) < 0 ||
+            fstat(st->walfd, &sb) < 0)
+            goto failed;
+
+        st->walsize = sb.st_size;
+    }
+
+    st->synced = now_msec();
+
+    return 0;
+
+ failed:
+    err = errno;
+
+    st->replaying = true;
+
+    for (i = st->ntable - 1;  i >= 0;  i--)
+        mdb_table_drop(st->tables[i]);
+
+    if (st->walfd >= 0)
+        close(st->walfd);
+
+    free(st->buf.data);
+    free(st->tables);
+    free(st->dir);
+    free(st);
+
+    store = NULL;
+    errno = err;
+
+    return -1;
+}
+
+int mdb_persist_close(void)
+{
+    store_t *st = store;
+    int      sts;
+    int      i;
+
+    MDB_PREREQUISITE(st, -1);
+
+    sts = flush(st);
+
+    disarm_deadline(st);
+
+    for (i = 0;  i < st->ntable;  i++)
+        st->tables[i]->persistent = false;
+
+    close(st->walfd);
+
+    free(st->buf.data);
+    free(st->tables);
+    free(st->dir);
+    free(st);
+
+    store = NULL;
+
+    return sts;
+}
+
+int mdb_persist_sync(void)
+{
+    store_t *st = store;
+    size_t   limit;
+
+    MDB_PREREQUISITE(st, -1);
+
+    if (flush(st) < 0)
+        return -1;
+
+    limit = st->snapsize * 2 > WAL_MIN ? st->snapsize * 2 : WAL_MIN;
+
+    if (st->walsize > limit && !mdb_transaction_get_depth())
+        return checkpoint(st);
+
+    return 0;
+}
+
+int mdb_persist_set_timer(mqi_timer_ops_t *ops, void *data)
+{
+    MDB_CHECKARG(!ops || (ops->add && ops->del), -1);
+
+    if (store)
+        disarm_deadline(store);
+
+    timer_ops  = ops;
+    timer_data = data;
+
+    if (store)
+        arm_deadline(store);
+
+    return 0;
+}
+
+int mdb_persist_checkpoint(void)
+{
+    MDB_PREREQUISITE(store, -1);
+    MDB_ASSERT(!mdb_transaction_get_depth(), EBUSY, -1);
+
+    return checkpoint(store);
+}
+
+int mdb_persist_table(mdb_table_t *tbl)
+{
+    store_t   *st = store;
+    mdb_row_t *row;
+
+    MDB_CHECKARG(tbl, -1);
+    MDB_PREREQUISITE(st, -1);
+
+    if (tbl->persistent)
+        return 0;
+
+    if (add_table(st, tbl) < 0)
+        return -1;
+
+    tbl->persistent = true;
+
+    if (put_schema(&st->buf, tbl) < 0)
+        goto failed;
+
+    MDB_DLIST_FOR_EACH(mdb_row_t, link, row, &tbl->rows) {
+        if (put_row(&st->buf, record_add, tbl, row) < 0)
+            goto failed;
+    }
+
+    return commit(st, !mdb_transaction_get_depth());
+
+ failed:
+    abort_group(st);
+    remove_table(st, tbl);
+    tbl->persistent = false;
+    return -1;
+}
+
+int mdb_persist_get_tables(mdb_table_t **tables, int len)
+{
+    int i;
+
+    MDB_CHECKARG(len >= 0 && (tables || !len), -1);
+
+    if (!store)
+        return 0;
+
+    for (i = 0;  i < store->ntable && i < len;  i++)
+        tables[i] = store->tables[i];
+
+    return store->ntable;
+}
+
+
+int mdb_persist_change(mdb_table_t    *tbl,
+                       mdb_log_type_t  type,
+                       mdb_row_t      *before,
+                       mdb_row_t      *after)
+{
+    store_t  *st = store;
+    buffer_t *buf;
+    int       sts;
+
+    if (!st || st->replaying || !tbl->persistent)
+        return 0;
+
+    buf = &st->buf;
+
+    switch (type) {
+    case mdb_log_insert:
+        sts = put_row(buf, record_add, tbl, after);
+        break;
+    case mdb_log_delete:
+        sts = put_row(buf, record_remove, tbl, before);
+        break;
+    case mdb_log_update:
+        if (!(sts = put_row(buf, record_remove, tbl, before)))
+            sts = put_row(buf, record_add, tbl, after);
+        break;
+    default:
+        sts = 0;
+        break;
+    }
+
+    if (sts < 0) {
+        abort_group(st);
+        return -1;
+    }
+
+    return commit(st, true);
+}
+
+int mdb_persist_transaction(uint32_t depth)
+{
+    store_t         *st = store;
+    mdb_log_entry_t *en;
+    mdb_hash_t      *hash = NULL;
+    net_change_t    *changes = NULL, *ch, *old;
+    mdb_row_t       *row;
+    void            *cursor;
+    int              nchange = 0, i, idx, oldidx;
+    bool             failed = false;
+
+    if (!st || st->replaying || !st->ntable)
+        return 0;
+
+    /*
+     * Fold the log of the transaction to its net effect: for every row
+     * touched we need its image before the transaction (none for new rows)
+     * and whether it is still around. Replacing a row with a new one is
+     * logged as an update from the old row to the new one, in which case
+     * the new row takes over the history of the old one.
+     */
+    MDB_TRANSACTION_LOG_FOR_EACH(depth, en, MDB_BACKWARD, cursor) {
+        if (failed || !en->table->persistent)
+            continue;
+
+        if (!hash && !(hash = MDB_HASH_TABLE_CREATE(pointer, 64))) {
+            failed = true;
+            continue;
+        }
+
+        oldidx = 0;
+
+        switch (en->change) {
+        case mdb_log_insert:
+            row = en->after;
+            break;
+        case mdb_log_delete:
+            row = en->before;
+            break;
+        case mdb_log_update:
+            if (en->before == en->after)
+                continue;
+            oldidx = mdb_hash_get_data(hash, 0, en->before) - NULL;
+            row = en->after;
+            break;
+        default:
+            continue;
+        }
+
+        if ((idx = mdb_hash_get_data(hash, 0, row) - NULL)) {
+            if (en->change == mdb_log_delete)
+                changes[idx - 1].deleted = true;
+            continue;
+        }
+
+        if (!(nchange % 32)) {
+            if (!(ch = realloc(changes, sizeof(*ch) * (nchange + 32)))) {
+                failed = true;
+                continue;
+            }
+
+            changes = ch;
+        }
+
+        ch = changes + nchange;
+
+        ch->table    = en->table;
+        ch->row      = row;
+        ch->orig     = NULL;
+        ch->deleted  = false;
+        ch->replaced = false;
+
+        switch (en->change) {
+        case mdb_log_update:
+            if (oldidx) {
+                old = changes + (oldidx - 1);
+                ch->orig = old->orig;
+                old->replaced = true;
+            }
+            else
+                ch->orig = en->before;
+            break;
+        case mdb_log_delete:
+            ch->orig    = row;
+            ch->deleted = true;
+            break;
+        default:
+            break;
+        }
+
+        if (mdb_hash_add(hash, 0, row, NULL + (nchange + 1)) < 0)
+            failed = true;
+        else
+            nchange++;
+    }
+
+    if (hash)
+        MDB_HASH_TABLE_DESTROY(hash);
+
+    /*
+     * Log the removed images first and the added ones after them, so that
+     * replaying never needs two rows with the same key at the same time.
+     */
+    for (i = 0, ch = changes;  i < nchange && !failed;  i++, ch++) {
+        if (ch->replaced || !ch->orig)
+            continue;
+
+        if (ch->deleted ||
+            memcmp(ch->orig->data, ch->row->data, ch->table->dlgh))
+        {
+            if (put_row(&st->buf, record_remove, ch->table, ch->orig) < 0)
+                failed = true;
+        }
+    }
+
+    for (i = 0, ch = changes;  i < nchange && !failed;  i++, ch++) {
+        if (ch->replaced || ch->deleted)
+            continue;
+
+        if (!ch->orig ||
+            memcmp(ch->orig->data, ch->row->data, ch->table->dlgh))
+        {
+            if (put_row(&st->buf, record_add, ch->table, ch->row) < 0)
+                failed = true;
+        }
+    }
+
+    free(changes);
+
+    if (failed) {
+        abort_group(st);
+        errno = ENOMEM;
+        return -1;
+    }
+
+    /* only the outermost transaction leaves the tables in a committed state */
+    return commit(st, depth == 1);
+}
+
+int mdb_persist_define(mdb_table_t *tbl)
+{
+    store_t *st = store;
+
+    if (!st || st->replaying || !tbl->persistent)
+        return 0;
+
+    if (put_schema(&st->buf, tbl) < 0) {
+        abort_group(st);
+        return -1;
+    }
+
+    return commit(st, !mdb_transaction_get_depth());
+}
+
+int mdb_persist_drop(mdb_table_t *tbl)
+{
+    store_t *st = store;
+    size_t   start;
+
+    if (!st || !tbl->persistent)
+        return 0;
+
+    remove_table(st, tbl);
+
+    if (st->replaying)
+        return 0;
+
+    if (begin_record(&st->buf, record_drop, &start) < 0 ||
+        put_string(&st->buf, tbl->name) < 0)
+    {
+        abort_group(st);
+        return -1;
+    }
+
+    end_record(&st->buf, start);
+
+    return commit(st, !mdb_transaction_get_depth());
+}
+
+
+static int add_table(store_t *st, mdb_table_t *tbl)
+{
+    mdb_table_t **tables;
+
+    if (!(tables = realloc(st->tables, sizeof(*tables) * (st->ntable + 1)))) {
+        errno = ENOMEM;
+        return -1;
+    }
+
+    tables[st->ntable++] = tbl;
+    st->tables = tables;
+
+    return 0;
+}
+
+static void remove_table(store_t *st, mdb_table_t *tbl)
+{
+    int i;
+
+    for (i = 0;  i < st->ntable;  i++) {
+        if (st->tables[i] == tbl) {
+            memmove(st->tables + i, st->tables + i+1,
+                    sizeof(*st->tables) * (st->ntable - (i+1)));
+            st->ntable--;
+            break;
+        }
+    }
+}
+
+static void *map_file(store_t *st, const char *name, size_t *size_ret)
+{
+    struct stat  sb;
+    char         path[PATH_MAX];
+    void        *map;
+    int          fd;
+
+    snprintf(path, sizeof(path), "%s/%s", st->dir, name);
+
+    if ((fd = open(path, O_RDONLY)) < 0)
+        return NULL;
+
+    if (fstat(fd, &sb) < 0) {
+        close(fd);
+        return NULL;
+    }
+
+    if (sb.st_size < (off_t)sizeof(file_header_t)) {
+        close(fd);
+        errno = EINVAL;
+        return NULL;
+    }
+
+    map = mmap(NULL, sb.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+    close(fd);
+
+    if (map == MAP_FAILED)
+        return NULL;
+
+    madvise(map, sb.st_size, MADV_SEQUENTIAL);
+
+    *size_ret = sb.st_size;
+
+    return map;
+}
+
+static int load_snapshot(store_t *st)
+{
+    file_header_t    hdr;
+    record_header_t  rh;
+    reader_t         r;
+    mdb_table_t     *tbl;
+    uint8_t         *map;
+    const void      *data;
+    size_t           size;
+    uint32_t         crc, ntable, stamp, nrow;
+    uint32_t         i, j;
+
+    if (!(map = map_file(st, SNAPSHOT_FILE, &size)))
+        return errno == ENOENT ? 0 : -1;
+
+    memcpy(&hdr, map, sizeof(hdr));
+    memcpy(&crc, map + size - sizeof(crc), sizeof(crc));
+
+    if (size < sizeof(hdr) + sizeof(crc) ||
+        memcmp(hdr.magic, SNAPSHOT_MAGIC, sizeof(hdr.magic)) ||
+        hdr.version != FORMAT_VERSION ||
+        checksum(map, size - sizeof(crc)) != crc)
+        goto invalid;
+
+    r.p = map + sizeof(hdr);
+    r.e = map + size - sizeof(crc);
+
+    if (get_u32(&r, &ntable) < 0)
+        goto invalid;
+
+    for (i = 0;  i < ntable;  i++) {
+        /* tables are stored as definition records followed by their rows */
+        if (get_u32(&r, &rh.type) < 0 || rh.type != record_define ||
+            get_u32(&r, &rh.length) < 0)
+            goto invalid;
+
+        if (!(tbl = get_schema(st, &r)))
+            goto failed;
+
+        if (get_u32(&r, &stamp) < 0 || get_u32(&r, &nrow) < 0)
+            goto invalid;
+
+        for (j = 0;  j < nrow;  j++) {
+            if (!(data = get_bytes(&r, tbl->dlgh)))
+                goto invalid;
+
+            if (add_row(tbl, data) < 0)
+                goto failed;
+        }
+
+        tbl->cnt.stamp = stamp;
+    }
+
+    st->generation = hdr.generation;
+    st->snapsize   = size;
+
+    munmap(map, size);
+
+    return 0;
+
+ invalid:
+    errno = EINVAL;
+ failed:
+    munmap(map, size);
+    return -1;
+}
+
+static int apply_record(store_t *st, uint32_t type, reader_t *r)
+{
+    mdb_table_t *tbl;
+    const char  *name;
+    const void  *data;
+
+    if (type == record_define)
+        return get_schema(st, r) ? 0 : -1;
+
+    if (!(name = get_string(r)) || !(tbl = mdb_table_find((char *)name))) {
+        errno = EINVAL;
+        return -1;
+    }
+
+    if (type == record_drop)
+        return mdb_table_drop(tbl);
+
+    if (!(data = get_bytes(r, tbl->dlgh))) {
+        errno = EINVAL;
+        return -1;
+    }
+
+    switch (type) {
+    case record_add:      return add_row(tbl, data);
+    case record_remove:   return remove_row(tbl, data);
+    default:              errno = EINVAL;  return -1;
+    }
+}
+
+static int replay_wal(store_t *st, bool *intact)
+{
+    file_header_t    hdr;
+    record_header_t  rh;
+    reader_t         r, g, p;
+    uint8_t         *map;
+    const uint8_t   *group, *record;
+    size_t           size;
+    uint32_t         crc;
+    int              ngroup;
+
+    *intact = false;
+
+    if (!(map = map_file(st, WAL_FILE, &size)))
+        return (errno == ENOENT || errno == EINVAL) ? 0 : -1;
+
+    memcpy(&hdr, map, sizeof(hdr));
+
+    if (memcmp(hdr.magic, WAL_MAGIC, sizeof(hdr.magic)) ||
+        hdr.version != FORMAT_VERSION ||
+        hdr.generation != st->generation)
+    {
+        /* stale log of an older snapshot, everything is in the snapshot */
+        munmap(map, size);
+        return 0;
+    }
+
+    r.p = group = map + sizeof(hdr);
+    r.e = map + size;
+
+    for (ngroup = 0;  r.p < r.e;  ) {
+        record = r.p;
+
+        if (get_u32(&r, &rh.type) < 0 || get_u32(&r, &rh.length) < 0 ||
+            !get_bytes(&r, rh.length))
+            break;
+
+        if (rh.type != record_commit)
+            continue;
+
+        memcpy(&crc, record + sizeof(rh), sizeof(crc));
+
+        if (rh.length != sizeof(crc) ||
+            checksum(group, record - group) != crc)
+            break;
+
+        for (g.p = group, g.e = record;  g.p < g.e;  g.p = p.e) {
+            get_u32(&g, &rh.type);
+            get_u32(&g, &rh.length);
+
+            p.p = g.p;
+            p.e = g.p + rh.length;
+
+            if (apply_record(st, rh.type, &p) < 0) {
+                munmap(map, size);
+                return -1;
+            }
+        }
+
+        group = r.p;
+        ngroup++;
+    }
+
+    *intact = (group == r.e);
+
+    munmap(map, size);
+
+    return ngroup;
+}
+
+static int write_file(store_t *st, const char *name, buffer_t *buf,
+                      bool keep_open)
+{
+    char           path[PATH_MAX];
+    char           tmp[PATH_MAX + sizeof(TMP_SUFFIX)];
+    const uint8_t *p;
+    size_t         left;
+    ssize_t        n;
+    int            fd, dfd;
+
+    snprintf(path, sizeof(path), "%s/%s", st->dir, name);
+    snprintf(tmp, sizeof(tmp), "%s%s", path, TMP_SUFFIX);
+
+    if ((fd = open(tmp, O_WRONLY | O_CREAT | O_TRUNC | O_APPEND, 0600)) < 0)
+        return -1;
+
+    for (p = buf->data, left = buf->length;  left > 0;  p += n, left -= n) {
+        if ((n = write(fd, p, left)) < 0) {
+            if (errno == EINTR) {
+                n = 0;
+                continue;
+            }
+            goto failed;
+        }
+    }
+
+    if (fsync(fd) < 0 || rename(tmp, path) < 0)
+        goto failed;
+
+    if ((dfd = open(st->dir, O_RDONLY | O_DIRECTORY)) >= 0) {
+        fsync(dfd);
+        close(dfd);
+    }
+
+    if (keep_open)
+        return fd;
+
+    close(fd);
+    return 0;
+
+ failed:
+    close(fd);
+    unlink(tmp);
+    return -1;
+}
+
+static int put_header(buffer_t *buf, const char *magic, uint32_t generation)
+{
+    file_header_t hdr;
+
+    memcpy(hdr.magic, magic, sizeof(hdr.magic));
+    hdr.version    = FORMAT_VERSION;
+    hdr.generation = generation;
+
+    return put_bytes(buf, &hdr, sizeof(hdr));
+}
+
+/*
+ * A row that is on the table but not in its index (eg. left behind by a
+ * rejected insert) is not part of the table's contents. Writing it out
+ * would give the snapshot a second row with the same key.
+ */
+static bool row_indexed(mdb_table_t *tbl, mdb_row_t *row)
+{
+    mdb_index_t *ix = &tbl->index;
+
+    if (!MDB_INDEX_DEFINED(ix))
+        return true;
+
+    return mdb_index_get_row(tbl, ix->length, row->data + ix->offset) == row;
+}
+
+static int write_snapshot(store_t *st)
+{
+    buffer_t     buf = { NULL, 0, 0 };
+    mdb_table_t *tbl;
+    mdb_row_t   *row;
+    uint32_t     nrow;
+    int          i;
+
+    if (put_header(&buf, SNAPSHOT_MAGIC, st->generation + 1) < 0 ||
+        put_u32(&buf, st->ntable) < 0)
+        goto failed;
+
+    for (i = 0;  i < st->ntable;  i++) {
+        tbl = st->tables[i];
+
+        if (put_schema(&buf, tbl) < 0 || put_u32(&buf, tbl->cnt.stamp) < 0)
+            goto failed;
+
+        nrow = 0;
+        MDB_DLIST_FOR_EACH(mdb_row_t, link, row, &tbl->rows) {
+            if (row_indexed(tbl, row))
+                nrow++;
+        }
+
+        if (put_u32(&buf, nrow) < 0)
+            goto failed;
+
+        MDB_DLIST_FOR_EACH(mdb_row_t, link, row, &tbl->rows) {
+            if (!row_indexed(tbl, row))
+                continue;
+
+            if (put_bytes(&buf, row->data, tbl->dlgh) < 0)
+                goto failed;
+        }
+    }
+
+    if (put_u32(&buf, checksum(buf.data, buf.length)) < 0 ||
+        write_file(st, SNAPSHOT_FILE, &buf, false) < 0)
+        goto failed;
+
+    st->snapsize = buf.length;
+
+    free(buf.data);
+
+    return 0;
+
+ failed:
+    free(buf.data);
+    return -1;
+}
+
+static int checkpoint(store_t *st)
+{
+    buffer_t wal = { NULL, 0, 0 };
+    int      fd;
+
+    if (write_snapshot(st) < 0)
+        return -1;
+
+    /*
+     * From here on the new snapshot has everything, including the commits
+     * still in the buffer. The old log is ignored by its generation even
+     * if we crash before replacing it.
+     */
+    if (put_header(&wal, WAL_MAGIC, st->generation + 1) < 0 ||
+        (fd = write_file(st, WAL_FILE, &wal, true)) < 0)
+    {
+        free(wal.data);
+        return -1;
+    }
+
+    free(wal.data);
+
+    if (st->walfd >= 0)
+        close(st->walfd);
+
+    st->walfd    = fd;
+    st->walsize  = sizeof(file_header_t);
+    st->generation++;
+
+    st->buf.length = 0;
+    st->group      = 0;
+    st->npending   = 0;
+    st->synced     = now_msec();
+
+    disarm_deadline(st);
+
+    return 0;
+}
+
+static int flush(store_t *st)
+{
+    const uint8_t *p;
+    size_t         left;
+    ssize_t        n;
+    int            err;
+
+    if (!st->group && !st->npending)
+        return 0;
+
+    for (p = st->buf.data, left = st->group;  left > 0;  p += n, left -= n) {
+        if ((n = write(st->walfd, p, left)) < 0) {
+            if (errno == EINTR) {
+                n = 0;
+                continue;
+            }
+
+            /* don't leave a partial group behind, retry on the next flush */
+            err = errno;
+            if (ftruncate(st->walfd, st->walsize) < 0)
+                err = errno;
+            errno = err;
+            return -1;
+        }
+    }
+
+    st->walsize += st->group;
+
+    memmove(st->buf.data, st->buf.data + st->group,
+            st->buf.length - st->group);
+    st->buf.length -= st->group;
+    st->group       = 0;
+
+    if (fdatasync(st->walfd) < 0)
+        return -1;
+
+    st->npending = 0;
+    st->synced   = now_msec();
+
+    disarm_deadline(st);
+
+    return 0;
+}
+
+static int commit(store_t *st, bool compact)
+{
+    buffer_t *buf = &st->buf;
+    size_t    limit;
+    uint32_t  crc;
+    int       sts;
+
+    if (buf->length == st->group)
+        return 0;
+
+    crc = checksum(buf->data + st->group, buf->length - st->group);
+
+    if (put_u32(buf, record_commit) < 0 || put_u32(buf, sizeof(crc)) < 0 ||
+        put_u32(buf, crc) < 0)
+    {
+        abort_group(st);
+        return -1;
+    }
+
+    st->group = buf->length;
+    st->npending++;
+
+    limit = st->snapsize * 2 > WAL_MIN ? st->snapsize * 2 : WAL_MIN;
+
+    if (compact && st->walsize + buf->length > limit)
+        return checkpoint(st);
+
+    if (st->npending >= st->sync_commits || buf->length >= BUFFER_MAX ||
+        (st->sync_msec > 0 &&
+         now_msec() - st->synced >= (uint64_t)st->sync_msec))
+        sts = flush(st);
+    else
+        sts = 0;
+
+    /* make sure whatever is left buffered gets written out eventually */
+    arm_deadline(st);
+
+    return sts;
+}
+
+static void arm_deadline(store_t *st)
+{
+    uint64_t elapsed;
+    int      msecs;
+
+    if (st->timer || !timer_ops || st->replaying || !st->npending)
+        return;
+
+    msecs   = st->sync_msec > 0 ? st->sync_msec : FLUSH_DEADLINE;
+    elapsed = now_msec() - st->synced;
+
+    if (elapsed < (uint64_t)msecs)
+        msecs -= (int)elapsed;
+
+    st->timer = timer_ops->add(timer_data, msecs, deadline_cb, st);
+}
+
+static void disarm_deadline(store_t *st)
+{
+    void *timer = st->timer;
+
+    if (timer) {
+        st->timer = NULL;
+        timer_ops->del(timer_data, timer);
+    }
+}
+
+static void deadline_cb(void *data)
+{
+    store_t *st = (store_t *)data;
+
+    disarm_deadline(st);
+
+    /* on failure keep the commits buffered and try again later */
+    if (flush(st) < 0)
+        arm_deadline(st);
+}
+
+static void abort_group(store_t *st)
+{
+    st->buf.length = st->group;
+}
+
+static int put_bytes(buffer_t *buf, const void *data, size_t size)
+{
+    uint8_t *d;
+    size_t   n;
+
+    if (buf->length + size > buf->size) {
+        for (n = buf->size ? buf->size : 4096;  n < buf->length + size; )
+            n *= 2;
+
+        if (!(d = realloc(buf->data, n))) {
+            errno = ENOMEM;
+            return -1;
+        }
+
+        buf->data = d;
+        buf->size = n;
+    }
+
+    memcpy(buf->data + buf->length, data, size);
+    buf->length += size;
+
+    return 0;
+}
+
+static int begin_record(buffer_t *buf, record_type_t type, size_t *start)
+{
+    record_header_t rh = { type, 0 };
+
+    *start = buf->length;
+
+    return put_bytes(buf, &rh, sizeof(rh));
+}
+
+static void end_record(buffer_t *buf, size_t start)
+{
+    record_header_t rh;
+
+    memcpy(&rh, buf->data + start, sizeof(rh));
+    rh.length = buf->length - start - sizeof(rh);
+    memcpy(buf->data + start, &rh, sizeof(rh));
+}
+
+static int put_u32(buffer_t *buf, uint32_t v)
+{
+    return put_bytes(buf, &v, sizeof(v));
+}
+
+static int put_string(buffer_t *buf, const char *s)
+{
+    uint32_t len = strlen(s) + 1;
+
+    if (put_u32(buf, len) < 0)
+        return -1;
+
+    return put_bytes(buf, s, len);
+}
+
+static int put_schema(buffer_t *buf, mdb_table_t *tbl)
+{
+    mdb_column_t          *col;
+    mdb_index_t           *ix = &tbl->index;
+    mdb_secondary_index_t *sx;
+    size_t                 start;
+    uint32_t               length;
+    int                    i, j;
+
+    if (begin_record(buf, record_define, &start) < 0 ||
+        put_string(buf, tbl->name) < 0 || put_u32(buf, tbl->ncolumn) < 0)
+        return -1;
+
+    for (i = 0;  i < tbl->ncolumn;  i++) {
+        col = tbl->columns + i;
+
+        length = col->length;
+
+        if (col->type == mqi_varchar)
+            length--;
+
+        if (put_string(buf, col->name) < 0 ||
+            put_u32(buf, col->type) < 0 || put_u32(buf, length) < 0)
+            return -1;
+    }
+
+    if (!MDB_INDEX_DEFINED(ix)) {
+        if (put_u32(buf, 0) < 0)
+            return -1;
+    }
+    else {
+        if (put_u32(buf, ix->ncolumn) < 0)
+            return -1;
+
+        for (i = 0;  i < ix->ncolumn;  i++) {
+            if (put_u32(buf, ix->columns[i]) < 0)
+                return -1;
+        }
+    }
+
+    if (put_u32(buf, tbl->nsecondary) < 0)
+        return -1;
+
+    for (i = 0;  i < tbl->nsecondary;  i++) {
+        sx = tbl->secondary[i];
+
+        if (put_string(buf, sx->name) < 0 || put_u32(buf, sx->flags) < 0 ||
+            put_u32(buf, sx->ncolumn) < 0)
+            return -1;
+
+        for (j = 0;  j < sx->ncolumn;  j++) {
+            if (put_u32(buf, sx->columns[j]) < 0)
+                return -1;
+        }
+    }
+
+    end_record(buf, start);
+
+    return 0;
+}
+
+static int put_row(buffer_t     *buf,
+                   record_type_t type,
+                   mdb_table_t  *tbl,
+                   mdb_row_t    *row)
+{
+    size_t start;
+
+    if (begin_record(buf, type, &start) < 0 ||
+        put_string(buf, tbl->name) < 0 ||
+        put_bytes(buf, row->data, tbl->dlgh) < 0)
+        return -1;
+
+    end_record(buf, start);
+
+    return 0;
+}
+
+static const void *get_bytes(reader_t *r, size_t size)
+{
+    const void *data;
+
+    if ((size_t)(r->e - r->p) < size)
+        return NULL;
+
+    data  = r->p;
+    r->p += size;
+
+    return data;
+}
+
+static int get_u32(reader_t *r, uint32_t *v)
+{
+    const void *data;
+
+    if (!(data = get_bytes(r, sizeof(*v))))
+        return -1;
+
+    memcpy(v, data, sizeof(*v));
+
+    return 0;
+}
+
+static const char *get_string(reader_t *r)
+{
+    const char *s;
+    uint32_t    len;
+
+    if (get_u32(r, &len) < 0 || !len || !(s = get_bytes(r, len)) ||
+        s[len - 1])
+        return NULL;
+
+    return s;
+}
+
+static mdb_secondary_index_t *find_secondary(mdb_table_t *tbl,
+                                             const char  *name)
+{
+    int i;
+
+    for (i = 0;  i < tbl->nsecondary;  i++) {
+        if (!strcmp(tbl->secondary[i]->name, name))
+            return tbl->secondary[i];
+    }
+
+    return NULL;
+}
+
+/*
+ * Create a table from its definition or, if it already exists, bring its
+ * indexes in sync with the definition.
+ */
+static mdb_table_t *get_schema(store_t *st, reader_t *r)
+{
+    mqi_column_def_t  defs[MQI_COLUMN_MAX + 1];
+    char             *cols[MQI_COLUMN_MAX + 1];
+    const char       *name, *sxname;
+    const char      **sxnames = NULL;
+    mdb_table_t      *tbl;
+    uint32_t          ncolumn, nkey, nsecondary, type, length, flags, n, idx;
+    uint32_t          i, j;
+    int               k;
+
+    if (!(name = get_string(r)) || get_u32(r, &ncolumn) < 0 ||
+        ncolumn < 1 || ncolumn > MQI_COLUMN_MAX)
+        goto invalid;
+
+    memset(defs, 0, sizeof(defs));
+
+    for (i = 0;  i < ncolumn;  i++) {
+        if (!(defs[i].name = get_string(r)) ||
+            get_u32(r, &type) < 0 || get_u32(r, &length) < 0)
+            goto invalid;
+
+        defs[i].type   = type;
+        defs[i].length = length;
+    }
+
+    if (get_u32(r, &nkey) < 0 || nkey > ncolumn)
+        goto invalid;
+
+    for (i = 0;  i < nkey;  i++) {
+        if (get_u32(r, &idx) < 0 || idx >= ncolumn)
+            goto invalid;
+
+        cols[i] = (char *)defs[idx].name;
+    }
+
+    cols[nkey] = NULL;
+
+    if (!(tbl = mdb_table_find((char *)name))) {
+        if (!(tbl = mdb_table_create((char *)name, nkey ? cols : NULL, defs)))
+            return NULL;
+
+        if (add_table(st, tbl) < 0) {
+            mdb_table_drop(tbl);
+            return NULL;
+        }
+
+        tbl->persistent = true;
+    }
+    else {
+        if (!tbl->persistent || tbl->ncolumn != (int)ncolumn) {
+            errno = EEXIST;
+            return NULL;
+        }
+
+        if (nkey && !MDB_TABLE_HAS_INDEX(tbl) &&
+            mdb_table_create_index(tbl, cols) < 0)
+            return NULL;
+    }
+
+    if (get_u32(r, &nsecondary) < 0 || nsecondary > (uint32_t)(r->e - r->p))
+        goto invalid;
+
+    if (nsecondary && !(sxnames = calloc(nsecondary, sizeof(*sxnames)))) {
+        errno = ENOMEM;
+        return NULL;
+    }
+
+    for (i = 0;  i < nsecondary;  i++) {
+        if (!(sxname = get_string(r)) || get_u32(r, &flags) < 0 ||
+            get_u32(r, &n) < 0 || n < 1 || n > ncolumn)
+            goto invalid;
+
+        for (j = 0;  j < n;  j++) {
+            if (get_u32(r, &idx) < 0 || idx >= ncolumn)
+                goto invalid;
+
+            cols[j] = (char *)defs[idx].name;
+        }
+
+        cols[n] = NULL;
+
+        sxnames[i] = sxname;
+
+        if (!find_secondary(tbl, sxname) &&
+            mdb_index_create_secondary(tbl, (char *)sxname, flags, cols) < 0)
+            goto failed;
+    }
+
+    for (k = tbl->nsecondary - 1;  k >= 0;  k--) {
+        for (i = 0;  i < nsecondary;  i++) {
+            if (!strcmp(tbl->secondary[k]->name, sxnames[i]))
+                break;
+        }
+
+        if (i >= nsecondary)
+            mdb_index_drop_secondary(tbl, tbl->secondary[k]->name);
+    }
+
+    free(sxnames);
+
+    return tbl;
+
+ invalid:
+    errno = EINVAL;
+ failed:
+    free(sxnames);
+    return NULL;
+}
+
+static int add_row(mdb_table_t *tbl, const void *data)
+{
+    mdb_row_t *row;
+
+    if (!(row = mdb_row_create(tbl)))
+        return -1;
+
+    memcpy(row->data, data, tbl->dlgh);
+
+    /* the index frees a rejected duplicate itself, anything else is ours */
+    if (mdb_index_insert(tbl, row, 0, 0) < 0) {
+        if (errno == EEXIST) {
+            fprintf(stderr, "murphy-db: dropping duplicate row of table "
+                    "'%s' during recovery\n", tbl->name);
+            return 0;
+        }
+
+        mdb_row_delete(tbl, row, 0, 1);
+        return -1;
+    }
+
+    tbl->nrow++;
+
+    return 0;
+}
+
+static int remove_row(mdb_table_t *tbl, const void *data)
+{
+    mdb_index_t *ix = &tbl->index;
+    mdb_row_t   *row, *r;
+
+    row = NULL;
+
+    if (MDB_INDEX_DEFINED(ix)) {
+        r = mdb_index_get_row(tbl, ix->length, (char *)data + ix->offset);
+
+        if (r && !memcmp(r->data, data, tbl->dlgh))
+            row = r;
+    }
+    else {
+        MDB_DLIST_FOR_EACH(mdb_row_t, link, r, &tbl->rows) {
+            if (!memcmp(r->data, data, tbl->dlgh)) {
+                row = r;
+                break;
+            }
+        }
+    }
+
+    if (!row) {
+        errno = ENOENT;
+        return -1;
+    }
+
+    if (mdb_row_delete(tbl, row, 1, 1) < 0)
+        return -1;
+
+    tbl->nrow--;
+
+    return 0;
+}
+
+static uint32_t checksum(const void *data, size_t size)
+{
+    static uint32_t  table[256];
+    const uint8_t   *p = data;
+    uint32_t         crc, c;
+    int              i, j;
+
+    if (!table[1]) {
+        for (i = 0;  i < 256;  i++) {
+            for (c = i, j = 0;  j < 8;  j++)
+                c = (c & 1) ? 0xedb88320 ^ (c >> 1) : c >> 1;
+            table[i] = c;
+        }
+    }
+
+    for (crc = 0xffffffff;  size > 0;  size--)
+        crc = table[(crc ^ *p++) & 0xff] ^ (crc >> 8);
+
+    return crc ^ 0xffffffff;
+}
+
+static uint64_t now_msec(void)
+{
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+
+    return (uint64_t)ts.tv_sec * 1000 + ts.tv_nsec / 1000000;
+}
+
+/*
+ * Local Variables:
+ * c-basic-offset: 4
+ * indent-tabs-mode: nil
+ * End:
+ *
+ */
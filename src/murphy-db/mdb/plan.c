@@ -0,0 +1,680 @@
+/*
+ * Copyright (c) 2012, Intel Corporation
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met:
+ *
+ *  * Redistributions of source code must retain the above copyright notice,
+ *    this list of conditions and the following disclaimer.
+ *  * Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ *  * Neither the name of Intel Corporation nor the names of its contributors
+ *    may be used to endorse or promote products derived from this software
+ *    without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+#include <stddef.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <stdio.h>
+#include <errno.h>
+
+#define _GNU_SOURCE
+#include <string.h>
+
+#include <murphy-db/assert.h>
+#include <murphy-db/sequence.h>
+#include "plan.h"
+#include "column.h"
+#include "index.h"
+#include "table.h"
+
+/*
+ * The planner splits the condition into terms at the top-level ANDs (AND
+ * has the lowest precedence of all operators) and looks for terms of the
+ * form 'column relop variable' (or 'variable relop column'). Terms which
+ * are parenthesized as a whole are split recursively. Anything else (OR,
+ * NOT, column-to-column comparisons, etc) is left for the filter. Since
+ * the filter always evaluates the full condition, the plan only needs to
+ * produce a superset of the matching rows.
+ *
+ * The collected equalities and bounds are then matched against the
+ * indexes of the table. In the order of preference the plan is
+ *
+ *   - a probe of the unique primary index,
+ *   - a probe of a secondary index (the one with most columns),
+ *   - a prefix scan of the primary or of an ordered secondary index,
+ *   - a range scan of a single column primary or ordered secondary index,
+ *   - a full scan.
+ *
+ * Candidates of a secondary index are collected before the first row is
+ * returned, so that updates of the index columns can't make the scan to
+ * skip or revisit rows.
+ */
+
+static mqi_cond_entry_t *analyze_expression(mdb_table_t *, mqi_cond_entry_t *,
+                                            mdb_plan_t *, int *);
+static void analyze_term(mdb_table_t *, mqi_cond_entry_t *, int,
+                         mdb_plan_t *);
+static mqi_cond_entry_t *skip_term(mqi_cond_entry_t *);
+static int equal_columns(mdb_plan_t *, int, int *);
+static void make_key(mdb_table_t *, mdb_plan_t *, int *, int);
+static mdb_row_t *secondary_next(mdb_plan_t *);
+static void secondary_collect(mdb_plan_t *);
+static int collect_bucket(mdb_plan_t *, mdb_index_bucket_t *);
+static void *variable_key(mqi_variable_t *);
+static int compare_key(mqi_data_type_t, int, void *, void *);
+static int print_columns(mdb_table_t *, int, int *, char *, int);
+
+
+void mdb_plan_create(mdb_table_t *tbl, mqi_cond_entry_t *cond, mdb_plan_t *plan)
+{
+    mdb_index_t           *ix;
+    mdb_secondary_index_t *sx, *best;
+    int                    nterm;
+    int                    neq, bestneq;
+    int                    i;
+
+    MDB_CHECKARG(tbl && plan,);
+
+    memset(plan, 0, offsetof(mdb_plan_t, key));
+
+    plan->type = mdb_plan_full_scan;
+
+    if (!cond)
+        return;
+
+    nterm = 0;
+    analyze_expression(tbl, cond, plan, &nterm);
+
+    plan->nterm = nterm;
+
+    ix  = &tbl->index;
+    neq = 0;
+
+    if (MDB_INDEX_DEFINED(ix)) {
+        if ((neq = equal_columns(plan, ix->ncolumn, ix->columns)) > 0) {
+            make_key(tbl, plan, ix->columns, neq);
+
+            if (plan->keylen <= 0 || plan->keylen > ix->length)
+                return;
+
+            if (neq == ix->ncolumn) {
+                plan->type = mdb_plan_index_probe;
+                return;
+            }
+        }
+    }
+
+    for (i = 0, best = NULL;  i < tbl->nsecondary;  i++) {
+        sx = tbl->secondary[i];
+
+        if (equal_columns(plan, sx->ncolumn, sx->columns) == sx->ncolumn) {
+            if (!best || sx->ncolumn > best->ncolumn)
+                best = sx;
+        }
+    }
+
+    if (best) {
+        plan->type = mdb_plan_index_probe;
+        plan->secondary = best;
+        make_key(tbl, plan, best->columns, best->ncolumn);
+
+        if (plan->keylen <= 0) {
+            plan->type      = mdb_plan_full_scan;
+            plan->secondary = NULL;
+        }
+
+        return;
+    }
+
+    if (neq > 0) {
+        plan->type = mdb_plan_index_range;
+        return;
+    }
+
+    for (i = 0, best = NULL, bestneq = 0;  i < tbl->nsecondary;  i++) {
+        sx = tbl->secondary[i];
+
+        if (!sx->sequence)
+            continue;
+
+        if ((neq = equal_columns(plan, sx->ncolumn, sx->columns)) > bestneq) {
+            best    = sx;
+            bestneq = neq;
+        }
+    }
+
+    if (best) {
+        plan->type = mdb_plan_index_range;
+        plan->secondary = best;
+        make_key(tbl, plan, best->columns, bestneq);
+
+        if (plan->keylen <= 0) {
+            plan->type      = mdb_plan_full_scan;
+            plan->secondary = NULL;
+        }
+
+        return;
+    }
+
+    if (MDB_INDEX_DEFINED(ix) && ix->ncolumn == 1) {
+        i = ix->columns[0];
+
+        if (plan->lo[i] || plan->hi[i]) {
+            plan->type  = mdb_plan_index_range;
+            plan->lower = plan->lo[i];
+            plan->upper = plan->hi[i];
+            return;
+        }
+    }
+
+    for (i = 0;  i < tbl->nsecondary;  i++) {
+        sx = tbl->secondary[i];
+
+        if (!sx->sequence || sx->ncolumn != 1)
+            continue;
+
+        if (plan->lo[sx->columns[0]] || plan->hi[sx->columns[0]]) {
+            plan->type      = mdb_plan_index_range;
+            plan->secondary = sx;
+            plan->lower     = plan->lo[sx->columns[0]];
+            plan->upper     = plan->hi[sx->columns[0]];
+            return;
+        }
+    }
+}
+
+mdb_row_t *mdb_plan_next(mdb_table_t *tbl, mdb_plan_t *plan)
+{
+    mdb_index_t *ix;
+    mdb_row_t   *row;
+    void        *key;
+
+    MDB_CHECKARG(tbl && plan && plan->type != mdb_plan_full_scan, NULL);
+
+    if (plan->done)
+        return NULL;
+
+    if (plan->secondary) {
+        if ((row = secondary_next(plan)))
+            return row;
+
+        mdb_plan_done(tbl, plan);
+
+        return NULL;
+    }
+
+    ix = &tbl->index;
+
+    switch (plan->type) {
+
+    case mdb_plan_index_probe:
+        plan->done = 1;
+        return mdb_index_get_row(tbl, ix->length, plan->key);
+
+    case mdb_plan_index_range:
+        if (plan->neq > 0)
+            key = plan->key;
+        else
+            key = plan->lower ? variable_key(&plan->lower->u.variable) : NULL;
+
+        row = mdb_sequence_iterate_from(ix->sequence, plan->neq > 0 ?
+                                        plan->keylen : ix->length,
+                                        key, &plan->cursor);
+        if (!row)
+            break;
+
+        key = (void *)row->data + ix->offset;
+
+        if (plan->neq > 0) {
+            if (memcmp(key, plan->key, plan->keylen))
+                break;
+        }
+        else if (plan->upper) {
+            if (compare_key(ix->type, ix->length, key,
+                            variable_key(&plan->upper->u.variable)) > 0)
+                break;
+        }
+
+        return row;
+
+    default:
+        break;
+    }
+
+    mdb_plan_done(tbl, plan);
+
+    return NULL;
+}
+
+void mdb_plan_done(mdb_table_t *tbl, mdb_plan_t *plan)
+{
+    mdb_sequence_t *seq;
+
+    MDB_CHECKARG(tbl && plan,);
+
+    if (plan->cursor) {
+        seq = plan->secondary ? plan->secondary->sequence : tbl->index.sequence;
+        mdb_sequence_cursor_destroy(seq, &plan->cursor);
+    }
+
+    free(plan->rows);
+
+    plan->rows = NULL;
+    plan->nrow = plan->size = plan->next = 0;
+    plan->done = 1;
+}
+
+int mdb_plan_print(mdb_table_t *tbl, mdb_plan_t *plan, char *buf, int len)
+{
+#define PRINT(args...)  if (e > p) p += snprintf(p, e-p, args)
+
+    mdb_secondary_index_t *sx;
+    int                    ncolumn;
+    int                   *columns;
+    char                  *p, *e;
+
+    MDB_CHECKARG(tbl && plan && buf && len > 0, 0);
+
+    if ((sx = plan->secondary)) {
+        ncolumn = sx->ncolumn;
+        columns = sx->columns;
+    }
+    else {
+        ncolumn = tbl->index.ncolumn;
+        columns = tbl->index.columns;
+    }
+
+    e = (p = buf) + len;
+    *buf = '\0';
+
+    switch (plan->type) {
+
+    case mdb_plan_index_probe:
+        PRINT("index probe on ");
+        if (sx)
+            PRINT("%s ", sx->name);
+        p += print_columns(tbl, ncolumn, columns, p, e-p);
+        break;
+
+    case mdb_plan_index_range:
+        if (plan->neq > 0) {
+            PRINT("index prefix scan on ");
+            p += print_columns(tbl, plan->neq, columns, p, e-p);
+            PRINT(" of ");
+            if (sx)
+                PRINT("%s ", sx->name);
+            p += print_columns(tbl, ncolumn, columns, p, e-p);
+        }
+        else {
+            PRINT("index range scan on ");
+            if (sx)
+                PRINT("%s ", sx->name);
+            p += print_columns(tbl, ncolumn, columns, p, e-p);
+            PRINT(" with %s", plan->lower ?
+                  (plan->upper ? "lower and upper bound" : "lower bound") :
+                  "upper bound");
+        }
+        break;
+
+    default:
+        PRINT("full scan");
+        break;
+    }
+
+    if (plan->nterm > 0)
+        PRINT(", filter on %d term%s", plan->nterm, plan->nterm>1 ? "s":"");
+
+    PRINT("\n");
+
+    return p - buf;
+
+#undef PRINT
+}
+
+
+static mqi_cond_entry_t *analyze_expression(mdb_table_t      *tbl,
+                                            mqi_cond_entry_t *cond,
+                                            mdb_plan_t       *plan,
+                                            int              *nterm)
+{
+    mqi_cond_entry_t *beg;
+
+    for (;;) {
+        beg  = cond;
+        cond = skip_term(cond);
+
+        analyze_term(tbl, beg, cond - beg, plan);
+
+        if (nterm)
+            (*nterm)++;
+
+        if (cond->u.operator_ == mqi_end)
+            return cond + 1;
+
+        cond++; /* skip mqi_and */
+    }
+}
+
+static void analyze_term(mdb_table_t      *tbl,
+                         mqi_cond_entry_t *term,
+                         int               nentry,
+                         mdb_plan_t       *plan)
+{
+    static mqi_operator_t flipped[mqi_operator_max] = {
+        [ mqi_less ] = mqi_gt,
+        [ mqi_leq  ] = mqi_geq,
+        [ mqi_eq   ] = mqi_eq,
+        [ mqi_geq  ] = mqi_leq,
+        [ mqi_gt   ] = mqi_less,
+    };
+
+    mqi_cond_entry_t *ce, *var;
+    mqi_operator_t    op;
+    mdb_column_t     *col;
+    int               cindex;
+
+    if (nentry < 1)
+        return;
+
+    if (term[0].type == mqi_operator && term[0].u.operator_ == mqi_begin) {
+        /* a parenthesized term: split it if the group spans all of it */
+        if (skip_term(term + 1) + 1 == term + nentry)
+            analyze_expression(tbl, term + 1, plan, NULL);
+        return;
+    }
+
+    if (nentry != 3)
+        return;
+
+    ce = term + 1;
+
+    if (ce->type != mqi_operator)
+        return;
+
+    op = ce->u.operator_;
+
+    if (term[0].type == mqi_column && term[2].type == mqi_variable) {
+        cindex = term[0].u.column;
+        var    = term + 2;
+    }
+    else if (term[0].type == mqi_variable && term[2].type == mqi_column) {
+        cindex = term[2].u.column;
+        var    = term;
+        op     = flipped[op];
+    }
+    else
+        return;
+
+    if (cindex < 0 || cindex >= tbl->ncolumn)
+        return;
+
+    col = tbl->columns + cindex;
+
+    if (col->type != var->u.variable.type || !variable_key(&var->u.variable))
+        return;
+
+    switch (col->type) {
+    case mqi_varchar:
+    case mqi_integer:
+    case mqi_unsignd:
+        break;
+    default:
+        return;
+    }
+
+    if (op == mqi_eq)
+        plan->eq[cindex] = var;
+
+    /* an equality bounds the range in both directions */
+    if (op == mqi_eq || op == mqi_geq || op == mqi_gt)
+        plan->lo[cindex] = var;
+    if (op == mqi_eq || op == mqi_leq || op == mqi_less)
+        plan->hi[cindex] = var;
+}
+
+static mqi_cond_entry_t *skip_term(mqi_cond_entry_t *cond)
+{
+    int depth = 0;
+
+    for (;;  cond++) {
+        if (cond->type != mqi_operator)
+            continue;
+
+        switch (cond->u.operator_) {
+        case mqi_begin:
+            depth++;
+            break;
+        case mqi_end:
+            if (depth-- == 0)
+                return cond;
+            break;
+        case mqi_and:
+            if (depth == 0)
+                return cond;
+            break;
+        default:
+            break;
+        }
+    }
+}
+
+static int equal_columns(mdb_plan_t *plan, int ncolumn, int *columns)
+{
+    int i;
+
+    for (i = 0;  i < ncolumn && plan->eq[columns[i]];  i++)
+        ;
+
+    return i;
+}
+
+static void make_key(mdb_table_t *tbl, mdb_plan_t *plan, int *columns,int neq)
+{
+    mdb_index_t       *ix = &tbl->index;
+    mdb_column_t      *col;
+    void              *value;
+    char              *str;
+    int                length, offset;
+    int                i;
+
+    /*
+     * the primary key is a slice of the row data while secondary keys are
+     * the concatenation of the column values. The key buffer has no
+     * alignment guarantees, so copy the values bytewise.
+     */
+    length = plan->secondary ? plan->secondary->length : ix->length;
+
+    if (length <= 0 || length > (int)sizeof(plan->key)) {
+        plan->keylen = -1;
+        return;
+    }
+
+    memset(plan->key, 0, length);
+
+    for (i = 0, offset = 0;  i < neq;  i++) {
+        col   = tbl->columns + columns[i];
+        value = plan->eq[columns[i]]->u.variable.v.generic;
+
+        if (!plan->secondary)
+            offset = col->offset - ix->offset;
+
+        if (offset < 0 || offset + col->length > length) {
+            plan->keylen = -1;
+            return;
+        }
+
+        switch (col->type) {
+        case mqi_varchar:
+            if ((str = *(char **)value) != NULL)
+                strncpy(plan->key + offset, str, col->length - 1);
+            break;
+        case mqi_integer:
+        case mqi_unsignd:
+        case mqi_floating:
+        case mqi_blob:
+            memcpy(plan->key + offset, value, col->length);
+            break;
+        default:
+            break;
+        }
+
+        offset += col->length;
+    }
+
+    plan->neq    = neq;
+    plan->keylen = offset;
+}
+
+static mdb_row_t *secondary_next(mdb_plan_t *plan)
+{
+    if (!plan->rows)
+        secondary_collect(plan);
+
+    if (plan->next >= plan->nrow)
+        return NULL;
+
+    return plan->rows[plan->next++];
+}
+
+static void secondary_collect(mdb_plan_t *plan)
+{
+    mdb_secondary_index_t *sx = plan->secondary;
+    mdb_index_bucket_t    *bucket;
+    void                  *key, *upper;
+    int                    klen;
+
+    if (plan->type == mdb_plan_index_probe) {
+        if ((bucket = mdb_index_get_bucket(sx, plan->key)))
+            collect_bucket(plan, bucket);
+        return;
+    }
+
+    if (plan->neq > 0) {
+        key  = plan->key;
+        klen = plan->keylen;
+    }
+    else {
+        key  = plan->lower ? variable_key(&plan->lower->u.variable) : NULL;
+        klen = sx->length;
+    }
+
+    upper = plan->upper ? variable_key(&plan->upper->u.variable) : NULL;
+
+    while ((bucket = mdb_sequence_iterate_from(sx->sequence, klen, key,
+                                               &plan->cursor)))
+    {
+        if (plan->neq > 0) {
+            if (memcmp(bucket->key, plan->key, plan->keylen))
+                break;
+        }
+        else if (upper) {
+            if (compare_key(sx->type, sx->length, bucket->key, upper) > 0)
+                break;
+        }
+
+        if (collect_bucket(plan, bucket) < 0)
+            break;
+    }
+
+    if (plan->cursor)
+        mdb_sequence_cursor_destroy(sx->sequence, &plan->cursor);
+}
+
+static int collect_bucket(mdb_plan_t *plan, mdb_index_bucket_t *bucket)
+{
+    mdb_row_t **rows;
+    int         size;
+
+    if (plan->nrow + bucket->nrow > plan->size) {
+        for (size = plan->size ? plan->size : 16;
+             size < plan->nrow + bucket->nrow;
+             size *= 2)
+            ;
+
+        if (!(rows = realloc(plan->rows, sizeof(mdb_row_t *) * size))) {
+            errno = ENOMEM;
+            return -1;
+        }
+
+        plan->rows = rows;
+        plan->size = size;
+    }
+
+    memcpy(plan->rows + plan->nrow, bucket->rows,
+           sizeof(mdb_row_t *) * bucket->nrow);
+
+    plan->nrow += bucket->nrow;
+
+    return 0;
+}
+
+static void *variable_key(mqi_variable_t *var)
+{
+    if (!var->v.generic)
+        return NULL;
+
+    if (var->type == mqi_varchar)
+        return *var->v.varchar;
+
+    return var->v.generic;
+}
+
+static int compare_key(mqi_data_type_t type, int length, void *key1,void *key2)
+{
+    switch (type) {
+    case mqi_varchar: return mqi_data_compare_string(length, key1, key2);
+    case mqi_integer: return mqi_data_compare_integer(length, key1, key2);
+    case mqi_unsignd: return mqi_data_compare_unsignd(length, key1, key2);
+    default:          return mqi_data_compare_blob(length, key1, key2);
+    }
+}
+
+static int print_columns(mdb_table_t *tbl,
+                         int          ncolumn,
+                         int         *columns,
+                         char        *buf,
+                         int          len)
+{
+#define PRINT(args...)  if (e > p) p += snprintf(p, e-p, args)
+
+    const char  *sep;
+    char        *p, *e;
+    int          i;
+
+    e = (p = buf) + len;
+
+    PRINT("(");
+
+    for (i = 0, sep = "";  i < ncolumn;  i++, sep = ",")
+        PRINT("%s%s", sep, tbl->columns[columns[i]].name);
+
+    PRINT(")");
+
+    return p - buf;
+
+#undef PRINT
+}
+
+/*
+ * Local Variables:
+ * c-basic-offset: 4
+ * indent-tabs-mode: nil
+ * End:
+ *
+ */
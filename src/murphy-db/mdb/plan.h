@@ -0,0 +1,87 @@
+/*
+ * Copyright (c) 2012, Intel Corporation
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met:
+ *
+ *  * Redistributions of source code must retain the above copyright notice,
+ *    this list of conditions and the following disclaimer.
+ *  * Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ *  * Neither the name of Intel Corporation nor the names of its contributors
+ *    may be used to endorse or promote products derived from this software
+ *    without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+#ifndef __MDB_PLAN_H__
+#define __MDB_PLAN_H__
+
+#include <murphy-db/mqi-types.h>
+#include <murphy-db/mdb.h>
+
+#include "index.h"
+#include "row.h"
+
+/*
+ * A query plan tells how to find the candidate rows for a condition.
+ * Candidates are always a superset of the matching rows, ie. the full
+ * condition still needs to be evaluated for every returned row.
+ */
+
+typedef enum {
+    mdb_plan_full_scan = 0,     /* iterate over every row */
+    mdb_plan_index_probe,       /* look up the row(s) by the full key */
+    mdb_plan_index_range,       /* scan a range of an ordered index */
+} mdb_plan_type_t;
+
+typedef struct {
+    mdb_plan_type_t    type;
+    mdb_secondary_index_t *secondary;   /* index to use, NULL for primary */
+    int                nterm;           /* number of top-level AND terms */
+    int                neq;             /* index columns bound by equality */
+    mqi_cond_entry_t  *eq[MQI_COLUMN_MAX]; /* equality values per column */
+    mqi_cond_entry_t  *lo[MQI_COLUMN_MAX]; /* lower bounds per column */
+    mqi_cond_entry_t  *hi[MQI_COLUMN_MAX]; /* upper bounds per column */
+    mqi_cond_entry_t  *lower;           /* lower bound value, if any */
+    mqi_cond_entry_t  *upper;           /* upper bound value, if any */
+    int                keylen;          /* length of probe or prefix key */
+    /* execution state */
+    int                done;            /* no more candidates */
+    void              *cursor;          /* sequence cursor for scans */
+    mdb_row_t        **rows;            /* candidates of a secondary index */
+    int                nrow;
+    int                size;
+    int                next;
+    char               key[MDB_INDEX_LENGTH_MAX];
+} mdb_plan_t;
+
+
+void mdb_plan_create(mdb_table_t *, mqi_cond_entry_t *, mdb_plan_t *);
+mdb_row_t *mdb_plan_next(mdb_table_t *, mdb_plan_t *);
+void mdb_plan_done(mdb_table_t *, mdb_plan_t *);
+int mdb_plan_print(mdb_table_t *, mdb_plan_t *, char *, int);
+
+
+#endif /* __MDB_PLAN_H__ */
+
+/*
+ * Local Variables:
+ * c-basic-offset: 4
+ * indent-tabs-mode: nil
+ * End:
+ *
+ */
@@ -0,0 +1,225 @@
+/*
+ * Copyright (c) 2012, Intel Corporation
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met:
+ *
+ *  * Redistributions of source code must retain the above copyright notice,
+ *    this list of conditions and the following disclaimer.
+ *  * Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ *  * Neither the name of Intel Corporation nor the names of its contributors
+ *    may be used to endorse or promote products derived from this software
+ *    without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+#include <stdint.h>
+#include <stdlib.h>
+#include <stdarg.h>
+#include <stdio.h>
+#include <errno.h>
+#include <string.h>
+
+#include <murphy-db/assert.h>
+#include "pool.h"
+
+#define POOL_CHUNK_SIZE   4096      /* max. size of a chunk */
+#define POOL_CHUNK_MIN    8         /* min. number of objects per chunk */
+#define POOL_ALIGN        8         /* object alignment */
+
+/*
+ * Fixed size object pools for the small objects mdb creates and destroys
+ * at a high rate (rows, log entries, hash entries). Objects are carved out
+ * of chunks and recycled through a free list. Every table has a pool of
+ * its own for its rows and most tables are small, so we start with a small
+ * chunk and double the capacity of the pool with every new chunk until
+ * chunks reach POOL_CHUNK_SIZE.
+ *
+ * Freed objects go back to the free list of their pool, never to malloc.
+ * Chunks are not returned, not even empty ones, until the pool itself is
+ * destroyed: a row pool keeps its chunks until its table is dropped and
+ * the shared pools of log entries, change records and hash entries keep
+ * theirs for the lifetime of the process. The footprint of a pool thus
+ * follows the high-water mark of its live objects, and because of the
+ * doubling it can be up to twice that.
+ */
+
+typedef struct pool_chunk_s pool_chunk_t;
+
+struct pool_chunk_s {
+    pool_chunk_t *next;
+    uint64_t      data[0];          /* must be POOL_ALIGN aligned */
+};
+
+typedef struct pool_free_s pool_free_t;
+
+struct pool_free_s {
+    pool_free_t  *next;
+};
+
+static MDB_DLIST_HEAD(pools);
+
+static size_t obj_size(mdb_pool_t *);
+static int pool_grow(mdb_pool_t *);
+
+
+void mdb_pool_init(mdb_pool_t *pool, size_t objsize, const char *fmt, ...)
+{
+    va_list ap;
+
+    memset(pool, 0, sizeof(*pool));
+
+    va_start(ap, fmt);
+    vsnprintf(pool->name, sizeof(pool->name), fmt, ap);
+    va_end(ap);
+
+    pool->objsize = objsize;
+}
+
+void mdb_pool_destroy(mdb_pool_t *pool)
+{
+    pool_chunk_t *chunk, *next;
+
+    if (pool) {
+        for (chunk = pool->chunks;  chunk;  chunk = next) {
+            next = chunk->next;
+            free(chunk);
+        }
+
+        if (pool->link.next)
+            MDB_DLIST_UNLINK(mdb_pool_t, link, pool);
+
+        pool->link.prev = pool->link.next = NULL;
+        pool->free   = NULL;
+        pool->chunks = NULL;
+        pool->nobj   = 0;
+        pool->nchunk = 0;
+        pool->nslot  = 0;
+    }
+}
+
+void *mdb_pool_alloc(mdb_pool_t *pool)
+{
+    pool_free_t *obj;
+
+    if (!pool->free && pool_grow(pool) < 0)
+        return NULL;
+
+    obj = pool->free;
+    pool->free = obj->next;
+
+    if (++pool->nobj > pool->nmax)
+        pool->nmax = pool->nobj;
+
+    memset(obj, 0, obj_size(pool));
+
+    return obj;
+}
+
+/* the object is only put on the free list, its chunk is never released */
+void mdb_pool_free(mdb_pool_t *pool, void *ptr)
+{
+    pool_free_t *obj = ptr;
+
+    if (obj) {
+        obj->next  = pool->free;
+        pool->free = obj;
+        pool->nobj--;
+    }
+}
+
+int mdb_pool_get_stats(mdb_pool_stats_t *stats, int size)
+{
+    mdb_pool_t *pool;
+    int         cnt;
+
+    MDB_CHECKARG(stats || !size, -1);
+
+    cnt = 0;
+
+    MDB_DLIST_FOR_EACH(mdb_pool_t, link, pool, &pools) {
+        if (cnt < size) {
+            stats[cnt].name    = pool->name;
+            stats[cnt].objsize = obj_size(pool);
+            stats[cnt].nobj    = pool->nobj;
+            stats[cnt].nmax    = pool->nmax;
+            stats[cnt].nchunk  = pool->nchunk;
+            stats[cnt].nslot   = pool->nslot;
+        }
+        cnt++;
+    }
+
+    return cnt;
+}
+
+
+static size_t obj_size(mdb_pool_t *pool)
+{
+    size_t size = pool->objsize;
+
+    if (size < sizeof(pool_free_t))
+        size = sizeof(pool_free_t);
+
+    return (size + (POOL_ALIGN - 1)) & ~(size_t)(POOL_ALIGN - 1);
+}
+
+static int pool_grow(mdb_pool_t *pool)
+{
+    pool_chunk_t *chunk;
+    pool_free_t  *obj;
+    size_t        size, max, n;
+    int           i;
+
+    size = obj_size(pool);
+    max  = (POOL_CHUNK_SIZE - sizeof(pool_chunk_t)) / size;
+    n    = pool->nslot ? pool->nslot : POOL_CHUNK_MIN;
+
+    if (n > max)
+        n = max;
+
+    if (n < POOL_CHUNK_MIN)
+        n = POOL_CHUNK_MIN;
+
+    if (!(chunk = malloc(sizeof(pool_chunk_t) + n * size))) {
+        errno = ENOMEM;
+        return -1;
+    }
+
+    chunk->next  = pool->chunks;
+    pool->chunks = chunk;
+    pool->nchunk++;
+    pool->nslot += n;
+
+    for (i = (int)n - 1;  i >= 0;  i--) {
+        obj = (pool_free_t *)((char *)chunk->data + i * size);
+        obj->next  = pool->free;
+        pool->free = obj;
+    }
+
+    if (!pool->link.next)
+        MDB_DLIST_APPEND(mdb_pool_t, link, pool, &pools);
+
+    return 0;
+}
+
+/*
+ * Local Variables:
+ * c-basic-offset: 4
+ * indent-tabs-mode: nil
+ * End:
+ *
+ */
@@ -0,0 +1,69 @@
+/*
+ * Copyright (c) 2012, Intel Corporation
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met:
+ *
+ *  * Redistributions of source code must retain the above copyright notice,
+ *    this list of conditions and the following disclaimer.
+ *  * Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ *  * Neither the name of Intel Corporation nor the names of its contributors
+ *    may be used to endorse or promote products derived from this software
+ *    without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+#ifndef __MDB_POOL_H__
+#define __MDB_POOL_H__
+
+#include <murphy-db/list.h>
+#include <murphy-db/mdb.h>
+
+#define MDB_POOL_NAME_MAX  48
+
+#define MDB_POOL_INIT(name, type)                                       \
+    { { NULL, NULL }, name, sizeof(type), NULL, NULL, 0, 0, 0, 0 }
+
+typedef struct mdb_pool_s mdb_pool_t;
+
+struct mdb_pool_s {
+    mdb_dlist_t  link;                    /* to the list of all pools */
+    char         name[MDB_POOL_NAME_MAX];
+    size_t       objsize;
+    void        *free;                    /* list of free objects */
+    void        *chunks;                  /* list of allocated chunks */
+    size_t       nobj;                    /* objects in use */
+    size_t       nmax;                    /* max. objects ever in use */
+    size_t       nchunk;                  /* number of allocated chunks */
+    size_t       nslot;                   /* number of object slots */
+};
+
+void mdb_pool_init(mdb_pool_t *, size_t, const char *, ...)
+    __attribute__ ((format (printf, 3, 4)));
+void mdb_pool_destroy(mdb_pool_t *);
+void *mdb_pool_alloc(mdb_pool_t *);
+void mdb_pool_free(mdb_pool_t *, void *);
+
+#endif /* __MDB_POOL_H__ */
+
+/*
+ * Local Variables:
+ * c-basic-offset: 4
+ * indent-tabs-mode: nil
+ * End:
+ *
+ */
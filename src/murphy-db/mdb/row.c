@@ -51,10 +51,8 @@ mdb_row_t *mdb_row_create(mdb_table_t *tbl)
 
     MDB_CHECKARG(tbl, NULL);
 
-    if (!(row = calloc(1, sizeof(mdb_row_t) + tbl->dlgh))) {
-        errno = ENOMEM;
+    if (!(row = mdb_pool_alloc(&tbl->rowpool)))
         return NULL;
-    }
 
     MDB_DLIST_APPEND(mdb_row_t, link, row, &tbl->rows);
 
@@ -67,10 +65,8 @@ mdb_row_t *mdb_row_duplicate(mdb_table_t *tbl, mdb_row_t *row)
 
     MDB_CHECKARG(tbl && row, NULL);
 
-    if (!(dup = calloc(1, sizeof(mdb_row_t) + tbl->dlgh))) {
-        errno = ENOMEM;
+    if (!(dup = mdb_pool_alloc(&tbl->rowpool)))
         return NULL;
-    }
 
     MDB_DLIST_INIT(dup->link);
     memcpy(dup->data, row->data, tbl->dlgh);
@@ -85,9 +81,7 @@ int mdb_row_delete(mdb_table_t *tbl,
 {
     int sts = 0;
 
-    (void)tbl;
-
-    MDB_CHECKARG(row, -1);
+    MDB_CHECKARG(tbl && row, -1);
 
     if (index_update && mdb_index_delete(tbl, row) < 0)
         sts = -1;
@@ -96,7 +90,7 @@ int mdb_row_delete(mdb_table_t *tbl,
         MDB_DLIST_UNLINK(mdb_row_t, link, row);
 
     if (free_it)
-        free(row);
+        mdb_pool_free(&tbl->rowpool, row);
     else
         MDB_DLIST_INIT(row->link);
 
@@ -41,33 +41,73 @@
 #endif
 
 #include <murphy-db/assert.h>
+#include <murphy-db/list.h>
 #include <murphy-db/sequence.h>
 
-typedef struct mdb_sequence_entry_s {
-    void         *key;
-    void         *data;
-} sequence_entry_t;
+#define SEQUENCE_LEVEL_MAX  16      /* enough for 4^16 entries */
+
+/*
+ * Sequences are kept in a skip list with a branching factor of 4, so both
+ * insertion and deletion are O(log n) on average.
+ *
+ * Active iterators are registered with the sequence. Whenever an entry is
+ * deleted, every cursor parked at it is advanced to its successor, so it is
+ * safe to delete (or update) entries while iterating. Every entry carries
+ * an insertion stamp and cursors skip entries that were inserted after the
+ * iteration was started. This keeps an iteration from visiting the same
+ * row twice when an update moves it forward in the sequence.
+ */
+
+#define STAMP_IS_NEWER(stamp, ref) ((int32_t)((stamp) - (ref)) > 0)
+
+typedef struct sequence_entry_s sequence_entry_t;
+
+struct sequence_entry_s {
+    void             *key;
+    void             *data;
+    uint32_t          stamp;        /* insertion stamp */
+    int               nlevel;       /* number of forward links */
+    sequence_entry_t *next[0];      /* forward links */
+};
+
+typedef struct {
+    mdb_dlist_t       link;         /* to list of active cursors */
+    sequence_entry_t *entry;        /* entry to return next */
+    uint32_t          stamp;        /* stamp at the start of iteration */
+} sequence_cursor_t;
 
 
 struct mdb_sequence_s {
-    int                     alloc;
     mdb_sequence_compare_t  scomp;
     mdb_sequence_print_t    sprint;
 #ifdef SEQUENCE_STATISTICS
     int                     max_entry;
 #endif
-    int                     size;
     int                     nentry;
-    sequence_entry_t       *entries;
+    int                     nlevel;     /* highest level currently in use */
+    uint32_t                stamp;      /* last insertion stamp */
+    uint32_t                seed;       /* state for level generation */
+    mdb_dlist_t             cursors;    /* active cursors */
+    sequence_entry_t       *head;       /* list head with all levels */
 };
 
 
+static sequence_cursor_t empty_cursor;
+
+static void sequence_reset(mdb_sequence_t *);
+static int random_level(mdb_sequence_t *);
+static sequence_entry_t *find_entry(mdb_sequence_t *, int, void *,
+                                    sequence_entry_t **, int);
+static void cursor_destroy(sequence_cursor_t *);
+
+
 
 mdb_sequence_t *mdb_sequence_table_create(int                    alloc,
                                           mdb_sequence_compare_t scomp,
                                           mdb_sequence_print_t   sprint)
 {
     mdb_sequence_t *seq;
+    size_t          size;
 
     MDB_CHECKARG(scomp && sprint && alloc > 0 && alloc < 65536, NULL);
 
@@ -76,18 +116,39 @@ mdb_sequence_t *mdb_sequence_table_create(int                    alloc,
         return NULL;
     }
 
-    seq->alloc  = alloc;
+    size = sizeof(sequence_entry_t) + sizeof(sequence_entry_t *) *
+        SEQUENCE_LEVEL_MAX;
+
+    if (!(seq->head = calloc(1, size))) {
+        free(seq);
+        errno = ENOMEM;
+        return NULL;
+    }
+
     seq->scomp  = scomp;
     seq->sprint = sprint;
+    seq->nlevel = 1;
+    seq->seed   = (uint32_t)((uintptr_t)seq >> 4) | 1;
+
+    seq->head->nlevel = SEQUENCE_LEVEL_MAX;
+
+    MDB_DLIST_INIT(seq->cursors);
 
     return seq;
 }
 
 int mdb_sequence_table_destroy(mdb_sequence_t *seq)
 {
+    sequence_cursor_t *cursor, *n;
+
     MDB_CHECKARG(seq, -1);
 
-    free(seq->entries);
+    sequence_reset(seq);
+
+    MDB_DLIST_FOR_EACH_SAFE(sequence_cursor_t, link, cursor,n, &seq->cursors)
+        MDB_DLIST_UNLINK(sequence_cursor_t, link, cursor);
+
+    free(seq->head);
     free(seq);
 
     return 0;
@@ -104,11 +165,7 @@ int mdb_sequence_table_reset(mdb_sequence_t *seq)
 {
     MDB_CHECKARG(seq, -1);
 
-    free(seq->entries);
-
-    seq->size    = 0;
-    seq->nentry  = 0;
-    seq->entries = NULL;
+    sequence_reset(seq);
 
     return 0;
 }
@@ -125,9 +182,10 @@ int mdb_sequence_table_print(mdb_sequence_t *seq, char *buf, int len)
     e = (p = buf) + len;
     *buf = '\0';
 
-    for (i = 0;  i < seq->nentry && p < e;  i++) {
-        entry = seq->entries + i;
-
+    for (i = 0, entry = seq->head->next[0];
+         entry && p < e;
+         i++, entry = entry->next[0])
+    {
         seq->sprint(entry->key, key, sizeof(key));
 
         p += snprintf(p, e-p, "   %05d: '%s' / %p\n", i, key, entry->data);
@@ -138,57 +196,42 @@ int mdb_sequence_table_print(mdb_sequence_t *seq, char *buf, int len)
 
 int mdb_sequence_add(mdb_sequence_t *seq, int klen, void *key, void *data)
 {
+    sequence_entry_t *update[SEQUENCE_LEVEL_MAX];
     sequence_entry_t *entry;
-    int               nentry;
-    size_t            old_size;
-    size_t            length;
-    int               cmp;
-    int               min, max, i;
+    int               nlevel;
+    int               i;
 
     MDB_CHECKARG(seq && key && data, -1);
 
-    nentry = seq->nentry++;
-
-    if ((nentry + 1) > seq->size) {
-        old_size = seq->size;
-        seq->size += seq->alloc;
-        length = sizeof(sequence_entry_t) * seq->size;
+    find_entry(seq, klen, key, update, 1);
 
-        if (!(seq->entries = realloc(seq->entries, length))) {
-            seq->nentry = 0;
-            errno = ENOMEM;
-            return 0;
-        }
+    nlevel = random_level(seq);
 
+    entry = malloc(sizeof(sequence_entry_t) +
+                   sizeof(sequence_entry_t *) * nlevel);
 
-        memset(seq->entries + old_size, 0, 
-               length - (old_size * sizeof(sequence_entry_t)));
+    if (!entry) {
+        errno = ENOMEM;
+        return -1;
     }
 
-    for (min = 0,  i = (max = nentry)/2;   ;    i = (min+max)/2) {
-        if (!(cmp = seq->scomp(klen, key, seq->entries[i].key)))
-            break;
+    for (i = seq->nlevel;  i < nlevel;  i++)
+        update[i] = seq->head;
 
-        if (i == min) {
-            if (cmp > 0)
-                i = max;
-            break;
-        }
+    if (nlevel > seq->nlevel)
+        seq->nlevel = nlevel;
 
-        if (cmp < 0)
-            max = i;
-        else
-            min = i;
-    }
-
-    entry = seq->entries + i;
+    entry->key    = key;
+    entry->data   = data;
+    entry->stamp  = ++seq->stamp;
+    entry->nlevel = nlevel;
 
-    if (i < nentry) {
-        memmove(entry+1, entry, sizeof(sequence_entry_t) * (nentry - i));
+    for (i = 0;  i < nlevel;  i++) {
+        entry->next[i] = update[i]->next[i];
+        update[i]->next[i] = entry;
     }
 
-    entry->key  = key;
-    entry->data = data;
+    seq->nentry++;
 
 #ifdef SEQUENCE_STATISTICS
     if (seq->nentry > seq->max_entry)
@@ -200,68 +243,34 @@ int mdb_sequence_add(mdb_sequence_t *seq, int klen, void *key, void *data)
 
 void *mdb_sequence_delete(mdb_sequence_t *seq, int klen, void *key)
 {
-    sequence_entry_t *entry;
-    int               i;
-    int               min, max;
-    int               cmp;
-    int               found;
-    void             *data;
-    size_t            length;
+    sequence_entry_t  *update[SEQUENCE_LEVEL_MAX];
+    sequence_entry_t  *entry;
+    sequence_cursor_t *cursor;
+    void              *data;
+    int                i;
 
     MDB_CHECKARG(seq && key, NULL);
 
-    for (found = 0, min = 0, i = (max = seq->nentry)/2;  ;  i = (min+max)/2) {
-        entry = seq->entries + i;
-
-        if (!(cmp = seq->scomp(klen, key, entry->key))) {
-            found = 1;
-            break;
-        }
-
-        if (i == min) {
-            if (i != max) {
-                entry = seq->entries + max;
-                if (!seq->scomp(klen, key, entry->key))
-                    found = 1;
-            }
-            break;
-        }
-
-        if (cmp < 0)
-            max = i;
-        else
-            min = i;
-    }
-
-    if (!found) {
+    if (!(entry = find_entry(seq, klen, key, update, 0))) {
         errno = ENOENT;
         return NULL;
     }
 
-    data = entry->data;
+    for (i = 0;  i < entry->nlevel;  i++)
+        update[i]->next[i] = entry->next[i];
 
-    if (--seq->nentry <= 0) {
-        free(seq->entries);
+    while (seq->nlevel > 1 && !seq->head->next[seq->nlevel - 1])
+        seq->nlevel--;
 
-        seq->size    = 0;
-        seq->nentry  = 0;
-        seq->entries = NULL;
+    MDB_DLIST_FOR_EACH(sequence_cursor_t, link, cursor, &seq->cursors) {
+        if (cursor->entry == entry)
+            cursor->entry = entry->next[0];
     }
-    else {
-        if (i < seq->nentry) {
-            length = sizeof(sequence_entry_t) * (seq->nentry - i);
-            memmove(entry, entry+1, length);
-        }
 
-        if (seq->nentry <= (seq->size - seq->alloc)) {
-            length = sizeof(sequence_entry_t) * (seq->size -= seq->alloc);
+    data = entry->data;
+    seq->nentry--;
 
-            if (!(seq->entries = realloc(seq->entries, length))) {
-                seq->nentry = 0;
-                errno = ENOMEM;
-            }
-        }
-    }
+    free(entry);
 
     return data;
 }
@@ -270,44 +279,53 @@ void *mdb_sequence_delete(mdb_sequence_t *seq, int klen, void *key)
 
 void *mdb_sequence_iterate(mdb_sequence_t *seq, void **cursor_ptr)
 {
-    typedef struct {
-        int   index;
-        int   nentry;
-        void *entries[];
-    } cursor_t;
-
-    static cursor_t   empty_cursor;
+    return mdb_sequence_iterate_from(seq, 0, NULL, cursor_ptr);
+}
 
-    size_t            length;
-    cursor_t         *cursor;
-    int               i;
+void *mdb_sequence_iterate_from(mdb_sequence_t *seq, int klen, void *key,
+                                void **cursor_ptr)
+{
+    sequence_entry_t  *update[SEQUENCE_LEVEL_MAX];
+    sequence_cursor_t *cursor;
+    sequence_entry_t  *entry;
 
     MDB_CHECKARG(seq && cursor_ptr, NULL);
 
     if (!(cursor = *cursor_ptr)) {
-        length = sizeof(cursor_t) + sizeof(void *) * seq->nentry;
-
-        if (!(cursor = malloc(length)))
+        if (!(cursor = calloc(1, sizeof(sequence_cursor_t))))
             return NULL;
 
-        cursor->index = 0;
-        cursor->nentry = seq->nentry;
+        if (!key)
+            cursor->entry = seq->head->next[0];
+        else {
+            find_entry(seq, klen, key, update, 0);
+            cursor->entry = update[0]->next[0];
+        }
+
+        cursor->stamp = seq->stamp;
 
-        for (i = 0;  i < seq->nentry;  i++)
-            cursor->entries[i] = seq->entries[i].data;
+        MDB_DLIST_APPEND(sequence_cursor_t, link, cursor, &seq->cursors);
 
         *cursor_ptr = cursor;
     }
 
-    if (cursor->index >= cursor->nentry) {
-        if (*cursor_ptr != &empty_cursor) {
-            *cursor_ptr = &empty_cursor;
-            free(cursor);
-        }
+    if (cursor == &empty_cursor)
+        return NULL;
+
+    for (entry = cursor->entry;  entry;  entry = entry->next[0]) {
+        if (!STAMP_IS_NEWER(entry->stamp, cursor->stamp))
+            break;
+    }
+
+    if (!entry) {
+        *cursor_ptr = &empty_cursor;
+        cursor_destroy(cursor);
         return NULL;
     }
 
-    return (void *)cursor->entries[cursor->index++];
+    cursor->entry = entry->next[0];
+
+    return entry->data;
 }
 
 
@@ -315,10 +333,98 @@ void mdb_sequence_cursor_destroy(mdb_sequence_t *seq, void **cursor)
 {
     (void)seq;
 
-    if (cursor)
-        free(*cursor);
+    if (cursor) {
+        cursor_destroy(*cursor);
+        *cursor = NULL;
+    }
+}
+
+
+static void sequence_reset(mdb_sequence_t *seq)
+{
+    sequence_entry_t  *entry, *next;
+    sequence_cursor_t *cursor;
+    int                i;
+
+    for (entry = seq->head->next[0];  entry;  entry = next) {
+        next = entry->next[0];
+        free(entry);
+    }
+
+    for (i = 0;  i < SEQUENCE_LEVEL_MAX;  i++)
+        seq->head->next[i] = NULL;
+
+    MDB_DLIST_FOR_EACH(sequence_cursor_t, link, cursor, &seq->cursors)
+        cursor->entry = NULL;
+
+    seq->nlevel = 1;
+    seq->nentry = 0;
 }
 
+static int random_level(mdb_sequence_t *seq)
+{
+    uint32_t r;
+    int      nlevel;
+
+    /* xorshift32 */
+    r  = seq->seed;
+    r ^= r << 13;
+    r ^= r >> 17;
+    r ^= r << 5;
+    seq->seed = r;
+
+    for (nlevel = 1;  nlevel < SEQUENCE_LEVEL_MAX;  nlevel++, r >>= 2) {
+        if (r & 3)
+            break;
+    }
+
+    return nlevel;
+}
+
+static sequence_entry_t *find_entry(mdb_sequence_t    *seq,
+                                    int                klen,
+                                    void              *key,
+                                    sequence_entry_t **update,
+                                    int                after)
+{
+    sequence_entry_t *entry, *next;
+    int               cmp;
+    int               i;
+
+    /*
+     * Find the predecessors of key on every level. With after set, go
+     * past entries with an equal key, ie. find the insertion point after
+     * all duplicates.
+     */
+
+    for (i = seq->nlevel - 1, entry = seq->head;  i >= 0;  i--) {
+        while ((next = entry->next[i])) {
+            cmp = seq->scomp(klen, next->key, key);
+
+            if (cmp > 0 || (cmp == 0 && !after))
+                break;
+
+            entry = next;
+        }
+
+        update[i] = entry;
+    }
+
+    next = entry->next[0];
+
+    if (after || !next || seq->scomp(klen, next->key, key) != 0)
+        return NULL;
+
+    return next;
+}
+
+static void cursor_destroy(sequence_cursor_t *cursor)
+{
+    if (cursor && cursor != &empty_cursor) {
+        MDB_DLIST_UNLINK(sequence_cursor_t, link, cursor);
+        free(cursor);
+    }
+}
 
 
 
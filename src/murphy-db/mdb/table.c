@@ -42,7 +42,9 @@
 #include "row.h"
 #include "table.h"
 #include "cond.h"
+#include "plan.h"
 #include "transaction.h"
+#include "persist.h"
 
 #define TABLE_STATISTICS
 
@@ -50,6 +52,7 @@
 typedef struct {
     int          indexed;
     void        *cursor;
+    mdb_plan_t  *plan;          /* query plan, if any */
 } table_iterator_t;
 
 
@@ -58,6 +61,7 @@ static int         table_count;
 
 static void destroy_table(mdb_table_t *);
 static mdb_row_t *table_iterator(mdb_table_t *, table_iterator_t *);
+static void table_iterator_done(mdb_table_t *, table_iterator_t *);
 #if 0
 static int table_print_info(mdb_table_t *, char *, int);
 #endif
@@ -177,6 +181,8 @@ mdb_table_t *mdb_table_create(char *name,
     tbl->columns   = columns;
     tbl->dlgh      = dlgh;
 
+    mdb_pool_init(&tbl->rowpool, sizeof(mdb_row_t) + dlgh, "row/%s", name);
+
     MDB_DLIST_INIT(tbl->rows);
     mdb_log_create(tbl);
     mdb_trigger_init(&tbl->trigger, ncolumn);
@@ -210,6 +216,7 @@ int mdb_table_drop(mdb_table_t *tbl)
 {
     MDB_CHECKARG(tbl, -1);
 
+    mdb_persist_drop(tbl);
     mdb_trigger_table_drop(tbl);
     mdb_trigger_reset(&tbl->trigger, tbl->ncolumn);
 
@@ -242,7 +249,8 @@ int mdb_table_create_index(mdb_table_t *tbl, char **index_columns)
         return -1;
     }
 
-    if (mdb_index_create(tbl, index_columns) < 0)
+    if (mdb_index_create(tbl, index_columns) < 0 ||
+        mdb_persist_define(tbl) < 0)
         return -1;
 
     MDB_DLIST_FOR_EACH_SAFE(mdb_row_t, link, row,n, &tbl->rows) {
@@ -260,6 +268,29 @@ int mdb_table_create_index(mdb_table_t *tbl, char **index_columns)
     return 0;
 }
 
+int mdb_table_create_named_index(mdb_table_t  *tbl,
+                                 char         *name,
+                                 uint32_t      flags,
+                                 char        **index_columns)
+{
+    MDB_CHECKARG(tbl && name && index_columns && index_columns[0], -1);
+
+    if (mdb_index_create_secondary(tbl, name, flags, index_columns) < 0)
+        return -1;
+
+    return mdb_persist_define(tbl);
+}
+
+int mdb_table_drop_index(mdb_table_t *tbl, char *name)
+{
+    MDB_CHECKARG(tbl && name, -1);
+
+    if (mdb_index_drop_secondary(tbl, name) < 0)
+        return -1;
+
+    return mdb_persist_define(tbl);
+}
+
 
 int mdb_table_describe(mdb_table_t *tbl, mqi_column_def_t *defs, int len)
 {
@@ -292,39 +323,74 @@ int mdb_table_insert(mdb_table_t        *tbl,
 {
     uint32_t   txdepth = mdb_transaction_get_depth();
     mdb_row_t    *row;
+    mdb_row_t   **batch;
+    int           nbatch;
     int           error;
     int           nrow;
     int           ninsert;
-    mqi_bitfld_t  cmask;
+    mqi_bitfld_t  cmask = 0;
     int           i;
 
     MDB_CHECKARG(tbl && cds && data && data[0], -1);
 
-    for (i = 0, error = 0, ninsert = 0;    data[i];    i++) {
-        if (!(row = mdb_row_create(tbl))) {
+    /*
+     * Unless duplicates are replaced (which logs its own changes) the
+     * inserted rows are logged together, looking up the log only once.
+     * All rows are written by the same column descriptors so they have
+     * the same column mask.
+     */
+    if (!ignore && data[1]) {
+        for (nbatch = 0;  data[nbatch];  nbatch++)
+            ;
+        if (!(batch = malloc(sizeof(mdb_row_t *) * nbatch))) {
             errno = ENOMEM;
             return -1;
         }
+    }
+    else
+        batch = NULL;
+
+    for (i = 0, error = 0, ninsert = 0, nbatch = 0;    data[i];    i++) {
+        if (!(row = mdb_row_create(tbl))) {
+            error = ENOMEM;
+            break;
+        }
 
         mdb_row_update(tbl, row, cds, data[i], 0, &cmask);
 
         if ((nrow = mdb_index_insert(tbl, row, cmask, ignore)) < 0) {
-            if ((error = errno) != EEXIST)
-                return -1;
+            /* a rejected duplicate is freed by the index, the rest is ours */
+            if ((error = errno) != EEXIST) {
+                mdb_row_delete(tbl, row, 0, 1);
+                break;
+            }
 
             ninsert = -1;
         }
         else if (nrow > 0) {
             tbl->nrow++;
 
-            if (mdb_log_change(tbl,txdepth,mdb_log_insert,cmask,NULL,row) < 0)
-                ninsert = -1;
-            else
-                ninsert += (ninsert >= 0) ? 1 : 0;
+            if (batch)
+                batch[nbatch++] = row;
+            else {
+                if (mdb_log_change(tbl,txdepth,mdb_log_insert,cmask,NULL,row)<0)
+                    ninsert = -1;
+                else
+                    ninsert += (ninsert >= 0) ? 1 : 0;
+            }
         }
 
     }
 
+    if (batch) {
+        if (mdb_log_insert_rows(tbl, txdepth, cmask, batch, nbatch) < 0)
+            ninsert = -1;
+        else if (ninsert >= 0)
+            ninsert = nbatch;
+
+        free(batch);
+    }
+
     if (error) {
         errno = error;
         return -1;
@@ -399,17 +465,21 @@ int mdb_table_update(mdb_table_t       *tbl,
 {
     int           index_update = 0;
     mdb_column_t *col;
+    mqi_bitfld_t  smask;
     int           cindex;
     int           nupdate;
     int           i;
 
     MDB_CHECKARG(tbl, -1);
 
+    smask = mdb_index_secondary_columns(tbl);
 
-    if (MDB_TABLE_HAS_INDEX(tbl)) {
+    if (MDB_TABLE_HAS_INDEX(tbl) || smask) {
         for (i = 0;   (cindex = cds[i].cindex) >= 0;    i++) {
             col = tbl->columns + cindex;
-            if ((col->flags & MQI_COLUMN_KEY)) {
+            if ((col->flags & MQI_COLUMN_KEY) ||
+                (smask & (((mqi_bitfld_t)1) << cindex)))
+            {
                 index_update = 1;
                 break;
             }
@@ -438,6 +508,20 @@ int mdb_table_delete(mdb_table_t *tbl, mqi_cond_entry_t *cond)
     return ndelete;
 }
 
+int mdb_table_explain(mdb_table_t      *tbl,
+                      mqi_cond_entry_t *cond,
+                      char             *buf,
+                      int               len)
+{
+    mdb_plan_t plan;
+
+    MDB_CHECKARG(tbl && buf && len > 0, -1);
+
+    mdb_plan_create(tbl, cond, &plan);
+
+    return mdb_plan_print(tbl, &plan, buf, len);
+}
+
 mdb_table_t *mdb_table_find(char *table_name)
 {
     MDB_CHECKARG(table_name, NULL);
@@ -447,6 +531,13 @@ mdb_table_t *mdb_table_find(char *table_name)
 }
 
 
+char *mdb_table_get_name(mdb_table_t *tbl)
+{
+    MDB_CHECKARG(tbl, NULL);
+
+    return tbl->name;
+}
+
 int mdb_table_get_column_index(mdb_table_t *tbl, char *column_name)
 {
     MDB_CHECKARG(tbl && column_name, -1);
@@ -512,12 +603,16 @@ int mdb_table_print_rows(mdb_table_t *tbl, char *buf, int len)
 
         p += snprintf(p, e-p, "\n%s\n", dashes);
 
+        it.plan = NULL;
+
         for (it.cursor = NULL;  (row = table_iterator(tbl, &it)) && p < e;) {
             for (i = 0;  i < tbl->ncolumn && p < e;  i++)
                 p += mdb_column_print(tbl->columns + i, row->data, p, e-p);
             if (p < e)
                 p += snprintf(p, e-p, "\n");
         }
+
+        table_iterator_done(tbl, &it);
     }
 
     return p - buf;
@@ -537,6 +632,8 @@ static void destroy_table(mdb_table_t *tbl)
     MDB_DLIST_FOR_EACH_SAFE(mdb_row_t, link, row,n, &tbl->rows)
         mdb_row_delete(tbl, row, 0, 1);
 
+    mdb_pool_destroy(&tbl->rowpool);
+
     for (i = 0, cols = tbl->columns;   i < tbl->ncolumn;    i++)
         free(cols[i].name);
 
@@ -552,6 +649,9 @@ static mdb_row_t *table_iterator(mdb_table_t *tbl, table_iterator_t *it)
     mdb_dlist_t *head;
     mdb_row_t   *row;
 
+    if (it->plan && it->plan->type != mdb_plan_full_scan)
+        return mdb_plan_next(tbl, it->plan);
+
     if (!it->cursor)
         it->indexed = MDB_TABLE_HAS_INDEX(tbl);
 
@@ -572,6 +672,14 @@ static mdb_row_t *table_iterator(mdb_table_t *tbl, table_iterator_t *it)
     return row;
 }
 
+static void table_iterator_done(mdb_table_t *tbl, table_iterator_t *it)
+{
+    if (it->plan && it->plan->type != mdb_plan_full_scan)
+        mdb_plan_done(tbl, it->plan);
+    else if (it->indexed && it->cursor)
+        mdb_sequence_cursor_destroy(tbl->index.sequence, &it->cursor);
+}
+
 #if 0
 static int table_print_info(mdb_table_t *tbl, char *buf, int len)
 {
@@ -620,7 +728,8 @@ static int select_conditional(mdb_table_t       *tbl,
 {
     mdb_column_t      *columns = tbl->columns;
     mdb_row_t         *row;
-    mqi_cond_entry_t  *ce;
+    mdb_cond_t        *prog;
+    mdb_plan_t         plan;
     table_iterator_t   it;
     int                nresult;
     void              *result;
@@ -628,10 +737,19 @@ static int select_conditional(mdb_table_t       *tbl,
     int                cindex;
     int                i;
 
-    for (it.cursor = NULL, nresult = 0;  (row = table_iterator(tbl, &it)); ) {
-        ce = cond;
-        if (mdb_cond_evaluate(tbl, &ce, row->data)) {
+    if (!(prog = mdb_cond_compile(tbl, cond)))
+        return -1;
+
+    mdb_plan_create(tbl, cond, &plan);
+
+    for (it.cursor = NULL, it.plan = &plan, nresult = 0;
+         (row = table_iterator(tbl, &it));
+         )
+    {
+        if (mdb_cond_execute(prog, row->data)) {
             if (nresult >= dim) {
+                table_iterator_done(tbl, &it);
+                mdb_cond_destroy(prog);
                 errno = EOVERFLOW;
                 return -1;
             }
@@ -643,6 +761,8 @@ static int select_conditional(mdb_table_t       *tbl,
         }
     }
 
+    mdb_cond_destroy(prog);
+
     return nresult;
 }
 
@@ -663,7 +783,7 @@ static int select_all(mdb_table_t       *tbl,
 
     MQI_UNUSED(dim);
 
-    for (it.cursor = NULL, nresult = 0;
+    for (it.cursor = NULL, it.plan = NULL, nresult = 0;
          (row = table_iterator(tbl, &it));
          nresult++)
     {
@@ -705,13 +825,21 @@ static int update_conditional(mdb_table_t       *tbl,
                               int                index_update)
 {
     mdb_row_t        *row;
-    mqi_cond_entry_t *ce;
+    mdb_cond_t       *prog;
+    mdb_plan_t        plan;
     table_iterator_t  it;
     int               nupdate, changed;
 
-    for (it.cursor = NULL, nupdate = 0;  (row = table_iterator(tbl, &it)); ) {
-        ce = cond;
-        if (mdb_cond_evaluate(tbl, &ce, row->data)) {
+    if (!(prog = mdb_cond_compile(tbl, cond)))
+        return -1;
+
+    mdb_plan_create(tbl, cond, &plan);
+
+    for (it.cursor = NULL, it.plan = &plan, nupdate = 0;
+         (row = table_iterator(tbl, &it));
+         )
+    {
+        if (mdb_cond_execute(prog, row->data)) {
             changed = update_single_row(tbl, row, cds, data, index_update);
 
             if (changed < 0)
@@ -721,6 +849,8 @@ static int update_conditional(mdb_table_t       *tbl,
         }
     }
 
+    mdb_cond_destroy(prog);
+
     return nupdate;
 }
 
@@ -733,7 +863,9 @@ static int update_all(mdb_table_t       *tbl,
     table_iterator_t  it;
     int               nupdate, changed;
 
-    for (it.cursor = NULL, nupdate = 0; (row = table_iterator(tbl, &it)); )
+    for (it.cursor = NULL, it.plan = NULL, nupdate = 0;
+         (row = table_iterator(tbl, &it));
+         )
     {
         changed = update_single_row(tbl, row, cds, data, index_update);
 
@@ -759,8 +891,11 @@ static int update_single_row(mdb_table_t       *tbl,
     uint32_t     txdepth = mdb_transaction_get_depth();
     mqi_bitfld_t cmask;
     int          changed;
+    int          sts;
 
-    if (txdepth > 0 && !(before = mdb_row_duplicate(tbl, row)))
+    /* persistent tables need the old image for the storage, too */
+    if ((txdepth > 0 || tbl->persistent) &&
+        !(before = mdb_row_duplicate(tbl, row)))
         return -1;
 
     changed = mdb_row_update(tbl, row, cds, data, index_update, &cmask);
@@ -770,7 +905,12 @@ static int update_single_row(mdb_table_t       *tbl,
         return changed;
     }
 
-    if (mdb_log_change(tbl, txdepth, mdb_log_update, cmask, before, row) < 0)
+    sts = mdb_log_change(tbl, txdepth, mdb_log_update, cmask, before, row);
+
+    if (!txdepth && before)
+        mdb_row_delete(tbl, before, 0, 1);
+
+    if (sts < 0)
         return -1;
 
     return 1;
@@ -780,13 +920,20 @@ static int delete_conditional(mdb_table_t *tbl, mqi_cond_entry_t *cond)
 {
     table_iterator_t  it;
     mdb_row_t        *row;
-    mqi_cond_entry_t *ce;
+    mdb_cond_t       *prog;
+    mdb_plan_t        plan;
     int               ndelete;
 
-    for (it.cursor = NULL, ndelete = 0; (row = table_iterator(tbl, &it)); )
+    if (!(prog = mdb_cond_compile(tbl, cond)))
+        return -1;
+
+    mdb_plan_create(tbl, cond, &plan);
+
+    for (it.cursor = NULL, it.plan = &plan, ndelete = 0;
+         (row = table_iterator(tbl, &it));
+         )
     {
-        ce = cond;
-        if (mdb_cond_evaluate(tbl, &ce, row->data)) {
+        if (mdb_cond_execute(prog, row->data)) {
             if (delete_single_row(tbl, row, 1) < 0)
                 ndelete = -1;
             else
@@ -794,6 +941,8 @@ static int delete_conditional(mdb_table_t *tbl, mqi_cond_entry_t *cond)
         }
     }
 
+    mdb_cond_destroy(prog);
+
     return ndelete;
 }
 
@@ -818,11 +967,17 @@ static int delete_all(mdb_table_t *tbl)
 static int delete_single_row(mdb_table_t *tbl, mdb_row_t *row,int index_update)
 {
     uint32_t txdepth = mdb_transaction_get_depth();
+    int      sts;
 
-    mdb_row_delete(tbl, row, index_update, !txdepth);
-    mdb_log_change(tbl, txdepth, mdb_log_delete, 0, row, NULL);
+    mdb_row_delete(tbl, row, index_update, 0);
+    tbl->nrow--;
 
-    return 0;
+    sts = mdb_log_change(tbl, txdepth, mdb_log_delete, 0, row, NULL);
+
+    if (!txdepth)
+        mdb_row_delete(tbl, row, 0, 1);
+
+    return sts;
 }
 
 
@@ -30,6 +30,8 @@
 #ifndef __MDB_TABLE_H__
 #define __MDB_TABLE_H__
 
+#include <stdbool.h>
+
 #include <murphy-db/mdb.h>
 #include <murphy-db/hash.h>
 #include <murphy-db/list.h>
@@ -37,6 +39,7 @@
 #include "column.h"
 #include "log.h"
 #include "trigger.h"
+#include "pool.h"
 
 #define MDB_TABLE_HAS_INDEX(t)  MDB_INDEX_DEFINED(&t->index)
 
@@ -44,14 +47,18 @@ struct mdb_table_s {
     mqi_handle_t  handle;
     char         *name;
     mdb_index_t   index;
+    int           nsecondary;    /* number of secondary indexes */
+    mdb_secondary_index_t **secondary;
     mdb_hash_t   *chash;         /* hash table for column names */
     int           ncolumn;
     mdb_column_t *columns;
     int           dlgh;          /* length of row data */
     int           nrow;
     mdb_dlist_t   rows;
+    mdb_pool_t    rowpool;      /* pool for rows (and their log copies) */
     mdb_dlist_t   logs;         /* transaction logs */
     mdb_opcnt_t   cnt;
+    bool          persistent;   /* changes are written to the storage */
     mdb_trigger_t trigger;      /* must be the last: it has a array[0] @end  */
 };
 
@@ -40,6 +40,7 @@
 #include "log.h"
 #include "index.h"
 #include "table.h"
+#include "persist.h"
 
 #define TRANSACTION_STATISTICS
 
@@ -85,6 +86,19 @@ int mdb_transaction_commit(uint32_t depth)
 
     MDB_CHECKARG(depth > 0 && depth == txdepth, -1);
 
+    /*
+     * a nested transaction is not over until the enclosing one is, so
+     * its changes go to the enclosing transaction. If that fails we're
+     * left with committing it on its own.
+     */
+    if (depth > 1 && mdb_log_merge(depth) == 0) {
+        txdepth--;
+        return 0;
+    }
+
+    if (mdb_persist_transaction(depth) < 0)
+        sts = -1;
+
     MDB_TRANSACTION_LOG_FOR_EACH_DELETE(depth, en, MDB_BACKWARD, cursor) {
 
         if (!(before = en->before))
@@ -217,6 +231,7 @@ static int remove_row(mdb_table_t *tbl, mdb_row_t *row)
         return -1;
     }
 
+    tbl->nrow--;
     tbl->cnt.inserts--;
 
     return 0;
@@ -228,6 +243,7 @@ static int add_row(mdb_table_t *tbl, mdb_row_t *row)
 
     MDB_DLIST_APPEND(mdb_row_t, link, row, &tbl->rows);
 
+    tbl->nrow++;
     tbl->cnt.deletes--;
 
     return mdb_index_insert(tbl, row, 0, 0);
@@ -444,7 +444,9 @@ void mdb_trigger_column_change(mdb_table_t  *tbl,
     memset(&evt, 0, sizeof(evt));
     ce = &evt.column;
 
-    ce->event = mqi_column_changed;
+    ce->event   = mqi_column_changed;
+    ce->colmask = colmask;
+    ce->row     = after;
 
     ce->table.handle = tbl->handle;
     ce->table.name   = tbl->name;
@@ -562,6 +564,7 @@ static void row_change(mqi_event_type_t  event,
     re = &evt.row;
 
     re->event = event;
+    re->row   = row;
 
     re->table.handle = tbl->handle;
     re->table.name   = tbl->name;
@@ -48,6 +48,8 @@ typedef struct {
     void *(*create_table)(char *, char **, mqi_column_def_t *);
     int (*register_table_handle)(void *, mqi_handle_t);
     int (*create_index)(void *, char **);
+    int (*create_named_index)(void *, char *, uint32_t, char **);
+    int (*drop_index)(void *, char *);
     int (*drop_table)(void *);
     int (*describe)(void *, mqi_column_def_t *, int);
     int (*insert_into)(void *, int, mqi_column_desc_t *, void **);
@@ -65,6 +67,7 @@ typedef struct {
     mqi_data_type_t (*get_column_type)(void *, int);
     int (*get_column_size)(void *, int);
     int (*print_rows)(void *, char *, int);
+    int (*explain)(void *, mqi_cond_entry_t *, char *, int);
 } mqi_db_functbl_t;
 
 
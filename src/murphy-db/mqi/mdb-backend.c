@@ -59,6 +59,8 @@ static uint32_t get_transaction_id(void);
 static void *   create_table(char *, char **, mqi_column_def_t *);
 static int      register_table_handle(void *, mqi_handle_t);
 static int      create_index(void *, char **);
+static int      create_named_index(void *, char *, uint32_t, char **);
+static int      drop_index(void *, char *);
 static int      drop_table(void *);
 static int      describe(void *, mqi_column_def_t *, int);
 static int      insert_into(void *, int, mqi_column_desc_t *, void **);
@@ -76,6 +78,7 @@ static char *   get_column_name(void *, int);
 static mqi_data_type_t get_column_type(void *, int);
 static int      get_column_size(void *, int);
 static int      print_rows(void *, char *, int);
+static int      explain(void *, mqi_cond_entry_t *, char *, int);
 
 static mqi_db_functbl_t functbl = {
     create_transaction_trigger,
@@ -93,6 +96,8 @@ static mqi_db_functbl_t functbl = {
     create_table,
     register_table_handle,
     create_index,
+    create_named_index,
+    drop_index,
     drop_table,
     describe,
     insert_into,
@@ -107,7 +112,8 @@ static mqi_db_functbl_t functbl = {
     get_column_name,
     get_column_type,
     get_column_size,
-    print_rows
+    print_rows,
+    explain
 };
 
 
@@ -212,6 +218,20 @@ static int create_index(void *t, char **index_columns)
     return mdb_table_create_index((mdb_table_t *)t, index_columns);
 }
 
+static int create_named_index(void      *t,
+                              char      *name,
+                              uint32_t   flags,
+                              char     **index_columns)
+{
+    return mdb_table_create_named_index((mdb_table_t *)t, name, flags,
+                                        index_columns);
+}
+
+static int drop_index(void *t, char *name)
+{
+    return mdb_table_drop_index((mdb_table_t *)t, name);
+}
+
 static int drop_table(void *t)
 {
     return mdb_table_drop((mdb_table_t *)t);
@@ -304,6 +324,11 @@ static int print_rows(void *t, char *buf, int len)
     return mdb_table_print_rows((mdb_table_t *)t, buf, len);
 }
 
+static int explain(void *t, mqi_cond_entry_t *cond, char *buf, int len)
+{
+    return mdb_table_explain((mdb_table_t *)t, cond, buf, len);
+}
+
 
 /*
  * Local Variables:
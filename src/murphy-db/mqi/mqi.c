@@ -41,9 +41,12 @@
 #include <murphy-db/handle.h>
 #include <murphy-db/hash.h>
 #include "mdb-backend.h"
+#include "persistent-backend.h"
 
 #define MAX_DB 2
 
+#define PERSISTENT_ENGINE "MurphyDB-persistent"
+
 #define TX_DEPTH_BITS  4
 #define TX_USEID_BITS  ((sizeof(mqi_handle_t) * 8) - TX_DEPTH_BITS)
 #define TX_DEPTH_MAX   (((mqi_handle_t)1) << TX_DEPTH_BITS)
@@ -100,10 +103,13 @@ typedef struct {
 
 
 static int db_register(const char *, uint32_t, mqi_db_functbl_t *);
+static mqi_db_t *db_find(const char *);
+static mqi_handle_t table_adopt(mqi_db_t *, char *, void *);
 
 
 static int        ndb;
 static mqi_db_t   *dbs;
+static int         storage;
 mdb_handle_map_t  *table_handle;
 mdb_hash_t        *table_name_hash;
 mdb_handle_map_t  *transact_handle;
@@ -137,6 +143,9 @@ int mqi_close(void)
 {
     int i;
 
+    if (storage)
+        mqi_close_storage();
+
     if (ndb > 0 && dbs) {
         for (i = 0; i < ndb; i++)
             free((void *)dbs[i].engine);
@@ -159,6 +168,119 @@ int mqi_close(void)
 }
 
 
+int mqi_open_storage(const char *path, int sync_commits, int sync_msec)
+{
+    mqi_db_t      *db;
+    void         **tables  = NULL;
+    char         **names   = NULL;
+    mqi_handle_t  *handles = NULL;
+    int            ntable;
+    int            nadopted;
+    int            err;
+    int            i;
+
+    MDB_CHECKARG(path && path[0], -1);
+    MDB_PREREQUISITE(dbs && ndb > 0, -1);
+    MDB_ASSERT(!storage, EEXIST, -1);
+
+    if (!(db = db_find(PERSISTENT_ENGINE))) {
+        if (db_register(PERSISTENT_ENGINE, MQI_PERSISTENT,
+                        persistent_backend_init()) < 0)
+            return -1;
+
+        db = db_find(PERSISTENT_ENGINE);
+    }
+
+    if (persistent_backend_open(path, sync_commits, sync_msec) < 0)
+        return -1;
+
+    storage  = 1;
+    nadopted = 0;
+
+    /* make the recovered tables available through MQI */
+    ntable = persistent_backend_get_tables(NULL, NULL, 0);
+
+    if (ntable > 0) {
+        tables  = calloc(ntable, sizeof(*tables));
+        names   = calloc(ntable, sizeof(*names));
+        handles = calloc(ntable, sizeof(*handles));
+
+        if (!tables || !names || !handles) {
+            errno = ENOMEM;
+            goto failed;
+        }
+
+        persistent_backend_get_tables(tables, names, ntable);
+
+        for (i = 0;  i < ntable;  i++) {
+            handles[i] = table_adopt(db, names[i], tables[i]);
+
+            if (handles[i] == MQI_HANDLE_INVALID)
+                goto failed;
+
+            nadopted++;
+        }
+
+        free(tables);
+        free(names);
+        free(handles);
+    }
+
+    return 0;
+
+ failed:
+    err = errno;
+
+    mqi_close_storage();
+
+    /* drop the recovered tables, unregistering the ones already adopted */
+    if (tables && names && handles) {
+        for (i = 0;  i < ntable;  i++) {
+            if (i < nadopted)
+                mqi_drop_table(handles[i]);
+            else
+                db->functbl->drop_table(tables[i]);
+        }
+    }
+
+    free(tables);
+    free(names);
+    free(handles);
+
+    errno = err;
+
+    return -1;
+}
+
+int mqi_sync_storage(void)
+{
+    MDB_PREREQUISITE(storage, -1);
+
+    return persistent_backend_sync();
+}
+
+int mqi_set_storage_timer(mqi_timer_ops_t *ops, void *data)
+{
+    return persistent_backend_set_timer(ops, data);
+}
+
+int mqi_checkpoint_storage(void)
+{
+    MDB_PREREQUISITE(storage, -1);
+
+    return persistent_backend_checkpoint();
+}
+
+int mqi_close_storage(void)
+{
+    MDB_PREREQUISITE(storage, -1);
+
+    storage = 0;
+
+    return persistent_backend_close();
+}
+
+
 int mqi_show_tables(uint32_t flags, char **buf, int len)
 {
     mqi_handle_t h;
@@ -561,6 +683,35 @@ int mqi_create_index(mqi_handle_t h, char **index_columns)
     return ftb->create_index(tbl, index_columns);
 }
 
+int mqi_create_named_index(mqi_handle_t   h,
+                           char          *name,
+                           uint32_t       flags,
+                           char         **index_columns)
+{
+    mqi_db_functbl_t *ftb;
+    void             *tbl;
+
+    MDB_CHECKARG(h != MDB_HANDLE_INVALID && name && index_columns, -1);
+    MDB_PREREQUISITE(dbs && ndb > 0, -1);
+
+    GET_TABLE(tbl, ftb, h, -1);
+
+    return ftb->create_named_index(tbl, name, flags, index_columns);
+}
+
+int mqi_drop_index(mqi_handle_t h, char *name)
+{
+    mqi_db_functbl_t *ftb;
+    void             *tbl;
+
+    MDB_CHECKARG(h != MDB_HANDLE_INVALID && name, -1);
+    MDB_PREREQUISITE(dbs && ndb > 0, -1);
+
+    GET_TABLE(tbl, ftb, h, -1);
+
+    return ftb->drop_index(tbl, name);
+}
+
 int mqi_drop_table(mqi_handle_t h)
 {
     mqi_table_t      *tbl;
@@ -791,6 +942,19 @@ int mqi_print_rows(mqi_handle_t h, char *buf, int len)
     return ftb->print_rows(tbl, buf, len);
 }
 
+int mqi_explain(mqi_handle_t h, mqi_cond_entry_t *cond, char *buf, int len)
+{
+    mqi_db_functbl_t *ftb;
+    void             *tbl;
+
+    MDB_CHECKARG(h != MDB_HANDLE_INVALID && buf && len > 0, -1);
+    MDB_PREREQUISITE(dbs && ndb > 0, -1);
+
+    GET_TABLE(tbl, ftb, h, -1);
+
+    return ftb->explain(tbl, cond, buf, len);
+}
+
 
 
 static int db_register(const char       *engine,
@@ -803,7 +967,7 @@ static int db_register(const char       *engine,
     MDB_CHECKARG(engine && engine[0] && functbl, -1);
     MDB_PREREQUISITE(dbs, -1);
 
-    if (ndb + 1 >= MAX_DB) {
+    if (ndb >= MAX_DB) {
         errno = EOVERFLOW;
         return -1;
     }
@@ -824,6 +988,56 @@ static int db_register(const char       *engine,
     return 0;
 }
 
+static mqi_db_t *db_find(const char *engine)
+{
+    int i;
+
+    for (i = 0;  i < ndb;  i++) {
+        if (!strcmp(engine, dbs[i].engine))
+            return dbs + i;
+    }
+
+    return NULL;
+}
+
+static mqi_handle_t table_adopt(mqi_db_t *db, char *name, void *handle)
+{
+    mqi_table_t  *tbl;
+    mqi_handle_t  h;
+    char         *namedup;
+
+    if (!(tbl = calloc(1, sizeof(mqi_table_t)))) {
+        errno = ENOMEM;
+        return MQI_HANDLE_INVALID;
+    }
+
+    tbl->db     = db;
+    tbl->handle = handle;
+
+    if (!(namedup = strdup(name))) {
+        free(tbl);
+        errno = ENOMEM;
+        return MQI_HANDLE_INVALID;
+    }
+
+    if ((h = mdb_handle_add(table_handle, tbl)) == MQI_HANDLE_INVALID) {
+        free(namedup);
+        free(tbl);
+        return MQI_HANDLE_INVALID;
+    }
+
+    if (mdb_hash_add(table_name_hash, 0,namedup, NULL + h) < 0) {
+        mdb_handle_delete(table_handle, h);
+        free(namedup);
+        free(tbl);
+        return MQI_HANDLE_INVALID;
+    }
+
+    db->functbl->register_table_handle(handle, h);
+
+    return h;
+}
+
 /*
  * Local Variables:
  * c-basic-offset: 4
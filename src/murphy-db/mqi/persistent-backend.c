@@ -0,0 +1,196 @@
+/*
+ * Copyright (c) 2012, Intel Corporation
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met:
+ *
+ *  * Redistributions of source code must retain the above copyright notice,
+ *    this list of conditions and the following disclaimer.
+ *  * Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ *  * Neither the name of Intel Corporation nor the names of its contributors
+ *    may be used to endorse or promote products derived from this software
+ *    without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+#include <stdint.h>
+#include <stdlib.h>
+#include <stdio.h>
+#include <errno.h>
+
+#define _GNU_SOURCE
+#include <string.h>
+
+#include <murphy-db/assert.h>
+#include <murphy-db/handle.h>
+#include <murphy-db/mdb.h>
+
+#include "mdb-backend.h"
+#include "persistent-backend.h"
+
+/*
+ * Persistent tables are ordinary MurphyDB tables that have their changes
+ * written to the storage as they get committed. They share the in-memory
+ * transactions and the global triggers with the MurphyDB backend, so those
+ * are left to it here and only the table creation differs.
+ */
+
+static int      create_transaction_trigger(mqi_trigger_cb_t, void *);
+static int      create_table_trigger(mqi_trigger_cb_t, void *);
+static int      drop_transaction_trigger(mqi_trigger_cb_t, void *);
+static int      drop_table_trigger(mqi_trigger_cb_t, void *);
+static uint32_t begin_transaction(void);
+static int      commit_transaction(uint32_t);
+static int      rollback_transaction(uint32_t);
+static void *   create_table(char *, char **, mqi_column_def_t *);
+
+static mqi_db_functbl_t functbl;
+
+
+mqi_db_functbl_t *persistent_backend_init(void)
+{
+    if (!functbl.create_table) {
+        functbl = *mdb_backend_init();
+
+        functbl.create_transaction_trigger = create_transaction_trigger;
+        functbl.create_table_trigger       = create_table_trigger;
+        functbl.drop_transaction_trigger   = drop_transaction_trigger;
+        functbl.drop_table_trigger         = drop_table_trigger;
+        functbl.begin_transaction          = begin_transaction;
+        functbl.commit_transaction         = commit_transaction;
+        functbl.rollback_transaction       = rollback_transaction;
+        functbl.create_table               = create_table;
+    }
+
+    return &functbl;
+}
+
+int persistent_backend_open(const char *dir, int sync_commits, int sync_msec)
+{
+    return mdb_persist_open(dir, sync_commits, sync_msec);
+}
+
+int persistent_backend_close(void)
+{
+    return mdb_persist_close();
+}
+
+int persistent_backend_sync(void)
+{
+    return mdb_persist_sync();
+}
+
+int persistent_backend_set_timer(mqi_timer_ops_t *ops, void *data)
+{
+    return mdb_persist_set_timer(ops, data);
+}
+
+int persistent_backend_checkpoint(void)
+{
+    return mdb_persist_checkpoint();
+}
+
+int persistent_backend_get_tables(void **tables, char **names, int len)
+{
+    int n, i;
+
+    if ((n = mdb_persist_get_tables((mdb_table_t **)tables, len)) < 0)
+        return -1;
+
+    for (i = 0;  i < n && i < len;  i++)
+        names[i] = mdb_table_get_name((mdb_table_t *)tables[i]);
+
+    return n;
+}
+
+
+static int create_transaction_trigger(mqi_trigger_cb_t cb, void *data)
+{
+    MQI_UNUSED(cb);
+    MQI_UNUSED(data);
+
+    return 0;
+}
+
+static int create_table_trigger(mqi_trigger_cb_t cb, void *data)
+{
+    MQI_UNUSED(cb);
+    MQI_UNUSED(data);
+
+    return 0;
+}
+
+static int drop_transaction_trigger(mqi_trigger_cb_t cb, void *data)
+{
+    MQI_UNUSED(cb);
+    MQI_UNUSED(data);
+
+    return 0;
+}
+
+static int drop_table_trigger(mqi_trigger_cb_t cb, void *data)
+{
+    MQI_UNUSED(cb);
+    MQI_UNUSED(data);
+
+    return 0;
+}
+
+static uint32_t begin_transaction(void)
+{
+    return mdb_transaction_get_depth();
+}
+
+static int commit_transaction(uint32_t depth)
+{
+    MQI_UNUSED(depth);
+
+    return 0;
+}
+
+static int rollback_transaction(uint32_t depth)
+{
+    MQI_UNUSED(depth);
+
+    return 0;
+}
+
+static void *create_table(char *name,
+                          char **index_columns,
+                          mqi_column_def_t *cdefs)
+{
+    mdb_table_t *tbl;
+
+    if (!(tbl = mdb_table_create(name, index_columns, cdefs)))
+        return NULL;
+
+    if (mdb_persist_table(tbl) < 0) {
+        mdb_table_drop(tbl);
+        return NULL;
+    }
+
+    return tbl;
+}
+
+
+/*
+ * Local Variables:
+ * c-basic-offset: 4
+ * indent-tabs-mode: nil
+ * End:
+ *
+ */
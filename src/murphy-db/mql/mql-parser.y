@@ -85,6 +85,7 @@ static void print_query_result(mqi_column_desc_t *, mqi_data_type_t *,
 
 static mqi_handle_t table;
 static uint32_t     table_flags;
+static uint32_t     index_flags;
 
 static char                  *trigger_name;
 static struct mql_callback_s *callback;
@@ -155,9 +156,11 @@ static FILE        *mqlout;
 %token <string>   TKN_DELETE
 %token <string>   TKN_DROP
 %token <string>   TKN_DESCRIBE
+%token <string>   TKN_EXPLAIN
 %token <string>   TKN_TABLE
 %token <string>   TKN_TABLES
 %token <string>   TKN_INDEX
+%token <string>   TKN_ORDERED
 %token <string>   TKN_ROWS
 %token <string>   TKN_COLUMN
 %token <string>   TKN_TRIGGER
@@ -267,6 +270,7 @@ static FILE        *mqlout;
     mql_result_t *mql_result_string_create_transaction_change(
                                                             mqi_event_type_t);
     mql_result_t *mql_result_string_create_column_list(int, mqi_column_def_t*);
+    mql_result_t *mql_result_string_create_query_plan(const char *);
     mql_result_t *mql_result_string_create_row_list(int, char **,
                                                     mqi_column_desc_t *,
                                                     mqi_data_type_t *, int *,
@@ -315,6 +319,7 @@ statement:
 | commit_statement
 | rollback_statement
 | describe_statement
+| explain_statement
 | insert_statement
 | update_statement
 | delete_statement
@@ -457,20 +462,41 @@ blob: TKN_BLOB TKN_LEFT_PAREN TKN_NUMBER TKN_RIGHT_PAREN {
 
 /* create index */
 
-create_index: TKN_INDEX {
+create_index: index_flags TKN_INDEX {
     ncolnam = 0;
 };
 
-index_definition: TKN_ON table_name TKN_LEFT_PAREN column_list TKN_RIGHT_PAREN
+/*#toplevel#*/
+index_definition:
+  primary_index_definition
+| named_index_definition
+;
+
+primary_index_definition:
+  TKN_ON table_name TKN_LEFT_PAREN column_list TKN_RIGHT_PAREN
 {
     colnams[ncolnam] = NULL;
 
+    if (index_flags != MQI_INDEX_HASH)
+        MQL_ERROR(EINVAL, "ordered index needs a name");
+
     if (mqi_create_index(table, colnams) < 0)
         MQL_ERROR(errno, "failed to create index: %s", strerror(errno));
     else
         MQL_SUCCESS;
 };
 
+named_index_definition:
+  TKN_IDENTIFIER TKN_ON table_name TKN_LEFT_PAREN column_list TKN_RIGHT_PAREN
+{
+    colnams[ncolnam] = NULL;
+
+    if (mqi_create_named_index(table, $1, index_flags, colnams) < 0)
+        MQL_ERROR(errno, "failed to create index: %s", strerror(errno));
+    else
+        MQL_SUCCESS;
+};
+
 
 /* create trigger */
 
@@ -628,8 +654,16 @@ drop_table_statement: TKN_DROP TKN_TABLE  table_name {
 /* drop index */
 
 /*#toplevel#*/
-drop_index_statement: TKN_DROP TKN_INDEX table_name {
-};
+drop_index_statement:
+  TKN_DROP TKN_INDEX table_name {
+}
+| TKN_DROP TKN_INDEX TKN_IDENTIFIER TKN_ON table_name {
+    if (mqi_drop_index(table, $3) < 0)
+        MQL_ERROR(errno, "failed to drop index: %s", strerror(errno));
+    else
+        MQL_SUCCESS;
+}
+;
 
 
 /***********************************
@@ -717,6 +751,43 @@ describe_statement: TKN_DESCRIBE table_name {
     }
 };
 
+/***********************************
+ *
+ * Explain statement
+ *
+ */
+/*#toplevel#*/
+explain_statement: TKN_EXPLAIN explained_statement {
+    mqi_cond_entry_t *where = (cond == conds) ? NULL : conds;
+    char              plan[1024];
+
+    if (mode == mql_mode_precompile)
+        MQL_ERROR(EINVAL, "explain can't be precompiled");
+
+    if (mqi_explain(table, where, plan, sizeof(plan)) < 0)
+        MQL_ERROR(errno, "explain failed: %s", strerror(errno));
+
+    if (mode == mql_mode_exec) {
+        switch (rtype) {
+        case mql_result_string:
+            result = mql_result_string_create_query_plan(plan);
+            break;
+        default:
+            result = mql_result_error_create(EINVAL, "explain failed: "
+                                             "invalid result type %d", rtype);
+            break;
+        }
+    }
+    else
+        fprintf(mqlout, "%s", plan);
+};
+
+explained_statement:
+  select columns TKN_FROM table_name where_clause
+| update table_name TKN_SET assignment_list where_clause
+| delete table_name where_clause
+;
+
 /***********************************
  *
  * Insert statement
@@ -1068,6 +1139,11 @@ table_flags:
 | TKN_TEMPORARY   { table_flags = MQI_TEMPORARY;  }
 ;
 
+index_flags:
+  /* no option */ { index_flags = MQI_INDEX_HASH;    }
+| TKN_ORDERED     { index_flags = MQI_INDEX_ORDERED; }
+;
+
 /***********************************
  *
  * Column list
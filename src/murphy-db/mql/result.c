@@ -1018,6 +1018,28 @@ mql_result_t *mql_result_string_create_transaction_change(mqi_event_type_t evt)
     return (mql_result_t *)rslt;
 }
 
+mql_result_t *mql_result_string_create_query_plan(const char *plan)
+{
+    result_string_t *rslt;
+    int              len;
+
+    MDB_CHECKARG(plan, NULL);
+
+    len = strlen(plan);
+
+    if (!(rslt = calloc(1, sizeof(result_string_t) + len + 1))) {
+        errno = ENOMEM;
+        return NULL;
+    }
+
+    memcpy(rslt->string, plan, len + 1);
+
+    rslt->type = mql_result_string;
+    rslt->length = len;
+
+    return (mql_result_t *)rslt;
+}
+
 mql_result_t *mql_result_string_create_column_list(int               ncol,
                                                    mqi_column_def_t *defs)
 {
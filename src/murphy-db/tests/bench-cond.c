@@ -0,0 +1,259 @@
+/*
+ * Copyright (c) 2012, Intel Corporation
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met:
+ *
+ *  * Redistributions of source code must retain the above copyright notice,
+ *    this list of conditions and the following disclaimer.
+ *  * Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ *  * Neither the name of Intel Corporation nor the names of its contributors
+ *    may be used to endorse or promote products derived from this software
+ *    without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+#include <stdlib.h>
+#include <stdio.h>
+#include <stdint.h>
+#include <string.h>
+#include <errno.h>
+#include <time.h>
+#include <libgen.h>
+
+#include <murphy-db/mqi.h>
+
+#include "../mdb/table.h"
+#include "../mdb/cond.h"
+
+/*
+ * Micro-benchmark comparing the interpreting condition evaluator with
+ * the compiled one. Both evaluators are run on every row, and any
+ * disagreement between them is reported as a failure.
+ */
+
+#define NAME_LENGTH  16
+
+typedef struct {
+    uint32_t id;
+    int32_t  a;
+    int32_t  b;
+    int32_t  flag;
+    char     name[NAME_LENGTH];
+} row_t;
+
+typedef struct {
+    const char       *name;
+    mqi_cond_entry_t *cond;
+} condition_t;
+
+
+static mdb_column_t columns[] = {
+    { "id"  , mqi_unsignd, sizeof(uint32_t), MQI_OFFSET(row_t, id)  , 0 },
+    { "a"   , mqi_integer, sizeof(int32_t) , MQI_OFFSET(row_t, a)   , 0 },
+    { "b"   , mqi_integer, sizeof(int32_t) , MQI_OFFSET(row_t, b)   , 0 },
+    { "flag", mqi_integer, sizeof(int32_t) , MQI_OFFSET(row_t, flag), 0 },
+    { "name", mqi_varchar, NAME_LENGTH     , MQI_OFFSET(row_t, name), 0 },
+};
+
+static int32_t   lo     = 250;
+static int32_t   hi     = 750;
+static uint32_t  idmax  = 5000;
+static char     *name   = "name-7";
+static char     *prefix = "name-3";
+
+MQI_WHERE_CLAUSE(flat,
+    MQI_GREATER( MQI_COLUMN(1), MQI_INTEGER_VAR(lo) ) MQI_AND
+    MQI_LESS   ( MQI_COLUMN(2), MQI_INTEGER_VAR(hi) )
+);
+
+MQI_WHERE_CLAUSE(nested,
+    MQI_EXPRESSION(
+        MQI_LESS   ( MQI_COLUMN(1), MQI_INTEGER_VAR(lo) ) MQI_OR
+        MQI_GREATER( MQI_COLUMN(2), MQI_INTEGER_VAR(hi) )
+    ) MQI_AND
+    MQI_EXPRESSION(
+        MQI_EQUAL  ( MQI_COLUMN(4), MQI_STRING_VAR(name)    ) MQI_OR
+        MQI_LESS   ( MQI_COLUMN(0), MQI_UNSIGNED_VAR(idmax) )
+    )
+);
+
+MQI_WHERE_CLAUSE(deep,
+    MQI_EXPRESSION(
+        MQI_EXPRESSION(
+            MQI_GREATER( MQI_COLUMN(1), MQI_INTEGER_VAR(lo) ) MQI_AND
+            MQI_GREATER( MQI_COLUMN(2), MQI_INTEGER_VAR(lo) )
+        ) MQI_OR
+        MQI_EXPRESSION(
+            MQI_LESS   ( MQI_COLUMN(1), MQI_INTEGER_VAR(hi) ) MQI_AND
+            MQI_LESS   ( MQI_COLUMN(2), MQI_INTEGER_VAR(hi) )
+        )
+    ) MQI_AND
+    MQI_NOT( MQI_COLUMN(3) ) MQI_AND
+    MQI_GREATER_OR_EQUAL( MQI_STRING_VAR(prefix), MQI_COLUMN(4) )
+);
+
+static condition_t conditions[] = {
+    { "flat"  , flat   },
+    { "nested", nested },
+    { "deep"  , deep   },
+    { NULL    , NULL   }
+};
+
+
+static double now(void)
+{
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+
+    return ts.tv_sec + ts.tv_nsec / 1000000000.0;
+}
+
+static row_t *create_rows(int nrow)
+{
+    row_t *rows, *r;
+    int    i;
+
+    if (!(rows = calloc(nrow, sizeof(row_t))))
+        return NULL;
+
+    srand(1);
+
+    for (i = 0;  i < nrow;  i++) {
+        r = rows + i;
+
+        r->id   = i;
+        r->a    = rand() % 1000;
+        r->b    = rand() % 1000;
+        r->flag = rand() % 2;
+        snprintf(r->name, sizeof(r->name), "name-%d", rand() % 10);
+    }
+
+    return rows;
+}
+
+static int run(mdb_table_t *tbl, condition_t *c, row_t *rows, int nrow,
+               int nround)
+{
+    mqi_cond_entry_t *ce;
+    mdb_cond_t       *prog;
+    double            start, interpreted, compiled;
+    int               nmatch, r1, r2;
+    int               i, n;
+
+    if (!(prog = mdb_cond_compile(tbl, c->cond))) {
+        printf("%-8s failed to compile condition (%s)\n", c->name,
+               strerror(errno));
+        return -1;
+    }
+
+    for (i = 0, nmatch = 0;  i < nrow;  i++) {
+        ce = c->cond;
+        r1 = mdb_cond_evaluate(tbl, &ce, rows + i) ? 1 : 0;
+        r2 = mdb_cond_execute(prog, rows + i) ? 1 : 0;
+
+        if (r1 != r2) {
+            printf("%-8s evaluators disagree on row %d (%d vs. %d)\n",
+                   c->name, i, r1, r2);
+            mdb_cond_destroy(prog);
+            return -1;
+        }
+
+        nmatch += r1;
+    }
+
+    start = now();
+    for (n = 0;  n < nround;  n++) {
+        for (i = 0;  i < nrow;  i++) {
+            ce = c->cond;
+            mdb_cond_evaluate(tbl, &ce, rows + i);
+        }
+    }
+    interpreted = now() - start;
+
+    start = now();
+    for (n = 0;  n < nround;  n++) {
+        for (i = 0;  i < nrow;  i++)
+            mdb_cond_execute(prog, rows + i);
+    }
+    compiled = now() - start;
+
+    mdb_cond_destroy(prog);
+
+    printf("%-8s %6d/%d rows match  interpreted %7.1f ns/row  "
+           "compiled %7.1f ns/row  (%.1fx)\n", c->name, nmatch, nrow,
+           interpreted * 1e9 / ((double)nrow * nround),
+           compiled * 1e9 / ((double)nrow * nround),
+           compiled > 0 ? interpreted / compiled : 0.0);
+
+    return 0;
+}
+
+int main(int argc, char **argv)
+{
+    mdb_table_t  tbl;
+    row_t       *rows;
+    condition_t *c;
+    int          nrow   = 10000;
+    int          nround = 100;
+    int          failed = 0;
+    int          i;
+
+    for (i = 1;  i < argc;  i++) {
+        if (!strcmp("-r", argv[i]) && i < argc - 1)
+            nrow = atoi(argv[++i]);
+        else if (!strcmp("-n", argv[i]) && i < argc - 1)
+            nround = atoi(argv[++i]);
+        else {
+            printf("Usage: %s [-h] [-r rows] [-n rounds]\n"
+                   "  -h     prints this message\n"
+                   "  -r     number of rows (default %d)\n"
+                   "  -n     number of rounds over the rows (default %d)\n",
+                   basename(argv[0]), nrow, nround);
+            exit(strcmp("-h", argv[i]) ? 1 : 0);
+        }
+    }
+
+    if (nrow <= 0 || nround <= 0 || !(rows = create_rows(nrow))) {
+        printf("failed to create %d rows\n", nrow);
+        exit(1);
+    }
+
+    memset(&tbl, 0, sizeof(tbl));
+    tbl.name    = "bench";
+    tbl.ncolumn = MQI_DIMENSION(columns);
+    tbl.columns = columns;
+    tbl.dlgh    = sizeof(row_t);
+
+    for (c = conditions;  c->name;  c++) {
+        if (run(&tbl, c, rows, nrow, nround) < 0)
+            failed = 1;
+    }
+
+    free(rows);
+
+    return failed;
+}
+
+/*
+ * Local Variables:
+ * c-basic-offset: 4
+ * indent-tabs-mode: nil
+ * End:
+ *
+ */
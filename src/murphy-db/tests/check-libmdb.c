@@ -27,8 +27,15 @@
  * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
  */
 
+#include <stdio.h>
+#include <stdint.h>
+#include <errno.h>
+
 #include <check.h>
 
+#include <murphy-db/hash.h>
+#include <murphy-db/sequence.h>
+
 #ifndef LOGFILE
 #define LOGFILE  "check_libmdb.log"
 #endif
@@ -68,12 +75,111 @@ START_TEST(create_table)
 }
 END_TEST
 
+START_TEST(hash_table_resize)
+{
+#define NENTRY 100000
+    static uint32_t  keys[NENTRY];
+    mdb_hash_t      *htbl;
+    void            *data;
+    int              i;
+
+    htbl = MDB_HASH_TABLE_CREATE(unsignd, 16);
+    fail_if(htbl == NULL, "failed to create hash table");
+
+    for (i = 0;  i < NENTRY;  i++) {
+        keys[i] = i * 7919;
+        fail_unless(mdb_hash_add(htbl, sizeof(keys[i]), keys + i,
+                                 (void *)(keys + i)) == 0,
+                    "failed to add hash entry #%d", i);
+    }
+
+    fail_unless(mdb_hash_add(htbl, sizeof(keys[0]), keys, keys + 1) < 0 &&
+                errno == EEXIST, "duplicate hash entry was accepted");
+
+    for (i = 0;  i < NENTRY;  i++) {
+        data = mdb_hash_get_data(htbl, sizeof(keys[i]), keys + i);
+        fail_unless(data == keys + i, "failed to look up hash entry #%d", i);
+    }
+
+    for (i = 0;  i < NENTRY;  i += 2) {
+        data = mdb_hash_delete(htbl, sizeof(keys[i]), keys + i);
+        fail_unless(data == keys + i, "failed to delete hash entry #%d", i);
+    }
+
+    for (i = 0;  i < NENTRY;  i++) {
+        data = mdb_hash_get_data(htbl, sizeof(keys[i]), keys + i);
+        fail_unless(data == ((i & 1) ? keys + i : NULL),
+                    "hash entry #%d is in wrong state after shrinking", i);
+    }
+
+    fail_unless(mdb_hash_table_destroy(htbl) == 0,
+                "failed to destroy hash table");
+#undef NENTRY
+}
+END_TEST
+
+START_TEST(sequence_ordering)
+{
+#define NENTRY 10000
+    static uint32_t  keys[NENTRY];
+    mdb_sequence_t  *seq;
+    uint32_t        *data, *prev;
+    void            *cursor;
+    int              i, n;
+
+    seq = MDB_SEQUENCE_TABLE_CREATE(unsignd, 16);
+    fail_if(seq == NULL, "failed to create sequence");
+
+    for (i = 0;  i < NENTRY;  i++) {
+        keys[i] = (i * 7919) % NENTRY;
+        fail_unless(mdb_sequence_add(seq, sizeof(keys[i]), keys + i,
+                                     keys + i) == 0,
+                    "failed to add sequence entry #%d", i);
+    }
+
+    fail_unless(mdb_sequence_table_get_size(seq) == NENTRY,
+                "wrong sequence size");
+
+    n    = 0;
+    prev = NULL;
+
+    MDB_SEQUENCE_FOR_EACH(seq, data, cursor) {
+        fail_unless(!prev || *prev < *data, "sequence is out of order");
+
+        /* delete the current and the next entry while iterating */
+        if (*data % 3 == 0) {
+            fail_unless(mdb_sequence_delete(seq, sizeof(*data), data) == data,
+                        "failed to delete current entry %u", *data);
+
+            if (*data + 1 < NENTRY) {
+                uint32_t next = *data + 1;
+                fail_if(mdb_sequence_delete(seq, sizeof(next), &next) == NULL,
+                        "failed to delete next entry %u", next);
+            }
+        }
+
+        prev = data;
+        n++;
+    }
+
+    fail_unless(n == NENTRY - NENTRY / 3, "iteration visited %d entries", n);
+    fail_unless(mdb_sequence_table_get_size(seq) == NENTRY / 3,
+                "wrong sequence size after deletions");
+
+    fail_unless(mdb_sequence_table_destroy(seq) == 0,
+                "failed to destroy sequence");
+#undef NENTRY
+}
+END_TEST
+
 
 static Suite *libmdb_suite(void)
 {
     Suite *s = suite_create("Memory Database - libmdb");
 
     ADD_TEST_CASE(s, create_table);
+    ADD_TEST_CASE(s, hash_table_resize);
+    ADD_TEST_CASE(s, sequence_ordering);
 
     return s;
 }
@@ -32,6 +32,8 @@
 #include <string.h>
 #include <errno.h>
 #include <libgen.h>
+#include <unistd.h>
+#include <sys/stat.h>
 
 #include <check.h>
 
@@ -462,6 +464,61 @@ END_TEST
 
 
 
+START_TEST(explain_select_from_persons)
+{
+    static uint32_t idlimit = 200;
+
+    MQI_WHERE_CLAUSE(probe,
+        MQI_EQUAL( MQI_COLUMN(1), MQI_STRING_VAR(elvis.family_name) ) MQI_AND
+        MQI_EQUAL( MQI_COLUMN(2), MQI_STRING_VAR(elvis.first_name ) )
+    );
+
+    MQI_WHERE_CLAUSE(prefix,
+        MQI_EQUAL( MQI_COLUMN(1), MQI_STRING_VAR(elvis.family_name) ) MQI_AND
+        MQI_GREATER( MQI_COLUMN(3), MQI_UNSIGNED_VAR(idlimit) )
+    );
+
+    MQI_WHERE_CLAUSE(scan,
+        MQI_GREATER( MQI_COLUMN(3), MQI_UNSIGNED_VAR(idlimit) )
+    );
+
+    query_t rows[32];
+    char    plan[256];
+    int     n;
+
+    PREREQUISITE(replace_in_persons);
+
+    n = mqi_explain(persons, probe, plan, sizeof(plan));
+
+    fail_if(n < 0, "errno (%s)", strerror(errno));
+    fail_if(strncmp(plan, "index probe", 11), "unexpected plan '%s'", plan);
+
+    n = mqi_explain(persons, prefix, plan, sizeof(plan));
+
+    fail_if(n < 0, "errno (%s)", strerror(errno));
+    fail_if(strncmp(plan, "index prefix scan", 17), "unexpected plan '%s'",
+            plan);
+
+    n = mqi_explain(persons, scan, plan, sizeof(plan));
+
+    fail_if(n < 0, "errno (%s)", strerror(errno));
+    fail_if(strncmp(plan, "full scan", 9), "unexpected plan '%s'", plan);
+
+    n = MQI_SELECT(persons_select_columns, persons, prefix, rows);
+
+    fail_if(n < 0, "errno (%s)", strerror(errno));
+
+    if (verbose)
+        print_rows(n, rows);
+
+    fail_if(n != 1, "selected %d rows but the right number would be 1", n);
+    fail_if(rows[0].id != elvis.id, "mismatching id (%u vs. %u)",
+            elvis.id, rows[0].id);
+}
+END_TEST
+
+
+
 START_TEST(update_in_persons)
 {
     MQI_WHERE_CLAUSE(where,
@@ -565,6 +622,9 @@ START_TEST(delete_all_persons)
 
     n = MQI_SELECT(persons_select_columns, persons, MQI_ALL, rows);
     fail_if(n != 0, "verification select failed (%s)", strerror(errno));
+
+    n = mqi_get_table_size(persons);
+    fail_if(n != 0, "table size is %d after deleting all rows", n);
 }
 END_TEST
 
@@ -871,6 +931,632 @@ END_TEST
 
 
 
+START_TEST(nested_transaction_commit)
+{
+    query_t       rows[32];
+    mqi_handle_t  outer, inner;
+    int           sts, n;
+
+    PREREQUISITE(create_table_persons);
+
+    sts = mqi_create_row_trigger(persons, row_event_cb, ROW_TRIGGER_DATA,
+                                 persons_select_columns);
+
+    fail_if(sts < 0, "create row trigger failed: errno (%s)", strerror(errno));
+
+    /* the enclosing rollback undoes what the nested transaction committed */
+    outer = mqi_begin_transaction();
+
+    fail_if(outer == MQI_HANDLE_INVALID, "begin failed: errno(%s)",
+            strerror(errno));
+
+    PREREQUISITE(insert_into_persons);
+
+    inner = mqi_begin_transaction();
+
+    fail_if(inner == MQI_HANDLE_INVALID, "nested begin failed: errno(%s)",
+            strerror(errno));
+
+    PREREQUISITE(delete_all_persons);
+
+    sts = mqi_commit_transaction(inner);
+
+    fail_if(sts < 0, "nested commit failed: errno (%s)", strerror(errno));
+    fail_unless(ntrigger == 0, "nested commit fired %d callbacks", ntrigger);
+
+    sts = mqi_rollback_transaction(outer);
+
+    fail_if(sts < 0, "rollback failed: errno (%s)", strerror(errno));
+    fail_unless(ntrigger == 0, "rollback fired %d callbacks", ntrigger);
+
+    n = MQI_SELECT(persons_select_columns, persons, MQI_ALL, rows);
+
+    fail_unless(n == 0, "%d rows left after rollback", n);
+
+    n = mqi_get_table_size(persons);
+
+    fail_unless(n == 0, "table size is %d after rollback", n);
+
+    /* the enclosing commit fires the triggers of the nested one */
+    outer = mqi_begin_transaction();
+    inner = mqi_begin_transaction();
+
+    fail_if(outer == MQI_HANDLE_INVALID || inner == MQI_HANDLE_INVALID,
+            "begin failed: errno(%s)", strerror(errno));
+
+    PREREQUISITE(insert_into_persons);
+
+    sts = mqi_commit_transaction(inner);
+
+    fail_if(sts < 0, "nested commit failed: errno (%s)", strerror(errno));
+    fail_unless(ntrigger == 0, "nested commit fired %d callbacks", ntrigger);
+
+    sts = mqi_commit_transaction(outer);
+
+    fail_if(sts < 0, "commit failed: errno (%s)", strerror(errno));
+    fail_unless(ntrigger == rows_no_in_persons,
+                "wrong number of callbacks (%d vs. %d)",
+                ntrigger, rows_no_in_persons);
+}
+END_TEST
+
+
+START_TEST(secondary_indexes)
+{
+    typedef struct {
+        const char *name;
+        const char *zone;
+        uint32_t    pid;
+        int32_t     state;
+    } owner_t;
+
+    MQI_COLUMN_DEFINITION_LIST(owners_coldefs,
+        MQI_COLUMN_DEFINITION( "name" , MQI_VARCHAR(16) ),
+        MQI_COLUMN_DEFINITION( "zone" , MQI_VARCHAR(16) ),
+        MQI_COLUMN_DEFINITION( "pid"  , MQI_UNSIGNED    ),
+        MQI_COLUMN_DEFINITION( "state", MQI_INTEGER     )
+    );
+
+    MQI_INDEX_DEFINITION(owners_indexdef,
+        MQI_INDEX_COLUMN("name")
+    );
+
+    MQI_COLUMN_SELECTION_LIST(owners_columns,
+        MQI_COLUMN_SELECTOR( 0, owner_t, name  ),
+        MQI_COLUMN_SELECTOR( 1, owner_t, zone  ),
+        MQI_COLUMN_SELECTOR( 2, owner_t, pid   ),
+        MQI_COLUMN_SELECTOR( 3, owner_t, state )
+    );
+
+    MQI_COLUMN_SELECTION_LIST(owners_zone_column,
+        MQI_COLUMN_SELECTOR( 1, owner_t, zone  )
+    );
+
+    static const char *zones[] = { "driver", "passenger", "rear" };
+    static char       *names[12];
+    static char       *driver = "driver";
+    static char       *rear   = "rear";
+    static uint32_t    pidmin = 105;
+    static uint32_t    pidmax = 108;
+    static int32_t     active = 1;
+    static char       *zone_columns[]  = { "zone", NULL };
+    static char       *pid_columns[]   = { "pid", NULL };
+    static char       *state_columns[] = { "zone", "state", NULL };
+
+    MQI_WHERE_CLAUSE(in_driver,
+        MQI_EQUAL( MQI_COLUMN(1), MQI_STRING_VAR(driver) )
+    );
+
+    MQI_WHERE_CLAUSE(in_rear,
+        MQI_EQUAL( MQI_COLUMN(1), MQI_STRING_VAR(rear) )
+    );
+
+    MQI_WHERE_CLAUSE(active_in_driver,
+        MQI_EQUAL( MQI_COLUMN(1), MQI_STRING_VAR(driver) ) MQI_AND
+        MQI_EQUAL( MQI_COLUMN(3), MQI_INTEGER_VAR(active) )
+    );
+
+    MQI_WHERE_CLAUSE(pid_range,
+        MQI_GREATER_OR_EQUAL( MQI_COLUMN(2), MQI_UNSIGNED_VAR(pidmin) ) MQI_AND
+        MQI_LESS_OR_EQUAL( MQI_COLUMN(2), MQI_UNSIGNED_VAR(pidmax) )
+    );
+
+    MQI_WHERE_CLAUSE(pid_above,
+        MQI_GREATER_OR_EQUAL( MQI_COLUMN(2), MQI_UNSIGNED_VAR(pidmin) )
+    );
+
+    owner_t       owners[12], *data[13], rows[32], upd;
+    mqi_handle_t  owners_table, tx;
+    char          buf[64], plan[256];
+    int           i, n, sts;
+
+    PREREQUISITE(open_db);
+
+    owners_table = MQI_CREATE_TABLE("owners", MQI_TEMPORARY,
+                                    owners_coldefs, owners_indexdef);
+
+    fail_if(owners_table == MQI_HANDLE_INVALID, "errno (%s)", strerror(errno));
+
+    for (i = 0;  i < (int)MQI_DIMENSION(owners);  i++) {
+        snprintf(buf, sizeof(buf), "owner%d", i);
+        names[i] = strdup(buf);
+
+        owners[i].name  = names[i];
+        owners[i].zone  = zones[i % 3];
+        owners[i].pid   = 100 + i;
+        owners[i].state = i & 1;
+
+        data[i] = owners + i;
+    }
+    data[i] = NULL;
+
+    n = MQI_INSERT_INTO(owners_table, owners_columns, data);
+
+    fail_if(n != (int)MQI_DIMENSION(owners), "inserted %d rows instead of %d "
+            "(%s)", n, MQI_DIMENSION(owners), strerror(errno));
+
+    sts = mqi_create_named_index(owners_table, "by_zone", MQI_INDEX_HASH,
+                                 zone_columns);
+    fail_if(sts < 0, "failed to create index by_zone (%s)", strerror(errno));
+
+    sts = mqi_create_named_index(owners_table, "by_pid", MQI_INDEX_ORDERED,
+                                 pid_columns);
+    fail_if(sts < 0, "failed to create index by_pid (%s)", strerror(errno));
+
+    sts = mqi_create_named_index(owners_table, "by_state", MQI_INDEX_HASH,
+                                 state_columns);
+    fail_if(sts < 0, "failed to create index by_state (%s)", strerror(errno));
+
+    sts = mqi_create_named_index(owners_table, "by_zone", MQI_INDEX_HASH,
+                                 pid_columns);
+    fail_if(sts == 0 || errno != EEXIST, "duplicate index name accepted");
+
+    n = mqi_explain(owners_table, in_driver, plan, sizeof(plan));
+    fail_if(n < 0 || strncmp(plan, "index probe on by_zone", 22),
+            "unexpected plan '%s'", plan);
+
+    n = mqi_explain(owners_table, active_in_driver, plan, sizeof(plan));
+    fail_if(n < 0 || strncmp(plan, "index probe on by_state", 23),
+            "unexpected plan '%s'", plan);
+
+    n = mqi_explain(owners_table, pid_range, plan, sizeof(plan));
+    fail_if(n < 0 || strncmp(plan, "index range scan on by_pid", 26),
+            "unexpected plan '%s'", plan);
+
+    n = MQI_SELECT(owners_columns, owners_table, in_driver, rows);
+    fail_if(n != 4, "selected %d rows in driver zone instead of 4", n);
+
+    n = MQI_SELECT(owners_columns, owners_table, active_in_driver, rows);
+    fail_if(n != 2, "selected %d active rows in driver zone instead of 2", n);
+
+    n = MQI_SELECT(owners_columns, owners_table, pid_range, rows);
+    fail_if(n != 4, "selected %d rows in pid range instead of 4", n);
+
+    for (i = 0;  i < n;  i++) {
+        fail_if(rows[i].pid < pidmin || rows[i].pid > pidmax,
+                "selected pid %u out of range %u-%u", rows[i].pid,
+                pidmin, pidmax);
+    }
+
+    tx = MQI_BEGIN;
+    fail_if(tx == MQI_HANDLE_INVALID, "error (%s)", strerror(errno));
+
+    upd.zone = rear;
+    n = MQI_UPDATE(owners_table, owners_zone_column, &upd, in_driver);
+    fail_if(n != 4, "updated %d rows instead of 4", n);
+
+    n = MQI_SELECT(owners_columns, owners_table, in_driver, rows);
+    fail_if(n != 0, "selected %d rows in driver zone after update", n);
+
+    n = MQI_SELECT(owners_columns, owners_table, in_rear, rows);
+    fail_if(n != 8, "selected %d rows in rear zone instead of 8", n);
+
+    n = MQI_DELETE(owners_table, pid_above);
+    fail_if(n != 7, "deleted %d rows instead of 7", n);
+
+    n = MQI_SELECT(owners_columns, owners_table, in_rear, rows);
+    fail_if(n != 3, "selected %d rows in rear zone instead of 3", n);
+
+    sts = MQI_ROLLBACK(tx);
+    fail_if(sts < 0, "rollback failed (%s)", strerror(errno));
+
+    n = MQI_SELECT(owners_columns, owners_table, in_driver, rows);
+    fail_if(n != 4, "selected %d rows in driver zone after rollback", n);
+
+    n = MQI_SELECT(owners_columns, owners_table, active_in_driver, rows);
+    fail_if(n != 2, "selected %d active rows in driver zone after rollback",n);
+
+    n = MQI_SELECT(owners_columns, owners_table, pid_above, rows);
+    fail_if(n != 7, "selected %d rows above pid %u after rollback",
+            n, pidmin);
+
+    sts = mqi_drop_index(owners_table, "by_zone");
+    fail_if(sts < 0, "failed to drop index by_zone (%s)", strerror(errno));
+
+    sts = mqi_drop_index(owners_table, "by_zone");
+    fail_if(sts == 0 || errno != ENOENT, "dropped a nonexistent index");
+
+    n = mqi_explain(owners_table, in_driver, plan, sizeof(plan));
+    fail_if(n < 0 || strncmp(plan, "full scan", 9),
+            "unexpected plan '%s'", plan);
+
+    n = MQI_SELECT(owners_columns, owners_table, in_driver, rows);
+    fail_if(n != 4, "selected %d rows in driver zone instead of 4", n);
+
+    sts = mqi_drop_table(owners_table);
+    fail_if(sts < 0, "failed to drop table (%s)", strerror(errno));
+
+    for (i = 0;  i < (int)MQI_DIMENSION(names);  i++)
+        free(names[i]);
+}
+END_TEST
+
+
+static int compare_settings(const void *a, const void *b)
+{
+    return strcmp(*(const char **)a, *(const char **)b);
+}
+
+START_TEST(persistent_tables)
+{
+    typedef struct {
+        const char *name;
+        int32_t     value;
+    } setting_t;
+
+    MQI_COLUMN_DEFINITION_LIST(settings_coldefs,
+        MQI_COLUMN_DEFINITION( "name" , MQI_VARCHAR(16) ),
+        MQI_COLUMN_DEFINITION( "value", MQI_INTEGER     )
+    );
+
+    MQI_INDEX_DEFINITION(settings_indexdef,
+        MQI_INDEX_COLUMN("name")
+    );
+
+    MQI_COLUMN_SELECTION_LIST(settings_columns,
+        MQI_COLUMN_SELECTOR( 0, setting_t, name  ),
+        MQI_COLUMN_SELECTOR( 1, setting_t, value )
+    );
+
+    MQI_COLUMN_SELECTION_LIST(settings_value_column,
+        MQI_COLUMN_SELECTOR( 1, setting_t, value )
+    );
+
+    static char    *names[10];
+    static int32_t  limit = 5;
+    static int32_t  large = 1000;
+    static char    *value_columns[] = { "value", NULL };
+
+    MQI_WHERE_CLAUSE(below_limit,
+        MQI_LESS( MQI_COLUMN(1), MQI_INTEGER_VAR(limit) )
+    );
+
+    MQI_WHERE_CLAUSE(above_limit,
+        MQI_GREATER( MQI_COLUMN(1), MQI_INTEGER_VAR(limit) )
+    );
+
+    MQI_WHERE_CLAUSE(at_limit,
+        MQI_EQUAL( MQI_COLUMN(1), MQI_INTEGER_VAR(limit) )
+    );
+
+    MQI_WHERE_CLAUSE(is_large,
+        MQI_GREATER_OR_EQUAL( MQI_COLUMN(1), MQI_INTEGER_VAR(large) )
+    );
+
+    setting_t     settings[10], *data[11], upd, extra;
+    setting_t     expected[32], rows[32];
+    char          expnames[32][32];
+    mqi_handle_t  table, tx;
+    char          dir[] = "/tmp/check-libmqi-XXXXXX";
+    char          buf[64], path[256], plan[256];
+    FILE         *fp;
+    int           nexpected, round;
+    int           i, n, sts;
+
+    PREREQUISITE(open_db);
+
+    fail_if(!mkdtemp(dir), "failed to create storage directory (%s)",
+            strerror(errno));
+
+    sts = mqi_open_storage(dir, 4, 0);
+    fail_if(sts < 0, "failed to open storage (%s)", strerror(errno));
+
+    table = MQI_CREATE_TABLE("settings", MQI_PERSISTENT,
+                             settings_coldefs, settings_indexdef);
+    fail_if(table == MQI_HANDLE_INVALID, "errno (%s)", strerror(errno));
+
+    sts = mqi_create_named_index(table, "by_value", MQI_INDEX_ORDERED,
+                                 value_columns);
+    fail_if(sts < 0, "failed to create index by_value (%s)", strerror(errno));
+
+    for (i = 0;  i < (int)MQI_DIMENSION(settings);  i++) {
+        snprintf(buf, sizeof(buf), "setting%d", i);
+        names[i] = strdup(buf);
+
+        settings[i].name  = names[i];
+        settings[i].value = i;
+
+        data[i] = settings + i;
+    }
+    data[i] = NULL;
+
+    n = MQI_INSERT_INTO(table, settings_columns, data);
+    fail_if(n != (int)MQI_DIMENSION(settings), "inserted %d rows instead of "
+            "%d (%s)", n, MQI_DIMENSION(settings), strerror(errno));
+
+    tx = MQI_BEGIN;
+    upd.value = large;
+    n = MQI_UPDATE(table, settings_value_column, &upd, above_limit);
+    fail_if(n != 4, "updated %d rows instead of 4", n);
+    n = MQI_DELETE(table, below_limit);
+    fail_if(n != 5, "deleted %d rows instead of 5", n);
+    sts = MQI_COMMIT(tx);
+    fail_if(sts < 0, "commit failed (%s)", strerror(errno));
+
+    tx = MQI_BEGIN;
+    n = MQI_DELETE(table, is_large);
+    fail_if(n != 4, "deleted %d rows instead of 4", n);
+    sts = MQI_ROLLBACK(tx);
+    fail_if(sts < 0, "rollback failed (%s)", strerror(errno));
+
+    /* a replace outside of a transaction is rejected and must leave no
+       stray row behind for the snapshot */
+    extra.name  = names[7];
+    extra.value = 7;
+    data[0] = &extra;
+    data[1] = NULL;
+
+    n = MQI_REPLACE(table, settings_columns, data);
+    fail_if(n >= 0 || errno != EIO, "replace outside of a transaction "
+            "returned %d (%s)", n, strerror(errno));
+
+    sts = mqi_checkpoint_storage();
+    fail_if(sts < 0, "checkpoint failed (%s)", strerror(errno));
+
+    for (round = 0;  round < 3;  round++) {
+        nexpected = MQI_SELECT(settings_columns, table, NULL, expected);
+        fail_if(nexpected < 5, "selected %d rows instead of at least 5",
+                nexpected);
+
+        qsort(expected, nexpected, sizeof(expected[0]), compare_settings);
+
+        /* the selected names point to the rows we are about to drop */
+        for (i = 0;  i < nexpected;  i++) {
+            snprintf(expnames[i], sizeof(expnames[i]), "%s",
+                     expected[i].name);
+            expected[i].name = expnames[i];
+        }
+
+        /* forget the in-memory table and recover it from the storage */
+        sts = mqi_close_storage();
+        fail_if(sts < 0, "failed to close storage (%s)", strerror(errno));
+
+        sts = mqi_drop_table(table);
+        fail_if(sts < 0, "failed to drop table (%s)", strerror(errno));
+
+        if (round == 2) {
+            snprintf(path, sizeof(path), "%s/wal", dir);
+            fail_if(!(fp = fopen(path, "a")), "can't open %s", path);
+            fprintf(fp, "torn commit group");
+            fclose(fp);
+        }
+
+        sts = mqi_open_storage(dir, 4, 0);
+        fail_if(sts < 0, "failed to reopen storage in round %d (%s)", round, strerror(errno));
+
+        table = mqi_get_table_handle("settings");
+        fail_if(table == MQI_HANDLE_INVALID, "table was not recovered");
+
+        n = MQI_SELECT(settings_columns, table, NULL, rows);
+        fail_if(n != nexpected, "recovered %d rows instead of %d", n,
+                nexpected);
+
+        qsort(rows, n, sizeof(rows[0]), compare_settings);
+
+        for (i = 0;  i < n;  i++) {
+            fail_if(strcmp(rows[i].name, expected[i].name) ||
+                    rows[i].value != expected[i].value,
+                    "recovered row %s/%d instead of %s/%d", rows[i].name,
+                    rows[i].value, expected[i].name, expected[i].value);
+        }
+
+        n = mqi_explain(table, is_large, plan, sizeof(plan));
+        fail_if(n < 0 || strncmp(plan, "index range scan on by_value", 28),
+                "unexpected plan '%s'", plan);
+
+        if (round == 0) {
+            sts = mqi_checkpoint_storage();
+            fail_if(sts < 0, "checkpoint failed (%s)", strerror(errno));
+        }
+
+        /* make some changes that only the log has */
+        tx = MQI_BEGIN;
+        upd.value = large + round + 1;
+        n = MQI_UPDATE(table, settings_value_column, &upd, is_large);
+        fail_if(n < 4, "updated %d rows instead of at least 4", n);
+        sts = MQI_COMMIT(tx);
+        fail_if(sts < 0, "commit failed (%s)", strerror(errno));
+
+        snprintf(buf, sizeof(buf), "extra%d", round);
+        extra.name  = buf;
+        extra.value = round;
+        data[0] = &extra;
+        data[1] = NULL;
+
+        n = MQI_INSERT_INTO(table, settings_columns, data);
+        fail_if(n != 1, "inserted %d rows instead of 1", n);
+
+        upd.value = large;
+        n = MQI_UPDATE(table, settings_value_column, &upd, below_limit);
+        fail_if(n != 1, "updated %d rows instead of 1", n);
+
+        n = MQI_DELETE(table, at_limit);
+        fail_if(n != (round ? 0 : 1), "deleted %d rows", n);
+
+        sts = mqi_sync_storage();
+        fail_if(sts < 0, "sync failed (%s)", strerror(errno));
+    }
+
+    sts = mqi_close_storage();
+    fail_if(sts < 0, "failed to close storage (%s)", strerror(errno));
+
+    sts = mqi_drop_table(table);
+    fail_if(sts < 0, "failed to drop table (%s)", strerror(errno));
+
+    snprintf(path, sizeof(path), "%s/snapshot", dir);
+    unlink(path);
+    snprintf(path, sizeof(path), "%s/wal", dir);
+    unlink(path);
+    rmdir(dir);
+
+    for (i = 0;  i < (int)MQI_DIMENSION(names);  i++)
+        free(names[i]);
+}
+END_TEST
+
+
+typedef struct {
+    void         (*cb)(void *);
+    void          *cb_data;
+    unsigned int   msecs;
+    int            nadd;
+    int            ndel;
+} deadline_t;
+
+static void *deadline_add(void *data, unsigned int msecs,
+                          void (*cb)(void *), void *cb_data)
+{
+    deadline_t *d = (deadline_t *)data;
+
+    d->cb      = cb;
+    d->cb_data = cb_data;
+    d->msecs   = msecs;
+    d->nadd++;
+
+    return d;
+}
+
+static void deadline_del(void *data, void *timer)
+{
+    deadline_t *d = (deadline_t *)data;
+
+    fail_if(timer != d || !d->cb, "deleting an unknown timer");
+
+    d->cb = NULL;
+    d->ndel++;
+}
+
+static off_t wal_size(const char *dir)
+{
+    struct stat st;
+    char        path[256];
+
+    snprintf(path, sizeof(path), "%s/wal", dir);
+
+    if (stat(path, &st) < 0)
+        return -1;
+
+    return st.st_size;
+}
+
+START_TEST(storage_deadline)
+{
+    typedef struct {
+        const char *name;
+        int32_t     value;
+    } setting_t;
+
+    MQI_COLUMN_DEFINITION_LIST(coldefs,
+        MQI_COLUMN_DEFINITION( "name" , MQI_VARCHAR(16) ),
+        MQI_COLUMN_DEFINITION( "value", MQI_INTEGER     )
+    );
+
+    MQI_INDEX_DEFINITION(indexdef,
+        MQI_INDEX_COLUMN("name")
+    );
+
+    MQI_COLUMN_SELECTION_LIST(columns,
+        MQI_COLUMN_SELECTOR( 0, setting_t, name  ),
+        MQI_COLUMN_SELECTOR( 1, setting_t, value )
+    );
+
+    static mqi_timer_ops_t ops = { deadline_add, deadline_del };
+
+    deadline_t    d;
+    setting_t     setting, *data[2];
+    mqi_handle_t  table;
+    char          dir[] = "/tmp/check-libmqi-XXXXXX";
+    char          path[256];
+    off_t         size;
+    int           n, sts;
+
+    PREREQUISITE(open_db);
+
+    memset(&d, 0, sizeof(d));
+
+    fail_if(!mkdtemp(dir), "failed to create storage directory (%s)",
+            strerror(errno));
+
+    sts = mqi_set_storage_timer(&ops, &d);
+    fail_if(sts < 0, "failed to set storage timer (%s)", strerror(errno));
+
+    sts = mqi_open_storage(dir, 4, 0);
+    fail_if(sts < 0, "failed to open storage (%s)", strerror(errno));
+    fail_if(d.cb != NULL, "deadline armed without pending commits");
+
+    table = MQI_CREATE_TABLE("deadline", MQI_PERSISTENT, coldefs, indexdef);
+    fail_if(table == MQI_HANDLE_INVALID, "errno (%s)", strerror(errno));
+
+    setting.name  = "volume";
+    setting.value = 7;
+    data[0] = &setting;
+    data[1] = NULL;
+
+    size = wal_size(dir);
+
+    n = MQI_INSERT_INTO(table, columns, data);
+    fail_if(n != 1, "inserted %d rows instead of 1", n);
+
+    /* below sync_commits, so the commits stay buffered... */
+    fail_if(wal_size(dir) != size, "commits were written out too early");
+    fail_if(d.cb == NULL || d.nadd != 1, "deadline timer was not armed");
+    fail_if(d.msecs == 0 || d.msecs > 1000, "unexpected deadline %u msecs",
+            d.msecs);
+
+    /* ...until the deadline expires */
+    d.cb(d.cb_data);
+
+    fail_if(d.cb != NULL || d.ndel != 1, "deadline timer was not cancelled");
+    fail_if(wal_size(dir) <= size, "deadline did not flush the commits");
+
+    /* an explicit sync cancels a pending deadline */
+    setting.name = "balance";
+    n = MQI_INSERT_INTO(table, columns, data);
+    fail_if(n != 1, "inserted %d rows instead of 1", n);
+    fail_if(d.cb == NULL || d.nadd != 2, "deadline timer was not rearmed");
+
+    sts = mqi_sync_storage();
+    fail_if(sts < 0, "sync failed (%s)", strerror(errno));
+    fail_if(d.cb != NULL || d.ndel != 2, "sync did not cancel the deadline");
+
+    sts = mqi_close_storage();
+    fail_if(sts < 0, "failed to close storage (%s)", strerror(errno));
+
+    sts = mqi_drop_table(table);
+    fail_if(sts < 0, "failed to drop table (%s)", strerror(errno));
+
+    sts = mqi_set_storage_timer(NULL, NULL);
+    fail_if(sts < 0, "failed to clear storage timer (%s)", strerror(errno));
+
+    snprintf(path, sizeof(path), "%s/snapshot", dir);
+    unlink(path);
+    snprintf(path, sizeof(path), "%s/wal", dir);
+    unlink(path);
+    rmdir(dir);
+}
+END_TEST
+
+
 static Suite *libmqi_suite(void)
 {
     Suite *s = suite_create("Murphy Query Interface - libmqi");
@@ -896,6 +1582,7 @@ static TCase *basic_tests(void)
     tcase_add_test(tc, filtered_select_from_persons);
     tcase_add_test(tc, full_select_from_persons);
     tcase_add_test(tc, select_from_persons_by_index);
+    tcase_add_test(tc, explain_select_from_persons);
     tcase_add_test(tc, update_in_persons);
     tcase_add_test(tc, delete_from_persons);
     tcase_add_test(tc, transaction_rollback);
@@ -904,6 +1591,10 @@ static TCase *basic_tests(void)
     tcase_add_test(tc, column_trigger);
     tcase_add_test(tc, sequential_transactions);
     tcase_add_test(tc, nested_transactions);
+    tcase_add_test(tc, nested_transaction_commit);
+    tcase_add_test(tc, secondary_indexes);
+    tcase_add_test(tc, persistent_tables);
+    tcase_add_test(tc, storage_deadline);
 
     return tc;
 }
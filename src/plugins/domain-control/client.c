@@ -117,13 +117,15 @@ mrp_domctl_t *mrp_domctl_create(const char *name, mrp_mainloop_t *ml,
         mrp_list_init(&dc->pending);
         dc->ml = ml;
 
-        dc->name    = mrp_strdup(name);
-        dc->tables  = mrp_allocz_array(typeof(*dc->tables) , ntable);
-        dc->watches = mrp_allocz_array(typeof(*dc->watches), nwatch);
+        dc->name     = mrp_strdup(name);
+        dc->tables   = mrp_allocz_array(typeof(*dc->tables)  , ntable);
+        dc->watches  = mrp_allocz_array(typeof(*dc->watches) , nwatch);
+        dc->replicas = mrp_allocz_array(typeof(*dc->replicas), nwatch);
 
         if (dc->name != NULL &&
-            (dc->tables  != NULL || ntable == 0) &&
-            (dc->watches != NULL || nwatch == 0)) {
+            (dc->tables   != NULL || ntable == 0) &&
+            (dc->watches  != NULL || nwatch == 0) &&
+            (dc->replicas != NULL || nwatch == 0)) {
             for (i = 0; i < ntable; i++) {
                 st = tables + i;
                 dt = dc->tables + i;
@@ -150,6 +152,7 @@ mrp_domctl_t *mrp_domctl_create(const char *name, mrp_mainloop_t *ml,
                 if (!dw->table || !dw->mql_columns || !dw->mql_where)
                     break;
 
+                dc->replicas[i].id = i;
                 dc->nwatch++;
             }
 
@@ -170,12 +173,32 @@ mrp_domctl_t *mrp_domctl_create(const char *name, mrp_mainloop_t *ml,
 }
 
 
+static void clear_replica(mrp_domctl_data_t *r)
+{
+    int i;
+
+    for (i = 0; i < r->nrow; i++)
+        mrp_free(r->rows[i]);
+
+    mrp_free(r->rows);
+    r->rows    = NULL;
+    r->nrow    = 0;
+    r->ncolumn = 0;
+}
+
+
 static void destroy_domctl(mrp_domctl_t *dc)
 {
     int i;
 
     purge_pending(dc);
 
+    if (dc->replicas != NULL) {
+        for (i = 0; i < dc->nwatch; i++)
+            clear_replica(dc->replicas + i);
+        mrp_free(dc->replicas);
+    }
+
     for (i = 0; i < dc->ntable; i++) {
         mrp_free((char *)dc->tables[i].table);
         mrp_free((char *)dc->tables[i].mql_columns);
@@ -502,9 +525,129 @@ static void process_nak(mrp_domctl_t *dc, nak_msg_t *nak)
 }
 
 
+static mrp_domctl_value_t *copy_row(mrp_domctl_value_t *src, int ncolumn)
+{
+    mrp_domctl_value_t *row;
+    size_t              size, len;
+    char               *p;
+    int                 i;
+
+    size = ncolumn * sizeof(*row);
+
+    for (i = 0; i < ncolumn; i++)
+        if (src[i].type == MRP_DOMCTL_STRING)
+            size += strlen(src[i].str) + 1;
+
+    row = mrp_alloc(size);
+
+    if (row == NULL)
+        return NULL;
+
+    memcpy(row, src, ncolumn * sizeof(*row));
+    p = (char *)(row + ncolumn);
+
+    for (i = 0; i < ncolumn; i++) {
+        if (row[i].type == MRP_DOMCTL_STRING) {
+            len = strlen(src[i].str) + 1;
+            memcpy(p, src[i].str, len);
+            row[i].str = p;
+            p += len;
+        }
+    }
+
+    return row;
+}
+
+
+static int append_rows(mrp_domctl_data_t *r, mrp_domctl_value_t **rows,
+                       int nrow)
+{
+    mrp_domctl_value_t *row;
+    int                 i;
+
+    if (nrow == 0)
+        return TRUE;
+
+    if (!mrp_reallocz(r->rows, r->nrow, r->nrow + nrow))
+        return FALSE;
+
+    for (i = 0; i < nrow; i++) {
+        if ((row = copy_row(rows[i], r->ncolumn)) == NULL)
+            return FALSE;
+
+        r->rows[r->nrow++] = row;
+    }
+
+    return TRUE;
+}
+
+
+static int remove_row(mrp_domctl_data_t *r, mrp_domctl_value_t *row)
+{
+    int i;
+
+    for (i = 0; i < r->nrow; i++) {
+        if (msg_equal_rows(r->rows[i], row, r->ncolumn)) {
+            mrp_free(r->rows[i]);
+            memmove(r->rows + i, r->rows + i + 1,
+                    (r->nrow - i - 1) * sizeof(r->rows[0]));
+            r->nrow--;
+
+            return TRUE;
+        }
+    }
+
+    return FALSE;
+}
+
+
+static int update_replica(mrp_domctl_data_t *r, mrp_domctl_data_t *d,
+                          int ndelete)
+{
+    int i;
+
+    /*
+     * Full data replaces the replica. Changes first list the deleted
+     * then the inserted rows, in the same format as the full data.
+     */
+
+    if (ndelete < 0) {
+        clear_replica(r);
+        r->ncolumn = d->ncolumn;
+
+        return append_rows(r, d->rows, d->nrow);
+    }
+
+    if (d->ncolumn != r->ncolumn)
+        return FALSE;
+
+    for (i = 0; i < ndelete; i++)
+        if (!remove_row(r, d->rows[i]))
+            return FALSE;
+
+    return append_rows(r, d->rows + ndelete, d->nrow - ndelete);
+}
+
+
 static void process_notify(mrp_domctl_t *dc, notify_msg_t *notify)
 {
-    dc->watch_cb(dc, notify->tables, notify->ntable, dc->user_data);
+    mrp_domctl_data_t *d;
+    int                i;
+
+    for (i = 0; i < notify->ntable; i++) {
+        d = notify->tables + i;
+
+        if (d->id < 0 || d->id >= dc->nwatch ||
+            !update_replica(dc->replicas + d->id, d, notify->ndelete[i])) {
+            mrp_log_error("Failed to update replica of watched table %d.",
+                          d->id);
+            mrp_domctl_disconnect(dc);
+            notify_disconnect(dc, EINVAL, "inconsistent table notification");
+            return;
+        }
+    }
+
+    dc->watch_cb(dc, dc->replicas, dc->nwatch, dc->user_data);
 }
 
 
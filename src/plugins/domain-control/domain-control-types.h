@@ -63,6 +63,7 @@ struct mrp_domctl_s {
     int                      ntable;     /* number of owned tables */
     mrp_domctl_watch_t      *watches;    /* watched tables */
     int                      nwatch;     /* number of watched tables */
+    mrp_domctl_data_t       *replicas;   /* local copies of watched tables */
     mrp_domctl_connect_cb_t  connect_cb; /* connection state change callback */
     mrp_domctl_watch_cb_t    watch_cb;   /* watched table change callback */
     void                    *user_data;  /* opqaue user data for callbacks */
@@ -74,6 +75,42 @@ struct mrp_domctl_s {
 };
 
 
+/*
+ * a row change recorded for a tracked table
+ */
+
+typedef struct {
+    mrp_domctl_value_t *values;          /* row image before or after change */
+    int                 deleted;         /* whether image was deleted */
+} pep_change_t;
+
+
+/*
+ * changed rows of a watch (deleted ones first, then inserted ones)
+ */
+
+typedef struct {
+    mrp_domctl_value_t **rows;           /* row data */
+    int                  nrow;           /* number of rows */
+    int                  ndelete;        /* number of deleted rows */
+    int                  ncolumn;        /* columns per row */
+} pep_delta_t;
+
+
+/*
+ * a precompiled select shared by identical watches of a table
+ */
+
+typedef struct {
+    char               *query;           /* MQL select statement */
+    mql_statement_t    *stmt;            /* precompiled statement, or NULL */
+    int                 failed;          /* precompilation failed */
+    mql_result_t       *result;          /* result of current notification */
+    int                 refcnt;          /* number of watches using this */
+    mrp_list_hook_t     hook;            /* to list of table selects */
+} pep_select_t;
+
+
 /*
  * a table associated with or tracked by an enforcement point
  */
@@ -88,8 +125,16 @@ struct pep_table_s {
     mqi_column_desc_t  *coldesc;         /* column descriptors */
     int                 ncolumn;         /* number of columns */
     int                 idx_col;         /* column index of index column */
+    int                *keys;            /* index columns, if any */
+    int                 nkey;            /* number of index columns */
     mrp_list_hook_t     watches;         /* watches for this table */
+    mrp_list_hook_t     selects;         /* selects of watches */
+    pep_change_t       *changes;         /* row changes since notification */
+    int                 nchange;         /* number of row changes */
+    mrp_htbl_t         *changed;         /* rows changed in current commit */
     int                 notify_all : 1;  /* notify all watches */
+    int                 tracked : 1;     /* row changes are being tracked */
+    int                 resync : 1;      /* changes lost, resync watches */
 };
 
 
@@ -102,9 +147,13 @@ struct pep_watch_s {
     char            *mql_columns;        /* column list to select */
     char            *mql_where;          /* where clause for select */
     int              max_rows;           /* max number of rows to select */
+    pep_select_t    *select;             /* select for full notifications */
     pep_proxy_t     *proxy;              /* enforcement point */
     int              id;                 /* table id within proxy */
     uint32_t         stamp;              /* last notified update stamp */
+    int             *columns;            /* selected columns, if trackable */
+    int              ncolumn;            /* number of selected columns */
+    int              notify;             /* type of pending notification */
     mrp_list_hook_t  tbl_hook;           /* hook to table watch list */
     mrp_list_hook_t  pep_hook;           /* hook to proxy watch list */
 };
@@ -119,6 +168,7 @@ typedef struct {
     void (*unref)(void *data);
     int  (*create_notify)(pep_proxy_t *proxy);
     int  (*update_notify)(pep_proxy_t *proxy, int tblid, mql_result_t *r);
+    int  (*delta_notify)(pep_proxy_t *proxy, int tblid, pep_delta_t *d);
     int  (*send_notify)(pep_proxy_t *proxy);
     void (*free_notify)(pep_proxy_t *proxy);
 } proxy_ops_t;
@@ -149,6 +199,20 @@ struct pep_proxy_s {
  * policy domain controller context
  */
 
+/*
+ * notification cycle latency histogram
+ */
+
+#define PDP_LATENCY_BUCKETS 20           /* log2 buckets, up to ~0.5 s */
+
+typedef struct {
+    uint32_t         count;              /* number of notification cycles */
+    uint64_t         total;              /* total time spent (usecs) */
+    uint64_t         max;                /* longest cycle (usecs) */
+    uint32_t         buckets[PDP_LATENCY_BUCKETS];
+} pdp_latency_t;
+
+
 struct pdp_s {
     mrp_context_t   *ctx;                /* murphy context */
     const char      *address;            /* external transport address */
@@ -160,6 +224,7 @@ struct pdp_s {
     mrp_htbl_t      *watched;            /* tracked tables by name */
     mrp_deferred_t  *notify;             /* deferred notification */
     int              notify_scheduled;   /* is notification scheduled? */
+    pdp_latency_t    latency;            /* notification cycle latencies */
 };
 
 
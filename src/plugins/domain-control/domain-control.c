@@ -390,6 +390,21 @@ static int msg_op_update_notify(pep_proxy_t *proxy, int tblid, mql_result_t *r)
 }
 
 
+static int msg_op_delta_notify(pep_proxy_t *proxy, int tblid, pep_delta_t *d)
+{
+    int n;
+
+    n = msg_update_notify_delta((mrp_msg_t *)proxy->notify_msg, tblid, d);
+
+    if (n >= 0) {
+        proxy->notify_ncolumn += n;
+        proxy->notify_ntable++;
+    }
+
+    return n;
+}
+
+
 static int msg_op_send_notify(pep_proxy_t *proxy)
 {
     mrp_msg_t *msg     = proxy->notify_msg;
@@ -417,6 +432,7 @@ static void msg_connect_cb(mrp_transport_t *t, void *user_data)
         .unref         = msg_op_unref_msg,
         .create_notify = msg_op_create_notify,
         .update_notify = msg_op_update_notify,
+        .delta_notify  = msg_op_delta_notify,
         .send_notify   = msg_op_send_notify,
         .free_notify   = msg_op_free_notify,
     };
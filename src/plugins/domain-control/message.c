@@ -475,11 +475,11 @@ msg_t *msg_decode_set(mrp_msg_t *msg)
             goto fail;
 
         /* Check if we go over the possible total */
-        if (ncol > ntotal || columns_so_far + ncol > ntotal)
+        if (columns_so_far + (uint64_t)nrow * ncol > ntotal)
             goto fail;
 
-        /* If we are not overflowing, add ncol to count */
-        columns_so_far += ncol;
+        /* If we are not overflowing, add the values to the count */
+        columns_so_far += (uint64_t)nrow * ncol;
 
         for (r = 0; r < nrow; r++) {
             d->rows[r] = v;
@@ -551,6 +551,7 @@ void msg_free_notify(msg_t *msg)
         }
 
         mrp_free(notify->tables);
+        mrp_free(notify->ndelete);
         unref_wire((msg_t *)notify);
         mrp_free(notify);
     }
@@ -593,9 +594,11 @@ int msg_update_notify(mrp_msg_t *msg, int tblid, mql_result_t *r)
         nrow = ncol = 0;
 
     tid = tblid;
-    if (!mrp_msg_append(msg, MSG_UINT16(TBLID, tid))  ||
-        !mrp_msg_append(msg, MSG_UINT16(NROW , nrow)) ||
-        !mrp_msg_append(msg, MSG_UINT16(NCOL , ncol)))
+    if (!mrp_msg_append(msg, MSG_UINT16(TBLID  , tid))   ||
+        !mrp_msg_append(msg, MSG_UINT16(NROW   , nrow))  ||
+        !mrp_msg_append(msg, MSG_UINT16(NCOL   , ncol))  ||
+        !mrp_msg_append(msg, MSG_BOOL  (DELTA  , FALSE)) ||
+        !mrp_msg_append(msg, MSG_UINT16(NDELETE, 0)))
         goto fail;
 
     for (i = 0; i < ncol; i++)
@@ -639,6 +642,119 @@ int msg_update_notify(mrp_msg_t *msg, int tblid, mql_result_t *r)
 }
 
 
+int msg_update_notify_delta(mrp_msg_t *msg, int tblid, pep_delta_t *d)
+{
+    uint16_t            tid, nrow, ncol, ndel;
+    mrp_domctl_value_t *v;
+    int                 i, j;
+
+    tid  = tblid;
+    nrow = d->nrow;
+    ncol = d->ncolumn;
+    ndel = d->ndelete;
+
+    if (!mrp_msg_append(msg, MSG_UINT16(TBLID  , tid))  ||
+        !mrp_msg_append(msg, MSG_UINT16(NROW   , nrow)) ||
+        !mrp_msg_append(msg, MSG_UINT16(NCOL   , ncol)) ||
+        !mrp_msg_append(msg, MSG_BOOL  (DELTA  , TRUE)) ||
+        !mrp_msg_append(msg, MSG_UINT16(NDELETE, ndel)))
+        goto fail;
+
+    for (i = 0; i < nrow; i++) {
+        for (j = 0; j < ncol; j++) {
+            v = d->rows[i] + j;
+
+            switch (v->type) {
+            case MRP_DOMCTL_STRING:
+                if (!mrp_msg_append(msg, MSG_STRING(DATA, v->str)))
+                    goto fail;
+                break;
+            case MRP_DOMCTL_INTEGER:
+                if (!mrp_msg_append(msg, MSG_SINT32(DATA, v->s32)))
+                    goto fail;
+                break;
+            case MRP_DOMCTL_UNSIGNED:
+                if (!mrp_msg_append(msg, MSG_UINT32(DATA, v->u32)))
+                    goto fail;
+                break;
+            case MRP_DOMCTL_DOUBLE:
+                if (!mrp_msg_append(msg, MSG_DOUBLE(DATA, v->dbl)))
+                    goto fail;
+                break;
+            default:
+                goto fail;
+            }
+        }
+    }
+
+    return nrow * ncol;
+
+ fail:
+    return -1;
+}
+
+
+uint32_t msg_hash_row(mrp_domctl_value_t *v, int ncolumn)
+{
+    uint32_t    h = 0;
+    uint64_t    u;
+    const char *p;
+    int         i;
+
+    for (i = 0; i < ncolumn; i++, v++) {
+        switch (v->type) {
+        case MRP_DOMCTL_STRING:
+            for (p = v->str; *p; p++)
+                h = 31 * h + (unsigned char)*p;
+            break;
+        case MRP_DOMCTL_DOUBLE:
+            memcpy(&u, &v->dbl, sizeof(u));
+            h = 31 * h + (uint32_t)(u ^ (u >> 32));
+            break;
+        default:
+            h = 31 * h + v->u32;
+            break;
+        }
+    }
+
+    return h;
+}
+
+
+int msg_equal_rows(mrp_domctl_value_t *a, mrp_domctl_value_t *b, int ncolumn)
+{
+    int i;
+
+    for (i = 0; i < ncolumn; i++, a++, b++) {
+        if (a->type != b->type)
+            return FALSE;
+
+        switch (a->type) {
+        case MRP_DOMCTL_STRING:
+            if (strcmp(a->str, b->str))
+                return FALSE;
+            break;
+        case MRP_DOMCTL_INTEGER:
+            if (a->s32 != b->s32)
+                return FALSE;
+            break;
+        case MRP_DOMCTL_UNSIGNED:
+            if (a->u32 != b->u32)
+                return FALSE;
+            break;
+        case MRP_DOMCTL_DOUBLE:
+            if (a->dbl != b->dbl)
+                return FALSE;
+            break;
+        default:
+            return FALSE;
+        }
+    }
+
+    return TRUE;
+}
+
+
 msg_t *msg_decode_notify(mrp_msg_t *msg)
 {
     notify_msg_t       *notify;
@@ -647,8 +763,9 @@ msg_t *msg_decode_notify(mrp_msg_t *msg)
     void               *it;
     uint64_t            columns_so_far;
     uint32_t            seqno;
-    uint16_t            ntable, ntotal, nrow, ncol;
+    uint16_t            ntable, ntotal, nrow, ncol, ndel;
     uint16_t            tblid;
+    bool                delta;
     int                 t, r, c;
     uint16_t            type;
     mrp_msg_value_t     value;
@@ -676,6 +793,11 @@ msg_t *msg_decode_notify(mrp_msg_t *msg)
     if (notify->tables == NULL && ntable != 0)
         goto fail;
 
+    notify->ndelete = mrp_allocz(sizeof(*notify->ndelete) * ntable);
+
+    if (notify->ndelete == NULL && ntable != 0)
+        goto fail;
+
     values = ntotal ? mrp_allocz(sizeof(*values) * ntotal) : NULL;
 
     if (values == NULL && ntotal != 0)
@@ -686,9 +808,11 @@ msg_t *msg_decode_notify(mrp_msg_t *msg)
 
     for (t = 0; t < ntable; t++) {
         if (!mrp_msg_iterate_get(msg, &it,
-                                 MSG_UINT16(TBLID, &tblid),
-                                 MSG_UINT16(NROW , &nrow ),
-                                 MSG_UINT16(NCOL , &ncol ),
+                                 MSG_UINT16(TBLID  , &tblid),
+                                 MSG_UINT16(NROW   , &nrow ),
+                                 MSG_UINT16(NCOL   , &ncol ),
+                                 MSG_BOOL  (DELTA  , &delta),
+                                 MSG_UINT16(NDELETE, &ndel ),
                                  MSG_END))
             goto fail;
 
@@ -700,12 +824,17 @@ msg_t *msg_decode_notify(mrp_msg_t *msg)
         if (d->rows == NULL && nrow != 0)
             goto fail;
 
+        if (ndel > nrow)
+            goto fail;
+
+        notify->ndelete[t] = delta ? ndel : -1;
+
         /* Check if we go over the possible total */
-        if (ncol > ntotal || columns_so_far + ncol > ntotal)
+        if (columns_so_far + (uint64_t)nrow * ncol > ntotal)
             goto fail;
 
-        /* If we are not overflowing, add ncol to count */
-        columns_so_far += ncol;
+        /* If we are not overflowing, add the values to the count */
+        columns_so_far += (uint64_t)nrow * ncol;
 
         for (r = 0; r < nrow; r++) {
             d->rows[r] = v;
@@ -74,6 +74,8 @@ typedef enum {
     MSGTAG_NROW    = 0x6,            /* number of table rows */
     MSGTAG_NCOL    = 0x7,            /* number of columns in a row */
     MSGTAG_DATA    = 0x8,            /* a data column */
+    MSGTAG_DELTA   = 0x9,            /* whether rows are changes only */
+    MSGTAG_NDELETE = 0xa,            /* number of deleted rows in changes */
 
     /* fixed tags in invoke and return messages */
     MSGTAG_METHOD  = 0x3,            /* method name */
@@ -136,6 +138,7 @@ typedef struct {
     COMMON_MSG_FIELDS;
     mrp_domctl_data_t *tables;           /* data in changed tables */
     int                ntable;           /* number of changed tables */
+    int               *ndelete;          /* deleted rows, -1 for full data */
 } notify_msg_t;
 
 
@@ -195,6 +198,10 @@ void msg_free_message(msg_t *msg);
 
 mrp_msg_t *msg_create_notify(void);
 int msg_update_notify(mrp_msg_t *msg, int tblid, mql_result_t *r);
+int msg_update_notify_delta(mrp_msg_t *msg, int tblid, pep_delta_t *d);
+
+int msg_equal_rows(mrp_domctl_value_t *a, mrp_domctl_value_t *b, int ncolumn);
+uint32_t msg_hash_row(mrp_domctl_value_t *v, int ncolumn);
 
 mrp_json_t *json_create_notify(void);
 int json_update_notify(mrp_json_t *msg, int tblid, mql_result_t *r);
@@ -27,6 +27,10 @@
  * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
  */
 
+#include <stdio.h>
+#include <string.h>
+#include <time.h>
+
 #include <murphy/common/mm.h>
 #include <murphy/common/log.h>
 
@@ -38,6 +42,17 @@
 #include "notify.h"
 
 
+/*
+ * type of pending watch notification
+ */
+
+enum {
+    WATCH_NOTIFY_NONE = 0,               /* watch is up to date */
+    WATCH_NOTIFY_DELTA,                  /* send changed rows only */
+    WATCH_NOTIFY_FULL,                   /* send full selection */
+};
+
+
 static void prepare_proxy_notification(pep_proxy_t *proxy)
 {
     proxy->notify_update  = FALSE;
@@ -51,20 +66,143 @@ static void check_watch_notification(pep_watch_t *w)
 {
     pep_proxy_t *proxy = w->proxy;
     pep_table_t *t     = w->table;
-    int          update;
 
     if (t->notify_all) {
-        t->h   = mqi_get_table_handle(t->name);
-        update = TRUE;
+        t->h      = mqi_get_table_handle(t->name);
+        w->notify = WATCH_NOTIFY_FULL;
     }
     else {
-        if (t->h != MQI_HANDLE_INVALID)
-            update = (w->stamp < mqi_get_table_stamp(t->h));
+        if (t->h != MQI_HANDLE_INVALID &&
+            w->stamp != mqi_get_table_stamp(t->h)) {
+            if (t->tracked && !t->resync && w->columns != NULL &&
+                proxy->ops->delta_notify != NULL)
+                w->notify = WATCH_NOTIFY_DELTA;
+            else
+                w->notify = WATCH_NOTIFY_FULL;
+        }
         else
-            update = FALSE;
+            w->notify = WATCH_NOTIFY_NONE;
     }
 
-    proxy->notify_update |= update;
+    proxy->notify_update |= (w->notify != WATCH_NOTIFY_NONE);
+}
+
+
+static int cancel_changes(pep_table_t *t, mrp_domctl_value_t **rows, int ncol,
+                          int *dropped)
+{
+    int      nbucket, *heads, *next, i, j, n;
+    uint32_t mask;
+
+    /*
+     * Drop every deleted row that has an identical inserted pair. This
+     * leaves us with the net changes since the last notification (and
+     * also takes care of updates that did not touch watched columns).
+     */
+
+    n = t->nchange;
+
+    for (nbucket = 16; nbucket < n; nbucket <<= 1)
+        ;
+    mask = nbucket - 1;
+
+    heads = mrp_alloc_array(int, nbucket + n);
+
+    if (heads == NULL)
+        return -1;
+
+    next = heads + nbucket;
+    memset(heads, -1, sizeof(*heads) * nbucket);
+
+    for (i = 0; i < n; i++) {
+        dropped[i] = FALSE;
+
+        if (t->changes[i].deleted) {
+            j        = msg_hash_row(rows[i], ncol) & mask;
+            next[i]  = heads[j];
+            heads[j] = i;
+        }
+    }
+
+    for (i = 0; i < n; i++) {
+        if (t->changes[i].deleted)
+            continue;
+
+        j = heads[msg_hash_row(rows[i], ncol) & mask];
+
+        for (; j >= 0; j = next[j]) {
+            if (!dropped[j] && msg_equal_rows(rows[i], rows[j], ncol)) {
+                dropped[i] = dropped[j] = TRUE;
+                break;
+            }
+        }
+    }
+
+    mrp_free(heads);
+
+    return 0;
+}
+
+
+static int collect_watch_delta(pep_watch_t *w)
+{
+    pep_proxy_t         *proxy = w->proxy;
+    pep_table_t         *t     = w->table;
+    int                  n     = t->nchange;
+    int                  ncol  = w->ncolumn;
+    mrp_domctl_value_t  *values, **rows, *v;
+    int                 *dropped;
+    pep_delta_t          d;
+    int                  i, j, status;
+
+    if (n == 0)
+        return 0;
+
+    rows    = mrp_allocz_array(typeof(*rows), 2 * n);
+    values  = mrp_allocz_array(typeof(*values), n * ncol);
+    dropped = mrp_allocz_array(typeof(*dropped), n);
+    status  = -1;
+
+    if (rows == NULL || values == NULL || dropped == NULL)
+        goto out;
+
+    for (i = 0, v = values; i < n; i++, v += ncol) {
+        rows[i] = v;
+        for (j = 0; j < ncol; j++)
+            v[j] = t->changes[i].values[w->columns[j]];
+    }
+
+    if (cancel_changes(t, rows, ncol, dropped) < 0)
+        goto out;
+
+    mrp_clear(&d);
+    d.rows    = rows + n;
+    d.ncolumn = ncol;
+
+    for (i = 0; i < n; i++)
+        if (!dropped[i] && t->changes[i].deleted)
+            d.rows[d.nrow++] = rows[i];
+
+    d.ndelete = d.nrow;
+
+    for (i = 0; i < n; i++)
+        if (!dropped[i] && !t->changes[i].deleted)
+            d.rows[d.nrow++] = rows[i];
+
+    mrp_debug("%d deleted, %d inserted rows of %d changes for %s",
+              d.ndelete, d.nrow - d.ndelete, n, proxy->name);
+
+    if (d.nrow > 0)
+        status = proxy->ops->delta_notify(proxy, w->id, &d);
+    else
+        status = 0;
+
+ out:
+    mrp_free(rows);
+    mrp_free(values);
+    mrp_free(dropped);
+
+    return status;
 }
 
 
@@ -81,22 +219,28 @@ static int collect_watch_notification(pep_watch_t *w)
             goto fail;
     }
 
-    if (w->table->h != MQI_HANDLE_INVALID) {
-        if (!exec_mql(mql_result_rows, &r, "select %s from %s%s%s",
-                      w->mql_columns, w->table->name,
-                      w->mql_where[0] ? " where " : "", w->mql_where)) {
-            mrp_debug("select from table %s failed", w->table->name);
-            goto fail;
+    if (w->notify == WATCH_NOTIFY_DELTA && !proxy->notify_all)
+        n = collect_watch_delta(w);
+    else {
+        /* the result is shared by all watches with the same select */
+        if (w->table->h != MQI_HANDLE_INVALID) {
+            if ((r = select_watch_data(w)) == NULL) {
+                mrp_debug("select from table %s failed", w->table->name);
+                goto fail;
+            }
         }
-    }
 
-    n = proxy->ops->update_notify(proxy, w->id, r);
+        n = proxy->ops->update_notify(proxy, w->id, r);
+    }
 
-    if (r != NULL)
-        mql_result_free(r);
+    if (n >= 0) {
+        if (w->table->h != MQI_HANDLE_INVALID)
+            w->stamp = mqi_get_table_stamp(w->table->h);
+        else
+            w->stamp = 0;
 
-    if (n >= 0)
         return TRUE;
+    }
     else {
     fail:
         proxy->ops->free_notify(proxy);
@@ -113,34 +257,130 @@ static int send_proxy_notification(pep_proxy_t *proxy)
         return TRUE;
 
     if (!proxy->notify_fail) {
-        mrp_debug("notifying client %s", proxy->name);
+        if (proxy->notify_ntable > 0 || proxy->notify_all) {
+            mrp_debug("notifying client %s", proxy->name);
+            proxy->ops->send_notify(proxy);
+        }
 
-        proxy->ops->send_notify(proxy);
         proxy->ops->free_notify(proxy);
+        proxy->notify_all = FALSE;
     }
-    else
+    else {
         mrp_log_error("Failed to generate/send notification to %s.",
                       proxy->name);
 
+        /* the client is out of sync now, send full data next time */
+        proxy->notify_all = TRUE;
+    }
+
     proxy->notify_msg     = NULL;
     proxy->notify_ntable  = 0;
     proxy->notify_ncolumn = 0;
     proxy->notify_fail    = FALSE;
-    proxy->notify_all     = FALSE;
 
     return TRUE;
 }
 
 
+static uint64_t time_usecs(void)
+{
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+
+    return (uint64_t)ts.tv_sec * 1000000 + ts.tv_nsec / 1000;
+}
+
+
+static void update_latency(pdp_latency_t *l, uint64_t usecs)
+{
+    int i;
+
+    for (i = 0; i < PDP_LATENCY_BUCKETS - 1 && (usecs >> (i + 1)) != 0; i++)
+        ;
+
+    l->buckets[i]++;
+    l->count++;
+    l->total += usecs;
+
+    if (usecs > l->max)
+        l->max = usecs;
+}
+
+
+void reset_notify_latency(pdp_t *pdp)
+{
+    mrp_clear(&pdp->latency);
+}
+
+
+int print_notify_latency(pdp_t *pdp, char *buf, size_t size)
+{
+    pdp_latency_t *l = &pdp->latency;
+    char          *p = buf;
+    int            l_max, i, j, n, width;
+
+#define P(fmt, args...) do {                                            \
+        n = snprintf(p, size, fmt, ## args);                            \
+        if (n >= (int)size)                                             \
+            return (p - buf) + n;                                       \
+        p    += n;                                                      \
+        size -= n;                                                      \
+    } while (0)
+
+    P("%u notification cycles", l->count);
+
+    if (l->count == 0) {
+        P("\n");
+        return p - buf;
+    }
+
+    P(", average %llu usecs, max. %llu usecs\n",
+      (unsigned long long)(l->total / l->count),
+      (unsigned long long)l->max);
+
+    for (i = 0, l_max = 0; i < PDP_LATENCY_BUCKETS; i++)
+        if ((int)l->buckets[i] > l_max)
+            l_max = l->buckets[i];
+
+    for (i = 0; i < PDP_LATENCY_BUCKETS; i++) {
+        if (l->buckets[i] == 0)
+            continue;
+
+        if (i == 0)
+            P("  %8s < %-8u: %8u ", "", 2, l->buckets[i]);
+        else if (i < PDP_LATENCY_BUCKETS - 1)
+            P("  %8u - %-8u: %8u ", 1U << i, (1U << (i + 1)) - 1,
+              l->buckets[i]);
+        else
+            P("  %8s >= %-7u: %8u ", "", 1U << i, l->buckets[i]);
+
+        width = (int)((uint64_t)l->buckets[i] * 40 / l_max);
+
+        for (j = 0; j < (width ? width : 1); j++)
+            P("#");
+
+        P("\n");
+    }
+
+#undef P
+
+    return p - buf;
+}
+
+
 void notify_table_changes(pdp_t *pdp)
 {
     mrp_list_hook_t *p, *n, *wp, *wn;
     pep_proxy_t     *proxy;
     pep_table_t     *t;
     pep_watch_t     *w;
+    uint64_t         start;
 
     mrp_debug("notifying clients about table changes");
 
+    start = time_usecs();
+
     mrp_list_foreach(&pdp->proxies, p, n) {
         proxy = mrp_list_entry(p, typeof(*proxy), hook);
         prepare_proxy_notification(proxy);
@@ -157,12 +397,23 @@ void notify_table_changes(pdp_t *pdp)
         t->notify_all = FALSE;
     }
 
+    /*
+     * Clients with a delta-capable transport keep a replica of their
+     * watched tables, so they only need the watches that did change.
+     * Others always get the full data of all their watches.
+     */
+
     mrp_list_foreach(&pdp->proxies, p, n) {
         proxy = mrp_list_entry(p, typeof(*proxy), hook);
 
         if (proxy->notify_update || proxy->notify_all) {
             mrp_list_foreach(&proxy->watches, wp, wn) {
                 w = mrp_list_entry(wp, typeof(*w), pep_hook);
+
+                if (w->notify == WATCH_NOTIFY_NONE && !proxy->notify_all &&
+                    proxy->ops->delta_notify != NULL)
+                    continue;
+
                 if (!collect_watch_notification(w))
                     break;
             }
@@ -170,4 +421,12 @@ void notify_table_changes(pdp_t *pdp)
             send_proxy_notification(proxy);
         }
     }
+
+    mrp_list_foreach(&pdp->tables, p, n) {
+        t = mrp_list_entry(p, typeof(*t), hook);
+        purge_table_changes(t);
+        reset_table_selects(t);
+    }
+
+    update_latency(&pdp->latency, time_usecs() - start);
 }
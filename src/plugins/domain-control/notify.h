@@ -34,4 +34,7 @@
 
 void notify_table_changes(pdp_t *pdp);
 
+void reset_notify_latency(pdp_t *pdp);
+int print_notify_latency(pdp_t *pdp, char *buf, size_t size);
+
 #endif /* __MURPHY_DOMAIN_CONTROL_NOTIFY_H__ */
@@ -27,6 +27,9 @@
  * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
  */
 
+#include <stdio.h>
+#include <string.h>
+
 #include <murphy/common/macros.h>
 
 #include <murphy/core/plugin.h>
@@ -35,6 +38,7 @@
 #include "domain-control-types.h"
 #include "domain-control.h"
 #include "client.h"
+#include "notify.h"
 
 #define DEFAULT_EXTADDR MRP_DEFAULT_DOMCTL_ADDRESS
 #define NO_ADDR         NULL
@@ -89,6 +93,26 @@ static void cmd_cb(mrp_console_t *c, void *user_data, int argc, char **argv)
 }
 
 
+static void latency_cb(mrp_console_t *c, void *user_data,
+                       int argc, char **argv)
+{
+    mrp_plugin_t *plugin = (mrp_plugin_t *)user_data;
+    pdp_t        *pdp    = (pdp_t *)plugin->data;
+    char          buf[4096];
+
+    MRP_UNUSED(c);
+
+    if (argc == 3 && !strcmp(argv[2], "reset")) {
+        reset_notify_latency(pdp);
+        printf("notification latencies reset\n");
+        return;
+    }
+
+    print_notify_latency(pdp, buf, sizeof(buf));
+    printf("%s", buf);
+}
+
+
 #define DOMCTL_DESCRIPTION "Murphy domain-control plugin."
 #define DOMCTL_HELP                                                         \
     "The domain-control plugin provides a control interface for Murphy\n"    \
@@ -108,6 +132,12 @@ static void cmd_cb(mrp_console_t *c, void *user_data, int argc, char **argv)
 MRP_CONSOLE_GROUP(domctl_commands, "domain-control", NULL, NULL, {
         MRP_TOKENIZED_CMD("cmd", cmd_cb, TRUE,
                           "cmd [args]", "a command", "A command..."),
+        MRP_TOKENIZED_CMD("latency", latency_cb, FALSE,
+                          "latency [reset]",
+                          "show notification latencies",
+                          "Show a histogram of the time (in usecs) spent "
+                          "in collecting and sending table change "
+                          "notifications to clients, or reset it."),
 });
 
 static mrp_plugin_arg_t domctl_args[] = {
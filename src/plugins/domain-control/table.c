@@ -29,6 +29,7 @@
 
 #include <errno.h>
 #include <stdarg.h>
+#include <strings.h>
 
 #include <murphy/common/debug.h>
 #include <murphy/common/mm.h>
@@ -39,6 +40,7 @@
 #include <murphy-db/mql.h>
 
 #include "domain-control.h"
+#include "message.h"
 #include "table.h"
 
 #define FAIL(ec, msg) do {                      \
@@ -47,7 +49,25 @@
         goto fail;                              \
     } while (0)
 
+#define CHANGES_MAX   4096               /* max. row changes to track */
+#define CHANGES_CHUNK   64               /* change buffer allocation unit */
+
+/*
+ * a row changed in the current commit
+ */
+
+typedef struct {
+    mrp_domctl_value_t *before;          /* recorded image before the commit */
+    mqi_bitfld_t        restored;        /* columns restored in the image */
+} changed_row_t;
+
 static pep_table_t *lookup_watch_table(pdp_t *pdp, const char *name);
+static int reset_changed_rows_cb(void *key, void *object, void *user_data);
+static int get_table_description(pep_table_t *t);
+static void track_table_changes(pep_table_t *t);
+static void untrack_table_changes(pep_table_t *t);
+static void map_watch_columns(pep_watch_t *w);
+static void invalidate_table_selects(pep_table_t *t);
 
 /*
  * proxied and tracked tables
@@ -78,6 +98,16 @@ static void table_event_cb(mqi_event_t *e, void *user_data)
     if (t != NULL) {
         t->notify_all = TRUE;
         t->h          = h;
+
+        /* the triggers of a dropped table are gone with the table */
+        t->tracked = FALSE;
+        purge_table_changes(t);
+
+        /* and so is the table handle of the precompiled selects */
+        invalidate_table_selects(t);
+
+        if (e->event == mqi_table_created)
+            track_table_changes(t);
     }
 
     schedule_notification(pdp);
@@ -91,6 +121,8 @@ static void transaction_event_cb(mqi_event_t *e, void *user_data)
     switch (e->event) {
     case mqi_transaction_end:
         mrp_debug("transaction ended");
+        if (pdp->watched != NULL)
+            mrp_htbl_foreach(pdp->watched, reset_changed_rows_cb, NULL);
         if (mqi_get_transaction_depth() == 1) {
             mrp_debug("was not nested, scheduling notification");
             schedule_notification(pdp);
@@ -211,6 +243,8 @@ static int get_table_description(pep_table_t *t)
         ncolumn = mqi_describe(t->h, columns, MRP_ARRAY_SIZE(columns));
 
         if (ncolumn > 0) {
+            mrp_free(t->columns);
+            mrp_free(t->coldesc);
             t->columns = mrp_allocz_array(typeof(*t->columns), ncolumn);
             t->coldesc = mrp_allocz_array(typeof(*t->coldesc), ncolumn + 1);
 
@@ -235,6 +269,433 @@ static int get_table_description(pep_table_t *t)
 }
 
 
+static mrp_domctl_value_t *copy_row_image(pep_table_t *t,
+                                          mrp_domctl_value_t *image)
+{
+    mrp_domctl_value_t *values;
+    int                 i;
+
+    values = mrp_allocz_array(typeof(*values), t->ncolumn);
+
+    if (values == NULL)
+        return NULL;
+
+    for (i = 0; i < t->ncolumn; i++) {
+        switch (t->columns[i].type) {
+        case mqi_varchar:
+            values[i].type = MRP_DOMCTL_STRING;
+            values[i].str  = mrp_strdup(image[i].str);
+            if (values[i].str == NULL)
+                goto fail;
+            break;
+        case mqi_integer:
+            values[i].type = MRP_DOMCTL_INTEGER;
+            values[i].s32  = image[i].s32;
+            break;
+        case mqi_unsignd:
+            values[i].type = MRP_DOMCTL_UNSIGNED;
+            values[i].u32  = image[i].u32;
+            break;
+        case mqi_floating:
+            values[i].type = MRP_DOMCTL_DOUBLE;
+            values[i].dbl  = image[i].dbl;
+            break;
+        default:
+            goto fail;
+        }
+    }
+
+    return values;
+
+ fail:
+    while (--i >= 0)
+        if (values[i].type == MRP_DOMCTL_STRING)
+            mrp_free((char *)values[i].str);
+    mrp_free(values);
+
+    return NULL;
+}
+
+
+static void free_row_image(pep_table_t *t, mrp_domctl_value_t *values)
+{
+    int i;
+
+    if (values != NULL) {
+        for (i = 0; i < t->ncolumn; i++)
+            if (values[i].type == MRP_DOMCTL_STRING)
+                mrp_free((char *)values[i].str);
+
+        mrp_free(values);
+    }
+}
+
+
+static int changed_row_comp(const void *key1, const void *key2)
+{
+    return (key1 == key2 ? 0 : (key1 < key2 ? -1 : 1));
+}
+
+
+static uint32_t changed_row_hash(const void *key)
+{
+    return (uint32_t)(((ptrdiff_t)key) >> 4);
+}
+
+
+static void changed_row_free(void *key, void *object)
+{
+    MRP_UNUSED(key);
+
+    mrp_free(object);
+}
+
+
+static void reset_changed_rows(pep_table_t *t)
+{
+    if (t->changed != NULL)
+        mrp_htbl_reset(t->changed, TRUE);
+}
+
+
+static int reset_changed_rows_cb(void *key, void *object, void *user_data)
+{
+    MRP_UNUSED(key);
+    MRP_UNUSED(user_data);
+
+    reset_changed_rows((pep_table_t *)object);
+
+    return MRP_HTBL_ITER_MORE;
+}
+
+
+void purge_table_changes(pep_table_t *t)
+{
+    int i;
+
+    for (i = 0; i < t->nchange; i++)
+        free_row_image(t, t->changes[i].values);
+
+    mrp_free(t->changes);
+
+    t->changes = NULL;
+    t->nchange = 0;
+    t->resync  = FALSE;
+
+    reset_changed_rows(t);
+}
+
+
+static void lose_table_changes(pep_table_t *t)
+{
+    mrp_debug("too many or untrackable changes in table %s", t->name);
+
+    purge_table_changes(t);
+    t->resync = TRUE;
+}
+
+
+static mrp_domctl_value_t *record_change(pep_table_t *t,
+                                         mrp_domctl_value_t *image, int deleted)
+{
+    pep_change_t *c;
+
+    if (t->resync)
+        return NULL;
+
+    if (t->nchange >= CHANGES_MAX)
+        goto lost;
+
+    if ((t->nchange % CHANGES_CHUNK) == 0) {
+        if (!mrp_reallocz(t->changes, t->nchange, t->nchange + CHANGES_CHUNK))
+            goto lost;
+    }
+
+    c = t->changes + t->nchange;
+    c->values  = copy_row_image(t, image);
+    c->deleted = deleted;
+
+    if (c->values == NULL)
+        goto lost;
+
+    t->nchange++;
+
+    return c->values;
+
+ lost:
+    lose_table_changes(t);
+
+    return NULL;
+}
+
+
+static changed_row_t *add_changed_row(pep_table_t *t, const void *row,
+                                      mrp_domctl_value_t *before)
+{
+    changed_row_t *r;
+
+    if ((r = mrp_allocz(sizeof(*r))) != NULL) {
+        r->before = before;
+
+        if (mrp_htbl_insert(t->changed, (void *)row, r))
+            return r;
+
+        mrp_free(r);
+    }
+
+    lose_table_changes(t);
+
+    return NULL;
+}
+
+
+static int tracking_changes(pep_table_t *t)
+{
+    if (t->resync)
+        return FALSE;
+
+    /*
+     * Nested commits are normally merged into the enclosing transaction.
+     * If that failed the nested one fires its triggers before the outer
+     * one, so its changes would end up out of order. Fall back to a full
+     * update.
+     */
+
+    if (mqi_get_transaction_depth() > 1) {
+        lose_table_changes(t);
+        return FALSE;
+    }
+
+    return TRUE;
+}
+
+
+static void row_event_cb(mqi_event_t *e, void *user_data)
+{
+    pep_table_t *t = (pep_table_t *)user_data;
+
+    if (!tracking_changes(t))
+        return;
+
+    switch (e->event) {
+    case mqi_row_inserted:
+        /* the column events that follow are for the same insert */
+        if (record_change(t, e->row.select.data, FALSE) != NULL)
+            add_changed_row(t, e->row.row, NULL);
+        break;
+
+    case mqi_row_deleted:
+        record_change(t, e->row.select.data, TRUE);
+        break;
+
+    default:
+        break;
+    }
+}
+
+
+static void column_event_cb(mqi_event_t *e, void *user_data)
+{
+    pep_table_t         *t    = (pep_table_t *)user_data;
+    mqi_column_event_t  *ce   = &e->column;
+    int                  cidx = ce->column.index;
+    mqi_bitfld_t         mask = ((mqi_bitfld_t)1) << cidx;
+    mrp_domctl_value_t  *v, *after, *before;
+    changed_row_t       *r;
+
+    if (e->event != mqi_column_changed || !tracking_changes(t))
+        return;
+
+    /*
+     * An updated row emits an event for every changed column (we have
+     * a trigger on all of them), in increasing column order and always
+     * with the final image of the row as the selection. We record the
+     * row as deleted and re-inserted at its first change in a commit,
+     * then patch the old column values into the deleted image as they
+     * come. Later changes of the same row only restore columns that
+     * have not been restored yet, so the deleted image ends up as the
+     * row was before the commit.
+     */
+
+    if ((r = mrp_htbl_lookup(t->changed, (void *)ce->row)) == NULL) {
+        if (cidx != ffs(ce->colmask) - 1)
+            return;
+
+        after  = record_change(t, ce->select.data, FALSE);
+        before = after ? record_change(t, ce->select.data, TRUE) : NULL;
+
+        if (before == NULL || (r = add_changed_row(t, ce->row, before)) == NULL)
+            return;
+    }
+
+    if (r->before == NULL || (r->restored & mask))
+        return;
+
+    r->restored |= mask;
+    v = r->before + cidx;
+
+    switch (ce->value.type) {
+    case mqi_varchar:
+        mrp_free((char *)v->str);
+        v->str = mrp_strdup(ce->value.old.varchar);
+        if (v->str == NULL)
+            lose_table_changes(t);
+        break;
+    case mqi_integer:
+        v->s32 = ce->value.old.integer;
+        break;
+    case mqi_unsignd:
+        v->u32 = ce->value.old.unsignd;
+        break;
+    case mqi_floating:
+        v->dbl = ce->value.old.floating;
+        break;
+    default:
+        lose_table_changes(t);
+        break;
+    }
+}
+
+
+static void track_table_changes(pep_table_t *t)
+{
+    mrp_list_hook_t   *p, *n;
+    pep_watch_t       *w;
+    mrp_htbl_config_t  hcfg;
+    int                i;
+
+    if (t->tracked || !get_table_description(t))
+        goto map_columns;
+
+    for (i = 0; i < t->ncolumn; i++) {
+        switch (t->columns[i].type) {
+        case mqi_varchar:
+        case mqi_integer:
+        case mqi_unsignd:
+        case mqi_floating:
+            break;
+        default:
+            goto map_columns;
+        }
+    }
+
+    if (t->changed == NULL) {
+        mrp_clear(&hcfg);
+        hcfg.comp = changed_row_comp;
+        hcfg.hash = changed_row_hash;
+        hcfg.free = changed_row_free;
+
+        if ((t->changed = mrp_htbl_create(&hcfg)) == NULL)
+            goto map_columns;
+    }
+
+    if (mqi_create_row_trigger(t->h, row_event_cb, t, t->coldesc) < 0)
+        goto map_columns;
+
+    for (i = 0; i < t->ncolumn; i++) {
+        if (mqi_create_column_trigger(t->h, i, column_event_cb, t,
+                                      t->coldesc) < 0) {
+            while (--i >= 0)
+                mqi_drop_column_trigger(t->h, i, column_event_cb, t);
+            mqi_drop_row_trigger(t->h, row_event_cb, t);
+
+            goto map_columns;
+        }
+    }
+
+    mrp_debug("tracking changes of table %s", t->name);
+
+    t->tracked = TRUE;
+
+ map_columns:
+    mrp_list_foreach(&t->watches, p, n) {
+        w = mrp_list_entry(p, typeof(*w), tbl_hook);
+        map_watch_columns(w);
+    }
+}
+
+
+static void untrack_table_changes(pep_table_t *t)
+{
+    int i;
+
+    if (t->tracked) {
+        mqi_drop_row_trigger(t->h, row_event_cb, t);
+
+        for (i = 0; i < t->ncolumn; i++)
+            mqi_drop_column_trigger(t->h, i, column_event_cb, t);
+
+        t->tracked = FALSE;
+    }
+
+    purge_table_changes(t);
+
+    if (t->changed != NULL) {
+        mrp_htbl_destroy(t->changed, TRUE);
+        t->changed = NULL;
+    }
+}
+
+
+static int get_table_keys(pep_table_t *t)
+{
+    const char *b, *e;
+    char        name[256];
+    int         l, cidx;
+
+    t->keys = NULL;
+    t->nkey = 0;
+
+    if (t->mql_index == NULL || !t->mql_index[0])
+        return TRUE;
+
+    t->keys = mrp_allocz_array(typeof(*t->keys), t->ncolumn);
+
+    if (t->keys == NULL)
+        return FALSE;
+
+    for (b = t->mql_index; *b; b = e) {
+        while (*b == ' ' || *b == '\t' || *b == ',')
+            b++;
+
+        for (e = b; *e && *e != ',' && *e != ' ' && *e != '\t'; e++)
+            ;
+
+        if ((l = e - b) == 0)
+            break;
+
+        if (l >= (int)sizeof(name) || t->nkey >= t->ncolumn)
+            goto fail;
+
+        strncpy(name, b, l);
+        name[l] = '\0';
+
+        if ((cidx = mqi_get_column_index(t->h, name)) < 0)
+            goto fail;
+
+        /* we can't look up rows by doubles, so treat the table unindexed */
+        if (t->columns[cidx].type == mqi_floating) {
+            mrp_free(t->keys);
+            t->keys = NULL;
+            t->nkey = 0;
+
+            return TRUE;
+        }
+
+        t->keys[t->nkey++] = cidx;
+    }
+
+    return TRUE;
+
+ fail:
+    mrp_free(t->keys);
+    t->keys = NULL;
+    t->nkey = 0;
+
+    return FALSE;
+}
+
+
 int create_proxy_table(pep_table_t *t, int *errcode, const char **errmsg)
 {
     mrp_list_init(&t->hook);
@@ -254,6 +715,9 @@ int create_proxy_table(pep_table_t *t, int *errcode, const char **errmsg)
         if (!get_table_description(t))
             FAIL(EINVAL, "DB error: failed to get table description");
 
+        if (!get_table_keys(t))
+            FAIL(EINVAL, "DB error: failed to get table index columns");
+
         return TRUE;
     }
     else
@@ -276,12 +740,15 @@ void destroy_proxy_table(pep_table_t *t)
 
     mrp_free(t->columns);
     mrp_free(t->coldesc);
+    mrp_free(t->keys);
     mrp_free(t->name);
 
     t->name    = NULL;
     t->h       = MQI_HANDLE_INVALID;
     t->columns = NULL;
     t->ncolumn = 0;
+    t->keys    = NULL;
+    t->nkey    = 0;
 }
 
 
@@ -311,6 +778,7 @@ pep_table_t *create_watch_table(pdp_t *pdp, const char *name)
     if (t != NULL) {
         mrp_list_init(&t->hook);
         mrp_list_init(&t->watches);
+        mrp_list_init(&t->selects);
 
         t->h    = MQI_HANDLE_INVALID;
         t->name = mrp_strdup(name);
@@ -318,8 +786,6 @@ pep_table_t *create_watch_table(pdp_t *pdp, const char *name)
         if (t->name == NULL)
             goto fail;
 
-        get_table_description(t);
-
         if (!mrp_htbl_insert(pdp->watched, t->name, t))
             goto fail;
 
@@ -335,6 +801,160 @@ pep_table_t *create_watch_table(pdp_t *pdp, const char *name)
 }
 
 
+static pep_select_t *get_table_select(pep_table_t *t, const char *columns,
+                                      const char *where)
+{
+    mrp_list_hook_t *p, *n;
+    pep_select_t    *sel;
+    char             query[4096];
+    int              len;
+
+    len = snprintf(query, sizeof(query), "select %s from %s%s%s",
+                   columns, t->name, where[0] ? " where " : "", where);
+
+    if (len >= (int)sizeof(query)) {
+        errno = EOVERFLOW;
+        return NULL;
+    }
+
+    mrp_list_foreach(&t->selects, p, n) {
+        sel = mrp_list_entry(p, typeof(*sel), hook);
+
+        if (!strcmp(sel->query, query)) {
+            sel->refcnt++;
+            return sel;
+        }
+    }
+
+    sel = mrp_allocz(sizeof(*sel));
+
+    if (sel != NULL) {
+        mrp_list_init(&sel->hook);
+        sel->query  = mrp_strdup(query);
+        sel->refcnt = 1;
+
+        if (sel->query == NULL) {
+            mrp_free(sel);
+            return NULL;
+        }
+
+        mrp_list_append(&t->selects, &sel->hook);
+    }
+
+    return sel;
+}
+
+
+static void reset_select(pep_select_t *sel)
+{
+    if (sel->result != NULL) {
+        mql_result_free(sel->result);
+        sel->result = NULL;
+    }
+}
+
+
+static void put_table_select(pep_select_t *sel)
+{
+    if (sel == NULL || --sel->refcnt > 0)
+        return;
+
+    mrp_list_delete(&sel->hook);
+    reset_select(sel);
+
+    if (sel->stmt != NULL)
+        mql_statement_free(sel->stmt);
+
+    mrp_free(sel->query);
+    mrp_free(sel);
+}
+
+
+static void invalidate_table_selects(pep_table_t *t)
+{
+    mrp_list_hook_t *p, *n;
+    pep_select_t    *sel;
+
+    mrp_list_foreach(&t->selects, p, n) {
+        sel = mrp_list_entry(p, typeof(*sel), hook);
+
+        reset_select(sel);
+
+        if (sel->stmt != NULL) {
+            mql_statement_free(sel->stmt);
+            sel->stmt = NULL;
+        }
+
+        sel->failed = FALSE;
+    }
+}
+
+
+void reset_table_selects(pep_table_t *t)
+{
+    mrp_list_hook_t *p, *n;
+    pep_select_t    *sel;
+
+    mrp_list_foreach(&t->selects, p, n) {
+        sel = mrp_list_entry(p, typeof(*sel), hook);
+        reset_select(sel);
+    }
+}
+
+
+mql_result_t *select_watch_data(pep_watch_t *w)
+{
+    pep_select_t *sel = w->select;
+    mql_result_t *r;
+
+    if (sel->result != NULL)
+        return sel->result;
+
+    /*
+     * Precompile the select the first time it is needed after the table
+     * has been (re)created. Should that fail, keep parsing it every time.
+     */
+
+    if (sel->stmt == NULL && !sel->failed) {
+        sel->stmt = mql_precompile(sel->query);
+
+        if (sel->stmt == NULL) {
+            mrp_debug("failed to precompile '%s' (%d: %s)", sel->query,
+                      errno, strerror(errno));
+            sel->failed = TRUE;
+        }
+    }
+
+    if (sel->stmt != NULL)
+        r = mql_exec_statement(mql_result_rows, sel->stmt);
+    else
+        r = mql_exec_string(mql_result_rows, sel->query);
+
+    if (r == NULL || !mql_result_is_success(r)) {
+        mql_result_free(r);
+        return NULL;
+    }
+
+    sel->result = r;
+
+    return r;
+}
+
+
+static void destroy_watch(pep_watch_t *w)
+{
+    mrp_list_delete(&w->tbl_hook);
+    mrp_list_delete(&w->pep_hook);
+
+    put_table_select(w->select);
+
+    mrp_free(w->mql_columns);
+    mrp_free(w->mql_where);
+    mrp_free(w->columns);
+    mrp_free(w);
+}
+
+
 static void destroy_table_watches(pep_table_t *t)
 {
     pep_watch_t     *w;
@@ -343,13 +963,7 @@ static void destroy_table_watches(pep_table_t *t)
     if (t != NULL) {
         mrp_list_foreach(&t->watches, p, n) {
             w = mrp_list_entry(p, typeof(*w), tbl_hook);
-
-            mrp_list_delete(&w->tbl_hook);
-            mrp_list_delete(&w->pep_hook);
-
-            mrp_free(w->mql_columns);
-            mrp_free(w->mql_where);
-            mrp_free(w);
+            destroy_watch(w);
         }
     }
 }
@@ -358,6 +972,7 @@ static void destroy_table_watches(pep_table_t *t)
 void destroy_watch_table(pdp_t *pdp, pep_table_t *t)
 {
     mrp_list_delete(&t->hook);
+    untrack_table_changes(t);
     t->h = MQI_HANDLE_INVALID;
 
     if (pdp != NULL)
@@ -383,6 +998,80 @@ static void purge_watch_table_cb(void *key, void *entry)
 }
 
 
+static void map_watch_columns(pep_watch_t *w)
+{
+    pep_table_t *t = w->table;
+    const char  *b, *e;
+    int          ncolumn, i, l;
+
+    mrp_free(w->columns);
+    w->columns = NULL;
+    w->ncolumn = 0;
+
+    /*
+     * We can only pass on recorded changes to watches that select
+     * plain columns without any filtering. Others get the full select.
+     */
+
+    if (!t->tracked || w->mql_where[0])
+        return;
+
+    w->columns = mrp_allocz_array(typeof(*w->columns), t->ncolumn);
+
+    if (w->columns == NULL)
+        return;
+
+    ncolumn = 0;
+    b       = w->mql_columns;
+
+    while (*b) {
+        while (*b == ' ' || *b == '\t')
+            b++;
+
+        for (e = b; *e && *e != ',' && *e != ' ' && *e != '\t'; e++)
+            ;
+        l = e - b;
+
+        if (l == 1 && *b == '*' && ncolumn == 0) {
+            for (i = 0; i < t->ncolumn; i++)
+                w->columns[ncolumn++] = i;
+        }
+        else {
+            for (i = 0; i < t->ncolumn; i++) {
+                if (!strncmp(t->columns[i].name, b, l) &&
+                    t->columns[i].name[l] == '\0')
+                    break;
+            }
+
+            if (l == 0 || i >= t->ncolumn || ncolumn >= t->ncolumn)
+                goto untrackable;
+
+            w->columns[ncolumn++] = i;
+        }
+
+        while (*e == ' ' || *e == '\t')
+            e++;
+
+        if (*e == ',')
+            e++;
+        else if (*e)
+            goto untrackable;
+
+        b = e;
+    }
+
+    if (ncolumn > 0) {
+        w->ncolumn = ncolumn;
+        return;
+    }
+
+ untrackable:
+    mrp_free(w->columns);
+    w->columns = NULL;
+    w->ncolumn = 0;
+}
+
+
 int create_proxy_watch(pep_proxy_t *proxy, int id,
                        const char *table, const char *mql_columns,
                        const char *mql_where, int max_rows,
@@ -400,6 +1089,8 @@ int create_proxy_watch(pep_proxy_t *proxy, int id,
         if (t == NULL) {
             *error  = EINVAL;
             *errmsg = "failed to watch table";
+
+            return FALSE;
         }
     }
 
@@ -419,9 +1110,19 @@ int create_proxy_watch(pep_proxy_t *proxy, int id,
         if (w->mql_columns == NULL || w->mql_where == NULL)
             goto fail;
 
+        w->select = get_table_select(t, w->mql_columns, w->mql_where);
+
+        if (w->select == NULL) {
+            *error  = errno;
+            *errmsg = "failed to create select for table watch";
+            goto fail;
+        }
+
         mrp_list_append(&t->watches, &w->tbl_hook);
         mrp_list_append(&proxy->watches, &w->pep_hook);
 
+        track_table_changes(t);
+
         return TRUE;
     }
     else {
@@ -448,40 +1149,393 @@ void destroy_proxy_watches(pep_proxy_t *proxy)
     if (proxy != NULL) {
         mrp_list_foreach(&proxy->watches, p, n) {
             w = mrp_list_entry(p, typeof(*w), pep_hook);
+            destroy_watch(w);
+        }
+    }
+}
 
-            mrp_list_delete(&w->tbl_hook);
-            mrp_list_delete(&w->pep_hook);
 
-            mrp_free(w);
+static int insert_into_table(pep_table_t *t,
+                             mrp_domctl_value_t **rows, int nrow)
+{
+    void **data;
+    int    i, n;
+
+    if (nrow <= 0)
+        return TRUE;
+
+    /* insert all rows with a single call, logging them as a batch */
+    data = mrp_alloc_array(void *, nrow + 1);
+
+    if (data == NULL)
+        return FALSE;
+
+    for (i = 0; i < nrow; i++)
+        data[i] = rows[i];
+    data[i] = NULL;
+
+    n = mqi_insert_into(t->h, 0, t->coldesc, data);
+
+    mrp_free(data);
+
+    return n == nrow;
+}
+
+
+static mqi_cond_entry_t *row_condition(pep_table_t *t, mrp_domctl_value_t *row,
+                                       int *cols, int ncol,
+                                       mqi_cond_entry_t *cond)
+{
+    mqi_cond_entry_t *c = cond;
+    mqi_variable_t   *v;
+    int               i, cidx;
+
+    /* col1 = value1 & col2 = value2 & ... */
+    for (i = 0; i < ncol; i++) {
+        cidx = cols ? cols[i] : i;
+
+        if (i > 0) {
+            c->type        = mqi_operator;
+            c->u.operator_ = mqi_and;
+            c++;
+        }
+
+        c->type     = mqi_column;
+        c->u.column = cidx;
+        c++;
+
+        c->type        = mqi_operator;
+        c->u.operator_ = mqi_eq;
+        c++;
+
+        c->type = mqi_variable;
+        v       = &c->u.variable;
+        v->type = t->columns[cidx].type;
+
+        switch (v->type) {
+        case mqi_varchar:  v->v.varchar  = (char **)&row[cidx].str; break;
+        case mqi_integer:  v->v.integer  = &row[cidx].s32;          break;
+        case mqi_unsignd:  v->v.unsignd  = &row[cidx].u32;          break;
+        case mqi_floating: v->v.floating = &row[cidx].dbl;          break;
+        default:
+            return NULL;
         }
+        c++;
     }
+
+    c->type        = mqi_operator;
+    c->u.operator_ = mqi_end;
+
+    return cond;
 }
 
 
-static void reset_proxy_tables(pep_proxy_t *proxy)
+static int select_table_rows(pep_table_t *t, mrp_domctl_value_t **valuesp)
+{
+    mrp_domctl_value_t *values;
+    int                 size, n, i, j;
+
+    *valuesp = NULL;
+
+    if ((size = mqi_get_table_size(t->h)) <= 0)
+        return size;
+
+    if (size > MQI_QUERY_RESULT_MAX)
+        return -1;
+
+    values = mrp_allocz_array(typeof(*values), size * t->ncolumn);
+
+    if (values == NULL)
+        return -1;
+
+    n = mqi_select(t->h, NULL, t->coldesc, values,
+                   t->ncolumn * sizeof(*values), size);
+
+    if (n != size) {
+        mrp_free(values);
+        return -1;
+    }
+
+    for (i = 0; i < n; i++) {
+        for (j = 0; j < t->ncolumn; j++) {
+            switch (t->columns[j].type) {
+            case mqi_varchar:
+                values[i * t->ncolumn + j].type = MRP_DOMCTL_STRING;
+                break;
+            case mqi_integer:
+                values[i * t->ncolumn + j].type = MRP_DOMCTL_INTEGER;
+                break;
+            case mqi_unsignd:
+                values[i * t->ncolumn + j].type = MRP_DOMCTL_UNSIGNED;
+                break;
+            case mqi_floating:
+                values[i * t->ncolumn + j].type = MRP_DOMCTL_DOUBLE;
+                break;
+            default:
+                mrp_free(values);
+                return -1;
+            }
+        }
+    }
+
+    *valuesp = values;
+
+    return n;
+}
+
+
+static int rewrite_table(pep_table_t *t, mrp_domctl_value_t **rows, int nrow)
+{
+    if (mqi_delete_from(t->h, NULL) < 0)
+        return FALSE;
+
+    return insert_into_table(t, rows, nrow);
+}
+
+
+static uint32_t hash_columns(mrp_domctl_value_t *row, int *cols, int ncol)
+{
+    uint32_t h = 0;
+    int      i;
+
+    for (i = 0; i < ncol; i++)
+        h = 31 * h + msg_hash_row(row + cols[i], 1);
+
+    return h;
+}
+
+
+static int equal_columns(mrp_domctl_value_t *a, mrp_domctl_value_t *b,
+                         int *cols, int ncol)
 {
     int i;
 
-    for (i = 0; i < proxy->ntable; i++)
-        mqi_delete_from(proxy->tables[i].h, NULL);
+    for (i = 0; i < ncol; i++)
+        if (!msg_equal_rows(a + cols[i], b + cols[i], 1))
+            return FALSE;
+
+    return TRUE;
 }
 
 
-static int insert_into_table(pep_table_t *t,
-                             mrp_domctl_value_t **rows, int nrow)
+static int update_row(pep_table_t *t, mrp_domctl_value_t *old,
+                      mrp_domctl_value_t *row)
 {
-    void *data[2];
-    int   i;
+    mqi_cond_entry_t  cond[4 * MQI_COLUMN_MAX];
+    mqi_column_desc_t cds[MQI_COLUMN_MAX + 1];
+    int               i, n;
+
+    for (i = n = 0; i < t->ncolumn; i++)
+        if (!msg_equal_rows(old + i, row + i, 1))
+            cds[n++] = t->coldesc[i];
+
+    cds[n].cindex = -1;
+    cds[n].offset = 0;
+
+    if (row_condition(t, row, t->keys, t->nkey, cond) == NULL)
+        return FALSE;
+
+    return mqi_update(t->h, cond, cds, row) == 1;
+}
+
+
+static int delete_row(pep_table_t *t, mrp_domctl_value_t *row,
+                      int *cols, int ncol)
+{
+    mqi_cond_entry_t cond[4 * MQI_COLUMN_MAX];
+
+    if (row_condition(t, row, cols, ncol, cond) == NULL)
+        return FALSE;
+
+    return mqi_delete_from(t->h, cond) == 1;
+}
+
+
+static int update_table(pep_table_t *t, mrp_domctl_value_t **rows, int nrow)
+{
+    mrp_domctl_value_t *values, *old, **ins;
+    int                 n, ncol, nbucket, *heads, *next, *match, i, j, k;
+    int                 ndelete, ninsert, success, cols[MQI_COLUMN_MAX], nc;
+    uint32_t            mask;
+
+    /*
+     * Diff the new contents against the current ones and only apply the
+     * difference, so unchanged rows are not logged, do not fire triggers
+     * and do not cause notifications. Rows with the same index key are
+     * updated in place, other ones are deleted and inserted.
+     *
+     * Tables with duplicate rows, ones with most of their rows changed
+     * and ones where we could not pick a row for deletion by a condition
+     * (which can't compare doubles) get rewritten instead.
+     */
+
+    if ((n = select_table_rows(t, &values)) <= 0) {
+        if (n < 0)
+            return rewrite_table(t, rows, nrow);
+        else
+            return insert_into_table(t, rows, nrow);
+    }
+
+    if (nrow == 0) {
+        mrp_free(values);
+        return mqi_delete_from(t->h, NULL) >= 0;
+    }
+
+    ncol = t->ncolumn;
+
+    for (nbucket = 16; nbucket < n; nbucket <<= 1)
+        ;
+    mask = nbucket - 1;
+
+    heads = mrp_alloc_array(int, nbucket + n + n);
+    ins   = mrp_alloc_array(mrp_domctl_value_t *, nrow);
+
+    if (heads == NULL || ins == NULL)
+        goto rewrite;
+
+    next  = heads + nbucket;
+    match = next + n;                    /* current row -> new row */
+    memset(heads, -1, sizeof(*heads) * (nbucket + n + n));
+
+    success = FALSE;
+
+    for (i = 0; i < n; i++) {
+        old = values + i * ncol;
+        k   = msg_hash_row(old, ncol) & mask;
+
+        for (j = heads[k]; j >= 0; j = next[j])
+            if (msg_equal_rows(values + j * ncol, old, ncol))
+                goto rewrite;
+
+        next[i]  = heads[k];
+        heads[k] = i;
+    }
 
-    data[1] = NULL;
+    ninsert = 0;
 
     for (i = 0; i < nrow; i++) {
-        data[0] = rows[i];
-        if (mqi_insert_into(t->h, 0, t->coldesc, data) != 1)
-            return FALSE;
+        j = heads[msg_hash_row(rows[i], ncol) & mask];
+
+        for (; j >= 0; j = next[j])
+            if (match[j] < 0 && msg_equal_rows(values + j*ncol, rows[i], ncol))
+                break;
+
+        if (j >= 0)
+            match[j] = i;
+        else
+            ins[ninsert++] = rows[i];
     }
 
-    return TRUE;
+    ndelete = 0;
+    for (i = 0; i < n; i++)
+        if (match[i] < 0)
+            ndelete++;
+
+    if (ndelete == 0 && ninsert == 0)
+        goto out;
+
+    if (ndelete > n / 2)
+        goto rewrite;
+
+    /*
+     * Pick the columns to identify rows by: the index key if we have one,
+     * otherwise all columns we can compare in a condition. In the latter
+     * case the rows to delete need to be unique by those.
+     */
+
+    if (t->nkey > 0) {
+        memcpy(cols, t->keys, t->nkey * sizeof(cols[0]));
+        nc = t->nkey;
+    }
+    else {
+        for (i = nc = 0; i < ncol; i++)
+            if (t->columns[i].type != mqi_floating)
+                cols[nc++] = i;
+
+        if (nc == 0)
+            goto rewrite;
+
+        if (nc < ncol && ndelete > 0) {
+            memset(heads, -1, sizeof(*heads) * nbucket);
+
+            for (i = 0; i < n; i++) {
+                k        = hash_columns(values + i * ncol, cols, nc) & mask;
+                next[i]  = heads[k];
+                heads[k] = i;
+            }
+
+            for (i = 0; i < n; i++) {
+                if (match[i] >= 0)
+                    continue;
+
+                old = values + i * ncol;
+                j   = heads[hash_columns(old, cols, nc) & mask];
+
+                for (; j >= 0; j = next[j])
+                    if (j != i && equal_columns(values + j*ncol, old, cols, nc))
+                        goto rewrite;
+            }
+        }
+    }
+
+    /*
+     * Pair the remaining current and new rows by their index key and
+     * update those in place.
+     */
+
+    if (t->nkey > 0 && ndelete > 0 && ninsert > 0) {
+        memset(heads, -1, sizeof(*heads) * nbucket);
+
+        for (i = 0; i < n; i++) {
+            if (match[i] < 0) {
+                k        = hash_columns(values + i * ncol, cols, nc) & mask;
+                next[i]  = heads[k];
+                heads[k] = i;
+            }
+        }
+
+        for (i = k = 0; i < ninsert; i++) {
+            j = heads[hash_columns(ins[i], cols, nc) & mask];
+
+            for (; j >= 0; j = next[j])
+                if (match[j] < 0 &&
+                    equal_columns(values + j * ncol, ins[i], cols, nc))
+                    break;
+
+            if (j >= 0) {
+                if (!update_row(t, values + j * ncol, ins[i]))
+                    goto fail;
+                match[j] = i;
+            }
+            else
+                ins[k++] = ins[i];
+        }
+
+        ninsert = k;
+    }
+
+    for (i = 0; i < n; i++)
+        if (match[i] < 0 && !delete_row(t, values + i * ncol, cols, nc))
+            goto fail;
+
+    if (!insert_into_table(t, ins, ninsert))
+        goto fail;
+
+ out:
+    success = TRUE;
+ fail:
+    mrp_free(heads);
+    mrp_free(ins);
+    mrp_free(values);
+
+    return success;
+
+ rewrite:
+    mrp_free(heads);
+    mrp_free(ins);
+    mrp_free(values);
+
+    return rewrite_table(t, rows, nrow);
 }
 
 
@@ -490,13 +1544,20 @@ int set_proxy_tables(pep_proxy_t *proxy, mrp_domctl_data_t *tables, int ntable,
 {
     mqi_handle_t    tx;
     pep_table_t    *t;
+    int            *set;
     int             i, id;
 
+    set = mrp_allocz_array(int, proxy->ntable + 1);
+
+    if (set == NULL) {
+        *error  = ENOMEM;
+        *errmsg = "failed to set tables";
+        return FALSE;
+    }
+
     tx = mqi_begin_transaction();
 
     if (tx != MQI_HANDLE_INVALID) {
-        reset_proxy_tables(proxy);
-
         for (i = 0; i < ntable; i++) {
             id = tables[i].id;
 
@@ -508,18 +1569,26 @@ int set_proxy_tables(pep_proxy_t *proxy, mrp_domctl_data_t *tables, int ntable,
             if (tables[i].ncolumn != t->ncolumn)
                 goto fail;
 
-#if 0
-            if (!delete_from_table(t, tables[i].rows, tables[i].nrow))
-                goto fail;
-#endif
-
-            if (!insert_into_table(t, tables[i].rows, tables[i].nrow))
-                goto fail;
-
+            /* the same table given twice gets the rows of both */
+            if (set[id]) {
+                if (!insert_into_table(t, tables[i].rows, tables[i].nrow))
+                    goto fail;
+            }
+            else {
+                if (!update_table(t, tables[i].rows, tables[i].nrow))
+                    goto fail;
+            }
 
+            set[id] = TRUE;
         }
 
+        /* tables not given are emptied */
+        for (id = 0; id < proxy->ntable; id++)
+            if (!set[id])
+                mqi_delete_from(proxy->tables[id].h, NULL);
+
         mqi_commit_transaction(tx);
+        mrp_free(set);
 
         return TRUE;
 
@@ -529,5 +1598,7 @@ int set_proxy_tables(pep_proxy_t *proxy, mrp_domctl_data_t *tables, int ntable,
         mqi_rollback_transaction(tx);
     }
 
+    mrp_free(set);
+
     return FALSE;
 }
@@ -52,6 +52,11 @@ void destroy_proxy_tables(pep_proxy_t *proxy);
 
 void destroy_proxy_watches(pep_proxy_t *proxy);
 
+void purge_table_changes(pep_table_t *t);
+
+mql_result_t *select_watch_data(pep_watch_t *w);
+void reset_table_selects(pep_table_t *t);
+
 int set_proxy_tables(pep_proxy_t *proxy, mrp_domctl_data_t *tables, int ntable,
                      int *error, const char **errmsg);
 
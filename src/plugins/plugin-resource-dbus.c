@@ -699,10 +699,10 @@ static void update_resources(resource_set_o_t *rset, mrp_resource_mask_t grant,
             continue;
         }
 
-        if (mask & grant) {
+        if (mrp_resource_mask_intersects(&mask, &grant)) {
             update_property(res->status_prop, "acquired");
         }
-        else if (mask & advice) {
+        else if (mrp_resource_mask_intersects(&mask, &advice)) {
             update_property(res->status_prop, "available");
         }
         else {
@@ -710,10 +710,10 @@ static void update_resources(resource_set_o_t *rset, mrp_resource_mask_t grant,
         }
     }
 
-    if (grant) {
+    if (!mrp_resource_mask_empty(&grant)) {
         update_property(rset->status_prop, "acquired");
     }
-    else if (advice) {
+    else if (!mrp_resource_mask_empty(&advice)) {
         update_property(rset->status_prop, "available");
     }
     else {
@@ -743,11 +743,13 @@ static void event_cb(uint32_t request_id, mrp_resource_set_t *set, void *data)
 
     mrp_resource_mask_t grant = mrp_get_resource_set_grant(set);
     mrp_resource_mask_t advice = mrp_get_resource_set_advice(set);
+    char gbuf[MRP_RESOURCE_MASK_STRLEN], abuf[MRP_RESOURCE_MASK_STRLEN];
 
     MRP_UNUSED(request_id);
 
-    mrp_log_info("Event for %s: grant 0x%08x, advice 0x%08x",
-        rset->path, grant, advice);
+    mrp_log_info("Event for %s: grant %s, advice %s", rset->path,
+        mrp_resource_mask_print(&grant, gbuf, sizeof(gbuf)),
+        mrp_resource_mask_print(&advice, abuf, sizeof(abuf)));
 
     if (!rset->set || !rset->committed) {
 
@@ -0,0 +1,494 @@
+/*
+ * Copyright (c) 2012, Intel Corporation
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met:
+ *
+ *   * Redistributions of source code must retain the above copyright notice,
+ *     this list of conditions and the following disclaimer.
+ *   * Redistributions in binary form must reproduce the above copyright
+ *     notice, this list of conditions and the following disclaimer in the
+ *     documentation and/or other materials provided with the distribution.
+ *   * Neither the name of Intel Corporation nor the names of its contributors
+ *     may be used to endorse or promote products derived from this software
+ *     without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+/*
+ * Test for batch requests of the native resource protocol. It needs a
+ * running murphy daemon with the native resource plugin loaded. It talks
+ * the protocol directly, so that it can send malformed batches too:
+ *
+ *   1. create a resource set
+ *   2. send a batch that acquires the set, followed by a sub-request
+ *      with a broken resource set id: the batch must be rejected as a
+ *      whole and the set must not get acquired
+ *   3. send a batch that acquires the set, releases an unknown set,
+ *      creates another set and then releases the first one again: each
+ *      sub-request gets its own status
+ *   4. send a batch that destroys both sets, with an acquire of an
+ *      already destroyed set in between
+ */
+
+#include <stdlib.h>
+#include <stdio.h>
+#include <string.h>
+#include <errno.h>
+#include <getopt.h>
+
+#include <murphy/common.h>
+#include <murphy/resource/protocol.h>
+
+#define INVALID_ID      (~(uint32_t)0)
+#define QUIET_PERIOD    300              /* msecs to wait for stray events */
+#define TEST_TIMEOUT    5000             /* msecs for the whole test */
+
+typedef enum {
+    STEP_CREATE = 0,
+    STEP_MALFORMED,
+    STEP_QUIET,
+    STEP_MIXED,
+    STEP_DESTROY,
+    STEP_DONE,
+} step_t;
+
+typedef struct {
+    mrp_mainloop_t  *ml;
+    mrp_transport_t *transp;
+    mrp_timer_t     *timer;
+    const char      *addr;
+    const char      *class;
+    const char      *zone;
+    const char      *resource;
+    uint32_t         seqno;
+    step_t           step;
+    uint32_t         rsid;
+    uint32_t         rsid2;
+    int              nfail;
+} test_t;
+
+#define CHECK(t, cond) do {                                               \
+        if (!(cond)) {                                                    \
+            printf("step %d: check '%s' failed\n", (t)->step, #cond);     \
+            (t)->nfail++;                                                 \
+        }                                                                 \
+    } while (0)
+
+#define APPEND(msg, tag, typ, val)                                        \
+    mrp_msg_append(msg, RESPROTO_##tag, MRP_MSG_FIELD_##typ, val)
+
+
+static void finish(test_t *t)
+{
+    t->step = STEP_DONE;
+    mrp_mainloop_quit(t->ml, t->nfail ? 1 : 0);
+}
+
+
+static mrp_msg_t *create_request(test_t *t, uint16_t type)
+{
+    return mrp_msg_create(RESPROTO_SEQUENCE_NO , MRP_MSG_FIELD_UINT32,
+                          t->seqno++,
+                          RESPROTO_REQUEST_TYPE, MRP_MSG_FIELD_UINT16, type,
+                          RESPROTO_MESSAGE_END);
+}
+
+
+/*
+ * Append the fields of a resource set creation, framed the same way as
+ * libmurphy-resource does it: the attributes of each resource are closed
+ * by a section end, and within a batch another section end closes the set.
+ */
+static bool append_create(test_t *t, mrp_msg_t *msg, bool batch)
+{
+    bool s = true;
+
+    s &= APPEND(msg, RESOURCE_FLAGS   , UINT32, 0);
+    s &= APPEND(msg, RESOURCE_PRIORITY, UINT32, 0);
+    s &= APPEND(msg, CLASS_NAME       , STRING, t->class);
+    s &= APPEND(msg, ZONE_NAME        , STRING, t->zone);
+    s &= APPEND(msg, RESOURCE_NAME    , STRING, t->resource);
+    s &= APPEND(msg, RESOURCE_FLAGS   , UINT32, RESPROTO_RESFLAG_MANDATORY);
+    s &= APPEND(msg, SECTION_END      , UINT8 , 0);
+
+    if (batch)
+        s &= APPEND(msg, SECTION_END  , UINT8 , 0);
+
+    return s;
+}
+
+
+static bool append_sub(mrp_msg_t *msg, uint16_t type, uint32_t rsid)
+{
+    return APPEND(msg, REQUEST_TYPE, UINT16, type) &&
+        APPEND(msg, RESOURCE_SET_ID, UINT32, rsid);
+}
+
+
+static void send_request(test_t *t, mrp_msg_t *msg, bool ok)
+{
+    if (!ok || !msg || !mrp_transport_send(t->transp, msg)) {
+        printf("step %d: failed to send request\n", t->step);
+        t->nfail++;
+        finish(t);
+    }
+
+    mrp_msg_unref(msg);
+}
+
+
+static void send_step(test_t *t)
+{
+    mrp_msg_t *msg;
+    bool       s;
+
+    switch (t->step) {
+    case STEP_CREATE:
+        msg = create_request(t, RESPROTO_CREATE_RESOURCE_SET);
+        s   = msg && append_create(t, msg, false);
+        break;
+
+    case STEP_MALFORMED:
+        msg = create_request(t, RESPROTO_BATCH_REQUEST);
+        s   = msg && append_sub(msg, RESPROTO_ACQUIRE_RESOURCE_SET, t->rsid);
+        s  &= msg && APPEND(msg, REQUEST_TYPE, UINT16,
+                            RESPROTO_RELEASE_RESOURCE_SET);
+        s  &= msg && APPEND(msg, RESOURCE_SET_ID, STRING, "bogus");
+        break;
+
+    case STEP_MIXED:
+        msg = create_request(t, RESPROTO_BATCH_REQUEST);
+        s   = msg && append_sub(msg, RESPROTO_ACQUIRE_RESOURCE_SET, t->rsid);
+        s  &= msg && append_sub(msg, RESPROTO_RELEASE_RESOURCE_SET,
+                                t->rsid + 1000);
+        s  &= msg && APPEND(msg, REQUEST_TYPE, UINT16,
+                            RESPROTO_CREATE_RESOURCE_SET);
+        s  &= msg && append_create(t, msg, true);
+        s  &= msg && append_sub(msg, RESPROTO_RELEASE_RESOURCE_SET, t->rsid);
+        break;
+
+    case STEP_DESTROY:
+        msg = create_request(t, RESPROTO_BATCH_REQUEST);
+        s   = msg && append_sub(msg, RESPROTO_DESTROY_RESOURCE_SET, t->rsid);
+        s  &= msg && append_sub(msg, RESPROTO_ACQUIRE_RESOURCE_SET, t->rsid);
+        s  &= msg && append_sub(msg, RESPROTO_DESTROY_RESOURCE_SET, t->rsid2);
+        break;
+
+    default:
+        return;
+    }
+
+    send_request(t, msg, s);
+}
+
+
+static bool fetch(mrp_msg_t *msg, void **pcursor, uint16_t tag, uint16_t type,
+                  mrp_msg_value_t *value)
+{
+    uint16_t t, y;
+    size_t   size;
+
+    return mrp_msg_iterate(msg, pcursor, &t, &y, value, &size) &&
+        t == tag && y == type;
+}
+
+
+/*
+ * Fetch the overall status and up to @max sub-request triplets of a batch
+ * reply. Returns the number of triplets, or -1 on a malformed reply.
+ */
+static int fetch_batch_reply(mrp_msg_t *msg, void **pcursor, int16_t *status,
+                             int16_t *substat, uint32_t *rsid, int max)
+{
+    mrp_msg_value_t v;
+    int             n;
+
+    if (!fetch(msg, pcursor, RESPROTO_REQUEST_STATUS, MRP_MSG_FIELD_SINT16,&v))
+        return -1;
+
+    *status = v.s16;
+
+    for (n = 0;  fetch(msg, pcursor, RESPROTO_REQUEST_TYPE,
+                       MRP_MSG_FIELD_UINT16, &v);  n++) {
+        if (n >= max)
+            return -1;
+
+        if (!fetch(msg, pcursor, RESPROTO_REQUEST_STATUS,
+                   MRP_MSG_FIELD_SINT16, &v))
+            return -1;
+
+        substat[n] = v.s16;
+
+        if (!fetch(msg, pcursor, RESPROTO_RESOURCE_SET_ID,
+                   MRP_MSG_FIELD_UINT32, &v))
+            return -1;
+
+        rsid[n] = v.u32;
+    }
+
+    return n;
+}
+
+
+static void quiet_cb(mrp_timer_t *timer, void *user_data)
+{
+    test_t *t = (test_t *)user_data;
+
+    mrp_del_timer(timer);
+    t->timer = NULL;
+
+    t->step = STEP_MIXED;
+    send_step(t);
+}
+
+
+static void recv_msg(mrp_transport_t *transp, mrp_msg_t *msg, void *user_data)
+{
+    test_t          *t      = (test_t *)user_data;
+    void            *cursor = NULL;
+    mrp_msg_value_t  v;
+    uint16_t         request;
+    int16_t          status;
+    int16_t          substat[RESPROTO_BATCH_MAX];
+    uint32_t         rsid[RESPROTO_BATCH_MAX];
+    int              n;
+
+    MRP_UNUSED(transp);
+
+    if (!fetch(msg, &cursor, RESPROTO_SEQUENCE_NO, MRP_MSG_FIELD_UINT32, &v) ||
+        !fetch(msg, &cursor, RESPROTO_REQUEST_TYPE, MRP_MSG_FIELD_UINT16, &v)) {
+        printf("step %d: malformed message\n", t->step);
+        t->nfail++;
+        finish(t);
+        return;
+    }
+
+    request = v.u16;
+
+    if (request == RESPROTO_RESOURCES_EVENT) {
+        /* a rejected batch must not have acquired anything */
+        CHECK(t, t->step != STEP_QUIET);
+        return;
+    }
+
+    switch (t->step) {
+    case STEP_CREATE:
+        CHECK(t, request == RESPROTO_CREATE_RESOURCE_SET);
+        CHECK(t, fetch(msg, &cursor, RESPROTO_REQUEST_STATUS,
+                       MRP_MSG_FIELD_SINT16, &v) && v.s16 == 0);
+        CHECK(t, fetch(msg, &cursor, RESPROTO_RESOURCE_SET_ID,
+                       MRP_MSG_FIELD_UINT32, &v) && v.u32 != INVALID_ID);
+        t->rsid = v.u32;
+
+        if (t->nfail)
+            finish(t);
+        else {
+            t->step = STEP_MALFORMED;
+            send_step(t);
+        }
+        break;
+
+    case STEP_MALFORMED:
+        n = fetch_batch_reply(msg, &cursor, &status, substat, rsid,
+                              RESPROTO_BATCH_MAX);
+        CHECK(t, request == RESPROTO_BATCH_REQUEST);
+        CHECK(t, status == EINVAL);
+        CHECK(t, n == 0);
+
+        t->step  = STEP_QUIET;
+        t->timer = mrp_add_timer(t->ml, QUIET_PERIOD, quiet_cb, t);
+        break;
+
+    case STEP_MIXED:
+        n = fetch_batch_reply(msg, &cursor, &status, substat, rsid,
+                              RESPROTO_BATCH_MAX);
+        CHECK(t, request == RESPROTO_BATCH_REQUEST);
+        CHECK(t, status == 0);
+        CHECK(t, n == 4);
+
+        if (n == 4) {
+            CHECK(t, substat[0] == 0 && rsid[0] == t->rsid);
+            CHECK(t, substat[1] == ENOENT);
+            CHECK(t, substat[2] == 0 && rsid[2] != INVALID_ID);
+            CHECK(t, substat[3] == 0 && rsid[3] == t->rsid);
+            t->rsid2 = rsid[2];
+        }
+
+        t->step = STEP_DESTROY;
+        send_step(t);
+        break;
+
+    case STEP_DESTROY:
+        n = fetch_batch_reply(msg, &cursor, &status, substat, rsid,
+                              RESPROTO_BATCH_MAX);
+        CHECK(t, request == RESPROTO_BATCH_REQUEST);
+        CHECK(t, status == 0);
+        CHECK(t, n == 3);
+
+        if (n == 3) {
+            CHECK(t, substat[0] == 0);
+            CHECK(t, substat[1] == ENOENT);
+            CHECK(t, substat[2] == 0);
+        }
+
+        finish(t);
+        break;
+
+    default:
+        CHECK(t, !"unexpected reply");
+        break;
+    }
+}
+
+
+static void recvfrom_msg(mrp_transport_t *transp, mrp_msg_t *msg,
+                         mrp_sockaddr_t *addr, socklen_t addrlen,
+                         void *user_data)
+{
+    MRP_UNUSED(addr);
+    MRP_UNUSED(addrlen);
+
+    recv_msg(transp, msg, user_data);
+}
+
+
+static void closed_evt(mrp_transport_t *transp, int error, void *user_data)
+{
+    test_t *t = (test_t *)user_data;
+
+    MRP_UNUSED(transp);
+
+    printf("step %d: connection closed (%d: %s)\n", t->step, error,
+           strerror(error));
+    t->nfail++;
+    finish(t);
+}
+
+
+static void timeout_cb(mrp_timer_t *timer, void *user_data)
+{
+    test_t *t = (test_t *)user_data;
+
+    MRP_UNUSED(timer);
+
+    printf("step %d: timed out\n", t->step);
+    t->nfail++;
+    finish(t);
+}
+
+
+static void print_usage(const char *argv0, int exit_code)
+{
+    printf("usage: %s [options]\n\n"
+           "The possible options are:\n"
+           "  -a, --address=ADDRESS    resource protocol address [%s]\n"
+           "  -c, --class=CLASS        application class [player]\n"
+           "  -z, --zone=ZONE          zone [driver]\n"
+           "  -r, --resource=RESOURCE  resource [audio_playback]\n"
+           "  -h, --help               show help on usage\n",
+           argv0, RESPROTO_DEFAULT_ADDRESS);
+
+    exit(exit_code);
+}
+
+
+static void parse_cmdline(test_t *t, int argc, char **argv)
+{
+    static struct option options[] = {
+        { "address" , required_argument, NULL, 'a' },
+        { "class"   , required_argument, NULL, 'c' },
+        { "zone"    , required_argument, NULL, 'z' },
+        { "resource", required_argument, NULL, 'r' },
+        { "help"    , no_argument      , NULL, 'h' },
+        { NULL      , 0                , NULL,  0  }
+    };
+
+    int opt;
+
+    t->addr     = RESPROTO_DEFAULT_ADDRESS;
+    t->class    = "player";
+    t->zone     = "driver";
+    t->resource = "audio_playback";
+
+    while ((opt = getopt_long(argc, argv, "a:c:z:r:h", options, NULL)) != -1) {
+        switch (opt) {
+        case 'a': t->addr     = optarg; break;
+        case 'c': t->class    = optarg; break;
+        case 'z': t->zone     = optarg; break;
+        case 'r': t->resource = optarg; break;
+        case 'h': print_usage(argv[0], 0); break;
+        default:  print_usage(argv[0], EINVAL);
+        }
+    }
+}
+
+
+int main(int argc, char **argv)
+{
+    static mrp_transport_evt_t evt = {
+        { .recvmsg     = recv_msg },
+        { .recvmsgfrom = recvfrom_msg },
+        .closed        = closed_evt,
+        .connection    = NULL
+    };
+
+    test_t          t;
+    mrp_sockaddr_t  addr;
+    socklen_t       alen;
+    const char     *atype;
+    int             status;
+
+    mrp_clear(&t);
+    parse_cmdline(&t, argc, argv);
+
+    t.seqno = 1;
+    t.rsid  = t.rsid2 = INVALID_ID;
+
+    if (!(t.ml = mrp_mainloop_create()))
+        exit(ENOMEM);
+
+    alen = mrp_transport_resolve(NULL, t.addr, &addr, sizeof(addr), &atype);
+
+    if (alen <= 0) {
+        printf("can't resolve transport address '%s'\n", t.addr);
+        exit(EINVAL);
+    }
+
+    if (!(t.transp = mrp_transport_create(t.ml, atype, &evt, &t, 0)) ||
+        !mrp_transport_connect(t.transp, &addr, alen)) {
+        printf("failed to connect to '%s'\n", t.addr);
+        exit(EIO);
+    }
+
+    mrp_add_timer(t.ml, TEST_TIMEOUT, timeout_cb, &t);
+
+    send_step(&t);
+    status = mrp_mainloop_run(t.ml);
+
+    mrp_transport_destroy(t.transp);
+
+    printf("batch test %s\n", status ? "failed" : "passed");
+
+    return status;
+}
+
+/*
+ * Local Variables:
+ * c-basic-offset: 4
+ * indent-tabs-mode: nil
+ * End:
+ *
+ */
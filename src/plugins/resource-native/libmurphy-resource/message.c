@@ -55,7 +55,8 @@ bool fetch_resource_set_state(mrp_msg_t *msg, void **pcursor,
 
 
 bool fetch_resource_set_mask(mrp_msg_t *msg, void **pcursor,
-                                    int mask_type, uint32_t *pmask)
+                                    int mask_type,
+                                    uint32_t pmask[RESPROTO_MASK_WORDS])
 {
     uint16_t expected_tag;
     uint16_t tag;
@@ -63,6 +64,8 @@ bool fetch_resource_set_mask(mrp_msg_t *msg, void **pcursor,
     mrp_msg_value_t value;
     size_t size;
 
+    memset(pmask, 0, sizeof(uint32_t) * RESPROTO_MASK_WORDS);
+
     switch (mask_type) {
     case 0:    expected_tag = RESPROTO_RESOURCE_GRANT;     break;
     case 1:   expected_tag = RESPROTO_RESOURCE_ADVICE;    break;
@@ -70,13 +73,18 @@ bool fetch_resource_set_mask(mrp_msg_t *msg, void **pcursor,
     }
 
     if (!mrp_msg_iterate(msg, pcursor, &tag, &type, &value, &size) ||
-        tag != expected_tag || type != MRP_MSG_FIELD_UINT32)
-    {
-        *pmask = 0;
+        tag != expected_tag)
+        return false;
+
+    /* masks of more than 32 resources come as an array of words */
+    if (type == MRP_MSG_FIELD_UINT32)
+        pmask[0] = value.u32;
+    else if (type == MRP_MSG_FIELD_ARRAY_OF(UINT32) &&
+             size <= RESPROTO_MASK_WORDS)
+        memcpy(pmask, value.au32, sizeof(uint32_t) * size);
+    else
         return false;
-    }
 
-    *pmask = value.u32;
     return true;
 }
 
@@ -238,6 +246,25 @@ int fetch_attribute_array(mrp_msg_t *msg, void **pcursor,
 }
 
 
+bool fetch_capabilities(mrp_msg_t *msg, void **pcursor, uint32_t *pcaps)
+{
+    uint16_t tag;
+    uint16_t type;
+    mrp_msg_value_t value;
+    size_t size;
+
+    if (!mrp_msg_iterate(msg, pcursor, &tag, &type, &value, &size) ||
+        tag != RESPROTO_CAPABILITIES || type != MRP_MSG_FIELD_UINT32)
+    {
+        *pcaps = 0;
+        return false;
+    }
+
+    *pcaps = value.u32;
+    return true;
+}
+
+
 bool fetch_resource_name(mrp_msg_t *msg, void **pcursor,
                                 const char **pname)
 {
@@ -409,6 +436,22 @@ error:
 }
 
 
+bool fetch_batch_result(mrp_msg_t *msg, void **pcursor, uint16_t *preqtype,
+        int *pstatus, uint32_t *pid)
+{
+    if (fetch_request(msg, pcursor, preqtype) < 0)
+        return false;
+
+    if (!fetch_status(msg, pcursor, pstatus) ||
+        !fetch_resource_set_id(msg, pcursor, pid)) {
+        mrp_res_error("malformed sub-request result in batch response");
+        return false;
+    }
+
+    return true;
+}
+
+
 mrp_res_resource_set_t *acquire_resource_set_response(mrp_msg_t *msg,
             mrp_res_context_t *cx, void **pcursor)
 {
@@ -511,37 +554,9 @@ error:
 }
 
 
-int create_resource_set_request(mrp_res_context_t *cx,
-        mrp_res_resource_set_t *rset)
+static bool append_resources(mrp_msg_t *msg, mrp_res_resource_set_t *rset)
 {
-    mrp_msg_t *msg = NULL;
     uint32_t i;
-    uint32_t rset_flags = 0;
-
-    if (!cx || !rset)
-        return -1;
-
-    if (!cx->priv->connected)
-        return -1;
-
-    if (rset->priv->autorelease)
-        rset_flags |= RESPROTO_RSETFLAG_AUTORELEASE;
-
-    msg = mrp_msg_create(
-            RESPROTO_SEQUENCE_NO, MRP_MSG_FIELD_UINT32, cx->priv->next_seqno,
-            RESPROTO_REQUEST_TYPE, MRP_MSG_FIELD_UINT16,
-                    RESPROTO_CREATE_RESOURCE_SET,
-            RESPROTO_RESOURCE_FLAGS, MRP_MSG_FIELD_UINT32, rset_flags,
-            RESPROTO_RESOURCE_PRIORITY, MRP_MSG_FIELD_UINT32, 0,
-            RESPROTO_CLASS_NAME, MRP_MSG_FIELD_STRING, rset->application_class,
-            RESPROTO_ZONE_NAME, MRP_MSG_FIELD_STRING, cx->zone,
-            RESPROTO_MESSAGE_END);
-
-    if (!msg)
-        return -1;
-
-    rset->priv->seqno = cx->priv->next_seqno;
-    cx->priv->next_seqno++;
 
     for (i = 0; i < rset->priv->num_resources; i++) {
         int j;
@@ -549,7 +564,7 @@ int create_resource_set_request(mrp_res_context_t *cx,
         mrp_res_resource_t *res = rset->priv->resources[i];
 
         if (!res)
-            goto error;
+            return false;
 
         if (res->priv->shared)
             res_flags |= RESPROTO_RESFLAG_SHARED;
@@ -594,6 +609,147 @@ int create_resource_set_request(mrp_res_context_t *cx,
         mrp_msg_append(msg, RESPROTO_SECTION_END, MRP_MSG_FIELD_UINT8, 0);
     }
 
+    return true;
+}
+
+
+int create_resource_set_request(mrp_res_context_t *cx,
+        mrp_res_resource_set_t *rset)
+{
+    mrp_msg_t *msg = NULL;
+    uint32_t rset_flags = 0;
+
+    if (!cx || !rset)
+        return -1;
+
+    if (!cx->priv->connected)
+        return -1;
+
+    if (rset->priv->autorelease)
+        rset_flags |= RESPROTO_RSETFLAG_AUTORELEASE;
+
+    msg = mrp_msg_create(
+            RESPROTO_SEQUENCE_NO, MRP_MSG_FIELD_UINT32, cx->priv->next_seqno,
+            RESPROTO_REQUEST_TYPE, MRP_MSG_FIELD_UINT16,
+                    RESPROTO_CREATE_RESOURCE_SET,
+            RESPROTO_RESOURCE_FLAGS, MRP_MSG_FIELD_UINT32, rset_flags,
+            RESPROTO_RESOURCE_PRIORITY, MRP_MSG_FIELD_UINT32, 0,
+            RESPROTO_CLASS_NAME, MRP_MSG_FIELD_STRING, rset->application_class,
+            RESPROTO_ZONE_NAME, MRP_MSG_FIELD_STRING, cx->zone,
+            RESPROTO_MESSAGE_END);
+
+    if (!msg)
+        return -1;
+
+    rset->priv->seqno = cx->priv->next_seqno;
+    cx->priv->next_seqno++;
+
+    if (!append_resources(msg, rset))
+        goto error;
+
+    if (!mrp_transport_send(cx->priv->transp, msg))
+        goto error;
+
+    mrp_msg_unref(msg);
+    return 0;
+
+error:
+    mrp_msg_unref(msg);
+    return -1;
+}
+
+
+int batch_request(mrp_res_context_t *cx, mrp_res_resource_set_t **rsets,
+        uint32_t n, bool acquire)
+{
+    mrp_msg_t *msg = NULL;
+    mrp_res_resource_set_t *rset;
+    uint32_t i;
+    uint32_t rset_flags;
+    uint16_t type;
+    bool s;
+
+    if (!cx->priv->connected || n > RESPROTO_BATCH_MAX)
+        return -1;
+
+    msg = mrp_msg_create(
+            RESPROTO_SEQUENCE_NO, MRP_MSG_FIELD_UINT32, cx->priv->next_seqno,
+            RESPROTO_REQUEST_TYPE, MRP_MSG_FIELD_UINT16,
+                    RESPROTO_BATCH_REQUEST,
+            RESPROTO_MESSAGE_END);
+
+    if (!msg)
+        return -1;
+
+    for (i = 0, s = true; s && i < n; i++) {
+        rset = rsets[i];
+        rset->priv->seqno = cx->priv->next_seqno;
+
+        if (rset->priv->id) {
+            type = acquire ? RESPROTO_ACQUIRE_RESOURCE_SET :
+                    RESPROTO_RELEASE_RESOURCE_SET;
+
+            s &= mrp_msg_append(msg, RESPROTO_REQUEST_TYPE,
+                    MRP_MSG_FIELD_UINT16, type);
+            s &= mrp_msg_append(msg, RESPROTO_RESOURCE_SET_ID,
+                    MRP_MSG_FIELD_UINT32, rset->priv->id);
+            continue;
+        }
+
+        /* sets to be acquired are acquired right at creation */
+
+        rset_flags = 0;
+
+        if (rset->priv->autorelease)
+            rset_flags |= RESPROTO_RSETFLAG_AUTORELEASE;
+
+        if (acquire)
+            rset_flags |= RESPROTO_RSETFLAG_AUTOACQUIRE;
+
+        s &= mrp_msg_append(msg, RESPROTO_REQUEST_TYPE, MRP_MSG_FIELD_UINT16,
+                RESPROTO_CREATE_RESOURCE_SET);
+        s &= mrp_msg_append(msg, RESPROTO_RESOURCE_FLAGS,
+                MRP_MSG_FIELD_UINT32, rset_flags);
+        s &= mrp_msg_append(msg, RESPROTO_RESOURCE_PRIORITY,
+                MRP_MSG_FIELD_UINT32, 0);
+        s &= mrp_msg_append(msg, RESPROTO_CLASS_NAME, MRP_MSG_FIELD_STRING,
+                rset->application_class);
+        s &= mrp_msg_append(msg, RESPROTO_ZONE_NAME, MRP_MSG_FIELD_STRING,
+                cx->zone);
+        s &= append_resources(msg, rset);
+        s &= mrp_msg_append(msg, RESPROTO_SECTION_END, MRP_MSG_FIELD_UINT8, 0);
+    }
+
+    cx->priv->next_seqno++;
+
+    if (!s || !mrp_transport_send(cx->priv->transp, msg))
+        goto error;
+
+    mrp_msg_unref(msg);
+    return 0;
+
+error:
+    mrp_msg_unref(msg);
+    return -1;
+}
+
+
+int set_capabilities_request(mrp_res_context_t *cx, uint32_t caps)
+{
+    mrp_msg_t *msg = NULL;
+
+    if (!cx->priv->connected)
+        goto error;
+
+    msg = mrp_msg_create(RESPROTO_SEQUENCE_NO, MRP_MSG_FIELD_UINT32, 0,
+            RESPROTO_REQUEST_TYPE, MRP_MSG_FIELD_UINT16,
+                    RESPROTO_SET_CAPABILITIES,
+            RESPROTO_CAPABILITIES, MRP_MSG_FIELD_UINT32, caps,
+            RESPROTO_MESSAGE_END);
+
+    if (!msg)
+        goto error;
+
     if (!mrp_transport_send(cx->priv->transp, msg))
         goto error;
 
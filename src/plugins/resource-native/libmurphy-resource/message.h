@@ -41,7 +41,8 @@ bool fetch_resource_set_state(mrp_msg_t *msg, void **pcursor,
                                      mrp_resproto_state_t *pstate);
 
 bool fetch_resource_set_mask(mrp_msg_t *msg, void **pcursor,
-                                    int mask_type, uint32_t *pmask);
+                                    int mask_type,
+                                    uint32_t pmask[RESPROTO_MASK_WORDS]);
 
 bool fetch_resource_set_id(mrp_msg_t *msg, void **pcursor, uint32_t *pid);
 
@@ -60,6 +61,11 @@ int fetch_attribute_array(mrp_msg_t *msg, void **pcursor,
 bool fetch_resource_name(mrp_msg_t *msg, void **pcursor,
                                 const char **pname);
 
+bool fetch_capabilities(mrp_msg_t *msg, void **pcursor, uint32_t *pcaps);
+
+bool fetch_batch_result(mrp_msg_t *msg, void **pcursor, uint16_t *preqtype,
+        int *pstatus, uint32_t *pid);
+
 /* handling of the message responses */
 
 mrp_res_resource_set_t *resource_query_response(mrp_res_context_t *cx,
@@ -84,6 +90,11 @@ int release_resource_set_request(mrp_res_context_t *cx,
 int create_resource_set_request(mrp_res_context_t *cx,
         mrp_res_resource_set_t *rset);
 
+int batch_request(mrp_res_context_t *cx, mrp_res_resource_set_t **rsets,
+        uint32_t n, bool acquire);
+
+int set_capabilities_request(mrp_res_context_t *cx, uint32_t caps);
+
 int get_application_classes_request(mrp_res_context_t *cx);
 
 int get_available_resources_request(mrp_res_context_t *cx);
@@ -274,6 +274,32 @@ int mrp_res_acquire_resource_set(const mrp_res_resource_set_t *rs);
 int mrp_res_release_resource_set(mrp_res_resource_set_t *rs);
 
 
+/**
+ * Acquire several resource sets at once. The sets are sent to
+ * the server in a single request and arbitrated together, which
+ * is considerably cheaper than acquiring them one by one. Sets
+ * not yet known to the server are created on the way. Like with
+ * mrp_res_acquire_resource_set, the outcome is delivered in the
+ * resource callbacks of the individual sets.
+ *
+ * @param rs array of resource sets you want to acquire.
+ * @param n number of sets in the array, at most RESPROTO_BATCH_MAX.
+ *
+ * @return murphy error code.
+ */
+int mrp_res_acquire_resource_sets(mrp_res_resource_set_t **rs, int n);
+
+/**
+ * Release several resource sets at once, in a single request
+ * to the server. See mrp_res_acquire_resource_sets.
+ *
+ * @param rs array of resource sets you want to release.
+ * @param n number of sets in the array, at most RESPROTO_BATCH_MAX.
+ *
+ * @return murphy error code.
+ */
+int mrp_res_release_resource_sets(mrp_res_resource_set_t **rs, int n);
+
 /**
  * Get a resource set unique server-side id. The id information is
  * normally available only after mrp_res_acquire_resource_set or
@@ -0,0 +1,987 @@
+/*
+ * Copyright (c) 2012, Intel Corporation
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met:
+ *
+ *  * Redistributions of source code must retain the above copyright notice,
+ *    this list of conditions and the following disclaimer.
+ *  * Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ *  * Neither the name of Intel Corporation nor the names of its contributors
+ *    may be used to endorse or promote products derived from this software
+ *    without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+/*
+ * Load generator for the resource manager. It opens a number of client
+ * connections to the native resource protocol and keeps each of them busy
+ * acquiring and releasing resource sets. Every phase of a run works with
+ * a given number of sets per client and prints one JSON object per line
+ * with the throughput and the request latency percentiles of the phase.
+ * If the console address of the server is given, the arbitration stats
+ * of the server are reset before and read after every phase over the
+ * console, and the number of arbitration passes and the time spent in
+ * them are included in the reports. If the process id of the server is
+ * given, the resident set size of the server (current and peak) is
+ * included in the reports, too.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdarg.h>
+#include <string.h>
+#include <errno.h>
+#include <time.h>
+#include <getopt.h>
+
+#include <murphy/common/macros.h>
+#include <murphy/common/mm.h>
+#include <murphy/common/mainloop.h>
+#include <murphy/common/transport.h>
+
+#include <murphy/plugins/console-protocol.h>
+#include <murphy/plugins/resource-native/libmurphy-resource/resource-api.h>
+
+#define MAX_CLIENTS   1024
+#define MAX_PHASES    32
+#define MAX_ITEMS     32
+
+typedef struct load_s        load_t;
+typedef struct load_client_s load_client_t;
+
+typedef struct {
+    load_client_t          *client;
+    mrp_res_resource_set_t *rset;
+    bool                    acquired;    /* last requested state */
+    bool                    pending;     /* request in flight */
+    uint64_t                stamp;       /* when the request was sent */
+} load_set_t;
+
+struct load_client_s {
+    load_t            *load;
+    mrp_res_context_t *cx;
+    int                id;
+    bool               connected;
+    load_set_t       **sets;
+    int                nset;
+    int                inflight;
+};
+
+typedef struct {
+    const char *name;
+    int         weight;
+} load_class_t;
+
+typedef enum {
+    STATS_IDLE = 0,                      /* no console command pending */
+    STATS_RESET,                         /* waiting for the stats reset */
+    STATS_QUERY,                         /* waiting for the stats */
+} stats_state_t;
+
+typedef struct {
+    const char        *address;          /* console address of the server */
+    mrp_transport_t   *t;                /* console connection */
+    stats_state_t      state;            /* console command pending */
+    char               buf[1024];        /* console output so far */
+    size_t             len;              /* length of console output */
+    bool               ready;            /* stats reset for this phase */
+    bool               valid;            /* stats of the phase received */
+    unsigned long long passes;           /* arbitration passes */
+    unsigned long long requests;         /* requests served by the passes */
+    double             total;            /* time spent arbitrating (usecs) */
+    double             mean;             /* mean time of a pass (usecs) */
+    double             max;              /* longest pass (usecs) */
+} load_stats_t;
+
+struct load_s {
+    mrp_mainloop_t *ml;
+    load_client_t  *clients;
+
+    /* configuration */
+    int             nclient;
+    int             phases[MAX_PHASES];
+    int             nphase;
+    int             nrequest;
+    int             acquire;
+    int             window;
+    int             batch;
+    int             timeout;
+    unsigned int    seed;
+    int             pid;
+    bool            verbose;
+    const char     *zones[MAX_ITEMS];
+    int             nzone;
+    load_class_t    classes[MAX_ITEMS];
+    int             nclass;
+    int             total_weight;
+    const char     *resources[MAX_ITEMS];
+    int             nresource;
+
+    /* run state */
+    int             nconnected;
+    int             phase;
+    bool            measuring;
+    int             warming;
+    int             issued;
+    int             completed;
+    int             granted;
+    int             denied;
+    int             preempted;
+    int             failed;
+    uint64_t        start;
+    uint64_t       *latency;
+    mrp_timer_t    *timer;
+    load_stats_t    stats;
+};
+
+
+static void issue_requests(load_client_t *client);
+static void start_phase(load_t *load);
+static void complete_phase(load_t *load);
+
+
+static uint64_t now_usecs(void)
+{
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+
+    return (uint64_t)ts.tv_sec * 1000000 + ts.tv_nsec / 1000;
+}
+
+
+static int random_index(load_t *load, int max)
+{
+    return rand_r(&load->seed) % max;
+}
+
+
+static const char *pick_class(load_t *load)
+{
+    int i, w;
+
+    w = random_index(load, load->total_weight);
+
+    for (i = 0; i < load->nclass; i++) {
+        if ((w -= load->classes[i].weight) < 0)
+            break;
+    }
+
+    return load->classes[i < load->nclass ? i : 0].name;
+}
+
+
+static int compare_latency(const void *a, const void *b)
+{
+    uint64_t la = *(const uint64_t *)a;
+    uint64_t lb = *(const uint64_t *)b;
+
+    return (la > lb) - (la < lb);
+}
+
+
+static uint64_t percentile(uint64_t *sorted, int n, double p)
+{
+    int idx;
+
+    if (n == 0)
+        return 0;
+
+    idx = (int)(p * n);
+
+    if (idx >= n)
+        idx = n - 1;
+
+    return sorted[idx];
+}
+
+
+static bool server_memory(int pid, unsigned long *rss, unsigned long *hwm)
+{
+    char  path[64], line[256];
+    FILE *fp;
+    int   n;
+
+    snprintf(path, sizeof(path), "/proc/%d/status", pid);
+
+    if ((fp = fopen(path, "r")) == NULL)
+        return false;
+
+    n = 0;
+    while (fgets(line, sizeof(line), fp) != NULL) {
+        if (sscanf(line, "VmRSS: %lu kB", rss) == 1 ||
+            sscanf(line, "VmHWM: %lu kB", hwm) == 1)
+            n++;
+    }
+
+    fclose(fp);
+
+    return n == 2;
+}
+
+
+static void report_phase(load_t *load)
+{
+    uint64_t       elapsed = now_usecs() - load->start;
+    int            sets    = load->phases[load->phase];
+    int            n       = load->completed;
+    uint64_t      *lat     = load->latency;
+    unsigned long  rss, hwm;
+
+    qsort(lat, n, sizeof(lat[0]), compare_latency);
+
+    printf("{\"phase\":%d,\"clients\":%d,\"sets_per_client\":%d,"
+           "\"sets\":%d,\"requests\":%d,\"completed\":%d,\"timeouts\":%d,"
+           "\"failed\":%d,\"granted\":%d,\"denied\":%d,\"preempted\":%d,"
+           "\"elapsed_us\":%llu,\"throughput_rps\":%.1f,"
+           "\"latency_us\":{\"min\":%llu,\"p50\":%llu,\"p99\":%llu,"
+           "\"p999\":%llu,\"max\":%llu}",
+           load->phase, load->nclient, sets, sets * load->nclient,
+           load->nrequest, n, load->issued - n - load->failed, load->failed,
+           load->granted, load->denied, load->preempted,
+           (unsigned long long)elapsed,
+           elapsed ? 1000000.0 * n / elapsed : 0.0,
+           (unsigned long long)(n ? lat[0] : 0),
+           (unsigned long long)percentile(lat, n, 0.50),
+           (unsigned long long)percentile(lat, n, 0.99),
+           (unsigned long long)percentile(lat, n, 0.999),
+           (unsigned long long)(n ? lat[n - 1] : 0));
+
+    if (load->pid && server_memory(load->pid, &rss, &hwm))
+        printf(",\"server_rss_kb\":%lu,\"server_hwm_kb\":%lu", rss, hwm);
+
+    if (load->stats.valid)
+        printf(",\"arbitration\":{\"passes\":%llu,\"requests\":%llu,"
+               "\"total_us\":%.1f,\"mean_us\":%.2f,\"max_us\":%.1f}",
+               load->stats.passes, load->stats.requests, load->stats.total,
+               load->stats.mean, load->stats.max);
+
+    printf("}\n");
+    fflush(stdout);
+}
+
+
+static bool send_console_command(load_t *load, const char *cmd)
+{
+    mrp_msg_t *msg;
+    int        success;
+
+    msg = mrp_msg_create(MRP_CONSOLE_INPUT, MRP_MSG_FIELD_BLOB,
+                         (uint32_t)strlen(cmd) + 1, cmd, NULL);
+
+    if (msg == NULL)
+        return false;
+
+    success = mrp_transport_send(load->stats.t, msg);
+    mrp_msg_unref(msg);
+
+    return success;
+}
+
+
+static bool request_stats(load_t *load, stats_state_t state)
+{
+    const char *cmd;
+
+    if (state == STATS_RESET)
+        cmd = "resource arbitration reset";
+    else
+        cmd = "resource arbitration";
+
+    load->stats.state = state;
+    load->stats.len   = 0;
+
+    if (!send_console_command(load, cmd)) {
+        fprintf(stderr, "failed to send console command '%s'\n", cmd);
+        mrp_mainloop_quit(load->ml, EIO);
+        return false;
+    }
+
+    return true;
+}
+
+
+static void stats_line(load_t *load, const char *line)
+{
+    load_stats_t *stats = &load->stats;
+
+    switch (stats->state) {
+    case STATS_RESET:
+        if (strstr(line, "reset") == NULL)
+            return;
+
+        stats->state = STATS_IDLE;
+        stats->ready = true;
+        start_phase(load);
+        break;
+
+    case STATS_QUERY:
+        if (sscanf(line, "Arbitration: passes %llu, requests %llu, "
+                   "total %lf us, mean %lf us, max %lf us",
+                   &stats->passes, &stats->requests, &stats->total,
+                   &stats->mean, &stats->max) != 5)
+            return;
+
+        stats->state = STATS_IDLE;
+        stats->valid = true;
+        complete_phase(load);
+        break;
+
+    default:
+        break;
+    }
+}
+
+
+static void console_recv(mrp_transport_t *t, mrp_msg_t *msg, void *user_data)
+{
+    load_t          *load  = (load_t *)user_data;
+    load_stats_t    *stats = &load->stats;
+    mrp_msg_field_t *f;
+    char            *nl;
+    size_t           size, n;
+
+    MRP_UNUSED(t);
+
+    if ((f = mrp_msg_find(msg, MRP_CONSOLE_OUTPUT)) == NULL ||
+        f->type != MRP_MSG_FIELD_BLOB)
+        return;
+
+    size = f->size[0];
+
+    /* collect the output and process it line by line */
+    while (size > 0) {
+        n = sizeof(stats->buf) - 1 - stats->len;
+
+        if (n > size)
+            n = size;
+
+        memcpy(stats->buf + stats->len, f->str + (f->size[0] - size), n);
+        stats->len += n;
+        stats->buf[stats->len] = '\0';
+        size -= n;
+
+        while ((nl = strchr(stats->buf, '\n')) != NULL) {
+            *nl = '\0';
+            stats_line(load, stats->buf);
+
+            stats->len -= nl + 1 - stats->buf;
+            memmove(stats->buf, nl + 1, stats->len + 1);
+        }
+
+        /* drop overlong lines, we would not recognize them anyway */
+        if (stats->len == sizeof(stats->buf) - 1)
+            stats->len = 0;
+    }
+}
+
+
+static void console_recvfrom(mrp_transport_t *t, mrp_msg_t *msg,
+                             mrp_sockaddr_t *addr, socklen_t addrlen,
+                             void *user_data)
+{
+    MRP_UNUSED(addr);
+    MRP_UNUSED(addrlen);
+
+    console_recv(t, msg, user_data);
+}
+
+
+static void console_closed(mrp_transport_t *t, int error, void *user_data)
+{
+    load_t *load = (load_t *)user_data;
+
+    MRP_UNUSED(t);
+
+    fprintf(stderr, "console connection closed (%d: %s)\n", error,
+            strerror(error));
+    mrp_mainloop_quit(load->ml, error ? error : ECONNRESET);
+}
+
+
+static bool connect_console(load_t *load)
+{
+    static mrp_transport_evt_t evt;
+
+    mrp_sockaddr_t  addr;
+    socklen_t       alen;
+    const char     *type;
+
+    alen = mrp_transport_resolve(NULL, load->stats.address,
+                                 &addr, sizeof(addr), &type);
+
+    if (alen <= 0)
+        return false;
+
+    evt.closed      = console_closed;
+    evt.recvmsg     = console_recv;
+    evt.recvmsgfrom = console_recvfrom;
+
+    load->stats.t = mrp_transport_create(load->ml, type, &evt, load, 0);
+
+    if (load->stats.t == NULL)
+        return false;
+
+    if (!mrp_transport_connect(load->stats.t, &addr, alen)) {
+        mrp_transport_destroy(load->stats.t);
+        load->stats.t = NULL;
+        return false;
+    }
+
+    return true;
+}
+
+
+static void finish_phase(load_t *load)
+{
+    load->measuring = false;
+
+    /* the phase is reported once we have the arbitration stats for it */
+    if (load->stats.t != NULL)
+        request_stats(load, STATS_QUERY);
+    else
+        complete_phase(load);
+}
+
+
+static void complete_phase(load_t *load)
+{
+    if (load->timer) {
+        mrp_del_timer(load->timer);
+        load->timer = NULL;
+    }
+
+    report_phase(load);
+
+    load->stats.ready = false;
+    load->stats.valid = false;
+
+    load->phase++;
+
+    if (load->phase < load->nphase)
+        start_phase(load);
+    else
+        mrp_mainloop_quit(load->ml, 0);
+}
+
+
+static void phase_timeout(mrp_timer_t *t, void *user_data)
+{
+    load_t *load = (load_t *)user_data;
+
+    fprintf(stderr, "phase %d timed out\n", load->phase);
+
+    /* requests still in flight would confuse the next phase, so stop here */
+    load->timer     = NULL;
+    load->measuring = false;
+    report_phase(load);
+
+    mrp_del_timer(t);
+    mrp_mainloop_quit(load->ml, ETIMEDOUT);
+}
+
+
+static void resource_callback(mrp_res_context_t *cx,
+                              const mrp_res_resource_set_t *rs,
+                              void *user_data)
+{
+    load_set_t    *set    = (load_set_t *)user_data;
+    load_client_t *client = set->client;
+    load_t        *load   = client->load;
+
+    MRP_UNUSED(cx);
+
+    if (!set->pending) {
+        if (load->measuring && set->acquired &&
+            rs->state != MRP_RES_RESOURCE_ACQUIRED)
+            load->preempted++;
+        return;
+    }
+
+    set->pending = false;
+    client->inflight--;
+
+    if (!load->measuring) {
+        if (--load->warming == 0)
+            start_phase(load);
+        return;
+    }
+
+    load->latency[load->completed++] = now_usecs() - set->stamp;
+
+    if (set->acquired) {
+        if (rs->state == MRP_RES_RESOURCE_ACQUIRED)
+            load->granted++;
+        else
+            load->denied++;
+    }
+
+    if (load->completed + load->failed >= load->nrequest)
+        finish_phase(load);
+    else
+        issue_requests(client);
+}
+
+
+static load_set_t *pick_set(load_client_t *client, bool acquired)
+{
+    load_t     *load = client->load;
+    load_set_t *set;
+    int         i, idx;
+
+    idx = random_index(load, client->nset);
+
+    for (i = 0; i < client->nset; i++) {
+        set = client->sets[(idx + i) % client->nset];
+
+        if (!set->pending && set->acquired == acquired)
+            return set;
+    }
+
+    return NULL;
+}
+
+
+static void issue_requests(load_client_t *client)
+{
+    load_t                 *load = client->load;
+    mrp_res_resource_set_t *rsets[MAX_ITEMS];
+    load_set_t             *sets[MAX_ITEMS];
+    load_set_t             *set;
+    bool                    acquire;
+    int                     n, i, r;
+
+    while (client->inflight < load->window &&
+           load->issued < load->nrequest && load->measuring) {
+        acquire = random_index(load, 100) < load->acquire;
+
+        for (n = 0; n < load->batch && load->issued + n < load->nrequest; n++) {
+            if (!(set = pick_set(client, !acquire)) &&
+                !(set = pick_set(client, acquire)))
+                break;
+
+            /* pick_set only offers sets that are not pending */
+            set->pending = true;
+            sets[n] = set;
+        }
+
+        if (n == 0)
+            return;
+
+        /* a batch only carries sets going the same way */
+        for (i = 0; i < n; i++) {
+            if (sets[i]->acquired != sets[0]->acquired) {
+                sets[i]->pending = false;
+                sets[i--] = sets[--n];
+            }
+        }
+
+        acquire = !sets[0]->acquired;
+
+        for (i = 0; i < n; i++) {
+            sets[i]->acquired = acquire;
+            sets[i]->stamp    = now_usecs();
+            rsets[i]          = sets[i]->rset;
+        }
+
+        if (n == 1) {
+            if (acquire)
+                r = mrp_res_acquire_resource_set(rsets[0]);
+            else
+                r = mrp_res_release_resource_set(rsets[0]);
+        }
+        else {
+            if (acquire)
+                r = mrp_res_acquire_resource_sets(rsets, n);
+            else
+                r = mrp_res_release_resource_sets(rsets, n);
+        }
+
+        load->issued += n;
+
+        if (r < 0) {
+            for (i = 0; i < n; i++)
+                sets[i]->pending = false;
+            load->failed += n;
+
+            if (load->completed + load->failed >= load->nrequest)
+                finish_phase(load);
+            return;
+        }
+
+        client->inflight += n;
+    }
+}
+
+
+static bool add_sets(load_client_t *client, int nset)
+{
+    load_t             *load = client->load;
+    load_set_t         *set;
+    mrp_res_resource_t *res;
+    int                 i, j, nres;
+
+    if (nset <= client->nset)
+        return true;
+
+    if (!mrp_reallocz(client->sets, client->nset, nset))
+        return false;
+
+    for (i = client->nset; i < nset; i++) {
+        if (!(set = mrp_allocz(sizeof(*set))))
+            return false;
+
+        set->client = client;
+        set->rset   = mrp_res_create_resource_set(client->cx, pick_class(load),
+                                                  resource_callback, set);
+
+        if (!set->rset) {
+            mrp_free(set);
+            return false;
+        }
+
+        nres = 1 + random_index(load, load->nresource);
+
+        for (j = 0; j < nres; j++) {
+            res = mrp_res_create_resource(set->rset,
+                                          load->resources[(i + j) %
+                                                          load->nresource],
+                                          j == 0, random_index(load, 2));
+            if (!res)
+                return false;
+        }
+
+        client->sets[client->nset++] = set;
+
+        /* get the set created on the server before we start measuring */
+        set->pending = true;
+        client->inflight++;
+        load->warming++;
+
+        if (mrp_res_release_resource_set(set->rset) < 0)
+            return false;
+    }
+
+    return true;
+}
+
+
+static void start_phase(load_t *load)
+{
+    load_client_t *client;
+    int            i, nset;
+
+    nset = load->phases[load->phase];
+
+    if (!load->timer)
+        load->timer = mrp_add_timer(load->ml, load->timeout * 1000,
+                                    phase_timeout, load);
+
+    /*
+     * First bring every client up to the number of sets of the phase. We
+     * get called again once the server has acknowledged all the new sets.
+     */
+    for (i = 0; i < load->nclient; i++) {
+        if (!add_sets(load->clients + i, nset)) {
+            fprintf(stderr, "failed to create resource sets\n");
+            mrp_mainloop_quit(load->ml, ENOMEM);
+            return;
+        }
+    }
+
+    if (load->warming > 0)
+        return;
+
+    /*
+     * Reset the arbitration stats of the server before measuring. We get
+     * called again once the console has acknowledged the reset.
+     */
+    if (load->stats.t != NULL && !load->stats.ready) {
+        request_stats(load, STATS_RESET);
+        return;
+    }
+
+    load->issued    = 0;
+    load->completed = 0;
+    load->granted   = 0;
+    load->denied    = 0;
+    load->preempted = 0;
+    load->failed    = 0;
+    load->measuring = true;
+    load->start     = now_usecs();
+
+    for (i = 0; i < load->nclient && load->measuring; i++) {
+        client = load->clients + i;
+        issue_requests(client);
+    }
+}
+
+
+static void state_callback(mrp_res_context_t *cx, mrp_res_error_t err,
+                           void *user_data)
+{
+    load_client_t *client = (load_client_t *)user_data;
+    load_t        *load   = client->load;
+
+    if (err != MRP_RES_ERROR_NONE) {
+        fprintf(stderr, "client %d: error %d from the server\n",
+                client->id, err);
+        mrp_mainloop_quit(load->ml, EIO);
+        return;
+    }
+
+    switch (cx->state) {
+    case MRP_RES_CONNECTED:
+        if (!client->connected) {
+            client->connected = true;
+            cx->zone = load->zones[client->id % load->nzone];
+
+            if (++load->nconnected == load->nclient)
+                start_phase(load);
+        }
+        break;
+
+    case MRP_RES_DISCONNECTED:
+        fprintf(stderr, "client %d: disconnected\n", client->id);
+        mrp_mainloop_quit(load->ml, ECONNRESET);
+        break;
+    }
+}
+
+
+static int parse_list(char *str, const char **items, int max)
+{
+    char *tok, *save;
+    int   n = 0;
+
+    for (tok = strtok_r(str, ",", &save); tok; tok = strtok_r(NULL, ",", &save))
+        if (n < max)
+            items[n++] = tok;
+
+    return n;
+}
+
+
+static void print_usage(const char *argv0, int exit_code, const char *fmt, ...)
+{
+    va_list ap;
+
+    if (fmt && *fmt) {
+        va_start(ap, fmt);
+        vfprintf(stderr, fmt, ap);
+        fprintf(stderr, "\n");
+        va_end(ap);
+    }
+
+    fprintf(stderr, "usage: %s [options]\n\n"
+           "The possible options are:\n"
+           "  -c, --clients=N                number of client connections\n"
+           "  -s, --sets=N[,N...]            resource sets per client, one\n"
+           "                                 measurement phase per number\n"
+           "  -n, --requests=N               requests per phase\n"
+           "  -a, --acquire=PERCENT          share of acquisitions\n"
+           "  -w, --window=N                 max. requests in flight per "
+           "client\n"
+           "  -b, --batch=N                  sets per batched request\n"
+           "  -z, --zones=ZONE[,ZONE...]     zones to spread the clients to\n"
+           "  -C, --classes=CLASS[:WEIGHT],...\n"
+           "                                 application classes to use\n"
+           "  -r, --resources=RES[,RES...]   resources to put in the sets\n"
+           "  -S, --seed=SEED                seed for the random choices\n"
+           "  -T, --timeout=SECONDS          max. duration of a phase\n"
+           "  -p, --pid=PID                  report the memory usage of the\n"
+           "                                 server with the given pid\n"
+           "  -A, --arbitration=ADDRESS      report the arbitration stats\n"
+           "                                 of the server read from its\n"
+           "                                 console at ADDRESS\n"
+           "  -v, --verbose                  show the library log\n"
+           "  -h, --help                     show help on usage\n",
+           argv0);
+
+    exit(exit_code);
+}
+
+
+static void parse_cmdline(load_t *load, int argc, char **argv)
+{
+#   define OPTIONS "c:s:n:a:w:b:z:C:r:S:T:p:A:vh"
+    struct option options[] = {
+        { "clients"  , required_argument, NULL, 'c' },
+        { "sets"     , required_argument, NULL, 's' },
+        { "requests" , required_argument, NULL, 'n' },
+        { "acquire"  , required_argument, NULL, 'a' },
+        { "window"   , required_argument, NULL, 'w' },
+        { "batch"    , required_argument, NULL, 'b' },
+        { "zones"    , required_argument, NULL, 'z' },
+        { "classes"  , required_argument, NULL, 'C' },
+        { "resources", required_argument, NULL, 'r' },
+        { "seed"     , required_argument, NULL, 'S' },
+        { "timeout"  , required_argument, NULL, 'T' },
+        { "pid"      , required_argument, NULL, 'p' },
+        { "arbitration", required_argument, NULL, 'A' },
+        { "verbose"  , no_argument      , NULL, 'v' },
+        { "help"     , no_argument      , NULL, 'h' },
+        { NULL, 0, NULL, 0 }
+    };
+
+    static char default_zones[]     = "driver";
+    static char default_classes[]   = "player:4,game:2,navigator:1,phone:1";
+    static char default_resources[] = "audio_playback,audio_recording";
+    static char default_sets[]      = "4,16,64";
+
+    const char *items[MAX_ITEMS];
+    char       *zones, *classes, *resources, *sets, *w;
+    int         opt, i, n;
+
+    load->nclient  = 8;
+    load->nrequest = 2000;
+    load->acquire  = 60;
+    load->window   = 1;
+    load->batch    = 1;
+    load->timeout  = 60;
+    load->seed     = 1;
+
+    zones     = default_zones;
+    classes   = default_classes;
+    resources = default_resources;
+    sets      = default_sets;
+
+    while ((opt = getopt_long(argc, argv, OPTIONS, options, NULL)) != -1) {
+        switch (opt) {
+        case 'c': load->nclient  = atoi(optarg);          break;
+        case 's': sets           = optarg;                break;
+        case 'n': load->nrequest = atoi(optarg);          break;
+        case 'a': load->acquire  = atoi(optarg);          break;
+        case 'w': load->window   = atoi(optarg);          break;
+        case 'b': load->batch    = atoi(optarg);          break;
+        case 'z': zones          = optarg;                break;
+        case 'C': classes        = optarg;                break;
+        case 'r': resources      = optarg;                break;
+        case 'S': load->seed     = strtoul(optarg, NULL, 10); break;
+        case 'T': load->timeout  = atoi(optarg);          break;
+        case 'p': load->pid      = atoi(optarg);          break;
+        case 'A': load->stats.address = optarg;           break;
+        case 'v': load->verbose  = true;                  break;
+        case 'h': print_usage(argv[0], 0, "");            break;
+        default:
+            print_usage(argv[0], EINVAL, "invalid option '%c'", opt);
+        }
+    }
+
+    if (load->nclient < 1 || load->nclient > MAX_CLIENTS)
+        print_usage(argv[0], EINVAL, "invalid number of clients");
+    if (load->nrequest < 1 || load->window < 1 || load->timeout < 1)
+        print_usage(argv[0], EINVAL, "invalid number of requests");
+    if (load->acquire < 0 || load->acquire > 100)
+        print_usage(argv[0], EINVAL, "invalid share of acquisitions");
+    if (load->batch < 1 || load->batch > MAX_ITEMS)
+        print_usage(argv[0], EINVAL, "invalid batch size");
+
+    load->nzone     = parse_list(zones, load->zones, MAX_ITEMS);
+    load->nresource = parse_list(resources, load->resources, MAX_ITEMS);
+    n               = parse_list(classes, items, MAX_ITEMS);
+
+    for (i = 0; i < n; i++) {
+        if ((w = strchr(items[i], ':')) != NULL)
+            *w++ = '\0';
+
+        load->classes[i].name   = items[i];
+        load->classes[i].weight = w ? atoi(w) : 1;
+
+        if (load->classes[i].weight < 1)
+            print_usage(argv[0], EINVAL, "invalid weight for class '%s'",
+                        items[i]);
+
+        load->total_weight += load->classes[i].weight;
+    }
+
+    load->nclass = n;
+    n = parse_list(sets, items, MAX_PHASES);
+
+    for (i = 0; i < n; i++) {
+        load->phases[i] = atoi(items[i]);
+
+        if (load->phases[i] < 1 || (i > 0 &&
+                                    load->phases[i] < load->phases[i - 1]))
+            print_usage(argv[0], EINVAL, "invalid set counts '%s'", sets);
+    }
+
+    load->nphase = n;
+
+    if (!load->nzone || !load->nresource || !load->nclass || !load->nphase)
+        print_usage(argv[0], EINVAL, "empty zone, class, resource or set list");
+}
+
+
+int main(int argc, char **argv)
+{
+    load_t load;
+    int    i, status;
+
+    mrp_clear(&load);
+    parse_cmdline(&load, argc, argv);
+
+    if (!load.verbose)
+        mrp_res_set_logger(NULL);
+
+    load.latency = mrp_allocz_array(uint64_t, load.nrequest);
+    load.clients = mrp_allocz_array(load_client_t, load.nclient);
+
+    if (!load.latency || !load.clients || !(load.ml = mrp_mainloop_create())) {
+        fprintf(stderr, "failed to allocate memory\n");
+        exit(ENOMEM);
+    }
+
+    if (load.stats.address != NULL && !connect_console(&load)) {
+        fprintf(stderr, "failed to connect to the console at '%s'\n",
+                load.stats.address);
+        exit(ECONNREFUSED);
+    }
+
+    for (i = 0; i < load.nclient; i++) {
+        load.clients[i].load = &load;
+        load.clients[i].id   = i;
+        load.clients[i].cx   = mrp_res_create(load.ml, state_callback,
+                                              load.clients + i);
+
+        if (!load.clients[i].cx) {
+            fprintf(stderr, "failed to connect to the resource manager\n");
+            exit(ECONNREFUSED);
+        }
+    }
+
+    status = mrp_mainloop_run(load.ml);
+
+    for (i = 0; i < load.nclient; i++)
+        mrp_res_destroy(load.clients[i].cx);
+
+    if (load.stats.t != NULL)
+        mrp_transport_destroy(load.stats.t);
+
+    mrp_mainloop_destroy(load.ml);
+
+    return status;
+}
+
+/*
+ * Local Variables:
+ * c-basic-offset: 4
+ * indent-tabs-mode: nil
+ * End:
+ *
+ */
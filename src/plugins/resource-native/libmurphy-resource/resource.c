@@ -89,7 +89,7 @@ static void resource_event(mrp_msg_t *msg,
         void **pcursor)
 {
     uint32_t rset_id;
-    uint32_t grant, advice;
+    uint32_t grant[RESPROTO_MASK_WORDS], advice[RESPROTO_MASK_WORDS];
     mrp_resproto_state_t state;
     uint16_t tag;
     uint16_t type;
@@ -99,16 +99,17 @@ static void resource_event(mrp_msg_t *msg,
     const char *resnam;
     mrp_res_attribute_t attrs[ATTRIBUTE_MAX + 1];
     int n_attrs;
-    uint32_t mask, all = 0x0, mandatory = 0x0;
-    uint32_t i;
+    uint32_t mask, all[RESPROTO_MASK_WORDS], mandatory[RESPROTO_MASK_WORDS];
+    uint32_t i, w;
+    bool granted, advised;
     mrp_res_resource_set_t *rset;
 
     mrp_res_info("Resource event (request no %u):", seqno);
 
     if (!fetch_resource_set_id(msg, pcursor, &rset_id) ||
         !fetch_resource_set_state(msg, pcursor, &state) ||
-        !fetch_resource_set_mask(msg, pcursor, 0, &grant) ||
-        !fetch_resource_set_mask(msg, pcursor, 1, &advice)) {
+        !fetch_resource_set_mask(msg, pcursor, 0, grant) ||
+        !fetch_resource_set_mask(msg, pcursor, 1, advice)) {
         mrp_res_error("failed to fetch data from message");
         goto ignore;
     }
@@ -117,32 +118,24 @@ static void resource_event(mrp_msg_t *msg,
 
     rset = mrp_htbl_lookup(cx->priv->rset_mapping, u_to_p(rset_id));
 
-    if (!rset) {
-        mrp_res_info("resource event outside the resource set lifecycle");
-        goto ignore;
-    }
+    /* the resources are still read to find the end of the set, as more
+     * sets might follow in a coalesced event */
 
     while (mrp_msg_iterate(msg, pcursor, &tag, &type, &value, &size)) {
 
         mrp_res_resource_t *res = NULL;
 
+        if (tag == RESPROTO_SECTION_END)
+            break;
+
         if ((tag != RESPROTO_RESOURCE_ID || type != MRP_MSG_FIELD_UINT32) ||
                 !fetch_resource_name(msg, pcursor, &resnam)) {
             mrp_res_error("failed to read resource from message");
             goto ignore;
         }
 
-        res = get_resource_by_name(rset, resnam);
-
-        if (!res) {
-            mrp_res_error("resource doesn't exist in resource set");
-            goto ignore;
-        }
-
         resid = value.u32;
 
-        mrp_res_info("data for '%s': %d", res->name, resid);
-
         n_attrs = fetch_attribute_array(msg, pcursor, ATTRIBUTE_MAX + 1, attrs);
 
         if (n_attrs < 0) {
@@ -150,6 +143,18 @@ static void resource_event(mrp_msg_t *msg,
             goto ignore;
         }
 
+        if (!rset)
+            continue;
+
+        res = get_resource_by_name(rset, resnam);
+
+        if (!res) {
+            mrp_res_error("resource doesn't exist in resource set");
+            goto ignore;
+        }
+
+        mrp_res_info("data for '%s': %d", res->name, resid);
+
         /* copy the attributes */
         for (i = 0; (int) i < n_attrs; i++) {
             mrp_res_attribute_t *src = &attrs[i];
@@ -183,19 +188,34 @@ static void resource_event(mrp_msg_t *msg,
         }
     }
 
+    if (!rset) {
+        mrp_res_info("resource event outside the resource set lifecycle");
+        goto ignore;
+    }
+
     /* go through all resources and see if they have been modified */
 
+    memset(all, 0, sizeof(all));
+    memset(mandatory, 0, sizeof(mandatory));
+
     for (i = 0; i < rset->priv->num_resources; i++)
     {
         mrp_res_resource_t *res = rset->priv->resources[i];
 
-        mask  = (1UL << res->priv->server_id);
-        all  |= mask;
+        w     = res->priv->server_id / 32;
+        mask  = (1UL << (res->priv->server_id % 32));
+
+        if (w >= RESPROTO_MASK_WORDS) {
+            res->state = MRP_RES_RESOURCE_LOST;
+            continue;
+        }
+
+        all[w] |= mask;
 
         if (res->priv->mandatory)
-            mandatory |= mask;
+            mandatory[w] |= mask;
 
-        if (grant & mask) {
+        if (grant[w] & mask) {
             res->state = MRP_RES_RESOURCE_ACQUIRED;
         }
         else {
@@ -204,12 +224,22 @@ static void resource_event(mrp_msg_t *msg,
     }
 
     mrp_res_info("advice = 0x%08x, grant = 0x%08x, mandatory = 0x%08x, all = 0x%08x",
-            advice, grant, mandatory, all);
+            advice[0], grant[0], mandatory[0], all[0]);
 
-    if (grant) {
+    granted = false;
+    advised = true;
+
+    for (w = 0; w < RESPROTO_MASK_WORDS; w++) {
+        if (grant[w])
+            granted = true;
+        if (advice[w] != mandatory[w])
+            advised = false;
+    }
+
+    if (granted) {
         rset->state = MRP_RES_RESOURCE_ACQUIRED;
     }
-    else if (advice == mandatory) {
+    else if (advised) {
         rset->state = MRP_RES_RESOURCE_AVAILABLE;
     }
     else {
@@ -363,11 +393,110 @@ static void recvfrom_msg(mrp_transport_t *transp, mrp_msg_t *msg,
 
             break;
         }
+        case RESPROTO_BATCH_REQUEST:
+        {
+            mrp_res_resource_set_private_t *priv;
+            mrp_res_resource_set_t *rset;
+            mrp_list_hook_t *p, *n;
+            uint16_t subreq;
+            uint32_t rset_id;
+            int status;
+            bool failed;
+
+            mrp_res_info("received BATCH_REQUEST response");
+
+            if (!fetch_status(msg, &cursor, &status))
+                goto error;
+
+            failed = (status != 0);
+
+            /* the results come in the order of the batched sets */
+
+            while (fetch_batch_result(msg, &cursor, &subreq, &status,
+                    &rset_id)) {
+                rset = NULL;
+
+                if (subreq != RESPROTO_CREATE_RESOURCE_SET) {
+                    rset = mrp_htbl_lookup(cx->priv->rset_mapping,
+                            u_to_p(rset_id));
+                    if (rset)
+                        rset->priv->seqno = 0;
+                    if (status)
+                        failed = TRUE;
+                    continue;
+                }
+
+                mrp_list_foreach(&cx->priv->pending_sets, p, n) {
+                    priv = mrp_list_entry(p, typeof(*priv), hook);
+
+                    if (priv->seqno == seqno) {
+                        rset = priv->pub;
+                        break;
+                    }
+                }
+
+                if (!rset) {
+                    failed = TRUE;
+                    continue;
+                }
+
+                mrp_list_delete(&rset->priv->hook);
+
+                if (status) {
+                    mrp_res_error("creation of resource set failed. "
+                            "error code %u", status);
+                    failed = TRUE;
+                    continue;
+                }
+
+                rset->priv->id = rset_id;
+
+                mrp_htbl_insert(cx->priv->rset_mapping,
+                        u_to_p(rset->priv->id), rset);
+
+                /* sets to be acquired were acquired already on creation */
+
+                if (rset->priv->waiting_for ==
+                        MRP_RES_PENDING_OPERATION_RELEASE) {
+                    if (release_resource_set_request(cx, rset) < 0)
+                        failed = TRUE;
+                }
+                else
+                    rset->priv->seqno = 0;
+
+                rset->priv->waiting_for = MRP_RES_PENDING_OPERATION_NONE;
+            }
+
+            if (failed)
+                goto error;
+            break;
+        }
         case RESPROTO_RESOURCES_EVENT:
             mrp_res_info("received RESOURCES_EVENT response");
 
             resource_event(msg, cx, seqno, &cursor);
             break;
+        case RESPROTO_COALESCED_RESOURCES_EVENT:
+            mrp_res_info("received COALESCED_RESOURCES_EVENT response");
+
+            /* each set carries the request number it acknowledges */
+            while (fetch_seqno(msg, &cursor, &seqno) == 0)
+                resource_event(msg, cx, seqno, &cursor);
+            break;
+        case RESPROTO_SET_CAPABILITIES:
+        {
+            int status;
+            uint32_t caps;
+
+            if (!fetch_status(msg, &cursor, &status) || status ||
+                    !fetch_capabilities(msg, &cursor, &caps)) {
+                mrp_res_info("server did not accept the capabilities");
+                break;
+            }
+
+            mrp_res_info("server capabilities 0x%x", caps);
+            break;
+        }
         case RESPROTO_DESTROY_RESOURCE_SET:
             mrp_res_info("received DESTROY_RESOURCE_SET response");
             /* TODO? */
@@ -527,6 +656,10 @@ mrp_res_context_t *mrp_res_create(mrp_mainloop_t *ml,
     cx->priv->connected = TRUE;
     cx->state = MRP_RES_DISCONNECTED;
 
+    /* servers that don't know about capabilities just ignore this */
+    if (set_capabilities_request(cx, RESPROTO_CAPABILITY_COALESCED_EVENTS) < 0)
+        goto error;
+
     if (get_application_classes_request(cx) < 0 || get_available_resources_request(cx) < 0) {
         goto error;
     }
@@ -457,6 +457,108 @@ error:
     return -1;
 }
 
+static int batch_operation(mrp_res_resource_set_t **rs, uint32_t n,
+        bool acquire)
+{
+    mrp_res_resource_set_t *sets[RESPROTO_BATCH_MAX];
+    mrp_res_resource_set_t *rset;
+    mrp_res_context_t *cx;
+    mrp_list_hook_t *p, *nx;
+    mrp_res_resource_set_private_t *pending_rset;
+    uint32_t i, nset;
+    bool pending;
+
+    if (!rs || n == 0 || n > RESPROTO_BATCH_MAX)
+        goto error;
+
+    cx = rs[0]->priv->cx;
+
+    if (!cx || !cx->priv->connected) {
+        mrp_res_error("not connected to server");
+        goto error;
+    }
+
+    /* check everything before touching any of the sets */
+
+    for (i = 0; i < n; i++) {
+        if (rs[i]->priv->cx != cx) {
+            mrp_res_error("resource sets of a batch in different contexts");
+            goto error;
+        }
+
+        rset = mrp_htbl_lookup(cx->priv->internal_rset_mapping,
+                u_to_p(rs[i]->priv->internal_id));
+
+        if (!rset) {
+            mrp_res_error("trying to batch a non-existent resource set");
+            goto error;
+        }
+
+        if (acquire && rset->priv->id &&
+                rset->state == MRP_RES_RESOURCE_ACQUIRED) {
+            mrp_res_error("trying to re-acquire already acquired set");
+            goto error;
+        }
+
+        sets[i] = rset;
+    }
+
+    for (i = 0, nset = 0; i < n; i++) {
+        rset = sets[i];
+
+        if (update_library_resource_set(cx, rs[i], rset) < 0)
+            goto error;
+
+        if (rset->priv->id) {
+            sets[nset++] = rset;
+            continue;
+        }
+
+        /* A set whose creation is already on its way is taken care of
+         * when the server replies to it. */
+
+        pending = FALSE;
+
+        mrp_list_foreach(&cx->priv->pending_sets, p, nx) {
+            pending_rset = mrp_list_entry(p, mrp_res_resource_set_private_t,
+                    hook);
+            if (pending_rset == rset->priv) {
+                pending = TRUE;
+                break;
+            }
+        }
+
+        rset->priv->waiting_for = acquire ?
+                MRP_RES_PENDING_OPERATION_ACQUIRE :
+                MRP_RES_PENDING_OPERATION_RELEASE;
+
+        if (!pending) {
+            mrp_list_append(&cx->priv->pending_sets, &rset->priv->hook);
+            sets[nset++] = rset;
+        }
+    }
+
+    if (nset == 0)
+        return 0;
+
+    if (batch_request(cx, sets, nset, acquire) < 0) {
+        mrp_res_error("sending batch request failed");
+
+        for (i = 0; i < nset; i++) {
+            if (!sets[i]->priv->id)
+                mrp_list_delete(&sets[i]->priv->hook);
+        }
+
+        goto error;
+    }
+
+    return 0;
+
+error:
+    mrp_res_error("error in batched %s", acquire ? "acquire" : "release");
+    return -1;
+}
+
 /* public API */
 
 const mrp_res_string_array_t * mrp_res_list_application_classes(
@@ -868,6 +970,24 @@ error:
 }
 
 
+int mrp_res_acquire_resource_sets(mrp_res_resource_set_t **rs, int n)
+{
+    if (n < 0)
+        return -1;
+
+    return batch_operation(rs, n, TRUE);
+}
+
+
+int mrp_res_release_resource_sets(mrp_res_resource_set_t **rs, int n)
+{
+    if (n < 0)
+        return -1;
+
+    return batch_operation(rs, n, FALSE);
+}
+
+
 int mrp_res_get_resource_set_id(mrp_res_resource_set_t *rs)
 {
     mrp_res_resource_set_t *internal_set;
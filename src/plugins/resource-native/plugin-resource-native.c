@@ -37,6 +37,7 @@
 #include <murphy/common/macros.h>
 #include <murphy/common/mm.h>
 #include <murphy/common/mainloop.h>
+#include <murphy/common/hashtbl.h>
 #include <murphy/common/msg.h>
 #include <murphy/common/transport.h>
 #include <murphy/common/debug.h>
@@ -71,6 +72,8 @@ enum {
 
 enum {
     ARG_ADDRESS,
+    ARG_BATCH,
+    ARG_BATCH_LATENCY,
 };
 
 
@@ -82,6 +85,7 @@ typedef struct {
     const char        *atyp;
     mrp_transport_t   *listen;
     mrp_list_hook_t    clients;
+    mrp_deferred_t    *flush;
 } resource_data_t;
 
 typedef struct {
@@ -90,16 +94,38 @@ typedef struct {
     uint32_t               id;
     mrp_resource_client_t *rscli;
     mrp_transport_t       *transp;
+    uint32_t               caps;
+    mrp_htbl_t            *notify;
+    mrp_list_hook_t        queue;
 } client_t;
 
+typedef struct {
+    uint32_t            rsid;        /* resource set id, the hash key */
+    uint32_t            reqid;       /* latest request to acknowledge */
+    bool                queued;      /* waiting for the next flush */
+    bool                notified;    /* has been sent at least once */
+    uint32_t            attrgen;     /* attribute generation last sent */
+    mrp_resource_mask_t grant;       /* grant last sent */
+    mrp_resource_mask_t advice;      /* advice last sent */
+    uint32_t            newgen;      /* attribute generation being sent */
+    mrp_resource_mask_t newgrant;    /* grant being sent */
+    mrp_resource_mask_t newadvice;   /* advice being sent */
+    mrp_list_hook_t     hook;        /* to the queue of the client */
+} notify_t;
+
 
 static void print_zones_cb(mrp_console_t *, void *, int, char **argv);
 static void print_classes_cb(mrp_console_t *, void *, int, char **argv);
 static void print_sets_cb(mrp_console_t *, void *, int, char **argv);
 static void print_owners_cb(mrp_console_t *, void *, int, char **argv);
 static void print_resources_cb(mrp_console_t *, void *, int, char **argv);
+static void print_veto_cb(mrp_console_t *, void *, int, char **argv);
+static void print_arbitration_cb(mrp_console_t *, void *, int, char **argv);
 
 static void resource_event_handler(uint32_t, mrp_resource_set_t *, void *);
+static void flush_events(mrp_deferred_t *, void *);
+static void flush_client_events(client_t *);
+static void forget_resource_set(client_t *, uint32_t);
 
 
 MRP_CONSOLE_GROUP(resource_group, "resource", NULL, NULL, {
@@ -131,6 +157,19 @@ MRP_CONSOLE_GROUP(resource_group, "resource", NULL, NULL, {
                           "all their attributes. The data sources for the "
                           "printout are the internal data structures of the "
                           "resource library"),
+        MRP_TOKENIZED_CMD("veto" , print_veto_cb , FALSE,
+                          "veto", "prints veto cache statistics",
+                          "prints whether the verdicts of the veto method "
+                          "are cached, the inputs the veto declared to "
+                          "depend on and the number of cache hits and "
+                          "misses."),
+        MRP_TOKENIZED_CMD("arbitration" , print_arbitration_cb , FALSE,
+                          "arbitration [reset]",
+                          "prints arbitration statistics",
+                          "prints the number of arbitration passes, the "
+                          "number of requests they served and the total, "
+                          "mean and maximum time (in usecs) spent in them, "
+                          "or resets the statistics."),
 
 });
 
@@ -209,6 +248,42 @@ static void print_owners_cb(mrp_console_t *c, void *user_data,
 }
 
 
+static void print_veto_cb(mrp_console_t *c, void *user_data,
+                          int argc, char **argv)
+{
+    char buf[512];
+
+    MRP_UNUSED(c);
+    MRP_UNUSED(user_data);
+    MRP_UNUSED(argc);
+    MRP_UNUSED(argv);
+
+    mrp_resource_veto_print(buf, sizeof(buf));
+
+    printf("%s", buf);
+}
+
+
+static void print_arbitration_cb(mrp_console_t *c, void *user_data,
+                                 int argc, char **argv)
+{
+    char buf[256];
+
+    MRP_UNUSED(c);
+    MRP_UNUSED(user_data);
+
+    if (argc == 3 && !strcmp(argv[2], "reset")) {
+        mrp_resource_owner_reset_stats();
+        printf("arbitration statistics reset\n");
+        return;
+    }
+
+    mrp_resource_owner_stats_print(buf, sizeof(buf));
+
+    printf("%s", buf);
+}
+
+
 static void print_resources_cb(mrp_console_t *c, void *user_data,
                                int argc, char **argv)
 {
@@ -556,6 +631,10 @@ static int read_resource(mrp_resource_set_t *rset, mrp_msg_t *req,void **pcurs)
     if (!mrp_msg_iterate(req, pcurs, &tag, &type, &value, &size))
         return RESOURCE_LAST;
 
+    /* in a batch the resources of a set are closed by a section end */
+    if (tag == RESPROTO_SECTION_END)
+        return RESOURCE_LAST;
+
     if (tag != RESPROTO_RESOURCE_NAME || type != MRP_MSG_FIELD_STRING)
         return RESOURCE_ERROR;
 
@@ -589,15 +668,11 @@ static int read_resource(mrp_resource_set_t *rset, mrp_msg_t *req,void **pcurs)
 }
 
 
-static void create_resource_set_request(client_t *client, mrp_msg_t *req,
-                                        uint32_t seqno, void **pcurs)
+static int16_t create_resource_set(client_t *client, mrp_msg_t *req,
+                                   uint32_t seqno, void **pcurs,
+                                   uint32_t *prsid)
 {
-    static uint16_t reqtyp = RESPROTO_CREATE_RESOURCE_SET;
-
-    resource_data_t        *data   = client->data;
-    mrp_plugin_t           *plugin = data->plugin;
     mrp_resource_set_t     *rset   = 0;
-    mrp_msg_t              *rpl;
     uint32_t                flags;
     uint32_t                priority;
     const char             *class;
@@ -608,7 +683,7 @@ static void create_resource_set_request(client_t *client, mrp_msg_t *req,
     mrp_msg_value_t         value;
     uint32_t                rsid;
     int                     arst;
-    int32_t                 status;
+    int16_t                 status;
     bool                    auto_release;
     bool                    auto_acquire;
     bool                    dont_wait;
@@ -675,6 +750,29 @@ static void create_resource_set_request(client_t *client, mrp_msg_t *req,
     }
 
  reply:
+    if (status != 0) {
+        mrp_resource_set_destroy(rset);
+        rsid = MRP_RESOURCE_ID_INVALID;
+    }
+
+    *prsid = rsid;
+
+    return status;
+}
+
+static void create_resource_set_request(client_t *client, mrp_msg_t *req,
+                                        uint32_t seqno, void **pcurs)
+{
+    static uint16_t reqtyp = RESPROTO_CREATE_RESOURCE_SET;
+
+    resource_data_t *data   = client->data;
+    mrp_plugin_t    *plugin = data->plugin;
+    mrp_msg_t       *rpl;
+    uint32_t         rsid;
+    int16_t          status;
+
+    status = create_resource_set(client, req, seqno, pcurs, &rsid);
+
     rpl = mrp_msg_create(MRP_MSG_TAG_UINT32( RESPROTO_SEQUENCE_NO    , seqno ),
                          MRP_MSG_TAG_UINT16( RESPROTO_REQUEST_TYPE   , reqtyp),
                          MRP_MSG_TAG_SINT16( RESPROTO_REQUEST_STATUS , status),
@@ -686,9 +784,6 @@ static void create_resource_set_request(client_t *client, mrp_msg_t *req,
     }
 
     mrp_msg_unref(rpl);
-
-    if (status != 0)
-        mrp_resource_set_destroy(rset);
 }
 
 static void destroy_resource_set_request(client_t *client, mrp_msg_t *req,
@@ -720,6 +815,7 @@ static void destroy_resource_set_request(client_t *client, mrp_msg_t *req,
 
     reply_with_status(client, req, 0);
 
+    forget_resource_set(client, rset_id);
     mrp_resource_set_destroy(rset);
 }
 
@@ -760,6 +856,252 @@ static void acquire_resource_set_request(client_t *client, mrp_msg_t *req,
         mrp_resource_set_release(rset, seqno);
 }
 
+static void batch_request(client_t *client, mrp_msg_t *req, uint32_t seqno,
+                          void **pcurs)
+{
+    static uint16_t reqtyp = RESPROTO_BATCH_REQUEST;
+
+    resource_data_t    *data   = client->data;
+    mrp_plugin_t       *plugin = data->plugin;
+    mrp_resource_set_t *destroy[RESPROTO_BATCH_MAX];
+    void               *start[RESPROTO_BATCH_MAX];
+    uint16_t            subtyp[RESPROTO_BATCH_MAX];
+    int16_t             substat[RESPROTO_BATCH_MAX];
+    uint32_t            rsid[RESPROTO_BATCH_MAX];
+    uint32_t            nsub, ndestroy, i, j;
+    mrp_resource_set_t *rset;
+    mrp_msg_t          *rpl;
+    void               *curs;
+    uint16_t            tag;
+    uint16_t            type;
+    size_t              size;
+    mrp_msg_value_t     value;
+    int16_t             status;
+    bool                inres;
+    bool                s;
+
+    MRP_ASSERT(client, "invalid argument");
+    MRP_ASSERT(client->rscli, "confused with data structures");
+
+    nsub     = 0;
+    ndestroy = 0;
+    status   = 0;
+
+    /*
+     * Check the framing of the whole batch before applying any of it, so
+     * that a malformed batch is rejected as a whole instead of leaving the
+     * sub-requests preceding the error applied. Remember where the fields
+     * of each sub-request start, so that a resource set creation failing
+     * halfway through its resources does not get us out of sync.
+     */
+    while (mrp_msg_iterate(req, pcurs, &tag, &type, &value, &size)) {
+        if (tag != RESPROTO_REQUEST_TYPE || type != MRP_MSG_FIELD_UINT16 ||
+            nsub >= RESPROTO_BATCH_MAX)
+        {
+            status = EINVAL;
+            break;
+        }
+
+        subtyp[nsub]  = value.u16;
+        substat[nsub] = 0;
+        rsid[nsub]    = MRP_RESOURCE_ID_INVALID;
+        start[nsub]   = *pcurs;
+
+        if (subtyp[nsub] == RESPROTO_CREATE_RESOURCE_SET) {
+            /*
+             * The attributes of each resource are closed by a section end
+             * of their own. The section end closing the set is the first
+             * one that is not preceded by a resource name.
+             */
+            inres  = false;
+            status = EINVAL;
+
+            while (mrp_msg_iterate(req, pcurs, &tag, &type, &value, &size) &&
+                   tag != RESPROTO_REQUEST_TYPE)
+            {
+                if (tag == RESPROTO_RESOURCE_NAME)
+                    inres = true;
+                else if (tag == RESPROTO_SECTION_END) {
+                    if (!inres) {
+                        status = 0;
+                        break;
+                    }
+                    inres = false;
+                }
+            }
+
+            if (status != 0)
+                break;
+        }
+        else {
+            if (!mrp_msg_iterate(req, pcurs, &tag, &type, &value, &size) ||
+                tag != RESPROTO_RESOURCE_SET_ID ||
+                type != MRP_MSG_FIELD_UINT32)
+            {
+                status = EINVAL;
+                break;
+            }
+
+            rsid[nsub] = value.u32;
+        }
+
+        nsub++;
+    }
+
+    if (status != 0) {
+        mrp_log_error("%s: malformed batch request, sub-request #%u",
+                      plugin->instance, nsub);
+        nsub = 0;
+    }
+
+    /*
+     * Arbitrate the whole batch as a single unit. Destroying a set settles
+     * its zone right away, so the destructions are postponed until all the
+     * other sub-requests have been queued up and the reply is out.
+     */
+    mrp_resource_owner_begin_batch();
+
+    for (i = 0;  i < nsub;  i++) {
+        if (subtyp[i] == RESPROTO_CREATE_RESOURCE_SET) {
+            curs = start[i];
+            substat[i] = create_resource_set(client, req, seqno, &curs,
+                                             rsid + i);
+            continue;
+        }
+
+        rset = mrp_resource_client_find_set(client->rscli, rsid[i]);
+
+        /* sets already doomed in this batch are treated as gone */
+        for (j = 0;  rset && j < ndestroy;  j++) {
+            if (destroy[j] == rset)
+                rset = NULL;
+        }
+
+        if (!rset)
+            substat[i] = ENOENT;
+        else {
+            switch (subtyp[i]) {
+            case RESPROTO_ACQUIRE_RESOURCE_SET:
+                mrp_resource_set_acquire(rset, seqno);
+                break;
+            case RESPROTO_RELEASE_RESOURCE_SET:
+                mrp_resource_set_release(rset, seqno);
+                break;
+            case RESPROTO_DESTROY_RESOURCE_SET:
+                destroy[ndestroy++] = rset;
+                break;
+            default:
+                substat[i] = EINVAL;
+                break;
+            }
+        }
+    }
+
+    mrp_log_info("%s: batch of %u request(s), status %d", plugin->instance,
+                 nsub, status);
+
+    rpl = mrp_msg_create(MRP_MSG_TAG_UINT32( RESPROTO_SEQUENCE_NO   , seqno ),
+                         MRP_MSG_TAG_UINT16( RESPROTO_REQUEST_TYPE  , reqtyp),
+                         MRP_MSG_TAG_SINT16( RESPROTO_REQUEST_STATUS, status),
+                         RESPROTO_MESSAGE_END                               );
+    s = (rpl != NULL);
+
+    for (i = 0;  s && i < nsub;  i++) {
+        s &= mrp_msg_append(rpl, MRP_MSG_TAG_UINT16(RESPROTO_REQUEST_TYPE,
+                                                    subtyp[i]));
+        s &= mrp_msg_append(rpl, MRP_MSG_TAG_SINT16(RESPROTO_REQUEST_STATUS,
+                                                    substat[i]));
+        s &= mrp_msg_append(rpl, MRP_MSG_TAG_UINT32(RESPROTO_RESOURCE_SET_ID,
+                                                    rsid[i]));
+    }
+
+    if (!s || !mrp_transport_send(client->transp, rpl))
+        mrp_log_error("%s: failed to send reply", plugin->instance);
+
+    mrp_msg_unref(rpl);
+
+    for (i = 0;  i < ndestroy;  i++) {
+        forget_resource_set(client, mrp_get_resource_set_id(destroy[i]));
+        mrp_resource_set_destroy(destroy[i]);
+    }
+
+    mrp_resource_owner_end_batch();
+}
+
+static int notify_comp(const void *key1, const void *key2)
+{
+    return *(const uint32_t *)key1 != *(const uint32_t *)key2;
+}
+
+static uint32_t notify_hash(const void *key)
+{
+    return *(const uint32_t *)key;
+}
+
+static void notify_free(void *key, void *object)
+{
+    notify_t *n = (notify_t *)object;
+
+    MRP_UNUSED(key);
+
+    mrp_list_delete(&n->hook);
+    mrp_free(n);
+}
+
+static void set_capabilities_request(client_t *client, mrp_msg_t *req,
+                                     void **pcurs)
+{
+    static uint32_t supported = RESPROTO_CAPABILITY_COALESCED_EVENTS;
+
+    resource_data_t    *data   = client->data;
+    mrp_plugin_t       *plugin = data->plugin;
+    uint16_t            tag;
+    uint16_t            type;
+    size_t              size;
+    mrp_msg_value_t     value;
+    uint32_t            caps;
+    mrp_htbl_config_t   cfg;
+
+    MRP_ASSERT(client, "invalid argument");
+
+    if (!mrp_msg_iterate(req, pcurs, &tag, &type, &value, &size) ||
+        tag != RESPROTO_CAPABILITIES || type != MRP_MSG_FIELD_UINT32)
+    {
+        reply_with_status(client, req, EINVAL);
+        return;
+    }
+
+    caps = value.u32 & supported;
+
+    if ((caps & RESPROTO_CAPABILITY_COALESCED_EVENTS) && !client->notify) {
+        mrp_clear(&cfg);
+        cfg.comp = notify_comp;
+        cfg.hash = notify_hash;
+        cfg.free = notify_free;
+
+        if (!data->flush || !(client->notify = mrp_htbl_create(&cfg)))
+            caps &= ~RESPROTO_CAPABILITY_COALESCED_EVENTS;
+    }
+
+    /* whatever was gathered so far goes out as negotiated earlier */
+    flush_client_events(client);
+    client->caps = caps;
+
+    mrp_log_info("%s: client%u capabilities 0x%x", plugin->instance,
+                 client->id, caps);
+
+    if (!mrp_msg_append(req, MRP_MSG_TAG_SINT16(RESPROTO_REQUEST_STATUS, 0)) ||
+        !mrp_msg_append(req, MRP_MSG_TAG_UINT32(RESPROTO_CAPABILITIES, caps)) ||
+        !mrp_transport_send(client->transp, req))
+        mrp_log_error("%s: failed to create or send reply", plugin->instance);
+}
+
+static void forget_resource_set(client_t *client, uint32_t rsid)
+{
+    if (client->notify)
+        mrp_htbl_remove(client->notify, &rsid, TRUE);
+}
+
 static void connection_evt(mrp_transport_t *listen, void *user_data)
 {
     static uint32_t  id;
@@ -777,6 +1119,7 @@ static void connection_evt(mrp_transport_t *listen, void *user_data)
     }
 
     client->data = data;
+    mrp_list_init(&client->queue);
 
     snprintf(name, sizeof(name), "client%u", (client->id = ++id));
     client->rscli = mrp_resource_client_create(name, client);
@@ -809,6 +1152,9 @@ static void closed_evt(mrp_transport_t *transp, int error, void *user_data)
 
     mrp_resource_client_destroy(client->rscli);
 
+    if (client->notify)
+        mrp_htbl_destroy(client->notify, TRUE);
+
     mrp_list_delete(&client->list);
     mrp_free(client);
 }
@@ -888,6 +1234,14 @@ static void recvfrom_msg(mrp_transport_t *transp, mrp_msg_t *msg,
         acquire_resource_set_request(client, msg, seqno, false, &cursor);
         break;
 
+    case RESPROTO_BATCH_REQUEST:
+        batch_request(client, msg, seqno, &cursor);
+        break;
+
+    case RESPROTO_SET_CAPABILITIES:
+        set_capabilities_request(client, msg, &cursor);
+        break;
+
     default:
         mrp_log_warning("%s: unsupported request type %d",
                         plugin->instance, reqtyp);
@@ -901,36 +1255,58 @@ static void recv_msg(mrp_transport_t *transp, mrp_msg_t *msg, void *user_data)
 }
 
 
-static void resource_event_handler(uint32_t reqid, mrp_resource_set_t *rset,
-                                   void *userdata)
+static int push_resource_mask(mrp_msg_t *msg, uint16_t tag,
+                              const mrp_resource_mask_t *mask,
+                              const mrp_resource_mask_t *all)
+{
+    uint32_t words[RESPROTO_MASK_WORDS];
+    int      nword, id, i;
+
+    /*
+     * Masks that only cover the first 32 resources go out as a single
+     * integer, like they always did. Wider ones are sent as an array of
+     * 32-bit words, long enough for the highest resource granted or
+     * advised to the set.
+     */
+
+    id = -1;
+    MRP_RESOURCE_MASK_FOREACH(all, i)
+        id = i;
+
+    if (id < 32)
+        return mrp_msg_append(msg, MRP_MSG_TAG_UINT32(tag,
+                                                      (uint32_t)mask->word[0]));
+
+    nword = id / 32 + 1;
+
+    if (nword > RESPROTO_MASK_WORDS)
+        return FALSE;
+
+    for (i = 0;  i < nword;  i++)
+        words[i] = (uint32_t)(mask->word[i / 2] >> (32 * (i & 1)));
+
+    return mrp_msg_append(msg, MRP_MSG_TAG_UINT32_ARRAY(tag, nword, words));
+}
+
+
+static bool push_resource_set(mrp_msg_t *msg, mrp_resource_set_t *rset,
+                              notify_t *n)
 {
-#define FIELD(tag, typ, val)      \
-    RESPROTO_##tag, MRP_MSG_FIELD_##typ, val
 #define PUSH(m, tag, typ, val)    \
     mrp_msg_append(m, MRP_MSG_TAG_##typ(RESPROTO_##tag, val))
 
-    client_t           *client = (client_t *)userdata;
-    resource_data_t    *data;
-    mrp_plugin_t       *plugin;
-    uint16_t            reqtyp;
     uint16_t            state;
     mrp_resource_mask_t grant;
     mrp_resource_mask_t advice;
     mrp_resource_mask_t mask;
     mrp_resource_mask_t all;
-    mrp_msg_t          *msg;
     mrp_resource_t     *res;
     uint32_t            id;
     const char         *name;
     void               *curs;
+    bool                incremental;
     mrp_attr_t          attrs[ATTRIBUTE_MAX + 1];
 
-    MRP_ASSERT(rset && client, "invalid argument");
-
-    data   = client->data;
-    plugin = data->plugin;
-
-    reqtyp = RESPROTO_RESOURCES_EVENT;
     id     = mrp_get_resource_set_id(rset);
     grant  = mrp_get_resource_set_grant(rset);
     advice = mrp_get_resource_set_advice(rset);
@@ -940,40 +1316,125 @@ static void resource_event_handler(uint32_t reqid, mrp_resource_set_t *rset,
     else
         state = RESPROTO_RELEASE;
 
-    msg = mrp_msg_create(FIELD( SEQUENCE_NO    , UINT32, reqid  ),
-                         FIELD( REQUEST_TYPE   , UINT16, reqtyp ),
-                         FIELD( RESOURCE_SET_ID, UINT32, id     ),
-                         FIELD( RESOURCE_STATE , UINT16, state  ),
-                         FIELD( RESOURCE_GRANT , UINT32, grant  ),
-                         FIELD( RESOURCE_ADVICE, UINT32, advice ),
-                         RESPROTO_MESSAGE_END                   );
+    all = grant;
+    mrp_resource_mask_or(&all, &advice);
 
-    if (!msg)
-        goto failed;
+    if (!PUSH(msg, RESOURCE_SET_ID, UINT32, id   ) ||
+        !PUSH(msg, RESOURCE_STATE , UINT16, state))
+        return false;
+
+    if (!push_resource_mask(msg, RESPROTO_RESOURCE_GRANT , &grant, &all) ||
+        !push_resource_mask(msg, RESPROTO_RESOURCE_ADVICE, &advice, &all))
+        return false;
+
+    /* with unchanged attributes only resources with a new verdict are sent */
+    incremental = (n && n->notified && n->attrgen == rset->resource.attrgen);
 
-    all = grant | advice;
     curs = NULL;
 
     while ((res = mrp_resource_set_iterate_resources(rset, &curs))) {
         mask = mrp_resource_get_mask(res);
 
-        if (!(all & mask))
+        if (!mrp_resource_mask_intersects(&all, &mask))
             continue;
 
         id = mrp_resource_get_id(res);
         name = mrp_resource_get_name(res);
 
-         if (!PUSH(msg, RESOURCE_ID  , UINT32, id  ) ||
-             !PUSH(msg, RESOURCE_NAME, STRING, name)  )
-             goto failed;
+        if (incremental &&
+            mrp_resource_mask_test(&grant, id) ==
+            mrp_resource_mask_test(&n->grant, id) &&
+            mrp_resource_mask_test(&advice, id) ==
+            mrp_resource_mask_test(&n->advice, id))
+            continue;
 
-         if (!mrp_resource_read_all_attributes(res, ATTRIBUTE_MAX + 1, attrs))
-             goto failed;
+        if (!PUSH(msg, RESOURCE_ID  , UINT32, id  ) ||
+            !PUSH(msg, RESOURCE_NAME, STRING, name)  )
+            return false;
 
-         if (!write_attributes(msg, attrs))
-                 goto failed;
+        if (!mrp_resource_read_all_attributes(res, ATTRIBUTE_MAX + 1, attrs))
+            return false;
+
+        if (!write_attributes(msg, attrs))
+            return false;
+    }
+
+    /* what was sent is taken into use only once the message is out */
+    if (n) {
+        n->newgen    = rset->resource.attrgen;
+        n->newgrant  = grant;
+        n->newadvice = advice;
     }
 
+    return true;
+
+#undef PUSH
+}
+
+
+static void resource_event_handler(uint32_t reqid, mrp_resource_set_t *rset,
+                                   void *userdata)
+{
+#define FIELD(tag, typ, val)      \
+    RESPROTO_##tag, MRP_MSG_FIELD_##typ, val
+
+    client_t           *client = (client_t *)userdata;
+    resource_data_t    *data;
+    mrp_plugin_t       *plugin;
+    uint16_t            reqtyp;
+    uint32_t            id;
+    notify_t           *n;
+    mrp_msg_t          *msg;
+
+    MRP_ASSERT(rset && client, "invalid argument");
+
+    data   = client->data;
+    plugin = data->plugin;
+
+    if (client->caps & RESPROTO_CAPABILITY_COALESCED_EVENTS) {
+        /* gather the events of the client until the next flush */
+        id = mrp_get_resource_set_id(rset);
+
+        if (!(n = mrp_htbl_lookup(client->notify, &id))) {
+            if ((n = mrp_allocz(sizeof(*n))) != NULL) {
+                n->rsid = id;
+                mrp_list_init(&n->hook);
+
+                if (!mrp_htbl_insert(client->notify, &n->rsid, n)) {
+                    mrp_free(n);
+                    n = NULL;
+                }
+            }
+        }
+
+        if (n) {
+            /* an unsolicited event must not hide the pending reply */
+            if (reqid != 0)
+                n->reqid = reqid;
+
+            if (!n->queued) {
+                n->queued = true;
+                mrp_list_append(&client->queue, &n->hook);
+                mrp_enable_deferred(data->flush);
+            }
+
+            return;
+        }
+
+        mrp_log_error("%s: failed to queue resource event, sending it "
+                      "right away", plugin->instance);
+        flush_client_events(client);
+    }
+
+    reqtyp = RESPROTO_RESOURCES_EVENT;
+
+    msg = mrp_msg_create(FIELD( SEQUENCE_NO    , UINT32, reqid  ),
+                         FIELD( REQUEST_TYPE   , UINT16, reqtyp ),
+                         RESPROTO_MESSAGE_END                   );
+
+    if (!msg || !push_resource_set(msg, rset, NULL))
+        goto failed;
+
     if (!mrp_transport_send(client->transp, msg))
         goto failed;
 
@@ -986,11 +1447,91 @@ static void resource_event_handler(uint32_t reqid, mrp_resource_set_t *rset,
                        plugin->instance);
          mrp_msg_unref(msg);
 
-#undef PUSH
 #undef FIELD
 }
 
 
+static void flush_client_events(client_t *client)
+{
+    resource_data_t    *data   = client->data;
+    mrp_plugin_t       *plugin = data->plugin;
+    uint16_t            reqtyp = RESPROTO_COALESCED_RESOURCES_EVENT;
+    mrp_list_hook_t    *p, *nx;
+    notify_t           *n;
+    mrp_resource_set_t *rset;
+    mrp_msg_t          *msg;
+    bool                s;
+
+    if (mrp_list_empty(&client->queue))
+        return;
+
+    msg = mrp_msg_create(MRP_MSG_TAG_UINT32(RESPROTO_SEQUENCE_NO , 0     ),
+                         MRP_MSG_TAG_UINT16(RESPROTO_REQUEST_TYPE, reqtyp),
+                         RESPROTO_MESSAGE_END                             );
+    s = (msg != NULL);
+
+    mrp_list_foreach(&client->queue, p, nx) {
+        n = mrp_list_entry(p, notify_t, hook);
+
+        if (!(rset = mrp_resource_client_find_set(client->rscli, n->rsid))) {
+            mrp_htbl_remove(client->notify, &n->rsid, TRUE);
+            continue;
+        }
+
+        if (s) {
+            s  = mrp_msg_append(msg, MRP_MSG_TAG_UINT32(RESPROTO_SEQUENCE_NO,
+                                                        n->reqid));
+            s &= push_resource_set(msg, rset, n);
+            s &= mrp_msg_append(msg, MRP_MSG_TAG_UINT8(RESPROTO_SECTION_END,
+                                                       0));
+        }
+    }
+
+    if (!s || !mrp_transport_send(client->transp, msg)) {
+        mrp_log_error("%s: failed to build/send message for resource events",
+                      plugin->instance);
+        s = false;
+    }
+
+    mrp_msg_unref(msg);
+
+    /*
+     * Only a delivered message updates what the client is known to have
+     * seen. Otherwise the next event of a set is computed against what
+     * was last delivered, so it carries the lost changes as well.
+     */
+    mrp_list_foreach(&client->queue, p, nx) {
+        n = mrp_list_entry(p, notify_t, hook);
+
+        mrp_list_delete(&n->hook);
+        n->queued = false;
+
+        if (s) {
+            n->reqid    = 0;
+            n->notified = true;
+            n->attrgen  = n->newgen;
+            n->grant    = n->newgrant;
+            n->advice   = n->newadvice;
+        }
+    }
+}
+
+
+static void flush_events(mrp_deferred_t *d, void *user_data)
+{
+    resource_data_t *data = (resource_data_t *)user_data;
+    mrp_list_hook_t *p, *n;
+    client_t        *client;
+
+    mrp_disable_deferred(d);
+
+    mrp_list_foreach(&data->clients, p, n) {
+        client = mrp_list_entry(p, client_t, list);
+        flush_client_events(client);
+    }
+}
+
+
 
 static int initiate_transport(mrp_plugin_t *plugin)
 {
@@ -1145,9 +1686,7 @@ static void register_events(mrp_plugin_t *plugin)
 
 static int resource_init(mrp_plugin_t *plugin)
 {
-#if 0
     mrp_plugin_arg_t *args = plugin->args;
-#endif
     resource_data_t  *data;
 
     mrp_log_info("%s() called for resource instance '%s'...", __FUNCTION__,
@@ -1162,22 +1701,41 @@ static int resource_init(mrp_plugin_t *plugin)
     data->plugin = plugin;
     mrp_list_init(&data->clients);
 
+    if ((data->flush = mrp_add_deferred(plugin->ctx->ml, flush_events, data)))
+        mrp_disable_deferred(data->flush);
+    else
+        mrp_log_error("Failed to set up coalescing of resource events.");
+
     plugin->data = data;
 
     register_events(plugin);
     subscribe_events(plugin);
     initiate_lua_configuration(plugin);
 
+    if (args[ARG_BATCH].bln) {
+        if (mrp_resource_owner_enable_batching(plugin->ctx->ml,
+                                               args[ARG_BATCH_LATENCY].u32) < 0)
+            mrp_log_error("Failed to enable batched resource arbitration.");
+    }
+
     return TRUE;
 }
 
 
 static void resource_exit(mrp_plugin_t *plugin)
 {
+    resource_data_t *data = (resource_data_t *)plugin->data;
+
     mrp_log_info("%s() called for test instance '%s'...", __FUNCTION__,
                  plugin->instance);
 
     unsubscribe_events(plugin);
+    mrp_resource_owner_disable_batching();
+
+    if (data->flush) {
+        mrp_del_deferred(data->flush);
+        data->flush = NULL;
+    }
 }
 
 
@@ -1188,9 +1746,14 @@ static void resource_exit(mrp_plugin_t *plugin)
 
 #define DEF_CONFIG_FILE      "/etc/murphy/resource.conf"
 #define DEF_ADDRESS          NULL
+#define DEF_BATCH            FALSE
+#define DEF_BATCH_LATENCY    5          /* msecs, 0 for no limit */
 
 static mrp_plugin_arg_t args[] = {
-    MRP_PLUGIN_ARGIDX( ARG_ADDRESS, STRING, "address", DEF_ADDRESS ),
+    MRP_PLUGIN_ARGIDX(ARG_ADDRESS      , STRING, "address"      , DEF_ADDRESS),
+    MRP_PLUGIN_ARGIDX(ARG_BATCH        , BOOL  , "batch"        , DEF_BATCH  ),
+    MRP_PLUGIN_ARGIDX(ARG_BATCH_LATENCY, UINT32, "batch-latency",
+                      DEF_BATCH_LATENCY),
 };
 
 
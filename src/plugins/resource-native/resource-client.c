@@ -596,13 +596,22 @@ static bool fetch_resource_set_mask(mrp_msg_t *msg, void **pcursor,
     }
 
     if (!mrp_msg_iterate(msg, pcursor, &tag, &type, &value, &size) ||
-        tag != expected_tag || type != MRP_MSG_FIELD_UINT32)
+        tag != expected_tag)
     {
         *pmask = 0;
         return false;
     }
 
-    *pmask = value.u32;
+    /* we only show the first 32 resources of wider masks */
+    if (type == MRP_MSG_FIELD_UINT32)
+        *pmask = value.u32;
+    else if (type == MRP_MSG_FIELD_ARRAY_OF(UINT32) && size > 0)
+        *pmask = value.au32[0];
+    else {
+        *pmask = 0;
+        return false;
+    }
+
     return true;
 }
 
@@ -946,7 +955,7 @@ static void resource_event(client_t *client, uint32_t seqno, mrp_msg_t *msg,
             goto malformed;
 
         resid = value.u32;
-        mask  = (1UL <<  resid);
+        mask  = resid < 32 ? (1UL << resid) : 0;
 
         if (!cnt++)
             printf("\n");
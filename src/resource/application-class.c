@@ -103,6 +103,13 @@ static void remove_from_name_hash(mrp_application_class_t *);
 static mqi_handle_t get_database_table(void);
 static void insert_into_application_class_table(const char *, uint32_t);
 
+static mrp_resource_set_t *find_predecessors(mrp_application_class_t *,
+                                             uint32_t, uint32_t, uint64_t,
+                                             mrp_resource_set_t **);
+static void link_resource_set(mrp_resource_set_t *);
+static void unlink_resource_set(mrp_resource_set_t *);
+static uint32_t random_level(void);
+
 
 mrp_application_class_t *mrp_application_class_create(const char *name,
                                                     uint32_t pri,
@@ -285,6 +292,8 @@ int mrp_application_class_add_resource_set(const char *class_name,
     if (!(zone = mrp_zone_find_by_name(zone_name)))
         return -1;
 
+    unlink_resource_set(rset);
+
     rset->class.ptr = class;
     rset->zone = mrp_zone_get_id(zone);
 
@@ -308,32 +317,49 @@ int mrp_application_class_add_resource_set(const char *class_name,
 
 void mrp_application_class_move_resource_set(mrp_resource_set_t *rset)
 {
-    mrp_application_class_t *class;
-    mrp_list_hook_t *list, *lentry, *n, *insert_before;
-    mrp_resource_set_t *rentry;
-    uint32_t key;
-    uint32_t zone;
+    MRP_ASSERT(rset, "invalid argument");
 
+    unlink_resource_set(rset);
+    link_resource_set(rset);
+}
+
+void mrp_application_class_remove_resource_set(mrp_resource_set_t *rset)
+{
     MRP_ASSERT(rset, "invalid argument");
 
-    mrp_list_delete(&rset->class.list);
+    unlink_resource_set(rset);
+}
 
-    class = rset->class.ptr;
-    zone  = rset->zone;
+void mrp_application_class_rebase_stamps(uint32_t min)
+{
+    mrp_application_class_t *class;
+    mrp_resource_set_t *rset;
+    mrp_list_hook_t *clen, *n, *rsen, *m;
+    uint32_t zone;
+    uint32_t stamp;
 
-    list = insert_before = class->resource_sets + zone;
-    key  = mrp_application_class_get_sorting_key(rset);
+    /*
+     * The request stamps were lowered by min. This keeps the relative
+     * order of the sets, so we only need to update the cached keys.
+     */
+    mrp_list_foreach(&class_list, clen, n) {
+        class = mrp_list_entry(clen, mrp_application_class_t, list);
 
-    mrp_list_foreach_back(list, lentry, n) {
-        rentry = mrp_list_entry(lentry, mrp_resource_set_t, class.list);
+        for (zone = 0;  zone < MRP_ZONE_MAX;  zone++) {
+            mrp_list_foreach(class->resource_sets + zone, rsen, m) {
+                rset  = mrp_list_entry(rsen, mrp_resource_set_t, class.list);
+                stamp = (rset->class.key >> STAMP_SHIFT) & STAMP_MASK;
 
-         if (key >= mrp_application_class_get_sorting_key(rentry))
-             break;
+                if (class->order == MRP_RESOURCE_ORDER_LIFO)
+                    stamp -= min;
+                else
+                    stamp += min;
 
-         insert_before = lentry;
+                rset->class.key &= ~STAMP_KEY(STAMP_MASK);
+                rset->class.key |= STAMP_KEY(stamp);
+            }
+        }
     }
-
-    mrp_list_append(insert_before, &rset->class.list);
 }
 
 uint32_t mrp_application_class_get_sorting_key(mrp_resource_set_t *rset)
@@ -449,6 +475,151 @@ int mrp_application_class_print(char *buf, int len, bool with_rsets)
 }
 
 
+/*
+ * The resource sets of a class in a zone are kept in ascending order of
+ * their sorting key in class->resource_sets[zone]. That list is the
+ * bottom level of a skip list, whose upper levels are linked through
+ * class->skip[zone] and rset->class.skip. A set is found and moved by
+ * the key it had when it was last moved (rset->class.key), since by the
+ * time it is moved its state or stamp already has changed. Sets with
+ * equal keys are ordered by rset->class.seq, so the latest one comes
+ * last and gets arbitrated first.
+ */
+
+static inline bool precedes(mrp_resource_set_t *rset, uint32_t key,
+                            uint64_t seq)
+{
+    return rset->class.key < key || (rset->class.key == key &&
+                                     rset->class.seq < seq);
+}
+
+static inline mrp_resource_set_t **forward(mrp_application_class_t *class,
+                                          uint32_t zone,
+                                          mrp_resource_set_t *rset)
+{
+    return rset ? rset->class.skip : class->skip[zone];
+}
+
+static mrp_resource_set_t *find_predecessors(mrp_application_class_t *class,
+                                             uint32_t zone,
+                                             uint32_t key,
+                                             uint64_t seq,
+                                             mrp_resource_set_t **update)
+{
+    mrp_resource_set_t *x, *next;
+    int level;
+
+    for (level = MRP_KEY_SKIP_LEVELS - 1, x = NULL;  level > 0;  level--) {
+        while ((next = forward(class, zone, x)[level]) &&
+               precedes(next, key, seq))
+            x = next;
+
+        update[level] = x;
+    }
+
+    return x;
+}
+
+static void link_resource_set(mrp_resource_set_t *rset)
+{
+    static uint64_t seq;
+
+    mrp_resource_set_t *update[MRP_KEY_SKIP_LEVELS];
+    mrp_application_class_t *class;
+    mrp_resource_set_t *x, *rentry;
+    mrp_list_hook_t *list, *insert_before;
+    mrp_resource_set_t **fwd;
+    uint32_t zone;
+    uint32_t level;
+
+    class = rset->class.ptr;
+    zone  = rset->zone;
+    list  = class->resource_sets + zone;
+
+    rset->class.key = mrp_application_class_get_sorting_key(rset);
+    rset->class.seq = ++seq;
+
+    x = find_predecessors(class, zone, rset->class.key, rset->class.seq,
+                          update);
+
+    /* finish the search on the bottom level */
+    insert_before = x ? x->class.list.next : list->next;
+
+    while (insert_before != list) {
+        rentry = mrp_list_entry(insert_before, mrp_resource_set_t, class.list);
+
+        if (!precedes(rentry, rset->class.key, rset->class.seq))
+            break;
+
+        insert_before = insert_before->next;
+    }
+
+    mrp_list_append(insert_before, &rset->class.list);
+
+    rset->class.level = random_level();
+
+    for (level = 1;  level < rset->class.level;  level++) {
+        fwd = forward(class, zone, update[level]);
+
+        rset->class.skip[level] = fwd[level];
+        fwd[level] = rset;
+    }
+}
+
+static void unlink_resource_set(mrp_resource_set_t *rset)
+{
+    mrp_resource_set_t *update[MRP_KEY_SKIP_LEVELS];
+    mrp_application_class_t *class;
+    mrp_resource_set_t **fwd;
+    uint32_t zone;
+    uint32_t level;
+
+    if (mrp_list_empty(&rset->class.list))
+        return;
+
+    class = rset->class.ptr;
+    zone  = rset->zone;
+
+    if (rset->class.level > 1) {
+        find_predecessors(class, zone, rset->class.key, rset->class.seq,
+                          update);
+
+        for (level = 1;  level < rset->class.level;  level++) {
+            fwd = forward(class, zone, update[level]);
+
+            MRP_ASSERT(fwd[level] == rset, "corrupted resource set index");
+
+            fwd[level] = rset->class.skip[level];
+            rset->class.skip[level] = NULL;
+        }
+    }
+
+    rset->class.level = 0;
+
+    mrp_list_delete(&rset->class.list);
+}
+
+static uint32_t random_level(void)
+{
+    static uint32_t state = 0x2545f491;
+
+    uint32_t level;
+
+    /* xorshift, to leave the state of rand() to others */
+    state ^= state << 13;
+    state ^= state >> 17;
+    state ^= state << 5;
+
+    /* each level has a quarter of the sets of the one below */
+    for (level = 1;  level < MRP_KEY_SKIP_LEVELS;  level++) {
+        if ((state >> (2 * level)) & 3)
+            break;
+    }
+
+    return level;
+}
+
+
 static void init_name_hash(void)
 {
     mrp_htbl_config_t  cfg;
@@ -44,6 +44,7 @@ struct mrp_application_class_s {
     bool                  modal;
     mrp_resource_order_t  order;
     mrp_list_hook_t       resource_sets[MRP_ZONE_MAX];
+    mrp_resource_set_t   *skip[MRP_ZONE_MAX][MRP_KEY_SKIP_LEVELS];
 };
 
 mrp_application_class_t *mrp_application_class_find(const char *);
@@ -52,6 +53,8 @@ mrp_resource_set_t *
 mrp_application_class_iterate_rsets(mrp_application_class_t*,uint32_t,void**);
 
 void mrp_application_class_move_resource_set(mrp_resource_set_t *);
+void mrp_application_class_remove_resource_set(mrp_resource_set_t *);
+void mrp_application_class_rebase_stamps(uint32_t);
 
 uint32_t mrp_application_class_get_sorting_key(mrp_resource_set_t *);
 
@@ -41,6 +41,12 @@ mrp_attr_t *mrp_resource_read_all_attributes(mrp_resource_t *resource,
                                              mrp_attr_t *buf);
 int mrp_resource_write_attributes(mrp_resource_t *resource, mrp_attr_t *attrs);
 
+#define MRP_RESOURCE_MASK_STRLEN (2 + 16 * MRP_RESOURCE_MASK_WORDS + 1)
+
+/** Print @mask in hex, for debugging and logging. */
+char *mrp_resource_mask_print(const mrp_resource_mask_t *mask,
+                              char *buf, int len);
+
 
 #endif  /* __MURPHY_RESOURCE_COMMON_API_H__ */
 
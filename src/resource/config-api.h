@@ -30,6 +30,7 @@
 #ifndef __MURPHY_RESOURCE_CONFIG_API_H__
 #define __MURPHY_RESOURCE_CONFIG_API_H__
 
+#include <murphy/common/mainloop.h>
 #include <murphy/resource/data-types.h>
 
 void mrp_resource_configuration_init(void);
@@ -46,6 +47,15 @@ mrp_application_class_t *mrp_application_class_create(const char *name,
 int mrp_application_class_print(char *buf, int len, bool with_resource_sets);
 
 int mrp_resource_owner_print(char *buf, int len);
+int mrp_resource_veto_print(char *buf, int len);
+int mrp_resource_owner_stats_print(char *buf, int len);
+void mrp_resource_owner_reset_stats(void);
+
+int mrp_resource_owner_enable_batching(mrp_mainloop_t *ml,
+                                       uint32_t max_latency);
+void mrp_resource_owner_disable_batching(void);
+void mrp_resource_owner_begin_batch(void);
+void mrp_resource_owner_end_batch(void);
 
 
 #endif  /* __MURPHY_RESOURCE_CONFIG_API_H__ */
@@ -88,6 +88,7 @@ enum field_e {
     OWNERS,
     RECALC,
     VETO,
+    VETO_DEPENDS,
     ID
 };
 
@@ -194,6 +195,8 @@ static int  resmethod_getfield(lua_State *);
 static int  resmethod_setfield(lua_State *);
 static void resmethod_destroy(void *);
 static mrp_lua_resmethod_t *to_resmethod(lua_State *, int);
+static void push_veto_depends(lua_State *, mrp_lua_resmethod_t *);
+static uint32_t check_veto_depends(lua_State *, int);
 
 static mrp_attr_def_t *check_attrdefs(lua_State *, int, int *);
 static void free_attrdefs(mrp_attr_def_t *);
@@ -1142,7 +1145,6 @@ static int resource_getfield(lua_State *L)
     field_t fld = field_check(L, 2, &name);
     mrp_resource_set_t *s;
     mrp_resource_t *r;
-    mrp_resource_mask_t m;
 
     MRP_LUA_ENTER;
 
@@ -1161,17 +1163,18 @@ static int resource_getfield(lua_State *L)
         break;
 
     default:
-        if (!(s = mrp_resource_set_find_by_id(res->rsetid)))
-            m = 0;
-        else
-            m = ((mrp_resource_mask_t)1) << res->resid;
+        s = mrp_resource_set_find_by_id(res->rsetid);
 
         switch (fld) {
         case MANDATORY:
-            lua_pushboolean(L, s->resource.mask.mandatory & m ? true : false);
+            lua_pushboolean(L, s && mrp_resource_mask_test(
+                                        &s->resource.mask.mandatory,
+                                        res->resid));
             break;
         case GRANT:
-            lua_pushboolean(L, s->resource.mask.grant & m ? true : false);
+            lua_pushboolean(L, s && mrp_resource_mask_test(
+                                        &s->resource.mask.grant,
+                                        res->resid));
             break;
         default:
             lua_pushnil(L);
@@ -1294,6 +1297,9 @@ static int resmethod_getfield(lua_State *L)
                 lua_pushstring(L, name);
                 lua_rawget(L, 1);
                 break;
+            case VETO_DEPENDS:
+                push_veto_depends(L, method);
+                break;
             default:
                 lua_pushnil(L);
                 break;
@@ -1318,8 +1324,22 @@ static int resmethod_setfield(lua_State *L)
             lua_pushstring(L, name);
             lua_pushvalue(L, 3);
             method->veto = mrp_funcarray_check(L, -1);
+            method->veto_gen++;
             lua_rawset(L, 1);
             break;
+        case VETO_DEPENDS:
+            /*
+             * Not stored in the table: a field present there would
+             * bypass us on every later assignment.
+             */
+            if (lua_isnil(L, 3))
+                method->veto_cached = false;
+            else {
+                method->veto_depends = check_veto_depends(L, 3);
+                method->veto_cached = true;
+            }
+            method->veto_gen++;
+            break;
         default:
             luaL_error(L, "invalid method '%s'", name);
             break;
@@ -1336,6 +1356,8 @@ static void resmethod_destroy(void *data)
     MRP_LUA_ENTER;
 
     method->veto = NULL;
+    method->veto_cached = false;
+    method->veto_gen++;
 
     MRP_LUA_LEAVE_NOARG;
 }
@@ -1345,6 +1367,72 @@ static mrp_lua_resmethod_t *to_resmethod(lua_State *L, int idx)
     return (mrp_lua_resmethod_t *)mrp_lua_to_object(L, RESMETHOD_CLASS, idx);
 }
 
+static void push_veto_depends(lua_State *L, mrp_lua_resmethod_t *method)
+{
+    static struct {
+        uint32_t    mask;
+        const char *name;
+    } inputs[] = {
+        { MRP_RESOURCE_VETO_OWNERS    , "owners"     },
+        { MRP_RESOURCE_VETO_ZONE      , "zone"       },
+        { MRP_RESOURCE_VETO_ATTRIBUTES, "attributes" },
+        { MRP_RESOURCE_VETO_REQUEST   , "request"    },
+    };
+
+    size_t i;
+    int    n;
+
+    if (!method->veto_cached) {
+        lua_pushnil(L);
+        return;
+    }
+
+    lua_createtable(L, MRP_ARRAY_SIZE(inputs), 0);
+
+    for (i = 0, n = 0;  i < MRP_ARRAY_SIZE(inputs);  i++) {
+        if (method->veto_depends & inputs[i].mask) {
+            lua_pushstring(L, inputs[i].name);
+            lua_rawseti(L, -2, ++n);
+        }
+    }
+}
+
+static uint32_t check_veto_depends(lua_State *L, int t)
+{
+    const char *input;
+    uint32_t depends;
+
+    /*
+     * By listing its inputs the veto declares that, besides them, its
+     * verdict depends only on the resource set and the grant it gets,
+     * and so the verdict can be reused until any of them changes.
+     */
+
+    t = (t < 0) ? lua_gettop(L) + t + 1 : t;
+
+    luaL_checktype(L, t, LUA_TTABLE);
+
+    depends = 0;
+
+    for (lua_pushnil(L);  lua_next(L, t);  lua_pop(L, 1)) {
+        if (lua_type(L, -2) != LUA_TNUMBER || !(input = lua_tostring(L, -1)))
+            luaL_error(L, "veto inputs must be a list of strings");
+
+        if (!strcmp(input, "owners"))
+            depends |= MRP_RESOURCE_VETO_OWNERS;
+        else if (!strcmp(input, "zone"))
+            depends |= MRP_RESOURCE_VETO_ZONE;
+        else if (!strcmp(input, "attributes"))
+            depends |= MRP_RESOURCE_VETO_ATTRIBUTES;
+        else if (!strcmp(input, "request"))
+            depends |= MRP_RESOURCE_VETO_REQUEST;
+        else
+            luaL_error(L, "invalid veto input '%s'", input);
+    }
+
+    return depends;
+}
+
 
 static mrp_attr_def_t *check_attrdefs(lua_State *L, int t, int *ret_len)
 {
@@ -1700,6 +1788,11 @@ static field_t field_name_to_type(const char *name, size_t len)
             return ATTRIBUTES;
         break;
 
+    case 12:
+        if (!strcmp(name, "veto_depends"))
+            return VETO_DEPENDS;
+        break;
+
     default:
         break;
     }
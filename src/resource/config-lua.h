@@ -34,10 +34,19 @@
 #include <murphy/core/lua-utils/funcbridge.h>
 #include <murphy/resource/data-types.h>
 
+/* inputs a veto can declare to depend on, besides the set and its grant */
+#define MRP_RESOURCE_VETO_OWNERS      (1 << 0) /* owners in the zone */
+#define MRP_RESOURCE_VETO_ZONE        (1 << 1) /* attributes of the zone */
+#define MRP_RESOURCE_VETO_ATTRIBUTES  (1 << 2) /* attributes of the set */
+#define MRP_RESOURCE_VETO_REQUEST     (1 << 3) /* the requesting set */
+
 typedef struct mrp_lua_resmethod_s   mrp_lua_resmethod_t;
 
 struct mrp_lua_resmethod_s {
     mrp_funcarray_t *veto;
+    bool             veto_cached;  /* verdicts can be reused */
+    uint32_t         veto_depends; /* MRP_RESOURCE_VETO_* inputs */
+    uint32_t         veto_gen;     /* changes whenever the veto does */
 };
 
 
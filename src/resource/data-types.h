@@ -32,26 +32,46 @@
 
 #include <stdint.h>
 #include <stdbool.h>
+#include <string.h>
 
 #include <murphy-db/mqi-types.h>
 
 /*
- * Remember: this should be smaller than
- * sizeof(mrp_zone_mask_t) * 8
+ * Zone masks are bitsets of MRP_ZONE_MAX bits (64 by default, can be
+ * overridden at build time), handled by the mrp_zone_mask_* functions.
  */
-#define MRP_ZONE_MAX            8
-#define MRP_ZONE_MASK           (((mrp_zone_mask_t)1 << MRP_ZONE_MAX) - 1)
+#ifndef MRP_ZONE_MAX
+#    define MRP_ZONE_MAX            64
+#endif
+#define MRP_ZONE_MASK_BITS          64
+#define MRP_ZONE_MASK_WORDS         \
+    ((MRP_ZONE_MAX + MRP_ZONE_MASK_BITS - 1) / MRP_ZONE_MASK_BITS)
 
 #define MRP_KEY_STAMP_BITS      27
 #define MRP_KEY_STATE_BITS      1
 #define MRP_KEY_USAGE_BITS      1
 #define MRP_KEY_PRIORITY_BITS   3
 
+#define MRP_KEY_SKIP_LEVELS     12   /* levels of the per-class rset index */
+
 #define MRP_ZONE_ID_INVALID        (~(uint32_t)0)
 #define MRP_RESOURCE_ID_INVALID    (~(uint32_t)0)
 #define MRP_RESOURCE_REQNO_INVALID (~(uint32_t)0)
 
-#define MRP_RESOURCE_MAX  (sizeof(mrp_resource_mask_t) * 8)
+/*
+ * Resource masks are bitsets of MRP_RESOURCE_MAX bits, manipulated
+ * a word at a time by the mrp_resource_mask_* functions below. Every
+ * resource set, owner and arbitration pass carries a few of these, so
+ * the default is a single word; builds that need more resources can
+ * override it.
+ */
+#ifndef MRP_RESOURCE_MAX
+#    define MRP_RESOURCE_MAX        64
+#endif
+#define MRP_RESOURCE_MASK_BITS      64
+#define MRP_RESOURCE_MASK_WORDS     \
+    ((MRP_RESOURCE_MAX + MRP_RESOURCE_MASK_BITS - 1) / MRP_RESOURCE_MASK_BITS)
+
 #define MRP_ATTRIBUTE_MAX (sizeof(mrp_attribute_mask_t) * 8)
 
 typedef enum   mrp_resource_state_e     mrp_resource_state_t;
@@ -76,9 +96,223 @@ typedef struct mrp_resource_mgr_s       mrp_resource_mgr_t;
 typedef struct mrp_resource_ownersref_s mrp_resource_ownersref_t;
 typedef struct mrp_resource_setref_s    mrp_resource_setref_t;
 
-typedef uint32_t                        mrp_resource_mask_t;
 typedef uint32_t                        mrp_attribute_mask_t;
-typedef uint32_t                        mrp_zone_mask_t;
+
+typedef struct {
+    uint64_t word[MRP_RESOURCE_MASK_WORDS];
+} mrp_resource_mask_t;
+
+typedef struct {
+    uint64_t word[MRP_ZONE_MASK_WORDS];
+} mrp_zone_mask_t;
+
+
+#define MRP_RESOURCE_MASK_FOREACH_WORD(i) \
+    for ((i) = 0;  (i) < MRP_RESOURCE_MASK_WORDS;  (i)++)
+
+static inline void mrp_resource_mask_zero(mrp_resource_mask_t *m)
+{
+    memset(m, 0, sizeof(*m));
+}
+
+static inline void mrp_resource_mask_fill(mrp_resource_mask_t *m)
+{
+    memset(m, 0xff, sizeof(*m));
+}
+
+static inline void mrp_resource_mask_set(mrp_resource_mask_t *m, uint32_t id)
+{
+    m->word[id / MRP_RESOURCE_MASK_BITS] |=
+        (uint64_t)1 << (id % MRP_RESOURCE_MASK_BITS);
+}
+
+static inline bool mrp_resource_mask_test(const mrp_resource_mask_t *m,
+                                          uint32_t id)
+{
+    return (m->word[id / MRP_RESOURCE_MASK_BITS] >>
+            (id % MRP_RESOURCE_MASK_BITS)) & 1;
+}
+
+/** Set the bits of @s in @d. */
+static inline void mrp_resource_mask_or(mrp_resource_mask_t *d,
+                                        const mrp_resource_mask_t *s)
+{
+    int i;
+
+    MRP_RESOURCE_MASK_FOREACH_WORD(i)
+        d->word[i] |= s->word[i];
+}
+
+/** Clear the bits of @d that are not set in @s. */
+static inline void mrp_resource_mask_and(mrp_resource_mask_t *d,
+                                         const mrp_resource_mask_t *s)
+{
+    int i;
+
+    MRP_RESOURCE_MASK_FOREACH_WORD(i)
+        d->word[i] &= s->word[i];
+}
+
+/** Clear the bits of @d that are set in @s. */
+static inline void mrp_resource_mask_andnot(mrp_resource_mask_t *d,
+                                            const mrp_resource_mask_t *s)
+{
+    int i;
+
+    MRP_RESOURCE_MASK_FOREACH_WORD(i)
+        d->word[i] &= ~s->word[i];
+}
+
+static inline bool mrp_resource_mask_empty(const mrp_resource_mask_t *m)
+{
+    uint64_t w = 0;
+    int i;
+
+    MRP_RESOURCE_MASK_FOREACH_WORD(i)
+        w |= m->word[i];
+
+    return !w;
+}
+
+static inline bool mrp_resource_mask_full(const mrp_resource_mask_t *m)
+{
+    uint64_t w = ~(uint64_t)0;
+    int i;
+
+    MRP_RESOURCE_MASK_FOREACH_WORD(i)
+        w &= m->word[i];
+
+    return !~w;
+}
+
+static inline bool mrp_resource_mask_equal(const mrp_resource_mask_t *a,
+                                           const mrp_resource_mask_t *b)
+{
+    uint64_t w = 0;
+    int i;
+
+    MRP_RESOURCE_MASK_FOREACH_WORD(i)
+        w |= a->word[i] ^ b->word[i];
+
+    return !w;
+}
+
+static inline bool mrp_resource_mask_intersects(const mrp_resource_mask_t *a,
+                                                const mrp_resource_mask_t *b)
+{
+    uint64_t w = 0;
+    int i;
+
+    MRP_RESOURCE_MASK_FOREACH_WORD(i)
+        w |= a->word[i] & b->word[i];
+
+    return !!w;
+}
+
+/** Check whether all the bits of @a are set in @b. */
+static inline bool mrp_resource_mask_subset(const mrp_resource_mask_t *a,
+                                            const mrp_resource_mask_t *b)
+{
+    uint64_t w = 0;
+    int i;
+
+    MRP_RESOURCE_MASK_FOREACH_WORD(i)
+        w |= a->word[i] & ~b->word[i];
+
+    return !w;
+}
+
+/** Get the first bit set in @m at or after @id, or -1 if there is none. */
+static inline int mrp_resource_mask_next(const mrp_resource_mask_t *m,
+                                         uint32_t id)
+{
+    uint32_t i;
+    uint64_t w;
+
+    if (id >= MRP_RESOURCE_MAX)
+        return -1;
+
+    i = id / MRP_RESOURCE_MASK_BITS;
+    w = m->word[i] & (~(uint64_t)0 << (id % MRP_RESOURCE_MASK_BITS));
+
+    for (;;) {
+        if (w)
+            return i * MRP_RESOURCE_MASK_BITS + __builtin_ctzll(w);
+
+        if (++i >= MRP_RESOURCE_MASK_WORDS)
+            return -1;
+
+        w = m->word[i];
+    }
+}
+
+#define MRP_RESOURCE_MASK_FOREACH(m, id)                                  \
+    for ((id) = mrp_resource_mask_next((m), 0);                          \
+         (id) >= 0;                                                       \
+         (id) = mrp_resource_mask_next((m), (id) + 1))
+
+
+static inline void mrp_zone_mask_zero(mrp_zone_mask_t *m)
+{
+    memset(m, 0, sizeof(*m));
+}
+
+static inline void mrp_zone_mask_set(mrp_zone_mask_t *m, uint32_t id)
+{
+    m->word[id / MRP_ZONE_MASK_BITS] |=
+        (uint64_t)1 << (id % MRP_ZONE_MASK_BITS);
+}
+
+static inline void mrp_zone_mask_clear(mrp_zone_mask_t *m, uint32_t id)
+{
+    m->word[id / MRP_ZONE_MASK_BITS] &=
+        ~((uint64_t)1 << (id % MRP_ZONE_MASK_BITS));
+}
+
+static inline bool mrp_zone_mask_test(const mrp_zone_mask_t *m, uint32_t id)
+{
+    return (m->word[id / MRP_ZONE_MASK_BITS] >>
+            (id % MRP_ZONE_MASK_BITS)) & 1;
+}
+
+static inline bool mrp_zone_mask_empty(const mrp_zone_mask_t *m)
+{
+    uint64_t w = 0;
+    int i;
+
+    for (i = 0;  i < MRP_ZONE_MASK_WORDS;  i++)
+        w |= m->word[i];
+
+    return !w;
+}
+
+/** Get the first zone set in @m at or after @id, or -1 if there is none. */
+static inline int mrp_zone_mask_next(const mrp_zone_mask_t *m, uint32_t id)
+{
+    uint32_t i;
+    uint64_t w;
+
+    if (id >= MRP_ZONE_MAX)
+        return -1;
+
+    i = id / MRP_ZONE_MASK_BITS;
+    w = m->word[i] & (~(uint64_t)0 << (id % MRP_ZONE_MASK_BITS));
+
+    for (;;) {
+        if (w)
+            return i * MRP_ZONE_MASK_BITS + __builtin_ctzll(w);
+
+        if (++i >= MRP_ZONE_MASK_WORDS)
+            return -1;
+
+        w = m->word[i];
+    }
+}
+
+#define MRP_ZONE_MASK_FOREACH(m, id)                                      \
+    for ((id) = mrp_zone_mask_next((m), 0);                              \
+         (id) >= 0;                                                       \
+         (id) = mrp_zone_mask_next((m), (id) + 1))
 
 
 enum mrp_resource_state_e {
@@ -420,8 +420,8 @@ void event_cb(uint32_t request_id, mrp_resource_set_t *resource_set, void *user_
     advice = mrp_get_resource_set_advice(rset->resource_set);
 
     /* update resource set */
-    rset->acquired = !!grant;
-    rset->available = !!advice;
+    rset->acquired = !mrp_resource_mask_empty(&grant);
+    rset->available = !mrp_resource_mask_empty(&advice);
 
     if (mrp_lua_object_deref_value(rset, rset->L, rset->callback, false)) {
         mrp_lua_push_object(rset->L, rset);
@@ -591,8 +591,8 @@ static int resource_set_get_resources(void *data, lua_State *L, int member, mrp_
             continue;
         }
 
-        res->acquired = !!(mask & grant);
-        res->available = !!(mask & advice);
+        res->acquired = mrp_resource_mask_intersects(&mask, &grant);
+        res->available = mrp_resource_mask_intersects(&mask, &advice);
 
         /* TODO: update attributes */
 
@@ -50,6 +50,32 @@
 #define RESPROTO_RESFLAG_MANDATORY    RESPROTO_BIT(0)
 #define RESPROTO_RESFLAG_SHARED       RESPROTO_BIT(1)
 
+/* optional protocol features, negotiated with RESPROTO_SET_CAPABILITIES */
+#define RESPROTO_CAPABILITY_COALESCED_EVENTS RESPROTO_BIT(0)
+
+/* masks wider than 32 bits are sent as arrays of at most this many words */
+#define RESPROTO_MASK_WORDS           8
+
+/*
+ * A coalesced resources event carries the changes of several resource
+ * sets of a client. For each set it has a SEQUENCE_NO, followed by the
+ * fields of a single RESPROTO_RESOURCES_EVENT and closed by a
+ * RESPROTO_SECTION_END. Only the resources whose grant, advice or
+ * attributes changed since the previous event of the set are included.
+ */
+
+/*
+ * A batch request carries a sequence of sub-requests, each introduced by
+ * its own RESPROTO_REQUEST_TYPE and followed by the fields of the
+ * corresponding single request. The resources of a batched resource set
+ * creation are closed by a RESPROTO_SECTION_END. The reply carries the
+ * overall status followed by a REQUEST_TYPE, REQUEST_STATUS and
+ * RESOURCE_SET_ID triplet for each sub-request, in request order. A
+ * malformed batch is rejected as a whole with an EINVAL status and no
+ * triplets, none of its sub-requests are applied.
+ */
+#define RESPROTO_BATCH_MAX            64
+
 #define RESPROTO_TAG(x)               ((uint16_t)(x))
 
 #define RESPROTO_MESSAGE_END          MRP_MSG_FIELD_END
@@ -71,6 +97,7 @@
 #define RESPROTO_ATTRIBUTE_INDEX      RESPROTO_TAG(16)
 #define RESPROTO_ATTRIBUTE_NAME       RESPROTO_TAG(17)
 #define RESPROTO_ATTRIBUTE_VALUE      RESPROTO_TAG(18)
+#define RESPROTO_CAPABILITIES         RESPROTO_TAG(19)
 
 typedef enum {
     RESPROTO_QUERY_RESOURCES,
@@ -81,6 +108,9 @@ typedef enum {
     RESPROTO_ACQUIRE_RESOURCE_SET,
     RESPROTO_RELEASE_RESOURCE_SET,
     RESPROTO_RESOURCES_EVENT,
+    RESPROTO_BATCH_REQUEST,
+    RESPROTO_SET_CAPABILITIES,
+    RESPROTO_COALESCED_RESOURCES_EVENT,
 } mrp_resproto_request_t;
 
 typedef enum {
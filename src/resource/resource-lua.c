@@ -102,6 +102,11 @@ static int  add_to_id_hash(mrp_resource_setref_t *);
 static mrp_resource_setref_t *remove_from_id_hash(uint32_t);
 static mrp_resource_setref_t *find_in_id_hash(uint32_t);
 
+static void veto_key(mrp_resource_veto_key_t *, mrp_lua_resmethod_t *,
+                     mrp_zone_t *, mrp_resource_set_t *,
+                     mrp_resource_owner_t *, const mrp_resource_mask_t *,
+                     mrp_resource_set_t *);
+
 static field_t field_check(lua_State *, int, const char **);
 static field_t field_name_to_type(const char *, size_t);
 
@@ -155,6 +160,12 @@ MRP_LUA_CLASS_DEF (
 static mrp_resource_ownersref_t *resource_owners[MRP_ZONE_MAX];
 static mrp_htbl_t *id_hash;
 
+static struct {
+    uint64_t hits;
+    uint64_t misses;
+    uint64_t uncached;
+} veto_stats;
+
 void mrp_resource_lua_init(lua_State *L)
 {
     static bool initialised = false;
@@ -171,7 +182,7 @@ void mrp_resource_lua_init(lua_State *L)
 bool mrp_resource_lua_veto(mrp_zone_t *zone,
                            mrp_resource_set_t *rset,
                            mrp_resource_owner_t *owners,
-                           mrp_resource_mask_t grant,
+                           const mrp_resource_mask_t *grant,
                            mrp_resource_set_t *reqset)
 {
     lua_State *L = mrp_lua_get_lua_state();
@@ -180,6 +191,8 @@ bool mrp_resource_lua_veto(mrp_zone_t *zone,
     mrp_resource_setref_t *sref, *rref;
     mrp_resource_ownersref_t *oref;
     mrp_funcbridge_value_t args[16];
+    mrp_resource_veto_key_t key;
+    bool verdict;
     int i;
 
     if (L && zone && rset && owners && methods &&
@@ -190,19 +203,143 @@ bool mrp_resource_lua_veto(mrp_zone_t *zone,
         oref->owners = owners;
 
         if ((veto = methods->veto)) {
+            if (methods->veto_cached) {
+                veto_key(&key, methods, zone, rset, owners, grant, reqset);
+
+                if (rset->veto.valid &&
+                    !memcmp(&rset->veto.key, &key, sizeof(key)))
+                {
+                    veto_stats.hits++;
+                    return rset->veto.verdict;
+                }
+
+                veto_stats.misses++;
+            }
+            else
+                veto_stats.uncached++;
+
             args[i=0].string  = zone->name;
             args[++i].pointer = sref;
-            args[++i].integer = grant;
+            /* the veto gets the grants of the first 32 resources */
+            args[++i].integer = (int32_t)grant->word[0];
             args[++i].pointer = oref;
             args[++i].pointer = rref;
 
-            return mrp_funcarray_call_from_c(L, veto, "sodoo", args);
+            verdict = mrp_funcarray_call_from_c(L, veto, "sodoo", args);
+
+            if (methods->veto_cached) {
+                rset->veto.valid   = true;
+                rset->veto.verdict = verdict;
+                memcpy(&rset->veto.key, &key, sizeof(key));
+            }
+
+            return verdict;
         }
     }
 
     return true;
 }
 
+static void veto_key(mrp_resource_veto_key_t *key,
+                     mrp_lua_resmethod_t *methods,
+                     mrp_zone_t *zone,
+                     mrp_resource_set_t *rset,
+                     mrp_resource_owner_t *owners,
+                     const mrp_resource_mask_t *grant,
+                     mrp_resource_set_t *reqset)
+{
+    uint32_t depends = methods->veto_depends;
+    mrp_resource_owner_t *o;
+    uint32_t rcnt, i;
+    uint64_t h;
+
+    /*
+     * A cached verdict is reused as long as the veto gets the same set
+     * with the same grant and the inputs it declared to depend on are
+     * unchanged. Zone attributes are fixed when the zone is created, so
+     * the zone itself stands for them. The owners are folded into a
+     * 64-bit FNV-1a digest of what the veto can see of them.
+     *
+     * Keys are compared with memcmp(), so they are cleared first to
+     * zero any padding.
+     */
+
+    memset(key, 0, sizeof(*key));
+
+    key->gen          = methods->veto_gen;
+    key->zone         = zone->id;
+    key->class        = rset->class.ptr;
+    key->auto_release = rset->auto_release.current;
+    key->dont_wait    = rset->dont_wait.current;
+    key->grant        = *grant;
+
+    if ((depends & MRP_RESOURCE_VETO_REQUEST))
+        key->reqset = reqset ? reqset->id : MRP_RESOURCE_ID_INVALID;
+
+    if ((depends & MRP_RESOURCE_VETO_ATTRIBUTES))
+        key->attrgen = rset->resource.attrgen;
+
+    if ((depends & MRP_RESOURCE_VETO_OWNERS)) {
+        rcnt = mrp_resource_definition_count();
+        h    = 14695981039346656037ULL;
+
+        for (i = 0, o = owners;  i < rcnt;  i++, o++) {
+            h = (h ^ (uint64_t)(uintptr_t)o->class) * 1099511628211ULL;
+            h = (h ^ (o->rset ? o->rset->id : ~0u)) * 1099511628211ULL;
+        }
+
+        key->owners = h;
+    }
+}
+
+int mrp_resource_veto_print(char *buf, int len)
+{
+#define PRINT(fmt, args...)  if (p<e) { p += snprintf(p, e-p, fmt , ##args); }
+
+    mrp_lua_resmethod_t *methods = mrp_lua_get_resource_methods();
+    uint32_t depends;
+    char *p, *e;
+
+    MRP_ASSERT(buf && len > 0, "invalid argument");
+
+    e = (p = buf) + len;
+
+    if (!methods || !methods->veto) {
+        PRINT("No veto method.\n");
+        return p - buf;
+    }
+
+    depends = methods->veto_depends;
+
+    if (!methods->veto_cached) {
+        PRINT("Veto verdicts are not cached.\n");
+    }
+    else {
+        PRINT("Veto verdicts are cached, the veto depends on:%s%s%s%s%s\n",
+              (depends & MRP_RESOURCE_VETO_OWNERS)     ? " owners"     : "",
+              (depends & MRP_RESOURCE_VETO_ZONE)       ? " zone"       : "",
+              (depends & MRP_RESOURCE_VETO_ATTRIBUTES) ? " attributes" : "",
+              (depends & MRP_RESOURCE_VETO_REQUEST)    ? " request"    : "",
+              depends ? "" : " nothing else");
+    }
+
+    PRINT("   hits %llu, misses %llu, uncached calls %llu\n",
+          (unsigned long long)veto_stats.hits,
+          (unsigned long long)veto_stats.misses,
+          (unsigned long long)veto_stats.uncached);
+
+    return p - buf;
+
+#undef PRINT
+}
+
+bool mrp_resource_lua_has_veto(void)
+{
+    mrp_lua_resmethod_t *methods = mrp_lua_get_resource_methods();
+
+    return mrp_lua_get_lua_state() && methods && methods->veto;
+}
+
 void mrp_resource_lua_set_owners(mrp_zone_t *zone,mrp_resource_owner_t *owners)
 {
     lua_State *L = mrp_lua_get_lua_state();
@@ -49,8 +49,10 @@ struct mrp_resource_setref_s {
 void mrp_resource_lua_init(lua_State *);
 
 bool mrp_resource_lua_veto(mrp_zone_t *, mrp_resource_set_t *,
-                           mrp_resource_owner_t *, mrp_resource_mask_t,
+                           mrp_resource_owner_t *,
+                           const mrp_resource_mask_t *,
                            mrp_resource_set_t *);
+bool mrp_resource_lua_has_veto(void);
 void mrp_resource_lua_set_owners(mrp_zone_t *, mrp_resource_owner_t *);
 
 void mrp_resource_lua_register_resource_set(mrp_resource_set_t *);
@@ -28,14 +28,18 @@
  */
 
 #include <stdio.h>
+#include <stdlib.h>
 #include <string.h>
+#include <strings.h>
 #include <ctype.h>
 #include <errno.h>
+#include <time.h>
 
 #include <murphy/common/mm.h>
 #include <murphy/common/hashtbl.h>
 #include <murphy/common/utils.h>
 #include <murphy/common/log.h>
+#include <murphy/common/mainloop.h>
 
 #include <murphy-db/mqi.h>
 
@@ -57,6 +61,8 @@
 #define RSET_ID_IDX          3
 #define FIRST_ATTRIBUTE_IDX  4
 
+#define ARBITRATION_ENVVAR   "__MURPHY_RESOURCE_ARBITRATION"
+
 typedef struct {
     uint32_t          zone_id;
     const char       *zone_name;
@@ -65,11 +71,111 @@ typedef struct {
     mrp_attr_value_t  attrs[MQI_COLUMN_MAX];
 } owner_row_t;
 
-static mrp_resource_owner_t  resource_owners[MRP_ZONE_MAX * MRP_RESOURCE_MAX];
+typedef enum {
+    ARBITRATION_INCREMENTAL = 0, /* re-arbitrate the affected slice only */
+    ARBITRATION_FULL,            /* re-arbitrate the whole zone */
+    ARBITRATION_CHECK,           /* incremental, verified by a full pass */
+} arbitration_mode_t;
+
+typedef struct {
+    uint32_t replyid;
+    mrp_resource_set_t *rset;
+    bool move;
+} event_t;
+
+typedef struct {
+    uint32_t rsetid;             /* id of the requesting resource set */
+    uint32_t reqid;              /* request id to reply with */
+    mrp_resource_set_t *rset;    /* requesting set, NULL if it's gone */
+} request_t;
+
+typedef struct {
+    request_t *reqs;             /* requests, in arrival order */
+    uint32_t nreq;               /* number of requests */
+    uint32_t size;               /* allocated size of reqs */
+    mrp_resource_mask_t mask;    /* resources of the requesting sets */
+    bool full;                   /* recalculate the whole zone */
+    uint64_t since;              /* arrival of the oldest request */
+} batch_t;
+
+typedef struct {
+    mrp_resource_set_t *rset;
+    mrp_resource_state_t state;
+    mrp_resource_mask_t grant;
+    mrp_resource_mask_t advice;
+    bool auto_release;
+    bool dont_wait;
+} rset_state_t;
+
+typedef struct {
+    mrp_resource_t *res;
+    bool advice;
+    bool result;
+} verdict_t;
+
+typedef struct {
+    mrp_resource_mask_t  dirty;                    /* unsettled resources */
+    mrp_resource_owner_t owners[MRP_RESOURCE_MAX]; /* owners by resource */
+    mrp_resource_mask_t  links[MRP_RESOURCE_MAX];  /* linked by rsets */
+} zone_owners_t;
+
+static zone_owners_t        *zone_owners[MRP_ZONE_MAX];
 static mqi_handle_t          owner_tables[MRP_RESOURCE_MAX];
 
+static struct {
+    verdict_t *buf;
+    uint32_t   nverdict;
+    uint32_t   size;
+    uint32_t   next;
+    bool       record;
+    bool       replay;
+    bool       lost;
+    bool       mismatch;
+} verdicts;
+
+static struct {
+    mrp_mainloop_t *ml;          /* mainloop we're batching in, if any */
+    mrp_deferred_t *deferred;    /* runs the batched arbitrations */
+    uint64_t        latency;     /* max. batching latency (usecs) */
+    uint32_t        depth;       /* nesting of explicit batches */
+    mrp_zone_mask_t pending;     /* zones to be re-arbitrated */
+    batch_t         zones[MRP_ZONE_MAX];
+} batching;
+
+static struct {
+    uint64_t passes;             /* arbitration passes run */
+    uint64_t requests;           /* requests served by the passes */
+    uint64_t total;              /* time spent arbitrating (nsecs) */
+    uint64_t max;                /* longest pass (nsecs) */
+} arbitration_stats;
+
+static void update_zone(uint32_t, request_t *, uint32_t,
+                        const mrp_resource_mask_t *, bool);
+static void queue_request(uint32_t, mrp_resource_set_t *, uint32_t);
+static void run_batches(mrp_deferred_t *, void *);
+static uint64_t batch_time(void);
+static uint64_t stats_time(void);
+
+static arbitration_mode_t get_arbitration_mode(void);
+static void affected_resources(uint32_t, const mrp_resource_mask_t *,
+                               mrp_resource_mask_t *);
+static uint32_t reply_id(mrp_resource_set_t *, request_t *, uint32_t, bool *);
+static bool superseded(request_t *, uint32_t, uint32_t);
+static uint32_t add_superseded_replies(request_t *, uint32_t, event_t **,
+                                       uint32_t);
+static uint32_t arbitrate(mrp_zone_t *, request_t *, uint32_t,
+                          const mrp_resource_mask_t *, bool, event_t **);
+static rset_state_t *save_rset_states(uint32_t, uint32_t *);
+static void restore_rset_states(rset_state_t *, uint32_t);
+static void check_arbitration(mrp_zone_t *, request_t *, uint32_t,
+                              const mrp_resource_mask_t *,
+                              mrp_resource_owner_t *, rset_state_t *,
+                              uint32_t, event_t *, uint32_t);
+
+static zone_owners_t *get_zone_owners(uint32_t);
 static mrp_resource_owner_t *get_owner(uint32_t, uint32_t);
-static void reset_owners(uint32_t, mrp_resource_owner_t *);
+static void reset_owners(uint32_t, mrp_resource_owner_t *,
+                         const mrp_resource_mask_t *);
 static bool grant_ownership(mrp_resource_owner_t *, mrp_zone_t *,
                             mrp_application_class_t *, mrp_resource_set_t *,
                             mrp_resource_t *);
@@ -77,6 +183,8 @@ static bool advice_ownership(mrp_resource_owner_t *, mrp_zone_t *,
                              mrp_application_class_t *, mrp_resource_set_t *,
                              mrp_resource_t *);
 
+static bool manager_verdict(mrp_zone_t *, mrp_resource_t *, bool);
+static void manager_free(mrp_zone_t *, mrp_resource_t *);
 static void manager_start_transaction(mrp_zone_t *);
 static void manager_end_transaction(mrp_zone_t *);
 
@@ -154,6 +262,12 @@ int mrp_resource_owner_create_database_table(mrp_resource_def_t *rdef)
 
     owner_tables[rdef->id] = table;
 
+    /* owners of a new resource are yet to be settled in every zone */
+    for (i = 0;  i < MRP_ZONE_MAX;  i++) {
+        if (zone_owners[i])
+            mrp_resource_mask_set(&zone_owners[i]->dirty, rdef->id);
+    }
+
     return 0;
 }
 
@@ -166,196 +280,341 @@ void mrp_resource_owner_update_zone(uint32_t zoneid,
                                     mrp_resource_set_t *reqset,
                                     uint32_t reqid)
 {
-    typedef struct {
-        uint32_t replyid;
-        mrp_resource_set_t *rset;
-        bool move;
-    } event_t;
-
-    mrp_resource_owner_t oldowners[MRP_RESOURCE_MAX];
-    mrp_resource_owner_t backup[MRP_RESOURCE_MAX];
-    mrp_zone_t *zone;
-    mrp_application_class_t *class;
-    mrp_resource_set_t *rset;
-    mrp_resource_t *res;
-    mrp_resource_def_t *rdef;
-    mrp_resource_mgr_ftbl_t *ftbl;
-    mrp_resource_owner_t *owner, *old, *owners;
-    mrp_resource_mask_t mask;
-    mrp_resource_mask_t mandatory;
-    mrp_resource_mask_t grant;
-    mrp_resource_mask_t advice;
-    void *clc, *rsc, *rc;
-    uint32_t rid;
-    uint32_t rcnt;
-    bool force_release;
-    bool changed;
-    bool move;
-    mrp_resource_event_t notify;
-    uint32_t replyid;
-    uint32_t nevent, maxev;
-    event_t *events, *ev, *lastev;
+    request_t req;
 
     MRP_ASSERT(zoneid < MRP_ZONE_MAX, "invalid argument");
 
-    zone = mrp_zone_find_by_id(zoneid);
+    if (batching.ml || batching.depth) {
+        queue_request(zoneid, reqset, reqid);
+        return;
+    }
 
-    MRP_ASSERT(zone, "zone is not defined");
+    if (!reqset)
+        update_zone(zoneid, NULL, 0, NULL, true);
+    else {
+        req.rsetid = reqset->id;
+        req.reqid  = reqid;
+        req.rset   = reqset;
+
+        update_zone(zoneid, &req, 1, &reqset->resource.mask.all, false);
+    }
+}
+
+int mrp_resource_owner_enable_batching(mrp_mainloop_t *ml,
+                                       uint32_t max_latency)
+{
+    if (!ml) {
+        errno = EINVAL;
+        return -1;
+    }
+
+    if (batching.ml) {
+        if (batching.ml != ml) {
+            errno = EBUSY;
+            return -1;
+        }
+    }
+    else {
+        if (!(batching.deferred = mrp_add_deferred(ml, run_batches, NULL)))
+            return -1;
+
+        mrp_disable_deferred(batching.deferred);
+        batching.ml = ml;
+    }
+
+    batching.latency = (uint64_t)max_latency * 1000;
+
+    mrp_log_info("resource arbitration is batched (max. latency %u msecs)",
+                 max_latency);
+
+    return 0;
+}
 
-    if (!(maxev = mrp_get_resource_set_count()))
+void mrp_resource_owner_disable_batching(void)
+{
+    batch_t *b;
+    uint32_t zoneid;
+
+    if (!batching.ml)
         return;
 
-    nevent = 0;
-    events = mrp_alloc(sizeof(event_t) * maxev);
+    mrp_del_deferred(batching.deferred);
 
-    MRP_ASSERT(events, "Memory alloc failure. Can't update zone");
+    batching.deferred = NULL;
+    batching.ml       = NULL;
 
-    reset_owners(zoneid, oldowners);
-    manager_start_transaction(zone);
+    for (zoneid = 0;  zoneid < MRP_ZONE_MAX;  zoneid++) {
+        mrp_resource_owner_flush_zone(zoneid);
 
-    rcnt = mrp_resource_definition_count();
-    clc  = NULL;
+        b = batching.zones + zoneid;
 
-    while ((class = mrp_application_class_iterate_classes(&clc))) {
-        rsc = NULL;
+        mrp_free(b->reqs);
+        b->reqs = NULL;
+        b->size = 0;
+    }
+}
 
-        while ((rset=mrp_application_class_iterate_rsets(class,zoneid,&rsc))) {
-            force_release = false;
-            mandatory = rset->resource.mask.mandatory;
-            grant = 0;
-            advice = 0;
-            rc = NULL;
+void mrp_resource_owner_begin_batch(void)
+{
+    batching.depth++;
+}
 
-            switch (rset->state) {
+void mrp_resource_owner_end_batch(void)
+{
+    int zoneid;
 
-            case mrp_resource_acquire:
-                while ((res = mrp_resource_set_iterate_resources(rset, &rc))) {
-                    rdef  = res->def;
-                    rid   = rdef->id;
-                    owner = get_owner(zoneid, rid);
+    MRP_ASSERT(batching.depth > 0, "unbalanced end of batch");
 
-                    backup[rid] = *owner;
+    if (--batching.depth > 0)
+        return;
 
-                    if (grant_ownership(owner, zone, class, rset, res))
-                        grant |= ((mrp_resource_mask_t)1 << rid);
-                    else {
-                        if (owner->rset != rset)
-                            force_release |= owner->modal;
-                    }
-                }
-                owners = get_owner(zoneid, 0);
-                if ((grant & mandatory) == mandatory &&
-                    mrp_resource_lua_veto(zone, rset, owners, grant, reqset))
-                {
-                    advice = grant;
-                }
-                else {
-                    /* rollback, ie. restore the backed up state */
-                    rc = NULL;
-                    while ((res=mrp_resource_set_iterate_resources(rset,&rc))){
-                        rdef = res->def;
-                        rid = rdef->id;
-                        mask = (mrp_resource_mask_t)1 << rid;
-                        owner = get_owner(zoneid, rid);
-                        *owner = backup[rid];
+    /* with mainloop batching the deferred callback will take care of it */
+    if (batching.ml)
+        return;
 
-                        if ((grant & mask)) {
-                            if ((ftbl = rdef->manager.ftbl) && ftbl->free)
-                                ftbl->free(zone, res, rdef->manager.userdata);
-                        }
+    MRP_ZONE_MASK_FOREACH(&batching.pending, zoneid)
+        mrp_resource_owner_flush_zone(zoneid);
+}
 
-                        if (advice_ownership(owner, zone, class, rset, res))
-                            advice |= mask;
-                    }
+void mrp_resource_owner_flush_zone(uint32_t zoneid)
+{
+    batch_t *b;
+    request_t *reqs;
+    uint32_t nreq, i;
+    mrp_resource_mask_t mask;
+    bool full;
+    mqi_handle_t trh;
 
-                    grant = 0;
+    MRP_ASSERT(zoneid < MRP_ZONE_MAX, "invalid argument");
 
-                    if ((advice & mandatory) != mandatory)
-                        advice = 0;
+    b = batching.zones + zoneid;
 
-                    mrp_resource_lua_set_owners(zone, owners);
-                }
-                break;
+    if (!mrp_zone_mask_test(&batching.pending, zoneid))
+        return;
 
-            case mrp_resource_release:
-                while ((res = mrp_resource_set_iterate_resources(rset, &rc))) {
-                    rdef  = res->def;
-                    rid   = rdef->id;
-                    owner = get_owner(zoneid, rid);
+    /*
+     * Take over the batch before running it, so that the requests the
+     * event callbacks might issue go to a fresh batch of their own.
+     */
+    reqs = b->reqs;
+    nreq = b->nreq;
+    mask = b->mask;
+    full = b->full;
 
-                    if (advice_ownership(owner, zone, class, rset, res))
-                        advice |= ((mrp_resource_mask_t)1 << rid);
-                }
-                if ((advice & mandatory) != mandatory)
-                    advice = 0;
-                break;
+    b->reqs    = NULL;
+    b->nreq    = 0;
+    b->size    = 0;
+    b->full    = false;
 
-            default:
-                break;
-            }
+    mrp_zone_mask_clear(&batching.pending, zoneid);
 
-            changed = false;
-            move    = false;
-            notify  = 0;
-            replyid = (reqset == rset && reqid == rset->request.id) ? reqid:0;
+    mrp_resource_mask_zero(&b->mask);
 
+    /* requesting sets might have been destroyed in the meantime */
+    for (i = 0;  i < nreq;  i++)
+        reqs[i].rset = mrp_resource_set_find_by_id(reqs[i].rsetid);
 
-            if (force_release) {
-                move = (rset->state != mrp_resource_release);
-                notify = move ? MRP_RESOURCE_EVENT_RELEASE : 0;
-                changed = move || rset->resource.mask.grant;
-                rset->state = mrp_resource_release;
-                rset->resource.mask.grant = 0;
+    trh = mqi_begin_transaction();
+    update_zone(zoneid, reqs, nreq, &mask, full);
+    mqi_commit_transaction(trh);
+
+    if (!b->reqs) {
+        b->reqs = reqs;
+        b->size = nreq;
+    }
+    else
+        mrp_free(reqs);
+}
+
+static void queue_request(uint32_t zoneid,
+                          mrp_resource_set_t *reqset,
+                          uint32_t reqid)
+{
+    batch_t *b;
+    request_t *req, fallback;
+    uint32_t size;
+    uint64_t now;
+
+    b   = batching.zones + zoneid;
+    now = batch_time();
+
+    if (!reqset)
+        b->full = true;
+    else {
+        if (b->nreq >= b->size) {
+            size = b->size ? 2 * b->size : 8;
+
+            if (!mrp_reallocz(b->reqs, b->size, size)) {
+                /* can't batch it, so settle the zone right away */
+                mrp_log_error("failed to batch request of resource set %u",
+                              reqset->id);
+                mrp_resource_owner_flush_zone(zoneid);
+
+                fallback.rsetid = reqset->id;
+                fallback.reqid  = reqid;
+                fallback.rset   = reqset;
+
+                update_zone(zoneid, &fallback, 1, &reqset->resource.mask.all,
+                            false);
+                return;
             }
-            else {
-                if (grant == rset->resource.mask.grant) {
-                    if (rset->state == mrp_resource_acquire &&
-                        !grant && rset->dont_wait.current)
-                    {
-                        rset->state = mrp_resource_release;
-                        rset->dont_wait.current = rset->dont_wait.client;
 
-                        notify = MRP_RESOURCE_EVENT_RELEASE;
-                        move = true;
-                    }
-                }
-                else {
-                    rset->resource.mask.grant = grant;
-                    changed = true;
+            b->size = size;
+        }
 
-                    if (rset->state != mrp_resource_release &&
-                        !grant && rset->auto_release.current)
-                    {
-                        rset->state = mrp_resource_release;
-                        rset->auto_release.current = rset->auto_release.client;
+        req = b->reqs + b->nreq++;
 
-                        notify = MRP_RESOURCE_EVENT_RELEASE;
-                        move = true;
-                    }
-                }
-            }
+        req->rsetid = reqset->id;
+        req->reqid  = reqid;
+        req->rset   = NULL;
 
-            if (notify) {
-                mrp_resource_set_notify(rset, notify);
-            }
+        /*
+         * The set might be gone by the time the batch is run, so we
+         * need to remember which resources it was holding.
+         */
+        mrp_resource_mask_or(&b->mask, &reqset->resource.mask.all);
+    }
 
-            if (advice != rset->resource.mask.advice) {
-                rset->resource.mask.advice = advice;
-                changed = true;
-            }
+    if (!mrp_zone_mask_test(&batching.pending, zoneid)) {
+        mrp_zone_mask_set(&batching.pending, zoneid);
+        b->since = now;
 
-            if (replyid || changed) {
-                ev = events + nevent++;
+        if (batching.deferred)
+            mrp_enable_deferred(batching.deferred);
+    }
 
-                ev->replyid = replyid;
-                ev->rset    = rset;
-                ev->move    = move;
-            }
-        } /* while rset */
-    } /* while class */
+    /* don't let a busy mainloop iteration hold back the oldest request */
+    if (batching.ml && !batching.depth && batching.latency &&
+        now - b->since >= batching.latency)
+        mrp_resource_owner_flush_zone(zoneid);
+}
+
+static void run_batches(mrp_deferred_t *d, void *user_data)
+{
+    int zoneid;
+
+    MRP_UNUSED(user_data);
+
+    /* re-enabled if the flushes trigger new requests */
+    mrp_disable_deferred(d);
+
+    MRP_ZONE_MASK_FOREACH(&batching.pending, zoneid)
+        mrp_resource_owner_flush_zone(zoneid);
+}
+
+static uint64_t batch_time(void)
+{
+    return stats_time() / 1000;
+}
+
+static uint64_t stats_time(void)
+{
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+
+    return (uint64_t)ts.tv_sec * 1000000000 + ts.tv_nsec;
+}
+
+static void update_zone(uint32_t zoneid,
+                        request_t *reqs,
+                        uint32_t nreq,
+                        const mrp_resource_mask_t *reqmask,
+                        bool full)
+{
+    int rcnt = mrp_resource_definition_count();
+    mrp_resource_owner_t oldowners[rcnt > 0 ? rcnt : 1];
+    zone_owners_t *zo;
+    mrp_zone_t *zone;
+    mrp_resource_set_t *rset;
+    mrp_resource_owner_t *owner, *old;
+    mrp_resource_mask_t slice;
+    arbitration_mode_t mode;
+    rset_state_t *before;
+    int rid;
+    uint32_t nbefore;
+    uint32_t nevent;
+    event_t *events, *ev, *lastev;
+    uint64_t start, elapsed;
+
+    zone = mrp_zone_find_by_id(zoneid);
+
+    MRP_ASSERT(zone, "zone is not defined");
+
+    if (!mrp_get_resource_set_count())
+        return;
+
+    start = stats_time();
+
+    /*
+     * Unless we were asked to recalculate everything, or a Lua veto
+     * (which sees all the owners and the requesting set) is in place,
+     * we only re-arbitrate the slice of the zone the requests affect.
+     */
+    mode = get_arbitration_mode();
+
+    if (mode == ARBITRATION_FULL || full || mrp_resource_lua_has_veto())
+        mrp_resource_mask_fill(&slice);
+    else
+        affected_resources(zoneid, reqmask, &slice);
+
+    before  = NULL;
+    nbefore = 0;
+
+    if (mode == ARBITRATION_CHECK && !mrp_resource_mask_full(&slice))
+        before = save_rset_states(zoneid, &nbefore);
+
+    /* only the owners in the slice are saved to oldowners */
+    reset_owners(zoneid, oldowners, &slice);
+    manager_start_transaction(zone);
+
+    verdicts.record   = (before != NULL);
+    verdicts.lost     = false;
+    verdicts.nverdict = 0;
+
+    events = NULL;
+    nevent = arbitrate(zone, reqs, nreq, &slice, false, &events);
+
+    verdicts.record = false;
 
     manager_end_transaction(zone);
 
+    /* the verification of the check mode is not part of the arbitration */
+    elapsed = stats_time() - start;
+
+    arbitration_stats.passes++;
+    arbitration_stats.requests += nreq;
+    arbitration_stats.total    += elapsed;
+
+    if (elapsed > arbitration_stats.max)
+        arbitration_stats.max = elapsed;
+
+    if (before) {
+        check_arbitration(zone, reqs, nreq, &slice, oldowners,
+                          before, nbefore, events, nevent);
+        mrp_free(before);
+    }
+
+    zo = get_zone_owners(zoneid);
+    mrp_resource_mask_zero(&zo->dirty);
+
+    /*
+     * Sets that moved, and waiting sets that just lost their grants but
+     * do not want to wait (they get released by the next pass), leave
+     * their resources unsettled.
+     */
+    for (lastev = (ev = events) + nevent;     ev < lastev;     ev++) {
+        rset = ev->rset;
+
+        if (ev->move || (rset->state == mrp_resource_acquire &&
+                         rset->dont_wait.current &&
+                         mrp_resource_mask_empty(&rset->resource.mask.grant)))
+            mrp_resource_mask_or(&zo->dirty, &rset->resource.mask.all);
+    }
+
+    if (nreq > 1)
+        nevent = add_superseded_replies(reqs, nreq, &events, nevent);
+
     for (lastev = (ev = events) + nevent;     ev < lastev;     ev++) {
         rset = ev->rset;
 
@@ -367,20 +626,23 @@ void mrp_resource_owner_update_zone(uint32_t zoneid,
         /* first we send out the revoke/deny events
          * followed by the grants (in the next for loop)
          */
-        if (rset->event && !rset->resource.mask.grant)
+        if (rset->event && mrp_resource_mask_empty(&rset->resource.mask.grant))
             rset->event(ev->replyid, rset, rset->user_data);
     }
 
     for (lastev = (ev = events) + nevent;     ev < lastev;     ev++) {
         rset = ev->rset;
 
-        if (rset->event && rset->resource.mask.grant)
+        if (rset->event && !mrp_resource_mask_empty(&rset->resource.mask.grant))
             rset->event(ev->replyid, rset, rset->user_data);
     }
 
     mrp_free(events);
 
-    for (rid = 0;  rid < rcnt;  rid++) {
+    MRP_RESOURCE_MASK_FOREACH(&slice, rid) {
+        if (rid >= rcnt)
+            break;
+
         owner = get_owner(zoneid, rid);
         old   = oldowners + rid;
 
@@ -467,47 +729,99 @@ int mrp_resource_owner_print(char *buf, int len)
 #undef PRINT
 }
 
-
-static mrp_resource_owner_t *get_owner(uint32_t zone, uint32_t resid)
+int mrp_resource_owner_stats_print(char *buf, int len)
 {
-    MRP_ASSERT(zone < MRP_ZONE_MAX && resid < MRP_RESOURCE_MAX,
-               "invalid argument");
+#define PRINT(fmt, args...)  if (p<e) { p += snprintf(p, e-p, fmt , ##args); }
 
-    return resource_owners + (zone * MRP_RESOURCE_MAX + resid);
-}
+    uint64_t passes = arbitration_stats.passes;
+    char *p, *e;
 
-static void reset_owners(uint32_t zone, mrp_resource_owner_t *oldowners)
-{
-    mrp_resource_owner_t *owners = get_owner(zone, 0);
-    size_t size = sizeof(mrp_resource_owner_t) * MRP_RESOURCE_MAX;
-    size_t i;
+    MRP_ASSERT(buf && len > 0, "invalid argument");
+
+    e = (p = buf) + len;
 
-    if (oldowners)
-        memcpy(oldowners, owners, size);
+    PRINT("Arbitration: passes %llu, requests %llu, total %.1f us, "
+          "mean %.2f us, max %.1f us\n",
+          (unsigned long long)passes,
+          (unsigned long long)arbitration_stats.requests,
+          arbitration_stats.total / 1000.0,
+          passes ? arbitration_stats.total / 1000.0 / passes : 0.0,
+          arbitration_stats.max / 1000.0);
 
-    memset(owners, 0, size);
+    return p - buf;
 
-    for (i = 0;   i < MRP_RESOURCE_MAX;   i++)
-        owners[i].share = true;
+#undef PRINT
 }
 
-static bool grant_ownership(mrp_resource_owner_t    *owner,
-                            mrp_zone_t              *zone,
-                            mrp_application_class_t *class,
-                            mrp_resource_set_t      *rset,
-                            mrp_resource_t          *res)
+void mrp_resource_owner_reset_stats(void)
 {
-    mrp_resource_def_t      *rdef = res->def;
-    mrp_resource_mgr_ftbl_t *ftbl = rdef->manager.ftbl;
-    bool                     set_owner = false;
+    memset(&arbitration_stats, 0, sizeof(arbitration_stats));
+}
 
-    /*
-      if (forbid_grant())
-        return false;
-     */
 
-    if (owner->modal)
-        return false;
+static zone_owners_t *get_zone_owners(uint32_t zone)
+{
+    zone_owners_t *zo;
+
+    MRP_ASSERT(zone < MRP_ZONE_MAX, "invalid argument");
+
+    if (!(zo = zone_owners[zone])) {
+        zo = mrp_allocz(sizeof(*zo));
+
+        MRP_ASSERT(zo, "Memory alloc failure. Can't set up zone owners");
+
+        /* owners of a new zone are yet to be settled */
+        mrp_resource_mask_fill(&zo->dirty);
+
+        zone_owners[zone] = zo;
+    }
+
+    return zo;
+}
+
+static mrp_resource_owner_t *get_owner(uint32_t zone, uint32_t resid)
+{
+    MRP_ASSERT(resid < MRP_RESOURCE_MAX, "invalid argument");
+
+    return get_zone_owners(zone)->owners + resid;
+}
+
+static void reset_owners(uint32_t zone,
+                         mrp_resource_owner_t *oldowners,
+                         const mrp_resource_mask_t *slice)
+{
+    mrp_resource_owner_t *owners = get_owner(zone, 0);
+    int rcnt = mrp_resource_definition_count();
+    int i;
+
+    MRP_RESOURCE_MASK_FOREACH(slice, i) {
+        if (i >= rcnt)
+            break;
+
+        if (oldowners)
+            oldowners[i] = owners[i];
+
+        memset(owners + i, 0, sizeof(owners[i]));
+        owners[i].share = true;
+    }
+}
+
+static bool grant_ownership(mrp_resource_owner_t    *owner,
+                            mrp_zone_t              *zone,
+                            mrp_application_class_t *class,
+                            mrp_resource_set_t      *rset,
+                            mrp_resource_t          *res)
+{
+    mrp_resource_def_t      *rdef = res->def;
+    bool                     set_owner = false;
+
+    /*
+      if (forbid_grant())
+        return false;
+     */
+
+    if (owner->modal)
+        return false;
 
     do { /* not a loop */
         if (!owner->class && !owner->rset) {
@@ -531,10 +845,8 @@ static bool grant_ownership(mrp_resource_owner_t    *owner,
 
     } while(0);
 
-    if (ftbl && ftbl->allocate) {
-        if (!ftbl->allocate(zone, res, rdef->manager.userdata))
-            return false;
-    }
+    if (!manager_verdict(zone, res, false))
+        return false;
 
     if (set_owner) {
         owner->class = class;
@@ -554,11 +866,6 @@ static bool advice_ownership(mrp_resource_owner_t    *owner,
                              mrp_resource_set_t      *rset,
                              mrp_resource_t          *res)
 {
-    mrp_resource_def_t      *rdef = res->def;
-    mrp_resource_mgr_ftbl_t *ftbl = rdef->manager.ftbl;
-
-    (void)zone;
-
     /*
       if (forbid_grant())
         return false;
@@ -587,14 +894,641 @@ static bool advice_ownership(mrp_resource_owner_t    *owner,
 
     } while(0);
 
-    if (ftbl && ftbl->advice) {
-        if (!ftbl->advice(zone, res, rdef->manager.userdata))
-            return false;
-    }
+    if (!manager_verdict(zone, res, true))
+        return false;
 
     return true;
 }
 
+static arbitration_mode_t get_arbitration_mode(void)
+{
+    static int mode = -1;
+    const char *env;
+
+    if (mode < 0) {
+        if (!(env = getenv(ARBITRATION_ENVVAR)) || !strcmp(env, "incremental"))
+            mode = ARBITRATION_INCREMENTAL;
+        else if (!strcmp(env, "full"))
+            mode = ARBITRATION_FULL;
+        else if (!strcmp(env, "check"))
+            mode = ARBITRATION_CHECK;
+        else {
+            mrp_log_error("invalid %s '%s', using incremental arbitration",
+                          ARBITRATION_ENVVAR, env);
+            mode = ARBITRATION_INCREMENTAL;
+        }
+    }
+
+    return (arbitration_mode_t)mode;
+}
+
+static void affected_resources(uint32_t zoneid,
+                               const mrp_resource_mask_t *reqmask,
+                               mrp_resource_mask_t *slice)
+{
+    zone_owners_t *zo = get_zone_owners(zoneid);
+    mrp_resource_def_t *rdef;
+    mrp_resource_mask_t prev;
+    void *cursor;
+    int id;
+
+    /*
+     * Owners evolve resource by resource, so a resource set is affected
+     * only by the sets it shares resources with. We start with the
+     * resources of the requests, the ones left unsettled by the previous
+     * pass and the managed ones (a manager needs to see every allocation
+     * of its resource within a transaction). Then we pull in the
+     * resources linked to the slice by any resource set in the zone
+     * until the slice is closed.
+     */
+
+    *slice = zo->dirty;
+    cursor = NULL;
+
+    if (reqmask)
+        mrp_resource_mask_or(slice, reqmask);
+
+    while ((rdef = mrp_resource_definition_iterate_manager(&cursor)))
+        mrp_resource_mask_set(slice, rdef->id);
+
+    do {
+        prev = *slice;
+
+        MRP_RESOURCE_MASK_FOREACH(&prev, id)
+            mrp_resource_mask_or(slice, zo->links + id);
+    } while (!mrp_resource_mask_equal(slice, &prev));
+}
+
+void mrp_resource_owner_invalidate(uint32_t zoneid,
+                                   const mrp_resource_mask_t *mask)
+{
+    mrp_resource_mask_or(&get_zone_owners(zoneid)->dirty, mask);
+}
+
+static uint32_t reply_id(mrp_resource_set_t *rset,
+                         request_t *reqs,
+                         uint32_t nreq,
+                         bool *requested)
+{
+    request_t *req;
+
+    /* the latest request of a set is the one answered by the pass */
+    for (req = reqs + nreq;  req > reqs;  req--) {
+        if (req[-1].rset == rset) {
+            *requested = true;
+            return (req[-1].reqid == rset->request.id) ? req[-1].reqid : 0;
+        }
+    }
+
+    *requested = false;
+    return 0;
+}
+
+static bool superseded(request_t *reqs, uint32_t nreq, uint32_t idx)
+{
+    uint32_t i;
+
+    if (!reqs[idx].rset || !reqs[idx].reqid)
+        return false;
+
+    for (i = idx + 1;  i < nreq;  i++) {
+        if (reqs[i].rset == reqs[idx].rset)
+            return true;
+    }
+
+    return false;
+}
+
+static uint32_t add_superseded_replies(request_t *reqs,
+                                       uint32_t nreq,
+                                       event_t **eventp,
+                                       uint32_t nevent)
+{
+    event_t *events, *ev;
+    uint32_t nextra, i;
+
+    /*
+     * A batch can contain several requests for the same set. The pass
+     * answered the latest one. The earlier ones still get their reply,
+     * ahead of the others and reporting the state the batch ended in.
+     */
+    for (i = 0, nextra = 0;  i < nreq;  i++) {
+        if (superseded(reqs, nreq, i))
+            nextra++;
+    }
+
+    if (!nextra)
+        return nevent;
+
+    events = *eventp;
+
+    if (!mrp_reallocz(events, nevent, nevent + nextra)) {
+        mrp_log_error("failed to reply to %u superseded resource requests",
+                      nextra);
+        return nevent;
+    }
+
+    memmove(events + nextra, events, nevent * sizeof(*events));
+
+    for (i = 0, ev = events;  i < nreq;  i++) {
+        if (superseded(reqs, nreq, i)) {
+            ev->replyid = reqs[i].reqid;
+            ev->rset    = reqs[i].rset;
+            ev->move    = false;
+            ev++;
+        }
+    }
+
+    *eventp = events;
+
+    return nevent + nextra;
+}
+
+static uint32_t arbitrate(mrp_zone_t *zone,
+                          request_t *reqs,
+                          uint32_t nreq,
+                          const mrp_resource_mask_t *slice,
+                          bool dry,
+                          event_t **eventp)
+{
+    int rcnt = mrp_resource_definition_count();
+    mrp_resource_owner_t backup[rcnt > 0 ? rcnt : 1];
+    mrp_resource_mask_t links[rcnt > 0 ? rcnt : 1];
+    zone_owners_t *zo;
+    mrp_application_class_t *class;
+    mrp_resource_set_t *rset, *reqset;
+    mrp_resource_t *res;
+    mrp_resource_def_t *rdef;
+    mrp_resource_owner_t *owner, *owners;
+    mrp_resource_mask_t all;
+    mrp_resource_mask_t mandatory;
+    mrp_resource_mask_t grant;
+    mrp_resource_mask_t advice;
+    void *clc, *rsc, *rc;
+    uint32_t zoneid;
+    uint32_t rid;
+    int id;
+    bool full;
+    bool force_release;
+    bool changed;
+    bool move;
+    bool requested;
+    mrp_resource_event_t notify;
+    uint32_t replyid;
+    uint32_t nevent, maxev;
+    event_t *events, *ev;
+    uint32_t i;
+
+    zoneid = zone->id;
+    nevent = maxev = 0;
+    events = NULL;
+    clc    = NULL;
+    reqset = NULL;
+
+    /* the veto sees the latest requesting set */
+    for (i = nreq;  i > 0 && !reqset;  i--)
+        reqset = reqs[i - 1].rset;
+
+    zo     = get_zone_owners(zoneid);
+    owners = zo->owners;
+    full   = mrp_resource_mask_full(slice);
+
+    memset(links, 0, sizeof(links[0]) * rcnt);
+
+    while ((class = mrp_application_class_iterate_classes(&clc))) {
+        rsc = NULL;
+
+        while ((rset=mrp_application_class_iterate_rsets(class,zoneid,&rsc))) {
+            all = rset->resource.mask.all;
+
+            /* collect which resources are linked by resource sets */
+            MRP_RESOURCE_MASK_FOREACH(&all, id)
+                mrp_resource_mask_or(links + id, &all);
+
+            replyid = reply_id(rset, reqs, nreq, &requested);
+
+            if (!full && !requested && !mrp_resource_mask_intersects(&all,
+                                                                     slice))
+                continue;
+
+            force_release = false;
+            mandatory = rset->resource.mask.mandatory;
+            mrp_resource_mask_zero(&grant);
+            mrp_resource_mask_zero(&advice);
+            rc = NULL;
+
+            switch (rset->state) {
+
+            case mrp_resource_acquire:
+                while ((res = mrp_resource_set_iterate_resources(rset, &rc))) {
+                    rdef  = res->def;
+                    rid   = rdef->id;
+                    owner = owners + rid;
+
+                    backup[rid] = *owner;
+
+                    if (grant_ownership(owner, zone, class, rset, res))
+                        mrp_resource_mask_set(&grant, rid);
+                    else {
+                        if (owner->rset != rset)
+                            force_release |= owner->modal;
+                    }
+                }
+                /*
+                 * a set that is forced to release must not be left behind
+                 * as the owner of the resources it managed to grab
+                 */
+                if (!force_release &&
+                    mrp_resource_mask_subset(&mandatory, &grant) &&
+                    mrp_resource_lua_veto(zone, rset, owners, &grant, reqset))
+                {
+                    advice = grant;
+                }
+                else {
+                    /* rollback, ie. restore the backed up state */
+                    rc = NULL;
+                    while ((res=mrp_resource_set_iterate_resources(rset,&rc))){
+                        rdef = res->def;
+                        rid = rdef->id;
+                        owner = owners + rid;
+                        *owner = backup[rid];
+
+                        if (mrp_resource_mask_test(&grant, rid))
+                            manager_free(zone, res);
+
+                        if (advice_ownership(owner, zone, class, rset, res))
+                            mrp_resource_mask_set(&advice, rid);
+                    }
+
+                    mrp_resource_mask_zero(&grant);
+
+                    if (!mrp_resource_mask_subset(&mandatory, &advice))
+                        mrp_resource_mask_zero(&advice);
+
+                    mrp_resource_lua_set_owners(zone, owners);
+                }
+                break;
+
+            case mrp_resource_release:
+                while ((res = mrp_resource_set_iterate_resources(rset, &rc))) {
+                    rdef  = res->def;
+                    rid   = rdef->id;
+                    owner = owners + rid;
+
+                    if (advice_ownership(owner, zone, class, rset, res))
+                        mrp_resource_mask_set(&advice, rid);
+                }
+                if (!mrp_resource_mask_subset(&mandatory, &advice))
+                    mrp_resource_mask_zero(&advice);
+                break;
+
+            default:
+                break;
+            }
+
+            changed = false;
+            move    = false;
+            notify  = 0;
+
+            if (force_release) {
+                move = (rset->state != mrp_resource_release);
+                notify = move ? MRP_RESOURCE_EVENT_RELEASE : 0;
+                changed = move ||
+                    !mrp_resource_mask_empty(&rset->resource.mask.grant);
+                rset->state = mrp_resource_release;
+                mrp_resource_mask_zero(&rset->resource.mask.grant);
+            }
+            else {
+                if (mrp_resource_mask_equal(&grant,
+                                            &rset->resource.mask.grant)) {
+                    if (rset->state == mrp_resource_acquire &&
+                        mrp_resource_mask_empty(&grant) &&
+                        rset->dont_wait.current)
+                    {
+                        rset->state = mrp_resource_release;
+                        rset->dont_wait.current = rset->dont_wait.client;
+
+                        notify = MRP_RESOURCE_EVENT_RELEASE;
+                        move = true;
+                    }
+                }
+                else {
+                    rset->resource.mask.grant = grant;
+                    changed = true;
+
+                    if (rset->state != mrp_resource_release &&
+                        mrp_resource_mask_empty(&grant) &&
+                        rset->auto_release.current)
+                    {
+                        rset->state = mrp_resource_release;
+                        rset->auto_release.current = rset->auto_release.client;
+
+                        notify = MRP_RESOURCE_EVENT_RELEASE;
+                        move = true;
+                    }
+                }
+            }
+
+            if (notify && !dry) {
+                mrp_resource_set_notify(rset, notify);
+            }
+
+            if (!mrp_resource_mask_equal(&advice,
+                                         &rset->resource.mask.advice)) {
+                rset->resource.mask.advice = advice;
+                changed = true;
+            }
+
+            if (replyid || changed || move) {
+                if (nevent >= maxev) {
+                    maxev = maxev ? 2 * maxev : 16;
+                    mrp_reallocz(events, nevent, maxev);
+
+                    MRP_ASSERT(events, "Memory alloc failure. "
+                               "Can't update zone");
+                }
+
+                ev = events + nevent++;
+
+                ev->replyid = replyid;
+                ev->rset    = rset;
+                ev->move    = move;
+            }
+        } /* while rset */
+    } /* while class */
+
+    if (!dry)
+        memcpy(zo->links, links, sizeof(links[0]) * rcnt);
+
+    *eventp = events;
+
+    return nevent;
+}
+
+static rset_state_t *save_rset_states(uint32_t zoneid, uint32_t *nstatep)
+{
+    mrp_application_class_t *class;
+    mrp_resource_set_t *rset;
+    rset_state_t *states, *st;
+    void *clc, *rsc;
+    uint32_t nstate;
+
+    states = mrp_allocz(sizeof(rset_state_t) * mrp_get_resource_set_count());
+    nstate = 0;
+
+    if (states) {
+        clc = NULL;
+
+        while ((class = mrp_application_class_iterate_classes(&clc))) {
+            rsc = NULL;
+
+            while ((rset = mrp_application_class_iterate_rsets(class, zoneid,
+                                                               &rsc))) {
+                st = states + nstate++;
+
+                st->rset         = rset;
+                st->state        = rset->state;
+                st->grant        = rset->resource.mask.grant;
+                st->advice       = rset->resource.mask.advice;
+                st->auto_release = rset->auto_release.current;
+                st->dont_wait    = rset->dont_wait.current;
+            }
+        }
+    }
+
+    *nstatep = nstate;
+
+    return states;
+}
+
+static void restore_rset_states(rset_state_t *states, uint32_t nstate)
+{
+    mrp_resource_set_t *rset;
+    rset_state_t *st;
+    uint32_t i;
+
+    for (i = 0, st = states;  i < nstate;  i++, st++) {
+        rset = st->rset;
+
+        rset->state                 = st->state;
+        rset->resource.mask.grant   = st->grant;
+        rset->resource.mask.advice  = st->advice;
+        rset->auto_release.current  = st->auto_release;
+        rset->dont_wait.current     = st->dont_wait;
+    }
+}
+
+static void check_arbitration(mrp_zone_t *zone,
+                              request_t *reqs,
+                              uint32_t nreq,
+                              const mrp_resource_mask_t *slice,
+                              mrp_resource_owner_t *oldowners,
+                              rset_state_t *before,
+                              uint32_t nbefore,
+                              event_t *events,
+                              uint32_t nevent)
+{
+    uint32_t rcnt = mrp_resource_definition_count();
+    mrp_resource_owner_t result[rcnt > 0 ? rcnt : 1];
+    mrp_resource_owner_t *owners, *o, *r;
+    mrp_resource_set_t *rset;
+    rset_state_t *after, *st;
+    event_t *fullev, *ev, *fev;
+    mrp_resource_mask_t all;
+    char grants[2][MRP_RESOURCE_MASK_STRLEN];
+    char advices[2][MRP_RESOURCE_MASK_STRLEN];
+    char slicebuf[MRP_RESOURCE_MASK_STRLEN];
+    uint32_t nafter, nfull, i;
+    int id;
+    bool ok;
+
+    /*
+     * Run a full arbitration pass over the zone state we had before the
+     * incremental one and compare the results. The full pass must not
+     * have any side effects, so it replays the verdicts the resource
+     * managers gave during the incremental pass instead of asking them.
+     */
+
+    if (verdicts.lost) {
+        mrp_log_error("can't check arbitration of zone '%s' (out of memory)",
+                      zone->name);
+        return;
+    }
+
+    owners = get_owner(zone->id, 0);
+    after  = save_rset_states(zone->id, &nafter);
+
+    if (!after || nafter != nbefore) {
+        mrp_log_error("can't check arbitration of zone '%s'", zone->name);
+        mrp_free(after);
+        return;
+    }
+
+    memcpy(result, owners, sizeof(result[0]) * rcnt);
+
+    restore_rset_states(before, nbefore);
+
+    /* oldowners is only valid for the slice, the rest was not touched */
+    MRP_RESOURCE_MASK_FOREACH(slice, id) {
+        if (id >= (int)rcnt)
+            break;
+        owners[id] = oldowners[id];
+    }
+
+    mrp_resource_mask_fill(&all);
+    reset_owners(zone->id, NULL, &all);
+
+    verdicts.replay   = true;
+    verdicts.next     = 0;
+    verdicts.mismatch = false;
+
+    fullev = NULL;
+    nfull  = arbitrate(zone, reqs, nreq, &all, true, &fullev);
+
+    verdicts.replay = false;
+
+    ok = true;
+
+    if (verdicts.mismatch || verdicts.next != verdicts.nverdict) {
+        mrp_log_error("arbitration of zone '%s': resource managers were "
+                      "consulted differently", zone->name);
+        ok = false;
+    }
+
+    for (i = 0, st = after;  i < nafter;  i++, st++) {
+        rset = st->rset;
+
+        if (rset->state                != st->state        ||
+            !mrp_resource_mask_equal(&rset->resource.mask.grant,
+                                     &st->grant)                   ||
+            !mrp_resource_mask_equal(&rset->resource.mask.advice,
+                                     &st->advice)                  ||
+            rset->auto_release.current != st->auto_release ||
+            rset->dont_wait.current    != st->dont_wait      )
+        {
+            mrp_log_error("arbitration of zone '%s': resource set %u "
+                          "differs (state %d/%d, grant %s/%s, "
+                          "advice %s/%s)", zone->name, rset->id,
+                          st->state, rset->state,
+                          mrp_resource_mask_print(&st->grant, grants[0],
+                                                  sizeof(grants[0])),
+                          mrp_resource_mask_print(&rset->resource.mask.grant,
+                                                  grants[1],
+                                                  sizeof(grants[1])),
+                          mrp_resource_mask_print(&st->advice, advices[0],
+                                                  sizeof(advices[0])),
+                          mrp_resource_mask_print(&rset->resource.mask.advice,
+                                                  advices[1],
+                                                  sizeof(advices[1])));
+            ok = false;
+        }
+    }
+
+    for (i = 0;  i < rcnt;  i++) {
+        r = result + i;
+        o = owners + i;
+
+        if (r->class != o->class || r->rset  != o->rset  ||
+            r->res   != o->res   || r->modal != o->modal ||
+            r->share != o->share)
+        {
+            mrp_log_error("arbitration of zone '%s': owner of resource %u "
+                          "differs (resource set %u/%u)", zone->name, i,
+                          r->rset ? r->rset->id : 0,
+                          o->rset ? o->rset->id : 0);
+            ok = false;
+        }
+    }
+
+    if (nfull != nevent)
+        ok = false;
+    else {
+        for (i = 0;  i < nevent;  i++) {
+            ev  = events + i;
+            fev = fullev + i;
+
+            if (ev->rset != fev->rset || ev->replyid != fev->replyid ||
+                ev->move != fev->move)
+                ok = false;
+        }
+    }
+
+    if (!ok) {
+        mrp_log_error("incremental arbitration of zone '%s' (slice %s) "
+                      "disagrees with a full pass", zone->name,
+                      mrp_resource_mask_print(slice, slicebuf,
+                                              sizeof(slicebuf)));
+    }
+
+    restore_rset_states(after, nafter);
+    memcpy(owners, result, sizeof(result[0]) * rcnt);
+
+    mrp_free(after);
+    mrp_free(fullev);
+
+    MRP_ASSERT(ok, "incremental and full arbitration disagree");
+}
+
+static bool manager_verdict(mrp_zone_t *zone, mrp_resource_t *res, bool advice)
+{
+    mrp_resource_def_t *rdef = res->def;
+    mrp_resource_mgr_ftbl_t *ftbl = rdef->manager.ftbl;
+    verdict_t *v;
+    bool result;
+
+    if (!ftbl || !(advice ? ftbl->advice : ftbl->allocate))
+        return true;
+
+    if (verdicts.replay) {
+        v = verdicts.buf + verdicts.next;
+
+        if (verdicts.next < verdicts.nverdict &&
+            v->res == res && v->advice == advice)
+        {
+            verdicts.next++;
+            return v->result;
+        }
+
+        verdicts.mismatch = true;
+        return false;
+    }
+
+    if (advice)
+        result = ftbl->advice(zone, res, rdef->manager.userdata);
+    else
+        result = ftbl->allocate(zone, res, rdef->manager.userdata);
+
+    if (verdicts.record) {
+        if (verdicts.nverdict >= verdicts.size) {
+            verdicts.size = verdicts.size ? 2 * verdicts.size : 32;
+
+            if (!mrp_reallocz(verdicts.buf, verdicts.nverdict, verdicts.size)) {
+                verdicts.size   = verdicts.nverdict;
+                verdicts.record = false;
+                verdicts.lost   = true;
+                return result;
+            }
+        }
+
+        v = verdicts.buf + verdicts.nverdict++;
+
+        v->res    = res;
+        v->advice = advice;
+        v->result = result;
+    }
+
+    return result;
+}
+
+static void manager_free(mrp_zone_t *zone, mrp_resource_t *res)
+{
+    mrp_resource_def_t *rdef = res->def;
+    mrp_resource_mgr_ftbl_t *ftbl = rdef->manager.ftbl;
+
+    if (!verdicts.replay && ftbl && ftbl->free)
+        ftbl->free(zone, res, rdef->manager.userdata);
+}
+
 static void manager_start_transaction(mrp_zone_t *zone)
 {
     mrp_resource_def_t *rdef;
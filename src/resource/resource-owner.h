@@ -50,6 +50,8 @@ struct mrp_resource_owner_s {
 
 int  mrp_resource_owner_create_database_table(mrp_resource_def_t *);
 void mrp_resource_owner_update_zone(uint32_t, mrp_resource_set_t *, uint32_t);
+void mrp_resource_owner_invalidate(uint32_t, const mrp_resource_mask_t *);
+void mrp_resource_owner_flush_zone(uint32_t);
 
 
 #endif  /* __MURPHY_RESOURCE_OWNER_H__ */
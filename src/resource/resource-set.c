@@ -148,6 +148,10 @@ void mrp_resource_set_destroy(mrp_resource_set_t *rset)
         if (state == mrp_resource_acquire)
             mrp_resource_set_release(rset, MRP_RESOURCE_REQNO_INVALID);
 
+        /* a batched release must not leave the set behind as an owner */
+        if (rset->class.ptr)
+            mrp_resource_owner_flush_zone(rset->zone);
+
         mrp_list_foreach(&rset->resource.list, entry, n) {
             res = mrp_list_entry(entry, mrp_resource_t, list);
             mrp_resource_notify(res, rset, MRP_RESOURCE_EVENT_DESTROYED);
@@ -156,7 +160,9 @@ void mrp_resource_set_destroy(mrp_resource_set_t *rset)
 
         mrp_list_delete(&rset->list);
         mrp_list_delete(&rset->client.list);
-        mrp_list_delete(&rset->class.list);
+
+        if (rset->class.ptr)
+            mrp_application_class_remove_resource_set(rset);
 
         mrp_free(rset);
 
@@ -247,7 +253,7 @@ int mrp_resource_set_add_resource(mrp_resource_set_t *rset,
                                   mrp_attr_t         *attrs,
                                   bool                mandatory)
 {
-    uint32_t mask;
+    mrp_resource_mask_t mask;
     mrp_resource_t *res;
     uint32_t rsetid;
     bool autorel;
@@ -265,13 +271,20 @@ int mrp_resource_set_add_resource(mrp_resource_set_t *rset,
 
     mask = mrp_resource_get_mask(res);
 
-    rset->resource.mask.all       |= mask;
-    rset->resource.mask.mandatory |= mandatory ? mask : 0;
-    rset->resource.share          |= mrp_resource_is_shared(res);
+    mrp_resource_mask_or(&rset->resource.mask.all, &mask);
+
+    if (mandatory)
+        mrp_resource_mask_or(&rset->resource.mask.mandatory, &mask);
+
+    rset->resource.share |= mrp_resource_is_shared(res);
+    rset->resource.attrgen++;
 
 
     mrp_list_append(&rset->resource.list, &res->list);
 
+    if (rset->class.ptr)
+        mrp_resource_owner_invalidate(rset->zone, &rset->resource.mask.all);
+
     mrp_resource_lua_add_resource_to_resource_set(rset, res);
 
     return 0;
@@ -321,6 +334,8 @@ int mrp_resource_set_write_attributes(mrp_resource_set_t *rset,
     if (mrp_resource_write_attributes(res, attrs) < 0)
         return -1;
 
+    rset->resource.attrgen++;
+
     return 0;
 }
 
@@ -383,7 +398,6 @@ void mrp_resource_set_updated(mrp_resource_set_t *rset)
     mrp_resource_t *res;
     mrp_resource_def_t *def;
     mrp_list_hook_t *resen, *n;
-    mrp_resource_mask_t mask;
     bool grant;
 
     MRP_ASSERT(rset, "invalid argument");
@@ -392,8 +406,7 @@ void mrp_resource_set_updated(mrp_resource_set_t *rset)
         res = mrp_list_entry(resen, mrp_resource_t, list);
         def = res->def;
 
-        mask = ((mrp_resource_mask_t)1) << def->id;
-        grant =  (mask & rset->resource.mask.grant) ? true : false;
+        grant = mrp_resource_mask_test(&rset->resource.mask.grant, def->id);
 
         mrp_resource_user_update(res, rset->state, grant);
     }
@@ -469,7 +482,9 @@ int mrp_resource_set_print(mrp_resource_set_t *rset, size_t indent,
 
     mrp_resource_t *res;
     mrp_list_hook_t *resen, *n;
-    uint32_t mandatory;
+    mrp_resource_mask_t *mandatory;
+    char all[MRP_RESOURCE_MASK_STRLEN], mand[MRP_RESOURCE_MASK_STRLEN];
+    char grant[MRP_RESOURCE_MASK_STRLEN], advice[MRP_RESOURCE_MASK_STRLEN];
     char gap[] = "                         ";
     char *p, *e;
 
@@ -483,12 +498,16 @@ int mrp_resource_set_print(mrp_resource_set_t *rset, size_t indent,
 
     e = (p = buf) + len;
 
-    mandatory = rset->resource.mask.mandatory;
+    mandatory = &rset->resource.mask.mandatory;
 
-    PRINT("%s%3u - 0x%02x/0x%02x 0x%02x/0x%02x 0x%08x %d %s%s%s %s\n",
+    PRINT("%s%3u - %s/%s %s/%s 0x%08x %d %s%s%s %s\n",
           gap, rset->id,
-          rset->resource.mask.all, mandatory,
-          rset->resource.mask.grant, rset->resource.mask.advice,
+          mrp_resource_mask_print(&rset->resource.mask.all, all, sizeof(all)),
+          mrp_resource_mask_print(mandatory, mand, sizeof(mand)),
+          mrp_resource_mask_print(&rset->resource.mask.grant,
+                                  grant, sizeof(grant)),
+          mrp_resource_mask_print(&rset->resource.mask.advice,
+                                  advice, sizeof(advice)),
           mrp_application_class_get_sorting_key(rset), rset->class.priority,
           rset->resource.share ? "shared   ":"exclusive",
           rset->auto_release.client ? ",autorelease" : "",
@@ -642,6 +661,8 @@ static uint32_t get_request_stamp(void)
             rset = mrp_list_entry(entry, mrp_resource_set_t, list);
             rset->request.stamp -= min;
         }
+
+        mrp_application_class_rebase_stamps(min);
     }
 
     MRP_ASSERT(stamp < STAMP_MAX, "Request stamp overflow");
@@ -43,6 +43,18 @@
 
 #define MRP_RESOURCE_TAG_RSET_ID ((uint16_t) 1)
 
+typedef struct {
+    mrp_resource_mask_t grant;
+    mrp_application_class_t *class;
+    uint32_t gen;                 /* generation of the veto method */
+    uint32_t zone;
+    uint64_t owners;              /* these three are only set if the */
+    uint32_t attrgen;             /*   veto declared to depend on them */
+    uint32_t reqset;
+    bool auto_release;
+    bool dont_wait;
+} mrp_resource_veto_key_t;
+
 struct mrp_resource_set_s {
     mrp_list_hook_t                 list;
     uint32_t                        id;
@@ -64,6 +76,7 @@ struct mrp_resource_set_s {
         } mask;
         mrp_list_hook_t list;
         bool share;
+        uint32_t attrgen;         /* bumped when the attributes change */
     }                               resource;
     struct {
         mrp_list_hook_t list;
@@ -74,12 +87,21 @@ struct mrp_resource_set_s {
         mrp_list_hook_t list;
         mrp_application_class_t *ptr;
         uint32_t priority;
+        uint32_t key;             /* sorting key when it was last moved */
+        uint64_t seq;             /* orders sets with the same key */
+        uint32_t level;           /* height of the tower in the index */
+        mrp_resource_set_t *skip[MRP_KEY_SKIP_LEVELS];
     }                               class;
     uint32_t                        zone;
     struct {
         uint32_t id;
         uint32_t stamp;
     }                               request;
+    struct {
+        bool valid;
+        bool verdict;             /* the last verdict of the veto ... */
+        mrp_resource_veto_key_t key;  /* ... and what it was given */
+    }                               veto;
     mrp_resource_event_cb_t         event;
     void                           *user_data;
 };
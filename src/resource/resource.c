@@ -47,7 +47,7 @@
 #include "zone.h"
 
 
-#define RESOURCE_MAX        (sizeof(mrp_resource_mask_t) * 8)
+#define RESOURCE_MAX        MRP_RESOURCE_MAX
 #define ATTRIBUTE_MAX       (sizeof(mrp_attribute_mask_t) * 8)
 #define NAME_LENGTH          24
 
@@ -348,19 +348,42 @@ const char *mrp_resource_get_name(mrp_resource_t *res)
 mrp_resource_mask_t mrp_resource_get_mask(mrp_resource_t *res)
 {
     mrp_resource_def_t *def;
-    mrp_resource_mask_t mask = 0;
+    mrp_resource_mask_t mask;
+
+    mrp_resource_mask_zero(&mask);
 
     if (res) {
         def = res->def;
 
         MRP_ASSERT(def, "confused with internal data structures");
 
-        mask = (mrp_resource_mask_t)1 << def->id;
+        mrp_resource_mask_set(&mask, def->id);
     }
 
     return mask;
 }
 
+char *mrp_resource_mask_print(const mrp_resource_mask_t *mask,
+                              char *buf, int len)
+{
+    char *p, *e;
+    int i;
+
+    MRP_ASSERT(mask && buf && len > 0, "invalid argument");
+
+    /* the words in use in hex, most significant first */
+    for (i = MRP_RESOURCE_MASK_WORDS - 1;  i > 0 && !mask->word[i];  i--)
+        ;
+
+    e = (p = buf) + len;
+    p += snprintf(p, e-p, "0x%llx", (unsigned long long)mask->word[i]);
+
+    while (--i >= 0 && p < e)
+        p += snprintf(p, e-p, "%016llx", (unsigned long long)mask->word[i]);
+
+    return buf;
+}
+
 bool mrp_resource_is_shared(mrp_resource_t *res)
 {
     if (res)
@@ -481,7 +504,8 @@ void mrp_resource_notify(mrp_resource_t *res,
     }
 }
 
-int mrp_resource_print(mrp_resource_t *res, uint32_t mandatory,
+int mrp_resource_print(mrp_resource_t *res,
+                       const mrp_resource_mask_t *mandatory,
                        size_t indent, char *buf, int len)
 {
 #define PRINT(fmt, args...)  if (p<e) { p += snprintf(p, e-p, fmt , ##args); }
@@ -489,12 +513,11 @@ int mrp_resource_print(mrp_resource_t *res, uint32_t mandatory,
     mrp_resource_def_t *rdef;
     char gap[] = "                         ";
     char *p, *e;
-    uint32_t m;
 
     if (len <= 0)
         return 0;
 
-    MRP_ASSERT(res && indent < sizeof(gap)-1 && buf,
+    MRP_ASSERT(res && mandatory && indent < sizeof(gap)-1 && buf,
                "invalid argument");
 
     rdef = res->def;
@@ -504,10 +527,10 @@ int mrp_resource_print(mrp_resource_t *res, uint32_t mandatory,
     gap[indent] = '\0';
 
     e = (p = buf) + len;
-    m = ((mrp_resource_mask_t)1 << rdef->id);
 
-    PRINT("%s%s: 0x%02x %s %s", gap, rdef->name, m,
-          (m & mandatory) ? "mandatory":"optional ",
+    PRINT("%s%s: %u %s %s", gap, rdef->name, rdef->id,
+          mrp_resource_mask_test(mandatory, rdef->id) ?
+          "mandatory":"optional ",
           res->shared ? "shared  ":"exlusive");
 
     p += mrp_resource_attribute_print(res, p, e-p);
@@ -809,7 +832,8 @@ void mrp_resource_user_update(mrp_resource_t *res, int state, bool grant)
 
     set_attr_descriptors(cdsc + (i+1), res);
 
-    if ((n = MQI_UPDATE(resource_user_table[rdef->id], cdsc,&row, where)) != 1)
+    /* an update that leaves the row as it was changes no rows */
+    if ((n = MQI_UPDATE(resource_user_table[rdef->id], cdsc,&row, where)) < 0)
         mrp_log_error("can't update row in resource user table");
 }
 
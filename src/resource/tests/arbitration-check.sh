@@ -0,0 +1,26 @@
+#!/bin/sh
+
+# Randomized test of the incremental arbitration.
+#
+# Runs the resource benchmark in check mode, where every incremental
+# arbitration is verified by a full pass over the zone and a disagreement
+# aborts the benchmark. Each seed drives a different random sequence of
+# acquires, releases and set re-creations, with and without batching and
+# with one and several zones.
+
+BENCH=${BENCH:-./resource-bench}
+SEEDS=${SEEDS:-"1 2 3 4 5"}
+
+for seed in $SEEDS; do
+    for zones in 1 3; do
+        for batch in "" "--batch"; do
+            if ! $BENCH --check --seed=$seed --zones=$zones $batch \
+                    --sets=10,50,200 --ops=2000 --rounds=1 > /dev/null; then
+                echo "check failed: seed $seed, $zones zone(s) $batch" 1>&2
+                exit 1
+            fi
+        done
+    done
+done
+
+exit 0
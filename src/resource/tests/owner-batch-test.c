@@ -0,0 +1,429 @@
+/*
+ * Copyright (c) 2012, Intel Corporation
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met:
+ *
+ *  * Redistributions of source code must retain the above copyright notice,
+ *    this list of conditions and the following disclaimer.
+ *  * Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ *  * Neither the name of Intel Corporation nor the names of its contributors
+ *    may be used to endorse or promote products derived from this software
+ *    without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+
+/*
+ * Tests for batched zone arbitration. Two zones are populated with the
+ * same resource sets, and the same random bursts of requests are issued
+ * in both: one request at a time in the first zone, and queued up in a
+ * single batch in the second one. After each burst the sets, the owners
+ * and what the sets were told in their events must match across the two
+ * zones, and every request in the batch must have been replied to.
+ *
+ * None of the sets is auto-released or asks not to wait: both depend on
+ * the grants a set goes through on the way, and a batch only settles
+ * where the requests end up.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <errno.h>
+
+#include <lua.h>
+#include <lauxlib.h>
+
+#include <murphy/common/macros.h>
+#include <murphy/common/mm.h>
+#include <murphy/common/log.h>
+#include <murphy/common/debug.h>
+
+#include <murphy/core/context.h>
+#include <murphy/core/lua-bindings/murphy.h>
+
+#include <murphy/resource/config-api.h>
+#include <murphy/resource/manager-api.h>
+#include <murphy/resource/client-api.h>
+
+#define CHECK(cond) do {                                                  \
+        if (!(cond)) {                                                    \
+            printf("%s:%d: check '%s' failed\n", __FUNCTION__, __LINE__,  \
+                   #cond);                                                \
+            nfail++;                                                      \
+        }                                                                 \
+    } while (0)
+
+#define ZONE_SINGLE  0                  /* requests issued one by one */
+#define ZONE_BATCH   1                  /* requests issued in a batch */
+#define NZONE        2
+
+#define NROUND       200                /* bursts of requests */
+#define NBURST       8                  /* max. requests in a burst */
+#define NREQID       (NROUND * NBURST + 1)
+
+typedef struct {
+    const char *name;                   /* resource name */
+    bool        shared;                 /* whether asked to be shared */
+    bool        mandatory;              /* whether mandatory */
+} res_def_t;
+
+typedef struct {
+    const char *class;                  /* application class */
+    res_def_t   res[2];                 /* resources of the set */
+} set_def_t;
+
+typedef struct {
+    mrp_resource_set_t  *rset;          /* the resource set */
+    uint32_t             zone;          /* ZONE_SINGLE or ZONE_BATCH */
+    int                  idx;           /* index in set_defs */
+    int                  nevent;        /* number of events received */
+    mrp_resource_mask_t  notified;      /* grant in the latest event */
+} set_t;
+
+typedef struct {
+    int  idx;                           /* index of the set */
+    bool acquire;                       /* acquire or release */
+} op_t;
+
+static const set_def_t set_defs[] = {
+    { "phone"     , { { "audio", true , true  }, { "video", false, false } } },
+    { "phone"     , { { "audio", false, true  }, { NULL                  } } },
+    { "navigator" , { { "audio", true , true  }, { NULL                  } } },
+    { "navigator" , { { "video", false, true  }, { "audio", true , false } } },
+    { "player"    , { { "audio", true , true  }, { "video", false, true  } } },
+    { "player"    , { { "video", false, true  }, { NULL                  } } },
+    { "player"    , { { "audio", false, false }, { "video", false, false } } },
+    { "background", { { "audio", true , true  }, { NULL                  } } },
+};
+
+#define NSET MRP_ARRAY_SIZE(set_defs)
+
+static lua_State             *L;
+static mrp_context_t         *ctx;
+static mrp_resource_client_t *client;
+static set_t                  sets[NZONE][NSET];
+static int                    replies[NZONE][NREQID];
+static int                    nfail;
+
+static const char *zone_names[NZONE] = { "single", "batch" };
+
+static const char *config =
+    "zone.attributes { type = { mdb.string, 'common', 'rw' } }\n"
+    "zone { name = 'single' }\n"
+    "zone { name = 'batch' }\n"
+    "application_class { name = 'phone', priority = 3, modal = false,\n"
+    "                    share = false, order = 'fifo' }\n"
+    "application_class { name = 'navigator', priority = 2, modal = false,\n"
+    "                    share = true, order = 'fifo' }\n"
+    "application_class { name = 'player', priority = 1, modal = false,\n"
+    "                    share = true, order = 'lifo' }\n"
+    "application_class { name = 'background', priority = 0,\n"
+    "                    modal = false, share = true, order = 'lifo' }\n"
+    "resource.class { name = 'audio', shareable = true }\n"
+    "resource.class { name = 'video', shareable = false }\n";
+
+
+static void event_cb(uint32_t reqid, mrp_resource_set_t *rset, void *data)
+{
+    set_t *s = data;
+
+    s->nevent++;
+    s->notified = mrp_get_resource_set_grant(rset);
+
+    if (reqid) {
+        CHECK(reqid < NREQID);
+        CHECK(replies[s->zone][reqid] == 0);
+
+        if (reqid < NREQID)
+            replies[s->zone][reqid] = s->idx + 1;
+    }
+}
+
+
+static int run(const char *code)
+{
+    if (luaL_loadstring(L, code) || lua_pcall(L, 0, 0, 0)) {
+        mrp_debug("'%s' failed: %s", code, lua_tostring(L, -1));
+        lua_pop(L, 1);
+        return -1;
+    }
+
+    return 0;
+}
+
+
+static void setup(void)
+{
+    mrp_log_set_mask(0);
+
+    if (!(ctx = mrp_context_create()) ||
+        !(L = mrp_lua_set_murphy_context(ctx))) {
+        printf("failed to create murphy context\n");
+        exit(ENOMEM);
+    }
+
+    mrp_resource_configuration_init();
+
+    if (run(config) < 0 ||
+        !(client = mrp_resource_client_create("owner-batch-test", NULL))) {
+        printf("failed to set up the resource configuration\n");
+        exit(1);
+    }
+}
+
+
+static void create_sets(void)
+{
+    const set_def_t *d;
+    const res_def_t *r;
+    set_t *s;
+    uint32_t z;
+    int i, j;
+
+    /* interleave the zones, so the sets are in the same order in both */
+    for (i = 0;  i < (int)NSET;  i++) {
+        for (z = 0;  z < NZONE;  z++) {
+            d = set_defs + i;
+            s = sets[z] + i;
+
+            s->zone = z;
+            s->idx  = i;
+            s->rset = mrp_resource_set_create(client, false, false, 0,
+                                              event_cb, s);
+
+            if (!s->rset) {
+                printf("failed to create resource set\n");
+                exit(1);
+            }
+
+            for (j = 0;  j < (int)MRP_ARRAY_SIZE(d->res);  j++) {
+                r = d->res + j;
+
+                if (r->name &&
+                    mrp_resource_set_add_resource(s->rset, r->name, r->shared,
+                                                  NULL, r->mandatory) < 0) {
+                    printf("failed to add resource '%s'\n", r->name);
+                    exit(1);
+                }
+            }
+
+            if (mrp_application_class_add_resource_set(d->class,
+                                                       zone_names[z],
+                                                       s->rset, 0) < 0) {
+                printf("failed to add resource set to class '%s'\n",
+                       d->class);
+                exit(1);
+            }
+        }
+    }
+}
+
+
+static void destroy_sets(void)
+{
+    uint32_t z;
+    int i;
+
+    for (z = 0;  z < NZONE;  z++)
+        for (i = 0;  i < (int)NSET;  i++)
+            mrp_resource_set_destroy(sets[z][i].rset);
+}
+
+
+static void issue(uint32_t zone, op_t *ops, int nop, uint32_t reqid)
+{
+    mrp_resource_set_t *rset;
+    int i;
+
+    for (i = 0;  i < nop;  i++) {
+        rset = sets[zone][ops[i].idx].rset;
+
+        if (ops[i].acquire)
+            mrp_resource_set_acquire(rset, reqid + i);
+        else
+            mrp_resource_set_release(rset, reqid + i);
+    }
+}
+
+
+static int zone_owners(const char *buf, const char *zone, const char **end)
+{
+    char hdr[64];
+    const char *beg, *next;
+
+    /* the owners of a zone are listed on the lines following its name */
+    snprintf(hdr, sizeof(hdr), "   Zone %s:", zone);
+
+    if (!(beg = strstr(buf, hdr)) || !(beg = strchr(beg, '\n')))
+        return -1;
+
+    if (!(next = strstr(beg, "   Zone ")))
+        next = beg + strlen(beg);
+
+    *end = next;
+
+    return beg - buf;
+}
+
+
+static void check_owners(int round)
+{
+    char buf[4096];
+    const char *single, *batch, *se, *be;
+    int s, b;
+
+    mrp_resource_owner_print(buf, sizeof(buf));
+
+    s = zone_owners(buf, zone_names[ZONE_SINGLE], &se);
+    b = zone_owners(buf, zone_names[ZONE_BATCH] , &be);
+
+    CHECK(s >= 0 && b >= 0);
+
+    if (s < 0 || b < 0)
+        return;
+
+    single = buf + s;
+    batch  = buf + b;
+
+    CHECK(se - single == be - batch && !memcmp(single, batch, se - single));
+
+    if (se - single != be - batch || memcmp(single, batch, se - single))
+        printf("owners differ after round %d:\n%s", round, buf);
+}
+
+
+static void check_round(int round, op_t *ops, int nop, uint32_t reqid,
+                        mrp_resource_mask_t *before, int *nevent)
+{
+    mrp_resource_mask_t gs, gb, as, ab;
+    set_t *s, *b;
+    int i;
+
+    for (i = 0;  i < (int)NSET;  i++) {
+        s = sets[ZONE_SINGLE] + i;
+        b = sets[ZONE_BATCH ] + i;
+
+        gs = mrp_get_resource_set_grant(s->rset);
+        gb = mrp_get_resource_set_grant(b->rset);
+        as = mrp_get_resource_set_advice(s->rset);
+        ab = mrp_get_resource_set_advice(b->rset);
+
+        CHECK(mrp_get_resource_set_state(s->rset) ==
+              mrp_get_resource_set_state(b->rset));
+        CHECK(mrp_resource_mask_equal(&gs, &gb));
+        CHECK(mrp_resource_mask_equal(&as, &ab));
+
+        /* the latest event tells the set where it ended up... */
+        CHECK(mrp_resource_mask_equal(&s->notified, &gs));
+        CHECK(mrp_resource_mask_equal(&b->notified, &gb));
+
+        /* ...and a set whose grant changed in the batch got one */
+        if (!mrp_resource_mask_equal(before + i, &gb))
+            CHECK(b->nevent > nevent[i]);
+    }
+
+    /* every request got its reply, and to the set that made it */
+    for (i = 0;  i < nop;  i++) {
+        CHECK(replies[ZONE_BATCH][reqid + i] == ops[i].idx + 1);
+        CHECK(replies[ZONE_SINGLE][reqid + i] ==
+              replies[ZONE_BATCH][reqid + i]);
+    }
+
+    check_owners(round);
+}
+
+
+static void test_bursts(unsigned int seed)
+{
+    op_t ops[NBURST];
+    mrp_resource_mask_t before[NSET];
+    int nevent[NSET];
+    uint32_t reqid;
+    int round, nop, i, failed;
+
+    srand(seed);
+    reqid = 1;
+
+    for (round = 0;  round < NROUND;  round++) {
+        nop = 1 + rand() % NBURST;
+
+        for (i = 0;  i < nop;  i++) {
+            ops[i].idx     = rand() % NSET;
+            ops[i].acquire = rand() % 3 != 0;
+        }
+
+        for (i = 0;  i < (int)NSET;  i++) {
+            before[i] = mrp_get_resource_set_grant(sets[ZONE_BATCH][i].rset);
+            nevent[i] = sets[ZONE_BATCH][i].nevent;
+        }
+
+        issue(ZONE_SINGLE, ops, nop, reqid);
+
+        mrp_resource_owner_begin_batch();
+        issue(ZONE_BATCH, ops, nop, reqid);
+        mrp_resource_owner_end_batch();
+
+        failed = nfail;
+        check_round(round, ops, nop, reqid, before, nevent);
+
+        if (nfail != failed) {
+            printf("round %d (seed %u) failed, requests:", round, seed);
+            for (i = 0;  i < nop;  i++)
+                printf(" %s %d", ops[i].acquire ? "acquire" : "release",
+                       ops[i].idx);
+            printf("\n");
+            return;
+        }
+
+        reqid += nop;
+    }
+}
+
+
+int main(int argc, char *argv[])
+{
+    unsigned int seed;
+
+    seed = argc > 1 ? (unsigned int)strtoul(argv[1], NULL, 10) : 1;
+
+    setup();
+    create_sets();
+
+    test_bursts(seed);
+
+    destroy_sets();
+    mrp_resource_client_destroy(client);
+
+    if (nfail) {
+        printf("%d checks failed\n", nfail);
+        return 1;
+    }
+
+    printf("all batch tests passed\n");
+
+    return 0;
+}
+
+/*
+ * Local Variables:
+ * c-basic-offset: 4
+ * indent-tabs-mode: nil
+ * End:
+ *
+ */
@@ -0,0 +1,581 @@
+/*
+ * Copyright (c) 2012, Intel Corporation
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met:
+ *
+ *  * Redistributions of source code must retain the above copyright notice,
+ *    this list of conditions and the following disclaimer.
+ *  * Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ *  * Neither the name of Intel Corporation nor the names of its contributors
+ *    may be used to endorse or promote products derived from this software
+ *    without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+/*
+ * In-process benchmark of the resource library. It sets up a fixed
+ * configuration of zones, resources and application classes, creates
+ * a number of resource sets and keeps acquiring, releasing, destroying
+ * and recreating random sets of them. Every set count (phase) prints
+ * one JSON object per line with the cost of an operation, which is
+ * dominated by the arbitration it triggers. No daemon or transport is
+ * involved, so the numbers are comparable between builds of the library.
+ * Every phase also reports the number of heap allocations per operation,
+ * the resident set size of the process and the memory held by the object
+ * pools of libmurphy-common and murphy-db.
+ *
+ * With --check every incremental arbitration is verified by a full pass
+ * over the zone, which aborts the benchmark if the two disagree. The
+ * timings are meaningless then, but a run over a few seeds is a cheap
+ * randomized test of the incremental arbitration.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <stdarg.h>
+#include <string.h>
+#include <errno.h>
+#include <time.h>
+#include <getopt.h>
+
+#include <murphy/common/macros.h>
+#include <murphy/common/mm.h>
+#include <murphy/common/log.h>
+#include <murphy/common/mainloop.h>
+
+#include <murphy-db/mdb.h>
+
+#include <murphy/core/context.h>
+#include <murphy/core/lua-bindings/murphy.h>
+
+#include <murphy/resource/config-api.h>
+#include <murphy/resource/manager-api.h>
+#include <murphy/resource/client-api.h>
+
+#define MAX_PHASES    32
+#define NRESOURCE     10
+#define NCLASS        5
+#define MAX_ZONES     16
+#define MAX_POOLS     256
+
+#define ARBITRATION_ENVVAR "__MURPHY_RESOURCE_ARBITRATION"
+
+typedef struct {
+    /* configuration */
+    int                    phases[MAX_PHASES];
+    int                    nphase;
+    int                    nop;
+    int                    nround;
+    int                    nzone;
+    bool                   batch;
+    bool                   check;
+    unsigned int           seed;
+
+    /* run state */
+    mrp_context_t         *ctx;
+    mrp_mainloop_t        *ml;
+    mrp_resource_client_t *client;
+    mrp_resource_set_t   **sets;
+    int                    nset;
+    unsigned long          nevent;
+    unsigned long          nverdict;
+} bench_t;
+
+static const char *classes[NCLASS] = { "c0", "c1", "c2", "c3", "c4" };
+
+
+#ifdef __GLIBC__
+extern void *__libc_malloc(size_t size);
+extern void *__libc_calloc(size_t n, size_t size);
+extern void *__libc_realloc(void *ptr, size_t size);
+
+static unsigned long nalloc;
+
+void *malloc(size_t size)
+{
+    nalloc++;
+    return __libc_malloc(size);
+}
+
+
+void *calloc(size_t n, size_t size)
+{
+    nalloc++;
+    return __libc_calloc(n, size);
+}
+
+
+void *realloc(void *ptr, size_t size)
+{
+    nalloc++;
+    return __libc_realloc(ptr, size);
+}
+#else
+static unsigned long nalloc;             /* can't count, always zero */
+#endif
+
+
+static void process_memory(unsigned long *rss, unsigned long *hwm)
+{
+    char  line[256];
+    FILE *fp;
+
+    *rss = *hwm = 0;
+
+    if ((fp = fopen("/proc/self/status", "r")) == NULL)
+        return;
+
+    while (fgets(line, sizeof(line), fp) != NULL) {
+        if (sscanf(line, "VmRSS: %lu kB", rss) != 1)
+            sscanf(line, "VmHWM: %lu kB", hwm);
+    }
+
+    fclose(fp);
+}
+
+
+/* memory reserved by and used from the object pools, in bytes */
+static void pool_memory(size_t *reserved, size_t *used)
+{
+    static mrp_objpool_stats_t mrp[MAX_POOLS];
+    static mdb_pool_stats_t    mdb[MAX_POOLS];
+
+    int nmrp, nmdb, i;
+
+    nmrp = MRP_MIN(mrp_objpool_get_stats(mrp, MAX_POOLS), MAX_POOLS);
+    nmdb = MRP_MIN(mdb_pool_get_stats(mdb, MAX_POOLS), MAX_POOLS);
+
+    *reserved = *used = 0;
+
+    for (i = 0; i < nmrp; i++) {
+        *reserved += mrp[i].nchunk * mrp[i].nperchunk * mrp[i].objsize;
+        *used     += mrp[i].nobj * mrp[i].objsize;
+    }
+
+    for (i = 0; i < nmdb; i++) {
+        *reserved += mdb[i].nslot * mdb[i].objsize;
+        *used     += mdb[i].nobj * mdb[i].objsize;
+    }
+}
+
+
+static uint64_t now_usecs(void)
+{
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+
+    return (uint64_t)ts.tv_sec * 1000000 + ts.tv_nsec / 1000;
+}
+
+
+static void event_cb(uint32_t reqid, mrp_resource_set_t *rset, void *data)
+{
+    bench_t *bench = (bench_t *)data;
+
+    MRP_UNUSED(reqid);
+    MRP_UNUSED(rset);
+
+    bench->nevent++;
+}
+
+
+/*
+ * A resource manager for a couple of the resources that turns down
+ * a fixed share of the allocations and advices.
+ */
+
+static bench_t *manager_bench;
+
+static bool manager_allocate(mrp_zone_t *zone, mrp_resource_t *res, void *data)
+{
+    MRP_UNUSED(zone);
+    MRP_UNUSED(res);
+    MRP_UNUSED(data);
+
+    return (manager_bench->nverdict++ % 5) != 0;
+}
+
+
+static bool manager_advice(mrp_zone_t *zone, mrp_resource_t *res, void *data)
+{
+    MRP_UNUSED(zone);
+    MRP_UNUSED(res);
+    MRP_UNUSED(data);
+
+    return (manager_bench->nverdict++ % 7) != 0;
+}
+
+
+static mrp_resource_mgr_ftbl_t manager = {
+    .allocate = manager_allocate,
+    .advice   = manager_advice,
+};
+
+
+static void configure(bench_t *bench)
+{
+    static mrp_attr_def_t none[] = { { NULL } };
+
+    mrp_resource_mgr_ftbl_t *mgr;
+    char                     name[32];
+    uint32_t                 id;
+    int                      i;
+
+    manager_bench = bench;
+
+    if (mrp_zone_definition_create(none) < 0)
+        goto failed;
+
+    for (i = 0; i < bench->nzone; i++) {
+        snprintf(name, sizeof(name), "z%d", i);
+
+        if (mrp_zone_create(name, NULL) == MRP_ZONE_ID_INVALID)
+            goto failed;
+    }
+
+    for (i = 0; i < NRESOURCE; i++) {
+        snprintf(name, sizeof(name), "r%d", i);
+
+        mgr = (i == 3 || i == 8) ? &manager : NULL;
+        id  = mrp_resource_definition_create(name, i % 3 != 0, none, mgr,
+                                             NULL);
+
+        if (id == MRP_RESOURCE_ID_INVALID)
+            goto failed;
+
+        /* the Lua view of the sets needs a class for every resource */
+        mrp_lua_resclass_create_from_c(id);
+    }
+
+    if (!mrp_application_class_create("c0", 10, false, false,
+                                      MRP_RESOURCE_ORDER_LIFO) ||
+        !mrp_application_class_create("c1", 20, true, false,
+                                      MRP_RESOURCE_ORDER_FIFO) ||
+        !mrp_application_class_create("c2", 30, false, true,
+                                      MRP_RESOURCE_ORDER_LIFO) ||
+        !mrp_application_class_create("c3", 40, false, true,
+                                      MRP_RESOURCE_ORDER_FIFO) ||
+        !mrp_application_class_create("c4", 50, false, false,
+                                      MRP_RESOURCE_ORDER_LIFO))
+        goto failed;
+
+    if (!(bench->client = mrp_resource_client_create("resource-bench", NULL)))
+        goto failed;
+
+    return;
+
+ failed:
+    fprintf(stderr, "failed to set up the resource configuration\n");
+    exit(1);
+}
+
+
+/*
+ * Sets mostly hold resources of their own neighbourhood, with an
+ * occasional one from elsewhere that links the neighbourhoods together.
+ */
+
+static mrp_resource_set_t *create_set(bench_t *bench, int idx)
+{
+    mrp_resource_set_t *rset;
+    char                name[32], zone[32];
+    bool                used[NRESOURCE];
+    int                 n, i, r;
+
+    rset = mrp_resource_set_create(bench->client, rand() % 3 == 0,
+                                   rand() % 3 == 0, rand() % 3,
+                                   event_cb, bench);
+
+    if (rset == NULL)
+        goto failed;
+
+    memset(used, 0, sizeof(used));
+
+    for (i = 0, n = 1 + rand() % 3; i < n; i++) {
+        r = (idx % (NRESOURCE / 2)) * 2 + rand() % 2;
+
+        if (rand() % 8 == 0)
+            r = rand() % NRESOURCE;
+
+        if (used[r])
+            continue;
+
+        used[r] = true;
+        snprintf(name, sizeof(name), "r%d", r);
+
+        if (mrp_resource_set_add_resource(rset, name, rand() % 2, NULL,
+                                          rand() % 3 != 0) < 0)
+            goto failed;
+    }
+
+    snprintf(zone, sizeof(zone), "z%d", rand() % bench->nzone);
+
+    if (mrp_application_class_add_resource_set(classes[rand() % NCLASS], zone,
+                                               rset, 0) < 0)
+        goto failed;
+
+    return rset;
+
+ failed:
+    fprintf(stderr, "failed to create resource set\n");
+    exit(1);
+}
+
+
+static void run_op(bench_t *bench, uint32_t reqid)
+{
+    int i = rand() % bench->nset;
+
+    switch (rand() % 6) {
+    case 0:
+    case 1:
+    case 2:
+        mrp_resource_set_acquire(bench->sets[i], reqid);
+        break;
+    case 3:
+    case 4:
+        mrp_resource_set_release(bench->sets[i], reqid);
+        break;
+    default:
+        mrp_resource_set_destroy(bench->sets[i]);
+        bench->sets[i] = create_set(bench, i);
+    }
+
+    /* with batching, let a handful of requests pile up per pass */
+    if (bench->batch && (reqid % 8) == 7)
+        mrp_mainloop_iterate(bench->ml);
+}
+
+
+static void set_count(bench_t *bench, int nset)
+{
+    int i;
+
+    for (i = nset; i < bench->nset; i++)
+        mrp_resource_set_destroy(bench->sets[i]);
+
+    if (!mrp_reallocz(bench->sets, bench->nset, nset) && nset > 0) {
+        fprintf(stderr, "failed to allocate memory\n");
+        exit(ENOMEM);
+    }
+
+    for (i = bench->nset; i < nset; i++)
+        bench->sets[i] = create_set(bench, i);
+
+    bench->nset = nset;
+}
+
+
+static void run_phase(bench_t *bench, int nset)
+{
+    uint64_t      start, usecs, best;
+    unsigned long nevent, nop, n, rss, hwm;
+    size_t        reserved, used;
+    uint32_t      reqid;
+    int           round;
+
+    set_count(bench, nset);
+
+    /* warm up, so that every set has been through a few requests */
+    for (reqid = 0; reqid < (uint32_t)bench->nop; reqid++)
+        run_op(bench, reqid);
+
+    best   = 0;
+    nevent = bench->nevent;
+    n      = nalloc;
+
+    for (round = 0; round < bench->nround; round++) {
+        start = now_usecs();
+
+        for (reqid = 0; reqid < (uint32_t)bench->nop; reqid++)
+            run_op(bench, reqid);
+
+        usecs = now_usecs() - start;
+
+        if (!round || usecs < best)
+            best = usecs;
+    }
+
+    n   = nalloc - n;
+    nop = (unsigned long)bench->nop * bench->nround;
+
+    process_memory(&rss, &hwm);
+    pool_memory(&reserved, &used);
+
+    printf("{\"sets\":%d,\"zones\":%d,\"batch\":%s,\"ops\":%d,\"rounds\":%d,"
+           "\"usecs_per_op\":%.2f,\"events_per_op\":%.2f,"
+           "\"allocs_per_op\":%.2f,\"rss_kb\":%lu,\"hwm_kb\":%lu,"
+           "\"pool_kb\":%zu,\"pool_used_kb\":%zu}\n",
+           nset, bench->nzone, bench->batch ? "true" : "false",
+           bench->nop, bench->nround, 1.0 * best / bench->nop,
+           1.0 * (bench->nevent - nevent) / nop, 1.0 * n / nop,
+           rss, hwm, reserved / 1024, used / 1024);
+    fflush(stdout);
+}
+
+
+static void print_usage(const char *argv0, int exit_code, const char *fmt, ...)
+{
+    va_list ap;
+
+    if (fmt && *fmt) {
+        va_start(ap, fmt);
+        vfprintf(stderr, fmt, ap);
+        fprintf(stderr, "\n");
+        va_end(ap);
+    }
+
+    fprintf(stderr, "usage: %s [options]\n\n"
+           "The possible options are:\n"
+           "  -s, --sets=N[,N...]            resource sets, one measurement\n"
+           "                                 phase per number\n"
+           "  -n, --ops=N                    operations per round\n"
+           "  -R, --rounds=N                 rounds per phase, the fastest\n"
+           "                                 one is reported\n"
+           "  -z, --zones=N                  number of zones\n"
+           "  -b, --batch                    batch arbitration in the "
+           "mainloop\n"
+           "  -S, --seed=SEED                seed for the random choices\n"
+           "  -c, --check                    verify every arbitration with "
+           "a full pass\n"
+           "  -h, --help                     show help on usage\n",
+           argv0);
+
+    exit(exit_code);
+}
+
+
+static void parse_cmdline(bench_t *bench, int argc, char **argv)
+{
+#   define OPTIONS "s:n:R:z:bS:ch"
+    struct option options[] = {
+        { "sets"  , required_argument, NULL, 's' },
+        { "ops"   , required_argument, NULL, 'n' },
+        { "rounds", required_argument, NULL, 'R' },
+        { "zones" , required_argument, NULL, 'z' },
+        { "batch" , no_argument      , NULL, 'b' },
+        { "seed"  , required_argument, NULL, 'S' },
+        { "check" , no_argument      , NULL, 'c' },
+        { "help"  , no_argument      , NULL, 'h' },
+        { NULL, 0, NULL, 0 }
+    };
+
+    static char default_sets[] = "30,300,3000";
+
+    char *sets, *p, *end;
+    int   opt;
+
+    bench->nop    = 20000;
+    bench->nround = 5;
+    bench->nzone  = 2;
+    bench->seed   = 1;
+
+    sets = default_sets;
+
+    while ((opt = getopt_long(argc, argv, OPTIONS, options, NULL)) != -1) {
+        switch (opt) {
+        case 's': sets          = optarg;                     break;
+        case 'n': bench->nop    = atoi(optarg);               break;
+        case 'R': bench->nround = atoi(optarg);               break;
+        case 'z': bench->nzone  = atoi(optarg);               break;
+        case 'b': bench->batch  = true;                       break;
+        case 'S': bench->seed   = strtoul(optarg, NULL, 10);  break;
+        case 'c': bench->check  = true;                       break;
+        case 'h': print_usage(argv[0], 0, "");                break;
+        default:
+            print_usage(argv[0], EINVAL, "invalid option '%c'", opt);
+        }
+    }
+
+    if (bench->nop < 1 || bench->nround < 1)
+        print_usage(argv[0], EINVAL, "invalid number of operations");
+    if (bench->nzone < 1 || bench->nzone > MAX_ZONES)
+        print_usage(argv[0], EINVAL, "invalid number of zones");
+
+    for (p = sets; *p; p = end) {
+        if (bench->nphase >= MAX_PHASES)
+            print_usage(argv[0], EINVAL, "too many phases");
+
+        bench->phases[bench->nphase] = strtol(p, &end, 10);
+
+        if (end == p || bench->phases[bench->nphase] < 1 ||
+            (*end && *end != ','))
+            print_usage(argv[0], EINVAL, "invalid set counts '%s'", sets);
+
+        bench->nphase++;
+
+        if (*end == ',')
+            end++;
+    }
+}
+
+
+int main(int argc, char *argv[])
+{
+    bench_t bench;
+    int     i;
+
+    mrp_clear(&bench);
+    parse_cmdline(&bench, argc, argv);
+
+    /* the mode is picked up by the first arbitration */
+    if (bench.check)
+        setenv(ARBITRATION_ENVVAR, "check", 1);
+
+    mrp_log_set_mask(bench.check ? MRP_LOG_MASK_ERROR : 0);
+
+    srand(bench.seed);
+
+    /* resource sets are registered with Lua, as they are in the daemon */
+    if (!(bench.ctx = mrp_context_create()) ||
+        !mrp_lua_set_murphy_context(bench.ctx)) {
+        fprintf(stderr, "failed to create murphy context\n");
+        exit(ENOMEM);
+    }
+
+    bench.ml = bench.ctx->ml;
+
+    mrp_resource_configuration_init();
+    configure(&bench);
+
+    if (bench.batch && mrp_resource_owner_enable_batching(bench.ml, 1) < 0) {
+        fprintf(stderr, "failed to enable batching\n");
+        exit(1);
+    }
+
+    for (i = 0; i < bench.nphase; i++)
+        run_phase(&bench, bench.phases[i]);
+
+    if (bench.batch)
+        mrp_resource_owner_disable_batching();
+
+    set_count(&bench, 0);
+    mrp_resource_client_destroy(bench.client);
+    mrp_context_destroy(bench.ctx);
+
+    return 0;
+}
+
+/*
+ * Local Variables:
+ * c-basic-offset: 4
+ * indent-tabs-mode: nil
+ * End:
+ *
+ */
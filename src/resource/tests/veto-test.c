@@ -0,0 +1,410 @@
+/*
+ * Copyright (c) 2012, Intel Corporation
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met:
+ *
+ *  * Redistributions of source code must retain the above copyright notice,
+ *    this list of conditions and the following disclaimer.
+ *  * Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ *  * Neither the name of Intel Corporation nor the names of its contributors
+ *    may be used to endorse or promote products derived from this software
+ *    without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ */
+
+/*
+ * Tests for caching the verdicts of the Lua veto method. A veto that
+ * counts its calls per resource set is installed, and the zone is then
+ * re-arbitrated with and without changing the inputs the veto declared
+ * to depend on (resource.method.veto_depends) to see which verdicts are
+ * reused and which ones are asked for again.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <errno.h>
+
+#include <lua.h>
+#include <lauxlib.h>
+
+#include <murphy/common/macros.h>
+#include <murphy/common/mm.h>
+#include <murphy/common/log.h>
+#include <murphy/common/debug.h>
+
+#include <murphy/core/context.h>
+#include <murphy/core/lua-bindings/murphy.h>
+
+#include <murphy/resource/config-api.h>
+#include <murphy/resource/manager-api.h>
+#include <murphy/resource/client-api.h>
+#include <murphy/resource/config-lua.h>
+
+#define CHECK(cond) do {                                                  \
+        if (!(cond)) {                                                    \
+            printf("%s:%d: check '%s' failed\n", __FUNCTION__, __LINE__,  \
+                   #cond);                                                \
+            nfail++;                                                      \
+        }                                                                 \
+    } while (0)
+
+static lua_State             *L;
+static mrp_context_t         *ctx;
+static mrp_resource_client_t *client;
+static uint32_t               zoneid;
+static int                    nfail;
+
+static const char *counting_veto =
+    "calls = {}\n"
+    "resource.method.veto = function(zone, rset, grant, owners, reqset)\n"
+    "    calls[rset.id] = (calls[rset.id] or 0) + 1\n"
+    "    return true\n"
+    "end\n";
+
+
+static void event_cb(uint32_t reqid, mrp_resource_set_t *rset, void *data)
+{
+    MRP_UNUSED(reqid);
+    MRP_UNUSED(rset);
+    MRP_UNUSED(data);
+}
+
+
+static int run(const char *code)
+{
+    if (luaL_loadstring(L, code) || lua_pcall(L, 0, 0, 0)) {
+        mrp_debug("'%s' failed: %s", code, lua_tostring(L, -1));
+        lua_pop(L, 1);
+        return -1;
+    }
+
+    return 0;
+}
+
+
+static int ncall(mrp_resource_set_t *rset)
+{
+    int n;
+
+    lua_getglobal(L, "calls");
+    lua_rawgeti(L, -1, mrp_get_resource_set_id(rset));
+    n = lua_tointeger(L, -1);
+    lua_pop(L, 2);
+
+    return n;
+}
+
+
+static void veto_stats(unsigned long long *hits, unsigned long long *misses)
+{
+    char buf[512], *p;
+
+    *hits = *misses = 0;
+
+    mrp_resource_veto_print(buf, sizeof(buf));
+
+    if ((p = strstr(buf, "hits ")) != NULL)
+        sscanf(p, "hits %llu, misses %llu", hits, misses);
+}
+
+
+static bool granted(mrp_resource_set_t *rset)
+{
+    mrp_resource_mask_t grant = mrp_get_resource_set_grant(rset);
+
+    return !mrp_resource_mask_empty(&grant);
+}
+
+
+/*
+ * The configuration has to come from Lua, like it does in the daemon:
+ * only resource classes defined there have the attribute definitions
+ * the Lua view of the resource sets, and so the veto, needs.
+ */
+static const char *config =
+    "zone.attributes { type = { mdb.string, 'common', 'rw' } }\n"
+    "zone { name = 'zone' }\n"
+    "application_class { name = 'phone', priority = 2, modal = false,\n"
+    "                    share = true, order = 'lifo' }\n"
+    "application_class { name = 'player', priority = 1, modal = false,\n"
+    "                    share = true, order = 'lifo' }\n"
+    "resource.class { name = 'audio', shareable = true,\n"
+    "                 attributes = { role = { mdb.string, 'music', 'rw' } } }\n"
+    "resource.class { name = 'video', shareable = false }\n";
+
+
+static void setup(void)
+{
+    mrp_log_set_mask(0);
+
+    if (!(ctx = mrp_context_create()) ||
+        !(L = mrp_lua_set_murphy_context(ctx))) {
+        printf("failed to create murphy context\n");
+        exit(ENOMEM);
+    }
+
+    mrp_resource_configuration_init();
+
+    zoneid = 0;                 /* the first and only zone */
+
+    if (run(config) < 0 ||
+        !(client = mrp_resource_client_create("veto-test", NULL))) {
+        printf("failed to set up the resource configuration\n");
+        exit(1);
+    }
+
+    if (run(counting_veto) < 0) {
+        printf("failed to install the veto method\n");
+        exit(1);
+    }
+}
+
+
+static mrp_resource_set_t *create_set(const char *class, const char *res)
+{
+    mrp_resource_set_t *rset;
+
+    if (!(rset = mrp_resource_set_create(client, false, false, 0,
+                                         event_cb, NULL)) ||
+        mrp_resource_set_add_resource(rset, res, true, NULL, true) < 0 ||
+        mrp_application_class_add_resource_set(class, "zone", rset, 0) < 0) {
+        printf("failed to create resource set\n");
+        exit(1);
+    }
+
+    return rset;
+}
+
+
+static void test_depends(void)
+{
+    mrp_lua_resmethod_t *methods = mrp_lua_get_resource_methods();
+    uint32_t gen;
+
+    CHECK(run("resource.method.veto_depends = { 'owners', 'attributes' }")
+          == 0);
+    CHECK(methods->veto_cached);
+    CHECK(methods->veto_depends ==
+          (MRP_RESOURCE_VETO_OWNERS | MRP_RESOURCE_VETO_ATTRIBUTES));
+
+    /* invalid declarations are rejected and leave the old one in place */
+    gen = methods->veto_gen;
+
+    CHECK(run("resource.method.veto_depends = { 'owners', 'weather' }") < 0);
+    CHECK(run("resource.method.veto_depends = { owners = true }") < 0);
+    CHECK(run("resource.method.veto_depends = 'owners'") < 0);
+    CHECK(methods->veto_cached);
+    CHECK(methods->veto_depends ==
+          (MRP_RESOURCE_VETO_OWNERS | MRP_RESOURCE_VETO_ATTRIBUTES));
+    CHECK(methods->veto_gen == gen);
+
+    CHECK(run("resource.method.veto_depends = { 'zone', 'request' }") == 0);
+    CHECK(methods->veto_cached);
+    CHECK(methods->veto_depends ==
+          (MRP_RESOURCE_VETO_ZONE | MRP_RESOURCE_VETO_REQUEST));
+    CHECK(methods->veto_gen != gen);
+    CHECK(run("local d = resource.method.veto_depends\n"
+              "assert(#d == 2 and d[1] == 'zone' and d[2] == 'request')")
+          == 0);
+
+    CHECK(run("resource.method.veto_depends = {}") == 0);
+    CHECK(methods->veto_cached);
+    CHECK(methods->veto_depends == 0);
+
+    CHECK(run("resource.method.veto_depends = nil") == 0);
+    CHECK(!methods->veto_cached);
+    CHECK(run("assert(resource.method.veto_depends == nil)") == 0);
+}
+
+
+static void test_hits(mrp_resource_set_t *a)
+{
+    unsigned long long hits, misses, h, m;
+    int n;
+
+    CHECK(run("resource.method.veto_depends = {}") == 0);
+
+    mrp_resource_set_acquire(a, 1);
+    CHECK(granted(a));
+
+    veto_stats(&hits, &misses);
+    n = ncall(a);
+    CHECK(n > 0);
+
+    /* nothing changed, so the cached verdict is reused */
+    mrp_resource_owner_recalc(zoneid);
+    mrp_resource_owner_recalc(zoneid);
+
+    veto_stats(&h, &m);
+    CHECK(ncall(a) == n);
+    CHECK(h == hits + 2);
+    CHECK(m == misses);
+    CHECK(granted(a));
+
+    /* without a declaration every verdict is asked for */
+    CHECK(run("resource.method.veto_depends = nil") == 0);
+
+    mrp_resource_owner_recalc(zoneid);
+    mrp_resource_owner_recalc(zoneid);
+
+    CHECK(ncall(a) == n + 2);
+}
+
+
+static void test_attributes(mrp_resource_set_t *a)
+{
+    mrp_attr_t role[] = {
+        { "role", mqi_string, .value.string = "navigation" },
+        { NULL }
+    };
+    int n;
+
+    /* a veto that did not declare the attributes ignores them... */
+    CHECK(run("resource.method.veto_depends = {}") == 0);
+    mrp_resource_owner_recalc(zoneid);
+    n = ncall(a);
+
+    CHECK(mrp_resource_set_write_attributes(a, "audio", role) == 0);
+    mrp_resource_owner_recalc(zoneid);
+    CHECK(ncall(a) == n);
+
+    /* ...one that did sees every write */
+    CHECK(run("resource.method.veto_depends = { 'attributes' }") == 0);
+    mrp_resource_owner_recalc(zoneid);
+    n = ncall(a);
+
+    mrp_resource_owner_recalc(zoneid);
+    CHECK(ncall(a) == n);
+
+    role[0].value.string = "phone";
+    CHECK(mrp_resource_set_write_attributes(a, "audio", role) == 0);
+    mrp_resource_owner_recalc(zoneid);
+    CHECK(ncall(a) == n + 1);
+
+    mrp_resource_owner_recalc(zoneid);
+    CHECK(ncall(a) == n + 1);
+}
+
+
+static void test_owners(mrp_resource_set_t *a)
+{
+    mrp_resource_set_t *b;
+    int n;
+
+    /* b is in a higher priority class, a sees it owning 'video' */
+    b = create_set("phone", "video");
+
+    CHECK(run("resource.method.veto_depends = { 'owners' }") == 0);
+    mrp_resource_owner_recalc(zoneid);
+    n = ncall(a);
+
+    mrp_resource_owner_recalc(zoneid);
+    CHECK(ncall(a) == n);
+
+    mrp_resource_set_acquire(b, 2);
+    CHECK(granted(b));
+    mrp_resource_owner_recalc(zoneid);
+    CHECK(ncall(a) == n + 1);
+
+    mrp_resource_owner_recalc(zoneid);
+    CHECK(ncall(a) == n + 1);
+
+    mrp_resource_set_release(b, 3);
+    mrp_resource_owner_recalc(zoneid);
+    CHECK(ncall(a) == n + 2);
+
+    /* an undeclared dependency on the owners is not tracked */
+    CHECK(run("resource.method.veto_depends = {}") == 0);
+    mrp_resource_owner_recalc(zoneid);
+    n = ncall(a);
+
+    mrp_resource_set_acquire(b, 4);
+    mrp_resource_owner_recalc(zoneid);
+    CHECK(ncall(a) == n);
+
+    mrp_resource_set_destroy(b);
+}
+
+
+static void test_replace(mrp_resource_set_t *a)
+{
+    int n;
+
+    CHECK(run("resource.method.veto_depends = {}") == 0);
+    mrp_resource_owner_recalc(zoneid);
+    n = ncall(a);
+    CHECK(granted(a));
+
+    /* a new veto is asked again, and its verdict is the one that counts */
+    CHECK(run("resource.method.veto = function(zone, rset)\n"
+              "    calls[rset.id] = (calls[rset.id] or 0) + 1\n"
+              "    return false\n"
+              "end\n") == 0);
+    mrp_resource_owner_recalc(zoneid);
+    CHECK(ncall(a) == n + 1);
+    CHECK(!granted(a));
+
+    mrp_resource_owner_recalc(zoneid);
+    CHECK(ncall(a) == n + 1);
+    CHECK(!granted(a));
+
+    CHECK(run(counting_veto) == 0);
+    mrp_resource_owner_recalc(zoneid);
+    CHECK(ncall(a) == 1);
+    CHECK(granted(a));
+}
+
+
+int main(int argc, char *argv[])
+{
+    mrp_resource_set_t *a;
+
+    MRP_UNUSED(argc);
+    MRP_UNUSED(argv);
+
+    setup();
+
+    a = create_set("player", "audio");
+
+    test_depends();
+    test_hits(a);
+    test_attributes(a);
+    test_owners(a);
+    test_replace(a);
+
+    mrp_resource_set_destroy(a);
+    mrp_resource_client_destroy(client);
+
+    if (nfail) {
+        printf("%d checks failed\n", nfail);
+        return 1;
+    }
+
+    printf("all veto tests passed\n");
+
+    return 0;
+}
+
+/*
+ * Local Variables:
+ * c-basic-offset: 4
+ * indent-tabs-mode: nil
+ * End:
+ *
+ */